@@ -0,0 +1,55 @@
+"""add_saldos_mensuales
+
+Revision ID: a1b2c3d4e5f6
+Revises: 1309082a4c2b
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e5f6'
+down_revision: Union[str, Sequence[str], None] = '1309082a4c2b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('saldos_mensuales_cuenta',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('cuenta_id', sa.Integer(), nullable=False),
+    sa.Column('centro_costo_id', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('ano', sa.Integer(), nullable=False),
+    sa.Column('mes', sa.Integer(), nullable=False),
+    sa.Column('debito', sa.Numeric(precision=18, scale=2), nullable=False, server_default='0'),
+    sa.Column('credito', sa.Numeric(precision=18, scale=2), nullable=False, server_default='0'),
+    sa.Column('cantidad_movimientos', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ),
+    sa.ForeignKeyConstraint(['cuenta_id'], ['plan_cuentas.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_saldos_mensuales_cuenta_id'), 'saldos_mensuales_cuenta', ['id'], unique=False)
+    op.create_index('uq_saldo_mensual_empresa_cuenta_cc_periodo', 'saldos_mensuales_cuenta', ['empresa_id', 'cuenta_id', 'centro_costo_id', 'ano', 'mes'], unique=True)
+    op.create_index('ix_saldo_mensual_empresa_periodo', 'saldos_mensuales_cuenta', ['empresa_id', 'ano', 'mes'], unique=False)
+
+    op.create_table('saldos_mensuales_estado',
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('fecha_reconstruccion', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ),
+    sa.PrimaryKeyConstraint('empresa_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('saldos_mensuales_estado')
+    op.drop_index('ix_saldo_mensual_empresa_periodo', table_name='saldos_mensuales_cuenta')
+    op.drop_index('uq_saldo_mensual_empresa_cuenta_cc_periodo', table_name='saldos_mensuales_cuenta')
+    op.drop_index(op.f('ix_saldos_mensuales_cuenta_id'), table_name='saldos_mensuales_cuenta')
+    op.drop_table('saldos_mensuales_cuenta')
@@ -0,0 +1,41 @@
+"""add_indice_paginacion_keyset
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7b8c9d0e1f2'
+down_revision: Union[str, Sequence[str], None] = 'f6a7b8c9d0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# La paginación por cursor del Libro Diario y del Super Informe recorre los
+# documentos de la empresa en orden (fecha, id) a partir de la última fila vista.
+NOMBRE = 'ix_documentos_empresa_fecha_id'
+COLUMNAS = ['empresa_id', 'fecha', 'id']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(
+                NOMBRE, 'documentos', COLUMNAS, unique=False, if_not_exists=True,
+                postgresql_concurrently=True
+            )
+    else:
+        op.create_index(NOMBRE, 'documentos', COLUMNAS, unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(NOMBRE, table_name='documentos', if_exists=True)
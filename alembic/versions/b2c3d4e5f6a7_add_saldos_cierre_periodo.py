@@ -0,0 +1,63 @@
+"""add_saldos_cierre_periodo
+
+Revision ID: b2c3d4e5f6a7
+Revises: a1b2c3d4e5f6
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2c3d4e5f6a7'
+down_revision: Union[str, Sequence[str], None] = 'a1b2c3d4e5f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('saldos_cierre_periodo',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('periodo_cerrado_id', sa.Integer(), nullable=True),
+    sa.Column('ano', sa.Integer(), nullable=False),
+    sa.Column('mes', sa.Integer(), nullable=False),
+    sa.Column('checksum', sa.String(length=64), nullable=False),
+    sa.Column('cantidad_filas', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ),
+    sa.ForeignKeyConstraint(['periodo_cerrado_id'], ['periodos_cerrados.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('empresa_id', 'ano', 'mes', name='_saldo_cierre_empresa_ano_mes_uc')
+    )
+    op.create_index(op.f('ix_saldos_cierre_periodo_id'), 'saldos_cierre_periodo', ['id'], unique=False)
+
+    op.create_table('saldos_cierre_periodo_detalle',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cierre_id', sa.Integer(), nullable=False),
+    sa.Column('cuenta_id', sa.Integer(), nullable=False),
+    sa.Column('tercero_id', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('centro_costo_id', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('debito', sa.Numeric(precision=18, scale=2), nullable=False, server_default='0'),
+    sa.Column('credito', sa.Numeric(precision=18, scale=2), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['cierre_id'], ['saldos_cierre_periodo.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['cuenta_id'], ['plan_cuentas.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_saldos_cierre_periodo_detalle_id'), 'saldos_cierre_periodo_detalle', ['id'], unique=False)
+    op.create_index('ix_saldo_cierre_detalle_cierre_cuenta', 'saldos_cierre_periodo_detalle', ['cierre_id', 'cuenta_id'], unique=False)
+    op.create_index('ix_saldo_cierre_detalle_cierre_tercero', 'saldos_cierre_periodo_detalle', ['cierre_id', 'tercero_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_saldo_cierre_detalle_cierre_tercero', table_name='saldos_cierre_periodo_detalle')
+    op.drop_index('ix_saldo_cierre_detalle_cierre_cuenta', table_name='saldos_cierre_periodo_detalle')
+    op.drop_index(op.f('ix_saldos_cierre_periodo_detalle_id'), table_name='saldos_cierre_periodo_detalle')
+    op.drop_table('saldos_cierre_periodo_detalle')
+    op.drop_index(op.f('ix_saldos_cierre_periodo_id'), table_name='saldos_cierre_periodo')
+    op.drop_table('saldos_cierre_periodo')
@@ -0,0 +1,63 @@
+"""add_indices_trigram_busqueda
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8c9d0e1f2a3'
+down_revision: Union[str, Sequence[str], None] = 'a7b8c9d0e1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Índices GIN de trigramas para los ILIKE '%texto%' de autocompletar y filtros
+# (app/services/busqueda.py). En SQLite la búsqueda usa tablas FTS5 que se
+# crean al arrancar, así que esta migración solo aplica a PostgreSQL.
+INDICES = [
+    ('ix_terceros_nit_trgm', 'terceros', 'nit'),
+    ('ix_terceros_razon_social_trgm', 'terceros', 'razon_social'),
+    ('ix_productos_codigo_trgm', 'productos', 'codigo'),
+    ('ix_productos_nombre_trgm', 'productos', 'nombre'),
+    ('ix_plan_cuentas_codigo_trgm', 'plan_cuentas', 'codigo'),
+    ('ix_plan_cuentas_nombre_trgm', 'plan_cuentas', 'nombre'),
+    ('ix_grupos_inventario_nombre_trgm', 'grupos_inventario', 'nombre'),
+    ('ix_movimientos_contables_concepto_trgm', 'movimientos_contables', 'concepto'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    disponible = bind.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).first()
+    if disponible is None:
+        print("  [Alembic] pg_trgm no está disponible en el servidor: la búsqueda seguirá sin índices de trigramas.")
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for nombre, tabla, columna in INDICES:
+            op.create_index(
+                nombre, tabla, [columna], unique=False, if_not_exists=True,
+                postgresql_using='gin', postgresql_ops={columna: 'gin_trgm_ops'},
+                postgresql_concurrently=True
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for nombre, tabla, _ in INDICES:
+        op.drop_index(nombre, table_name=tabla, if_exists=True)
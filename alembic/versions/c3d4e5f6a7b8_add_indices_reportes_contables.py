@@ -0,0 +1,59 @@
+"""add_indices_reportes_contables
+
+Revision ID: c3d4e5f6a7b8
+Revises: b2c3d4e5f6a7
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d4e5f6a7b8'
+down_revision: Union[str, Sequence[str], None] = 'b2c3d4e5f6a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (nombre, tabla, columnas, columnas incluidas solo en PostgreSQL)
+INDICES = [
+    ('ix_movcont_documento', 'movimientos_contables', ['documento_id'], None),
+    ('ix_movcont_cuenta_documento', 'movimientos_contables', ['cuenta_id', 'documento_id'], ['debito', 'credito']),
+    ('ix_movcont_tercero_cuenta', 'movimientos_contables', ['tercero_id', 'cuenta_id'], None),
+    ('ix_movcont_centro_costo', 'movimientos_contables', ['centro_costo_id'], None),
+    ('ix_movcont_producto', 'movimientos_contables', ['producto_id'], None),
+    ('ix_documentos_empresa_fecha_anulado', 'documentos', ['empresa_id', 'fecha', 'anulado'], None),
+    ('ix_documentos_empresa_tipo_numero', 'documentos', ['empresa_id', 'tipo_documento_id', 'numero'], None),
+    ('ix_documentos_empresa_beneficiario', 'documentos', ['empresa_id', 'beneficiario_id'], None),
+    ('ix_aplicacion_pagos_factura', 'aplicacion_pagos', ['documento_factura_id'], None),
+    ('ix_aplicacion_pagos_pago', 'aplicacion_pagos', ['documento_pago_id'], None),
+    ('ix_aplicacion_pagos_empresa', 'aplicacion_pagos', ['empresa_id'], None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    es_postgres = op.get_bind().dialect.name == 'postgresql'
+
+    if es_postgres:
+        # CREATE INDEX CONCURRENTLY no bloquea escrituras en tablas grandes,
+        # pero debe ejecutarse fuera de la transacción de la migración.
+        with op.get_context().autocommit_block():
+            for nombre, tabla, columnas, incluidas in INDICES:
+                op.create_index(
+                    nombre, tabla, columnas, unique=False, if_not_exists=True,
+                    postgresql_concurrently=True,
+                    postgresql_include=incluidas or []
+                )
+    else:
+        for nombre, tabla, columnas, _ in INDICES:
+            op.create_index(nombre, tabla, columnas, unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for nombre, tabla, _, _ in reversed(INDICES):
+        op.drop_index(nombre, table_name=tabla, if_exists=True)
@@ -0,0 +1,81 @@
+"""add_bank_movements_content_hash
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+import hashlib
+from decimal import Decimal
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9d0e1f2a3b4'
+down_revision: Union[str, Sequence[str], None] = 'b8c9d0e1f2a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BLOQUE = 1000
+
+
+def _huella(bank_account_id, transaction_date, amount, description, reference, occurrence):
+    """Copia fija de services.conciliacion_bancaria.bank_movement_hash al momento de la migración"""
+    normalized = "|".join([
+        str(bank_account_id),
+        transaction_date.isoformat(),
+        str(Decimal(str(amount)).quantize(Decimal("0.01"))),
+        " ".join((description or "").lower().split()),
+        (reference or "").strip().lower(),
+        str(occurrence),
+    ])
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('bank_movements', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+    # Huella de los movimientos existentes; las líneas repetidas de una cuenta se numeran por id
+    bind = op.get_bind()
+    movimientos = sa.table(
+        'bank_movements',
+        sa.column('id', sa.Integer), sa.column('bank_account_id', sa.Integer),
+        sa.column('transaction_date', sa.Date), sa.column('amount', sa.Numeric(15, 2)),
+        sa.column('description', sa.Text), sa.column('reference', sa.String),
+        sa.column('content_hash', sa.String),
+    )
+    filas = bind.execute(sa.select(
+        movimientos.c.id, movimientos.c.bank_account_id, movimientos.c.transaction_date,
+        movimientos.c.amount, movimientos.c.description, movimientos.c.reference
+    ).order_by(movimientos.c.id))
+    ocurrencias = {}
+    pendientes = []
+    actualizar = movimientos.update().where(movimientos.c.id == sa.bindparam('b_id')).values(
+        content_hash=sa.bindparam('b_hash')
+    )
+    for fila in filas.fetchall():
+        base = _huella(fila.bank_account_id, fila.transaction_date, fila.amount, fila.description, fila.reference, 0)
+        ocurrencia = ocurrencias.get(base, 0)
+        ocurrencias[base] = ocurrencia + 1
+        huella = base if ocurrencia == 0 else _huella(
+            fila.bank_account_id, fila.transaction_date, fila.amount, fila.description, fila.reference, ocurrencia
+        )
+        pendientes.append({'b_id': fila.id, 'b_hash': huella})
+        if len(pendientes) >= BLOQUE:
+            bind.execute(actualizar, pendientes)
+            pendientes = []
+    if pendientes:
+        bind.execute(actualizar, pendientes)
+
+    op.create_index('uq_bank_movements_content_hash', 'bank_movements', ['content_hash'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_bank_movements_content_hash', table_name='bank_movements')
+    op.drop_column('bank_movements', 'content_hash')
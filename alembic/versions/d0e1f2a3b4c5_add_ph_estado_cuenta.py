@@ -0,0 +1,62 @@
+"""add_ph_estado_cuenta
+
+Revision ID: d0e1f2a3b4c5
+Revises: c9d0e1f2a3b4
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd0e1f2a3b4c5'
+down_revision: Union[str, Sequence[str], None] = 'c9d0e1f2a3b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Las tablas arrancan vacías: cada unidad se construye en su primera consulta de cartera
+    op.create_table('ph_estado_cuenta_unidad',
+    sa.Column('unidad_id', sa.Integer(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('firma', sa.String(length=64), nullable=False),
+    sa.Column('estado', sa.JSON(), nullable=False),
+    sa.Column('ultima_fecha', sa.Date(), nullable=True),
+    sa.Column('ultimo_documento_id', sa.Integer(), nullable=True),
+    sa.Column('documentos', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('recalcular_desde', sa.Date(), nullable=True),
+    sa.Column('actualizado_en', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ),
+    sa.ForeignKeyConstraint(['unidad_id'], ['ph_unidades.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('unidad_id')
+    )
+    op.create_index(op.f('ix_ph_estado_cuenta_unidad_empresa_id'), 'ph_estado_cuenta_unidad', ['empresa_id'], unique=False)
+
+    op.create_table('ph_estado_cuenta_cortes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('unidad_id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('estado', sa.JSON(), nullable=False),
+    sa.ForeignKeyConstraint(['unidad_id'], ['ph_unidades.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ph_estado_cuenta_cortes_id'), 'ph_estado_cuenta_cortes', ['id'], unique=False)
+    op.create_index('uq_ph_estado_cuenta_corte_unidad_fecha', 'ph_estado_cuenta_cortes', ['unidad_id', 'fecha'], unique=True)
+
+    # Lectura incremental del historial de cada unidad
+    op.create_index('ix_documentos_unidad_ph_fecha_id', 'documentos', ['unidad_ph_id', 'fecha', 'id'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_documentos_unidad_ph_fecha_id', table_name='documentos', if_exists=True)
+    op.drop_index('uq_ph_estado_cuenta_corte_unidad_fecha', table_name='ph_estado_cuenta_cortes')
+    op.drop_index(op.f('ix_ph_estado_cuenta_cortes_id'), table_name='ph_estado_cuenta_cortes')
+    op.drop_table('ph_estado_cuenta_cortes')
+    op.drop_index(op.f('ix_ph_estado_cuenta_unidad_empresa_id'), table_name='ph_estado_cuenta_unidad')
+    op.drop_table('ph_estado_cuenta_unidad')
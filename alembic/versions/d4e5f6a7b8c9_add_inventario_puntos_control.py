@@ -0,0 +1,50 @@
+"""add_inventario_puntos_control
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e5f6a7b8c9'
+down_revision: Union[str, Sequence[str], None] = 'c3d4e5f6a7b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('inventario_puntos_control',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('producto_id', sa.Integer(), nullable=False),
+    sa.Column('movimiento_id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('num_movimientos', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('stock_total', sa.Float(), nullable=False, server_default='0'),
+    sa.Column('costo_promedio', sa.Float(), nullable=False, server_default='0'),
+    sa.Column('stocks_bodega', sa.JSON(), nullable=False),
+    sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['producto_id'], ['productos.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_inventario_puntos_control_id'), 'inventario_puntos_control', ['id'], unique=False)
+    op.create_index('ix_inv_punto_control_producto_posicion', 'inventario_puntos_control', ['producto_id', 'fecha', 'movimiento_id'], unique=False)
+
+    # El recálculo (desde un punto de control o completo) recorre el kárdex por (fecha, id)
+    op.create_index('ix_movinv_producto_fecha_id', 'movimientos_inventario', ['producto_id', 'fecha', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_movinv_documento', 'movimientos_inventario', ['documento_id'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_movinv_documento', table_name='movimientos_inventario', if_exists=True)
+    op.drop_index('ix_movinv_producto_fecha_id', table_name='movimientos_inventario', if_exists=True)
+    op.drop_index('ix_inv_punto_control_producto_posicion', table_name='inventario_puntos_control')
+    op.drop_index(op.f('ix_inventario_puntos_control_id'), table_name='inventario_puntos_control')
+    op.drop_table('inventario_puntos_control')
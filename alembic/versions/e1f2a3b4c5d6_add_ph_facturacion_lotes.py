@@ -0,0 +1,83 @@
+"""add_ph_facturacion_lotes
+
+Revision ID: e1f2a3b4c5d6
+Revises: d0e1f2a3b4c5
+Create Date: 2026-10-18 23:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1f2a3b4c5d6'
+down_revision: Union[str, Sequence[str], None] = 'd0e1f2a3b4c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ph_facturacion_lotes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=True),
+    sa.Column('periodo', sa.String(length=7), nullable=False),
+    sa.Column('fecha_factura', sa.Date(), nullable=False),
+    sa.Column('tipo_documento_id', sa.Integer(), nullable=False),
+    sa.Column('numero_inicial', sa.Integer(), nullable=True),
+    sa.Column('numero_final', sa.Integer(), nullable=True),
+    sa.Column('estado', sa.String(length=30), nullable=False),
+    sa.Column('tamano_bloque', sa.Integer(), nullable=False),
+    sa.Column('workers', sa.Integer(), nullable=False),
+    sa.Column('total_unidades', sa.Integer(), nullable=False),
+    sa.Column('total_bloques', sa.Integer(), nullable=False),
+    sa.Column('detalles', sa.JSON(), nullable=True),
+    sa.Column('fecha_inicio', sa.DateTime(), nullable=True),
+    sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+    sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tipo_documento_id'], ['tipos_documento.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ph_facturacion_lotes_id'), 'ph_facturacion_lotes', ['id'], unique=False)
+    op.create_index(op.f('ix_ph_facturacion_lotes_empresa_id'), 'ph_facturacion_lotes', ['empresa_id'], unique=False)
+    op.create_index('ix_ph_facturacion_lote_periodo_estado', 'ph_facturacion_lotes', ['empresa_id', 'periodo', 'estado'], unique=False)
+
+    op.create_table('ph_facturacion_lote_unidades',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lote_id', sa.Integer(), nullable=False),
+    sa.Column('unidad_id', sa.Integer(), nullable=False),
+    sa.Column('unidad_codigo', sa.String(length=50), nullable=True),
+    sa.Column('bloque', sa.Integer(), nullable=False),
+    sa.Column('numero', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('factura', sa.JSON(), nullable=False),
+    sa.Column('cruce', sa.JSON(), nullable=True),
+    sa.Column('valor_cruce', sa.Float(), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('documento_id', sa.Integer(), nullable=True),
+    sa.Column('cruce_documento_id', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['lote_id'], ['ph_facturacion_lotes.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['unidad_id'], ['ph_unidades.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ph_facturacion_lote_unidades_id'), 'ph_facturacion_lote_unidades', ['id'], unique=False)
+    op.create_index('ix_ph_facturacion_lote_unidad_bloque', 'ph_facturacion_lote_unidades', ['lote_id', 'bloque', 'estado'], unique=False)
+    op.create_index('uq_ph_facturacion_lote_unidad', 'ph_facturacion_lote_unidades', ['lote_id', 'unidad_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_ph_facturacion_lote_unidad', table_name='ph_facturacion_lote_unidades')
+    op.drop_index('ix_ph_facturacion_lote_unidad_bloque', table_name='ph_facturacion_lote_unidades')
+    op.drop_index(op.f('ix_ph_facturacion_lote_unidades_id'), table_name='ph_facturacion_lote_unidades')
+    op.drop_table('ph_facturacion_lote_unidades')
+    op.drop_index('ix_ph_facturacion_lote_periodo_estado', table_name='ph_facturacion_lotes')
+    op.drop_index(op.f('ix_ph_facturacion_lotes_empresa_id'), table_name='ph_facturacion_lotes')
+    op.drop_index(op.f('ix_ph_facturacion_lotes_id'), table_name='ph_facturacion_lotes')
+    op.drop_table('ph_facturacion_lotes')
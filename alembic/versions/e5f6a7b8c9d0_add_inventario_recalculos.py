@@ -0,0 +1,68 @@
+"""add_inventario_recalculos
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f6a7b8c9d0'
+down_revision: Union[str, Sequence[str], None] = 'd4e5f6a7b8c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('inventario_recalculos',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=True),
+    sa.Column('estado', sa.String(length=30), nullable=False, server_default='PENDIENTE'),
+    sa.Column('tamano_bloque', sa.Integer(), nullable=False),
+    sa.Column('workers', sa.Integer(), nullable=False, server_default='1'),
+    sa.Column('total_productos', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('total_bloques', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('productos_procesados', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('bloques_completados', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('bloques_con_error', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('fecha_inicio', sa.DateTime(), nullable=True),
+    sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+    sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_inventario_recalculos_id'), 'inventario_recalculos', ['id'], unique=False)
+    op.create_index(op.f('ix_inventario_recalculos_empresa_id'), 'inventario_recalculos', ['empresa_id'], unique=False)
+
+    op.create_table('inventario_recalculo_bloques',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recalculo_id', sa.Integer(), nullable=False),
+    sa.Column('numero', sa.Integer(), nullable=False),
+    sa.Column('producto_ids', sa.JSON(), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False, server_default='PENDIENTE'),
+    sa.Column('productos_procesados', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('productos_negativos', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['recalculo_id'], ['inventario_recalculos.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_inventario_recalculo_bloques_id'), 'inventario_recalculo_bloques', ['id'], unique=False)
+    op.create_index('ix_inv_recalculo_bloque_estado', 'inventario_recalculo_bloques', ['recalculo_id', 'estado'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_inv_recalculo_bloque_estado', table_name='inventario_recalculo_bloques')
+    op.drop_index(op.f('ix_inventario_recalculo_bloques_id'), table_name='inventario_recalculo_bloques')
+    op.drop_table('inventario_recalculo_bloques')
+    op.drop_index(op.f('ix_inventario_recalculos_empresa_id'), table_name='inventario_recalculos')
+    op.drop_index(op.f('ix_inventario_recalculos_id'), table_name='inventario_recalculos')
+    op.drop_table('inventario_recalculos')
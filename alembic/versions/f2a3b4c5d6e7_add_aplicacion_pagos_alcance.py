@@ -0,0 +1,34 @@
+"""add_aplicacion_pagos_alcance
+
+Revision ID: f2a3b4c5d6e7
+Revises: e1f2a3b4c5d6
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a3b4c5d6e7'
+down_revision: Union[str, Sequence[str], None] = 'e1f2a3b4c5d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Las filas existentes quedan en NULL (alcance desconocido): el primer
+    # recálculo de cada tercero las completa.
+    op.add_column('aplicacion_pagos', sa.Column('alcance_fecha', sa.Date(), nullable=True))
+    op.add_column('aplicacion_pagos', sa.Column('alcance_documento_id', sa.Integer(), nullable=True))
+    op.add_column('aplicacion_pagos', sa.Column('valor_por_concepto', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('aplicacion_pagos', 'valor_por_concepto')
+    op.drop_column('aplicacion_pagos', 'alcance_documento_id')
+    op.drop_column('aplicacion_pagos', 'alcance_fecha')
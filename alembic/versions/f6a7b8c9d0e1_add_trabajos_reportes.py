@@ -0,0 +1,56 @@
+"""add_trabajos_reportes
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, Sequence[str], None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('trabajos_reportes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=True),
+    sa.Column('reporte_key', sa.String(length=100), nullable=False),
+    sa.Column('formato', sa.String(length=10), nullable=False, server_default='pdf'),
+    sa.Column('filtros', sa.JSON(), nullable=True),
+    sa.Column('huella', sa.String(length=64), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False, server_default='PENDIENTE'),
+    sa.Column('porcentaje', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('mensaje', sa.String(length=255), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('nombre_archivo', sa.String(length=255), nullable=True),
+    sa.Column('ruta_archivo', sa.String(length=500), nullable=True),
+    sa.Column('tamano_bytes', sa.Integer(), nullable=True),
+    sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+    sa.Column('fecha_inicio', sa.DateTime(), nullable=True),
+    sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+    sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+    sa.Column('fecha_expiracion', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresas.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_trabajos_reportes_id'), 'trabajos_reportes', ['id'], unique=False)
+    op.create_index(op.f('ix_trabajos_reportes_empresa_id'), 'trabajos_reportes', ['empresa_id'], unique=False)
+    op.create_index('ix_trabajos_reportes_huella_estado', 'trabajos_reportes', ['empresa_id', 'huella', 'estado'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_trabajos_reportes_huella_estado', table_name='trabajos_reportes')
+    op.drop_index(op.f('ix_trabajos_reportes_empresa_id'), table_name='trabajos_reportes')
+    op.drop_index(op.f('ix_trabajos_reportes_id'), table_name='trabajos_reportes')
+    op.drop_table('trabajos_reportes')
@@ -552,7 +552,7 @@ def generar_reporte_pdf(
 
     # 2. Renderizar Template
     from jinja2 import Environment, FileSystemLoader
-    from weasyprint import HTML
+    from app.services import motor_pdf
     import os
 
     template_dir = os.path.join(os.getcwd(), 'app/templates')
@@ -581,7 +581,7 @@ def generar_reporte_pdf(
     )
     
     # 3. Generar PDF
-    pdf_bytes = HTML(string=html_content).write_pdf()
+    pdf_bytes = motor_pdf.html_a_pdf(html_content)
     
     from fastapi.responses import Response
     return Response(
@@ -2,7 +2,7 @@ from typing import List, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
-from app.services import cartera as cartera_service
+from app.services import cartera as cartera_service, cola_cartera
 from app.core.database import get_db
 # --- IMPORTACIONES CORREGIDAS ---
 from app.core.security import get_current_user
@@ -31,4 +31,28 @@ def get_facturas_pendientes(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error inesperado al consultar la cartera: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.get("/recalculo-lotes", response_model=List[Dict[str, Any]])
+def listar_lotes_recalculo(
+    current_user: models_usuario = Depends(get_current_user)
+):
+    """
+    Lotes recientes de recálculo diferido de cartera (recaudo/pago masivo,
+    anulaciones, importaciones) con su avance.
+    """
+    return cola_cartera.listar_lotes(current_user.empresa_id)
+
+
+@router.get("/recalculo-lotes/{lote_id}", response_model=Dict[str, Any])
+def get_progreso_lote_recalculo(
+    lote_id: str,
+    current_user: models_usuario = Depends(get_current_user)
+):
+    """
+    Avance de un lote de recálculo de cartera: procesados/total, errores y estado.
+    """
+    progreso = cola_cartera.get_progreso_lote(lote_id, current_user.empresa_id)
+    if progreso is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lote de recálculo no encontrado.")
+    return progreso
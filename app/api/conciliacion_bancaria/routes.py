@@ -335,10 +335,15 @@ async def import_bank_statement(
     file: Optional[UploadFile] = File(None),
     pdf_password: Optional[str] = Form(None),
     raw_text: Optional[str] = Form(None),
+    skip_duplicates: bool = Form(False),
     current_user: Usuario = Depends(has_permission("conciliacion_bancaria:importar")),
     db: Session = Depends(get_db)
 ):
-    """Importar extracto bancario"""
+    """
+    Importar extracto bancario.
+    skip_duplicates: importa sin pasar por revisión omitiendo las líneas ya importadas
+    (útil al volver a cargar un extracto que se solapa con el anterior).
+    """
     # Verificar configuración
     config = db.query(ImportConfig).filter(
         ImportConfig.id == config_id,
@@ -382,38 +387,48 @@ async def import_bank_statement(
             temp_file_path, config_id, bank_account_id, current_user.empresa_id, current_user.id, original_filename
         )
         
-        # 3. Parsear movimientos
-        movements = import_engine.parse_bank_statement(temp_file_path, config, pdf_password)
-        
-        # 4. Detectar duplicados
-        duplicate_report = import_engine.detect_duplicates(movements, bank_account_id)
-        
-        if duplicate_report.action_required:
-            # Actualizar sesión con información de duplicados
-            import_engine.update_import_session(
-                import_session.id,
-                len(movements),
-                0,
-                [f"Se encontraron {duplicate_report.total_duplicates} posibles duplicados"],
-                "PENDING_REVIEW"
+        if skip_duplicates:
+            # 3-5. Sin revisión: los movimientos se almacenan por bloques a medida que se parsean
+            # (en PDF, a medida que se extraen las páginas) y se omiten los ya importados
+            store_result = import_engine.store_movements_stream(
+                import_engine.iter_bank_statement(temp_file_path, config, pdf_password),
+                import_session.id, bank_account_id, current_user.empresa_id
             )
+            total_movements = store_result['total_stored'] + store_result['total_skipped']
+        else:
+            # 3. Parsear movimientos
+            movements = import_engine.parse_bank_statement(temp_file_path, config, pdf_password)
             
-            return {
-                **import_session.__dict__,
-                "duplicate_report": duplicate_report
-            }
-        
-        # 5. Almacenar movimientos
-        store_result = import_engine.store_movements(
-            movements, import_session.id, bank_account_id, current_user.empresa_id
-        )
+            # 4. Detectar duplicados
+            duplicate_report = import_engine.detect_duplicates(movements, bank_account_id)
+            
+            if duplicate_report.action_required:
+                # Actualizar sesión con información de duplicados
+                import_engine.update_import_session(
+                    import_session.id,
+                    len(movements),
+                    0,
+                    [f"Se encontraron {duplicate_report.total_duplicates} posibles duplicados"],
+                    "PENDING_REVIEW"
+                )
+                
+                return {
+                    **import_session.__dict__,
+                    "duplicate_report": duplicate_report
+                }
+            
+            # 5. Almacenar movimientos
+            store_result = import_engine.store_movements(
+                movements, import_session.id, bank_account_id, current_user.empresa_id
+            )
+            total_movements = len(movements)
         
         # 6. Actualizar sesión
         import_engine.update_import_session(
             import_session.id,
-            len(movements),
+            total_movements,
             store_result['total_stored'],
-            [],
+            [f"Se omitieron {store_result['total_skipped']} movimientos ya importados"] if store_result['total_skipped'] else [],
             "COMPLETED"
         )
         
@@ -11,6 +11,7 @@ from app.core.security import decode_print_token, get_current_user, has_permissi
 # ==================================
 
 from app.services import documento as service
+from app.services import documento_masivo
 from app.services import cartera as cartera_service
 from app.services import plantilla as services_plantilla
 from app.schemas import documento as schemas
@@ -68,6 +69,30 @@ def create_documento(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado al crear el documento: {str(e)}")
 
 
+@router.post("/masivo", response_model=schemas.DocumentoCreacionMasivaResponse, status_code=status.HTTP_201_CREATED)
+def create_documentos_masivo(
+    payload: schemas.DocumentoCreacionMasivaPayload,
+    db: Session = Depends(get_db),
+    current_user: models_usuario = Depends(has_permission("contabilidad:crear_documento"))
+):
+    """Crea un lote de documentos con numeración, validación e inserción por lotes."""
+    for documento in payload.documentos:
+        documento.empresa_id = current_user.empresa_id
+    try:
+        return documento_masivo.create_documentos_bulk(
+            db=db,
+            documentos=payload.documentos,
+            user_id=current_user.id,
+            empresa_id=current_user.empresa_id,
+            conservar_numeros=payload.conservarNumeros,
+            omitir_invalidos=payload.omitirInvalidos
+        )
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado en la creación masiva: {str(e)}")
+
+
 @router.get("/", response_model=schemas.ListaDocumentosResponse)
 def read_documentos(
     filtros: schemas.DocumentoFiltros = Depends(),
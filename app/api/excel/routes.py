@@ -11,6 +11,7 @@ from app.core import security
 from app.core.hashing import verify_password
 from app.schemas import token as token_schema
 from app.services import usuario as services_usuario
+from app.services import saldos_mensuales as saldos_mensuales_service
 from app.models.plan_cuenta import PlanCuenta
 from app.models.movimiento_contable import MovimientoContable
 from app.models.documento import Documento
@@ -123,18 +124,8 @@ def get_saldo_excel(
     
     cuenta_ids = [c[0] for c in cuentas_obj]
     
-    query = db.query(
-        func.coalesce(func.sum(MovimientoContable.debito), 0).label("total_debito"),
-        func.coalesce(func.sum(MovimientoContable.credito), 0).label("total_credito")
-    ).join(
-        Documento, MovimientoContable.documento_id == Documento.id
-    ).filter(
-        MovimientoContable.cuenta_id.in_(cuenta_ids)
-    )
-    
-    # Asegurarnos de que el documento no esté anulado (Acepta B y EMITIDO, etc)
-    query = query.filter(Documento.estado != 'ANULADO')
-    
+    # Fecha de corte (None = sin corte, todo el histórico)
+    fecha_corte = None
     if periodo:
         try:
             # Soporta tanto "2026-03" como "2026-03-01"
@@ -142,7 +133,7 @@ def get_saldo_excel(
             
             if len(parts) == 3:
                 # Caso: YYYY-MM-DD
-                end_date_str = f"{periodo} 23:59:59"
+                fecha_corte = date(int(parts[0]), int(parts[1]), int(parts[2]))
             elif len(parts) == 2:
                 # Caso: YYYY-MM (Fin de mes)
                 year, month = int(parts[0]), int(parts[1])
@@ -150,20 +141,20 @@ def get_saldo_excel(
                     next_month = date(year + 1, 1, 1)
                 else:
                     next_month = date(year, month + 1, 1)
-                end_date = next_month - timedelta(days=1)
-                end_date_str = end_date.strftime("%Y-%m-%d 23:59:59")
+                fecha_corte = next_month - timedelta(days=1)
             else:
                 raise ValueError("Formato inválido")
-                
-            query = query.filter(Documento.fecha <= end_date_str)
         except Exception:
             raise HTTPException(status_code=400, detail="Formato de periodo inválido. Use YYYY-MM o YYYY-MM-DD.")
-            
-    resultado = query.first()
+
+    # Documentos no anulados, servidos desde los saldos mensuales materializados
+    sumas = saldos_mensuales_service.sumas_por_cuenta(
+        db, empresa_id, fecha_corte, cuenta_ids=cuenta_ids
+    )
     
-    if resultado:
-        debito = float(resultado.total_debito)
-        credito = float(resultado.total_credito)
+    if sumas:
+        debito = float(sum(d for d, _ in sumas.values()))
+        credito = float(sum(c for _, c in sumas.values()))
         
         # Naturaleza Contable de Colombia
         # Activos (1), Gastos (5), Costos (6): Naturaleza Débito (Saldo = D - C)
@@ -21,6 +21,7 @@ from app.schemas import tipo_documento as schemas_tipo_doc
 from app.schemas import documento as schemas_doc
 from app.schemas import token as schemas_token
 from app.services import inventario as service_inventario
+from app.services import inventario_recalculo as service_inventario_recalculo
 
 
 router = APIRouter()
@@ -300,6 +301,49 @@ def recalcular_saldos_masivo_route(db: Session = Depends(get_db), current_user:
     return service_inventario.recalcular_todo_inventario(db=db, empresa_id=current_user.empresa_id)
 
 
+# --- RECÁLCULO MASIVO EN SEGUNDO PLANO (POR BLOQUES, REANUDABLE) ---
+
+@router.post("/recalcular-saldos/trabajos", dependencies=[Depends(get_current_user)])
+def iniciar_recalculo_masivo_route(background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(get_current_user)):
+    """
+    Registra el recálculo masivo y lo ejecuta en segundo plano. Retorna el id
+    para consultar el avance (GET .../trabajos/{id} o el flujo SSE .../eventos).
+    Si ya hay uno abierto de la empresa, retorna ese.
+    """
+    recalculo = service_inventario_recalculo.iniciar_recalculo(db, current_user.empresa_id, usuario_id=current_user.id)
+    background_tasks.add_task(service_inventario_recalculo.ejecutar_recalculo, recalculo.id, current_user.empresa_id)
+    return service_inventario_recalculo.get_progreso(db, recalculo.id, current_user.empresa_id)
+
+
+@router.get("/recalcular-saldos/trabajos", dependencies=[Depends(get_current_user)])
+def listar_recalculos_masivos_route(db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(get_current_user)):
+    return service_inventario_recalculo.listar_recalculos(db, current_user.empresa_id)
+
+
+@router.get("/recalcular-saldos/trabajos/{recalculo_id}", dependencies=[Depends(get_current_user)])
+def get_progreso_recalculo_route(recalculo_id: int, db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(get_current_user)):
+    return service_inventario_recalculo.get_progreso(db, recalculo_id, current_user.empresa_id)
+
+
+@router.get("/recalcular-saldos/trabajos/{recalculo_id}/eventos", dependencies=[Depends(get_current_user)])
+def eventos_recalculo_route(recalculo_id: int, db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(get_current_user)):
+    """Avance del recálculo como Server-Sent Events (text/event-stream) hasta que termina."""
+    service_inventario_recalculo.get_recalculo(db, recalculo_id, current_user.empresa_id)
+    return StreamingResponse(
+        service_inventario_recalculo.eventos_progreso(recalculo_id, current_user.empresa_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/recalcular-saldos/trabajos/{recalculo_id}/reanudar", dependencies=[Depends(get_current_user)])
+def reanudar_recalculo_route(recalculo_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(get_current_user)):
+    """Retoma un recálculo interrumpido: solo procesa los bloques pendientes o con error."""
+    service_inventario_recalculo.reanudar_recalculo(db, recalculo_id, current_user.empresa_id)
+    background_tasks.add_task(service_inventario_recalculo.ejecutar_recalculo, recalculo_id, current_user.empresa_id)
+    return service_inventario_recalculo.get_progreso(db, recalculo_id, current_user.empresa_id)
+
+
 # ==============================================================================
 # === ENDPOINTS CRUD PARA MOVIMIENTOS DIRECTOS DE KARDEX (HUÉRFANOS) ===
 # ==============================================================================
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import date
@@ -14,7 +15,7 @@ from app.schemas.propiedad_horizontal import modulo_contribucion as modulo_schem
 from app.schemas.propiedad_horizontal import recaudos as recaudo_schemas
 from app.schemas.propiedad_horizontal import presupuesto as presupuesto_schemas
 from app.schemas.propiedad_horizontal import recaudo_masivo as rm_schemas
-from app.services.propiedad_horizontal import unidad_service, configuracion_service, facturacion_service, pago_service, reportes as reportes_service, modulo_service, presupuesto_service, recaudo_masivo_service
+from app.services.propiedad_horizontal import unidad_service, configuracion_service, facturacion_service, facturacion_lote_service, pago_service, reportes as reportes_service, modulo_service, presupuesto_service, recaudo_masivo_service
 
 from . import conceptos
 
@@ -379,6 +380,76 @@ def generar_facturacion_masiva(
     )
     return resultado
 
+# --- FACTURACION MASIVA EN SEGUNDO PLANO (POR BLOQUES, REANUDABLE) ---
+@router.post("/facturacion/masiva/lotes")
+def iniciar_facturacion_masiva_lote(
+    payload: FacturacionMasivaRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Registra la facturación del periodo (facturas calculadas y consecutivos reservados)
+    y la ejecuta en segundo plano. Retorna el id para consultar el avance
+    (GET .../lotes/{id} o el flujo SSE .../eventos). Si ya hay uno abierto del periodo, retorna ese.
+    """
+    lote = facturacion_lote_service.iniciar_facturacion(
+        db, current_user.empresa_id, payload.fecha, usuario_id=current_user.id,
+        conceptos_ids=payload.conceptos_ids, configuracion_conceptos=payload.configuracion_conceptos
+    )
+    background_tasks.add_task(facturacion_lote_service.ejecutar_facturacion, lote.id, current_user.empresa_id)
+    return facturacion_lote_service.get_progreso(db, lote.id, current_user.empresa_id)
+
+@router.get("/facturacion/masiva/lotes")
+def listar_facturacion_masiva_lotes(
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    return facturacion_lote_service.listar_lotes(db, current_user.empresa_id)
+
+@router.get("/facturacion/masiva/lotes/{lote_id}")
+def get_progreso_facturacion_masiva_lote(
+    lote_id: int,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    return facturacion_lote_service.get_progreso(db, lote_id, current_user.empresa_id)
+
+@router.get("/facturacion/masiva/lotes/{lote_id}/resultado")
+def get_resultado_facturacion_masiva_lote(
+    lote_id: int,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Resumen con el mismo formato de POST /facturacion/masiva."""
+    return facturacion_lote_service.get_resultado(db, lote_id, current_user.empresa_id)
+
+@router.get("/facturacion/masiva/lotes/{lote_id}/eventos")
+def eventos_facturacion_masiva_lote(
+    lote_id: int,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Avance de la facturación como Server-Sent Events (text/event-stream) hasta que termina."""
+    facturacion_lote_service.get_lote(db, lote_id, current_user.empresa_id)
+    return StreamingResponse(
+        facturacion_lote_service.eventos_progreso(lote_id, current_user.empresa_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/facturacion/masiva/lotes/{lote_id}/reanudar")
+def reanudar_facturacion_masiva_lote(
+    lote_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """Retoma una facturación interrumpida: solo crea las facturas pendientes o con error, con sus números."""
+    facturacion_lote_service.reanudar_facturacion(db, lote_id, current_user.empresa_id)
+    background_tasks.add_task(facturacion_lote_service.ejecutar_facturacion, lote_id, current_user.empresa_id)
+    return facturacion_lote_service.get_progreso(db, lote_id, current_user.empresa_id)
+
 @router.get("/facturacion/historial")
 def get_historial_facturacion(
     db: Session = Depends(get_db),
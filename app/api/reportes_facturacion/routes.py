@@ -153,7 +153,7 @@ def generar_csv_desempeno_vendedores_route(
     current_user: models_usuario = Depends(has_permission("reportes:ver_facturacion_detallado"))
 ):
     try:
-        csv_bytes = service.generar_csv_desempeno_vendedores(
+        csv_bloques = service.generar_csv_desempeno_vendedores(
             db=db,
             empresa_id=current_user.empresa_id,
             fecha_inicio=fecha_inicio,
@@ -165,7 +165,7 @@ def generar_csv_desempeno_vendedores_route(
             'Access-Control-Expose-Headers': 'Content-Disposition'
         }
         return StreamingResponse(
-            io.BytesIO(csv_bytes),
+            csv_bloques,
             media_type="text/csv; charset=utf-8-sig",
             headers=headers
         )
@@ -228,7 +228,7 @@ def exportar_csv_rentabilidad_producto(
     Respeta todos los filtros de grupos, fechas, terceros, etc.
     """
     try:
-        csv_bytes = service.generar_csv_rentabilidad_producto(
+        csv_bloques = service.generar_csv_rentabilidad_producto(
             db=db,
             empresa_id=current_user.empresa_id,
             filtros=filtros
@@ -239,7 +239,7 @@ def exportar_csv_rentabilidad_producto(
             'Access-Control-Expose-Headers': 'Content-Disposition'
         }
         return StreamingResponse(
-            io.BytesIO(csv_bytes),
+            csv_bloques,
             media_type="text/csv; charset=utf-8-sig",
             headers=headers
         )
@@ -427,7 +427,7 @@ def exportar_csv_ventas_cliente(
     current_user: models_usuario = Depends(has_permission("reportes:ver_facturacion_detallado"))
 ):
     try:
-        csv_bytes = service.generar_csv_ventas_cliente(
+        csv_bloques = service.generar_csv_ventas_cliente(
             db=db,
             empresa_id=current_user.empresa_id,
             filtros=filtros
@@ -438,7 +438,7 @@ def exportar_csv_ventas_cliente(
             'Access-Control-Expose-Headers': 'Content-Disposition'
         }
         return StreamingResponse(
-            io.BytesIO(csv_bytes),
+            csv_bloques,
             media_type="text/csv; charset=utf-8-sig",
             headers=headers
         )
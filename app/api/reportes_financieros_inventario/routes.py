@@ -5,18 +5,19 @@ from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
 import io
-import weasyprint
-from jinja2 import Environment, DictLoader
 
 from app.core.database import get_db
 from app.core.security import has_permission, create_signed_token, validate_signed_token
 from app.models import usuario as models_usuario, producto as models_producto, empresa as models_empresa
 from app.services import reportes_financieros as service_reportes
 from app.schemas.reporte_rentabilidad import RentabilidadProductoFiltros, RentabilidadProductoResponse
-from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
+from app.services import plantillas_html, motor_pdf
 
 router = APIRouter()
 
+# Sin autoescape, como el entorno que se creaba en cada petición
+_JINJA_ENV = plantillas_html.crear_entorno(autoescape=False)
+
 @router.post(
     "/rentabilidad-producto",
     response_model=RentabilidadProductoResponse
@@ -69,10 +70,9 @@ def imprimir_pdf_rentabilidad(token: str, db: Session = Depends(get_db)):
         "data": report_data
     }
 
-    env = Environment(loader=DictLoader(TEMPLATES_EMPAQUETADOS))
-    template = env.get_template("reports/rentabilidad_producto.html")
+    template = plantillas_html.plantilla(_JINJA_ENV, "reports/rentabilidad_producto.html")
     html_content = template.render(context)
     
-    pdf_bytes = weasyprint.HTML(string=html_content).write_pdf()
+    pdf_bytes = motor_pdf.html_a_pdf(html_content)
     
     return StreamingResponse(io.BytesIO(pdf_bytes), media_type="application/pdf")
\ No newline at end of file
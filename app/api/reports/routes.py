@@ -2,7 +2,7 @@ from typing import List, Dict, Any, Optional
 from app.services import super_informe as super_informe_service
 from app.schemas import documento as schemas_doc
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from fastapi.responses import Response
+from fastapi.responses import Response, FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import date, datetime
 
@@ -25,6 +25,9 @@ from app.services import periodo as periodo_service
 from app.services.email_service import email_service # <-- NUEVO SERVICIO EMAIL
 from app.schemas.compras import FiltrosDetalladoCompras, CompraDetalladaResponse
 from app.schemas.reporte_comparacion_saldos import FiltrosComparacionSaldos
+from app.schemas import trabajo_reporte as schemas_trabajo
+from app.services import trabajos_reportes as trabajos_reportes_service
+from app.services import exportacion_streaming
 
 # --- FIN: MODIFICACIÓN ARQUITECTÓNICA ---
 
@@ -280,6 +283,52 @@ def get_journal_report(
     print(f"[ESPIA-MONITOR] Resultados encontrados: {len(report_data)}")
     return report_data
 
+@router.get("/journal/paginado", response_model=schemas_doc.PaginaCursorResponse)
+def get_journal_report_paginado(
+    fecha_inicio: date = Query(..., description="Fecha de inicio del reporte (YYYY-MM-DD)"),
+    fecha_fin: date = Query(..., description="Fecha de fin del reporte (YYYY-MM-DD)"),
+    tipos_documento_ids: Optional[List[int]] = Query(None, description="Lista de IDs de tipos de documento"),
+    cuenta_filtro: Optional[str] = Query(None, description="Filtro por código o nombre de cuenta"),
+    numero_documento: Optional[str] = Query(None, description="Filtro por número de documento"),
+    beneficiario_filtro: Optional[str] = Query(None, description="Filtro por beneficiario (Nombre o NIT)"),
+    concepto_filtro: Optional[str] = Query(None, description="Filtro por concepto"),
+    valor_filtro: Optional[float] = Query(None, description="Filtro por valor"),
+    operador_valor: Optional[str] = Query(">=", description="Operador de valor"),
+    centro_costo_filtro: Optional[str] = Query(None, description="Filtro por Centro de Costo"),
+    vendedor_filtro: Optional[str] = Query(None, description="Filtro por Vendedor"),
+    producto_filtro: Optional[str] = Query(None, description="Filtro por Producto"),
+    cursor: Optional[str] = Query(None, description="siguiente_cursor de la página anterior"),
+    limite: int = Query(200, ge=1, le=1000, description="Movimientos por página"),
+    acumulados: bool = Query(False, description="Incluir débito/crédito acumulados por fila"),
+    incluir_totales: Optional[bool] = Query(None, description="Totales del período (por defecto solo en la primera página)"),
+    db: Session = Depends(get_db),
+    current_user: usuario_schema.User = Depends(get_current_user)
+):
+    """
+    Libro Diario paginado por cursor: ordenado por (fecha, documento, movimiento),
+    con totales del período en una consulta agregada aparte.
+    """
+    return libros_oficiales_service.get_pagina_libro_diario(
+        db=db,
+        empresa_id=current_user.empresa_id,
+        cursor=cursor,
+        limite=limite,
+        acumulados=acumulados,
+        incluir_totales=incluir_totales,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        tipos_documento_ids=tipos_documento_ids or None,
+        cuenta_filtro=cuenta_filtro,
+        numero_documento=numero_documento,
+        beneficiario_filtro=beneficiario_filtro,
+        concepto_filtro=concepto_filtro,
+        valor_filtro=valor_filtro,
+        operador_valor=operador_valor,
+        centro_costo_filtro=centro_costo_filtro,
+        vendedor_filtro=vendedor_filtro,
+        producto_filtro=producto_filtro
+    )
+
 @router.get("/journal/get-signed-url", response_model=Dict[str, str])
 def get_signed_journal_report_url(
     fecha_inicio: date = Query(..., description="Fecha de inicio del reporte (YYYY-MM-DD)"),
@@ -1776,6 +1825,22 @@ def get_super_informe(
             detail=f"Ocurrió un error inesperado al procesar la solicitud: {e}"
         )
     
+@router.post("/super-informe/paginado", response_model=schemas_doc.PaginaCursorResponse)
+def get_super_informe_paginado(
+    filtros: schemas_doc.SuperInformeCursorFiltros,
+    db: Session = Depends(get_db),
+    current_user: usuario_schema.User = Depends(get_current_user)
+):
+    """
+    Super Informe (movimientos) paginado por cursor, del más reciente al más antiguo.
+    Se envía `cursor` = siguiente_cursor de la respuesta anterior para la página siguiente.
+    """
+    return super_informe_service.get_pagina_super_informe(
+        db=db,
+        filtros=filtros,
+        empresa_id=current_user.empresa_id
+    )
+
 @router.post("/super-informe/get-signed-url", response_model=Dict[str, str])
 def get_signed_super_informe_url(
     filtros: schemas_doc.DocumentoGestionFiltros,
@@ -1862,11 +1927,12 @@ def get_signed_super_informe_csv_url(
 
 @router.get("/super-informe/exportar-csv")
 def get_super_informe_csv(
-    signed_token: str = Query(..., description="Token de URL firmada"),
-    db: Session = Depends(get_db)
+    signed_token: str = Query(..., description="Token de URL firmada")
 ):
     """
     SIRVE el Super Informe en formato CSV (Excel compatible).
+    Se envía por bloques mientras se leen los movimientos (cursor del lado del
+    servidor), con una sesión propia que vive lo que dura la descarga.
     """
     verified_params = reports_service.verify_signed_report_url(
         signed_token, "/api/reports/super-informe/exportar-csv", 90
@@ -1879,22 +1945,15 @@ def get_super_informe_csv(
     
     # Reconstruir objeto de filtros
     filtros = schemas_doc.DocumentoGestionFiltros(**filtros_dict)
-    
-    csv_content = super_informe_service.generate_super_informe_csv(
-        db, filtros=filtros, empresa_id=empresa_id
+    super_informe_service.validar_filtros_movimientos(filtros)
+
+    bloques = exportacion_streaming.en_sesion_propia(
+        lambda db_exportacion: super_informe_service.generate_super_informe_csv(
+            db_exportacion, filtros=filtros, empresa_id=empresa_id
+        )
     )
-    
-    from fastapi.responses import Response
     filename = f"Super_Informe_{date.today().strftime('%Y%m%d')}.csv"
-    
-    return Response(
-        content=csv_content, 
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}",
-            "Cache-Control": "no-cache"
-        }
-    )
+    return exportacion_streaming.respuesta_streaming(bloques, filename, "csv")
 
 
 
@@ -2217,19 +2276,17 @@ def generate_purchases_detailed_pdf_route(
 )
 def generate_purchases_detailed_csv_route(
     filtros: FiltrosDetalladoCompras,
-    db: Session = Depends(get_db),
     current_user: usuario_schema.User = Depends(get_current_user)
 ):
-    csv_content, filename = documento_service.generate_purchases_detailed_csv(
-        db=db,
-        empresa_id=current_user.empresa_id,
-        filtros=filtros
-    )
-    return Response(
-        content=csv_content,
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    # Las líneas se leen por lotes durante la descarga, con una sesión propia
+    empresa_id = current_user.empresa_id
+    bloques = exportacion_streaming.en_sesion_propia(
+        lambda db_exportacion: documento_service.generate_purchases_detailed_csv(
+            db=db_exportacion, empresa_id=empresa_id, filtros=filtros
+        )[0]
     )
+    filename = f"Reporte_Compras_Detallado_{filtros.fecha_inicio}_{filtros.fecha_fin}.csv"
+    return exportacion_streaming.respuesta_streaming(bloques, filename, "csv")
 
 
 # --- REPORTES DE COMPARACIÓN MENSUAL DE SALDOS ---
@@ -2298,3 +2355,101 @@ def get_comparacion_saldos_csv_direct(
     )
     return comparacion_saldos_service.generate_comparacion_saldos_csv(report_data)
 
+
+# --- INICIO: TRABAJOS DE REPORTES EN SEGUNDO PLANO ---
+# Para reportes pesados: se solicita el reporte, se consulta el avance (o se
+# escucha el flujo SSE) y se descarga el archivo generado mientras esté vigente.
+
+@router.get("/trabajos/catalogo", response_model=List[schemas_trabajo.ReporteDisponible])
+def listar_reportes_disponibles(current_user: usuario_schema.User = Depends(get_current_user)):
+    """ Reportes de ReportRegistry que se pueden solicitar como trabajo, con sus formatos. """
+    return trabajos_reportes_service.listar_reportes()
+
+@router.post("/trabajos", status_code=status.HTTP_202_ACCEPTED)
+def crear_trabajo_reporte(
+    payload: schemas_trabajo.TrabajoReporteCreate,
+    db: Session = Depends(get_db),
+    current_user: usuario_schema.User = Depends(get_current_user)
+):
+    """
+    Registra la generación del reporte y retorna el trabajo. Si ya hay uno
+    idéntico en curso para la empresa, retorna ese (deduplicado=True).
+    """
+    trabajo, nuevo = trabajos_reportes_service.crear_trabajo(
+        db, current_user.empresa_id, payload.reporte_key, payload.formato, payload.filtros, usuario_id=current_user.id
+    )
+    if nuevo:
+        trabajos_reportes_service.programar(trabajo.id, current_user.empresa_id)
+    progreso = trabajos_reportes_service.get_progreso(db, trabajo.id, current_user.empresa_id)
+    progreso["deduplicado"] = not nuevo
+    return progreso
+
+@router.get("/trabajos")
+def listar_trabajos_reportes(
+    db: Session = Depends(get_db),
+    current_user: usuario_schema.User = Depends(get_current_user)
+):
+    return trabajos_reportes_service.listar_trabajos(db, current_user.empresa_id)
+
+@router.get("/trabajos/descargar")
+def descargar_trabajo_reporte_firmado(
+    signed_token: str = Query(..., description="Token de URL firmada"),
+    db: Session = Depends(get_db)
+):
+    """ Sirve el archivo generado después de verificar la URL firmada. """
+    verified_params = reports_service.verify_signed_report_url(signed_token, "/api/reports/trabajos/descargar")
+    if not verified_params:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="URL inválida o expirada.")
+
+    ruta, filename, media_type = trabajos_reportes_service.get_archivo(
+        db, verified_params["trabajo_id"], verified_params["empresa_id"]
+    )
+    return FileResponse(ruta, media_type=media_type, filename=filename)
+
+@router.get("/trabajos/{trabajo_id}")
+def get_progreso_trabajo_reporte(
+    trabajo_id: int,
+    db: Session = Depends(get_db),
+    current_user: usuario_schema.User = Depends(get_current_user)
+):
+    return trabajos_reportes_service.get_progreso(db, trabajo_id, current_user.empresa_id)
+
+@router.get("/trabajos/{trabajo_id}/eventos")
+def eventos_trabajo_reporte(
+    trabajo_id: int,
+    db: Session = Depends(get_db),
+    current_user: usuario_schema.User = Depends(get_current_user)
+):
+    """ Avance del trabajo como Server-Sent Events (text/event-stream) hasta que termina. """
+    trabajos_reportes_service.get_trabajo(db, trabajo_id, current_user.empresa_id)
+    return StreamingResponse(
+        trabajos_reportes_service.eventos_progreso(trabajo_id, current_user.empresa_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/trabajos/{trabajo_id}/archivo")
+def descargar_trabajo_reporte(
+    trabajo_id: int,
+    db: Session = Depends(get_db),
+    current_user: usuario_schema.User = Depends(get_current_user)
+):
+    ruta, filename, media_type = trabajos_reportes_service.get_archivo(db, trabajo_id, current_user.empresa_id)
+    return FileResponse(ruta, media_type=media_type, filename=filename)
+
+@router.get("/trabajos/{trabajo_id}/get-signed-url", response_model=Dict[str, str])
+def get_signed_trabajo_reporte_url(
+    trabajo_id: int,
+    db: Session = Depends(get_db),
+    current_user: usuario_schema.User = Depends(get_current_user)
+):
+    """ URL firmada para descargar el resultado desde el navegador (sin encabezado de autorización). """
+    trabajos_reportes_service.get_archivo(db, trabajo_id, current_user.empresa_id)
+    signed_token = reports_service.generate_signed_report_url(
+        endpoint="/api/reports/trabajos/descargar",
+        expiration_seconds=60,
+        empresa_id=current_user.empresa_id,
+        trabajo_id=trabajo_id
+    )
+    return {"signed_url_token": signed_token}
+# --- FIN: TRABAJOS DE REPORTES EN SEGUNDO PLANO ---
@@ -9,7 +9,9 @@ from app.services import (
     migracion as migracion_service,
     diagnostico as diagnostico_service,
     auditoria as auditoria_service,
-    consumo_service
+    consumo_service,
+    saldos_mensuales as saldos_mensuales_service,
+    saldos_cierre as saldos_cierre_service
 )
 from app.schemas import (
     usuario as usuario_schema,
@@ -99,6 +101,15 @@ def contar_registros(
 ):
     return diagnostico_service.contar_registros_por_empresa(db=db)
 
+@router.get("/asesor-indices", response_model=List[diagnostico_schemas.PlanConsultaResult])
+def asesor_indices(
+    min_registros: int = 50000,
+    max_empresas: int = 5,
+    db: Session = Depends(get_db),
+    current_user: models_usuario.Usuario = Depends(has_permission("utilidades:usar_herramientas"))
+):
+    return diagnostico_service.analizar_indices_reportes(db=db, min_registros=min_registros, max_empresas=max_empresas)
+
 @router.post("/get-tipos-documento", response_model=List[tipo_documento_schema.TipoDocumento])
 def get_tipos_documento_soporte(
     request: diagnostico_schemas.TiposDocumentoRequest,
@@ -131,6 +142,19 @@ def erradicar_documento(
 ):
     return diagnostico_service.erradicar_documentos_por_ids(db=db, request=request)
 
+@router.post("/reconstruir-saldos-mensuales")
+def reconstruir_saldos_mensuales(
+    db: Session = Depends(get_db),
+    current_user: models_usuario.Usuario = Depends(has_permission("utilidades:usar_herramientas"))
+):
+    """Regenera los saldos mensuales materializados y las fotos de períodos cerrados de la empresa actual."""
+    if not current_user.empresa_id:
+        raise HTTPException(status_code=400, detail="El usuario no tiene una empresa asignada.")
+    resultado = saldos_mensuales_service.reconstruir_saldos_mensuales(db, current_user.empresa_id, commit=False)
+    resultado["periodos_congelados"] = saldos_cierre_service.regenerar_saldos_cierre(db, current_user.empresa_id)
+    db.commit()
+    return resultado
+
 @router.get("/soporte/maestros", response_model=diagnostico_schemas.MaestrosSoporteResponse)
 def get_maestros_soporte(
     db: Session = Depends(get_db),
@@ -303,33 +327,36 @@ def resetear_password(payload: usuario_schema.PasswordResetPayload, db: Session
     usuario_service.update_password(db, user=usuario, new_password=payload.nueva_password)
     return {"msg": "¡Contraseña actualizada exitosamente!"}
 
-@router.post("/exportar-datos")
-def exportar_datos(export_request: migracion_schemas.ExportRequest, db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(has_permission("utilidades:migracion"))): # <-- CAMBIO AQUÍ
-    print(f"DEBUG EXPORT: {export_request.dict(exclude_none=True)}")
-    # 1. Obtener Data
-    data = migracion_service.exportar_datos(db=db, export_request=export_request, empresa_id=current_user.empresa_id)
-    
-    # 2. Obtener Nombre Empresa
+def _nombre_archivo_backup(db: Session, empresa_id: int, extension: str) -> str:
     from app.models.empresa import Empresa
-    from fastapi.responses import JSONResponse, Response
     from datetime import datetime
     import re
 
-    empresa = db.query(Empresa).filter(Empresa.id == current_user.empresa_id).first()
+    empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
     nombre_empresa = empresa.razon_social if empresa else "Empresa"
     
-    # 3. Sanitizar nombre de archivo
+    # Sanitizar nombre de archivo
     # Reemplazar caracteres ilegales y espacios. Asegurar que no haya saltos de línea.
     safe_name = nombre_empresa.strip()
     safe_name = re.sub(r'[\r\n\t]', '', safe_name) # Eliminar control chars
     safe_name = re.sub(r'[\\/*?:"<>|]', "", safe_name) # Eliminar prohibidos OS
     nombre_clean = safe_name.replace(" ", "_")
     
-    # 4. Construir Filename
     fecha_str = datetime.now().strftime("%Y-%m-%d")
-    filename = f"backup_contable_{nombre_clean}_{fecha_str}.json"
+    return f"backup_contable_{nombre_clean}_{fecha_str}.{extension}"
+
+@router.post("/exportar-datos")
+def exportar_datos(export_request: migracion_schemas.ExportRequest, db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(has_permission("utilidades:migracion"))): # <-- CAMBIO AQUÍ
+    print(f"DEBUG EXPORT: {export_request.dict(exclude_none=True)}")
+    # 1. Obtener Data
+    data = migracion_service.exportar_datos(db=db, export_request=export_request, empresa_id=current_user.empresa_id)
     
-    # 5. Retornar como Stream Binario (Fuerza descarga correcta)
+    from fastapi.responses import Response
+
+    # 2. Construir Filename (nombre de la empresa sanitizado)
+    filename = _nombre_archivo_backup(db, current_user.empresa_id, "json")
+    
+    # 3. Retornar como Stream Binario (Fuerza descarga correcta)
     import json
     json_content = json.dumps(data)
     
@@ -339,6 +366,27 @@ def exportar_datos(export_request: migracion_schemas.ExportRequest, db: Session
         headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
+@router.post("/exportar-datos-bloques")
+def exportar_datos_bloques(export_request: migracion_schemas.ExportRequest, db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(has_permission("utilidades:migracion"))):
+    """Backup .zip por bloques firmados (empresas grandes): se escribe a un temporal y se envía desde el disco."""
+    import os
+    import tempfile
+    from fastapi.responses import FileResponse
+    from starlette.background import BackgroundTask
+
+    descriptor, ruta = tempfile.mkstemp(suffix=".zip", prefix="backup_")
+    os.close(descriptor)
+    try:
+        migracion_service.exportar_datos_streaming(db=db, export_request=export_request, empresa_id=current_user.empresa_id, destino=ruta)
+    except Exception:
+        os.remove(ruta)
+        raise
+    return FileResponse(
+        ruta, media_type="application/zip",
+        filename=_nombre_archivo_backup(db, current_user.empresa_id, "zip"),
+        background=BackgroundTask(os.remove, ruta)
+    )
+
 @router.post("/backup-rapido")
 def backup_rapido(current_user: models_usuario.Usuario = Depends(has_permission("utilidades:migracion")), db: Session = Depends(get_db)):
     """Genera un backup completo inmediato (para uso por comandos de voz/AI)"""
@@ -439,6 +487,23 @@ def analizar_backup(analysis_request: migracion_schemas.AnalysisRequest, db: Ses
 def ejecutar_restauracion(request: migracion_schemas.AnalysisRequest, db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(has_permission("utilidades:migracion"))): # <-- CAMBIO AQUÍ
     return migracion_service.ejecutar_restauracion(db=db, request=request, user_id=current_user.id)
 
+from fastapi import UploadFile, File, Form
+
+@router.post("/ejecutar-restauracion-bloques")
+def ejecutar_restauracion_bloques(
+    archivo: UploadFile = File(...),
+    targetEmpresaId: int = Form(...),
+    bypass_signature: bool = Form(False),
+    modulesToRestore: Optional[List[str]] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: models_usuario.Usuario = Depends(has_permission("utilidades:migracion"))
+):
+    """Restaura un backup .zip por bloques. Si se interrumpe, enviar el mismo archivo la reanuda."""
+    return migracion_service.ejecutar_restauracion_streaming(
+        db=db, archivo=archivo.file, target_empresa_id=targetEmpresaId, user_id=current_user.id,
+        modules_to_restore=modulesToRestore, bypass_signature=bypass_signature
+    )
+
 # --- MEJORA PROACTIVA: Se restaura la llamada a su versión original, más robusta y legible ---
 @router.post("/recodificar-cuenta")
 def recodificar_cuenta(request_data: recodificacion_schemas.RecodificacionRequest, db: Session = Depends(get_db), current_user: models_usuario.Usuario = Depends(get_current_user)):
@@ -731,7 +796,7 @@ def reparacion_critica_inventario(
         # --- 2. RECALCULAR COSTOS DE SALIDAS (FIX KARDEX VS SUPER INFORME) ---
         productos = db.query(Producto).all()
         for p in productos:
-            recalcular_saldos_producto(db, p.id)
+            recalcular_saldos_producto(db, p.id, desde_cero=True)
         db.commit()
         mensajes.append(f"Saldos y costos históricos recalculados para {len(productos)} productos.")
         
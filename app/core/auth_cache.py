@@ -0,0 +1,129 @@
+"""
+Caché de contexto de autenticación (principal).
+
+get_current_user resolvía en CADA request: usuario + roles→permisos +
+excepciones→permiso + empresas asignadas, la empresa del token y el estado
+de licencia (que vuelve a consultar la empresa y calcula el machine id).
+Aquí se guarda, con TTL corto, un resumen inmutable por
+(email, empresa_id, iat del token): el conjunto de permisos efectivos y el
+estado de licencia. Usa el caché global (app/core/cache.py), así que con
+CACHE_BACKEND=sqlite también se comparte entre workers.
+
+Invalidación: al confirmar (commit) una sesión que modificó roles, permisos,
+excepciones de usuario, usuarios o empresas (licencia) se eliminan los
+principales afectados. De un usuario o una empresa existentes solo cuentan
+los atributos que alteran el principal: get_current_user reasigna
+user.empresa_id / user.empresa al contexto del token en cada request, y eso
+no debe desalojar el principal recién guardado. Los cambios hechos por otro worker con backend en
+memoria se ven, a más tardar, al vencer el TTL.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .cache import cache
+
+AUTH_CACHE_TTL_SECONDS = 60
+_PREFIJO = "auth_principal"
+_TAG_AUTH = f"prefix:{_PREFIJO}"
+
+
+@dataclass(frozen=True)
+class PrincipalAuth:
+    """Resumen inmutable del usuario autenticado para una empresa y un token."""
+    usuario_id: int
+    email: str
+    empresa_id: Optional[int]
+    permisos: FrozenSet[str]
+    licencia_modo: Optional[str]
+    licencia_error: Optional[str]
+
+
+def _clave(email: str, empresa_id: Optional[int], iat: Any) -> str:
+    espacio = f"empresa:{empresa_id}" if empresa_id is not None else "global"
+    return f"{espacio}:{_PREFIJO}:{email}:{iat}"
+
+
+def obtener_principal(email: str, empresa_id: Optional[int], iat: Any) -> Optional[PrincipalAuth]:
+    valor = cache.get(_clave(email, empresa_id, iat))
+    return valor if isinstance(valor, PrincipalAuth) else None
+
+
+def guardar_principal(principal: PrincipalAuth, token_empresa_id: Optional[int], iat: Any) -> None:
+    """Se indexa por la empresa del token; se etiqueta con la empresa efectiva (licencia)."""
+    cache.set(
+        _clave(principal.email, token_empresa_id, iat),
+        principal,
+        ttl=AUTH_CACHE_TTL_SECONDS,
+        empresa_id=principal.empresa_id,
+        tags=(_TAG_AUTH, f"usuario_id:{principal.usuario_id}"),
+    )
+
+
+def invalidar_principales(empresa_id: Optional[int] = None, usuario_id: Optional[int] = None) -> int:
+    """Sin argumentos invalida todos los principales cacheados."""
+    tags = [_TAG_AUTH]
+    if usuario_id is not None:
+        tags.append(f"usuario_id:{usuario_id}")
+    return cache.invalidate_tags(*tags, empresa_id=empresa_id)
+
+
+# --- INVALIDACIÓN AUTOMÁTICA AL CONFIRMAR CAMBIOS DE SEGURIDAD ---
+_CLAVE_PENDIENTES = "auth_cache_pendientes"
+
+# Atributos del usuario que alteran su principal (empresa_id/empresa no: son el contexto del token)
+_ATRIBUTOS_USUARIO = ("email", "password_hash", "totp_enabled", "roles", "excepciones", "empresas_asignadas")
+
+
+def _con_cambios(obj, atributos) -> bool:
+    estado = inspect(obj)
+    return any(estado.attrs[atributo].history.has_changes() for atributo in atributos)
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_cambios_seguridad(session, flush_context):
+    from app.models.permiso import Rol, Permiso, UsuarioPermisoExcepcion
+    from app.models.usuario import Usuario
+    from app.models.empresa import Empresa
+
+    pendientes = None
+    modificados = session.dirty
+    for obj in list(session.new) + list(modificados) + list(session.deleted):
+        if isinstance(obj, (Rol, Permiso)):
+            objetivo = ("todo", None)
+        elif isinstance(obj, UsuarioPermisoExcepcion):
+            objetivo = ("usuario", obj.usuario_id)
+        elif isinstance(obj, Usuario):
+            if obj in modificados and not _con_cambios(obj, _ATRIBUTOS_USUARIO):
+                continue
+            objetivo = ("usuario", obj.id)
+        elif isinstance(obj, Empresa):
+            # Solo columnas propias (licencia, límites...): asignarle un usuario no la cambia
+            columnas = [columna.key for columna in inspect(Empresa).column_attrs]
+            if obj in modificados and not _con_cambios(obj, columnas):
+                continue
+            objetivo = ("empresa", obj.id)
+        else:
+            continue
+        if pendientes is None:
+            pendientes = session.info.setdefault(_CLAVE_PENDIENTES, set())
+        pendientes.add(objetivo)
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_invalidaciones(session):
+    pendientes = session.info.pop(_CLAVE_PENDIENTES, None)
+    if not pendientes:
+        return
+    if ("todo", None) in pendientes:
+        invalidar_principales()
+        return
+    for tipo, identificador in pendientes:
+        if tipo == "usuario":
+            invalidar_principales(usuario_id=identificador)
+        else:
+            invalidar_principales(empresa_id=identificador)
+
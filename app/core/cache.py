@@ -1,256 +1,603 @@
 """
-Sistema de caché para el módulo de Conciliación Bancaria
+Sistema de caché de la aplicación (nació para Conciliación Bancaria).
+
+- Acotado por número de entradas con desalojo LRU.
+- Claves legibles y con espacio de nombres por empresa:
+      empresa:{empresa_id}:{prefijo}:{funcion}:{hash_argumentos}
+      global:{prefijo}:{funcion}:{hash_argumentos}
+- Invalidación por etiquetas ("todo lo de la empresa 12", "todos los
+  balances de la empresa 12") y por patrón (fnmatch sobre la clave legible).
+- Seguro entre hilos (las rutas síncronas de FastAPI corren en un threadpool).
+- Contadores de aciertos, fallos y desalojos.
+- Backend opcional en archivo SQLite (CACHE_BACKEND=sqlite) para que varios
+  workers de uvicorn compartan las entradas.
 """
 
-import json
+import os
 import time
-from typing import Any, Optional, Dict
-from functools import wraps
+import pickle
+import sqlite3
 import hashlib
+import inspect
+import tempfile
+import threading
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Any, Optional, Dict, Iterable, List, Tuple
+from functools import wraps
+
+# Centinela para distinguir "no está en caché" de un valor None cacheado
+_NO_ENCONTRADO = object()
+
+
+def _tag_empresa(empresa_id: Any) -> str:
+    return f"empresa:{empresa_id}"
+
+
+def _es_patron(pattern: str) -> bool:
+    return any(c in pattern for c in "*?[")
+
+
+# --- BACKEND EN MEMORIA (POR PROCESO) ---
+class _BackendMemoria:
+    """OrderedDict en orden de uso: el primer elemento es el menos usado recientemente."""
+
+    nombre = "memory"
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._datos: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def obtener(self, key: str) -> Tuple[str, Any]:
+        """Retorna ('hit' | 'miss' | 'expired', valor)."""
+        with self._lock:
+            entry = self._datos.get(key)
+            if entry is None:
+                return "miss", None
+            ahora = time.time()
+            if ahora >= entry['expires_at']:
+                del self._datos[key]
+                return "expired", None
+            self._datos.move_to_end(key)
+            entry['hits'] += 1
+            entry['last_accessed'] = ahora
+            return "hit", entry['value']
+
+    def guardar(self, key: str, value: Any, ttl: int, tags: frozenset) -> int:
+        """Guarda la entrada y retorna cuántas entradas se desalojaron por LRU."""
+        ahora = time.time()
+        with self._lock:
+            self._datos[key] = {
+                'value': value,
+                'expires_at': ahora + ttl,
+                'created_at': ahora,
+                'last_accessed': ahora,
+                'hits': 0,
+                'tags': tags,
+                'size': None,  # Se mide al pedir estadísticas, no en cada escritura
+            }
+            self._datos.move_to_end(key)
+            desalojadas = 0
+            while len(self._datos) > self.max_entries:
+                self._datos.popitem(last=False)
+                desalojadas += 1
+            return desalojadas
+
+    def eliminar(self, key: str) -> bool:
+        with self._lock:
+            return self._datos.pop(key, None) is not None
+
+    def eliminar_por(self, pattern: Optional[str] = None, tags: Iterable[str] = ()) -> int:
+        tags = frozenset(tags)
+        with self._lock:
+            borrar = [
+                key for key, entry in self._datos.items()
+                if (pattern is None or fnmatchcase(key, pattern)) and tags <= entry['tags']
+            ]
+            for key in borrar:
+                del self._datos[key]
+            return len(borrar)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def limpiar_expiradas(self) -> int:
+        ahora = time.time()
+        with self._lock:
+            expiradas = [key for key, entry in self._datos.items() if ahora >= entry['expires_at']]
+            for key in expiradas:
+                del self._datos[key]
+            return len(expiradas)
+
+    @staticmethod
+    def _tamano(entry: Dict[str, Any]) -> int:
+        if entry['size'] is None:
+            try:
+                entry['size'] = len(pickle.dumps(entry['value'], protocol=pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                entry['size'] = 0
+        return entry['size']
+
+    def entradas(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    'key': key, 'hits': e['hits'], 'created_at': e['created_at'],
+                    'expires_at': e['expires_at'], 'size': self._tamano(e),
+                }
+                for key, e in self._datos.items()
+            ]
+
+
+# --- BACKEND EN ARCHIVO SQLITE (COMPARTIDO ENTRE PROCESOS) ---
+class _BackendSQLite:
+    """
+    Entradas serializadas con pickle en un archivo SQLite en modo WAL.
+    Una conexión por hilo; el LRU se resuelve con la columna last_accessed.
+    El número de entradas lo mantienen triggers en cache_meta (compartido entre
+    procesos), para no contar la tabla en cada escritura.
+    """
+
+    nombre = "sqlite"
 
-class SimpleCache:
-    """Cache simple en memoria para configuraciones y datos frecuentemente accedidos"""
-    
-    def __init__(self, default_ttl: int = 300):  # 5 minutos por defecto
-        self._cache: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " key TEXT PRIMARY KEY, tags TEXT NOT NULL, value BLOB NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL,"
+            " last_accessed REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_last_accessed ON cache_entries (last_accessed)")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_meta ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1), total INTEGER NOT NULL)"
+            )
+            # Archivos creados antes del contador: se inicializa con el conteo actual
+            conn.execute("INSERT OR IGNORE INTO cache_meta (id, total) SELECT 1, COUNT(*) FROM cache_entries")
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS tr_cache_entries_insert AFTER INSERT ON cache_entries"
+                " BEGIN UPDATE cache_meta SET total = total + 1 WHERE id = 1; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS tr_cache_entries_delete AFTER DELETE ON cache_entries"
+                " BEGIN UPDATE cache_meta SET total = total - 1 WHERE id = 1; END"
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _tags_texto(tags: Iterable[str]) -> str:
+        # Delimitadas con '|' para poder filtrar con LIKE '%|tag|%'
+        return "|" + "|".join(sorted(tags)) + "|"
+
+    def obtener(self, key: str) -> Tuple[str, Any]:
+        conn = self._conn()
+        fila = conn.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if fila is None:
+            return "miss", None
+        ahora = time.time()
+        if ahora >= fila[1]:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            return "expired", None
+        try:
+            valor = pickle.loads(fila[0])
+        except Exception:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            return "miss", None
+        conn.execute(
+            "UPDATE cache_entries SET hits = hits + 1, last_accessed = ? WHERE key = ?", (ahora, key)
+        )
+        return "hit", valor
+
+    def guardar(self, key: str, value: Any, ttl: int, tags: frozenset) -> int:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        ahora = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # UPSERT (no REPLACE): reemplazar una clave no dispara los triggers del contador
+            conn.execute(
+                "INSERT INTO cache_entries"
+                " (key, tags, value, size, created_at, expires_at, last_accessed, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, 0)"
+                " ON CONFLICT(key) DO UPDATE SET tags = excluded.tags, value = excluded.value,"
+                " size = excluded.size, created_at = excluded.created_at, expires_at = excluded.expires_at,"
+                " last_accessed = excluded.last_accessed, hits = 0",
+                (key, self._tags_texto(tags), blob, len(blob), ahora, ahora + ttl, ahora),
+            )
+            total = conn.execute("SELECT total FROM cache_meta WHERE id = 1").fetchone()[0]
+            exceso = max(0, total - self.max_entries)
+            if exceso:
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE key IN ("
+                    " SELECT key FROM cache_entries ORDER BY last_accessed LIMIT ?)",
+                    (exceso,),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return exceso
+
+    def eliminar(self, key: str) -> bool:
+        return self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,)).rowcount > 0
+
+    def eliminar_por(self, pattern: Optional[str] = None, tags: Iterable[str] = ()) -> int:
+        condiciones, params = [], []
+        if pattern is not None:
+            # GLOB de SQLite usa la misma sintaxis que fnmatch (*, ?, [..])
+            condiciones.append("key GLOB ?")
+            params.append(pattern)
+        for tag in tags:
+            condiciones.append("tags LIKE ? ESCAPE '\\'")
+            params.append("%|" + tag.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "|%")
+        where = " AND ".join(condiciones) or "1=1"
+        return self._conn().execute(f"DELETE FROM cache_entries WHERE {where}", params).rowcount
+
+    def limpiar(self) -> None:
+        self._conn().execute("DELETE FROM cache_entries")
+
+    def limpiar_expiradas(self) -> int:
+        return self._conn().execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def entradas(self) -> List[Dict[str, Any]]:
+        filas = self._conn().execute(
+            "SELECT key, hits, created_at, expires_at, size FROM cache_entries ORDER BY last_accessed"
+        ).fetchall()
+        return [
+            {'key': k, 'hits': h, 'created_at': c, 'expires_at': e, 'size': s}
+            for k, h, c, e, s in filas
+        ]
+
+
+class TenantCache:
+    """Caché LRU acotado, con espacio de nombres por empresa e invalidación por etiquetas."""
+
+    def __init__(self, default_ttl: int = 300, max_entries: int = 5000, backend: str = "memory",
+                 sqlite_path: Optional[str] = None):
         self.default_ttl = default_ttl
-    
-    def _generate_key(self, prefix: str, *args, **kwargs) -> str:
-        """Generar clave única para el cache"""
-        key_data = f"{prefix}:{args}:{sorted(kwargs.items())}"
-        return hashlib.md5(key_data.encode()).hexdigest()
-    
+        self.max_entries = max_entries
+        if backend == "sqlite":
+            path = sqlite_path or os.path.join(tempfile.gettempdir(), "finaxis_cache.sqlite3")
+            self._backend = _BackendSQLite(path, max_entries)
+        else:
+            self._backend = _BackendMemoria(max_entries)
+
+        # Contadores del proceso actual
+        self._lock_contadores = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def backend(self) -> str:
+        return self._backend.nombre
+
+    def _contar(self, campo: str, n: int = 1) -> None:
+        if n:
+            with self._lock_contadores:
+                setattr(self, campo, getattr(self, campo) + n)
+
+    def _generate_key(self, prefix: str, *args, empresa_id: Any = None, **kwargs) -> str:
+        """Clave legible `empresa:{id}:{prefix}:{hash}` (o `global:...` sin empresa)."""
+        key_data = f"{args}:{sorted(kwargs.items())}"
+        digest = hashlib.md5(key_data.encode()).hexdigest()
+        espacio = _tag_empresa(empresa_id) if empresa_id is not None else "global"
+        return f"{espacio}:{prefix}:{digest}"
+
+    def lookup(self, key: str) -> Any:
+        """Como get(), pero retorna _NO_ENCONTRADO en un fallo (permite cachear None)."""
+        estado, valor = self._backend.obtener(key)
+        if estado == "hit":
+            self._contar('hits')
+            return valor
+        self._contar('misses')
+        if estado == "expired":
+            self._contar('expirations')
+        return _NO_ENCONTRADO
+
     def get(self, key: str) -> Optional[Any]:
         """Obtener valor del cache"""
-        if key in self._cache:
-            entry = self._cache[key]
-            if time.time() < entry['expires_at']:
-                entry['hits'] += 1
-                entry['last_accessed'] = time.time()
-                return entry['value']
-            else:
-                # Expirado, eliminar
-                del self._cache[key]
-        return None
-    
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
-        """Establecer valor en el cache"""
+        valor = self.lookup(key)
+        return None if valor is _NO_ENCONTRADO else valor
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None,
+            empresa_id: Any = None, tags: Iterable[str] = ()) -> None:
+        """Establecer valor en el cache. Las etiquetas permiten invalidar grupos de entradas."""
         if ttl is None:
             ttl = self.default_ttl
-        
-        self._cache[key] = {
-            'value': value,
-            'expires_at': time.time() + ttl,
-            'created_at': time.time(),
-            'last_accessed': time.time(),
-            'hits': 0
-        }
-    
+        etiquetas = set(tags)
+        if empresa_id is not None:
+            etiquetas.add(_tag_empresa(empresa_id))
+        elif key.startswith("empresa:"):
+            etiquetas.add(":".join(key.split(":", 2)[:2]))
+        try:
+            desalojadas = self._backend.guardar(key, value, ttl, frozenset(etiquetas))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Valor no serializable: el backend SQLite no puede compartirlo entre procesos
+            return
+        self._contar('evictions', desalojadas)
+
     def delete(self, key: str) -> bool:
         """Eliminar valor del cache"""
-        if key in self._cache:
-            del self._cache[key]
-            return True
-        return False
-    
+        return self._backend.eliminar(key)
+
+    def invalidate_pattern(self, pattern: str) -> int:
+        """Elimina las entradas cuya clave coincide (fnmatch). Sin comodines, busca subcadena."""
+        if not _es_patron(pattern):
+            pattern = f"*{pattern}*"
+        n = self._backend.eliminar_por(pattern=pattern)
+        self._contar('invalidations', n)
+        return n
+
+    def invalidate_tags(self, *tags: str, empresa_id: Any = None) -> int:
+        """Elimina las entradas que tienen TODAS las etiquetas indicadas."""
+        etiquetas = set(tags)
+        if empresa_id is not None:
+            etiquetas.add(_tag_empresa(empresa_id))
+        if not etiquetas:
+            return 0
+        n = self._backend.eliminar_por(tags=etiquetas)
+        self._contar('invalidations', n)
+        return n
+
+    def invalidate_empresa(self, empresa_id: Any) -> int:
+        """Elimina todas las entradas de una empresa."""
+        return self.invalidate_tags(empresa_id=empresa_id)
+
     def clear(self) -> None:
         """Limpiar todo el cache"""
-        self._cache.clear()
-    
+        self._backend.limpiar()
+
     def get_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas del cache"""
-        total_entries = len(self._cache)
-        total_hits = sum(entry['hits'] for entry in self._cache.values())
-        
+        ahora = time.time()
+        entradas = self._backend.entradas()
+        accesos = self.hits + self.misses
         return {
-            'total_entries': total_entries,
-            'total_hits': total_hits,
-            'memory_usage_mb': len(str(self._cache)) / (1024 * 1024),
+            'backend': self._backend.nombre,
+            'max_entries': self.max_entries,
+            'total_entries': len(entradas),
+            'total_hits': sum(e['hits'] for e in entradas),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'hit_rate_percent': round(self.hits * 100 / accesos, 2) if accesos else 0.0,
+            # Tamaño serializado de los valores (aproximación estable del consumo)
+            'memory_usage_mb': sum(e['size'] for e in entradas) / (1024 * 1024),
             'entries': [
                 {
-                    'key': key[:50] + '...' if len(key) > 50 else key,
-                    'hits': entry['hits'],
-                    'age_seconds': time.time() - entry['created_at'],
-                    'ttl_remaining': max(0, entry['expires_at'] - time.time())
+                    'key': e['key'][:80] + '...' if len(e['key']) > 80 else e['key'],
+                    'hits': e['hits'],
+                    'age_seconds': ahora - e['created_at'],
+                    'ttl_remaining': max(0, e['expires_at'] - ahora)
                 }
-                for key, entry in self._cache.items()
+                for e in entradas
             ]
         }
-    
+
     def cleanup_expired(self) -> int:
         """Limpiar entradas expiradas"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, entry in self._cache.items()
-            if current_time >= entry['expires_at']
-        ]
-        
-        for key in expired_keys:
-            del self._cache[key]
-        
-        return len(expired_keys)
+        n = self._backend.limpiar_expiradas()
+        self._contar('expirations', n)
+        return n
+
+
+# Compatibilidad con el nombre anterior
+SimpleCache = TenantCache
+
+
+def _crear_cache_global() -> TenantCache:
+    try:
+        from .config import settings
+        backend = settings.CACHE_BACKEND
+        max_entries = settings.CACHE_MAX_ENTRIES
+        sqlite_path = settings.CACHE_SQLITE_PATH or None
+    except Exception:
+        backend = os.getenv("CACHE_BACKEND", "memory")
+        max_entries = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+        sqlite_path = os.getenv("CACHE_SQLITE_PATH") or None
+    try:
+        return TenantCache(max_entries=max_entries, backend=backend, sqlite_path=sqlite_path)
+    except Exception as e:
+        print(f"⚠️ Cache: no se pudo iniciar el backend '{backend}' ({e}). Se usa memoria local.")
+        return TenantCache(max_entries=max_entries)
+
 
 # Instancia global del cache
-cache = SimpleCache()
+cache = _crear_cache_global()
+
+
+def cached(ttl: int = 300, key_prefix: str = "", tags: Iterable[str] = (), tag_args: Iterable[str] = ()):
+    """
+    Decorador para cachear resultados de funciones.
+
+    Si la función recibe `empresa_id` la entrada queda en el espacio de nombres
+    de esa empresa. `tags` agrega etiquetas fijas y `tag_args` convierte
+    argumentos en etiquetas (p.ej. tag_args=("bank_account_id",) -> "bank_account_id:5").
+    """
+    tags = tuple(tags)
+    tag_args = tuple(tag_args)
 
-def cached(ttl: int = 300, key_prefix: str = ""):
-    """Decorador para cachear resultados de funciones"""
     def decorator(func):
+        firma = inspect.signature(func)
+        prefijo = f"{key_prefix}:{func.__name__}" if key_prefix else func.__name__
+
+        def _clave_y_tags(args, kwargs):
+            try:
+                ligados = firma.bind_partial(*args, **kwargs).arguments
+            except TypeError:
+                ligados = dict(kwargs)
+            empresa_id = ligados.get('empresa_id')
+            etiquetas = {f"prefix:{key_prefix}"} if key_prefix else set()
+            etiquetas.update(tags)
+            etiquetas.update(f"{nombre}:{ligados[nombre]}" for nombre in tag_args if nombre in ligados)
+            key = cache._generate_key(prefijo, *args, empresa_id=empresa_id, **kwargs)
+            return key, empresa_id, etiquetas
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generar clave del cache
-            cache_key = cache._generate_key(
-                f"{key_prefix}:{func.__name__}", 
-                *args, 
-                **kwargs
-            )
-            
+            cache_key, empresa_id, etiquetas = _clave_y_tags(args, kwargs)
+
             # Intentar obtener del cache
-            result = cache.get(cache_key)
-            if result is not None:
+            result = cache.lookup(cache_key)
+            if result is not _NO_ENCONTRADO:
                 return result
-            
+
             # Ejecutar función y cachear resultado
             result = func(*args, **kwargs)
-            cache.set(cache_key, result, ttl)
-            
+            cache.set(cache_key, result, ttl, empresa_id=empresa_id, tags=etiquetas)
+
             return result
-        
-        # Agregar método para limpiar cache de esta función
-        wrapper.clear_cache = lambda: cache.clear()
-        wrapper.cache_key = lambda *args, **kwargs: cache._generate_key(
-            f"{key_prefix}:{func.__name__}", *args, **kwargs
-        )
-        
+
+        # Limpia solo las entradas de esta función
+        wrapper.clear_cache = lambda: cache.invalidate_pattern(f"*:{prefijo}:*")
+        wrapper.cache_key = lambda *args, **kwargs: _clave_y_tags(args, kwargs)[0]
+
         return wrapper
     return decorator
 
+
 def invalidate_cache_pattern(pattern: str) -> int:
-    """Invalidar entradas del cache que coincidan con un patrón"""
-    keys_to_delete = [
-        key for key in cache._cache.keys()
-        if pattern in key
-    ]
-    
-    for key in keys_to_delete:
-        cache.delete(key)
-    
-    return len(keys_to_delete)
+    """Invalidar entradas del cache que coincidan con un patrón (fnmatch sobre la clave legible)"""
+    return cache.invalidate_pattern(pattern)
+
+
+def invalidate_empresa_cache(empresa_id: int, *tags: str) -> int:
+    """Invalida todas las entradas de una empresa, o solo las que tengan las etiquetas dadas."""
+    return cache.invalidate_tags(*tags, empresa_id=empresa_id)
+
 
 # Funciones específicas para conciliación bancaria
 class BankReconciliationCache:
     """Cache especializado para conciliación bancaria"""
-    
+
     @staticmethod
     @cached(ttl=600, key_prefix="import_config")  # 10 minutos
     def get_import_config(config_id: int, empresa_id: int):
         """Cache para configuraciones de importación"""
         # Esta función será implementada en el servicio
         pass
-    
+
     @staticmethod
-    @cached(ttl=300, key_prefix="accounting_config")  # 5 minutos
+    @cached(ttl=300, key_prefix="accounting_config", tag_args=("bank_account_id",))  # 5 minutos
     def get_accounting_config(bank_account_id: int, empresa_id: int):
         """Cache para configuraciones contables"""
         # Esta función será implementada en el servicio
         pass
-    
+
     @staticmethod
-    @cached(ttl=180, key_prefix="reconciliation_summary")  # 3 minutos
+    @cached(ttl=180, key_prefix="reconciliation_summary", tag_args=("bank_account_id",))  # 3 minutos
     def get_reconciliation_summary(bank_account_id: int, empresa_id: int):
         """Cache para resúmenes de conciliación"""
         # Esta función será implementada en el servicio
         pass
-    
+
     @staticmethod
     def invalidate_config_cache(empresa_id: int, config_type: str = None):
         """Invalidar cache de configuraciones"""
         if config_type:
-            pattern = f"{config_type}:*:{empresa_id}"
-        else:
-            pattern = f"*:{empresa_id}"
-        
-        return invalidate_cache_pattern(pattern)
-    
+            return cache.invalidate_tags(f"prefix:{config_type}", empresa_id=empresa_id)
+        return cache.invalidate_empresa(empresa_id)
+
     @staticmethod
     def invalidate_reconciliation_cache(bank_account_id: int, empresa_id: int):
         """Invalidar cache de conciliación para una cuenta específica"""
-        patterns = [
-            f"reconciliation_summary:*:{bank_account_id}:{empresa_id}",
-            f"unmatched_movements:*:{bank_account_id}:{empresa_id}"
-        ]
-        
         total_invalidated = 0
-        for pattern in patterns:
-            total_invalidated += invalidate_cache_pattern(pattern)
-        
+        for prefix in ("reconciliation_summary", "unmatched_movements"):
+            total_invalidated += cache.invalidate_tags(
+                f"prefix:{prefix}", f"bank_account_id:{bank_account_id}", empresa_id=empresa_id
+            )
+
         return total_invalidated
 
 # Middleware para limpieza automática del cache
 class CacheCleanupMiddleware:
     """Middleware para limpiar automáticamente el cache"""
-    
+
     def __init__(self, cleanup_interval: int = 300):  # 5 minutos
         self.cleanup_interval = cleanup_interval
         self.last_cleanup = time.time()
-    
+
     def __call__(self, request, call_next):
         """Procesar request y limpiar cache si es necesario"""
         current_time = time.time()
-        
+
         # Limpiar cache expirado si ha pasado el intervalo
         if current_time - self.last_cleanup > self.cleanup_interval:
             expired_count = cache.cleanup_expired()
             if expired_count > 0:
                 print(f"🧹 Cache cleanup: {expired_count} entradas expiradas eliminadas")
             self.last_cleanup = current_time
-        
+
         return call_next(request)
 
 # Funciones de utilidad para monitoreo
 def get_cache_health() -> Dict[str, Any]:
     """Obtener estado de salud del cache"""
     stats = cache.get_stats()
-    
-    # Calcular métricas de salud
-    hit_rate = 0
-    if stats['total_entries'] > 0:
-        total_accesses = sum(entry['hits'] for entry in stats['entries'])
-        hit_rate = (total_accesses / max(1, stats['total_entries'])) * 100
-    
+
     memory_usage_mb = stats['memory_usage_mb']
-    
+
     # Determinar estado de salud
     health_status = "healthy"
     if memory_usage_mb > 100:  # Más de 100MB
         health_status = "warning"
     if memory_usage_mb > 500:  # Más de 500MB
         health_status = "critical"
-    
+
     return {
         'status': health_status,
-        'hit_rate_percent': round(hit_rate, 2),
+        'backend': stats['backend'],
+        'hit_rate_percent': stats['hit_rate_percent'],
+        'hits': stats['hits'],
+        'misses': stats['misses'],
+        'evictions': stats['evictions'],
         'memory_usage_mb': round(memory_usage_mb, 2),
         'total_entries': stats['total_entries'],
+        'max_entries': stats['max_entries'],
         'recommendations': _get_cache_recommendations(stats)
     }
 
 def _get_cache_recommendations(stats: Dict[str, Any]) -> list:
     """Generar recomendaciones basadas en estadísticas del cache"""
     recommendations = []
-    
+
     if stats['memory_usage_mb'] > 100:
         recommendations.append("Considerar reducir TTL de entradas para liberar memoria")
-    
+
     low_hit_entries = [
-        entry for entry in stats['entries'] 
+        entry for entry in stats['entries']
         if entry['hits'] < 2 and entry['age_seconds'] > 300
     ]
-    
+
     if len(low_hit_entries) > 10:
         recommendations.append("Muchas entradas con pocos hits, revisar patrones de cache")
-    
-    if stats['total_entries'] > 1000:
-        recommendations.append("Cache muy grande, considerar implementar LRU eviction")
-    
-    return recommendations
\ No newline at end of file
+
+    if stats['evictions'] > stats['hits'] and stats['evictions'] > 100:
+        recommendations.append("Muchos desalojos LRU frente a aciertos: considerar aumentar CACHE_MAX_ENTRIES")
+
+    return recommendations
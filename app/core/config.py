@@ -37,5 +37,53 @@ class Settings(BaseSettings):
     # Prioridad: ENV VAR > Producción > Localhost (fallback)
     BASE_URL: str = os.getenv("BASE_URL", "https://www.finaxis.com.co")
 
+    # --- CACHÉ DE APLICACIÓN (ver app/core/cache.py) ---
+    # CACHE_BACKEND: "memory" (por proceso) o "sqlite" (archivo compartido entre workers de uvicorn)
+    CACHE_BACKEND: str = "memory"
+    CACHE_MAX_ENTRIES: int = 5000
+    CACHE_SQLITE_PATH: str = ""
+
+    # --- RECÁLCULO DIFERIDO DE CARTERA (ver app/services/cola_cartera.py) ---
+    # Sesiones en paralelo al cerrar un lote (solo PostgreSQL; 1 = secuencial)
+    CARTERA_RECALCULO_WORKERS: int = 4
+
+    # --- RECÁLCULO MASIVO DE INVENTARIO (ver app/services/inventario_recalculo.py) ---
+    # Productos por bloque (una transacción por bloque) y sesiones en paralelo (solo PostgreSQL)
+    INVENTARIO_RECALCULO_TAMANO_BLOQUE: int = 200
+    INVENTARIO_RECALCULO_WORKERS: int = 4
+
+    # --- FACTURACIÓN MASIVA PH (ver app/services/propiedad_horizontal/facturacion_lote_service.py) ---
+    # Unidades por bloque (una transacción por bloque) y sesiones en paralelo (solo PostgreSQL)
+    PH_FACTURACION_TAMANO_BLOQUE: int = 200
+    PH_FACTURACION_WORKERS: int = 4
+
+    # --- MOTOR DE PDF (ver app/services/motor_pdf.py) ---
+    # Procesos de WeasyPrint (0 = generar en el proceso del API), límites por trabajo y reciclaje
+    PDF_WORKERS: int = 2
+    PDF_TIMEOUT_SEGUNDOS: int = 600
+    PDF_MEMORIA_MAXIMA_MB: int = 2048
+    PDF_TRABAJOS_POR_WORKER: int = 50
+
+    # --- EXTRACTOS BANCARIOS EN PDF (ver app/services/extracto_pdf.py) ---
+    # Procesos de extracción (0 = en el proceso del API), páginas por tarea y caché de páginas extraídas
+    EXTRACTO_PDF_WORKERS: int = 2
+    EXTRACTO_PDF_PAGINAS_POR_TAREA: int = 8
+    EXTRACTO_PDF_CACHE_DIR: str = ""
+    EXTRACTO_PDF_CACHE_TTL_MINUTOS: int = 120
+
+    # --- TRABAJOS DE REPORTES EN SEGUNDO PLANO (ver app/services/trabajos_reportes.py) ---
+    # Reportes generándose a la vez, carpeta de resultados (vacío = temporal del sistema) y vigencia
+    REPORTES_WORKERS: int = 2
+    REPORTES_RESULTADOS_DIR: str = ""
+    REPORTES_RESULTADOS_TTL_MINUTOS: int = 120
+
+    # --- CONCILIACIÓN BANCARIA POR GRUPOS (ver app/services/conciliacion_grupos.py) ---
+    # Diferencia máxima en pesos entre la suma del grupo y el movimiento, ventana de fechas,
+    # partidas por grupo y tiempo máximo de búsqueda por corrida de auto-conciliación
+    CONCILIACION_GRUPOS_TOLERANCIA: float = 0.0
+    CONCILIACION_GRUPOS_VENTANA_DIAS: int = 3
+    CONCILIACION_GRUPOS_MAX_PARTIDAS: int = 5
+    CONCILIACION_GRUPOS_PRESUPUESTO_MS: int = 1500
+
 
 settings = Settings()
\ No newline at end of file
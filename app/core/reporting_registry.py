@@ -1,7 +1,44 @@
-from typing import Any, Dict, Optional, Type, Tuple
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence, Type, Tuple, Union
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
+# Tipos de archivo que puede producir un reporte (ver app/services/trabajos_reportes.py)
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Callback de avance (porcentaje, mensaje) del archivo en generación; ver generate_file
+Progreso = Callable[[Optional[int], Optional[str]], None]
+_progreso_actual: ContextVar[Optional[Progreso]] = ContextVar("progreso_reporte", default=None)
+
+
+def reportar_avance(porcentaje: Optional[int] = None, mensaje: Optional[str] = None) -> None:
+    """
+    Informa el avance (0-100) del reporte que se está generando. Fuera de un
+    trabajo en segundo plano no hace nada. porcentaje=None solo actualiza el mensaje.
+    """
+    progreso = _progreso_actual.get()
+    if progreso is not None:
+        progreso(porcentaje, mensaje)
+
+
+def _bloques_con_progreso(bloques: Iterable[bytes], progreso: Progreso) -> Iterator[bytes]:
+    """Los reportes en streaming se generan al consumir los bloques: el callback sigue activo."""
+    iterador = iter(bloques)
+    while True:
+        token = _progreso_actual.set(progreso)
+        try:
+            bloque = next(iterador)
+        except StopIteration:
+            return
+        finally:
+            _progreso_actual.reset(token)
+        yield bloque
+
+
 class BaseReport:
     """
     Clase base abstracta para todos los reportes del sistema.
@@ -14,6 +51,9 @@ class BaseReport:
     # El esquema Pydantic usado para validar los filtros de este reporte
     filter_schema: Type[BaseModel] = None 
 
+    # Formatos que el reporte sabe generar como archivo (subconjunto de MEDIA_TYPES)
+    formats: Tuple[str, ...] = ("pdf",)
+
     def get_data(self, db: Session, empresa_id: int, filtros: BaseModel) -> Dict[str, Any]:
         """
         Obtiene los datos crudos del reporte (para JSON/Frontend).
@@ -27,6 +67,44 @@ class BaseReport:
         """
         raise NotImplementedError("Este reporte no implementa generate_pdf")
 
+    def generate_csv(self, db: Session, empresa_id: int, filtros: BaseModel) -> Tuple[bytes, str]:
+        raise NotImplementedError("Este reporte no implementa generate_csv")
+
+    def generate_xlsx(self, db: Session, empresa_id: int, filtros: BaseModel) -> Tuple[bytes, str]:
+        raise NotImplementedError("Este reporte no implementa generate_xlsx")
+
+    def generate_file(self, db: Session, empresa_id: int, filtros: Any, formato: str,
+                      progreso: Optional[Progreso] = None) -> Tuple[Union[bytes, Iterable[bytes]], str]:
+        """
+        Genera el archivo en el formato pedido (uno de `formats`).
+        Retorna: (contenido, filename). Los CSV/XLSX de tamaño libro retornan
+        un iterador de bloques (ver app/services/exportacion_streaming.py).
+        `progreso` recibe lo que el reporte informe con reportar_avance, también
+        mientras se consumen los bloques.
+        """
+        if formato not in self.formats:
+            raise ValueError(f"El reporte '{self.key}' no se genera en formato '{formato}'.")
+        token = _progreso_actual.set(progreso)
+        try:
+            contenido, nombre_archivo = getattr(self, f"generate_{formato}")(db, empresa_id, filtros)
+        finally:
+            _progreso_actual.reset(token)
+        if progreso is not None and not isinstance(contenido, (bytes, bytearray, str)) and isinstance(contenido, Iterable):
+            contenido = _bloques_con_progreso(contenido, progreso)
+        return contenido, nombre_archivo
+
+
+def rows_to_csv(headers: Sequence[str], rows: Iterable[Sequence[Any]]) -> bytes:
+    """CSV compatible con Excel (delimitador ';' y UTF-8 con BOM), igual que los CSV existentes."""
+    from app.services.exportacion_streaming import csv_en_streaming
+    return b"".join(csv_en_streaming(headers, rows))
+
+
+def rows_to_xlsx(headers: Sequence[str], rows: Iterable[Sequence[Any]], title: str = "Reporte") -> bytes:
+    """Libro XLSX de una hoja (openpyxl en modo write_only)."""
+    from app.services.exportacion_streaming import xlsx_en_streaming
+    return b"".join(xlsx_en_streaming(headers, rows, titulo=title))
+
 class ReportRegistry:
     """
     Registro central (Singleton) de todos los reportes disponibles.
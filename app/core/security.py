@@ -18,6 +18,7 @@ from app.schemas import token as schemas_token
 from app.models import usuario as models_usuario
 from app.models import permiso as models_permiso
 from app.core.hashing import verify_password, get_password_hash # Asegurar esta importación
+from app.core import auth_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/auth/token", auto_error=False)
@@ -29,6 +30,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(hours=1) # FIX: Fallback de 30 días cambiado a 1 hora (A07)
     to_encode.update({"exp": expire})
+    # iat distingue cada emisión de token en el caché de principal (auth_cache)
+    to_encode.setdefault("iat", datetime.now(timezone.utc))
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
@@ -107,6 +110,10 @@ def validate_signed_token(token: str, salt: str, max_age: int) -> Optional[str]:
 
 def get_user_permissions(user: models_usuario.Usuario) -> Set[str]:
     # ... (Lógica de permisos) ...
+    # get_current_user deja precalculados los permisos (caché de principal)
+    permisos_efectivos = getattr(user, "permisos_efectivos", None)
+    if permisos_efectivos is not None:
+        return set(permisos_efectivos)
     if not user.roles:
         return set()
     permissions = set()
@@ -195,18 +202,32 @@ async def get_current_user(
         print(f"DEBUG AUTH: JWT Error: {e}")
         raise credentials_exception
 
-    user = db.query(models_usuario.Usuario).options(
-        selectinload(models_usuario.Usuario.roles).selectinload(models_permiso.Rol.permisos),
-        selectinload(models_usuario.Usuario.excepciones).selectinload(models_permiso.UsuarioPermisoExcepcion.permiso),
-        selectinload(models_usuario.Usuario.empresas_asignadas) # <--- EAGER LOAD FIX
-    ).filter(models_usuario.Usuario.email == token_data.email).first()
+    # --- CACHÉ DE PRINCIPAL: permisos y licencia ya resueltos para este token ---
+    token_empresa_id = payload.get("empresa_id")
+    token_iat = payload.get("iat") or payload.get("exp")
+    principal = auth_cache.obtener_principal(token_data.email, token_empresa_id, token_iat)
+
+    if principal is not None:
+        # Roles, permisos y excepciones no se cargan: se usan los permisos cacheados
+        user = db.query(models_usuario.Usuario).options(
+            selectinload(models_usuario.Usuario.empresas_asignadas)
+        ).filter(models_usuario.Usuario.email == token_data.email).first()
+        if user is not None and user.id != principal.usuario_id:
+            auth_cache.invalidar_principales(usuario_id=principal.usuario_id)
+            principal = None
+            user = None
+    else:
+        user = db.query(models_usuario.Usuario).options(
+            selectinload(models_usuario.Usuario.roles).selectinload(models_permiso.Rol.permisos),
+            selectinload(models_usuario.Usuario.excepciones).selectinload(models_permiso.UsuarioPermisoExcepcion.permiso),
+            selectinload(models_usuario.Usuario.empresas_asignadas) # <--- EAGER LOAD FIX
+        ).filter(models_usuario.Usuario.email == token_data.email).first()
 
     if user is None:
         print(f"DEBUG AUTH: User {token_data.email} not found in DB")
         raise credentials_exception
     
     # --- FIX CRÍTICO: CONTEXT SWITCHING ---
-    token_empresa_id = payload.get("empresa_id")
     if token_empresa_id:
         # Configurar Middleware de Multitenancy para SQLAlchemy
         current_empresa_id.set(token_empresa_id)
@@ -226,14 +247,26 @@ async def get_current_user(
     # --- VERIFICACIÓN DE LICENCIA (HARDWARE LOCK) ---
     # Si la aplicación detecta que la licencia no corresponde a este hardware, bloqueamos el acceso.
     # Esto evita que se copie y pegue la carpeta en otros computadores sin autorización.
-    from app.core.licencia import obtener_estado_licencia
-    estado_lic = obtener_estado_licencia(db, user.empresa_id)
-    if estado_lic.get("modo") == "BLOQUEADO":
+    if principal is None:
+        from app.core.licencia import obtener_estado_licencia
+        estado_lic = obtener_estado_licencia(db, user.empresa_id)
+        principal = auth_cache.PrincipalAuth(
+            usuario_id=user.id,
+            email=user.email,
+            empresa_id=user.empresa_id,
+            permisos=frozenset(get_user_permissions(user)),
+            licencia_modo=estado_lic.get("modo"),
+            licencia_error=estado_lic.get("error"),
+        )
+        auth_cache.guardar_principal(principal, token_empresa_id, token_iat)
+
+    if principal.licencia_modo == "BLOQUEADO":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail=estado_lic.get("error")
+            detail=principal.licencia_error
         )
 
+    user.permisos_efectivos = principal.permisos
     return user
 
 async def get_current_user_optional(
@@ -77,6 +77,13 @@ async def run_startup_tasks():
             seed_database()
         except Exception as e:
             print(f"Error en tareas de startup (Mantenimiento DB): {e}")
+
+    # 4. Índices de búsqueda de texto (tablas FTS5 en SQLite; en PostgreSQL vienen de Alembic)
+    try:
+        from app.services import busqueda
+        busqueda.iniciar()
+    except Exception as e:
+        print(f"Advertencia en índices de búsqueda: {e}")
 # --- FIN: LÓGICA DE AUTO-CREACIÓN ---
 
 
@@ -259,11 +266,19 @@ if os.path.isdir(EXCEL_ADDON_PATH):
 # ... (omni-existing code) ...
 if os.getenv("VERCEL") != "1":
     from app.services.scheduler_backup import start_scheduler
+    from app.services import motor_pdf
+    from app.services import trabajos_reportes
     
     @app.on_event("startup")
     async def startup_event():
         await run_startup_tasks() # Ejecutar migraciones y seeds de forma segura
         start_scheduler()
+        trabajos_reportes.iniciar() # Reencola los reportes abiertos y programa la limpieza del almacén
+        motor_pdf.iniciar_pool() # Workers de PDF calientes antes de la primera petición
+
+    @app.on_event("shutdown")
+    def shutdown_motor_pdf():
+        motor_pdf.detener_pool()
 # --- FIN: SCHEDULER ---
 
 
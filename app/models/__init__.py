@@ -55,7 +55,7 @@ from .activo_novedad import ActivoNovedad
 from .configuracion_reporte import ConfiguracionReporte
 
 # --- PROPIEDAD HORIZONTAL (Nuevo Módulo) ---
-from .propiedad_horizontal import PHTorre, PHUnidad, PHVehiculo, PHMascota, PHConcepto, PHCampoPersonalizado, PHConfiguracion, PHModuloContribucion, PHPresupuesto
+from .propiedad_horizontal import PHTorre, PHUnidad, PHVehiculo, PHMascota, PHConcepto, PHCampoPersonalizado, PHConfiguracion, PHModuloContribucion, PHPresupuesto, PHEstadoCuentaUnidad, PHEstadoCuentaCorte, PHFacturacionLote, PHFacturacionLoteUnidad
 
 # --- PRODUCCION (Nuevo Módulo) ---
 from .produccion import Receta, RecetaDetalle, RecetaRecurso, OrdenProduccion, OrdenProduccionInsumo, OrdenProduccionRecurso
@@ -87,3 +87,16 @@ from .indicador_economico import IndicadorEconomico
 from .configuracion_fe import ConfiguracionFE
 
 from .copia_seguridad import CopiaSeguridad
+
+# --- SALDOS MENSUALES MATERIALIZADOS ---
+from .saldo_mensual import SaldoMensualCuenta, SaldoMensualEstado
+from .saldo_cierre_periodo import SaldoCierrePeriodo, SaldoCierrePeriodoDetalle
+
+# --- PUNTOS DE CONTROL DEL KÁRDEX (COSTO PROMEDIO) ---
+from .inventario_punto_control import PuntoControlInventario
+
+# --- RECÁLCULO MASIVO DE INVENTARIO POR BLOQUES ---
+from .inventario_recalculo import RecalculoInventario, RecalculoInventarioBloque
+
+# --- TRABAJOS DE REPORTES EN SEGUNDO PLANO ---
+from .trabajo_reporte import TrabajoReporte
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Numeric, ForeignKey, TIMESTAMP, text, func
+from sqlalchemy import Column, Integer, Numeric, ForeignKey, TIMESTAMP, text, func, Index, Date, JSON
 from sqlalchemy.orm import relationship # <-- IMPORTACIÓN CORREGIDA
 from ..core.database import Base
 
@@ -12,6 +12,14 @@ class AplicacionPago(Base):
     fecha_aplicacion = Column(TIMESTAMP(timezone=True), server_default=func.now())
     empresa_id = Column(Integer, ForeignKey("empresas.id", ondelete="CASCADE"))
 
+    # --- ESTADO DEL CRUCE FIFO (ver services.cartera) ---
+    # Última factura que examinó el pago (igual en todas sus filas); NULL si el
+    # pago no se agotó y recorrió todas las facturas, o si se desconoce.
+    alcance_fecha = Column(Date, nullable=True)
+    alcance_documento_id = Column(Integer, nullable=True)
+    # Parte del valor aplicada contra el saldo de cada concepto PH {concepto_id: valor}
+    valor_por_concepto = Column(JSON, nullable=True)
+
     # --- RELACIONES BIDIRECCIONALES ---
     documento_factura = relationship(
         "Documento",
@@ -23,4 +31,11 @@ class AplicacionPago(Base):
         "Documento",
         foreign_keys=[documento_pago_id],
         back_populates="aplicaciones_realizadas"
-    )
\ No newline at end of file
+    )
+
+    # --- ÍNDICES DE CARTERA (ver migración c3d4e5f6a7b8) ---
+    __table_args__ = (
+        Index("ix_aplicacion_pagos_factura", "documento_factura_id"),
+        Index("ix_aplicacion_pagos_pago", "documento_pago_id"),
+        Index("ix_aplicacion_pagos_empresa", "empresa_id"),
+    )
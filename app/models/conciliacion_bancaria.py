@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, DateTime, TIMESTAMP, Text, Numeric, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, DateTime, TIMESTAMP, Text, Numeric, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..core.database import Base
@@ -72,6 +72,13 @@ class BankMovement(Base):
     balance = Column(Numeric(15, 2), nullable=True)
     status = Column(String(20), default="PENDING")  # PENDING, MATCHED, ADJUSTED
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Huella SHA256 de cuenta, fecha, monto, descripción normalizada, referencia y ocurrencia
+    # (ver services.conciliacion_bancaria.bank_movement_hash); única para no reimportar líneas
+    content_hash = Column(String(64), nullable=True)
+
+    __table_args__ = (
+        Index("uq_bank_movements_content_hash", "content_hash", unique=True),
+    )
 
     # Relaciones
     import_session = relationship("ImportSession", back_populates="bank_movements")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, DateTime, TIMESTAMP, text, Text, Numeric
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, DateTime, TIMESTAMP, text, Text, Numeric, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..core.database import Base
@@ -92,6 +92,17 @@ class Documento(Base):
         cascade="all, delete-orphan"
     )
 
+    # --- ÍNDICES DE REPORTES Y CARTERA (ver migración c3d4e5f6a7b8) ---
+    __table_args__ = (
+        Index("ix_documentos_empresa_fecha_anulado", "empresa_id", "fecha", "anulado"),
+        Index("ix_documentos_empresa_tipo_numero", "empresa_id", "tipo_documento_id", "numero"),
+        Index("ix_documentos_empresa_beneficiario", "empresa_id", "beneficiario_id"),
+        # Paginación por cursor (fecha, documento_id) del Libro Diario y Super Informe (migración a7b8c9d0e1f2)
+        Index("ix_documentos_empresa_fecha_id", "empresa_id", "fecha", "id"),
+        # Historial por unidad PH en orden cronológico (estado de cuenta materializado, migración d0e1f2a3b4c5)
+        Index("ix_documentos_unidad_ph_fecha_id", "unidad_ph_id", "fecha", "id"),
+    )
+
 
 class DocumentoEliminado(Base):
     __tablename__ = 'documentos_eliminados'
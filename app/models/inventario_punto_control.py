@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey, DateTime, JSON, Index
+from datetime import datetime
+from ..core.database import Base
+
+
+class PuntoControlInventario(Base):
+    """
+    Foto del estado del kárdex de un producto (stock por bodega, stock global y
+    costo promedio ponderado) justo DESPUÉS de procesar el movimiento
+    `movimiento_id` en el orden (fecha, id) que usa
+    inventario.recalcular_saldos_producto.
+
+    El recálculo arranca desde el último punto vigente en lugar de repasar todo
+    el historial. Cualquier cambio en un movimiento (o en la anulación de su
+    documento) elimina los puntos desde su fecha en adelante
+    (app/services/inventario_puntos_control.py).
+
+    stocks_bodega: {"<bodega_id>": cantidad}.
+    """
+    __tablename__ = "inventario_puntos_control"
+
+    id = Column(Integer, primary_key=True, index=True)
+    producto_id = Column(Integer, ForeignKey("productos.id", ondelete="CASCADE"), nullable=False)
+    movimiento_id = Column(Integer, nullable=False)
+    fecha = Column(DateTime(timezone=True), nullable=False)
+    num_movimientos = Column(Integer, nullable=False, default=0)
+
+    stock_total = Column(Float, nullable=False, default=0.0)
+    costo_promedio = Column(Float, nullable=False, default=0.0)
+    stocks_bodega = Column(JSON, nullable=False, default=dict)
+
+    fecha_creacion = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_inv_punto_control_producto_posicion", "producto_id", "fecha", "movimiento_id"),
+    )
@@ -0,0 +1,67 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON, Index
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from ..core.database import Base
+
+
+class RecalculoInventario(Base):
+    """
+    Ejecución del recálculo masivo de saldos y costos de inventario de una
+    empresa (app/services/inventario_recalculo.py).
+
+    Los productos se reparten en bloques (RecalculoInventarioBloque); cada
+    bloque se confirma en su propia transacción, de modo que si el proceso se
+    interrumpe, la reanudación solo procesa los bloques pendientes.
+
+    estado: PENDIENTE | EN_PROCESO | COMPLETADO | COMPLETADO_CON_ERRORES
+    """
+    __tablename__ = "inventario_recalculos"
+
+    id = Column(Integer, primary_key=True, index=True)
+    empresa_id = Column(Integer, ForeignKey("empresas.id", ondelete="CASCADE"), nullable=False, index=True)
+    usuario_id = Column(Integer, nullable=True)
+
+    estado = Column(String(30), nullable=False, default="PENDIENTE")
+    tamano_bloque = Column(Integer, nullable=False)
+    workers = Column(Integer, nullable=False, default=1)
+
+    total_productos = Column(Integer, nullable=False, default=0)
+    total_bloques = Column(Integer, nullable=False, default=0)
+    productos_procesados = Column(Integer, nullable=False, default=0)
+    bloques_completados = Column(Integer, nullable=False, default=0)
+    bloques_con_error = Column(Integer, nullable=False, default=0)
+
+    fecha_inicio = Column(DateTime, default=datetime.utcnow)
+    fecha_actualizacion = Column(DateTime, default=datetime.utcnow)
+    fecha_fin = Column(DateTime, nullable=True)
+
+    bloques = relationship("RecalculoInventarioBloque", back_populates="recalculo",
+                           cascade="all, delete-orphan", order_by="RecalculoInventarioBloque.numero")
+
+
+class RecalculoInventarioBloque(Base):
+    """
+    Bloque de productos de un recálculo masivo.
+
+    producto_ids: lista de ids del bloque.
+    productos_negativos: ids que terminaron con stock global negativo (advertencia).
+    estado: PENDIENTE | COMPLETADO | ERROR
+    """
+    __tablename__ = "inventario_recalculo_bloques"
+
+    id = Column(Integer, primary_key=True, index=True)
+    recalculo_id = Column(Integer, ForeignKey("inventario_recalculos.id", ondelete="CASCADE"), nullable=False)
+    numero = Column(Integer, nullable=False)
+    producto_ids = Column(JSON, nullable=False)
+
+    estado = Column(String(20), nullable=False, default="PENDIENTE")
+    productos_procesados = Column(Integer, nullable=False, default=0)
+    productos_negativos = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    fecha_fin = Column(DateTime, nullable=True)
+
+    recalculo = relationship("RecalculoInventario", back_populates="bloques")
+
+    __table_args__ = (
+        Index("ix_inv_recalculo_bloque_estado", "recalculo_id", "estado"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, Text, Numeric, String
+from sqlalchemy import Column, Integer, ForeignKey, Text, Numeric, String, Index
 from sqlalchemy.orm import relationship
 from ..core.database import Base
 from sqlalchemy.schema import UniqueConstraint
@@ -42,6 +42,16 @@ class MovimientoContable(Base):
     producto = relationship("Producto", back_populates="movimientos_contables")
     # --- FIN: NUEVA RELACIÓN ---
 
+    # --- ÍNDICES DE REPORTES (ver migración c3d4e5f6a7b8) ---
+    # En PostgreSQL el índice por cuenta incluye débito/crédito (index-only scan en auxiliares y balances).
+    __table_args__ = (
+        Index("ix_movcont_documento", "documento_id"),
+        Index("ix_movcont_cuenta_documento", "cuenta_id", "documento_id", postgresql_include=["debito", "credito"]),
+        Index("ix_movcont_tercero_cuenta", "tercero_id", "cuenta_id"),
+        Index("ix_movcont_centro_costo", "centro_costo_id"),
+        Index("ix_movcont_producto", "producto_id"),
+    )
+
 
 # --- MODELO PARA MOVIMIENTOS ELIMINADOS ---
 class MovimientoEliminado(Base):
@@ -1,6 +1,6 @@
 # app/models/producto.py (Versión con Precio Base Manual y Valores de Características)
 
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Index, func
 # Quitar JSONB si ya no se usa directamente aquí
 # from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
@@ -86,4 +86,10 @@ class MovimientoInventario(Base):
     costo_total = Column(Float, nullable=False)
     producto = relationship('Producto', back_populates='movimientos')
     bodega = relationship('Bodega')
-    documento = relationship('Documento')
\ No newline at end of file
+    documento = relationship('Documento')
+
+    # Orden del recálculo de costo promedio y de los puntos de control (ver migración d4e5f6a7b8c9)
+    __table_args__ = (
+        Index('ix_movinv_producto_fecha_id', 'producto_id', 'fecha', 'id'),
+        Index('ix_movinv_documento', 'documento_id'),
+    )
@@ -4,3 +4,5 @@ from .concepto import PHConcepto
 from .modulo_contribucion import PHModuloContribucion
 from .presupuesto import PHPresupuesto
 from .campo_personalizado import PHCampoPersonalizado
+from .estado_cuenta import PHEstadoCuentaUnidad, PHEstadoCuentaCorte
+from .facturacion_lote import PHFacturacionLote, PHFacturacionLoteUnidad
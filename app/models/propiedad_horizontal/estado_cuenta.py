@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, JSON, Index
+from app.core.database import Base
+from datetime import datetime
+
+
+class PHEstadoCuentaUnidad(Base):
+    """
+    Estado de cuenta materializado de una unidad: deudas pendientes (con su
+    concepto, tipo y fecha, en el orden de prelación del motor de pagos) y
+    saldo a favor después del último documento procesado.
+
+    Lo mantiene app/services/propiedad_horizontal/estado_cuenta_service.py;
+    `recalcular_desde` marca la fecha más antigua modificada desde entonces.
+    """
+    __tablename__ = "ph_estado_cuenta_unidad"
+
+    unidad_id = Column(Integer, ForeignKey("ph_unidades.id", ondelete="CASCADE"), primary_key=True)
+    empresa_id = Column(Integer, ForeignKey("empresas.id"), nullable=False, index=True)
+    # Huella de conceptos y cuentas con que se clasificaron los movimientos
+    firma = Column(String(64), nullable=False)
+    # {"deudas": [...], "saldo_a_favor": float, "saldo_acumulado": float}
+    estado = Column(JSON, nullable=False)
+    ultima_fecha = Column(Date, nullable=True)
+    ultimo_documento_id = Column(Integer, nullable=True)
+    documentos = Column(Integer, nullable=False, default=0)
+    recalcular_desde = Column(Date, nullable=True)
+    actualizado_en = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PHEstadoCuentaCorte(Base):
+    """
+    Estado de cuenta de una unidad justo antes del primer documento de un mes
+    (fecha = día 1). Permite consultar cortes históricos y reconstruir desde
+    una edición con fecha anterior sin repetir toda la historia.
+    """
+    __tablename__ = "ph_estado_cuenta_cortes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    unidad_id = Column(Integer, ForeignKey("ph_unidades.id", ondelete="CASCADE"), nullable=False)
+    fecha = Column(Date, nullable=False)
+    estado = Column(JSON, nullable=False)
+
+    __table_args__ = (
+        Index("uq_ph_estado_cuenta_corte_unidad_fecha", "unidad_id", "fecha", unique=True),
+    )
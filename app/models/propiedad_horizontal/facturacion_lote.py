@@ -0,0 +1,85 @@
+from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, Date, DateTime, JSON, Index
+from sqlalchemy.orm import relationship
+from app.core.database import Base
+from datetime import datetime
+
+
+class PHFacturacionLote(Base):
+    """
+    Ejecución de la facturación masiva de un periodo
+    (app/services/propiedad_horizontal/facturacion_lote_service.py).
+
+    Las facturas de todas las unidades se calculan al registrar el lote y los
+    consecutivos se reservan de una vez (numero_inicial..numero_final). Las
+    unidades (PHFacturacionLoteUnidad) se reparten en bloques; cada bloque se
+    confirma en su propia transacción junto con el estado de sus unidades, de
+    modo que reanudar solo procesa lo pendiente y nunca duplica facturas.
+
+    detalles: unidades que no se facturaron al calcular (sin propietario, sin cuentas).
+    estado: PENDIENTE | EN_PROCESO | COMPLETADO | COMPLETADO_CON_ERRORES
+    """
+    __tablename__ = "ph_facturacion_lotes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    empresa_id = Column(Integer, ForeignKey("empresas.id", ondelete="CASCADE"), nullable=False, index=True)
+    usuario_id = Column(Integer, nullable=True)
+
+    periodo = Column(String(7), nullable=False)  # YYYY-MM
+    fecha_factura = Column(Date, nullable=False)
+    tipo_documento_id = Column(Integer, ForeignKey("tipos_documento.id"), nullable=False)
+    numero_inicial = Column(Integer, nullable=True)
+    numero_final = Column(Integer, nullable=True)
+
+    estado = Column(String(30), nullable=False, default="PENDIENTE")
+    tamano_bloque = Column(Integer, nullable=False)
+    workers = Column(Integer, nullable=False, default=1)
+    total_unidades = Column(Integer, nullable=False, default=0)
+    total_bloques = Column(Integer, nullable=False, default=0)
+    detalles = Column(JSON, nullable=True)
+
+    fecha_inicio = Column(DateTime, default=datetime.utcnow)
+    fecha_actualizacion = Column(DateTime, default=datetime.utcnow)
+    fecha_fin = Column(DateTime, nullable=True)
+
+    unidades = relationship("PHFacturacionLoteUnidad", back_populates="lote",
+                            cascade="all, delete-orphan", order_by="PHFacturacionLoteUnidad.id")
+
+    __table_args__ = (
+        Index("ix_ph_facturacion_lote_periodo_estado", "empresa_id", "periodo", "estado"),
+    )
+
+
+class PHFacturacionLoteUnidad(Base):
+    """
+    Factura calculada para una unidad dentro de un lote de facturación masiva.
+
+    factura / cruce: DocumentoCreate (JSON) con el número ya reservado; cruce es
+    la nota de cruce contra anticipos del propietario (None si no aplica).
+    estado: PENDIENTE | FACTURADA | ERROR
+    """
+    __tablename__ = "ph_facturacion_lote_unidades"
+
+    id = Column(Integer, primary_key=True, index=True)
+    lote_id = Column(Integer, ForeignKey("ph_facturacion_lotes.id", ondelete="CASCADE"), nullable=False)
+    unidad_id = Column(Integer, ForeignKey("ph_unidades.id", ondelete="CASCADE"), nullable=False)
+    unidad_codigo = Column(String(50), nullable=True)
+    bloque = Column(Integer, nullable=False)
+
+    numero = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False, default=0)
+    factura = Column(JSON, nullable=False)
+    cruce = Column(JSON, nullable=True)
+    valor_cruce = Column(Float, nullable=False, default=0)
+
+    estado = Column(String(20), nullable=False, default="PENDIENTE")
+    documento_id = Column(Integer, nullable=True)
+    cruce_documento_id = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    fecha_fin = Column(DateTime, nullable=True)
+
+    lote = relationship("PHFacturacionLote", back_populates="unidades")
+
+    __table_args__ = (
+        Index("ix_ph_facturacion_lote_unidad_bloque", "lote_id", "bloque", "estado"),
+        Index("uq_ph_facturacion_lote_unidad", "lote_id", "unidad_id", unique=True),
+    )
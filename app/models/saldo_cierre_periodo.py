@@ -0,0 +1,54 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, DateTime, Index, UniqueConstraint
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from ..core.database import Base
+
+
+class SaldoCierrePeriodo(Base):
+    """
+    Foto inmutable de los saldos ACUMULADOS (desde el inicio de operaciones hasta
+    el último día del mes) que se congela al cerrar un período contable.
+
+    La integridad del detalle se verifica con `checksum` (SHA-256 del detalle
+    ordenado). Reabrir el período, o cualquier cambio posterior sobre movimientos
+    de un mes igual o anterior, elimina la foto y los reportes vuelven a
+    consultar los movimientos.
+    """
+    __tablename__ = "saldos_cierre_periodo"
+
+    id = Column(Integer, primary_key=True, index=True)
+    empresa_id = Column(Integer, ForeignKey("empresas.id"), nullable=False)
+    periodo_cerrado_id = Column(Integer, ForeignKey("periodos_cerrados.id", ondelete="CASCADE"), nullable=True)
+    ano = Column(Integer, nullable=False)
+    mes = Column(Integer, nullable=False)
+
+    checksum = Column(String(64), nullable=False)
+    cantidad_filas = Column(Integer, nullable=False, default=0)
+    fecha_creacion = Column(DateTime, default=datetime.utcnow)
+
+    detalles = relationship("SaldoCierrePeriodoDetalle", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (UniqueConstraint('empresa_id', 'ano', 'mes', name='_saldo_cierre_empresa_ano_mes_uc'),)
+
+
+class SaldoCierrePeriodoDetalle(Base):
+    """
+    Débito y crédito acumulados por cuenta / tercero / centro de costo.
+    tercero_id es el tercero efectivo del movimiento (tercero del movimiento o,
+    en su defecto, el beneficiario del documento). 0 = sin tercero / sin centro de costo.
+    """
+    __tablename__ = "saldos_cierre_periodo_detalle"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cierre_id = Column(Integer, ForeignKey("saldos_cierre_periodo.id", ondelete="CASCADE"), nullable=False)
+    cuenta_id = Column(Integer, ForeignKey("plan_cuentas.id"), nullable=False)
+    tercero_id = Column(Integer, nullable=False, default=0)
+    centro_costo_id = Column(Integer, nullable=False, default=0)
+
+    debito = Column(Numeric(18, 2), nullable=False, default=0)
+    credito = Column(Numeric(18, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_saldo_cierre_detalle_cierre_cuenta", "cierre_id", "cuenta_id"),
+        Index("ix_saldo_cierre_detalle_cierre_tercero", "cierre_id", "tercero_id"),
+    )
@@ -0,0 +1,46 @@
+from sqlalchemy import Column, Integer, ForeignKey, Numeric, DateTime, Index
+from datetime import datetime
+from ..core.database import Base
+
+
+class SaldoMensualCuenta(Base):
+    """
+    Acumulado materializado de movimientos contables por empresa / cuenta /
+    centro de costo / mes. Solo incluye documentos NO anulados.
+
+    Se mantiene de forma incremental desde el servicio de documentos
+    (app/services/saldos_mensuales.py) y puede reconstruirse completo con
+    app/scripts/reconstruir_saldos_mensuales.py.
+
+    NOTA: centro_costo_id usa 0 como "sin centro de costo" (en lugar de NULL)
+    para que el índice único funcione igual en PostgreSQL y SQLite.
+    """
+    __tablename__ = "saldos_mensuales_cuenta"
+
+    id = Column(Integer, primary_key=True, index=True)
+    empresa_id = Column(Integer, ForeignKey("empresas.id"), nullable=False)
+    cuenta_id = Column(Integer, ForeignKey("plan_cuentas.id"), nullable=False)
+    centro_costo_id = Column(Integer, nullable=False, default=0)
+    ano = Column(Integer, nullable=False)
+    mes = Column(Integer, nullable=False)
+
+    debito = Column(Numeric(18, 2), nullable=False, default=0)
+    credito = Column(Numeric(18, 2), nullable=False, default=0)
+    cantidad_movimientos = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("uq_saldo_mensual_empresa_cuenta_cc_periodo", "empresa_id", "cuenta_id", "centro_costo_id", "ano", "mes", unique=True),
+        Index("ix_saldo_mensual_empresa_periodo", "empresa_id", "ano", "mes"),
+    )
+
+
+class SaldoMensualEstado(Base):
+    """
+    Marca por empresa que indica que la tabla de saldos mensuales fue
+    reconstruida y es confiable. Mientras no exista, los reportes siguen
+    consultando directamente los movimientos.
+    """
+    __tablename__ = "saldos_mensuales_estado"
+
+    empresa_id = Column(Integer, ForeignKey("empresas.id"), primary_key=True)
+    fecha_reconstruccion = Column(DateTime, default=datetime.utcnow)
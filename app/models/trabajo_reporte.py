@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON, Index
+from datetime import datetime
+from ..core.database import Base
+
+
+class TrabajoReporte(Base):
+    """
+    Reporte generado en segundo plano (app/services/trabajos_reportes.py).
+
+    reporte_key: clave del reporte en ReportRegistry.
+    filtros: filtros normalizados (JSON) con los que se generó.
+    huella: hash de empresa + reporte + formato + filtros; dos solicitudes
+            iguales mientras la primera sigue abierta comparten el trabajo.
+    ruta_archivo: resultado en el almacén local; se borra al vencer fecha_expiracion.
+    estado: PENDIENTE | EN_PROCESO | COMPLETADO | ERROR | EXPIRADO
+    """
+    __tablename__ = "trabajos_reportes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    empresa_id = Column(Integer, ForeignKey("empresas.id", ondelete="CASCADE"), nullable=False, index=True)
+    usuario_id = Column(Integer, nullable=True)
+
+    reporte_key = Column(String(100), nullable=False)
+    formato = Column(String(10), nullable=False, default="pdf")
+    filtros = Column(JSON, nullable=True)
+    huella = Column(String(64), nullable=False)
+
+    estado = Column(String(20), nullable=False, default="PENDIENTE")
+    porcentaje = Column(Integer, nullable=False, default=0)
+    mensaje = Column(String(255), nullable=True)
+    error = Column(Text, nullable=True)
+
+    nombre_archivo = Column(String(255), nullable=True)
+    ruta_archivo = Column(String(500), nullable=True)
+    tamano_bytes = Column(Integer, nullable=True)
+
+    fecha_creacion = Column(DateTime, default=datetime.utcnow)
+    fecha_inicio = Column(DateTime, nullable=True)
+    fecha_actualizacion = Column(DateTime, default=datetime.utcnow)
+    fecha_fin = Column(DateTime, nullable=True)
+    fecha_expiracion = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_trabajos_reportes_huella_estado", "empresa_id", "huella", "estado"),
+    )
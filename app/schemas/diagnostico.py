@@ -30,6 +30,16 @@ class ConteoResult(BaseModel):
     recargas_disponibles: int = 0
 # --- FIN: SCHEMA ACTUALIZADO ---
 
+# --- ASESOR DE ÍNDICES (EXPLAIN DE CONSULTAS DE REPORTES) ---
+class PlanConsultaResult(BaseModel):
+    empresa_id: int
+    nombre_empresa: str
+    total_registros: int
+    consulta: str
+    escaneos_secuenciales: List[str] = []  # Tablas calientes leídas sin índice
+    alerta: bool = False
+    plan: List[str] = []
+
 class TiposDocumentoRequest(BaseModel):
     empresaId: int
 
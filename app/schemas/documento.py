@@ -33,6 +33,7 @@ class DetalleProductoVendido(BaseModel):
 class MovimientoContableBase(BaseModel):
     cuenta_id: int
     centro_costo_id: Optional[int] = None
+    tercero_id: Optional[int] = None
     concepto: Optional[str] = None
     debito: Decimal = Field(default=0, ge=0)
     credito: Decimal = Field(default=0, ge=0)
@@ -192,12 +193,39 @@ class DocumentoAccionMasivaPayload(BaseModel):
     documentoIds: List[int]
     razon: str = Field(min_length=5)
 
+# --- CREACIÓN MASIVA DE DOCUMENTOS ---
+class DocumentoCreacionMasivaPayload(BaseModel):
+    documentos: List[DocumentoCreate] = Field(min_length=1)
+    conservarNumeros: bool = False  # Respeta el número de cada documento (importaciones históricas)
+    omitirInvalidos: bool = False  # Crea los válidos y reporta los demás en lugar de rechazar el lote
+
+class DocumentoCreacionMasivaResponse(BaseModel):
+    creados: int
+    ids: List[Optional[int]]  # Alineados con la entrada; None si el documento se omitió
+    numeros: List[Optional[int]]
+    errores: List[Dict[str, Any]] = []
+    cartera_lote_id: Optional[str] = None
+
 class SuperInformeResponse(BaseModel):
     total_registros: int
     total_paginas: int
     pagina_actual: int
     resultados: List[Dict[str, Any]]
 
+# --- PAGINACIÓN POR CURSOR (KEYSET) PARA LIBRO DIARIO Y SUPER INFORME ---
+class SuperInformeCursorFiltros(DocumentoGestionFiltros):
+    cursor: Optional[str] = None  # siguiente_cursor de la página anterior
+    acumulados: bool = False  # Débito/crédito acumulados por fila
+    incluirTotales: Optional[bool] = None  # Por defecto solo en la primera página
+    limite: int = Field(200, ge=1, le=1000)
+
+class PaginaCursorResponse(BaseModel):
+    items: List[Dict[str, Any]]
+    siguiente_cursor: Optional[str] = None
+    tiene_mas: bool
+    limite: int
+    totales: Optional[Dict[str, Any]] = None
+
 class DocumentoAnuladoResult(BaseModel):
     id: int
     fecha: date
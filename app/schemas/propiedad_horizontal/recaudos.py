@@ -41,6 +41,11 @@ class CarteraEdadesResponse(BaseModel):
     total_mas_90: float = 0
     total_general: float = 0
 
+class FiltrosCarteraEdades(BaseModel):
+    fecha_corte: Optional[date] = None
+    filtro_metadato_llave: Optional[str] = None
+    filtro_metadato_valor: Optional[str] = None
+
 class ReporteSaldoItem(BaseModel):
     unidad_id: int
     unidad_codigo: str
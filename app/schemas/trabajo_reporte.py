@@ -0,0 +1,38 @@
+from pydantic import BaseModel, Field
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+
+class TrabajoReporteCreate(BaseModel):
+    """ Solicitud de un reporte en segundo plano (clave de ReportRegistry + filtros). """
+    reporte_key: str
+    formato: str = "pdf"
+    filtros: Dict[str, Any] = Field(default_factory=dict)
+
+
+class ReporteDisponible(BaseModel):
+    key: str
+    description: str
+    formats: List[str]
+
+
+# --- Filtros de reportes que antes solo recibían parámetros sueltos por query ---
+
+class FiltrosLibroDiario(BaseModel):
+    fecha_inicio: date
+    fecha_fin: date
+    tipos_documento_ids: Optional[List[int]] = None
+    cuenta_filtro: Optional[str] = None
+    numero_documento: Optional[str] = None
+    beneficiario_filtro: Optional[str] = None
+    concepto_filtro: Optional[str] = None
+    valor_filtro: Optional[float] = None
+    operador_valor: Optional[str] = ">="
+    centro_costo_filtro: Optional[str] = None
+    vendedor_filtro: Optional[str] = None
+    producto_filtro: Optional[str] = None
+
+
+class FiltrosFuentesUsos(BaseModel):
+    fecha_inicio: date
+    fecha_fin: date
@@ -0,0 +1,41 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+from app.core.database import SessionLocal
+from app.models.empresa import Empresa
+from app.services.saldos_mensuales import reconstruir_saldos_mensuales
+from app.services.saldos_cierre import regenerar_saldos_cierre
+
+
+def main(empresa_ids=None):
+    """
+    Reconstruye la tabla de saldos mensuales materializados y las fotos de
+    saldos de los períodos cerrados.
+    Uso:
+        python app/scripts/reconstruir_saldos_mensuales.py            (todas las empresas)
+        python app/scripts/reconstruir_saldos_mensuales.py 12 15      (solo las indicadas)
+    """
+    db = SessionLocal()
+    try:
+        if not empresa_ids:
+            empresa_ids = [e.id for e in db.query(Empresa.id).order_by(Empresa.id).all()]
+
+        print(f"[INFO] Reconstruyendo saldos mensuales para {len(empresa_ids)} empresa(s)...")
+        for empresa_id in empresa_ids:
+            try:
+                resultado = reconstruir_saldos_mensuales(db, empresa_id, commit=False)
+                cierres = regenerar_saldos_cierre(db, empresa_id)
+                db.commit()
+                print(f"  > Empresa {empresa_id}: {resultado['filas']} filas, {cierres} período(s) cerrado(s) congelados.")
+            except Exception as e:
+                db.rollback()
+                print(f"  [ERROR] Empresa {empresa_id}: {e}")
+        print("[OK] Proceso terminado.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]])
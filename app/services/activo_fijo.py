@@ -6,6 +6,7 @@ from fastapi import HTTPException
 from ..models import activo_fijo as models, activo_categoria as models_cat, activo_novedad as models_nov
 from ..models import documento as models_doc, movimiento_contable as models_mov, tipo_documento as models_tipo
 from ..services import periodo as service_periodo
+from ..services import saldos_mensuales as saldos_mensuales_service
 from ..schemas import activo_fijo as schemas
 
 # --- CATEGORIAS ---
@@ -391,7 +392,9 @@ def limpiar_depreciaciones_prueba(db: Session, empresa_id: int, user_id: int):
         
         # 2. Eliminar documentos y sus movimientos
         for doc in documentos_depreciacion:
-            # Eliminar movimientos contables
+            # Eliminar movimientos contables (antes, descontarlos de los saldos mensuales si el documento aún sumaba)
+            if not doc.anulado:
+                saldos_mensuales_service.retirar_documento(db, doc.id)
             db.query(models_mov.MovimientoContable).filter(
                 models_mov.MovimientoContable.documento_id == doc.id
             ).delete(synchronize_session=False)
@@ -522,7 +525,9 @@ def eliminar_todos_documentos_activos(db: Session, empresa_id: int, user_id: int
         
         # 2. Eliminar documentos y movimientos en lotes
         for doc in documentos_activos:
-            # Eliminar movimientos contables
+            # Eliminar movimientos contables (antes, descontarlos de los saldos mensuales si el documento aún sumaba)
+            if not doc.anulado:
+                saldos_mensuales_service.retirar_documento(db, doc.id)
             movimientos_eliminados = db.query(models_mov.MovimientoContable).filter(
                 models_mov.MovimientoContable.documento_id == doc.id
             ).delete(synchronize_session=False)
@@ -11,11 +11,12 @@ from app.models.plan_cuenta import PlanCuenta
 from app.models.movimiento_contable import MovimientoContable
 from app.models.documento import Documento
 from app.models.empresa import Empresa
-from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
-from jinja2 import Environment, select_autoescape
-from weasyprint import HTML
+from app.services.plantillas_html import TEMPLATES_EMPAQUETADOS
+from app.services import plantillas_html
+from app.services import arbol_puc
+from app.services import motor_pdf
 
-GLOBAL_JINJA_ENV = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
+GLOBAL_JINJA_ENV = plantillas_html.crear_entorno()
 
 def get_fuentes_usos_capital_trabajo(
     db: Session,
@@ -41,16 +42,21 @@ def get_fuentes_usos_capital_trabajo(
     # El usuario quiere ver "Cambios", así que ver nivel Cuenta (4 dígitos) o Subcuenta (6 dígitos) es útil.
     # Usemos todas las cuentas que tengan movimiento o saldo.
     
+    # Cuentas de los grupos de capital de trabajo (subárboles del PUC, ver arbol_puc)
+    arbol = arbol_puc.get_arbol_puc(db, empresa_id)
+    cuenta_ids = arbol.descendientes(all_prefixes)
+    if not cuenta_ids:
+        return {"filas": [], "totales": {}}
+
     # Consulta masiva de saldos iniciales (antes de fecha_inicio)
     sq_saldo_ini = db.query(
         MovimientoContable.cuenta_id,
         func.sum(MovimientoContable.debito - MovimientoContable.credito).label("saldo")
-    ).join(Documento).join(PlanCuenta).filter(
+    ).join(Documento).filter(
         Documento.empresa_id == empresa_id,
         Documento.fecha < fecha_inicio,
         Documento.anulado.is_(False),
-        # Filtro de prefijos
-        func.substr(PlanCuenta.codigo, 1, 2).in_(all_prefixes)
+        MovimientoContable.cuenta_id.in_(cuenta_ids)
     ).group_by(MovimientoContable.cuenta_id).all()
     
     mapa_ini = {r.cuenta_id: float(r.saldo or 0) for r in sq_saldo_ini}
@@ -59,11 +65,11 @@ def get_fuentes_usos_capital_trabajo(
     sq_movs = db.query(
         MovimientoContable.cuenta_id,
         func.sum(MovimientoContable.debito - MovimientoContable.credito).label("variacion_neta")
-    ).join(Documento).join(PlanCuenta).filter(
+    ).join(Documento).filter(
         Documento.empresa_id == empresa_id,
         Documento.fecha.between(fecha_inicio, fecha_fin),
         Documento.anulado.is_(False),
-        func.substr(PlanCuenta.codigo, 1, 2).in_(all_prefixes)
+        MovimientoContable.cuenta_id.in_(cuenta_ids)
     ).group_by(MovimientoContable.cuenta_id).all()
     
     mapa_movs = {r.cuenta_id: float(r.variacion_neta or 0) for r in sq_movs}
@@ -73,7 +79,7 @@ def get_fuentes_usos_capital_trabajo(
     if not all_ids:
         return {"filas": [], "totales": {}}
         
-    cuentas = db.query(PlanCuenta).filter(PlanCuenta.id.in_(all_ids)).all()
+    cuentas = [arbol.cuenta(cuenta_id) for cuenta_id in all_ids]
     
     filas = []
     
@@ -225,6 +231,32 @@ def generate_fuentes_usos_pdf(db: Session, empresa_id: int, fecha_inicio: date,
          pass
 
     template_str = TEMPLATES_EMPAQUETADOS.get("reports/fuentes_usos_report.html", "<h1>Plantilla no encontrada</h1>")
-    template = GLOBAL_JINJA_ENV.from_string(template_str)
+    template = plantillas_html.compilar(GLOBAL_JINJA_ENV, template_str)
     html_out = template.render(context)
-    return HTML(string=html_out).write_pdf()
+    return motor_pdf.html_a_pdf(html_out)
+
+
+# ==============================================================================
+# === REGISTRY INTEGRATION: FUENTES Y USOS (TRABAJOS EN SEGUNDO PLANO) ===
+# ==============================================================================
+from app.core.reporting_registry import BaseReport, ReportRegistry
+from app.schemas.trabajo_reporte import FiltrosFuentesUsos
+
+
+@ReportRegistry.register
+class FuentesUsosReportService(BaseReport):
+    key = "fuentes_usos"
+    description = "Estado de Fuentes y Usos del Capital de Trabajo"
+    filter_schema = FiltrosFuentesUsos
+
+    def _filtros(self, filtros) -> FiltrosFuentesUsos:
+        return filtros if isinstance(filtros, FiltrosFuentesUsos) else self.filter_schema(**filtros)
+
+    def get_data(self, db: Session, empresa_id: int, filtros):
+        filtros_obj = self._filtros(filtros)
+        return get_fuentes_usos_capital_trabajo(db, empresa_id, filtros_obj.fecha_inicio, filtros_obj.fecha_fin)
+
+    def generate_pdf(self, db: Session, empresa_id: int, filtros):
+        filtros_obj = self._filtros(filtros)
+        pdf_bytes = generate_fuentes_usos_pdf(db, empresa_id, filtros_obj.fecha_inicio, filtros_obj.fecha_fin)
+        return pdf_bytes, f"Fuentes_Usos_{filtros_obj.fecha_inicio}_{filtros_obj.fecha_fin}.pdf"
@@ -0,0 +1,343 @@
+# app/services/arbol_puc.py
+"""
+Motor único de mayorización (suma de saldos hacia las cuentas padre) para los
+reportes jerárquicos.
+
+La lógica "sumar las hojas hacia arriba en el PUC" estaba repetida: recursiva
+y mutando objetos Pydantic nodo por nodo (balance de prueba, comparación de
+saldos), por recorte de códigos (dashboard, libro mayor) y por prefijos en SQL
+(fuentes y usos). Cada versión resolvía distinto los casos borde.
+
+Aquí el árbol de cuentas de la empresa se arma UNA vez y queda en caché
+(app/core/cache.py) como arreglos NumPy:
+  - `padre[i]`: posición del padre de la cuenta i (-1 en las raíces),
+  - `por_profundidad`: posiciones agrupadas por profundidad, de la más honda a
+    la raíz, para sumar hacia arriba un nivel a la vez sin recursión (O(n)),
+  - `orden`: recorrido en preorden con los hijos ordenados por código (el
+    orden de presentación de los reportes).
+
+Padre de una cuenta: cuenta_padre_id si existe; si no, el código padre según el
+PUC (auxiliar→subcuenta→cuenta→grupo→clase). Si ese código no existe en el plan
+se crea un nodo "virtual" (sin id) para que los saldos igual suban a la clase.
+
+Invalidación: al confirmar una sesión que crea/modifica/elimina cuentas (o
+centros de costo) se elimina el árbol de la empresa. Cuentas creadas por otro
+worker (caché en memoria) se detectan porque su id no está en el árbol.
+"""
+
+from collections import namedtuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.cache import cache
+
+ARBOL_CACHE_TTL_SECONDS = 600
+_PREFIJO = "arbol_puc"
+_TAG_ARBOL = f"prefix:{_PREFIJO}"
+_NIVEL_POR_LONGITUD = {1: 1, 2: 2, 4: 3, 6: 4}
+
+NodoCuenta = namedtuple("NodoCuenta", "id codigo nombre nivel")
+
+
+def codigo_padre_puc(codigo: str) -> Optional[str]:
+    """Código padre según la estructura del PUC colombiano (None para una clase)."""
+    n = len(codigo)
+    if n > 6:
+        return codigo[:6]
+    if n > 4:
+        return codigo[:4]
+    if n > 2:
+        return codigo[:2]
+    if n > 1:
+        return codigo[:1]
+    return None
+
+
+class ArbolCuentas:
+    """
+    Árbol inmutable de cuentas (o centros de costo) de una empresa.
+    Las posiciones 0..n-1 indexan todos los arreglos; `virtual[i]` marca los
+    nodos sintetizados por código que no existen en el plan.
+    """
+
+    def __init__(self, filas: Sequence[tuple], sintetizar_padres: bool = True):
+        """filas: (id, codigo, nombre, nivel, padre_id)."""
+        ids: List[Optional[int]] = []
+        codigos: List[str] = []
+        nombres: List[Optional[str]] = []
+        niveles: List[int] = []
+        padres_id: List[Optional[int]] = []
+        for id_, codigo, nombre, nivel, padre_id in filas:
+            ids.append(id_)
+            codigos.append(str(codigo))
+            nombres.append(nombre)
+            niveles.append(nivel if nivel is not None else _NIVEL_POR_LONGITUD.get(len(str(codigo)), len(str(codigo))))
+            padres_id.append(padre_id)
+
+        indice = {id_: i for i, id_ in enumerate(ids)}
+        indice_codigo: Dict[str, int] = {}
+        for i, codigo in enumerate(codigos):
+            indice_codigo.setdefault(codigo, i)
+
+        padre: List[int] = []
+        i = 0
+        while i < len(codigos):
+            p = indice.get(padres_id[i], -1) if padres_id[i] is not None else -1
+            if p == i:
+                p = -1
+            if p < 0:
+                p = self._padre_por_codigo(codigos[i], indice_codigo, sintetizar_padres,
+                                           ids, codigos, nombres, niveles, padres_id)
+            padre.append(p)
+            i += 1
+
+        self.n = len(codigos)
+        self.ids = ids
+        self.codigos = codigos
+        self.nombres = nombres
+        self.niveles = np.array(niveles, dtype=np.int64)
+        self.virtual = np.array([id_ is None for id_ in ids], dtype=bool)
+        self.indice = {id_: i for i, id_ in enumerate(ids) if id_ is not None}
+        self.indice_codigo = indice_codigo
+        self.padre = np.array(padre, dtype=np.int64)
+        self._armar_recorridos()
+
+    @staticmethod
+    def _padre_por_codigo(codigo, indice_codigo, sintetizar, ids, codigos, nombres, niveles, padres_id) -> int:
+        """Posición del padre por código; con `sintetizar` agrega los códigos faltantes como nodos virtuales."""
+        codigo_padre = codigo_padre_puc(codigo)
+        while codigo_padre is not None:
+            if codigo_padre in indice_codigo:
+                return indice_codigo[codigo_padre]
+            if sintetizar:
+                posicion = len(codigos)
+                ids.append(None)
+                codigos.append(codigo_padre)
+                nombres.append(None)
+                niveles.append(_NIVEL_POR_LONGITUD.get(len(codigo_padre), len(codigo_padre)))
+                padres_id.append(None)
+                indice_codigo[codigo_padre] = posicion
+                return posicion
+            codigo_padre = codigo_padre_puc(codigo_padre)
+        return -1
+
+    def _armar_recorridos(self) -> None:
+        hijos: List[List[int]] = [[] for _ in range(self.n)]
+        for i, p in enumerate(self.padre.tolist()):
+            if p >= 0:
+                hijos[p].append(i)
+        for lista in hijos:
+            lista.sort(key=lambda h: self.codigos[h])
+
+        profundidad = np.full(self.n, -1, dtype=np.int64)
+        orden: List[int] = []
+        raices = sorted((i for i in range(self.n) if self.padre[i] < 0), key=lambda r: self.codigos[r])
+        while True:
+            pila = [(r, 0) for r in reversed(raices)]
+            while pila:
+                nodo, prof = pila.pop()
+                profundidad[nodo] = prof
+                orden.append(nodo)
+                pila.extend((h, prof + 1) for h in reversed(hijos[nodo]))
+            sin_visitar = np.flatnonzero(profundidad < 0)
+            if not len(sin_visitar):
+                break
+            # Datos con ciclos en cuenta_padre_id: se corta el ciclo en la cuenta de menor código
+            corte = min(sin_visitar.tolist(), key=lambda i: self.codigos[i])
+            hijos[self.padre[corte]].remove(corte)
+            self.padre[corte] = -1
+            raices = [corte]
+
+        self.profundidad = profundidad
+        self.orden = np.array(orden, dtype=np.int64)
+        self.por_profundidad = [
+            np.flatnonzero(profundidad == p) for p in range(int(profundidad.max(initial=0)), 0, -1)
+        ]
+
+    # --- AGREGACIÓN ---
+
+    def vector(self, valores_por_id: Dict[int, Any], columnas: int = 0) -> np.ndarray:
+        """
+        Arreglo (n,) o (n, columnas) con los valores propios de cada cuenta por id.
+        Con `columnas`, un valor escalar se ubica en la primera columna.
+        """
+        forma = (self.n, columnas) if columnas else (self.n,)
+        salida = np.zeros(forma, dtype=np.float64)
+        for cuenta_id, valor in valores_por_id.items():
+            posicion = self.indice.get(cuenta_id)
+            if posicion is None:
+                continue
+            if columnas and np.ndim(valor) == 0:
+                salida[posicion, 0] = valor
+            else:
+                salida[posicion] = valor
+        return salida
+
+    def acumular(self, valores: np.ndarray) -> np.ndarray:
+        """Valor propio + el de todos los descendientes, para cada nodo (sin recursión)."""
+        total = np.array(valores, dtype=np.float64, copy=True)
+        for posiciones in self.por_profundidad:
+            np.add.at(total, self.padre[posiciones], total[posiciones])
+        return total
+
+    def con_descendientes(self, marcas: np.ndarray) -> np.ndarray:
+        """Marca cada nodo que tiene (él o un descendiente) la marca."""
+        return self.acumular(np.asarray(marcas, dtype=np.float64)) > 0
+
+    def acumular_por_codigo(self, valores: Dict[str, float]) -> Dict[str, float]:
+        """
+        Mayoriza saldos indexados por código. Retorna los códigos recibidos más
+        los ancestros de los que tienen valor distinto de cero (mismo resultado
+        que recortar códigos según el PUC, ver codigo_padre_puc).
+        """
+        propios = np.zeros(self.n, dtype=np.float64)
+        marcas = np.zeros(self.n, dtype=np.float64)
+        fuera_del_arbol: Dict[str, float] = {}
+        for codigo, valor in valores.items():
+            codigo = str(codigo)
+            posicion = self.indice_codigo.get(codigo)
+            # Códigos que no están en el plan suben por recorte hasta el primer ancestro que sí esté
+            while posicion is None and codigo is not None:
+                fuera_del_arbol[codigo] = fuera_del_arbol.get(codigo, 0.0) + valor
+                if not valor:
+                    break
+                codigo = codigo_padre_puc(codigo)
+                posicion = self.indice_codigo.get(codigo) if codigo is not None else None
+            if posicion is None:
+                continue
+            propios[posicion] += valor
+            if valor:
+                marcas[posicion] = 1.0
+        totales = self.acumular(propios)
+        visibles = self.acumular(marcas) > 0
+        salida = {self.codigos[i]: float(totales[i]) for i in np.flatnonzero(visibles)}
+        for codigo in valores:
+            posicion = self.indice_codigo.get(str(codigo))
+            if posicion is not None:
+                salida.setdefault(self.codigos[posicion], float(totales[posicion]))
+        salida.update(fuera_del_arbol)
+        return salida
+
+    # --- SELECCIÓN ---
+
+    def posiciones_con_prefijo(self, prefijos: Iterable[str]) -> np.ndarray:
+        prefijos = tuple(str(p) for p in prefijos)
+        return np.array([c.startswith(prefijos) for c in self.codigos], dtype=bool)
+
+    def descendientes(self, codigos: Iterable[str]) -> List[int]:
+        """Ids (reales) de las cuentas con esos códigos y de todo su subárbol."""
+        marcas = np.zeros(self.n, dtype=bool)
+        for codigo in codigos:
+            posicion = self.indice_codigo.get(str(codigo))
+            if posicion is not None:
+                marcas[posicion] = True
+        # Baja de la raíz a las hojas: un nodo queda marcado si lo está su padre
+        for posiciones in reversed(self.por_profundidad):
+            marcas[posiciones] |= marcas[self.padre[posiciones]]
+        return [self.ids[i] for i in np.flatnonzero(marcas & ~self.virtual)]
+
+    def cuenta(self, cuenta_id: int) -> Optional[NodoCuenta]:
+        posicion = self.indice.get(cuenta_id)
+        if posicion is None:
+            return None
+        return NodoCuenta(cuenta_id, self.codigos[posicion], self.nombres[posicion], int(self.niveles[posicion]))
+
+    def contiene(self, ids: Iterable[int]) -> bool:
+        return all(i in self.indice for i in ids)
+
+
+# ==========================================================
+# CACHÉ POR EMPRESA
+# ==========================================================
+
+def _clave(tipo: str, empresa_id: int) -> str:
+    return f"empresa:{empresa_id}:{_PREFIJO}:{tipo}"
+
+
+def _obtener(db: Session, tipo: str, empresa_id: int, cuenta_ids: Optional[Iterable[int]], construir) -> ArbolCuentas:
+    clave = _clave(tipo, empresa_id)
+    arbol = cache.get(clave)
+    if isinstance(arbol, ArbolCuentas) and (cuenta_ids is None or arbol.contiene(cuenta_ids)):
+        return arbol
+    arbol = construir(db, empresa_id)
+    cache.set(clave, arbol, ttl=ARBOL_CACHE_TTL_SECONDS, empresa_id=empresa_id, tags=(_TAG_ARBOL,))
+    return arbol
+
+
+def _construir_puc(db: Session, empresa_id: int) -> ArbolCuentas:
+    from app.models.plan_cuenta import PlanCuenta
+    filas = db.query(
+        PlanCuenta.id, PlanCuenta.codigo, PlanCuenta.nombre, PlanCuenta.nivel, PlanCuenta.cuenta_padre_id
+    ).filter(PlanCuenta.empresa_id == empresa_id).order_by(PlanCuenta.codigo).all()
+    return ArbolCuentas(filas, sintetizar_padres=True)
+
+
+def _construir_centros_costo(db: Session, empresa_id: int) -> ArbolCuentas:
+    from app.models.centro_costo import CentroCosto
+    filas = db.query(
+        CentroCosto.id, CentroCosto.codigo, CentroCosto.nombre, CentroCosto.nivel, CentroCosto.centro_costo_padre_id
+    ).filter(CentroCosto.empresa_id == empresa_id).order_by(CentroCosto.codigo).all()
+    return ArbolCuentas(filas, sintetizar_padres=False)
+
+
+def get_arbol_puc(db: Session, empresa_id: int, cuenta_ids: Optional[Iterable[int]] = None) -> ArbolCuentas:
+    """Árbol del plan de cuentas. Con `cuenta_ids`, se reconstruye si alguna no está (creada en otro proceso)."""
+    return _obtener(db, "puc", empresa_id, cuenta_ids, _construir_puc)
+
+
+def get_arbol_centros_costo(db: Session, empresa_id: int, centro_costo_ids: Optional[Iterable[int]] = None) -> ArbolCuentas:
+    return _obtener(db, "centros_costo", empresa_id, centro_costo_ids, _construir_centros_costo)
+
+
+def invalidar_arbol(empresa_id: Optional[int] = None) -> int:
+    """Sin empresa invalida los árboles de todas."""
+    return cache.invalidate_tags(_TAG_ARBOL, empresa_id=empresa_id)
+
+
+# --- INVALIDACIÓN AUTOMÁTICA AL CONFIRMAR CAMBIOS EN EL PLAN ---
+_CLAVE_PENDIENTES = "arbol_puc_pendientes"
+
+
+def _es_jerarquia(clase) -> bool:
+    from app.models.plan_cuenta import PlanCuenta
+    from app.models.centro_costo import CentroCosto
+    return clase is PlanCuenta or clase is CentroCosto
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_cambios_plan(session, flush_context):
+    pendientes = None
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not _es_jerarquia(type(obj)):
+            continue
+        if pendientes is None:
+            pendientes = session.info.setdefault(_CLAVE_PENDIENTES, set())
+        pendientes.add(getattr(obj, "empresa_id", None))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _registrar_sentencia_masiva(orm_execute_state):
+    """UPDATE/DELETE masivos (recodificación, borrado del PUC) no pasan por el flush."""
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or not _es_jerarquia(mapper.class_):
+        return
+    # No se sabe qué empresas toca la sentencia: se invalidan todas al confirmar
+    orm_execute_state.session.info.setdefault(_CLAVE_PENDIENTES, set()).add(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_invalidaciones(session):
+    pendientes = session.info.pop(_CLAVE_PENDIENTES, None)
+    if not pendientes:
+        return
+    if None in pendientes:
+        invalidar_arbol()
+        return
+    for empresa_id in pendientes:
+        invalidar_arbol(empresa_id)
+
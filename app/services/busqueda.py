@@ -0,0 +1,374 @@
+# app/services/busqueda.py
+"""
+Búsqueda de texto indexada para autocompletar y filtros (terceros, productos,
+cuentas, grupos de inventario y concepto de movimientos).
+
+Los autocompletar y los filtros del Libro Diario / Super Informe usaban
+ilike('%texto%') sobre columnas sin índice: cada tecla recorría la tabla
+completa de terceros o productos, y filtrar por concepto recorría todos los
+movimientos del período.
+
+  - PostgreSQL: índices GIN con gin_trgm_ops (migración de pg_trgm). El mismo
+    ILIKE '%texto%' los usa sin cambiar la consulta; la búsqueda aproximada
+    agrega el operador de similitud por palabra (texto <% columna).
+  - SQLite: una tabla sombra FTS5 por entidad (tokenizador trigram, rowid = id
+    de la fila) mantenida por eventos del ORM; el filtro es
+    id IN (SELECT rowid FROM busqueda_<entidad>_fts WHERE ... MATCH ...).
+  - Textos de menos de 3 caracteres (no forman un trigrama) o sin índice
+    disponible vuelven al ILIKE de siempre: el resultado es el mismo.
+
+API única para los llamadores:
+  filtrar(query, "tercero", texto)              -> query filtrada
+  condicion(db, "tercero", texto, objetivo=...) -> expresión (para or_ / alias)
+  orden(db, "tercero", texto)                   -> criterios de ORDER BY por relevancia
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    case, column, delete, event, func, insert, inspect, literal, literal_column, or_, select, table, text, true
+)
+from sqlalchemy.orm import Session
+
+# entidad -> (clase en app.models, columnas indexadas)
+ENTIDADES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "tercero": ("Tercero", ("nit", "razon_social")),
+    "producto": ("Producto", ("codigo", "nombre")),
+    "cuenta": ("PlanCuenta", ("codigo", "nombre")),
+    "grupo": ("GrupoInventario", ("nombre",)),
+    "concepto": ("MovimientoContable", ("concepto",)),
+}
+
+_MINIMO_TRIGRAMA = 3
+
+# Motor -> {entidad: tabla FTS lista} (SQLite) / pg_trgm instalado (PostgreSQL)
+_fts_listas: Dict[Any, Dict[str, bool]] = {}
+_trgm_por_motor: Dict[Any, bool] = {}
+
+
+def _modelo(entidad: str):
+    import app.models as modelos
+    if entidad not in ENTIDADES:
+        raise ValueError(f"Entidad de búsqueda no soportada: '{entidad}'.")
+    return getattr(modelos, ENTIDADES[entidad][0])
+
+
+_por_clase: Dict[Any, str] = {}
+
+
+def _entidad_de_clase(clase) -> Optional[str]:
+    if not _por_clase:
+        _por_clase.update({_modelo(entidad): entidad for entidad in ENTIDADES})
+    return _por_clase.get(clase)
+
+
+def tabla_fts(entidad: str) -> str:
+    return f"busqueda_{entidad}_fts"
+
+
+# --- CAPACIDADES DEL MOTOR ---
+# Las verificaciones usan la conexión de la sesión: con SQLite (StaticPool) abrir
+# otra conexión y cerrarla haría rollback de la transacción en curso.
+
+def _pg_trgm_disponible(db: Session) -> bool:
+    motor = db.get_bind()
+    if motor not in _trgm_por_motor:
+        _trgm_por_motor[motor] = db.connection().execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).first() is not None
+    return _trgm_por_motor[motor]
+
+
+def _fts_lista(db: Session, entidad: str) -> bool:
+    """
+    Se cachea también la ausencia: las tablas solo las crea asegurar_indices(),
+    que marca la entidad como lista al terminar.
+    """
+    listas = _fts_listas.setdefault(db.get_bind(), {})
+    if entidad not in listas:
+        listas[entidad] = db.connection().execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nombre"),
+            {"nombre": tabla_fts(entidad)}
+        ).first() is not None
+    return listas[entidad]
+
+
+# --- FILTRO Y ORDEN ---
+
+def _escapar_like(texto: str) -> str:
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _cadena_fts(texto: str) -> str:
+    return '"' + texto.replace('"', '""') + '"'
+
+
+def _consulta_fts(texto: str, columnas: Sequence[str], aproximada: bool) -> Optional[str]:
+    """
+    Expresión MATCH de FTS5, o None si el texto no alcanza para un trigrama.
+    La aproximada exige cada palabra en cualquier orden en lugar de la frase exacta.
+    """
+    if aproximada:
+        palabras = [p for p in re.split(r"\s+", texto) if len(p) >= _MINIMO_TRIGRAMA]
+        if not palabras:
+            return None
+        terminos = " AND ".join(_cadena_fts(p) for p in palabras)
+    else:
+        if len(texto) < _MINIMO_TRIGRAMA:
+            return None
+        terminos = _cadena_fts(texto)
+    return "{" + " ".join(columnas) + "} : (" + terminos + ")"
+
+
+def _columnas_objetivo(entidad: str, objetivo, columnas: Optional[Sequence[str]]):
+    nombres = tuple(columnas or ENTIDADES[entidad][1])
+    desconocidas = set(nombres) - set(ENTIDADES[entidad][1])
+    if desconocidas:
+        raise ValueError(f"Columnas no indexadas para '{entidad}': {sorted(desconocidas)}")
+    return nombres, [getattr(objetivo, nombre) for nombre in nombres]
+
+
+def condicion(db: Session, entidad: str, texto: Optional[str], objetivo=None,
+              columnas: Optional[Sequence[str]] = None, aproximada: bool = False):
+    """
+    Expresión de filtro "contiene `texto`" sobre las columnas indexadas de la entidad.
+    objetivo: la clase o un alias de ella (p. ej. el tercero del movimiento). Si es
+    otra clase con las mismas columnas (MovimientoEliminado), se usa ILIKE.
+    aproximada: en PostgreSQL suma similitud por palabra (tolera errores de tipeo);
+    en SQLite busca cada palabra por separado.
+    """
+    texto = (texto or "").strip()
+    if not texto:
+        return true()
+    modelo = _modelo(entidad)
+    objetivo = objetivo if objetivo is not None else modelo
+    nombres, cols = _columnas_objetivo(entidad, objetivo, columnas)
+
+    patron = f"%{_escapar_like(texto)}%"
+    contiene = or_(*[c.ilike(patron, escape="\\") for c in cols])
+
+    dialecto = db.get_bind().dialect.name
+    misma_tabla = inspect(objetivo).mapper.class_ is modelo
+
+    if dialecto == "postgresql":
+        # ILIKE '%texto%' ya usa el índice GIN de trigramas
+        if aproximada and _pg_trgm_disponible(db):
+            return or_(contiene, *[literal(texto).op("<%")(c) for c in cols])
+        return contiene
+
+    if dialecto == "sqlite" and misma_tabla and _fts_lista(db, entidad):
+        consulta = _consulta_fts(texto, nombres, aproximada)
+        if consulta is not None:
+            fts = tabla_fts(entidad)
+            ids = select(literal_column("rowid")).select_from(table(fts)).where(
+                literal_column(fts).op("MATCH")(literal(consulta))
+            )
+            return objetivo.id.in_(ids)
+
+    return contiene
+
+
+def orden(db: Session, entidad: str, texto: Optional[str], objetivo=None,
+          columnas: Optional[Sequence[str]] = None) -> List[Any]:
+    """
+    Criterios de relevancia: primero las coincidencias exactas, luego las que
+    empiezan por el texto y, en PostgreSQL con pg_trgm, por similitud.
+    Sin texto retorna [] y el llamador conserva su orden habitual.
+    """
+    texto = (texto or "").strip()
+    if not texto:
+        return []
+    objetivo = objetivo if objetivo is not None else _modelo(entidad)
+    _, cols = _columnas_objetivo(entidad, objetivo, columnas)
+    prefijo = f"{_escapar_like(texto)}%"
+
+    criterios = [case(
+        (or_(*[func.lower(c) == texto.lower() for c in cols]), 0),
+        (or_(*[c.ilike(prefijo, escape="\\") for c in cols]), 1),
+        else_=2
+    )]
+    if db.get_bind().dialect.name == "postgresql" and _pg_trgm_disponible(db):
+        similitudes = [func.word_similarity(texto, c) for c in cols]
+        criterios.append((func.greatest(*similitudes) if len(similitudes) > 1 else similitudes[0]).desc())
+    return criterios
+
+
+def filtrar(query, entidad: str, texto: Optional[str], objetivo=None,
+            columnas: Optional[Sequence[str]] = None, aproximada: bool = False, ordenar: bool = False):
+    """Aplica condicion() y, con ordenar, antepone orden() al ORDER BY."""
+    texto = (texto or "").strip()
+    if not texto:
+        return query
+    db = query.session
+    query = query.filter(condicion(db, entidad, texto, objetivo, columnas, aproximada))
+    if ordenar:
+        query = query.order_by(*orden(db, entidad, texto, objetivo, columnas))
+    return query
+
+
+# --- TABLAS FTS5 (SQLITE) ---
+
+def _sql_tabla(entidad: str) -> Tuple[str, str]:
+    modelo = _modelo(entidad)
+    return modelo.__tablename__, ", ".join(ENTIDADES[entidad][1])
+
+
+def reindexar(conn, entidad: str) -> int:
+    """Reconstruye la tabla FTS de la entidad desde la tabla base. Retorna las filas indexadas."""
+    tabla_base, columnas = _sql_tabla(entidad)
+    fts = tabla_fts(entidad)
+    conn.execute(text(f"DELETE FROM {fts}"))
+    conn.execute(text(f"INSERT INTO {fts}(rowid, {columnas}) SELECT id, {columnas} FROM {tabla_base}"))
+    return conn.execute(text(f"SELECT count(*) FROM {fts}")).scalar() or 0
+
+
+def indexar(db: Session, entidad: str, ids) -> None:
+    """
+    Copia a la tabla FTS filas escritas con INSERT masivo (no pasan por el flush).
+    ids: lista de ids o un select de ids. Sin efecto fuera de SQLite.
+    """
+    if db.get_bind().dialect.name != "sqlite" or not _fts_lista(db, entidad):
+        return
+    modelo = _modelo(entidad)
+    columnas = ENTIDADES[entidad][1]
+    fts = table(tabla_fts(entidad), column("rowid"), *[column(c) for c in columnas])
+    conn = db.connection()
+    conn.execute(delete(fts).where(fts.c.rowid.in_(ids)))
+    conn.execute(insert(fts).from_select(
+        ["rowid", *columnas],
+        select(modelo.id, *[getattr(modelo, c) for c in columnas]).where(modelo.id.in_(ids))
+    ))
+
+
+def asegurar_indices(motor) -> Dict[str, int]:
+    """
+    Crea las tablas FTS5 que falten y reconstruye las que no cuadran con la
+    tabla base (creadas ahora, o cargas masivas que no pasaron por el ORM).
+    Solo aplica a SQLite. Retorna {entidad: filas reindexadas}.
+    """
+    if motor.dialect.name != "sqlite":
+        return {}
+    reindexadas = {}
+    for entidad in ENTIDADES:
+        tabla_base, columnas = _sql_tabla(entidad)
+        fts = tabla_fts(entidad)
+        try:
+            with motor.begin() as conn:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columnas}, tokenize = 'trigram')"
+                ))
+                en_base = conn.execute(text(f"SELECT count(*) FROM {tabla_base}")).scalar() or 0
+                en_indice = conn.execute(text(f"SELECT count(*) FROM {fts}")).scalar() or 0
+                if en_base != en_indice:
+                    reindexadas[entidad] = reindexar(conn, entidad)
+            _fts_listas.setdefault(motor, {})[entidad] = True
+        except Exception as e:
+            print(f"  [Busqueda] No se pudo preparar el índice '{fts}': {e}")
+    return reindexadas
+
+
+def iniciar():
+    """Arranque: prepara las tablas FTS5 en SQLite (en PostgreSQL los índices vienen de Alembic)."""
+    from app.core.database import get_engine
+    reindexadas = asegurar_indices(get_engine())
+    for entidad, filas in reindexadas.items():
+        print(f"  [Busqueda] Índice '{entidad}' reconstruido ({filas} filas).")
+
+
+# --- SINCRONIZACIÓN CON EL ORM (SQLITE) ---
+_TAMANO_BLOQUE_IDS = 500
+
+
+def _entidad_sincronizable(session, clase) -> Optional[str]:
+    entidad = _entidad_de_clase(clase)
+    if entidad is None or session.get_bind().dialect.name != "sqlite":
+        return None
+    return entidad
+
+
+def _cambio_indexado(obj, entidad: str) -> bool:
+    estado = inspect(obj)
+    return any(estado.attrs[c].history.has_changes() for c in ENTIDADES[entidad][1])
+
+
+@event.listens_for(Session, "after_flush")
+def _sincronizar_fts(session, flush_context):
+    """Reemplaza las filas FTS de lo insertado/modificado/borrado, en la misma transacción."""
+    cambios = []
+    listas: Dict[Any, Optional[str]] = {}
+    for coleccion, tipo in ((session.new, "nuevo"), (session.dirty, "modificado"), (session.deleted, "borrado")):
+        for obj in coleccion:
+            clase = type(obj)
+            # Una sola verificación por clase en cada flush (los flush grandes traen miles de objetos)
+            if clase not in listas:
+                entidad = _entidad_sincronizable(session, clase)
+                listas[clase] = entidad if entidad is not None and _fts_lista(session, entidad) else None
+            entidad = listas[clase]
+            if entidad is None or obj.id is None:
+                continue
+            if tipo == "modificado" and not _cambio_indexado(obj, entidad):
+                continue
+            cambios.append((entidad, obj, tipo))
+    if not cambios:
+        return
+    conn = session.connection()
+    for entidad, obj, tipo in cambios:
+        fts = tabla_fts(entidad)
+        conn.execute(text(f"DELETE FROM {fts} WHERE rowid = :id"), {"id": obj.id})
+        if tipo != "borrado":
+            columnas = ENTIDADES[entidad][1]
+            conn.execute(
+                text(f"INSERT INTO {fts}(rowid, {', '.join(columnas)}) VALUES (:id, {', '.join(':' + c for c in columnas)})"),
+                {"id": obj.id, **{c: getattr(obj, c) for c in columnas}}
+            )
+
+
+def _columnas_asignadas(orm_execute_state) -> set:
+    """Columnas del SET del UPDATE (con valores o, en el UPDATE por clave primaria, de los parámetros)."""
+    sentencia = orm_execute_state.statement
+    valores = sentencia._values or dict(sentencia._ordered_values or ())
+    if valores:
+        return {getattr(clave, "key", clave) for clave in valores}
+    parametros = orm_execute_state.parameters
+    if isinstance(parametros, list):
+        return {clave for fila in parametros for clave in fila}
+    return set()
+
+
+def _ids_afectados(orm_execute_state, modelo) -> List[Any]:
+    """Ids que tocará el UPDATE, leídos antes de ejecutarlo (el SET puede cambiar su propio WHERE)."""
+    parametros = orm_execute_state.parameters
+    if isinstance(parametros, list):
+        return [fila["id"] for fila in parametros if "id" in fila]
+    consulta = select(modelo.id).distinct()
+    criterio = orm_execute_state.statement.whereclause
+    if criterio is not None:
+        consulta = consulta.where(criterio)
+    return list(orm_execute_state.session.execute(consulta, parametros or {}).scalars())
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _sincronizar_update_masivo(orm_execute_state):
+    """
+    Un UPDATE masivo no pasa por el flush: si su SET toca columnas indexadas, se
+    reindexan solo las filas que cumple su WHERE, en la misma transacción. Los
+    DELETE masivos dejan filas FTS huérfanas que no afectan el resultado (el
+    filtro es id IN ...) y se reemplazan si el id se reutiliza.
+    """
+    if not orm_execute_state.is_update:
+        return None
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return None
+    session = orm_execute_state.session
+    entidad = _entidad_sincronizable(session, mapper.class_)
+    if entidad is None or not _columnas_asignadas(orm_execute_state) & set(ENTIDADES[entidad][1]):
+        return None
+    if not _fts_lista(session, entidad):
+        return None
+    ids = _ids_afectados(orm_execute_state, mapper.class_)
+    resultado = orm_execute_state.invoke_statement()
+    for inicio in range(0, len(ids), _TAMANO_BLOQUE_IDS):
+        indexar(session, entidad, ids[inicio:inicio + _TAMANO_BLOQUE_IDS])
+    return resultado
@@ -1,6 +1,7 @@
 from typing import List, Dict, Any
-from sqlalchemy.orm import Session, joinedload, selectinload
-from sqlalchemy import and_, func, select, or_
+from collections import namedtuple
+from sqlalchemy.orm import Session, joinedload, selectinload, aliased
+from sqlalchemy import and_, func, select, or_, case
 from datetime import date
 
 from ..models import PlanCuenta as models_plan
@@ -134,289 +135,725 @@ def _documento_afecta_cuentas(db: Session, documento_id: int, cuentas_ids: List[
     ).first()
     return movimiento_existente is not None
 
-def recalcular_aplicaciones_tercero(db: Session, tercero_id: int, empresa_id: int, commit: bool = True,
-                                    injected_cuentas_cxc=None, injected_cuentas_cxp=None, injected_conceptos_ph=None):
-    # CORRECCIÓN CRÍTICA: Buscamos documentos donde el tercero aparece en el encabezado
-    # O en los movimientos contables de las cuentas CXC/CXP (el caso de los CE/RC).
-    try:
-        cuentas_cxc_ids = injected_cuentas_cxc if injected_cuentas_cxc is not None else get_cuentas_especiales_ids(db, empresa_id, 'cxc')
-        cuentas_cxp_ids = injected_cuentas_cxp if injected_cuentas_cxp is not None else get_cuentas_especiales_ids(db, empresa_id, 'cxp')
-        todas_cuentas_ids = list(set(cuentas_cxc_ids + cuentas_cxp_ids))
+# --- MOTOR DE CRUCE DE CARTERA / PROVEEDORES ---
+# Los documentos se manejan como tuplas livianas (sin cargar el ORM completo).
+_DocCartera = namedtuple("_DocCartera", "id fecha numero unidad_ph_id tipo_codigo")
 
-        # IDs de docs donde el tercero está en el ENCABEZADO
-        ids_por_encabezado = select(models_doc.id).where(
-            models_doc.beneficiario_id == tercero_id,
-            models_doc.empresa_id == empresa_id
+TEXTOS_GENERICOS = ('CARTERA PH', 'ABONO PH', 'RECAUDO PH', 'ANTICIPO', 'SALDO EXCEDENTE')
+
+
+def _condicion_documentos_tercero(doc_entity, tercero_id: int, empresa_id: int, todas_cuentas_ids: List[int]):
+    """Documentos donde el tercero está en el encabezado o en un movimiento CXC/CXP."""
+    ids_por_movimiento = select(models_mov.documento_id).where(
+        models_mov.tercero_id == tercero_id,
+        models_mov.cuenta_id.in_(todas_cuentas_ids) if todas_cuentas_ids else False
+    ).join(models_doc, models_mov.documento_id == models_doc.id).where(
+        models_doc.empresa_id == empresa_id
+    )
+    return or_(
+        doc_entity.beneficiario_id == tercero_id,
+        doc_entity.id.in_(ids_por_movimiento)
+    )
+
+
+def _desde_posicion(doc_entity, desde):
+    """(fecha, id) >= desde, en el orden de la línea de tiempo del cruce."""
+    fecha, doc_id = desde
+    return or_(doc_entity.fecha > fecha, and_(doc_entity.fecha == fecha, doc_entity.id >= doc_id))
+
+
+def _cargar_linea_tiempo(db: Session, empresa_id: int, condicion, cuentas_cxc_ids, cuentas_cxp_ids,
+                         conceptos_ph, desde=None):
+    """
+    Clasifica los movimientos CXC/CXP de los documentos activos del tercero en
+    facturas y pagos, igual que el recálculo original, leyendo solo columnas.
+    Con `desde` solo se leen los documentos en esa posición o posteriores.
+    """
+    fac_cxc, pag_cxc, fac_cxp, pag_cxp = {}, {}, {}, {}
+    todas_cuentas_ids = cuentas_cxc_ids | cuentas_cxp_ids
+    if not todas_cuentas_ids:
+        return fac_cxc, pag_cxc, fac_cxp, pag_cxp
+
+    query = db.query(
+        models_doc.id, models_doc.fecha, models_doc.numero, models_doc.unidad_ph_id, models_tipo.codigo,
+        models_mov.cuenta_id, models_mov.concepto, models_mov.debito, models_mov.credito
+    ).join(
+        models_mov, models_mov.documento_id == models_doc.id
+    ).outerjoin(
+        models_tipo, models_doc.tipo_documento_id == models_tipo.id
+    ).filter(
+        models_doc.empresa_id == empresa_id,
+        models_doc.anulado == False,
+        condicion,
+        models_mov.cuenta_id.in_(list(todas_cuentas_ids))
+    )
+    if desde is not None:
+        query = query.filter(_desde_posicion(models_doc, desde))
+
+    docs = {}
+    for row in query.order_by(models_doc.fecha, models_doc.id, models_mov.id).all():
+        d = docs.get(row[0])
+        if d is None:
+            d = docs[row[0]] = _DocCartera(row[0], row[1], row[2], row[3], row[4])
+        debito = row.debito or 0
+        credito = row.credito or 0
+
+        # ── CARTERA (CXC) ──
+        if row.cuenta_id in cuentas_cxc_ids:
+            if debito > 0:
+                if d.id not in fac_cxc:
+                    fac_cxc[d.id] = {'doc': d, 'saldo': 0.0, 'saldo_x_cid': {}}
+                monto = float(debito)
+                fac_cxc[d.id]['saldo'] += monto
+                # Desglose por concepto (usando texto del débito)
+                co = identificar_concepto_ph(row.concepto, conceptos_ph)
+                cid = co.id if co else 0
+                sxc = fac_cxc[d.id]['saldo_x_cid']
+                sxc[cid] = sxc.get(cid, 0.0) + monto
+
+            elif credito > 0:
+                if d.id not in pag_cxc:
+                    pag_cxc[d.id] = {'doc': d, 'monto': 0.0, 'movs': []}
+                pag_cxc[d.id]['monto'] += float(credito)
+                pag_cxc[d.id]['movs'].append(row)
+
+        # ── PROVEEDORES (CXP) ──
+        elif row.cuenta_id in cuentas_cxp_ids:
+            if credito > 0:
+                if d.id not in fac_cxp:
+                    fac_cxp[d.id] = {'doc': d, 'saldo': 0.0}
+                fac_cxp[d.id]['saldo'] += float(credito)
+            elif debito > 0:
+                if d.id not in pag_cxp:
+                    pag_cxp[d.id] = {'doc': d, 'monto': 0.0}
+                pag_cxp[d.id]['monto'] += float(debito)
+
+    return fac_cxc, pag_cxc, fac_cxp, pag_cxp
+
+
+def _nuevo_detalle():
+    """
+    Acumulador opcional del cruce para persistir su estado en AplicacionPago:
+      - alcances: {pago_id: posición (fecha, id) de la última factura que
+        examinó, o None si el pago no se agotó (recorrió todas las facturas)},
+      - conceptos: {(factura_id, pago_id): {concepto_id: valor}} con lo que se
+        descontó del saldo por concepto de la factura.
+    """
+    return {'alcances': {}, 'conceptos': {}}
+
+
+def _fusionar_alcance(alcances, pago_id, alcance):
+    previo = alcances.get(pago_id, ())
+    alcances[pago_id] = None if previo is None or alcance is None else max(previo, alcance)
+
+
+def _cruzar_cxc(facturas_cxc, pagos_cxc, conceptos_ph, tercero_id, detalle=None) -> Dict[tuple, float]:
+    """
+    Cruce FIFO de cartera: pagos dirigidos por concepto primero, luego el monto
+    genérico siguiendo la jerarquía de conceptos (misma unidad y después otras).
+    Modifica los saldos de `facturas_cxc` y retorna {(factura_id, pago_id): valor}.
+    Con `detalle` (ver _nuevo_detalle) registra además alcance y conceptos.
+    """
+    aplicaciones = {}
+
+    # ─────────────────────────────────────────────────────────────────────
+    # pending_aplica: acumulador antes de persistir.
+    # Clave (fac_id, pag_id) → monto_total garantiza
+    # UN SOLO AplicacionPago por par, aunque pasen múltiples conceptos.
+    # ─────────────────────────────────────────────────────────────────────
+    pending_aplica = {}
+    pending_conceptos = {}
+    # Alcance del pago en curso: () sin facturas examinadas, None si no se agotó
+    alcance = {'pago': ()}
+
+    def apply_fifo(facturas, valor_restante, p_doc_id,
+                   solo_unidad_id=None, concepto_id=None):
+        ultima = None
+        for fac in facturas:
+            if valor_restante <= 0.01:
+                break
+            f_doc = fac['doc']
+
+            # Filtrar por unidad si es necesario
+            if solo_unidad_id and f_doc.unidad_ph_id != solo_unidad_id:
+                continue
+
+            if fac['saldo'] <= 0.01:
+                continue
+
+            if concepto_id is not None:
+                sxc = fac.get('saldo_x_cid', {})
+                monto_concepto = sxc.get(concepto_id, 0.0)
+                if monto_concepto <= 0.01:
+                    continue
+                aplicar = min(valor_restante, monto_concepto, fac['saldo'])
+                c_nom = next((c.nombre for c in conceptos_ph if c.id == concepto_id), "ID:"+str(concepto_id))
+                print(f"       [ESPIA FIFO] Pago -> Factura {f_doc.numero} [{c_nom}]: Aplicando {aplicar}")
+            else:
+                aplicar = min(valor_restante, fac['saldo'])
+                print(f"       [ESPIA FIFO] Pago -> Factura {f_doc.numero} [GENERICO]: Aplicando {aplicar}")
+
+            if aplicar <= 0.01:
+                continue
+
+            # Acumular — no crear DB record todavía
+            key = (f_doc.id, p_doc_id)
+            pending_aplica[key] = pending_aplica.get(key, 0.0) + aplicar
+            ultima = (f_doc.fecha, f_doc.id)
+
+            fac['saldo'] -= aplicar
+            valor_restante -= aplicar
+            if concepto_id is not None and 'saldo_x_cid' in fac:
+                fac['saldo_x_cid'][concepto_id] = max(
+                    0.0, fac['saldo_x_cid'].get(concepto_id, 0.0) - aplicar
+                )
+                por_concepto = pending_conceptos.setdefault(key, {})
+                por_concepto[concepto_id] = por_concepto.get(concepto_id, 0.0) + aplicar
+
+        # Un pago agotado solo vio las facturas hasta la última que tocó;
+        # si sobra valor, cualquier factura pudo haberlo recibido.
+        if valor_restante > 0.01:
+            alcance['pago'] = None
+        elif ultima is not None and alcance['pago'] is not None:
+            alcance['pago'] = max(alcance['pago'], ultima)
+        return valor_restante
+
+    print(f"\n[ESPIA CARTERA] Iniciando cruce CXC para Tercero ID: {tercero_id}")
+    print(f"[ESPIA CARTERA] Facturas encontradas: {len(facturas_cxc)}, Pagos encontrados: {len(pagos_cxc)}")
+
+    for pag in pagos_cxc:
+        valor_pago = pag['monto']
+        pago_doc   = pag['doc']
+        movs_pago  = pag.get('movs', [])
+
+        print(f"\n---> [ESPIA] Procesando PAGO: {pago_doc.tipo_codigo}-{pago_doc.numero} (Monto: {valor_pago})")
+
+        # Limpiar acumulador para este pago
+        pending_aplica.clear()
+        pending_conceptos.clear()
+        alcance['pago'] = ()
+
+        # ── IDENTIFICACIÓN DE CONCEPTOS DIRIGIDOS ──
+        intentos_pago = [] # List[(concepto_id, monto)]
+        monto_generico = 0
+
+        for mv in movs_pago:
+            txt = pnorm_ph(mv.concepto or '')
+            print(f"     [ESPIA] Analizando Movimiento: '{mv.concepto}' (Credito: {mv.credito})")
+
+            # Si el texto es genérico, ignoramos identificación específica
+            if any(pnorm_ph(g) in txt for g in TEXTOS_GENERICOS):
+                print(f"     [ESPIA]   - Es un texto GENERICO. Se suma a monto_generico.")
+                monto_generico += float(mv.credito)
+                continue
+
+            co = identificar_concepto_ph(mv.concepto, conceptos_ph)
+            if co:
+                print(f"     [ESPIA]   - Concepto IDENTIFICADO: {co.nombre} (ID: {co.id})")
+                intentos_pago.append((co.id, float(mv.credito)))
+            else:
+                print(f"     [ESPIA]   - NO se identificó concepto. Se suma a monto_generico.")
+                monto_generico += float(mv.credito)
+
+        print(f"     [ESPIA] Resultado ID: {len(intentos_pago)} dirigidos, Generico: {monto_generico}")
+
+        # 1. Aplicar montos DIRIGIDOS primero
+        for cid, monto in intentos_pago:
+            if monto <= 0: continue
+            # Buscamos el nombre del concepto para el log
+            c_nom = next((c.nombre for c in conceptos_ph if c.id == cid), "ID:"+str(cid))
+            print(f"     [ESPIA] APLICANDO DIRIGIDO -> Concepto: {c_nom}, Monto: {monto}")
+
+            restante_dirigido = apply_fifo(facturas_cxc, monto, pago_doc.id,
+                                           solo_unidad_id=pago_doc.unidad_ph_id,
+                                           concepto_id=cid)
+
+            print(f"     [ESPIA]   - Restante tras aplicar dirigido: {restante_dirigido}")
+            # ¡OJO! Ya NO movemos el restante dirigido a monto_generico.
+            # Si el usuario dijo "esto es para Pintura", el sobrante se queda quieto como anticipo.
+
+        # 2. Aplicar monto GENÉRICO siguiendo jerarquía
+        if monto_generico > 0.01:
+            print(f"     [ESPIA] APLICANDO GENERICO (FIFO) -> Monto: {monto_generico}")
+            jerarquia = [cp.id for cp in conceptos_ph] + [None]
+
+            # A. Misma Unidad (Jerarquía)
+            if pago_doc.unidad_ph_id:
+                for cid in jerarquia:
+                    if monto_generico <= 0.01: break
+                    c_nom = next((c.nombre for c in conceptos_ph if c.id == cid), "ANTICIPO")
+
+                    antes = monto_generico
+                    monto_generico = apply_fifo(
+                        facturas_cxc, monto_generico, pago_doc.id,
+                        solo_unidad_id=pago_doc.unidad_ph_id,
+                        concepto_id=cid)
+
+                    if antes != monto_generico:
+                        print(f"     [ESPIA]   - Aplicado a {c_nom}: {antes - monto_generico}")
+
+            # B. Otras Unidades (Fallback)
+            if monto_generico > 0.01:
+                print(f"     [ESPIA]   - Aplicando remanente {monto_generico} a otras unidades...")
+                for cid in jerarquia:
+                    if monto_generico <= 0.01: break
+                    monto_generico = apply_fifo(
+                        facturas_cxc, monto_generico, pago_doc.id,
+                        concepto_id=cid)
+
+        # UN solo AplicacionPago por par (factura, pago)
+        for key, total in pending_aplica.items():
+            if total > 0:
+                aplicaciones[key] = aplicaciones.get(key, 0.0) + total
+        if detalle is not None:
+            _fusionar_alcance(detalle['alcances'], pago_doc.id, alcance['pago'])
+            for key, por_concepto in pending_conceptos.items():
+                destino = detalle['conceptos'].setdefault(key, {})
+                for cid, valor in por_concepto.items():
+                    destino[cid] = destino.get(cid, 0.0) + valor
+
+    return aplicaciones
+
+
+def _cruzar_cxp(facturas_cxp, pagos_cxp, aplicaciones: Dict[tuple, float], detalle=None) -> Dict[tuple, float]:
+    """Cruce FIFO simple de proveedores; agrega sus pares a `aplicaciones`."""
+    for pago_data in pagos_cxp:
+        valor_pago = pago_data['monto']
+        ultima = ()
+        for fac_data in facturas_cxp:
+            if valor_pago <= 0:
+                break
+            if fac_data['saldo'] <= 0:
+                continue
+            valor_a_aplicar = min(valor_pago, fac_data['saldo'])
+            key = (fac_data['doc'].id, pago_data['doc'].id)
+            aplicaciones[key] = aplicaciones.get(key, 0.0) + valor_a_aplicar
+            fac_data['saldo'] -= valor_a_aplicar
+            valor_pago -= valor_a_aplicar
+            ultima = (fac_data['doc'].fecha, fac_data['doc'].id)
+        if detalle is not None:
+            _fusionar_alcance(detalle['alcances'], pago_data['doc'].id, None if valor_pago > 0 else ultima)
+    return aplicaciones
+
+
+def _ordenar_fifo(items):
+    return sorted(items, key=lambda x: (x['doc'].fecha, x['doc'].id))
+
+
+def _columnas_aplicacion():
+    return (
+        models_aplica.id, models_aplica.documento_factura_id, models_aplica.documento_pago_id,
+        models_aplica.valor_aplicado, models_aplica.alcance_fecha, models_aplica.alcance_documento_id,
+        models_aplica.valor_por_concepto
+    )
+
+
+def _estado_cruce(detalle, key) -> Dict[str, Any]:
+    alcance = detalle['alcances'].get(key[1])
+    return {
+        'alcance_fecha': alcance[0] if alcance else None,
+        'alcance_documento_id': alcance[1] if alcance else None,
+        'valor_por_concepto': {str(cid): valor for cid, valor in detalle['conceptos'].get(key, {}).items()},
+    }
+
+
+def _sincronizar_aplicaciones(db: Session, empresa_id: int, existentes, objetivo: Dict[tuple, float],
+                              detalle) -> Dict[str, int]:
+    """
+    Lleva las aplicaciones existentes (filas de _columnas_aplicacion) al
+    resultado objetivo, con el estado del cruce de `detalle`, escribiendo solo
+    las diferencias.
+    """
+    conservadas = {}
+    borrar_ids = []
+    actualizar = []
+    for row in existentes:
+        key = (row.documento_factura_id, row.documento_pago_id)
+        if key not in objetivo or key in conservadas:
+            borrar_ids.append(row.id)
+            continue
+        conservadas[key] = row
+        estado = _estado_cruce(detalle, key)
+        if (abs(float(row.valor_aplicado) - objetivo[key]) >= 0.005
+                or any(getattr(row, columna) != valor for columna, valor in estado.items())):
+            actualizar.append({'id': row.id, 'valor_aplicado': objetivo[key], **estado})
+
+    if borrar_ids:
+        for i in range(0, len(borrar_ids), 1000):
+            db.query(models_aplica).filter(
+                models_aplica.id.in_(borrar_ids[i:i + 1000])
+            ).delete(synchronize_session=False)
+    if actualizar:
+        db.bulk_update_mappings(models_aplica, actualizar)
+
+    nuevas = [
+        models_aplica(
+            documento_factura_id=fac_id,
+            documento_pago_id=pag_id,
+            valor_aplicado=total,
+            empresa_id=empresa_id,
+            **_estado_cruce(detalle, (fac_id, pag_id))
         )
+        for (fac_id, pag_id), total in objetivo.items()
+        if (fac_id, pag_id) not in conservadas
+    ]
+    if nuevas:
+        db.add_all(nuevas)
 
-        # IDs de docs donde el tercero está en un MOVIMIENTO sobre cuentas CXC/CXP
-        ids_por_movimiento = select(models_mov.documento_id).where(
-            models_mov.tercero_id == tercero_id,
-            models_mov.cuenta_id.in_(todas_cuentas_ids) if todas_cuentas_ids else False
-        ).join(models_doc, models_mov.documento_id == models_doc.id).where(
-            models_doc.empresa_id == empresa_id
+    return {"insertadas": len(nuevas), "actualizadas": len(actualizar), "eliminadas": len(borrar_ids)}
+
+
+def _cargar_conceptos_ph(db: Session, empresa_id: int, injected_conceptos_ph=None):
+    if injected_conceptos_ph is not None:
+        return injected_conceptos_ph
+    return db.query(models_ph_concepto).filter(
+        models_ph_concepto.empresa_id == empresa_id,
+        models_ph_concepto.activo == True
+    ).order_by(func.coalesce(models_ph_concepto.orden, 999).asc(), models_ph_concepto.id.asc()).all()
+
+
+# Pista de un documento ya eliminado: su posición en la línea de tiempo,
+# capturada antes de borrarlo (sus aplicaciones se van con él).
+PistaEliminado = namedtuple("PistaEliminado", "fecha id")
+
+# Resultado de _posicion_recalculo_acotado cuando la pista no permite acotar
+_RECALCULO_COMPLETO = object()
+
+_TAMANO_CONSULTA_IDS = 1000
+
+
+def _orden_pista(pista):
+    return (1, tuple(pista)) if isinstance(pista, PistaEliminado) else (0, pista)
+
+
+def _condiciones_rol(cuentas_cxc_ids, cuentas_cxp_ids):
+    """Condiciones de movimiento que hacen de un documento factura y pago, como en _cargar_linea_tiempo."""
+    es_cxc = models_mov.cuenta_id.in_(list(cuentas_cxc_ids or [0]))
+    es_cxp = and_(models_mov.cuenta_id.in_(list(cuentas_cxp_ids or [0])), ~es_cxc)
+    factura = or_(and_(es_cxc, models_mov.debito > 0), and_(es_cxp, models_mov.credito > 0))
+    pago = or_(
+        and_(es_cxc, or_(models_mov.debito == None, models_mov.debito <= 0), models_mov.credito > 0),
+        and_(es_cxp, or_(models_mov.credito == None, models_mov.credito <= 0), models_mov.debito > 0)
+    )
+    return factura, pago
+
+
+def _primer_pago_alcanzado(db: Session, tercero_id: int, empresa_id: int, posicion,
+                           cuentas_cxc_ids, cuentas_cxp_ids):
+    """
+    Posición del primer pago del tercero que pudo ver una factura en `posicion`:
+    su alcance guardado llega hasta ella, no se conoce, o el pago no tiene
+    aplicaciones (quedó como anticipo). Los pagos anteriores se agotaron antes
+    de esa factura y no cambian si ella cambia. None si no hay ninguno.
+    """
+    todas_cuentas_ids = list(cuentas_cxc_ids | cuentas_cxp_ids)
+    fecha, doc_id = posicion
+    pago = aliased(models_doc)
+
+    con_aplicaciones = db.query(pago.fecha, pago.id).join(
+        models_aplica, models_aplica.documento_pago_id == pago.id
+    ).filter(
+        pago.empresa_id == empresa_id,
+        pago.anulado == False,
+        _condicion_documentos_tercero(pago, tercero_id, empresa_id, todas_cuentas_ids),
+        or_(
+            models_aplica.alcance_fecha == None,
+            models_aplica.alcance_documento_id == None,
+            models_aplica.alcance_fecha > fecha,
+            and_(models_aplica.alcance_fecha == fecha, models_aplica.alcance_documento_id >= doc_id)
         )
+    ).order_by(pago.fecha, pago.id).first()
 
-        # UNIÓN de ambos conjuntos para obtener todos los IDs relevantes
-        todos_ids_subquery = select(models_doc.id).where(
-            models_doc.empresa_id == empresa_id,
-            or_(
-                models_doc.beneficiario_id == tercero_id,
-                models_doc.id.in_(ids_por_movimiento)
-            )
-        ).scalar_subquery()
+    _, es_pago = _condiciones_rol(cuentas_cxc_ids, cuentas_cxp_ids)
+    sin_aplicaciones = db.query(models_doc.fecha, models_doc.id).join(
+        models_mov, models_mov.documento_id == models_doc.id
+    ).filter(
+        models_doc.empresa_id == empresa_id,
+        models_doc.anulado == False,
+        _condicion_documentos_tercero(models_doc, tercero_id, empresa_id, todas_cuentas_ids),
+        es_pago,
+        ~select(models_aplica.id).where(models_aplica.documento_pago_id == models_doc.id).exists()
+    ).order_by(models_doc.fecha, models_doc.id).first()
 
-        # Eliminar aplicaciones existentes de TODOS los documentos relevantes
-        db.query(models_aplica).where(
-            or_(
-                models_aplica.documento_factura_id.in_(todos_ids_subquery),
-                models_aplica.documento_pago_id.in_(todos_ids_subquery)
-            )
-        ).delete(synchronize_session=False)
+    candidatos = [tuple(p) for p in (con_aplicaciones, sin_aplicaciones) if p is not None]
+    return min(candidatos) if candidatos else None
 
-        # Cargar documentos usando la condición extendida
-        documentos_potenciales = db.query(models_doc).options(
-            joinedload(models_doc.tipo_documento),
-            selectinload(models_doc.movimientos)
+
+def _posicion_recalculo_acotado(db: Session, tercero_id: int, empresa_id: int, pista,
+                                cuentas_cxc_ids, cuentas_cxp_ids):
+    """
+    Primera posición (fecha, id) de la línea de tiempo cuyo cruce cambia por la
+    pista: el id de un documento creado, anulado o modificado sin cambiar de
+    fecha, o un PistaEliminado. Los pagos anteriores conservan sus aplicaciones.
+      - Si el documento es (o fue) un pago, cambian él y los pagos posteriores.
+      - Si es (o fue) una factura, cambian los pagos que la alcanzan (ver
+        _primer_pago_alcanzado). Una factura nueva que ningún pago alcanza no
+        cambia nada.
+    Retorna None si ningún pago cambia y _RECALCULO_COMPLETO si la pista es el
+    id de un documento que ya no existe.
+    """
+    if isinstance(pista, PistaEliminado):
+        posicion, es_factura, es_pago = tuple(pista), True, True
+    else:
+        doc = db.query(models_doc.id, models_doc.fecha).filter(
+            models_doc.id == pista,
+            models_doc.empresa_id == empresa_id
+        ).first()
+        if not doc:
+            return _RECALCULO_COMPLETO
+        posicion = (doc.fecha, doc.id)
+
+        condicion_factura, condicion_pago = _condiciones_rol(cuentas_cxc_ids, cuentas_cxp_ids)
+        roles = db.query(
+            func.max(case((condicion_factura, 1), else_=0)),
+            func.max(case((condicion_pago, 1), else_=0))
         ).filter(
-            models_doc.empresa_id == empresa_id,
-            models_doc.anulado == False,
-            or_(
-                models_doc.beneficiario_id == tercero_id,
-                models_doc.id.in_(ids_por_movimiento)
-            )
-        ).order_by(models_doc.fecha, models_doc.id).all()
+            models_mov.documento_id == pista,
+            models_mov.cuenta_id.in_(list(cuentas_cxc_ids | cuentas_cxp_ids) or [0])
+        ).one()
+        es_factura = bool(roles[0]) or db.query(models_aplica.id).filter(
+            models_aplica.documento_factura_id == pista
+        ).first() is not None
+        es_pago = bool(roles[1]) or db.query(models_aplica.id).filter(
+            models_aplica.documento_pago_id == pista
+        ).first() is not None
+
+    candidatos = [posicion] if es_pago else []
+    if es_factura:
+        alcanzado = _primer_pago_alcanzado(db, tercero_id, empresa_id, posicion, cuentas_cxc_ids, cuentas_cxp_ids)
+        if alcanzado is not None:
+            candidatos.append(alcanzado)
+    return min(candidatos) if candidatos else None
+
+
+def _saldos_por_concepto(db: Session, empresa_id: int, tercero_id: int, desde, facturas_cxc,
+                         cuentas_cxc_ids, todas_cuentas_ids, conceptos_ph) -> bool:
+    """
+    Reconstruye el saldo por concepto de las facturas CXC abiertas al llegar a
+    `desde`: débitos de cada concepto menos lo que los pagos anteriores
+    descontaron de él (AplicacionPago.valor_por_concepto). Retorna False si
+    algún pago anterior no tiene ese desglose guardado.
+    """
+    por_id = {fac['doc'].id: fac for fac in facturas_cxc}
+    ids = list(por_id)
+    pago = aliased(models_doc)
+    for i in range(0, len(ids), _TAMANO_CONSULTA_IDS):
+        bloque = ids[i:i + _TAMANO_CONSULTA_IDS]
+        for doc_id, concepto, debito in db.query(
+            models_mov.documento_id, models_mov.concepto, models_mov.debito
+        ).filter(
+            models_mov.documento_id.in_(bloque),
+            models_mov.cuenta_id.in_(list(cuentas_cxc_ids)),
+            models_mov.debito > 0
+        ).order_by(models_mov.id).all():
+            co = identificar_concepto_ph(concepto, conceptos_ph)
+            cid = co.id if co else 0
+            sxc = por_id[doc_id]['saldo_x_cid']
+            sxc[cid] = sxc.get(cid, 0.0) + float(debito)
+
+        for factura_id, por_concepto in db.query(
+            models_aplica.documento_factura_id, models_aplica.valor_por_concepto
+        ).join(
+            pago, pago.id == models_aplica.documento_pago_id
+        ).filter(
+            models_aplica.documento_factura_id.in_(bloque),
+            pago.empresa_id == empresa_id,
+            pago.anulado == False,
+            _condicion_documentos_tercero(pago, tercero_id, empresa_id, todas_cuentas_ids),
+            ~_desde_posicion(pago, desde)
+        ).all():
+            if por_concepto is None:
+                return False
+            sxc = por_id[factura_id]['saldo_x_cid']
+            for cid, valor in por_concepto.items():
+                cid = int(cid)
+                sxc[cid] = max(0.0, sxc.get(cid, 0.0) - float(valor))
+    return True
+
+
+def _recalculo_acotado(db: Session, tercero_id: int, empresa_id: int, desde,
+                       cuentas_cxc_ids, cuentas_cxp_ids, conceptos_ph):
+    """
+    Recalcula solo los pagos en la posición `desde` o posteriores. Los pagos
+    anteriores conservan sus aplicaciones y el saldo de cada factura se parte de
+    (valor de la factura - lo aplicado por esos pagos), por concepto en PH, que
+    es exactamente el estado que tendría el cruce completo al llegar a `desde`.
+    Retorna None si los datos no permiten el atajo (factura CXC y CXP a la vez,
+    o un pago anterior sin desglose por concepto).
+    """
+    todas_cuentas_ids = list(cuentas_cxc_ids | cuentas_cxp_ids)
+    condicion = _condicion_documentos_tercero(models_doc, tercero_id, empresa_id, todas_cuentas_ids)
+
+    # 1. Valor de cada factura (agregado en la BD, sin cargar movimientos)
+    es_cxc = models_mov.cuenta_id.in_(list(cuentas_cxc_ids or [0]))
+    es_cxp = and_(models_mov.cuenta_id.in_(list(cuentas_cxp_ids or [0])), ~es_cxc)
+    filas_facturas = db.query(
+        models_doc.id, models_doc.fecha, models_doc.numero, models_doc.unidad_ph_id,
+        func.sum(case((and_(es_cxc, models_mov.debito > 0), models_mov.debito), else_=0)).label("total_cxc"),
+        func.sum(case((and_(es_cxp, models_mov.credito > 0), models_mov.credito), else_=0)).label("total_cxp")
+    ).join(
+        models_mov, models_mov.documento_id == models_doc.id
+    ).filter(
+        models_doc.empresa_id == empresa_id,
+        models_doc.anulado == False,
+        condicion,
+        models_mov.cuenta_id.in_(todas_cuentas_ids)
+    ).group_by(
+        models_doc.id, models_doc.fecha, models_doc.numero, models_doc.unidad_ph_id
+    ).all()
 
+    # 2. Lo aplicado a cada factura por los pagos anteriores a `desde` (se conservan)
+    pago = aliased(models_doc)
+    aplicado_previo = dict(db.query(
+        models_aplica.documento_factura_id,
+        func.sum(models_aplica.valor_aplicado)
+    ).join(
+        pago, pago.id == models_aplica.documento_pago_id
+    ).filter(
+        pago.empresa_id == empresa_id,
+        pago.anulado == False,
+        _condicion_documentos_tercero(pago, tercero_id, empresa_id, todas_cuentas_ids),
+        ~_desde_posicion(pago, desde)
+    ).group_by(models_aplica.documento_factura_id).all())
+
+    # Las facturas sin saldo ya no reciben nada: el cruce las salta
+    facturas_cxc, facturas_cxp = [], []
+    for row in filas_facturas:
+        total_cxc = float(row.total_cxc or 0)
+        total_cxp = float(row.total_cxp or 0)
+        if total_cxc > 0 and total_cxp > 0:
+            return None
+        if total_cxc <= 0 and total_cxp <= 0:
+            continue
+        d = _DocCartera(row.id, row.fecha, row.numero, row.unidad_ph_id, None)
+        saldo = (total_cxc or total_cxp) - float(aplicado_previo.get(row.id) or 0)
+        if total_cxc > 0 and saldo > 0.01:
+            facturas_cxc.append({'doc': d, 'saldo': saldo, 'saldo_x_cid': {} if conceptos_ph else {0: total_cxc}})
+        elif total_cxp > 0 and saldo > 0:
+            facturas_cxp.append({'doc': d, 'saldo': saldo})
+
+    if conceptos_ph and facturas_cxc and not _saldos_por_concepto(
+        db, empresa_id, tercero_id, desde, facturas_cxc, cuentas_cxc_ids, todas_cuentas_ids, conceptos_ph
+    ):
+        return None
+
+    # 3. Pagos desde la posición afectada
+    _, pag_cxc, _, pag_cxp = _cargar_linea_tiempo(
+        db, empresa_id, condicion, cuentas_cxc_ids, cuentas_cxp_ids, conceptos_ph, desde=desde
+    )
 
-        # Cargar conceptos PH para identificación por texto
-        if injected_conceptos_ph is not None:
-            conceptos_ph = injected_conceptos_ph
-        else:
-            conceptos_ph = db.query(models_ph_concepto).filter(
-                models_ph_concepto.empresa_id == empresa_id,
-                models_ph_concepto.activo == True
-            ).order_by(func.coalesce(models_ph_concepto.orden, 999).asc(), models_ph_concepto.id.asc()).all()
-        
-        # Log para debug en producción
-        nombres_c = [f"{c.nombre} (ID:{c.id}, Ord:{c.orden})" for c in conceptos_ph]
-        print(f"[ESPIA CARTERA] Jerarquia Activa: {nombres_c}")
+    detalle = _nuevo_detalle()
+    aplicaciones = _cruzar_cxc(_ordenar_fifo(facturas_cxc), _ordenar_fifo(pag_cxc.values()), conceptos_ph, tercero_id, detalle)
+    _cruzar_cxp(_ordenar_fifo(facturas_cxp), _ordenar_fifo(pag_cxp.values()), aplicaciones, detalle)
 
-        fac_cxc = {}   # doc_id -> {'doc': doc, 'saldo': float, 'saldo_x_cid': {cid: float}}
-        pag_cxc = {}   # doc_id -> {'doc': doc, 'monto': float, 'movs': [mov, ...]}
-        fac_cxp = {}   # doc_id -> {'doc': doc, 'saldo': float}
-        pag_cxp = {}   # doc_id -> {'doc': doc, 'monto': float}
-
-        for d in documentos_potenciales:
-            for mov in d.movimientos:
-                # ── CARTERA (CXC) ──
-                if mov.cuenta_id in cuentas_cxc_ids:
-                    if mov.debito > 0:
-                        if d.id not in fac_cxc:
-                            fac_cxc[d.id] = {'doc': d, 'saldo': 0.0, 'saldo_x_cid': {}}
-                        monto = float(mov.debito)
-                        fac_cxc[d.id]['saldo'] += monto
-                        # Desglose por concepto (usando texto del débito)
-                        co = identificar_concepto_ph(mov.concepto, conceptos_ph)
-                        cid = co.id if co else 0
-                        sxc = fac_cxc[d.id]['saldo_x_cid']
-                        sxc[cid] = sxc.get(cid, 0.0) + monto
-
-                    elif mov.credito > 0:
-                        if d.id not in pag_cxc:
-                            pag_cxc[d.id] = {'doc': d, 'monto': 0.0, 'movs': []}
-                        pag_cxc[d.id]['monto'] += float(mov.credito)
-                        pag_cxc[d.id]['movs'].append(mov)
-
-                # ── PROVEEDORES (CXP) ──
-                elif mov.cuenta_id in cuentas_cxp_ids:
-                    if mov.credito > 0:
-                        if d.id not in fac_cxp:
-                            fac_cxp[d.id] = {'doc': d, 'saldo': 0.0}
-                        fac_cxp[d.id]['saldo'] += float(mov.credito)
-                    elif mov.debito > 0:
-                        if d.id not in pag_cxp:
-                            pag_cxp[d.id] = {'doc': d, 'monto': 0.0}
-                        pag_cxp[d.id]['monto'] += float(mov.debito)
-
-        # Listas ordenadas FIFO
-        facturas_cxc = sorted(fac_cxc.values(), key=lambda x: (x['doc'].fecha, x['doc'].id))
-        pagos_cxc    = sorted(pag_cxc.values(), key=lambda x: (x['doc'].fecha, x['doc'].id))
-        facturas_cxp = sorted(fac_cxp.values(), key=lambda x: (x['doc'].fecha, x['doc'].id))
-        pagos_cxp    = sorted(pag_cxp.values(), key=lambda x: (x['doc'].fecha, x['doc'].id))
-
-        # ─────────────────────────────────────────────────────────────────────
-        # pending_aplica: acumulador antes de persistir.
-        # Clave (fac_id, pag_id) → monto_total garantiza
-        # UN SOLO AplicacionPago por par, aunque pasen múltiples conceptos.
-        # ─────────────────────────────────────────────────────────────────────
-        pending_aplica = {}
-
-        def apply_fifo(facturas, valor_restante, p_doc_id,
-                       solo_unidad_id=None, concepto_id=None):
-            for fac in facturas:
-                if valor_restante <= 0.01:
-                    break
-                f_doc = fac['doc']
-                
-                # Filtrar por unidad si es necesario
-                if solo_unidad_id and f_doc.unidad_ph_id != solo_unidad_id:
-                    continue
-                
-                if fac['saldo'] <= 0.01:
-                    continue
+    # 4. Aplicaciones a reemplazar: las de pagos anulados o en/después de `desde`
+    existentes = db.query(*_columnas_aplicacion()).join(
+        pago, pago.id == models_aplica.documento_pago_id
+    ).filter(
+        pago.empresa_id == empresa_id,
+        _condicion_documentos_tercero(pago, tercero_id, empresa_id, todas_cuentas_ids),
+        or_(pago.anulado == True, _desde_posicion(pago, desde))
+    ).all()
 
-                if concepto_id is not None:
-                    sxc = fac.get('saldo_x_cid', {})
-                    monto_concepto = sxc.get(concepto_id, 0.0)
-                    if monto_concepto <= 0.01:
-                        continue
-                    aplicar = min(valor_restante, monto_concepto, fac['saldo'])
-                    c_nom = next((c.nombre for c in conceptos_ph if c.id == concepto_id), "ID:"+str(concepto_id))
-                    print(f"       [ESPIA FIFO] Pago -> Factura {f_doc.numero} [{c_nom}]: Aplicando {aplicar}")
-                else:
-                    aplicar = min(valor_restante, fac['saldo'])
-                    print(f"       [ESPIA FIFO] Pago -> Factura {f_doc.numero} [GENERICO]: Aplicando {aplicar}")
+    return _sincronizar_aplicaciones(db, empresa_id, existentes, aplicaciones, detalle)
 
-                if aplicar <= 0.01:
-                    continue
 
-                # Acumular — no crear DB record todavía
-                key = (f_doc.id, p_doc_id)
-                pending_aplica[key] = pending_aplica.get(key, 0.0) + aplicar
+def _recalculo_completo(db: Session, tercero_id: int, empresa_id: int,
+                        cuentas_cxc_ids, cuentas_cxp_ids, conceptos_ph):
+    todas_cuentas_ids = list(cuentas_cxc_ids | cuentas_cxp_ids)
+    condicion = _condicion_documentos_tercero(models_doc, tercero_id, empresa_id, todas_cuentas_ids)
 
-                fac['saldo'] -= aplicar
-                valor_restante -= aplicar
-                if concepto_id is not None and 'saldo_x_cid' in fac:
-                    fac['saldo_x_cid'][concepto_id] = max(
-                        0.0, fac['saldo_x_cid'].get(concepto_id, 0.0) - aplicar
-                    )
-            return valor_restante
+    fac_cxc, pag_cxc, fac_cxp, pag_cxp = _cargar_linea_tiempo(
+        db, empresa_id, condicion, cuentas_cxc_ids, cuentas_cxp_ids, conceptos_ph
+    )
 
-        # ============================================================
-        # CRUCE CXC
-        # ============================================================
-        TEXTOS_GENERICOS = ('CARTERA PH', 'ABONO PH', 'RECAUDO PH', 'ANTICIPO', 'SALDO EXCEDENTE')
+    # Listas ordenadas FIFO
+    detalle = _nuevo_detalle()
+    aplicaciones = _cruzar_cxc(_ordenar_fifo(fac_cxc.values()), _ordenar_fifo(pag_cxc.values()), conceptos_ph, tercero_id, detalle)
+    _cruzar_cxp(_ordenar_fifo(fac_cxp.values()), _ordenar_fifo(pag_cxp.values()), aplicaciones, detalle)
 
-        print(f"\n[ESPIA CARTERA] Iniciando cruce CXC para Tercero ID: {tercero_id}")
-        print(f"[ESPIA CARTERA] Facturas encontradas: {len(facturas_cxc)}, Pagos encontrados: {len(pagos_cxc)}")
+    # Aplicaciones existentes de TODOS los documentos relevantes (incluye anulados)
+    todos_ids_subquery = select(models_doc.id).where(
+        models_doc.empresa_id == empresa_id,
+        condicion
+    ).scalar_subquery()
+    existentes = db.query(*_columnas_aplicacion()).filter(
+        or_(
+            models_aplica.documento_factura_id.in_(todos_ids_subquery),
+            models_aplica.documento_pago_id.in_(todos_ids_subquery)
+        )
+    ).all()
 
-        for pag in pagos_cxc:
-            valor_pago = pag['monto']
-            pago_doc   = pag['doc']
-            movs_pago  = pag.get('movs', [])
+    return _sincronizar_aplicaciones(db, empresa_id, existentes, aplicaciones, detalle)
 
-            print(f"\n---> [ESPIA] Procesando PAGO: {pago_doc.tipo_documento.codigo}-{pago_doc.numero} (Monto: {valor_pago})")
 
-            # Limpiar acumulador para este pago
-            pending_aplica.clear()
+def recalcular_aplicaciones_tercero(db: Session, tercero_id: int, empresa_id: int, commit: bool = True,
+                                    injected_cuentas_cxc=None, injected_cuentas_cxp=None, injected_conceptos_ph=None,
+                                    documento_id=None):
+    """
+    Recalcula el cruce FIFO de facturas y pagos (CXC y CXP) del tercero.
+
+    Si se indica `documento_id` (el documento que acaba de crearse, anularse o
+    modificarse sin cambiar de fecha, o un PistaEliminado si se eliminó) solo
+    se recalculan los pagos desde la primera posición afectada (ver
+    _posicion_recalculo_acotado): un pago al final es apenas su delta y una
+    factura nueva que ningún pago alcanza no recalcula nada. En PH el saldo por
+    concepto se reconstruye desde AplicacionPago. En todos los casos solo se
+    escriben las aplicaciones que cambian y el resultado es el mismo del
+    recálculo completo. `documento_id` también acepta varias pistas: se
+    recalcula desde la más antigua.
+
+    Dentro de un lote con recálculo diferido (ver cola_cartera) solo se marca
+    el tercero y el recálculo real ocurre una vez al cerrar el lote.
+    """
+    from app.services import cola_cartera
+    cola = cola_cartera.cola_activa(db, empresa_id)
+    if cola is not None:
+        cola.marcar(tercero_id, documento_id)
+        return {"status": "diferido", "message": "Recálculo de cartera diferido al cierre del lote.", "modo": "diferido"}
 
-            # ── IDENTIFICACIÓN DE CONCEPTOS DIRIGIDOS ──
-            intentos_pago = [] # List[(concepto_id, monto)]
-            monto_generico = 0
-            
-            for mv in movs_pago:
-                txt = pnorm_ph(mv.concepto or '')
-                print(f"     [ESPIA] Analizando Movimiento: '{mv.concepto}' (Credito: {mv.credito})")
-                
-                # Si el texto es genérico, ignoramos identificación específica
-                if any(pnorm_ph(g) in txt for g in TEXTOS_GENERICOS):
-                    print(f"     [ESPIA]   - Es un texto GENERICO. Se suma a monto_generico.")
-                    monto_generico += float(mv.credito)
-                    continue
-                
-                co = identificar_concepto_ph(mv.concepto, conceptos_ph)
-                if co:
-                    print(f"     [ESPIA]   - Concepto IDENTIFICADO: {co.nombre} (ID: {co.id})")
-                    intentos_pago.append((co.id, float(mv.credito)))
+    # CORRECCIÓN CRÍTICA: Buscamos documentos donde el tercero aparece en el encabezado
+    # O en los movimientos contables de las cuentas CXC/CXP (el caso de los CE/RC).
+    try:
+        cuentas_cxc_ids = set(injected_cuentas_cxc if injected_cuentas_cxc is not None else get_cuentas_especiales_ids(db, empresa_id, 'cxc'))
+        cuentas_cxp_ids = set(injected_cuentas_cxp if injected_cuentas_cxp is not None else get_cuentas_especiales_ids(db, empresa_id, 'cxp'))
+
+        # Cargar conceptos PH para identificación por texto
+        conceptos_ph = _cargar_conceptos_ph(db, empresa_id, injected_conceptos_ph)
+
+        # Log para debug en producción
+        nombres_c = [f"{c.nombre} (ID:{c.id}, Ord:{c.orden})" for c in conceptos_ph]
+        print(f"[ESPIA CARTERA] Jerarquia Activa: {nombres_c}")
+
+        resultado = None
+        modo = "completo"
+        if documento_id is not None:
+            pistas = [documento_id] if isinstance(documento_id, (int, PistaEliminado)) else list(documento_id)
+            posiciones = [
+                _posicion_recalculo_acotado(db, tercero_id, empresa_id, pista, cuentas_cxc_ids, cuentas_cxp_ids)
+                for pista in pistas
+            ]
+            if pistas and _RECALCULO_COMPLETO not in posiciones:
+                afectadas = [p for p in posiciones if p is not None]
+                if afectadas:
+                    resultado = _recalculo_acotado(
+                        db, tercero_id, empresa_id, min(afectadas), cuentas_cxc_ids, cuentas_cxp_ids, conceptos_ph
+                    )
                 else:
-                    print(f"     [ESPIA]   - NO se identificó concepto. Se suma a monto_generico.")
-                    monto_generico += float(mv.credito)
-
-            print(f"     [ESPIA] Resultado ID: {len(intentos_pago)} dirigidos, Generico: {monto_generico}")
-
-            # 1. Aplicar montos DIRIGIDOS primero
-            for cid, monto in intentos_pago:
-                if monto <= 0: continue
-                # Buscamos el nombre del concepto para el log
-                c_nom = next((c.nombre for c in conceptos_ph if c.id == cid), "ID:"+str(cid))
-                print(f"     [ESPIA] APLICANDO DIRIGIDO -> Concepto: {c_nom}, Monto: {monto}")
-                
-                restante_dirigido = apply_fifo(facturas_cxc, monto, pago_doc.id,
-                                               solo_unidad_id=pago_doc.unidad_ph_id,
-                                               concepto_id=cid)
-                
-                print(f"     [ESPIA]   - Restante tras aplicar dirigido: {restante_dirigido}")
-                # ¡OJO! Ya NO movemos el restante dirigido a monto_generico.
-                # Si el usuario dijo "esto es para Pintura", el sobrante se queda quieto como anticipo.
-                # if restante_dirigido > 0.01:
-                #    monto_generico += restante_dirigido
-                #    print(f"     [ESPIA]   - Sobrante {restante_dirigido} movido a monto_generico.")
-
-            # 2. Aplicar monto GENÉRICO siguiendo jerarquía
-            if monto_generico > 0.01:
-                print(f"     [ESPIA] APLICANDO GENERICO (FIFO) -> Monto: {monto_generico}")
-                jerarquia = [cp.id for cp in conceptos_ph] + [None]
-                
-                # A. Misma Unidad (Jerarquía)
-                if pago_doc.unidad_ph_id:
-                    for cid in jerarquia:
-                        if monto_generico <= 0.01: break
-                        c_nom = next((c.nombre for c in conceptos_ph if c.id == cid), "ANTICIPO")
-                        
-                        antes = monto_generico
-                        monto_generico = apply_fifo(
-                            facturas_cxc, monto_generico, pago_doc.id,
-                            solo_unidad_id=pago_doc.unidad_ph_id,
-                            concepto_id=cid)
-                        
-                        if antes != monto_generico:
-                            print(f"     [ESPIA]   - Aplicado a {c_nom}: {antes - monto_generico}")
-
-                # B. Otras Unidades (Fallback)
-                if monto_generico > 0.01:
-                    print(f"     [ESPIA]   - Aplicando remanente {monto_generico} a otras unidades...")
-                    for cid in jerarquia:
-                        if monto_generico <= 0.01: break
-                        monto_generico = apply_fifo(
-                            facturas_cxc, monto_generico, pago_doc.id,
-                            concepto_id=cid)
-
-            # ── Persistir UN solo AplicacionPago por par (factura, pago) ──
-            for (fac_id, pag_id), total in pending_aplica.items():
-                if total > 0:
-                    db.add(models_aplica(
-                        documento_factura_id=fac_id,
-                        documento_pago_id=pag_id,
-                        valor_aplicado=total,
-                        empresa_id=empresa_id
-                    ))
-
-
-        # ============================================================
-        # CRUCE CXP (FIFO simple, sin cambios)
-        # ============================================================
-        for pago_data in pagos_cxp:
-            valor_pago = pago_data['monto']
-            for fac_data in facturas_cxp:
-                if valor_pago <= 0:
-                    break
-                if fac_data['saldo'] <= 0:
-                    continue
-                valor_a_aplicar = min(valor_pago, fac_data['saldo'])
-                db.add(models_aplica(
-                    documento_factura_id=fac_data['doc'].id,
-                    documento_pago_id=pago_data['doc'].id,
-                    valor_aplicado=valor_a_aplicar,
-                    empresa_id=empresa_id
-                ))
-                fac_data['saldo'] -= valor_a_aplicar
-                valor_pago -= valor_a_aplicar
+                    resultado = {"insertadas": 0, "actualizadas": 0, "eliminadas": 0}
+                modo = "incremental"
+        if resultado is None:
+            modo = "completo"
+            resultado = _recalculo_completo(
+                db, tercero_id, empresa_id, cuentas_cxc_ids, cuentas_cxp_ids, conceptos_ph
+            )
+        print(f"[CARTERA] Tercero {tercero_id}: recálculo {modo} {resultado}")
 
         if commit:
             db.commit()
         else:
             db.flush()
-        return {"status": "ok", "message": "Recálculo de cartera y proveedores completado."}
+        return {"status": "ok", "message": "Recálculo de cartera y proveedores completado.", "modo": modo, **resultado}
 
     except Exception as e:
         db.rollback()
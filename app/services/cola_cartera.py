@@ -0,0 +1,299 @@
+"""
+Recálculo diferido y coalescido de cartera (CXC/CXP) para operaciones masivas.
+
+Los procesos por lote (recaudo masivo, pago masivo PH, anulación/eliminación
+masiva, eliminación de facturación PH, importación universal) tocan muchos
+documentos del mismo tercero. Dentro de `recalculo_diferido(...)` cada llamada
+a cartera.recalcular_aplicaciones_tercero solo marca el tercero en la cola; al
+cerrar el lote se recalcula cada tercero UNA sola vez:
+  - con pistas de documento (ids o PistaEliminado) se usa el recálculo acotado
+    desde la posición afectada más antigua; si algún cambio exige el completo,
+    se hace el completo,
+  - en PostgreSQL y con commit=True se reparte entre sesiones en paralelo
+    (settings.CARTERA_RECALCULO_WORKERS); en otro caso es secuencial en la
+    misma sesión (y con commit=False queda dentro de la transacción del caller).
+
+El avance de cada lote queda consultable con get_progreso_lote / listar_lotes
+(endpoint /api/cartera/recalculo-lotes).
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+_CLAVE_COLAS = "colas_cartera"
+_MAX_LOTES_REGISTRADOS = 50
+_MIN_TERCEROS_PARALELO = 20
+_TAMANO_CONSULTA_IDS = 1000
+
+# Copia liviana de PHConcepto: los workers no deben tocar objetos ORM de otra sesión
+_ConceptoPH = namedtuple("_ConceptoPH", "id nombre orden")
+
+# --- REGISTRO DE AVANCE DE LOTES (por proceso) ---
+_lotes: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lotes_lock = threading.Lock()
+
+
+def _registrar_lote(lote_id: str, empresa_id: int, descripcion: str, total: int) -> None:
+    with _lotes_lock:
+        _lotes[lote_id] = {
+            "lote_id": lote_id,
+            "empresa_id": empresa_id,
+            "descripcion": descripcion,
+            "estado": "EN_PROCESO",
+            "total": total,
+            "procesados": 0,
+            "errores": 0,
+            "incrementales": 0,
+            "completos": 0,
+            "workers": 1,
+            "inicio": time.time(),
+            "fin": None,
+        }
+        while len(_lotes) > _MAX_LOTES_REGISTRADOS:
+            _lotes.popitem(last=False)
+
+
+def _actualizar_lote(lote_id: str, **cambios) -> None:
+    with _lotes_lock:
+        lote = _lotes.get(lote_id)
+        if lote is not None:
+            lote.update(cambios)
+
+
+def _avanzar_lote(lote_id: str, modo: Optional[str]) -> None:
+    with _lotes_lock:
+        lote = _lotes.get(lote_id)
+        if lote is None:
+            return
+        lote["procesados"] += 1
+        if modo == "incremental":
+            lote["incrementales"] += 1
+        elif modo == "completo":
+            lote["completos"] += 1
+        else:
+            lote["errores"] += 1
+
+
+def _vista_lote(lote: Dict[str, Any]) -> Dict[str, Any]:
+    vista = dict(lote)
+    vista["porcentaje"] = round(100.0 * lote["procesados"] / lote["total"], 1) if lote["total"] else 100.0
+    vista["segundos"] = round((lote["fin"] or time.time()) - lote["inicio"], 2)
+    return vista
+
+
+def get_progreso_lote(lote_id: str, empresa_id: int) -> Optional[Dict[str, Any]]:
+    with _lotes_lock:
+        lote = _lotes.get(lote_id)
+        if lote is None or lote["empresa_id"] != empresa_id:
+            return None
+        return _vista_lote(lote)
+
+
+def listar_lotes(empresa_id: int) -> List[Dict[str, Any]]:
+    """Lotes recientes de la empresa, del más nuevo al más antiguo."""
+    with _lotes_lock:
+        return [_vista_lote(l) for l in reversed(_lotes.values()) if l["empresa_id"] == empresa_id]
+
+
+# --- COLA ---
+class ColaRecalculoCartera:
+    """
+    Terceros pendientes de recálculo de un lote. Por tercero se guardan las
+    pistas de documento (documentos cambiados) o None si necesita el completo.
+    """
+
+    def __init__(self, empresa_id: int, descripcion: str = "",
+                 injected_cuentas_cxc=None, injected_cuentas_cxp=None, injected_conceptos_ph=None):
+        self.empresa_id = empresa_id
+        self.descripcion = descripcion
+        self.lote_id = uuid.uuid4().hex
+        self.injected_cuentas_cxc = injected_cuentas_cxc
+        self.injected_cuentas_cxp = injected_cuentas_cxp
+        self.injected_conceptos_ph = injected_conceptos_ph
+        self.pendientes: Dict[int, Optional[set]] = {}
+        self.marcas = 0
+        self.resumen: Optional[Dict[str, Any]] = None
+
+    def marcar(self, tercero_id: Optional[int], documento_id=None) -> None:
+        from app.services import cartera as cartera_service
+        if not tercero_id:
+            return
+        self.marcas += 1
+        if documento_id is None:
+            self.pendientes[tercero_id] = None
+            return
+        unica = isinstance(documento_id, (int, cartera_service.PistaEliminado))
+        nuevos = {documento_id} if unica else set(documento_id)
+        if tercero_id not in self.pendientes:
+            self.pendientes[tercero_id] = nuevos
+        elif self.pendientes[tercero_id] is not None:
+            self.pendientes[tercero_id] |= nuevos
+
+    def marcar_documentos(self, db: Session, documentos_ids: Iterable[int]) -> int:
+        """
+        Marca (recálculo completo) los terceros de encabezado y de movimiento de
+        los documentos indicados que afectan cuentas CXC/CXP. Consulta por bloques
+        en lugar de un gatillo por documento. Retorna cuántos terceros marcó.
+        """
+        from app.models.documento import Documento
+        from app.models.movimiento_contable import MovimientoContable
+        cuentas = list(set(self._cuentas(db, "cxc")) | set(self._cuentas(db, "cxp")))
+        ids = list(documentos_ids)
+        if not cuentas or not ids:
+            return 0
+        terceros = set()
+        for i in range(0, len(ids), _TAMANO_CONSULTA_IDS):
+            bloque = ids[i:i + _TAMANO_CONSULTA_IDS]
+            filas = db.query(Documento.beneficiario_id, MovimientoContable.tercero_id).join(
+                MovimientoContable, MovimientoContable.documento_id == Documento.id
+            ).filter(
+                Documento.empresa_id == self.empresa_id,
+                Documento.id.in_(bloque),
+                MovimientoContable.cuenta_id.in_(cuentas),
+                or_(Documento.beneficiario_id.isnot(None), MovimientoContable.tercero_id.isnot(None))
+            ).distinct().all()
+            for beneficiario_id, tercero_id in filas:
+                terceros.update(t for t in (beneficiario_id, tercero_id) if t)
+        for t_id in terceros:
+            self.marcar(t_id)
+        return len(terceros)
+
+    def _cuentas(self, db: Session, tipo: str) -> List[int]:
+        from app.services import cartera as cartera_service
+        atributo = f"injected_cuentas_{tipo}"
+        if getattr(self, atributo) is None:
+            setattr(self, atributo, cartera_service.get_cuentas_especiales_ids(db, self.empresa_id, tipo))
+        return getattr(self, atributo)
+
+    def _conceptos(self, db: Session) -> List[_ConceptoPH]:
+        from app.services import cartera as cartera_service
+        conceptos = cartera_service._cargar_conceptos_ph(db, self.empresa_id, self.injected_conceptos_ph)
+        return [_ConceptoPH(c.id, c.nombre, c.orden) for c in conceptos]
+
+    # --- PROCESAMIENTO AL CIERRE DEL LOTE ---
+    def procesar(self, db: Session, commit: bool = True, paralelo: bool = True) -> Dict[str, Any]:
+        """
+        Recalcula cada tercero pendiente una vez. Con commit=True primero se
+        confirma el lote y cada tercero se confirma por separado (un error no
+        revierte a los demás). Con commit=False todo queda en la transacción
+        del caller y los errores se propagan.
+        """
+        trabajos = sorted(self.pendientes.items())
+        self.pendientes = {}
+        _registrar_lote(self.lote_id, self.empresa_id, self.descripcion, len(trabajos))
+        resumen = {"lote_id": self.lote_id, "terceros": len(trabajos), "marcas": self.marcas, "errores": []}
+        if not trabajos:
+            _actualizar_lote(self.lote_id, estado="COMPLETADO", fin=time.time())
+            return resumen
+
+        if commit:
+            db.commit()
+        cuentas_cxc = list(self._cuentas(db, "cxc"))
+        cuentas_cxp = list(self._cuentas(db, "cxp"))
+        conceptos = self._conceptos(db)
+
+        workers = max(1, int(settings.CARTERA_RECALCULO_WORKERS or 1))
+        es_postgres = db.get_bind().dialect.name == "postgresql"
+        usar_paralelo = paralelo and commit and es_postgres and workers > 1 and len(trabajos) >= _MIN_TERCEROS_PARALELO
+        print(f"[COLA CARTERA] Lote {self.lote_id} ({self.descripcion}): {len(trabajos)} terceros "
+              f"de {self.marcas} marcas, {'paralelo x' + str(workers) if usar_paralelo else 'secuencial'}.")
+
+        try:
+            if usar_paralelo:
+                _actualizar_lote(self.lote_id, workers=workers)
+                bloques = [trabajos[i::workers] for i in range(workers)]
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for errores in pool.map(
+                        lambda bloque: self._procesar_en_sesion_propia(bloque, cuentas_cxc, cuentas_cxp, conceptos),
+                        bloques
+                    ):
+                        resumen["errores"].extend(errores)
+            else:
+                resumen["errores"] = self._procesar_bloque(db, trabajos, cuentas_cxc, cuentas_cxp, conceptos, commit)
+        except Exception:
+            _actualizar_lote(self.lote_id, estado="ERROR", fin=time.time())
+            raise
+
+        estado = "COMPLETADO_CON_ERRORES" if resumen["errores"] else "COMPLETADO"
+        _actualizar_lote(self.lote_id, estado=estado, fin=time.time())
+        print(f"[COLA CARTERA] Lote {self.lote_id}: {estado}.")
+        return resumen
+
+    def _procesar_bloque(self, db: Session, trabajos, cuentas_cxc, cuentas_cxp, conceptos, commit: bool) -> List[str]:
+        from app.services import cartera as cartera_service
+        errores = []
+        for tercero_id, documentos_ids in trabajos:
+            try:
+                resultado = cartera_service.recalcular_aplicaciones_tercero(
+                    db, tercero_id, self.empresa_id, commit=commit,
+                    injected_cuentas_cxc=cuentas_cxc,
+                    injected_cuentas_cxp=cuentas_cxp,
+                    injected_conceptos_ph=conceptos,
+                    documento_id=sorted(documentos_ids, key=cartera_service._orden_pista) if documentos_ids else None
+                )
+                _avanzar_lote(self.lote_id, resultado.get("modo"))
+            except Exception as e:
+                _avanzar_lote(self.lote_id, None)
+                if not commit:
+                    raise
+                errores.append(f"Tercero {tercero_id}: {e}")
+                print(f"[COLA CARTERA] Error recalculando tercero {tercero_id}: {e}")
+        return errores
+
+    def _procesar_en_sesion_propia(self, trabajos, cuentas_cxc, cuentas_cxp, conceptos) -> List[str]:
+        from app.core.database import SessionLocal, current_empresa_id
+        token = current_empresa_id.set(self.empresa_id)
+        db = SessionLocal()
+        try:
+            return self._procesar_bloque(db, trabajos, cuentas_cxc, cuentas_cxp, conceptos, commit=True)
+        finally:
+            db.close()
+            current_empresa_id.reset(token)
+
+
+def cola_activa(db: Session, empresa_id: int) -> Optional[ColaRecalculoCartera]:
+    """Cola abierta en la sesión para la empresa, o None si no hay lote en curso."""
+    for cola in reversed(db.info.get(_CLAVE_COLAS, ())):
+        if cola.empresa_id == empresa_id:
+            return cola
+    return None
+
+
+@contextmanager
+def recalculo_diferido(db: Session, empresa_id: int, descripcion: str = "", commit: bool = True,
+                       paralelo: bool = True, injected_cuentas_cxc=None, injected_cuentas_cxp=None,
+                       injected_conceptos_ph=None):
+    """
+    Abre un lote con recálculo de cartera diferido. Si ya hay uno abierto para
+    la empresa en la sesión, se reutiliza y el recálculo lo hace el externo.
+    Si el bloque termina con excepción, la cola se descarta sin recalcular.
+    Tras salir, `cola.resumen` tiene el resultado del procesamiento.
+    """
+    externa = cola_activa(db, empresa_id)
+    if externa is not None:
+        yield externa
+        return
+
+    cola = ColaRecalculoCartera(
+        empresa_id, descripcion,
+        injected_cuentas_cxc=injected_cuentas_cxc,
+        injected_cuentas_cxp=injected_cuentas_cxp,
+        injected_conceptos_ph=injected_conceptos_ph
+    )
+    colas = db.info.setdefault(_CLAVE_COLAS, [])
+    colas.append(cola)
+    try:
+        yield cola
+    finally:
+        colas.remove(cola)
+    cola.resumen = cola.procesar(db, commit=commit, paralelo=paralelo)
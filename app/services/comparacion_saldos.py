@@ -5,15 +5,17 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
 from fastapi import Response
 from fastapi.responses import StreamingResponse
-import io
+import numpy as np
 
 from app.models.plan_cuenta import PlanCuenta
 from app.models.movimiento_contable import MovimientoContable
 from app.models.documento import Documento
 from app.models.empresa import Empresa
 from app.schemas.reporte_comparacion_saldos import FiltrosComparacionSaldos, FilaComparacionSaldos
+from app.services import arbol_puc
 
-from weasyprint import HTML
+from app.services import motor_pdf
+from app.services import exportacion_streaming
 
 NOMBRES_MESES = {
     1: "Enero",
@@ -43,45 +45,21 @@ def generate_comparacion_saldos_report(db: Session, empresa_id: int, filtros: Fi
         
     meses = list(range(mes_inicio, mes_fin + 1))
     
-    # 1. Consultar cuentas que cumplan los filtros base
-    q_cuentas = db.query(PlanCuenta).filter(PlanCuenta.empresa_id == empresa_id)
-    
-    if filtros.cuenta_codigo:
-        q_cuentas = q_cuentas.filter(PlanCuenta.codigo.startswith(filtros.cuenta_codigo))
-        
-    if filtros.tipo_filtro == "BALANCE":
-        q_cuentas = q_cuentas.filter(or_(*[PlanCuenta.codigo.startswith(str(i)) for i in [1, 2, 3]]))
-    elif filtros.tipo_filtro == "RESULTADOS":
-        q_cuentas = q_cuentas.filter(or_(*[PlanCuenta.codigo.startswith(str(i)) for i in [4, 5, 6, 7]]))
-        
-    cuentas = q_cuentas.order_by(PlanCuenta.codigo).all()
-    
-    if not cuentas:
+    # 1. Cuentas que cumplan los filtros base (sobre el árbol del PUC en caché)
+    def cuentas_seleccionadas(arbol):
+        seleccion = ~arbol.virtual
+        if filtros.cuenta_codigo:
+            seleccion &= arbol.posiciones_con_prefijo([filtros.cuenta_codigo])
+        if filtros.tipo_filtro == "BALANCE":
+            seleccion &= arbol.posiciones_con_prefijo(['1', '2', '3'])
+        elif filtros.tipo_filtro == "RESULTADOS":
+            seleccion &= arbol.posiciones_con_prefijo(['4', '5', '6', '7'])
+        return seleccion
+
+    if not cuentas_seleccionadas(arbol_puc.get_arbol_puc(db, empresa_id)).any():
         return {"filas": [], "meses": meses}
-        
-    # 2. Inicializar mapa de cuentas en memoria
-    cuentas_map = {c.id: {
-        "data": {
-            "codigo": c.codigo,
-            "nombre": c.nombre,
-            "nivel": c.nivel,
-            "saldo_inicial": 0.0,
-            "saldos_mensuales": {m: 0.0 for m in meses}
-        },
-        "children": [],
-        "parent_id": c.cuenta_padre_id,
-        "id": c.id
-    } for c in cuentas}
-    
-    # Construir relaciones jerárquicas
-    root_cuentas = []
-    for c_id, c_node in cuentas_map.items():
-        if c_node['parent_id'] and c_node['parent_id'] in cuentas_map:
-            cuentas_map[c_node['parent_id']]['children'].append(c_id)
-        else:
-            root_cuentas.append(c_id)
-            
-    # 3. Obtener el saldo inicial (acumulado histórico de movimientos antes del 1 de enero del año de consulta)
+
+    # 2. Obtener el saldo inicial (acumulado histórico de movimientos antes del 1 de enero del año de consulta)
     saldos_iniciales_q = db.query(
         MovimientoContable.cuenta_id,
         func.sum(MovimientoContable.debito - MovimientoContable.credito).label("saldo_inicial")
@@ -90,24 +68,14 @@ def generate_comparacion_saldos_report(db: Session, empresa_id: int, filtros: Fi
         Documento.fecha < date(filtros.anio, 1, 1),
         Documento.anulado == False
     ).group_by(MovimientoContable.cuenta_id).all()
-    
-    for row in saldos_iniciales_q:
-        if row.cuenta_id in cuentas_map:
-            codigo = cuentas_map[row.cuenta_id]['data']['codigo']
-            if codigo and codigo[0] in ('4', '5', '6', '7'):
-                cuentas_map[row.cuenta_id]['data']['saldo_inicial'] = 0.0
-            else:
-                cuentas_map[row.cuenta_id]['data']['saldo_inicial'] = float(row.saldo_inicial or 0.0)
-            
-    # 4. Obtener movimientos mensuales agrupados por cuenta para cada mes del rango
-    # movimientos_mensuales[cuenta_id][mes] = (debito, credito)
-    movimientos_mensuales = {}
-    
-    for m in meses:
+
+    # 3. Obtener movimientos netos (débito - crédito) por cuenta para cada mes del rango
+    movimientos_q = []
+    for columna, m in enumerate(meses, start=1):
         _, ultimo_dia = calendar.monthrange(filtros.anio, m)
         f_ini = date(filtros.anio, m, 1)
         f_fin = date(filtros.anio, m, ultimo_dia)
-        
+
         movs_mes = db.query(
             MovimientoContable.cuenta_id,
             func.sum(MovimientoContable.debito).label("debito"),
@@ -117,123 +85,76 @@ def generate_comparacion_saldos_report(db: Session, empresa_id: int, filtros: Fi
             Documento.fecha.between(f_ini, f_fin),
             Documento.anulado == False
         ).group_by(MovimientoContable.cuenta_id).all()
-        
-        for row in movs_mes:
-            c_id = row.cuenta_id
-            if c_id not in movimientos_mensuales:
-                movimientos_mensuales[c_id] = {}
-            movimientos_mensuales[c_id][m] = (float(row.debito or 0.0), float(row.credito or 0.0))
-            
-    # 5. Calcular saldos mensuales en las cuentas auxiliares (hojas)
-    for c_id, c_node in cuentas_map.items():
-        if not c_node['children']:
-            codigo = c_node['data']['codigo']
-            es_balance = codigo and codigo[0] in ('1', '2', '3')
-            
-            if es_balance:
-                saldo_acumulado = c_node['data']['saldo_inicial']
-                for m in meses:
-                    deb, cred = 0.0, 0.0
-                    if c_id in movimientos_mensuales and m in movimientos_mensuales[c_id]:
-                        deb, cred = movimientos_mensuales[c_id][m]
-                    saldo_acumulado += (deb - cred)
-                    c_node['data']['saldos_mensuales'][m] = saldo_acumulado
-            else:
-                c_node['data']['saldo_inicial'] = 0.0
-                for m in meses:
-                    deb, cred = 0.0, 0.0
-                    if c_id in movimientos_mensuales and m in movimientos_mensuales[c_id]:
-                        deb, cred = movimientos_mensuales[c_id][m]
-                    c_node['data']['saldos_mensuales'][m] = deb - cred
-                
-    # 6. Agregación recursiva hacia las cuentas padre (desde hojas hacia arriba)
-    def acumular_padre(cuenta_id):
-        c_node = cuentas_map[cuenta_id]
-        if not c_node['children']:
-            return
-            
-        # Procesar primero todos los hijos de forma recursiva
-        for child_id in c_node['children']:
-            acumular_padre(child_id)
-            
-        # Inicializar sumas del padre a cero
-        c_node['data']['saldo_inicial'] = 0.0
-        for m in meses:
-            c_node['data']['saldos_mensuales'][m] = 0.0
-            
-        # Sumar los valores correspondientes de todos los hijos en este sub-árbol
-        for child_id in c_node['children']:
-            child_node = cuentas_map[child_id]
-            c_node['data']['saldo_inicial'] += child_node['data']['saldo_inicial']
-            for m in meses:
-                c_node['data']['saldos_mensuales'][m] += child_node['data']['saldos_mensuales'][m]
-                
-    for root_id in root_cuentas:
-        acumular_padre(root_id)
-        
-    # 7. Aplanar el árbol y formatear según el nivel máximo solicitado
+        movimientos_q.extend((columna, row) for row in movs_mes)
+
+    # Se rearma si aparecen cuentas creadas después de guardar el árbol (otro proceso)
+    ids_con_valores = [row.cuenta_id for row in saldos_iniciales_q] + [row.cuenta_id for _, row in movimientos_q]
+    arbol = arbol_puc.get_arbol_puc(db, empresa_id, cuenta_ids=ids_con_valores)
+    seleccion = cuentas_seleccionadas(arbol)
+
+    # 4. Matriz de valores propios: columna 0 = saldo inicial, columnas 1..k = meses
+    valores = np.zeros((arbol.n, len(meses) + 1), dtype=np.float64)
+    for row in saldos_iniciales_q:
+        if row.cuenta_id in arbol.indice:
+            valores[arbol.indice[row.cuenta_id], 0] = float(row.saldo_inicial or 0.0)
+    for columna, row in movimientos_q:
+        if row.cuenta_id in arbol.indice:
+            valores[arbol.indice[row.cuenta_id], columna] = float(row.debito or 0.0) - float(row.credito or 0.0)
+    valores[~seleccion] = 0.0
+
+    # Balance (clases 1-3): saldo acumulado de fin de mes. Resultados: movimiento del mes, sin saldo inicial.
+    es_balance = arbol.posiciones_con_prefijo(['1', '2', '3'])
+    valores[~es_balance, 0] = 0.0
+    valores[es_balance, 1:] = valores[es_balance, :1] + np.cumsum(valores[es_balance, 1:], axis=1)
+
+    # 5. Mayorización hacia las cuentas padre en una sola pasada
+    totales = arbol.acumular(valores)
+
+    # 6. Aplanar en orden jerárquico según el nivel máximo solicitado
+    visibles = seleccion & (arbol.niveles <= (filtros.nivel_maximo or 9))
     filas_reporte = []
-    def aplanar(cuenta_id):
-        c_node = cuentas_map[cuenta_id]
-        
-        if c_node['data']['nivel'] <= (filtros.nivel_maximo or 9):
-            filas_reporte.append(FilaComparacionSaldos(
-                codigo=c_node['data']['codigo'],
-                nombre=c_node['data']['nombre'],
-                nivel=c_node['data']['nivel'],
-                saldo_inicial=c_node['data']['saldo_inicial'],
-                saldos_mensuales=c_node['data']['saldos_mensuales']
-            ))
-            
-        for child_id in sorted(c_node['children'], key=lambda x: cuentas_map[x]['data']['codigo']):
-            aplanar(child_id)
-            
-    for root_id in sorted(root_cuentas, key=lambda x: cuentas_map[x]['data']['codigo']):
-        aplanar(root_id)
-        
+    for i in arbol.orden[visibles[arbol.orden]].tolist():
+        filas_reporte.append(FilaComparacionSaldos(
+            codigo=arbol.codigos[i],
+            nombre=arbol.nombres[i],
+            nivel=int(arbol.niveles[i]),
+            saldo_inicial=float(totales[i, 0]),
+            saldos_mensuales={m: float(totales[i, columna]) for columna, m in enumerate(meses, start=1)}
+        ))
+
     return {"filas": filas_reporte, "meses": meses}
 
-def generate_comparacion_saldos_csv(data: Dict[str, Any]) -> Response:
+def generate_comparacion_saldos_csv(data: Dict[str, Any]) -> StreamingResponse:
     """
     Genera un archivo CSV con la comparación de saldos mensuales,
     diseñado específicamente para compatibilidad impecable con Microsoft Excel.
+    Se envía por bloques a medida que se escriben las filas.
     """
     filas: List[FilaComparacionSaldos] = data["filas"]
     meses: List[int] = data["meses"]
     
-    # BOM UTF-8 para garantizar acentos en Excel
-    output = io.StringIO()
-    output.write('\ufeff')
-    
     # Construir cabeceras
     headers = ["Código", "Nombre", "Nivel", "Saldo Inicial"]
     for m in meses:
         headers.append(NOMBRES_MESES.get(m, f"Mes {m}"))
-        
-    output.write(";".join(headers) + "\n")
-    
-    for f in filas:
-        row_data = [
-            f.codigo,
-            f.nombre,
-            str(f.nivel),
-            f"{f.saldo_inicial:.2f}".replace(".", ",")  # Formato numérico para Excel hispano
-        ]
-        for m in meses:
-            val = f.saldos_mensuales.get(m, 0.0)
-            row_data.append(f"{val:.2f}".replace(".", ","))
-            
-        output.write(";".join(row_data) + "\n")
-        
-    csv_data = output.getvalue()
-    output.close()
-    
-    return Response(
-        content=csv_data.encode('utf-8-sig'),
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": "attachment; filename=comparacion_saldos_mensuales.csv"
-        }
+
+    def filas_csv():
+        for f in filas:
+            row_data = [
+                f.codigo,
+                f.nombre,
+                str(f.nivel),
+                f"{f.saldo_inicial:.2f}".replace(".", ",")  # Formato numérico para Excel hispano
+            ]
+            for m in meses:
+                val = f.saldos_mensuales.get(m, 0.0)
+                row_data.append(f"{val:.2f}".replace(".", ","))
+            yield row_data
+
+    # BOM UTF-8 para garantizar acentos en Excel; los nombres con ';' quedan entre comillas
+    return exportacion_streaming.respuesta_streaming(
+        exportacion_streaming.csv_en_streaming(headers, filas_csv()),
+        "comparacion_saldos_mensuales.csv", "csv"
     )
 
 def generate_comparacion_saldos_pdf(db: Session, empresa_id: int, filtros: FiltrosComparacionSaldos) -> Response:
@@ -516,7 +437,7 @@ def generate_comparacion_saldos_pdf(db: Session, empresa_id: int, filtros: Filtr
     """
     
     # 4. Compilar a PDF con WeasyPrint
-    pdf_bytes = HTML(string=html_template).write_pdf()
+    pdf_bytes = motor_pdf.html_a_pdf(html_template)
     
     return Response(
         content=pdf_bytes,
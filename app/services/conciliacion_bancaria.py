@@ -1,16 +1,20 @@
 import os
+import re
 import csv
 import hashlib
 import uuid
 import pandas as pd
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from datetime import datetime, date, timedelta
 from decimal import Decimal, InvalidOperation
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import and_, or_, insert, inspect as sa_inspect
+from bisect import bisect_left, bisect_right
+import heapq
+import itertools
+from functools import lru_cache
 import difflib
 import time
-import pdfplumber
 
 from ..core.cache import cached, BankReconciliationCache, cache
 from ..core.monitoring import monitor_performance, BankReconciliationMonitor, log_performance_warning
@@ -23,6 +27,33 @@ from ..schemas.conciliacion_bancaria import (
     FileValidationResult, ImportSessionCreate, BankMovementCreate, DuplicateReport
 )
 from ..core.database import get_db
+from ..core.config import settings
+from . import extracto_pdf
+
+# Líneas por sentencia al consultar huellas e insertar movimientos bancarios
+_IMPORT_BLOCK_SIZE = 1000
+
+# Acepta: YYYY/MM/DD, DD-MM-YYYY, DD.MM.YYYY, 12/03, o '12 MAY 2026' en cualquier lugar de la línea
+_DATE_PATTERN = re.compile(r'(\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|\d{1,2}[-/.]\d{1,2}|\d{1,2}\s+[A-Za-z]{2,8}\s+\d{0,4})')
+
+
+def bank_movement_hash(bank_account_id: int, transaction_date: date, amount, description: Optional[str],
+                       reference: Optional[str], occurrence: int = 0) -> str:
+    """
+    Huella de contenido de un movimiento bancario. `occurrence` distingue líneas idénticas
+    legítimas dentro de un mismo extracto (dos retiros iguales el mismo día): la k-ésima
+    repetición lleva k, así reimportar el extracto produce las mismas huellas.
+    """
+    normalized = "|".join([
+        str(bank_account_id),
+        transaction_date.isoformat(),
+        str(Decimal(str(amount)).quantize(Decimal("0.01"))),
+        " ".join((description or "").lower().split()),
+        (reference or "").strip().lower(),
+        str(occurrence),
+    ])
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+from . import conciliacion_grupos
 
 
 class AuditService:
@@ -456,22 +487,23 @@ class ImportEngine:
     
     def parse_bank_statement(self, file_path: str, config: ImportConfig, password: Optional[str] = None) -> List[BankMovementCreate]:
         """Parsea un extracto bancario y retorna lista de movimientos"""
-        movements = []
-        
+        return list(self.iter_bank_statement(file_path, config, password))
+    
+    def iter_bank_statement(self, file_path: str, config: ImportConfig,
+                            password: Optional[str] = None) -> Iterator[BankMovementCreate]:
+        """Como parse_bank_statement, pero los PDF entregan los movimientos a medida que se extraen las páginas"""
         try:
             if config.file_format.upper() in ['CSV', 'TXT']:
-                movements = self._parse_csv_file(file_path, config)
+                yield from self._parse_csv_file(file_path, config)
             elif config.file_format.upper() in ['XLS', 'XLSX']:
-                movements = self._parse_excel_file(file_path, config)
+                yield from self._parse_excel_file(file_path, config)
             elif config.file_format.upper() == 'PDF':
-                movements = self._parse_pdf_file(file_path, config, password)
+                yield from self._iter_pdf_movements(file_path, config, password)
             elif config.file_format.upper() == 'TEXTO':
-                movements = self._parse_text_file(file_path, config)
+                yield from self._parse_text_file(file_path, config)
         
         except Exception as e:
             raise Exception(f"Error parseando archivo: {str(e)}")
-        
-        return movements
     
     def _parse_csv_file(self, file_path: str, config: ImportConfig) -> List[BankMovementCreate]:
         """Parsea archivo CSV/TXT"""
@@ -514,115 +546,90 @@ class ImportEngine:
         return movements
     
     def _validate_pdf_file(self, file_path: str, config: ImportConfig, password: Optional[str] = None) -> FileValidationResult:
-        """Valida archivo PDF usando pdfplumber"""
+        """Valida archivo PDF sobre las primeras páginas (ver services/extracto_pdf.py)"""
         errors = []
         warnings = []
         sample_data = []
         total_rows = 0
         
         try:
-            with pdfplumber.open(file_path, password=password) as pdf:
-                if len(pdf.pages) == 0:
-                    errors.append("El archivo PDF está vacío.")
-                    return FileValidationResult(is_valid=False, errors=errors)
-                
-                # Intentar leer tablas de las páginas (máximo 5 páginas para validación)
-                pages_to_check = min(len(pdf.pages), 5)
-                tables_found = False
-                
-                # Variables temporales para evitar acumular errores de "tablas falsas" 
-                # si finalmente pasamos al modo fallback
-                temp_errors = []
-                temp_warnings = []
-                temp_sample_data = []
-                
-                for p in range(pages_to_check):
-                    page = pdf.pages[p]
-                    # Configuración especial para extractos bancarios sin cuadricula
-                    table_settings = {
-                        "vertical_strategy": "text",
-                        "horizontal_strategy": "text",
-                        "snap_tolerance": 5,
-                        "join_tolerance": 5
-                    }
-                    tables = page.extract_tables(table_settings)
+            # Máximo 5 páginas para validación; quedan en caché para la importación
+            pages = list(extracto_pdf.paginas(file_path, password, limite=5))
+            if len(pages) == 0:
+                errors.append("El archivo PDF está vacío.")
+                return FileValidationResult(is_valid=False, errors=errors)
+            
+            tables_found = False
+            
+            # Variables temporales para evitar acumular warnings de "tablas falsas" 
+            # si finalmente pasamos al modo fallback
+            temp_warnings = []
+            temp_sample_data = []
+            
+            for p, page in enumerate(pages):
+                for cleaned_table in page["tablas"]:
+                    # Saltar encabezados si es la primera página procesada (heurística simple)
+                    start_idx = config.header_rows if p == 0 else 0
                     
-                    if tables:
-                        for table in tables:
-                            # Ignorar filas vacías
-                            cleaned_table = [row for row in table if any(cell for cell in row)]
-                            
-                            # Saltar encabezados si es la primera página procesada (heurística simple)
-                            start_idx = config.header_rows if p == 0 else 0
-                            
-                            for i, row in enumerate(cleaned_table[start_idx:]):
-                                total_rows += 1
-                                
-                                # Limpiar nulos de pdfplumber
-                                row_str = [str(cell).replace('\\n', ' ').strip() if cell else "" for cell in row]
-                                
-                                row_errors = self._validate_row_data(row_str, config, total_rows + config.header_rows)
-                                
+                    for row_str in cleaned_table[start_idx:]:
+                        total_rows += 1
+                        
+                        row_errors = self._validate_row_data(row_str, config, total_rows + config.header_rows)
+                        
+                        if not row_errors:
+                            tables_found = True
+                            if len(temp_sample_data) < 5:
+                                temp_sample_data.append(self._extract_row_data(row_str, config))
+                        else:
+                            # Silenciosamente ignoramos las filas inválidas en tablas de PDF,
+                            # pero guardamos un warning por si acaso.
+                            temp_warnings.append(f"Fila {total_rows + config.header_rows} ignorada: {row_errors[0]}")
+                        
+                        if total_rows > 1000:
+                            temp_warnings.append("Validación PDF limitada a las primeras 1000 filas.")
+                            break
+                    
+                    if total_rows > 1000:
+                        break
+                if total_rows > 1000:
+                    break
+            
+            # FALLBACK: Si no sirvió ningún dato extraído por tablas, usar extracción textual
+            if not tables_found:
+                total_rows = 0  # Reset
+                
+                for page in pages:
+                    text = page["texto"]
+                    if not text:
+                        continue
+                        
+                    lines = text.split('\n')
+                    for line in lines:
+                        if _DATE_PATTERN.search(line):
+                            tables_found = True  # Marca que al menos procesamos líneas de texto utilizables
+                            total_rows += 1
+                            # Separar la línea de manera inteligente
+                            parts = self._fallback_parse_line(line, config)
+                            if parts and len(parts) >= 3:
+                                row_errors = self._validate_row_data(parts, config, total_rows + config.header_rows)
                                 if not row_errors:
-                                    tables_found = True
                                     if len(temp_sample_data) < 5:
-                                        temp_sample_data.append(self._extract_row_data(row_str, config))
+                                        temp_sample_data.append(self._extract_row_data(parts, config))
                                 else:
-                                    # Silenciosamente ignoramos las filas inválidas en tablas de PDF,
-                                    # pero guardamos un warning por si acaso.
-                                    temp_warnings.append(f"Fila {total_rows + config.header_rows} ignorada: {row_errors[0]}")
-                                
-                                if total_rows > 1000:
-                                    temp_warnings.append("Validación PDF limitada a las primeras 1000 filas.")
-                                    break
+                                    temp_warnings.append(f"Línea de texto {total_rows} ignorada: {row_errors[0]}")
                             
                             if total_rows > 1000:
                                 break
                     if total_rows > 1000:
                         break
                 
-                # FALLBACK: Si no sirvió ningún dato extraído por tablas, usar extracción textual
                 if not tables_found:
-                    total_rows = 0  # Reset
-                    
-                    import re
-                    # Acepta: YYYY/MM/DD, DD-MM-YYYY, DD.MM.YYYY, 12/03, o '12 MAY 2026' en cualquier lugar de la línea
-                    date_pattern = re.compile(r'(\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|\d{1,2}[-/.]\d{1,2}|\d{1,2}\s+[A-Za-z]{2,8}\s+\d{0,4})')
-                    
-                    for p in range(pages_to_check):
-                        page = pdf.pages[p]
-                        text = page.extract_text()
-                        if not text:
-                            continue
-                            
-                        lines = text.split('\n')
-                        for line in lines:
-                            if date_pattern.search(line):
-                                tables_found = True  # Marca que al menos procesamos líneas de texto utilizables
-                                total_rows += 1
-                                # Separar la línea de manera inteligente
-                                parts = self._fallback_parse_line(line, config)
-                                if parts and len(parts) >= 3:
-                                    row_errors = self._validate_row_data(parts, config, total_rows + config.header_rows)
-                                    if not row_errors:
-                                        tables_found = True  # Marca que al menos procesamos líneas utilizables
-                                        if len(temp_sample_data) < 5:
-                                            temp_sample_data.append(self._extract_row_data(parts, config))
-                                    else:
-                                        temp_warnings.append(f"Línea de texto {total_rows} ignorada: {row_errors[0]}")
-                                
-                                if total_rows > 1000:
-                                    break
-                        if total_rows > 1000:
-                            break
-                    
-                    if not tables_found:
-                        errors.append("No se detectaron tablas estructuradas ni formato de texto reconocible en el PDF.")
-                else:
-                    # Si las tablas de pdfplumber hallaron filas válidas, no registramos errores bloqueantes
-                    # simplemente agregamos los warnings de las filas basura que saltamos
-                    warnings.extend(temp_warnings)
-                    sample_data.extend(temp_sample_data)
+                    errors.append("No se detectaron tablas estructuradas ni formato de texto reconocible en el PDF.")
+            else:
+                # Si las tablas de pdfplumber hallaron filas válidas, no registramos errores bloqueantes
+                # simplemente agregamos los warnings de las filas basura que saltamos
+                warnings.extend(temp_warnings)
+                sample_data.extend(temp_sample_data)
         
         except Exception as e:
             errors.append(f"Error leyendo archivo PDF: {str(e)}")
@@ -744,69 +751,50 @@ class ImportEngine:
 
     def _parse_pdf_file(self, file_path: str, config: ImportConfig, password: Optional[str] = None) -> List[BankMovementCreate]:
         """Parsea archivo PDF usando pdfplumber"""
-        movements = []
-        
-        with pdfplumber.open(file_path, password=password) as pdf:
-            is_first_page = True
-            tables_found_anywhere = False
-            
-            for page in pdf.pages:
-                # Configuración especial para extractos bancarios sin cuadricula
-                table_settings = {
-                    "vertical_strategy": "text",
-                    "horizontal_strategy": "text",
-                    "snap_tolerance": 5,
-                    "join_tolerance": 5
-                }
-                tables = page.extract_tables(table_settings)
+        return list(self._iter_pdf_movements(file_path, config, password))
+    
+    def _iter_pdf_movements(self, file_path: str, config: ImportConfig,
+                            password: Optional[str] = None) -> Iterator[BankMovementCreate]:
+        """Movimientos del PDF a medida que se extraen las páginas (ver services/extracto_pdf.py)"""
+        is_first_page = True
+        tables_found_anywhere = False
+        
+        for page in extracto_pdf.paginas(file_path, password):
+            for cleaned_table in page["tablas"]:
+                # Saltar los header_rows solo en la primera tabla de la primera página
+                start_idx = config.header_rows if is_first_page else 0
                 
-                if tables:
-                    for table in tables:
-                        # Ignorar filas vacías extraídas por pdfplumber
-                        cleaned_table = [row for row in table if any(cell for cell in row)]
-                        
-                        # Saltar los header_rows solo en la primera tabla de la primera página
-                        start_idx = config.header_rows if is_first_page else 0
-                        
-                        for row in cleaned_table[start_idx:]:
-                            try:
-                                # Preparar row para parseo (pdfplumber extrae None si la celda está vacía)
-                                row_str = [str(cell).replace('\\n', ' ').strip() if cell else "" for cell in row]
-                                
-                                movement = self._create_movement_from_row(row_str, config)
-                                if movement:
-                                    tables_found_anywhere = True
-                                    movements.append(movement)
-                            except Exception as e:
-                                print(f"Error procesando fila de PDF tabla: {str(e)}")
-                                continue
-                        
-                        is_first_page = False
-
-            # FALLBACK si no se encontraron tablas: usar texto puro
-            if not tables_found_anywhere:
-                import re
-                date_pattern = re.compile(r'(\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|\d{1,2}[-/.]\d{1,2}|\d{1,2}\s+[A-Za-z]{2,8}\s+\d{0,4})')
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if not text:
+                for row_str in cleaned_table[start_idx:]:
+                    try:
+                        movement = self._create_movement_from_row(row_str, config)
+                    except Exception as e:
+                        print(f"Error procesando fila de PDF tabla: {str(e)}")
                         continue
-                        
-                    lines = text.split('\n')
-                    for line in lines:
-                        if date_pattern.search(line):
-                            try:
-                                # Separar la línea de manera inteligente
-                                parts = self._fallback_parse_line(line, config)
-                                if parts and len(parts) >= 3:
-                                    movement = self._create_movement_from_row(parts, config)
-                                    if movement:
-                                        movements.append(movement)
-                            except Exception as e:
-                                print(f"Error procesando fila de PDF texto: {str(e)}")
-                                continue
-        
-        return movements
+                    if movement:
+                        tables_found_anywhere = True
+                        yield movement
+                
+                is_first_page = False
+
+        # FALLBACK si no se encontraron tablas: usar texto puro (las páginas ya están en caché)
+        if not tables_found_anywhere:
+            for page in extracto_pdf.paginas(file_path, password):
+                text = page["texto"]
+                if not text:
+                    continue
+                    
+                lines = text.split('\n')
+                for line in lines:
+                    if _DATE_PATTERN.search(line):
+                        try:
+                            # Separar la línea de manera inteligente
+                            parts = self._fallback_parse_line(line, config)
+                            movement = self._create_movement_from_row(parts, config) if parts and len(parts) >= 3 else None
+                        except Exception as e:
+                            print(f"Error procesando fila de PDF texto: {str(e)}")
+                            continue
+                        if movement:
+                            yield movement
 
     def _parse_text_file(self, file_path: str, config: ImportConfig) -> List[BankMovementCreate]:
         """Parsea un archivo de texto crudo convertido a líneas individuales"""
@@ -934,22 +922,42 @@ class ImportEngine:
             print(f"Error creando movimiento: {str(e)}")
             return None
     
+    def _content_hashes(self, movements: List[BankMovementCreate], bank_account_id: int,
+                        occurrences: Optional[Dict[str, int]] = None) -> List[str]:
+        """
+        Huella de cada movimiento del lote, numerando las líneas idénticas.
+        occurrences: conteo compartido entre bloques del mismo extracto (store_movements_stream).
+        """
+        occurrences = {} if occurrences is None else occurrences
+        hashes = []
+        for movement in movements:
+            base = bank_movement_hash(bank_account_id, movement.transaction_date, movement.amount,
+                                      movement.description, movement.reference)
+            occurrence = occurrences.get(base, 0)
+            occurrences[base] = occurrence + 1
+            hashes.append(base if occurrence == 0 else bank_movement_hash(
+                bank_account_id, movement.transaction_date, movement.amount,
+                movement.description, movement.reference, occurrence
+            ))
+        return hashes
+    
     def detect_duplicates(self, movements: List[BankMovementCreate], bank_account_id: int) -> DuplicateReport:
         """Detecta movimientos duplicados"""
         duplicates = []
         duplicate_groups = []
         
-        # Buscar duplicados en la base de datos
-        for movement in movements:
-            existing = self.db.query(BankMovement).filter(
-                and_(
-                    BankMovement.bank_account_id == bank_account_id,
-                    BankMovement.transaction_date == movement.transaction_date,
-                    BankMovement.amount == movement.amount,
-                    BankMovement.description == movement.description
-                )
-            ).first()
-            
+        # Buscar duplicados en la base de datos: una consulta por bloque de huellas
+        hashes = self._content_hashes(movements, bank_account_id)
+        existing_by_hash = {}
+        for start in range(0, len(hashes), _IMPORT_BLOCK_SIZE):
+            rows = self.db.query(
+                BankMovement.id, BankMovement.content_hash, BankMovement.transaction_date,
+                BankMovement.amount, BankMovement.description, BankMovement.import_session_id
+            ).filter(BankMovement.content_hash.in_(hashes[start:start + _IMPORT_BLOCK_SIZE]))
+            existing_by_hash.update((row.content_hash, row) for row in rows)
+        
+        for movement, content_hash in zip(movements, hashes):
+            existing = existing_by_hash.get(content_hash)
             if existing:
                 duplicates.append({
                     'new_movement': movement.dict(),
@@ -985,41 +993,93 @@ class ImportEngine:
         )
     
     def store_movements(self, movements: List[BankMovementCreate], import_session_id: str, 
-                       bank_account_id: int, empresa_id: int) -> Dict[str, Any]:
-        """Almacena los movimientos en la base de datos"""
+                       bank_account_id: int, empresa_id: int, skip_duplicates: bool = False,
+                       occurrences: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        Almacena los movimientos en la base de datos con INSERT de varias filas por sentencia.
+        skip_duplicates: las líneas ya importadas (misma huella) se omiten (ON CONFLICT DO
+        NOTHING); sin él, una línea repetida hace fallar la importación completa.
+        """
         try:
-            stored_movements = []
-            
-            for movement_data in movements:
-                movement = BankMovement(
-                    import_session_id=import_session_id,
-                    bank_account_id=bank_account_id,
-                    empresa_id=empresa_id,
-                    transaction_date=movement_data.transaction_date,
-                    value_date=movement_data.value_date,
-                    amount=movement_data.amount,
-                    description=movement_data.description,
-                    reference=movement_data.reference,
-                    transaction_type=movement_data.transaction_type,
-                    balance=movement_data.balance,
-                    status="PENDING"
+            hashes = self._content_hashes(movements, bank_account_id, occurrences)
+            rows = [{
+                "import_session_id": import_session_id,
+                "bank_account_id": bank_account_id,
+                "empresa_id": empresa_id,
+                "transaction_date": movement_data.transaction_date,
+                "value_date": movement_data.value_date,
+                "amount": movement_data.amount,
+                "description": movement_data.description,
+                "reference": movement_data.reference,
+                "transaction_type": movement_data.transaction_type,
+                "balance": movement_data.balance,
+                "status": "PENDING",
+                "created_at": datetime.utcnow(),
+                "content_hash": content_hash
+            } for movement_data, content_hash in zip(movements, hashes)]
+            
+            stmt = self._insert_movements_statement(skip_duplicates)
+            ids_by_hash = {}
+            for start in range(0, len(rows), _IMPORT_BLOCK_SIZE):
+                result = self.db.execute(
+                    stmt.returning(BankMovement.id, BankMovement.content_hash),
+                    rows[start:start + _IMPORT_BLOCK_SIZE]
                 )
-                
-                self.db.add(movement)
-                stored_movements.append(movement)
+                ids_by_hash.update((row.content_hash, row.id) for row in result)
             
             self.db.commit()
             
+            # Ids en el orden del extracto (las líneas omitidas no tienen id)
+            stored_ids = [ids_by_hash[h] for h in hashes if h in ids_by_hash]
             return {
                 'success': True,
-                'total_stored': len(stored_movements),
-                'movements': [m.id for m in stored_movements]
+                'total_stored': len(stored_ids),
+                'total_skipped': len(rows) - len(stored_ids),
+                'movements': stored_ids
             }
         
         except Exception as e:
             self.db.rollback()
             raise Exception(f"Error almacenando movimientos: {str(e)}")
     
+    def store_movements_stream(self, movements: Iterable[BankMovementCreate], import_session_id: str,
+                               bank_account_id: int, empresa_id: int) -> Dict[str, Any]:
+        """
+        Almacena los movimientos por bloques a medida que llegan (iter_bank_statement), omitiendo
+        los ya importados. Cada bloque se confirma por separado: si la importación se interrumpe,
+        repetirla continúa donde iba sin duplicar.
+        """
+        occurrences = {}
+        total_stored = 0
+        total_skipped = 0
+        movements = iter(movements)
+        while True:
+            block = list(itertools.islice(movements, _IMPORT_BLOCK_SIZE))
+            if not block:
+                break
+            result = self.store_movements(block, import_session_id, bank_account_id, empresa_id,
+                                          skip_duplicates=True, occurrences=occurrences)
+            total_stored += result['total_stored']
+            total_skipped += result['total_skipped']
+        return {
+            'success': True,
+            'total_stored': total_stored,
+            'total_skipped': total_skipped
+        }
+    
+    def _insert_movements_statement(self, skip_duplicates: bool):
+        """INSERT de movimientos bancarios; con skip_duplicates, ON CONFLICT DO NOTHING sobre la huella"""
+        if not skip_duplicates:
+            return insert(BankMovement)
+        dialect = self.db.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise Exception(f"Omitir duplicados no está soportado en {dialect}")
+        return dialect_insert(BankMovement).on_conflict_do_nothing(index_elements=["content_hash"])
+    
     def create_import_session(self, file_path: str, config_id: int, bank_account_id: int, 
                             empresa_id: int, user_id: int, original_filename: str = None) -> ImportSession:
         """Crea una nueva sesión de importación"""
@@ -1532,6 +1592,93 @@ class ConfigurationManager:
         }
 
 
+# Tipos de transacción del extracto que indican salida de dinero
+_BANK_OUTFLOW_TYPES = {"DEBIT", "DEBITO", "DÉBITO", "CARGO", "RETIRO", "EGRESO"}
+
+
+@lru_cache(maxsize=65536)
+def _normalizar_texto(texto: str) -> str:
+    """Texto en minúsculas y sin espacios extremos para comparar descripciones"""
+    return texto.lower().strip()
+
+
+def _centavos(valor) -> int:
+    return int((Decimal(valor) * 100).to_integral_value())
+
+
+def _pk(obj) -> int:
+    """Id de una instancia aunque esté expirada tras el commit (sin ir a la base)"""
+    return sa_inspect(obj).identity[0]
+
+
+class _IndiceContable:
+    """
+    Índices en memoria de los movimientos contables candidatos a conciliar.
+    Las posiciones son las de la lista original, así el primer candidato en el
+    orden de la consulta sigue siendo el elegido, como en el recorrido lineal.
+    """
+    
+    def __init__(self, accounting_movements: List):
+        self.dates = []
+        self.values = []  # Valor absoluto (débito - crédito)
+        self._by_key: Dict[Tuple[date, int], List[int]] = {}
+        by_date: Dict[date, List[int]] = {}
+        for position, acc_mov in enumerate(accounting_movements):
+            acc_date = acc_mov.documento.fecha
+            value = abs(acc_mov.debito - acc_mov.credito)
+            self.dates.append(acc_date)
+            self.values.append(value)
+            self._by_key.setdefault((acc_date, _centavos(value)), []).append(position)
+            by_date.setdefault(acc_date, []).append(position)
+        # Ventanas de monto: global y por fecha, ordenadas por valor
+        self._by_amount = self._sorted_by_amount(range(len(self.values)))
+        self._by_date_amount = {acc_date: self._sorted_by_amount(positions) for acc_date, positions in by_date.items()}
+    
+    def _sorted_by_amount(self, positions) -> Tuple[List[float], List[int]]:
+        ordered = sorted(positions, key=lambda i: self.values[i])
+        return [float(self.values[i]) for i in ordered], ordered
+    
+    def exact(self, transaction_date: date, amount, tolerance: float) -> Optional[int]:
+        """Primera posición con la misma fecha y monto a menos de `tolerance`"""
+        cents = _centavos(amount)
+        span = int(tolerance * 100) + 1
+        best = None
+        for key in range(cents - span, cents + span + 1):
+            for position in self._by_key.get((transaction_date, key), ()):
+                if best is not None and position >= best:
+                    break
+                if abs(amount - self.values[position]) < tolerance:
+                    best = position
+                    break
+        return best
+    
+    def by_amount_window(self, amount: float, window: Optional[float], on_date: date = None) -> List[int]:
+        """Posiciones con valor a menos de `window` de `amount` (todas si window es None), opcionalmente de una fecha"""
+        values, positions = self._by_amount if on_date is None else self._by_date_amount.get(on_date, ((), ()))
+        if window is None:
+            return positions
+        # Margen mínimo por redondeo binario; el score exacto se calcula después
+        margin = window + 1e-6
+        return positions[bisect_left(values, amount - margin):bisect_right(values, amount + margin)]
+    
+    def nearest_amounts(self, amount: float, window: float):
+        """Posiciones a menos de `window` de `amount`, de la menor a la mayor diferencia"""
+        values, positions = self._by_amount
+        margin = window + 1e-6
+        right = bisect_left(values, amount)
+        left = right - 1
+        while left >= 0 or right < len(values):
+            if right >= len(values) or (left >= 0 and amount - values[left] <= values[right] - amount):
+                diff, position = amount - values[left], positions[left]
+                left -= 1
+            else:
+                diff, position = values[right] - amount, positions[right]
+                right += 1
+            if diff > margin:
+                return
+            yield position
+
+
 class MatchingEngine:
     """Motor de conciliación automática de movimientos bancarios y contables"""
     
@@ -1540,6 +1687,11 @@ class MatchingEngine:
         self.default_date_tolerance = 3  # días
         self.default_amount_tolerance = 0.01  # 1 centavo
         self.min_confidence_score = 0.7  # 70% mínimo para auto-match
+        # Conciliación por grupos (N contables : 1 bancario y 1 contable : N bancarios)
+        self.group_amount_tolerance = settings.CONCILIACION_GRUPOS_TOLERANCIA
+        self.group_date_window = settings.CONCILIACION_GRUPOS_VENTANA_DIAS
+        self.group_max_items = settings.CONCILIACION_GRUPOS_MAX_PARTIDAS
+        self.group_time_budget_ms = settings.CONCILIACION_GRUPOS_PRESUPUESTO_MS
     
     @monitor_performance("bank_reconciliation.auto_matching")
     def auto_match(self, bank_account_id: int, empresa_id: int, 
@@ -1551,17 +1703,32 @@ class MatchingEngine:
                 bank_account_id, empresa_id, date_from, date_to
             )
             
-            # 2. Obtener movimientos contables no conciliados
+            # 2. Obtener movimientos contables no conciliados (con la fecha del documento precargada)
             accounting_movements = self._get_unmatched_accounting_movements(
                 bank_account_id, empresa_id, date_from, date_to
             )
             
-            # 3. Ejecutar algoritmos de matching
-            exact_matches = self._find_exact_matches(bank_movements, accounting_movements)
-            probable_matches = self._find_probable_matches(bank_movements, accounting_movements, exact_matches)
+            # Estado de conciliación previo en memoria (una consulta por lado, no una por fila)
+            matched_bank_ids = self._matched_bank_movement_ids(bank_account_id, empresa_id)
+            matched_acc_ids = self._matched_accounting_movement_ids(bank_account_id)
+            bank_ids = [bm.id for bm in bank_movements]
+            acc_ids = [am.id for am in accounting_movements]
+            
+            # 3. Ejecutar algoritmos de matching sobre índices
+            index = _IndiceContable(accounting_movements)
+            exact_matches = self._find_exact_matches(bank_movements, accounting_movements, index)
+            probable_matches = self._find_probable_matches(bank_movements, accounting_movements, exact_matches, index)
+            group_matches = self._find_group_matches(bank_movements, accounting_movements, exact_matches)
             
-            # 4. Aplicar matches automáticos (solo exactos y con alta confianza)
-            auto_applied = self._apply_automatic_matches(exact_matches, probable_matches)
+            # 4. Aplicar matches automáticos (exactos, probables y grupos con alta confianza),
+            #    asignados globalmente por puntaje
+            auto_applied = self._apply_automatic_matches(exact_matches, probable_matches, group_matches)
+            
+            # El commit expira los objetos: los ids se toman de la identidad, sin recargar
+            for match in auto_applied:
+                matched_bank_ids.update(_pk(bm) for bm in match.get("bank_movements") or [match["bank_movement"]])
+                matched_acc_ids.update(_pk(am) for am in match["accounting_movements"])
+            unmatched_bank = [bm for bm, bm_id in zip(bank_movements, bank_ids) if bm_id not in matched_bank_ids]
             
             # 5. Generar reporte de resultados
             result = {
@@ -1569,12 +1736,14 @@ class MatchingEngine:
                 "total_accounting_movements": len(accounting_movements),
                 "exact_matches": len(exact_matches),
                 "probable_matches": len(probable_matches),
+                "group_matches": len(group_matches),
                 "auto_applied": len(auto_applied),
-                "pending_review": len(bank_movements) - len(auto_applied),
+                "pending_review": len(unmatched_bank),
                 "matches_applied": auto_applied,
                 "suggested_matches": probable_matches,
-                "unmatched_bank": [bm for bm in bank_movements if not self._is_movement_matched(bm.id)],
-                "unmatched_accounting": [am for am in accounting_movements if not self._is_accounting_movement_matched(am.id)]
+                "suggested_groups": group_matches,
+                "unmatched_bank": unmatched_bank,
+                "unmatched_accounting": [am for am, am_id in zip(accounting_movements, acc_ids) if am_id not in matched_acc_ids]
             }
             
             return result
@@ -1605,7 +1774,10 @@ class MatchingEngine:
         from ..models.movimiento_contable import MovimientoContable
         from ..models.documento import Documento
         
-        query = self.db.query(MovimientoContable).join(Documento).filter(
+        # contains_eager: el documento (y su fecha) llega en la misma consulta del JOIN
+        query = self.db.query(MovimientoContable).join(Documento).options(
+            contains_eager(MovimientoContable.documento)
+        ).filter(
             MovimientoContable.cuenta_id == bank_account_id,
             Documento.empresa_id == empresa_id,
             MovimientoContable.reconciliation_status == "UNRECONCILED"
@@ -1618,84 +1790,221 @@ class MatchingEngine:
         
         return query.all()
     
+    def _matched_bank_movement_ids(self, bank_account_id: int, empresa_id: int) -> set:
+        """Ids de movimientos bancarios de la cuenta con conciliación activa"""
+        rows = self.db.query(Reconciliation.bank_movement_id).join(
+            BankMovement, Reconciliation.bank_movement_id == BankMovement.id
+        ).filter(
+            BankMovement.bank_account_id == bank_account_id,
+            BankMovement.empresa_id == empresa_id,
+            Reconciliation.status == "ACTIVE"
+        )
+        return {row.bank_movement_id for row in rows}
+    
+    def _matched_accounting_movement_ids(self, bank_account_id: int) -> set:
+        """Ids de movimientos contables de la cuenta que figuran en alguna conciliación"""
+        from ..models.movimiento_contable import MovimientoContable
+        
+        rows = self.db.query(ReconciliationMovement.accounting_movement_id).join(
+            MovimientoContable, ReconciliationMovement.accounting_movement_id == MovimientoContable.id
+        ).filter(MovimientoContable.cuenta_id == bank_account_id)
+        return {row.accounting_movement_id for row in rows}
+    
     def _find_exact_matches(self, bank_movements: List[BankMovement], 
-                           accounting_movements: List) -> List[Dict[str, Any]]:
-        """Encuentra coincidencias exactas por fecha, monto y referencia"""
+                           accounting_movements: List, index: "_IndiceContable" = None) -> List[Dict[str, Any]]:
+        """Encuentra coincidencias exactas por fecha y monto (índice hash por fecha y centavos)"""
+        index = index or _IndiceContable(accounting_movements)
         exact_matches = []
         
         for bank_mov in bank_movements:
-            for acc_mov in accounting_movements:
-                # Obtener fecha del documento asociado
-                acc_date = acc_mov.documento.fecha
-                # Calcular valor del movimiento contable (débito - crédito)
-                acc_value = acc_mov.debito - acc_mov.credito
-                
-                # Verificar coincidencia exacta
-                if (bank_mov.transaction_date == acc_date and
-                    abs(bank_mov.amount - abs(acc_value)) < self.default_amount_tolerance):
-                    
-                    match = {
-                        "bank_movement": bank_mov,
-                        "accounting_movements": [acc_mov],
-                        "match_type": "EXACT",
-                        "confidence_score": 1.0,
-                        "criteria_matched": ["date", "amount"],
-                        "date_difference": 0,
-                        "amount_difference": float(abs(bank_mov.amount - abs(acc_value)))
-                    }
-                    exact_matches.append(match)
-                    break  # Una vez encontrado match exacto, no buscar más
+            # El primero en el orden de la consulta gana, como en el recorrido lineal
+            position = index.exact(bank_mov.transaction_date, bank_mov.amount, self.default_amount_tolerance)
+            if position is None:
+                continue
+            acc_mov = accounting_movements[position]
+            match = {
+                "bank_movement": bank_mov,
+                "accounting_movements": [acc_mov],
+                "match_type": "EXACT",
+                "confidence_score": 1.0,
+                "criteria_matched": ["date", "amount"],
+                "date_difference": 0,
+                "amount_difference": float(abs(bank_mov.amount - index.values[position]))
+            }
+            exact_matches.append(match)
         
         return exact_matches
     
     def _find_probable_matches(self, bank_movements: List[BankMovement], 
                               accounting_movements: List, 
-                              exact_matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+                              exact_matches: List[Dict[str, Any]],
+                              index: "_IndiceContable" = None) -> List[Dict[str, Any]]:
         """Encuentra coincidencias probables con scoring"""
+        index = index or _IndiceContable(accounting_movements)
         probable_matches = []
+        matchers = {}
         
         # Excluir movimientos ya matched exactamente
         exact_bank_ids = {match["bank_movement"].id for match in exact_matches}
         exact_acc_ids = {acc_mov.id for match in exact_matches for acc_mov in match["accounting_movements"]}
         
+        # Fecha y monto aportan hasta 0.8 y el texto hasta 0.2: para llegar a 0.5 hace falta
+        # que fecha + monto sumen al menos 0.3. Con la fecha a d días, el monto debe aportar
+        # lo que le falte a la fecha, lo que acota la diferencia de monto a una fracción de
+        # la tolerancia del 5%. Solo esos candidatos, tomados de las ventanas ordenadas, se puntúan.
+        minimum_base = 0.5 - 0.2
+        windows = []  # (días, fracción de la tolerancia de monto; None = cualquier monto)
+        for days in range(-self.default_date_tolerance + 1, self.default_date_tolerance):
+            date_part = 0.4 if days == 0 else 0.4 * (1 - abs(days) / self.default_date_tolerance)
+            missing = minimum_base - date_part
+            windows.append((days, None if missing <= 0 else 1 - missing / 0.4))
+        far_fraction = 1 - minimum_base / 0.4
+        
         for bank_mov in bank_movements:
             if bank_mov.id in exact_bank_ids:
                 continue
-                
-            best_matches = []
             
-            for acc_mov in accounting_movements:
-                if acc_mov.id in exact_acc_ids:
+            amount = float(bank_mov.amount)
+            amount_limit = abs(amount * 0.05)
+            near = set()
+            for days, fraction in windows:
+                near.update(index.by_amount_window(
+                    amount, None if fraction is None else max(amount_limit * fraction, self.default_amount_tolerance),
+                    bank_mov.transaction_date + timedelta(days=days)
+                ))
+            
+            # Cota superior de cada candidato: fecha + monto + texto perfecto
+            pending = []
+            for position in near:
+                if accounting_movements[position].id in exact_acc_ids:
                     continue
+                partial = self._date_amount_score(bank_mov, index.dates[position], index.values[position])
+                if partial[0] + 0.2 >= 0.5:  # Umbral mínimo para considerar
+                    pending.append((partial[0] + 0.2, position, partial))
+            pending.sort(key=lambda x: (-x[0], x[1]))
+            
+            far = self._far_date_candidates(
+                bank_mov, index, max(amount_limit * far_fraction, self.default_amount_tolerance),
+                near, exact_acc_ids, accounting_movements
+            )
+            
+            # Textos solo mientras algún candidato pueda entrar al top 3 (orden estable por posición)
+            best_matches = []
+            for upper, position, partial in heapq.merge(pending, far, key=lambda x: -x[0]):
+                if len(best_matches) >= 3 and upper < best_matches[2][0]:
+                    break
+                acc_mov = accounting_movements[position]
+                score_data = self._text_score(bank_mov, acc_mov.concepto, partial, matchers)
+                if score_data["confidence_score"] < 0.5:
+                    continue
+                match = {
+                    "bank_movement": bank_mov,
+                    "accounting_movements": [acc_mov],
+                    "match_type": "PROBABLE",
+                    **score_data
+                }
+                best_matches.append((score_data["confidence_score"], position, match))
+                best_matches.sort(key=lambda x: (-x[0], x[1]))
+                del best_matches[3:]
+            
+            probable_matches.extend(match for _, _, match in best_matches)  # Top 3 matches por movimiento bancario
+        
+        return probable_matches
+    
+    def _far_date_candidates(self, bank_mov: BankMovement, index: "_IndiceContable", window: float,
+                             near: set, exclude_ids: set, accounting_movements: List):
+        """
+        Candidatos fuera de las ventanas de fecha: solo aporta el monto, así que la cota
+        baja con la diferencia. Se recorren del monto más cercano al más lejano.
+        """
+        for position in index.nearest_amounts(float(bank_mov.amount), window):
+            if position in near or accounting_movements[position].id in exclude_ids:
+                continue
+            partial = self._date_amount_score(bank_mov, index.dates[position], index.values[position])
+            if partial[0] + 0.2 >= 0.5:
+                yield partial[0] + 0.2, position, partial
+    
+    def _bank_direction(self, bank_mov: BankMovement) -> int:
+        """1 = entrada de dinero (débito en la cuenta contable del banco), -1 = salida"""
+        if bank_mov.amount < 0 or (bank_mov.transaction_type or "").strip().upper() in _BANK_OUTFLOW_TYPES:
+            return -1
+        return 1
+    
+    def _find_group_matches(self, bank_movements: List[BankMovement], accounting_movements: List,
+                            exact_matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Grupos N contables : 1 bancario (GROUP) y 1 contable : N bancarios (SPLIT) del mismo
+        sentido, dentro de la ventana de fechas, sobre los movimientos sin match exacto.
+        """
+        exact_bank_ids = {match["bank_movement"].id for match in exact_matches}
+        exact_acc_ids = {acc_mov.id for match in exact_matches for acc_mov in match["accounting_movements"]}
+        deadline = time.monotonic() + self.group_time_budget_ms / 1000
+        tolerance = _centavos(self.group_amount_tolerance)
+        
+        # Partidas por sentido, en centavos; la clave es la posición en la lista original
+        bank_items = {1: [], -1: []}
+        for position, bank_mov in enumerate(bank_movements):
+            cents = abs(_centavos(bank_mov.amount))
+            if bank_mov.id not in exact_bank_ids and cents:
+                bank_items[self._bank_direction(bank_mov)].append(
+                    conciliacion_grupos.Partida(position, bank_mov.transaction_date, cents)
+                )
+        acc_items = {1: [], -1: []}
+        for position, acc_mov in enumerate(accounting_movements):
+            cents = _centavos(acc_mov.debito - acc_mov.credito)
+            if acc_mov.id not in exact_acc_ids and cents:
+                acc_items[1 if cents > 0 else -1].append(
+                    conciliacion_grupos.Partida(position, acc_mov.documento.fecha, abs(cents))
+                )
+        
+        group_matches = []
+        for direction in (1, -1):
+            for match_type, targets, items in (("GROUP", bank_items[direction], acc_items[direction]),
+                                               ("SPLIT", acc_items[direction], bank_items[direction])):
+                groups = conciliacion_grupos.buscar_grupos(
+                    targets, items, tolerance, self.group_date_window, self.group_max_items, deadline
+                )
+                for group in groups:
+                    group["puntaje"] = conciliacion_grupos.puntaje_grupo(group, self.group_date_window, self.group_max_items)
+                conciliacion_grupos.marcar_ambiguos(groups)
                 
-                # Calcular score de coincidencia
-                score_data = self._calculate_match_score(bank_mov, acc_mov)
-                
-                if score_data["confidence_score"] >= 0.5:  # Umbral mínimo para considerar
+                for group in groups:
+                    if match_type == "GROUP":
+                        banks = [bank_movements[group["objetivo"]]]
+                        accounts = [accounting_movements[p] for p in group["partidas"]]
+                    else:
+                        banks = [bank_movements[p] for p in group["partidas"]]
+                        accounts = [accounting_movements[group["objetivo"]]]
                     match = {
-                        "bank_movement": bank_mov,
-                        "accounting_movements": [acc_mov],
-                        "match_type": "PROBABLE",
-                        **score_data
+                        "bank_movements": banks,
+                        "accounting_movements": accounts,
+                        "match_type": match_type,
+                        "confidence_score": group["puntaje"],
+                        "criteria_matched": ["amount_sum" if group["diferencia"] == 0 else "amount_sum_close", "date_window"],
+                        "date_difference": group["dias"],
+                        "amount_difference": group["diferencia"] / 100,
+                        "ambiguous": group["ambiguo"]
                     }
-                    best_matches.append(match)
-            
-            # Ordenar por score y tomar los mejores
-            best_matches.sort(key=lambda x: x["confidence_score"], reverse=True)
-            probable_matches.extend(best_matches[:3])  # Top 3 matches por movimiento bancario
+                    if match_type == "GROUP":
+                        match["bank_movement"] = banks[0]
+                    group_matches.append(match)
         
-        return probable_matches
+        if time.monotonic() > deadline:
+            print(f"[CONCILIACIÓN] Búsqueda por grupos cortada por tiempo ({self.group_time_budget_ms} ms); "
+                  f"{len(group_matches)} grupos encontrados.")
+        return group_matches
     
     def _calculate_match_score(self, bank_mov: BankMovement, acc_mov) -> Dict[str, Any]:
         """Calcula el score de coincidencia entre dos movimientos"""
+        # Valor del movimiento contable (débito - crédito) y fecha del documento asociado
+        partial = self._date_amount_score(bank_mov, acc_mov.documento.fecha, abs(acc_mov.debito - acc_mov.credito))
+        return self._text_score(bank_mov, acc_mov.concepto, partial)
+    
+    def _date_amount_score(self, bank_mov: BankMovement, acc_date: date, acc_value) -> Tuple[float, List[str], int, Any]:
+        """Parte del score por fecha y monto: (score, criterios, diferencia en días, diferencia de monto)"""
         score = 0.0
         criteria_matched = []
         
-        # Obtener fecha del documento asociado
-        acc_date = acc_mov.documento.fecha
-        # Calcular valor del movimiento contable (débito - crédito)
-        acc_value = acc_mov.debito - acc_mov.credito
-        
         # 1. Coincidencia de fecha (40% del score)
         date_diff = abs((bank_mov.transaction_date - acc_date).days)
         if date_diff == 0:
@@ -1706,18 +2015,28 @@ class MatchingEngine:
             criteria_matched.append("date_close")
         
         # 2. Coincidencia de monto (40% del score)
-        amount_diff = abs(bank_mov.amount - abs(acc_value))
+        amount_diff = abs(bank_mov.amount - acc_value)
+        amount_limit = abs(float(bank_mov.amount) * 0.05)  # 5% de tolerancia
         if amount_diff < self.default_amount_tolerance:
             score += 0.4
             criteria_matched.append("amount")
-        elif amount_diff <= abs(bank_mov.amount * 0.05):  # 5% de tolerancia
-            score += 0.4 * (1 - amount_diff / abs(bank_mov.amount * 0.05))
+        elif float(amount_diff) <= amount_limit:
+            score += 0.4 * (1 - float(amount_diff) / amount_limit)
             criteria_matched.append("amount_close")
         
+        return score, criteria_matched, date_diff, amount_diff
+    
+    def _text_score(self, bank_mov: BankMovement, concepto: Optional[str], partial: Tuple,
+                    matchers: Dict[str, difflib.SequenceMatcher] = None) -> Dict[str, Any]:
+        """Completa el score con la coincidencia de referencia/descripción"""
+        score, criteria_matched, date_diff, amount_diff = partial
+        criteria_matched = list(criteria_matched)
+        
         # 3. Coincidencia de referencia/descripción (20% del score)
         ref_similarity = self._calculate_text_similarity(
             bank_mov.description or "", 
-            acc_mov.concepto or ""
+            concepto or "",
+            matchers
         )
         
         if ref_similarity > 0.8:
@@ -1735,21 +2054,29 @@ class MatchingEngine:
             "reference_similarity": ref_similarity
         }
     
-    def _calculate_text_similarity(self, text1: str, text2: str) -> float:
+    def _calculate_text_similarity(self, text1: str, text2: str,
+                                   matchers: Dict[str, difflib.SequenceMatcher] = None) -> float:
         """Calcula similitud entre dos textos"""
         if not text1 or not text2:
             return 0.0
         
-        # Normalizar textos
-        text1 = text1.lower().strip()
-        text2 = text2.lower().strip()
+        # Normalizar textos (caché compartida: los conceptos se repiten mucho)
+        text1 = _normalizar_texto(text1)
+        text2 = _normalizar_texto(text2)
         
         if text1 == text2:
             return 1.0
         
-        # Usar difflib para calcular similitud
-        similarity = difflib.SequenceMatcher(None, text1, text2).ratio()
-        return similarity
+        # Usar difflib para calcular similitud. El matcher se reutiliza por texto contable:
+        # set_seq1 conserva el índice de caracteres de la segunda secuencia.
+        if matchers is None:
+            return difflib.SequenceMatcher(None, text1, text2).ratio()
+        matcher = matchers.get(text2)
+        if matcher is None:
+            matcher = matchers[text2] = difflib.SequenceMatcher(None, text1, text2)
+        else:
+            matcher.set_seq1(text1)
+        return matcher.ratio()
     
     def _compare_references(self, ref1: str, ref2: str) -> bool:
         """Compara referencias para match exacto"""
@@ -1759,46 +2086,58 @@ class MatchingEngine:
         return ref1.strip().lower() == ref2.strip().lower()
     
     def _apply_automatic_matches(self, exact_matches: List[Dict[str, Any]], 
-                               probable_matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Aplica matches automáticos que cumplen criterios de confianza"""
+                               probable_matches: List[Dict[str, Any]],
+                               group_matches: List[Dict[str, Any]] = ()) -> List[Dict[str, Any]]:
+        """
+        Aplica matches automáticos que cumplen criterios de confianza. La asignación es
+        global por puntaje: cada movimiento bancario o contable entra en una sola conciliación.
+        """
         applied_matches = []
         
         try:
-            # Aplicar todos los matches exactos
-            for match in exact_matches:
-                reconciliation = self._create_reconciliation(
-                    match["bank_movement"],
-                    match["accounting_movements"],
-                    "AUTO",
-                    match["confidence_score"],
-                    f"Match automático exacto: {', '.join(match['criteria_matched'])}"
-                )
+            # Exactos, probables con alta confianza y grupos no ambiguos con alta confianza
+            candidates = [(match, f"Match automático exacto: {', '.join(match['criteria_matched'])}")
+                          for match in exact_matches]
+            candidates += [(match, f"Match automático probable: {', '.join(match['criteria_matched'])}")
+                           for match in probable_matches if match["confidence_score"] >= self.min_confidence_score]
+            for match in group_matches:
+                if match["ambiguous"] or match["confidence_score"] < self.min_confidence_score:
+                    continue
+                if match["match_type"] == "GROUP":
+                    note = f"Match automático por grupo: {len(match['accounting_movements'])} movimientos contables"
+                else:
+                    note = f"Match automático fraccionado: {len(match['bank_movements'])} movimientos bancarios"
+                candidates.append((match, note))
+            
+            selected = conciliacion_grupos.asignar([
+                (match["confidence_score"],
+                 [bm.id for bm in match.get("bank_movements") or [match["bank_movement"]]],
+                 [am.id for am in match["accounting_movements"]])
+                for match, _ in candidates
+            ])
+            
+            for i in selected:
+                match, note = candidates[i]
+                # En un pago fraccionado cada movimiento bancario lleva su conciliación
+                reconciliations = [
+                    self._create_reconciliation(
+                        bank_movement,
+                        match["accounting_movements"],
+                        "AUTO",
+                        match["confidence_score"],
+                        note
+                    )
+                    for bank_movement in match.get("bank_movements") or [match["bank_movement"]]
+                ]
                 
-                if reconciliation:
+                if all(reconciliations):
                     applied_matches.append({
                         **match,
-                        "reconciliation_id": reconciliation.id,
+                        "reconciliation_id": reconciliations[0].id,
+                        "reconciliation_ids": [r.id for r in reconciliations],
                         "applied": True
                     })
             
-            # Aplicar matches probables con alta confianza
-            for match in probable_matches:
-                if match["confidence_score"] >= self.min_confidence_score:
-                    reconciliation = self._create_reconciliation(
-                        match["bank_movement"],
-                        match["accounting_movements"],
-                        "AUTO",
-                        match["confidence_score"],
-                        f"Match automático probable: {', '.join(match['criteria_matched'])}"
-                    )
-                    
-                    if reconciliation:
-                        applied_matches.append({
-                            **match,
-                            "reconciliation_id": reconciliation.id,
-                            "applied": True
-                        })
-            
             self.db.commit()
             return applied_matches
             
@@ -1973,10 +2312,17 @@ class MatchingEngine:
             bank_movement = reconciliation.bank_movement
             bank_movement.status = "PENDING"
             
-            # Revertir estado de movimientos contables
+            # Revertir estado de movimientos contables (en un pago fraccionado la partida
+            # sigue conciliada mientras otra conciliación activa la incluya)
             for rec_mov in reconciliation.accounting_movements:
                 acc_mov = rec_mov.accounting_movement
-                acc_mov.reconciliation_status = "UNRECONCILED"
+                still_active = self.db.query(ReconciliationMovement.id).join(Reconciliation).filter(
+                    ReconciliationMovement.accounting_movement_id == acc_mov.id,
+                    Reconciliation.status == "ACTIVE",
+                    Reconciliation.id != reconciliation_id
+                ).first()
+                if not still_active:
+                    acc_mov.reconciliation_status = "UNRECONCILED"
             
             # Marcar reconciliación como revertida
             reconciliation.status = "REVERSED"
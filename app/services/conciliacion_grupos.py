@@ -0,0 +1,186 @@
+# app/services/conciliacion_grupos.py
+"""
+Conciliación bancaria por grupos: varias partidas contables contra un
+movimiento bancario (consignaciones en lote) y una partida contable contra
+varios movimientos bancarios (pagos fraccionados).
+
+MatchingEngine solo propone parejas 1:1; estos casos se conciliaban a mano
+con apply_manual_match. Aquí:
+  - buscar_grupos: para cada objetivo busca subconjuntos de partidas dentro de
+    la ventana de fechas cuya suma coincide con el objetivo (± tolerancia).
+    Búsqueda en profundidad sobre los candidatos de mayor a menor, podando por
+    la suma máxima alcanzable con los cupos restantes, con tope de nodos por
+    objetivo y un presupuesto de tiempo para toda la corrida.
+  - asignar: selección global voraz por puntaje (mayor primero, grupos más
+    pequeños ante empate); cada movimiento entra en una sola conciliación.
+    Sustituye el "primero que llega" por fila bancaria.
+
+Los montos van en centavos (enteros) para que las sumas sean exactas. El módulo
+no toca la base: MatchingEngine arma las partidas y aplica el resultado.
+"""
+
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# clave: identificador opaco del llamador (posición o id); centavos > 0
+Partida = namedtuple("Partida", "clave fecha centavos")
+
+_MAX_CANDIDATOS = 32       # Partidas más cercanas en fecha que se consideran por objetivo
+_MAX_NODOS_OBJETIVO = 5000
+_MAX_GRUPOS_OBJETIVO = 3   # Al llegar aquí la búsqueda se corta y el objetivo queda ambiguo
+
+
+class _FinBusqueda(Exception):
+    pass
+
+
+def _subconjuntos(valores: List[int], objetivo: int, tolerancia: int, max_partidas: int,
+                  fin: Optional[float]) -> Tuple[List[Tuple[int, ...]], bool]:
+    """
+    Índices de los subconjuntos (2..max_partidas) de `valores` (descendentes) que suman
+    objetivo ± tolerancia, y si la búsqueda terminó (False si se cortó por algún tope).
+    """
+    acumulados = [0]
+    for valor in valores:
+        acumulados.append(acumulados[-1] + valor)
+    negativos = [-valor for valor in valores]  # Ascendente, para bisect
+    total = len(valores)
+    resultados: List[Tuple[int, ...]] = []
+    elegidos: List[int] = []
+    nodos = 0
+
+    def explorar(inicio: int, suma: int):
+        nonlocal nodos
+        nodos += 1
+        if nodos > _MAX_NODOS_OBJETIVO:
+            raise _FinBusqueda()
+        if fin is not None and nodos % 256 == 0 and time.monotonic() > fin:
+            raise _FinBusqueda()
+
+        # Última partida del grupo: las que cierran la suma forman un tramo contiguo (valores ordenados)
+        if elegidos:
+            desde = max(inicio, bisect_left(negativos, suma - objetivo - tolerancia))
+            hasta = bisect_right(negativos, suma - objetivo + tolerancia)
+            for j in range(desde, hasta):
+                resultados.append(tuple(elegidos) + (j,))
+                if len(resultados) >= _MAX_GRUPOS_OBJETIVO:
+                    raise _FinBusqueda()
+
+        # Partidas intermedias: hace falta espacio para al menos una más
+        cupos = max_partidas - len(elegidos)
+        if cupos < 2:
+            return
+        # Desde la primera que deja espacio para la menor de todas (las siguientes también caben)
+        desde = max(inicio, bisect_left(negativos, suma + valores[-1] - objetivo - tolerancia))
+        for i in range(desde, total - 1):
+            # Lo máximo que se puede sumar desde i con los cupos que quedan (los valores bajan)
+            tope = i + cupos if i + cupos < total else total
+            if suma + acumulados[tope] - acumulados[i] < objetivo - tolerancia:
+                return
+            elegidos.append(i)
+            explorar(i + 1, suma + valores[i])
+            elegidos.pop()
+
+    try:
+        explorar(0, 0)
+    except _FinBusqueda:
+        return resultados, False
+    return resultados, True
+
+
+def buscar_grupos(objetivos: Iterable[Partida], partidas: Sequence[Partida], tolerancia: int,
+                  ventana_dias: int, max_partidas: int, fin: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Grupos de `partidas` cuya suma coincide con cada objetivo. tolerancia en centavos;
+    fin: instante (time.monotonic) en que se deja de buscar.
+    Retorna [{"objetivo", "partidas" (claves), "diferencia" (centavos), "dias" (desfase máximo),
+    "completo" (False si la búsqueda de ese objetivo se cortó)}].
+    """
+    # Partidas por fecha, ordenadas por valor
+    por_fecha: Dict[Any, Tuple[List[int], List[Partida]]] = {}
+    for partida in sorted(partidas, key=lambda p: p.centavos):
+        valores, lista = por_fecha.setdefault(partida.fecha, ([], []))
+        valores.append(partida.centavos)
+        lista.append(partida)
+    # Días de la ventana del más cercano al más lejano: 0, -1, +1, -2, +2...
+    desfases = sorted(range(-ventana_dias, ventana_dias + 1), key=lambda d: (abs(d), d))
+
+    grupos = []
+    for objetivo in objetivos:
+        if fin is not None and time.monotonic() > fin:
+            break
+        # Con días muy cargados se toman las fechas más cercanas y, dentro del día,
+        # las partidas de mayor valor que caben en el objetivo
+        candidatos: List[Partida] = []
+        for desfase in desfases:
+            valores, lista = por_fecha.get(objetivo.fecha + timedelta(days=desfase), ((), ()))
+            hasta = bisect_right(valores, objetivo.centavos + tolerancia)
+            candidatos.extend(lista[max(0, hasta - (_MAX_CANDIDATOS - len(candidatos))):hasta])
+            if len(candidatos) >= _MAX_CANDIDATOS:
+                break
+        if len(candidatos) < 2:
+            continue
+        candidatos.sort(key=lambda p: -p.centavos)
+
+        encontrados, completo = _subconjuntos(
+            [p.centavos for p in candidatos], objetivo.centavos, tolerancia, max_partidas, fin
+        )
+        for indices in encontrados:
+            elegidas = [candidatos[i] for i in indices]
+            grupos.append({
+                "objetivo": objetivo.clave,
+                "partidas": tuple(p.clave for p in elegidas),
+                "diferencia": abs(sum(p.centavos for p in elegidas) - objetivo.centavos),
+                "dias": max(abs((p.fecha - objetivo.fecha).days) for p in elegidas),
+                "completo": completo,
+            })
+    return grupos
+
+
+def puntaje_grupo(grupo: Dict[str, Any], ventana_dias: int, max_partidas: int) -> float:
+    """Confianza de un grupo: monto exacto, cercanía de fechas y pocas partidas suben el puntaje"""
+    puntaje = 0.95 if grupo["diferencia"] == 0 else 0.85
+    if ventana_dias:
+        puntaje -= 0.1 * grupo["dias"] / ventana_dias
+    if max_partidas > 2:
+        puntaje -= 0.1 * (len(grupo["partidas"]) - 2) / (max_partidas - 2)
+    return round(puntaje, 4)
+
+
+def marcar_ambiguos(grupos: List[Dict[str, Any]]) -> None:
+    """
+    Marca `ambiguo` los grupos de objetivos con más de un grupo en el mejor puntaje o
+    cuya búsqueda se cortó (puede haber alternativas sin explorar). No se aplican solos.
+    """
+    mejores: Dict[Any, List[Dict[str, Any]]] = {}
+    for grupo in grupos:
+        actuales = mejores.get(grupo["objetivo"])
+        if not actuales or grupo["puntaje"] > actuales[0]["puntaje"]:
+            mejores[grupo["objetivo"]] = [grupo]
+        elif grupo["puntaje"] == actuales[0]["puntaje"]:
+            actuales.append(grupo)
+    for grupo in grupos:
+        grupo["ambiguo"] = len(mejores[grupo["objetivo"]]) > 1 or not grupo["completo"]
+
+
+def asignar(candidatos: List[Tuple[float, Iterable[Any], Iterable[Any]]]) -> List[int]:
+    """
+    Selección global voraz. candidatos: (puntaje, claves bancarias, claves contables).
+    Retorna los índices elegidos en orden de aplicación; ante empate de puntaje gana
+    el grupo más pequeño y luego el que llegó primero.
+    """
+    orden = sorted(range(len(candidatos)), key=lambda i: (
+        -candidatos[i][0], len(candidatos[i][1]) + len(candidatos[i][2]), i
+    ))
+    usados_banco, usados_contables = set(), set()
+    elegidos = []
+    for i in orden:
+        _, bancos, contables = candidatos[i]
+        if usados_banco.isdisjoint(bancos) and usados_contables.isdisjoint(contables):
+            usados_banco.update(bancos)
+            usados_contables.update(contables)
+            elegidos.append(i)
+    return elegidos
@@ -499,6 +499,71 @@ def registrar_consumo(db: Session, empresa_id: int, cantidad: int, documento_id:
             detalle={"faltante": remanente_a_consumir}
         )
 
+
+def registrar_consumo_lote(db: Session, empresa_id: int, documentos):
+    """
+    Consumo de un lote de documentos (creación masiva): una sola pasada de
+    registrar_consumo por mes con la cantidad total, en lugar de una por documento.
+    El historial se reparte luego por documento (mismas fuentes, en orden) para
+    que revertir_consumo de un documento individual siga devolviendo lo suyo.
+    documentos: iterable de (documento_id, fecha, cantidad).
+    """
+    por_mes = {}
+    for documento_id, fecha, cantidad in documentos:
+        if cantidad > 0:
+            por_mes.setdefault((fecha.year, fecha.month), []).append((documento_id, fecha, cantidad))
+
+    for _, grupo in sorted(por_mes.items()):
+        ancla_id, fecha_ancla, _ = grupo[0]
+        registrar_consumo(db, empresa_id, sum(c for _, _, c in grupo), documento_id=ancla_id, fecha_doc=fecha_ancla)
+        if len(grupo) > 1:
+            _repartir_historial(db, ancla_id, grupo)
+
+
+def _repartir_historial(db: Session, ancla_id: int, grupo):
+    db.flush()
+    tramos = db.query(HistorialConsumo).filter(
+        HistorialConsumo.documento_id == ancla_id,
+        HistorialConsumo.tipo_operacion == TipoOperacionConsumo.CONSUMO
+    ).order_by(HistorialConsumo.id).all()
+
+    pendientes = [[documento_id, cantidad] for documento_id, _, cantidad in grupo]
+    i = 0
+    for tramo in tramos:
+        restante = tramo.cantidad
+        saldo = tramo.saldo_fuente_antes
+        primero = True
+        while restante > 0 and i < len(pendientes):
+            documento_id, falta = pendientes[i]
+            toma = min(falta, restante)
+            if primero:
+                # El registro original queda con la porción del primer documento
+                tramo.documento_id = documento_id
+                tramo.cantidad = toma
+                tramo.saldo_fuente_despues = saldo - toma
+                primero = False
+            else:
+                db.add(HistorialConsumo(
+                    empresa_id=tramo.empresa_id,
+                    cantidad=toma,
+                    tipo_operacion=tramo.tipo_operacion,
+                    fuente_tipo=tramo.fuente_tipo,
+                    fuente_id=tramo.fuente_id,
+                    saldo_fuente_antes=saldo,
+                    saldo_fuente_despues=saldo - toma,
+                    documento_id=documento_id,
+                    fecha=tramo.fecha
+                ))
+            saldo -= toma
+            restante -= toma
+            pendientes[i][1] -= toma
+            if pendientes[i][1] == 0:
+                i += 1
+        if i >= len(pendientes):
+            # Jerarquía hija -> padre: cada nivel tiene sus propios tramos por el total
+            i = 0
+            pendientes = [[documento_id, cantidad] for documento_id, _, cantidad in grupo]
+
 def revertir_consumo(db: Session, documento_id: int):
     """
     Revierte TODO el consumo asociado a un documento.
@@ -14,6 +14,8 @@ from ..models import movimiento_contable as models_mov_cont
 from ..models import documento as models_doc
 from ..models import plan_cuenta as models_pc
 from ..models import empresa as models_empresa # <--- AGREGAR ESTA LÍNEA
+from app.services import saldos_mensuales as saldos_mensuales_service
+from app.services import arbol_puc
 
 # --- FIX: IMPORTACIONES PARA CONSUMO DE REGISTROS ---
 from sqlalchemy import extract
@@ -150,52 +152,20 @@ def get_escenario_estrategico(ratios: Dict[str, Decimal], capital_trabajo_neto:
 
 def get_saldos_balance_acumulado(db: Session, empresa_id: int, fecha_fin: date) -> List: 
     """Consulta consolidada de Balance (Clases 1, 2, 3) hasta la fecha de corte.
-    OPTIMIZADO: Usa func.left() en vez de múltiples startswith() para mejor rendimiento en PostgreSQL.
+    OPTIMIZADO: Lee los meses completos desde la tabla de saldos mensuales materializados
+    y solo consulta en vivo los días del mes en curso.
     """
-    Mov = models_mov_cont.MovimientoContable
-    Doc = models_doc.Documento
-    PC = models_pc.PlanCuenta
-    
-    q_saldos_acumulados = db.query(
-        PC.codigo.label('codigo'),
-        func.sum(Mov.debito).label('total_debito'),
-        func.sum(Mov.credito).label('total_credito'),
-    ).join(Mov, Mov.cuenta_id == PC.id
-    ).join(Doc, Doc.id == Mov.documento_id
-    ).filter(
-        Doc.empresa_id == empresa_id, 
-        Doc.anulado == False,
-        Doc.fecha <= fecha_fin,
-        # ✅ OPTIMIZADO: Condición única que usa índice en PostgreSQL
-        func.left(PC.codigo, 1).in_(['1', '2', '3'])
-    ).group_by(PC.codigo).all()
-    
-    return q_saldos_acumulados
+    return saldos_mensuales_service.sumas_por_codigo(
+        db, empresa_id, fecha_fin, prefijos=['1', '2', '3']
+    )
 
 def get_saldos_pyg_periodo(db: Session, empresa_id: int, fecha_inicio: date, fecha_fin: date) -> List:
     """Consulta consolidada de PyG (Clases 4, 5, 6, 7, 8) para un periodo específico.
-    OPTIMIZADO: Usa func.left() en vez de múltiples startswith() para mejor rendimiento en PostgreSQL.
+    OPTIMIZADO: Lee los meses completos desde la tabla de saldos mensuales materializados.
     """
-    Mov = models_mov_cont.MovimientoContable
-    Doc = models_doc.Documento
-    PC = models_pc.PlanCuenta
-    
-    q_saldos_periodo = db.query(
-        PC.codigo.label('codigo'),
-        func.sum(Mov.debito).label('total_debito'),
-        func.sum(Mov.credito).label('total_credito'),
-    ).join(Mov, Mov.cuenta_id == PC.id
-    ).join(Doc, Doc.id == Mov.documento_id
-    ).filter(
-        Doc.empresa_id == empresa_id, 
-        Doc.anulado == False,
-        Doc.fecha >= fecha_inicio,
-        Doc.fecha <= fecha_fin,
-        # ✅ OPTIMIZADO: Condición única que usa índice en PostgreSQL
-        func.left(PC.codigo, 1).in_(['4', '5', '6', '7', '8'])
-    ).group_by(PC.codigo).all()
-    
-    return q_saldos_periodo
+    return saldos_mensuales_service.sumas_por_codigo(
+        db, empresa_id, fecha_fin, fecha_desde=fecha_inicio, prefijos=['4', '5', '6', '7', '8']
+    )
 
 
 # ==========================================================
@@ -627,59 +597,16 @@ def get_unified_saldos(db: Session, empresa_id: int, fecha_start: date, fecha_en
             
     return saldos
 
-def build_hierarchical_data(saldos: Dict[str, float], names_map: Dict[str, str]) -> Dict[str, float]:
-    """
-    Genera saldos en las cuentas padre sumando recursivamente los hijos (mayorizacion PUC).
-
-    CORRECCION: La version anterior tenia doble conteo porque:
-      1. Leia expanded_saldos[code] mientras modificaba ese mismo dict.
-      2. El while tenia DOS recortes por iteracion, saltando niveles.
-
-    Esta version itera sobre el dict ORIGINAL invariable y sube UN nivel a la vez.
-    Jerarquia PUC Colombia: Auxiliar(6+) -> Subcuenta(6) -> Cuenta(4) -> Grupo(2) -> Clase(1)
-    """
-    # 1. Comenzar con los saldos originales (cuentas con movimientos reales)
-    expanded_saldos = dict(saldos)
-
-    # 2. CRITICO: iteramos sobre 'saldos' (original inmutable), NO sobre 'expanded_saldos'
-    for code, val in saldos.items():
-        if not val:
-            continue
-
-        current = str(code)
-
-        # Subir UN nivel a la vez hasta la Clase (1 digito)
-        while True:
-            n = len(current)
-            if n > 6:
-                parent = current[:6]      # Auxiliar largo -> Subcuenta (6 digitos)
-            elif n > 4:
-                parent = current[:4]      # Subcuenta     -> Cuenta    (4 digitos)
-            elif n > 2:
-                parent = current[:2]      # Cuenta        -> Grupo     (2 digitos)
-            elif n > 1:
-                parent = current[:1]      # Grupo         -> Clase     (1 digito)
-            else:
-                break  # Ya estamos en Clase (1 digito), no hay padre
-
-            # Acumular el valor de la hoja en el padre
-            expanded_saldos[parent] = expanded_saldos.get(parent, 0.0) + val
-
-            # El padre se convierte en el siguiente "current"
-            current = parent
-
-    return expanded_saldos
-
-
 def get_horizontal_analysis(db: Session, empresa_id: int, p1_start: date, p1_end: date, p2_start: date, p2_end: date):
     # 1. Obtener saldos crudos
     saldos_1 = get_unified_saldos(db, empresa_id, p1_start, p1_end)
     saldos_2 = get_unified_saldos(db, empresa_id, p2_start, p2_end)
     names_map = get_account_names_map(db, empresa_id)
     
-    # 2. Expandir jerarquía
-    tree_1 = build_hierarchical_data(saldos_1, names_map)
-    tree_2 = build_hierarchical_data(saldos_2, names_map)
+    # 2. Expandir jerarquía (mayorización PUC, ver arbol_puc)
+    arbol = arbol_puc.get_arbol_puc(db, empresa_id)
+    tree_1 = arbol.acumular_por_codigo(saldos_1)
+    tree_2 = arbol.acumular_por_codigo(saldos_2)
     
     # 3. Unir claves
     all_codes = sorted(set(list(tree_1.keys()) + list(tree_2.keys())))
@@ -721,7 +648,7 @@ def get_horizontal_analysis(db: Session, empresa_id: int, p1_start: date, p1_end
 def get_vertical_analysis(db: Session, empresa_id: int, start: date, end: date):
     saldos = get_unified_saldos(db, empresa_id, start, end)
     names_map = get_account_names_map(db, empresa_id)
-    tree = build_hierarchical_data(saldos, names_map)
+    tree = arbol_puc.get_arbol_puc(db, empresa_id).acumular_por_codigo(saldos)
     
     all_codes = sorted(tree.keys())
     
@@ -3,7 +3,7 @@
 # para la funcionalidad de utilidades, añadiendo la función faltante.
 
 from sqlalchemy.orm import Session, selectinload, joinedload, contains_eager, aliased
-from sqlalchemy import func, and_, case, or_, inspect, delete, select, cast, String as SAString, DECIMAL
+from sqlalchemy import func, and_, case, or_, inspect, delete, select, cast, text, String as SAString, DECIMAL
 from fastapi import HTTPException, status
 from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, date, time
@@ -145,6 +145,114 @@ def contar_registros_por_empresa(db: Session) -> List[diagnostico_schemas.Conteo
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error interno al calcular el conteo de registros.")
 
 
+# --- ASESOR DE ÍNDICES ---
+# Tablas calientes de reportes: un escaneo secuencial sobre ellas en un tenant grande
+# indica un índice faltante (ver migración c3d4e5f6a7b8).
+TABLAS_CALIENTES = ("movimientos_contables", "documentos", "aplicacion_pagos")
+
+
+def _consultas_reportes(db: Session, empresa_id: int) -> List[Tuple[str, Any]]:
+    """Réplicas representativas de las consultas de balance, auxiliares y cartera."""
+    Mov = models_mov.MovimientoContable
+    Doc = models_doc.Documento
+    Apl = models_aplicacion.AplicacionPago
+
+    muestra = db.query(Mov.cuenta_id, Mov.tercero_id, Doc.beneficiario_id, Doc.tipo_documento_id, Doc.numero)\
+        .join(Doc, Doc.id == Mov.documento_id)\
+        .filter(Doc.empresa_id == empresa_id).order_by(Doc.id.desc()).first()
+    if not muestra:
+        return []
+    tercero_id = muestra.tercero_id or muestra.beneficiario_id or 0
+    hoy = date.today()
+    inicio_ano = date(hoy.year, 1, 1)
+
+    return [
+        ("Balance de prueba (saldos iniciales)",
+         select(Mov.cuenta_id, func.sum(Mov.debito), func.sum(Mov.credito))
+         .join(Doc, Doc.id == Mov.documento_id)
+         .where(Doc.empresa_id == empresa_id, Doc.anulado == False, Doc.fecha < inicio_ano)
+         .group_by(Mov.cuenta_id)),
+        ("Auxiliar por cuenta",
+         select(Doc.fecha, Doc.numero, Mov.debito, Mov.credito)
+         .join(Doc, Doc.id == Mov.documento_id)
+         .where(Doc.empresa_id == empresa_id, Mov.cuenta_id == muestra.cuenta_id,
+                Doc.fecha.between(inicio_ano, hoy), Doc.anulado == False)
+         .order_by(Doc.fecha, Doc.numero)),
+        ("Auxiliar por tercero",
+         select(Mov.cuenta_id, func.sum(Mov.debito), func.sum(Mov.credito))
+         .join(Doc, Doc.id == Mov.documento_id)
+         .where(Doc.empresa_id == empresa_id, Doc.anulado == False, Doc.fecha < hoy,
+                or_(Mov.tercero_id == tercero_id, and_(Mov.tercero_id.is_(None), Doc.beneficiario_id == tercero_id)))
+         .group_by(Mov.cuenta_id)),
+        ("Cartera (aplicaciones por factura)",
+         select(Apl.documento_factura_id, func.sum(Apl.valor_aplicado))
+         .join(Doc, Doc.id == Apl.documento_factura_id)
+         .where(Doc.empresa_id == empresa_id, Doc.beneficiario_id == tercero_id, Doc.anulado == False)
+         .group_by(Apl.documento_factura_id)),
+        ("Documento por tipo y número",
+         select(Doc.id)
+         .where(Doc.empresa_id == empresa_id, Doc.tipo_documento_id == muestra.tipo_documento_id,
+                Doc.numero == muestra.numero)),
+    ]
+
+
+def _escaneos_secuenciales(plan: List[str], dialecto: str) -> List[str]:
+    tablas = []
+    for linea in plan:
+        for tabla in TABLAS_CALIENTES:
+            if dialecto == "postgresql":
+                if f"Seq Scan on {tabla}" in linea:
+                    tablas.append(tabla)
+            elif f"SCAN {tabla}" in linea and "USING" not in linea:
+                tablas.append(tabla)
+    return sorted(set(tablas))
+
+
+def analizar_indices_reportes(db: Session, min_registros: int = 50000, max_empresas: int = 5) -> List[diagnostico_schemas.PlanConsultaResult]:
+    """
+    Ejecuta EXPLAIN sobre las consultas principales de reportes para los tenants
+    más grandes y marca los escaneos secuenciales sobre las tablas calientes.
+    """
+    dialecto = db.get_bind().dialect.name
+    prefijo_explain = "EXPLAIN " if dialecto == "postgresql" else "EXPLAIN QUERY PLAN "
+
+    conteos = db.query(
+        models_doc.Documento.empresa_id,
+        func.count(models_mov.MovimientoContable.id).label("total")
+    ).join(models_mov.MovimientoContable, models_mov.MovimientoContable.documento_id == models_doc.Documento.id)\
+     .group_by(models_doc.Documento.empresa_id)\
+     .having(func.count(models_mov.MovimientoContable.id) >= min_registros)\
+     .order_by(func.count(models_mov.MovimientoContable.id).desc())\
+     .limit(max_empresas).all()
+
+    nombres = {e.id: e.razon_social for e in db.query(models_empresa.Empresa.id, models_empresa.Empresa.razon_social)
+               .filter(models_empresa.Empresa.id.in_([c.empresa_id for c in conteos])).all()}
+
+    resultados = []
+    for conteo in conteos:
+        for nombre_consulta, stmt in _consultas_reportes(db, conteo.empresa_id):
+            sql = str(stmt.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True}))
+            try:
+                filas = db.execute(text(prefijo_explain + sql)).all()
+            except Exception as e:
+                db.rollback()
+                print(f"[ASESOR INDICES] Error en EXPLAIN '{nombre_consulta}' empresa {conteo.empresa_id}: {e}")
+                continue
+            # PostgreSQL: una columna de texto por línea. SQLite: (id, parent, notused, detail).
+            plan = [str(f[-1]) for f in filas]
+            escaneos = _escaneos_secuenciales(plan, dialecto)
+            resultados.append(diagnostico_schemas.PlanConsultaResult(
+                empresa_id=conteo.empresa_id,
+                nombre_empresa=nombres.get(conteo.empresa_id, ""),
+                total_registros=conteo.total,
+                consulta=nombre_consulta,
+                escaneos_secuenciales=escaneos,
+                alerta=bool(escaneos),
+                plan=plan
+            ))
+    return resultados
+
+
 # Asegúrate de importar esto en la parte superior si no existe: 
 # from sqlalchemy import func, cast, String as SAString
 
@@ -1000,7 +1108,7 @@ def get_producto_para_kardex(db: Session, producto_id: int) -> Optional[models_p
 # Importaciones para PDF
 from jinja2 import Environment, FileSystemLoader
 from io import BytesIO
-from weasyprint import HTML
+from ..services import motor_pdf
 import os
 
 
@@ -1009,7 +1117,7 @@ import os
 # Importaciones para PDF
 from jinja2 import Environment, FileSystemLoader
 from io import BytesIO
-from weasyprint import HTML
+from ..services import motor_pdf
 import os
 
 # --- INICIO: LÓGICA DE FILTRO DE MILES INYECTADA ---
@@ -1089,7 +1197,7 @@ def generar_pdf_lista_productos(db: Session, empresa_id: int, filtros: schemas.P
         html_out = template.render(context)
 
         # 5. Generar PDF con WeasyPrint
-        pdf_file = HTML(string=html_out).write_pdf(stylesheets=[])
+        pdf_file = motor_pdf.html_a_pdf(html_out)
         return pdf_file
 
     except HTTPException as e:
@@ -12,9 +12,10 @@ from app.core.security import create_print_token
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 import json
-from weasyprint import HTML
+from app.services import motor_pdf
 # Se añade la importación del servicio de cartera para el recálculo
 from app.services import cartera as cartera_service
+from app.services import cola_cartera
 
 # Importamos el guardián de periodos
 from app.services import periodo as periodo_service
@@ -24,15 +25,21 @@ import os
 from app.services import consumo_service
 from app.services.consumo_service import SaldoInsuficienteException
 # ---------------------------
+# --- SALDOS MENSUALES MATERIALIZADOS ---
+from app.services import saldos_mensuales as saldos_mensuales_service
+from app.services import saldos_cierre as saldos_cierre_service
+from app.services import inventario_puntos_control  # Registra la invalidación de puntos de control del kárdex
+from app.services.propiedad_horizontal import estado_cuenta_service  # Registra la invalidación del estado de cuenta PH
+from app.services import exportacion_streaming
 
 
 
 # --- INICIO: ARQUITECTURA DE PLANTILLAS REFACTORIZADA ---
-# 1. Importamos el nuevo diccionario con las plantillas pre-compiladas.
-from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
+# 1. Diccionario de plantillas empaquetadas (carga perezosa) y registro de plantillas compiladas.
+from app.services.plantillas_html import TEMPLATES_EMPAQUETADOS
+from app.services import plantillas_html
 
 # 2. Importamos las librerías necesarias para filtros complejos de Jinja2.
-from jinja2 import Environment, select_autoescape
 import itertools
 import operator
 
@@ -45,11 +52,19 @@ from app.utils.numero_a_letras import numero_a_letras
 from app.models.cupo_adicional import CupoAdicional # <--- AGREGAR ESTO
 
 # 3. Creamos UNA ÚNICA instancia del entorno de Jinja2 para todo el módulo.
-#    Ya no cargará desde el sistema de archivos (loader=None).
+#    Carga desde las plantillas empaquetadas (ver plantillas_html), no del sistema de archivos.
 #    Le pre-cargamos los filtros que sabemos que se usan en las plantillas.
-GLOBAL_JINJA_ENV = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
+def _format_decimal_filter(value, precision=2):
+    try:
+        val = float(value)
+        return f"{val:,.{precision}f}"
+    except (ValueError, TypeError):
+        return value
+
+GLOBAL_JINJA_ENV = plantillas_html.crear_entorno()
 GLOBAL_JINJA_ENV.filters['slice'] = lambda value, start, end: value[start:end]
 GLOBAL_JINJA_ENV.filters['groupby'] = lambda value, attribute: itertools.groupby(sorted(value, key=operator.itemgetter(attribute)), operator.itemgetter(attribute))
+GLOBAL_JINJA_ENV.filters['format_decimal'] = _format_decimal_filter
 
 GLOBAL_JINJA_ENV.globals['list'] = list
 # --- FIN: ARQUITECTURA DE PLANTILLAS REFACTORIZADA ---
@@ -109,11 +124,14 @@ def _documento_afecta_cuentas(db: Session, documento_id: int, cuentas_ids: List[
 # --- FIN: FUNCIONES AUXILIARES ---
 
 def trigger_recalc_if_cxc_cxp(db: Session, documento_id: int, empresa_id: int, commit: bool = False,
-                              injected_cuentas_cxc=None, injected_cuentas_cxp=None, injected_conceptos_ph=None):
+                              injected_cuentas_cxc=None, injected_cuentas_cxp=None, injected_conceptos_ph=None,
+                              incremental: bool = True):
     """
     Gatillo automático: Identifica si un documento afecta cuentas de Cartera/Proveedores
     y dispara el recálculo para los terceros involucrados.
     Nota: commit=False por defecto para que el caller controle la transacción.
+    incremental=True permite recalcular solo desde la posición del documento
+    (usar False si el documento pudo cambiar de fecha).
     IMPORTANTE: Las excepciones se propagan al caller para que pueda hacer rollback.
     """
     # 1. Obtener cuentas configuradas
@@ -167,7 +185,8 @@ def trigger_recalc_if_cxc_cxp(db: Session, documento_id: int, empresa_id: int, c
             commit=commit,
             injected_cuentas_cxc=injected_cuentas_cxc,
             injected_cuentas_cxp=injected_cuentas_cxp,
-            injected_conceptos_ph=injected_conceptos_ph
+            injected_conceptos_ph=injected_conceptos_ph,
+            documento_id=documento_id if incremental else None
         )
     print(f"[TRIGGER CXC/CXP] Doc {documento_id}: Recalculo completado exitosamente.")
 
@@ -283,6 +302,7 @@ def create_documento(db: Session, documento: schemas_doc.DocumentoCreate, user_i
         
         # 2. Hacemos FLUSH para que la BD asigne el ID (autoincrement) y valores por defecto,
         #    pero SIN confirmar la transacción todavía.
+        #    (Los saldos mensuales materializados se suman en este mismo flush.)
         db.flush()
         db.refresh(db_documento)
         
@@ -380,6 +400,9 @@ def anular_documento(db: Session, documento_id: int, empresa_id: int, user_id: i
         db.add(log_entry)
         db_documento.anulado = True
         db_documento.estado = 'ANULADO'
+
+        # --- SALDOS MENSUALES: el documento deja de sumar ---
+        saldos_mensuales_service.retirar_documento(db, db_documento.id)
         
         # --- REVERSIÓN DE CONSUMO ---
         # "Todo documento anulado devuelve sus registros al plan (o fuente)"
@@ -619,9 +642,14 @@ def eliminar_documento(db: Session, documento_id: int, empresa_id: int, user_id:
                 terceros_recalc.add(mt.tercero_id)
 
         # C. Eliminar Movimientos Contables
+        #    (Antes, descontamos sus valores de los saldos mensuales si el documento aún sumaba)
+        if not db_documento.anulado:
+            saldos_mensuales_service.retirar_documento(db, documento_id)
         db.query(models_mov).filter(models_mov.documento_id == documento_id).delete(synchronize_session=False)
         
         # D. Finalmente, Eliminar el Documento
+        #    (su posición queda como pista para el recálculo acotado de cartera)
+        pista_cartera = cartera_service.PistaEliminado(db_documento.fecha, db_documento.id)
         db.delete(db_documento)
 
 
@@ -655,7 +683,8 @@ def eliminar_documento(db: Session, documento_id: int, empresa_id: int, user_id:
                     commit=commit,
                     injected_cuentas_cxc=injected_cuentas_cxc,
                     injected_cuentas_cxp=injected_cuentas_cxp,
-                    injected_conceptos_ph=injected_conceptos_ph
+                    injected_conceptos_ph=injected_conceptos_ph,
+                    documento_id=pista_cartera
                 )
         
         if commit:
@@ -802,6 +831,9 @@ def reactivar_documento(db: Session, documento_id: int, empresa_id: int):
 
         db_documento.anulado = False
         db_documento.estado = 'ACTIVO'
+
+        # --- SALDOS MENSUALES: el documento vuelve a sumar ---
+        saldos_mensuales_service.aplicar_documento(db, db_documento.id)
         
         # --- GATILLO AUTOMÁTICO DE RECÁLCULO (NUEVO) ---
         # Si el documento afecta inventario, al reactivarlo debemos recalcular
@@ -851,6 +883,7 @@ def generar_pdf_documento(db: Session, documento_id: int, empresa_id: int):
 
     # 2. SELECCIÓN DE PLANTILLA (Refactorizado para priorizar diseños de usuario)
     html_content = None
+    formato_usuario = None
     tipo_doc = db_doc.tipo_documento
     tipo_codigo = tipo_doc.codigo.lower() if tipo_doc else "unknown"
     func_especial = tipo_doc.funcion_especial if tipo_doc else None
@@ -875,6 +908,7 @@ def generar_pdf_documento(db: Session, documento_id: int, empresa_id: int):
         if plantilla_db:
             print(f"[OK] [PDF] -> Usando plantilla personalizada de BD: {plantilla_db.nombre}")
             html_content = plantilla_db.contenido_html
+            formato_usuario = plantilla_db if html_content else None
 
     # PRIORIDAD 3: FALLBACK A PLANTILLAS EMPAQUETADAS SEGÚN COMPORTAMIENTO
     if not html_content:
@@ -1255,18 +1289,12 @@ def generar_pdf_documento(db: Session, documento_id: int, empresa_id: int):
 
     # 6. Render
     try:
-        if 'format_decimal' not in GLOBAL_JINJA_ENV.filters:
-            def format_decimal_filter(value, precision=2):
-                try:
-                    val = float(value)
-                    return f"{val:,.{precision}f}"
-                except (ValueError, TypeError):
-                    return value
-            GLOBAL_JINJA_ENV.filters['format_decimal'] = format_decimal_filter
-            
-        template = GLOBAL_JINJA_ENV.from_string(html_content)
+        if formato_usuario is not None:
+            template = plantillas_html.compilar_formato(GLOBAL_JINJA_ENV, formato_usuario)
+        else:
+            template = plantillas_html.compilar(GLOBAL_JINJA_ENV, html_content)
         rendered_html = template.render(context)
-        pdf_file = HTML(string=rendered_html).write_pdf()
+        pdf_file = motor_pdf.html_a_pdf(rendered_html, prioridad=motor_pdf.PRIORIDAD_INTERACTIVA)
         filename = f"{db_doc.tipo_documento.codigo}_{db_doc.numero}.pdf"
         return pdf_file, filename
     except Exception as e:
@@ -1289,17 +1317,11 @@ def generate_account_ledger_report(
     if not cuenta_info:
         raise HTTPException(status_code=404, detail="Cuenta no encontrada para la empresa.")
 
-    saldo_anterior_query = db.query(
-        func.sum(models_mov.debito).label('total_debito'),
-        func.sum(models_mov.credito).label('total_credito')
-    ).join(models_doc, models_mov.documento_id == models_doc.id) \
-    .filter(
-        models_doc.empresa_id == empresa_id,
-        models_mov.cuenta_id == cuenta_id,
-        models_doc.fecha < fecha_inicio,
-        models_doc.anulado.is_(False)
-    )
-    saldo_anterior_result = saldo_anterior_query.first()
+    # Saldo anterior: parte de la foto congelada del último período cerrado
+    # y solo suma los movimientos posteriores a ella.
+    saldo_anterior_debito, saldo_anterior_credito = saldos_cierre_service.saldos_anteriores_por_cuenta(
+        db, empresa_id, fecha_inicio, cuenta_ids=[cuenta_id]
+    ).get(cuenta_id, (0, 0))
     # --- MEJORA: LÓGICA DE NATURALEZA DE CUENTA ---
     # Determinamos si la cuenta es de naturaleza CRÉDITO para invertir el signo visualmente.
     # 1 (Activo), 5 (Gastos), 6 (Costos), 8 (Debe) -> Naturaleza DÉBITO (+).
@@ -1309,8 +1331,7 @@ def generate_account_ledger_report(
     nature_factor = -1 if is_credit_nature else 1
 
     # Calculamos el saldo neto matemático (Débito - Crédito)
-    saldo_anterior_neto = (saldo_anterior_result.total_debito or 0) - \
-                     (saldo_anterior_result.total_credito or 0)
+    saldo_anterior_neto = saldo_anterior_debito - saldo_anterior_credito
     
     # Aplicamos el factor para el saldo inicial visual
     saldo_anterior = saldo_anterior_neto * nature_factor
@@ -1427,10 +1448,9 @@ def generate_account_ledger_report_pdf(
     }
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/account_ledger_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/account_ledger_report.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/account_ledger_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -1451,25 +1471,11 @@ def generate_tercero_account_ledger_report(
     if not tercero_info:
         raise HTTPException(status_code=404, detail="Tercero no encontrado para la empresa.")
 
-    saldo_anterior_global_query = db.query(
-        func.sum(models_mov.debito).label('total_debito'),
-        func.sum(models_mov.credito).label('total_credito')
-    ).join(models_doc, models_mov.documento_id == models_doc.id) \
-    .filter(
-        models_doc.empresa_id == empresa_id,
-        or_(
-            models_mov.tercero_id == tercero_id,
-            and_(models_mov.tercero_id.is_(None), models_doc.beneficiario_id == tercero_id)
-        ),
-        models_doc.fecha < fecha_inicio,
-        models_doc.anulado == False
+    # Saldos anteriores por cuenta del tercero (foto de cierre + movimientos posteriores)
+    saldos_anteriores = saldos_cierre_service.saldos_anteriores_por_cuenta(
+        db, empresa_id, fecha_inicio, cuenta_ids=cuenta_ids or None, tercero_id=tercero_id
     )
-    if cuenta_ids:
-        saldo_anterior_global_query = saldo_anterior_global_query.filter(models_mov.cuenta_id.in_(cuenta_ids))
-
-    saldo_anterior_global_result = saldo_anterior_global_query.first()
-    saldo_anterior_global = float((saldo_anterior_global_result.total_debito or 0) - \
-                                (saldo_anterior_global_result.total_credito or 0))
+    saldo_anterior_global = float(sum(d - c for d, c in saldos_anteriores.values()))
 
     movimientos_query = db.query(
         models_doc.fecha,
@@ -1516,24 +1522,9 @@ def generate_tercero_account_ledger_report(
     all_affected_account_ids = set(mov['cuenta_id'] for mov in movimientos_data_dicts)
     saldos_iniciales_por_cuenta = {}
 
-    if all_affected_account_ids:
-        for c_id in all_affected_account_ids:
-            saldo_query_cuenta = db.query(
-                func.sum(models_mov.debito).label('total_debito'),
-                func.sum(models_mov.credito).label('total_credito')
-            ).join(models_doc, models_mov.documento_id == models_doc.id) \
-            .filter(
-                models_doc.empresa_id == empresa_id,
-                or_(
-                    models_mov.tercero_id == tercero_id,
-                    and_(models_mov.tercero_id.is_(None), models_doc.beneficiario_id == tercero_id)
-                ),
-                models_mov.cuenta_id == c_id,
-                models_doc.fecha < fecha_inicio,
-                models_doc.anulado == False
-            ).first()
-            saldos_iniciales_por_cuenta[c_id] = float((saldo_query_cuenta.total_debito or 0) - \
-                                                (saldo_query_cuenta.total_credito or 0))
+    for c_id in all_affected_account_ids:
+        debito_ant, credito_ant = saldos_anteriores.get(c_id, (0, 0))
+        saldos_iniciales_por_cuenta[c_id] = float(debito_ant - credito_ant)
 
     current_running_balances_per_account = saldos_iniciales_por_cuenta.copy()
     final_formatted_movimientos = []
@@ -1615,10 +1606,9 @@ def generate_tercero_account_ledger_report_pdf(
     }
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/tercero_account_ledger_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/tercero_account_ledger_report.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'tercero_account_ledger_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -1768,10 +1758,9 @@ def generate_income_statement_report_pdf(
     }
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/income_statement_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/income_statement_report.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/income_statement_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -1944,11 +1933,11 @@ def generate_income_statement_gerencial_report_pdf(
         if not template_string:
             raise KeyError("Template 'reports/estado_resultados_gerencial.html' not found in package or filesystem")
             
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.compilar(GLOBAL_JINJA_ENV, template_string)
         rendered_html = template.render(context)
         
         # Opciones para WeasyPrint si es necesario
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/estado_resultados_gerencial.html' no pudo ser localizada.")
     except Exception as e:
@@ -2083,10 +2072,9 @@ def generate_income_statement_cc_report_pdf(
     }
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/income_statement_cc_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/income_statement_cc_report.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/income_statement_cc_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -2278,10 +2266,9 @@ def generate_auxiliar_cc_cuenta_report_pdf(
     }
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/auxiliar_cc_cuenta_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/auxiliar_cc_cuenta_report.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/auxiliar_cc_cuenta_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -2368,15 +2355,14 @@ def generate_balance_sheet_cc_report_pdf(db: Session, empresa_id: int, fecha_cor
             centro_costo_nombre = f"{cc.codigo} - {cc.nombre}"
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS["reports/balance_general_cc_report.html"]
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/balance_general_cc_report.html')
         html_string = template.render(
             reporte=report_data,
             empresa=empresa,
             fecha_corte=fecha_corte,
             centro_costo_nombre=centro_costo_nombre 
         )
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/balance_general_cc_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -2475,52 +2461,45 @@ def anular_documentos_masivamente(db: Session, payload: schemas_doc.DocumentoAcc
         ).order_by(func.coalesce(models_ph_concepto.orden, 999).asc(), models_ph_concepto.id.asc()).all()
         # -------------------------
 
-        terceros_a_recalcular = set()
-
-        # Iniciamos un savepoint para que el rollback sea total pero podamos manejar excepciones
-        with db.begin_nested():
-            for doc_id in payload.documentoIds:
-                res = anular_documento(
-                    db=db,
-                    documento_id=doc_id,
-                    empresa_id=empresa_id,
-                    user_id=user_id,
-                    user_email=user_email,
-                    razon=payload.razon,
-                    commit=False, # <--- IMPORTANTE: No commit individual
-                    skip_recalc_cartera=True, # Lo haremos al final en lote
-                    injected_cuentas_cxc=cuentas_cxc_batch,
-                    injected_cuentas_cxp=cuentas_cxp_batch,
-                    injected_conceptos_ph=conceptos_ph_batch
-                )
-                documentos_anulados_count += 1
-                
-                # Colectar terceros para el recálculo final
-                if res.beneficiario_id:
-                    terceros_a_recalcular.add(res.beneficiario_id)
+        # Recálculo único de Cartera/Proveedores: la cola recalcula cada tercero una vez
+        # al cerrar el bloque, dentro de esta misma transacción (commit=False)
+        with cola_cartera.recalculo_diferido(
+            db, empresa_id, descripcion="Anulación masiva", commit=False,
+            injected_cuentas_cxc=cuentas_cxc_batch,
+            injected_cuentas_cxp=cuentas_cxp_batch,
+            injected_conceptos_ph=conceptos_ph_batch
+        ):
+            # Iniciamos un savepoint para que el rollback sea total pero podamos manejar excepciones
+            with db.begin_nested():
+                for doc_id in payload.documentoIds:
+                    res = anular_documento(
+                        db=db,
+                        documento_id=doc_id,
+                        empresa_id=empresa_id,
+                        user_id=user_id,
+                        user_email=user_email,
+                        razon=payload.razon,
+                        commit=False, # <--- IMPORTANTE: No commit individual
+                        skip_recalc_cartera=False, # Con la cola activa solo marca los terceros
+                        injected_cuentas_cxc=cuentas_cxc_batch,
+                        injected_cuentas_cxp=cuentas_cxp_batch,
+                        injected_conceptos_ph=conceptos_ph_batch
+                    )
+                    documentos_anulados_count += 1
                 
-                # Colectar productos afectados para recálculo optimizado
-                # Buscamos los productos que acabamos de afectar con las anulaciones
-                movs_inv = db.query(models_mov_inv.producto_id).filter(
-                    models_mov_inv.documento_id == res.id
-                ).all()
-                for mi in movs_inv:
-                    productos_totales_afectados.add(mi.producto_id)
-
-        # Recálculo único al final del lote (Integridad de Inventario Optimizado)
-        if productos_totales_afectados:
-            from app.services.inventario import recalcular_saldos_producto
-            for p_id in productos_totales_afectados:
-                recalcular_saldos_producto(db, p_id, commit=False)
-
-        # Recálculo único de Cartera/Proveedores
-        for t_id in terceros_a_recalcular:
-            cartera_service.recalcular_aplicaciones_tercero(
-                db, t_id, empresa_id, commit=False,
-                injected_cuentas_cxc=cuentas_cxc_batch,
-                injected_cuentas_cxp=cuentas_cxp_batch,
-                injected_conceptos_ph=conceptos_ph_batch
-            )
+                    # Colectar productos afectados para recálculo optimizado
+                    # Buscamos los productos que acabamos de afectar con las anulaciones
+                    movs_inv = db.query(models_mov_inv.producto_id).filter(
+                        models_mov_inv.documento_id == res.id
+                    ).all()
+                    for mi in movs_inv:
+                        productos_totales_afectados.add(mi.producto_id)
+
+            # Recálculo único al final del lote (Integridad de Inventario Optimizado)
+            if productos_totales_afectados:
+                from app.services.inventario import recalcular_saldos_producto
+                for p_id in productos_totales_afectados:
+                    recalcular_saldos_producto(db, p_id, commit=False)
 
         db.commit()
 
@@ -2563,53 +2542,47 @@ def eliminar_documentos_masivamente(db: Session, payload: schemas_doc.DocumentoA
         ).order_by(func.coalesce(models_ph_concepto.orden, 999).asc(), models_ph_concepto.id.asc()).all()
         # -------------------------
 
-        with db.begin_nested():
-            for doc in docs_a_eliminar:
-                # 1. Eliminar documento silenciando el recálculo individual (recalc=False)
-                # Esto es la CLAVE de la optimización de rendimiento.
-                res = eliminar_documento(
-                    db=db, documento_id=doc.id, empresa_id=empresa_id, 
-                    user_id=user_id, razon=payload.razon, 
-                    commit=False, recalc=False,
-                    existing_doc=doc,
-                    injected_cuentas_cxc=cuentas_cxc_batch,
-                    injected_cuentas_cxp=cuentas_cxp_batch
-                )
+        # eliminar_documento marca los terceros en la cola; se recalculan una vez al final
+        with cola_cartera.recalculo_diferido(
+            db, empresa_id, descripcion="Eliminación masiva", commit=False,
+            injected_cuentas_cxc=cuentas_cxc_batch,
+            injected_cuentas_cxp=cuentas_cxp_batch,
+            injected_conceptos_ph=conceptos_ph_batch
+        ):
+            with db.begin_nested():
+                for doc in docs_a_eliminar:
+                    # 1. Eliminar documento silenciando el recálculo individual (recalc=False)
+                    # Esto es la CLAVE de la optimización de rendimiento.
+                    res = eliminar_documento(
+                        db=db, documento_id=doc.id, empresa_id=empresa_id, 
+                        user_id=user_id, razon=payload.razon, 
+                        commit=False, recalc=False,
+                        existing_doc=doc,
+                        injected_cuentas_cxc=cuentas_cxc_batch,
+                        injected_cuentas_cxp=cuentas_cxp_batch
+                    )
                 
-                # 2. Colectar productos afectados para recalcular al final
-                if res and "productos_afectados_ids" in res:
-                    for pid in res["productos_afectados_ids"]:
-                        productos_totales_afectados.add(pid)
+                    # 2. Colectar productos afectados para recalcular al final
+                    if res and "productos_afectados_ids" in res:
+                        for pid in res["productos_afectados_ids"]:
+                            productos_totales_afectados.add(pid)
 
-                # Optimización Consecutivo: Usar el mapa pre-cargado
-                tipo_doc = tipos_map.get(doc.tipo_documento_id)
+                    # Optimización Consecutivo: Usar el mapa pre-cargado
+                    tipo_doc = tipos_map.get(doc.tipo_documento_id)
 
-                if tipo_doc and not tipo_doc.numeracion_manual:
-                    if tipo_doc.consecutivo_actual == doc.numero:
-                        tipo_doc.consecutivo_actual -= 1
+                    if tipo_doc and not tipo_doc.numeracion_manual:
+                        if tipo_doc.consecutivo_actual == doc.numero:
+                            tipo_doc.consecutivo_actual -= 1
 
-                eliminados_count += 1
-
-        # 3. RECALCULO ÚNICO POST-LOTE (Integridad de Inventario Optimizado)
-        if productos_totales_afectados:
-            from app.services.inventario import recalcular_saldos_producto, SaldoNegativoException
-            print(f"[ELIMINACION MASIVA] Iniciando recálculo final para {len(productos_totales_afectados)} productos únicos...")
-            for pid in productos_totales_afectados:
-                recalcular_saldos_producto(db, pid, commit=False, validar_negativos=True)
+                    eliminados_count += 1
 
-        terceros_afectados_ids = {doc.beneficiario_id for doc in docs_a_eliminar if doc.beneficiario_id}
+            # 3. RECALCULO ÚNICO POST-LOTE (Integridad de Inventario Optimizado)
+            if productos_totales_afectados:
+                from app.services.inventario import recalcular_saldos_producto, SaldoNegativoException
+                print(f"[ELIMINACION MASIVA] Iniciando recálculo final para {len(productos_totales_afectados)} productos únicos...")
+                for pid in productos_totales_afectados:
+                    recalcular_saldos_producto(db, pid, commit=False, validar_negativos=True)
 
-        for tercero_id in terceros_afectados_ids:
-            cartera_service.recalcular_aplicaciones_tercero(
-                db, 
-                tercero_id=tercero_id, 
-                empresa_id=empresa_id, 
-                commit=False,
-                injected_cuentas_cxc=cuentas_cxc_batch,
-                injected_cuentas_cxp=cuentas_cxp_batch,
-                injected_conceptos_ph=conceptos_ph_batch
-            )
-        
         db.commit() # Commit final de eliminación + inventario + cartera
 
         mensaje = f"{eliminados_count} documento(s) eliminado(s) exitosamente."
@@ -2673,6 +2646,9 @@ def update_documento(db: Session, documento_id: int, documento_update: schemas_d
             if abs(total_debito - total_credito) > 0.001:
                 raise HTTPException(status_code=400, detail="Error de partida doble.")
 
+            # Saldos mensuales: retiramos los valores originales (con la fecha original)
+            saldos_mensuales_service.retirar_documento(db, documento_id)
+
             update_data = documento_update.model_dump(exclude={"movimientos", "aplicaciones"}, exclude_unset=True)
             for key, value in update_data.items():
                 setattr(db_documento, key, value)
@@ -2692,6 +2668,7 @@ def update_documento(db: Session, documento_id: int, documento_update: schemas_d
                 for aplicacion in documento_update.aplicaciones:
                     db.add(models_aplica(**aplicacion.model_dump(), documento_pago_id=documento_id, empresa_id=empresa_id))
 
+            # ...y los nuevos movimientos se suman con la fecha vigente al hacer flush
             db.flush()
 
         # Log de auditoría (se guarda con el commit principal)
@@ -2733,7 +2710,8 @@ def update_documento(db: Session, documento_id: int, documento_update: schemas_d
                 terceros_a_recalcular.add(nuevo_beneficiario_id)
             
             # Disparar el trigger (detecta terceros en movimientos CXC/CXP)
-            trigger_recalc_if_cxc_cxp(db, db_documento.id, empresa_id, commit=False)
+            # La fecha pudo cambiar: recálculo completo (sin atajo incremental)
+            trigger_recalc_if_cxc_cxp(db, db_documento.id, empresa_id, commit=False, incremental=False)
             
             # Recalcular también el beneficiario original (cubre el caso de cambio de tercero)
             for t_id in terceros_a_recalcular:
@@ -2971,8 +2949,7 @@ def generate_auxiliar_por_facturas_pdf(
     tercero = db.query(models_tercero).filter(models_tercero.id == tercero_id).first()
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/auxiliar_por_facturas_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/auxiliar_por_facturas_report.html')
         html_string = template.render(
             reporte=report_data,
             empresa=empresa,
@@ -2980,7 +2957,7 @@ def generate_auxiliar_por_facturas_pdf(
             fecha_inicio=fecha_inicio.strftime('%d/%m/%Y'),
             fecha_fin=fecha_fin.strftime('%d/%m/%Y')
         )
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/auxiliar_por_facturas_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -2999,8 +2976,7 @@ def generate_auxiliar_por_recibos_pdf(
     tercero = db.query(models_tercero).filter(models_tercero.id == tercero_id).first()
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/auxiliar_por_recibos_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/auxiliar_por_recibos_report.html')
         html_string = template.render(
             reporte=report_data,
             empresa=empresa,
@@ -3008,7 +2984,7 @@ def generate_auxiliar_por_recibos_pdf(
             fecha_inicio=fecha_inicio.strftime('%d/%m/%Y'),
             fecha_fin=fecha_fin.strftime('%d/%m/%Y')
         )
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/auxiliar_por_recibos_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -3194,8 +3170,7 @@ def generate_auxiliar_proveedores_por_facturas_pdf(
     tercero = db.query(models_tercero).filter(models_tercero.id == tercero_id).first()
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/auxiliar_proveedores_por_facturas_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/auxiliar_proveedores_por_facturas_report.html')
         html_string = template.render(
             reporte=report_data,
             empresa=empresa,
@@ -3203,7 +3178,7 @@ def generate_auxiliar_proveedores_por_facturas_pdf(
             fecha_inicio=fecha_inicio.strftime('%d/%m/%Y'),
             fecha_fin=fecha_fin.strftime('%d/%m/%Y')
         )
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/auxiliar_proveedores_por_facturas_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -3222,8 +3197,7 @@ def generate_auxiliar_proveedores_por_recibos_pdf(
     tercero = db.query(models_tercero).filter(models_tercero.id == tercero_id).first()
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/auxiliar_proveedores_por_recibos_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/auxiliar_proveedores_por_recibos_report.html')
         html_string = template.render(
             reporte=report_data,
             empresa=empresa,
@@ -3231,7 +3205,7 @@ def generate_auxiliar_proveedores_por_recibos_pdf(
             fecha_inicio=fecha_inicio.strftime('%d/%m/%Y'),
             fecha_fin=fecha_fin.strftime('%d/%m/%Y')
         )
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/auxiliar_proveedores_por_recibos_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -3376,13 +3350,12 @@ def generate_estado_cuenta_cliente_report_pdf(
     empresa_info = db.query(models_empresa).filter(models_empresa.id == empresa_id).first()
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/estado_cuenta_cliente_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/estado_cuenta_cliente_report.html')
         html_string = template.render(
             reporte=report_data,
             empresa=empresa_info
         )
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/estado_cuenta_cliente_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -3493,13 +3466,12 @@ def generate_estado_cuenta_proveedor_report_pdf(
     empresa_info = db.query(models_empresa).filter(models_empresa.id == empresa_id).first()
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/estado_cuenta_proveedor_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/estado_cuenta_proveedor_report.html')
         html_string = template.render(
             reporte=report_data,
             empresa=empresa_info
         )
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/estado_cuenta_proveedor_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -3704,10 +3676,9 @@ def generar_pdf_rentabilidad_factura(db: Session, documento_id: int, empresa_id:
 
     # 6. Renderizamos el HTML desde la plantilla empaquetada y generamos el PDF.
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/rentabilidad_factura_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/rentabilidad_factura_report.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/rentabilidad_factura_report.html' no fue encontrada en el paquete.")
     except Exception as e:
@@ -3754,25 +3725,11 @@ def generate_balance_sheet_report(
     y la utilidad del ejercicio a una fecha de corte para el reporte en pantalla.
     Soporta niveles: 'auxiliar' (detalle), 'mayor' (4 dígitos), 'clasificado' (Corriente/No Corriente).
     """
-    saldos_query = db.query(
-        models_plan.codigo,
-        models_plan.nombre,
-        func.sum(models_mov.debito - models_mov.credito).label('saldo')
-    ).join(models_mov, models_plan.id == models_mov.cuenta_id)\
-     .join(models_doc, models_mov.documento_id == models_doc.id)\
-     .filter(
-        models_doc.empresa_id == empresa_id,
-        models_doc.fecha <= fecha_corte,
-        models_doc.anulado == False,
-        or_(
-            models_plan.codigo.startswith('1'), # Activos
-            models_plan.codigo.startswith('2'), # Pasivos
-            models_plan.codigo.startswith('3'), # Patrimonio
-            models_plan.codigo.startswith('4'), # Ingresos
-            models_plan.codigo.startswith('5'), # Gastos
-            models_plan.codigo.startswith('6'), # Costos de Venta
-        )
-     ).group_by(models_plan.codigo, models_plan.nombre).all()
+    # Saldos acumulados a la fecha de corte (Activo, Pasivo, Patrimonio, Ingresos, Gastos, Costos)
+    # servidos desde la tabla de saldos mensuales materializados.
+    saldos_query = saldos_mensuales_service.sumas_por_codigo(
+        db, empresa_id, fecha_corte, prefijos=['1', '2', '3', '4', '5', '6']
+    )
 
     # Estructuras base
     raw_activos = []
@@ -3801,7 +3758,7 @@ def generate_balance_sheet_report(
 
     # 1. Clasificación inicial y cálculo de utilidad
     for cuenta in saldos_query:
-        saldo = float(cuenta.saldo or 0.0)
+        saldo = float(cuenta.total_debito - cuenta.total_credito)
         
         # Ingresos, Costos, Gastos (Solo para utilidad)
         if cuenta.codigo.startswith('4'):
@@ -3993,17 +3950,17 @@ def generate_balance_sheet_gerencial_report_pdf(
         if os.path.exists(template_os_path):
             with open(template_os_path, 'r', encoding='utf-8') as f:
                 template_string = f.read()
-            template = GLOBAL_JINJA_ENV.from_string(template_string)
+            template = plantillas_html.compilar(GLOBAL_JINJA_ENV, template_string)
         else:
             template_string = TEMPLATES_EMPAQUETADOS.get('reports/balance_general_gerencial.html')
             if not template_string:
                 raise HTTPException(status_code=500, detail="La plantilla 'reports/balance_general_gerencial.html' no fue encontrada.")
-            template = GLOBAL_JINJA_ENV.from_string(template_string)
+            template = plantillas_html.compilar(GLOBAL_JINJA_ENV, template_string)
             
         rendered_html = template.render(context)
         
         # Opciones de WeasyPrint para mayor calidad
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
         
     except Exception as e:
         print(f"Error generando PDF Balance Gerencial: {str(e)}")
@@ -4329,9 +4286,9 @@ def generate_balance_sheet_report_pdf(
         
 
 
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.compilar(GLOBAL_JINJA_ENV, template_string)
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/balance_general_report.html' no fue encontrada.")
     except Exception as e:
@@ -4345,6 +4302,44 @@ from app.schemas.compras import (
     FiltrosDetalladoCompras
 )
 
+def _filtrar_documentos_compra(query, empresa_id: int, filtros: FiltrosDetalladoCompras):
+    """Documentos de compra activos del rango (la consulta ya une Documento y TipoDocumento)."""
+    query = query.filter(
+        models_doc.empresa_id == empresa_id,
+        models_doc.anulado == False,
+        models_tipo.es_compra == True,
+        models_doc.fecha >= filtros.fecha_inicio,
+        models_doc.fecha <= filtros.fecha_fin,
+    )
+
+    # Aplica filtros opcionales a nivel de documento
+    if filtros.proveedor_id:
+        query = query.filter(models_doc.beneficiario_id == filtros.proveedor_id)
+    if filtros.tipo_documento_id:
+        query = query.filter(models_doc.tipo_documento_id == filtros.tipo_documento_id)
+    if filtros.codigo_documento:
+        query = query.filter(models_tipo.codigo.ilike(f"%{filtros.codigo_documento}%"))
+    if filtros.numero_documento:
+        from sqlalchemy import cast, String
+        query = query.filter(cast(models_doc.numero, String).ilike(f"%{filtros.numero_documento}%"))
+    if filtros.centro_costo_id:
+        query = query.filter(models_doc.centro_costo_id == filtros.centro_costo_id)
+    return query
+
+
+def _calcular_linea_compra(funcion_especial, cantidad, costo_unitario, tasa: float):
+    """Retorna (cantidad, base, iva, total) de una línea de compra, con signo."""
+    # Signo: las Notas Crédito de compra restan (es_compra y funcion_especial == 'nota_credito_compra')
+    es_devolucion = funcion_especial in ('nota_credito_compra', 'devolucion_compra')
+    signo = -1 if es_devolucion else 1
+
+    base = round(float(costo_unitario or 0) * float(cantidad or 0) * signo, 2)
+    iva_valor = round(base * tasa, 2)
+    total_linea = round(base + iva_valor, 2)
+    cantidad_f = float(cantidad or 0) * signo
+    return cantidad_f, base, iva_valor, total_linea
+
+
 def get_purchases_detailed_report(db: Session, empresa_id: int, filtros: FiltrosDetalladoCompras) -> CompraDetalladaResponse:
     """
     Genera un reporte detallado de compras por ítem/producto.
@@ -4358,26 +4353,9 @@ def get_purchases_detailed_report(db: Session, empresa_id: int, filtros: Filtros
     # Filtramos primero los documentos vía TipoDocumento.es_compra = True
     doc_query = db.query(models_doc).join(
         models_tipo, models_doc.tipo_documento_id == models_tipo.id
-    ).filter(
-        models_doc.empresa_id == empresa_id,
-        models_doc.anulado == False,
-        models_tipo.es_compra == True,
-        models_doc.fecha >= filtros.fecha_inicio,
-        models_doc.fecha <= filtros.fecha_fin,
     )
 
-    # Aplica filtros opcionales a nivel de documento
-    if filtros.proveedor_id:
-        doc_query = doc_query.filter(models_doc.beneficiario_id == filtros.proveedor_id)
-    if filtros.tipo_documento_id:
-        doc_query = doc_query.filter(models_doc.tipo_documento_id == filtros.tipo_documento_id)
-    if filtros.codigo_documento:
-        doc_query = doc_query.filter(models_tipo.codigo.ilike(f"%{filtros.codigo_documento}%"))
-    if filtros.numero_documento:
-        from sqlalchemy import cast, String
-        doc_query = doc_query.filter(cast(models_doc.numero, String).ilike(f"%{filtros.numero_documento}%"))
-    if filtros.centro_costo_id:
-        doc_query = doc_query.filter(models_doc.centro_costo_id == filtros.centro_costo_id)
+    doc_query = _filtrar_documentos_compra(doc_query, empresa_id, filtros)
 
     documentos = doc_query.all()
     doc_ids = [d.id for d in documentos]
@@ -4444,15 +4422,10 @@ def get_purchases_detailed_report(db: Session, empresa_id: int, filtros: Filtros
         tercero = terceros_dict.get(doc.beneficiario_id)
         centro = centros_dict.get(doc.centro_costo_id)
 
-        # Signo: las Notas Crédito de compra restan (es_compra y funcion_especial == 'nota_credito_compra')
-        es_devolucion = tipo and tipo.funcion_especial in ('nota_credito_compra', 'devolucion_compra')
-        signo = -1 if es_devolucion else 1
-
-        base = round(float(costo_unitario or 0) * float(cantidad or 0) * signo, 2)
         tasa = float(impuestos.get(producto.impuesto_iva_id, 0)) if producto else 0.0
-        iva_valor = round(base * tasa, 2)
-        total_linea = round(base + iva_valor, 2)
-        cantidad_f = float(cantidad or 0) * signo
+        cantidad_f, base, iva_valor, total_linea = _calcular_linea_compra(
+            tipo.funcion_especial if tipo else None, cantidad, costo_unitario, tasa
+        )
 
         item = CompraDetalladaItem(
             documento_id=doc.id,
@@ -4562,7 +4535,6 @@ def generate_purchases_detailed_pdf(db: Session, empresa_id: int, filtros: Filtr
     }
     
     # 3. Renderizar y convertir a PDF
-    from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
     template_string = TEMPLATES_EMPAQUETADOS.get("reports/purchases_detailed.html")
     if not template_string:
         # Fallback si no está en empaquetados (desarrollo)
@@ -4572,49 +4544,111 @@ def generate_purchases_detailed_pdf(db: Session, empresa_id: int, filtros: Filtr
         except:
              raise HTTPException(status_code=500, detail="Plantilla 'reports/purchases_detailed.html' no encontrada.")
 
-    template = GLOBAL_JINJA_ENV.from_string(template_string)
+    template = plantillas_html.compilar(GLOBAL_JINJA_ENV, template_string)
     rendered_html = template.render(context)
     
     filename = f"Reporte_Compras_Detallado_{filtros.fecha_inicio}_{filtros.fecha_fin}.pdf"
-    return HTML(string=rendered_html).write_pdf(), filename
+    return motor_pdf.html_a_pdf(rendered_html), filename
+
+def _filas_compras_detalladas(db: Session, empresa_id: int, filtros: FiltrosDetalladoCompras):
+    """
+    Mismas líneas que get_purchases_detailed_report (sin los gráficos), leídas
+    por lotes con una sola consulta unida y ordenadas por fecha descendente.
+    Al final agrega la fila de totales.
+    """
+    from app.models.impuesto import TasaImpuesto as models_imp
+
+    def base_compras(*columnas):
+        return _filtrar_documentos_compra(
+            db.query(*columnas).join(models_doc, columnas[-1] == models_doc.id)
+            .join(models_tipo, models_doc.tipo_documento_id == models_tipo.id),
+            empresa_id, filtros
+        )
+
+    # Modo inventario (siempre tiene producto) o, si no hay movimientos de
+    # inventario y no se filtra por bodega/producto, movimientos contables con producto
+    inventario = base_compras(models_mov_inv.id, models_mov_inv.documento_id)
+    if filtros.bodega_id:
+        inventario = inventario.filter(models_mov_inv.bodega_id == filtros.bodega_id)
+    if filtros.producto_id:
+        inventario = inventario.filter(models_mov_inv.producto_id == filtros.producto_id)
+    modo_inventario = bool(filtros.bodega_id or filtros.producto_id) or db.query(inventario.exists()).scalar()
+
+    columnas_doc = (
+        models_doc.fecha, models_doc.numero,
+        models_tipo.nombre.label("tipo_nombre"), models_tipo.funcion_especial,
+        models_tercero.razon_social.label("proveedor_nombre"),
+        models_centro_costo.nombre.label("centro_costo_nombre"),
+        models_producto.nombre.label("producto_nombre"), models_producto.impuesto_iva_id,
+    )
+    if modo_inventario:
+        query = inventario.with_entities(
+            *columnas_doc, models_bodega.nombre.label("bodega_nombre"),
+            models_mov_inv.cantidad, models_mov_inv.costo_unitario, models_mov_inv.id.label("linea_id")
+        ).outerjoin(models_bodega, models_mov_inv.bodega_id == models_bodega.id)\
+         .outerjoin(models_producto, models_mov_inv.producto_id == models_producto.id)
+    else:
+        query = base_compras(models_mov.id, models_mov.documento_id).filter(
+            models_mov.producto_id != None
+        ).with_entities(
+            *columnas_doc, models_mov.debito, models_mov.credito, models_mov.cantidad, models_mov.id.label("linea_id")
+        ).outerjoin(models_producto, models_mov.producto_id == models_producto.id)
+
+    query = query.outerjoin(models_tercero, models_doc.beneficiario_id == models_tercero.id)\
+        .outerjoin(models_centro_costo, models_doc.centro_costo_id == models_centro_costo.id)\
+        .order_by(models_doc.fecha.desc(), models_doc.id, "linea_id")
+
+    impuestos = {imp.id: imp.tasa for imp in db.query(models_imp).all()}
+    t_base = t_iva = t_general = 0.0
+
+    for linea in exportacion_streaming.iterar_consulta(query):
+        if modo_inventario:
+            cantidad, costo_unitario, bodega_nombre = linea.cantidad, linea.costo_unitario, linea.bodega_nombre
+        else:
+            # Fallback contable (servicios sin inventario)
+            valor_base = float(linea.debito or 0) - float(linea.credito or 0)
+            cantidad = float(linea.cantidad or 1)
+            costo_unitario = valor_base / cantidad if cantidad != 0 else valor_base
+            bodega_nombre = None
+
+        tasa = float(impuestos.get(linea.impuesto_iva_id, 0)) if linea.producto_nombre is not None else 0.0
+        cantidad_f, base, iva_valor, total_linea = _calcular_linea_compra(
+            linea.funcion_especial, cantidad, costo_unitario, tasa
+        )
+        t_base += base
+        t_iva += iva_valor
+        t_general += total_linea
+
+        prefix = linea.tipo_nombre[:2].upper() if linea.tipo_nombre else "FC"
+        yield [
+            linea.fecha,
+            f"{prefix}-{str(linea.numero) if linea.numero else 'S/N'}",
+            linea.proveedor_nombre or "Desconocido",
+            linea.producto_nombre or "Desconocido",
+            bodega_nombre or "",
+            linea.centro_costo_nombre or "",
+            cantidad_f,
+            float(costo_unitario or 0),
+            base,
+            iva_valor,
+            total_linea
+        ]
 
-def generate_purchases_detailed_csv(db: Session, empresa_id: int, filtros: FiltrosDetalladoCompras):
-    """Genera el CSV del reporte detallado de compras."""
-    import csv
-    import io
-    
-    data = get_purchases_detailed_report(db, empresa_id, filtros)
-    
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-    
-    # Header
-    writer.writerow([
-        "Fecha", "Documento", "Proveedor", "Producto", 
-        "Bodega", "Centro Costo", "CANT", "V/U", "Subtotal", "IVA", "Total"
-    ])
-    
-    # Data
-    for item in data.items:
-        prefix = item.tipo_documento_nombre[:2].upper() if item.tipo_documento_nombre else "FC"
-        writer.writerow([
-            item.fecha,
-            f"{prefix}-{item.numero}",
-            item.proveedor_nombre,
-            item.producto_nombre,
-            item.bodega_nombre or "",
-            item.centro_costo_nombre or "",
-            item.cantidad,
-            item.valor_unitario,
-            item.subtotal,
-            item.iva,
-            item.total
-        ])
-    
     # Totales
-    writer.writerow([])
-    writer.writerow(["", "", "", "", "", "", "TOTALES", "", data.total_base, data.total_iva, data.total_general])
-    
+    yield []
+    yield ["", "", "", "", "", "", "TOTALES", "", round(t_base, 2), round(t_iva, 2), round(t_general, 2)]
+
+
+def generate_purchases_detailed_csv(db: Session, empresa_id: int, filtros: FiltrosDetalladoCompras):
+    """
+    Genera el CSV del reporte detallado de compras por bloques (para StreamingResponse).
+    Retorna: (bloques, filename)
+    """
+    bloques = exportacion_streaming.csv_en_streaming(
+        ["Fecha", "Documento", "Proveedor", "Producto",
+         "Bodega", "Centro Costo", "CANT", "V/U", "Subtotal", "IVA", "Total"],
+        _filas_compras_detalladas(db, empresa_id, filtros)
+    )
     filename = f"Reporte_Compras_Detallado_{filtros.fecha_inicio}_{filtros.fecha_fin}.csv"
-    return output.getvalue().encode('utf-8-sig'), filename
+    return bloques, filename
 
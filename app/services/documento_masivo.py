@@ -0,0 +1,254 @@
+# app/services/documento_masivo.py
+"""
+Creación masiva de documentos contables (importaciones, recaudos y
+facturación por lotes).
+
+documento.create_documento está pensado para un documento por llamada:
+bloquea el tipo de documento, hace flush + refresh, registra el consumo y
+dispara el recálculo de cartera por documento. En un ciclo de 100k
+documentos eso son cientos de miles de idas y vueltas a la base.
+
+  - Una sola validación por lote: partida doble de cada documento, períodos
+    cerrados y fecha de inicio de operaciones (en memoria) y disponibilidad
+    de registros por el total.
+  - Numeración: los tipos de documento del lote se bloquean una vez
+    (FOR UPDATE, en orden de id) y se reserva un bloque de consecutivos por tipo.
+  - Documentos y movimientos con INSERT de varias filas por sentencia
+    (RETURNING id para los documentos), en bloques de TAMANO_BLOQUE.
+  - Saldos mensuales, índice de búsqueda de conceptos y consumo de registros
+    se aplican una vez por lote (los INSERT masivos no pasan por el flush).
+  - Cartera: los terceros de los documentos que tocan CXC/CXP se marcan en
+    la cola de recálculo diferido (un recálculo por tercero, ver cola_cartera).
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app.models import (
+    Documento as models_doc,
+    MovimientoContable as models_mov,
+    TipoDocumento as models_tipo,
+    PeriodoContableCerrado as models_periodo,
+    Empresa as models_empresa,
+)
+from app.schemas import documento as schemas_doc
+from app.services import busqueda
+from app.services import cola_cartera
+from app.services import consumo_service
+from app.services import saldos_mensuales as saldos_mensuales_service
+from app.services.propiedad_horizontal import estado_cuenta_service
+
+TAMANO_BLOQUE = 1000
+_MAX_ERRORES_DETALLE = 100
+
+
+def _validar_documentos(db: Session, empresa_info, documentos: List[schemas_doc.DocumentoCreate],
+                        tipos: Dict[int, Any], historico: bool = False) -> Dict[int, str]:
+    """Errores por índice del lote. Sin consultas por documento."""
+    cerrados = {
+        (p.ano, p.mes) for p in db.query(models_periodo.ano, models_periodo.mes).filter(
+            models_periodo.empresa_id == empresa_info.id
+        )
+    }
+    errores: Dict[int, str] = {}
+    for indice, documento in enumerate(documentos):
+        tipo = tipos.get(documento.tipo_documento_id)
+        total_debito = sum(mov.debito for mov in documento.movimientos)
+        total_credito = sum(mov.credito for mov in documento.movimientos)
+        if tipo is None:
+            errores[indice] = "El tipo de documento no existe."
+        elif abs(total_debito - total_credito) > 0.001:
+            errores[indice] = "Error de partida doble."
+        elif (documento.fecha.year, documento.fecha.month) in cerrados:
+            errores[indice] = (f"El período {documento.fecha.month}/{documento.fecha.year} está CERRADO. "
+                               f"No se pueden crear documentos en esta fecha.")
+        elif (not historico and empresa_info.fecha_inicio_operaciones
+              and documento.fecha < empresa_info.fecha_inicio_operaciones):
+            errores[indice] = "La fecha del documento no puede ser anterior al inicio de operaciones."
+        elif tipo.numeracion_manual and not documento.numero:
+            errores[indice] = "El tipo de documento usa numeración manual y el documento no trae número."
+    return errores
+
+
+def _asignar_numeros(documentos: List[schemas_doc.DocumentoCreate], validos: List[int],
+                     tipos: Dict[int, Any], conservar_numeros: bool) -> Dict[int, int]:
+    """Reserva un bloque de consecutivos por tipo (los tipos ya están bloqueados)."""
+    numeros: Dict[int, int] = {}
+    siguientes = {tipo_id: (tipo.consecutivo_actual or 0) for tipo_id, tipo in tipos.items()}
+    for indice in validos:
+        documento = documentos[indice]
+        tipo = tipos[documento.tipo_documento_id]
+        if tipo.numeracion_manual or (conservar_numeros and documento.numero):
+            numeros[indice] = documento.numero
+        else:
+            siguientes[tipo.id] += 1
+            numeros[indice] = siguientes[tipo.id]
+    for tipo_id, ultimo in siguientes.items():
+        tipo = tipos[tipo_id]
+        if not tipo.numeracion_manual and ultimo != (tipo.consecutivo_actual or 0):
+            tipo.consecutivo_actual = ultimo
+    return numeros
+
+
+def reservar_consecutivos(db: Session, tipo_documento_id: int, cantidad: int) -> int:
+    """
+    Reserva `cantidad` consecutivos del tipo y retorna el primero. El tipo queda
+    bloqueado solo hasta que el llamador confirme; los documentos se crean después
+    con esos números (create_documentos_bulk con conservar_numeros).
+    """
+    tipo = db.query(models_tipo).filter(models_tipo.id == tipo_documento_id).with_for_update().first()
+    if not tipo:
+        raise HTTPException(status_code=400, detail="El tipo de documento no existe.")
+    if tipo.numeracion_manual:
+        raise HTTPException(status_code=400, detail=f"El tipo de documento {tipo.codigo} usa numeración manual.")
+    primero = (tipo.consecutivo_actual or 0) + 1
+    tipo.consecutivo_actual = primero + cantidad - 1
+    db.flush()
+    return primero
+
+
+def _insertar_bloque(db: Session, empresa_id: int, user_id: int, documentos, indices: List[int],
+                     numeros: Dict[int, int], saldos: List[tuple]) -> List[int]:
+    ahora = datetime.utcnow()
+    filas_doc = []
+    for indice in indices:
+        documento = documentos[indice]
+        filas_doc.append({
+            "empresa_id": empresa_id,
+            "tipo_documento_id": documento.tipo_documento_id,
+            "numero": numeros[indice],
+            "fecha": documento.fecha,
+            "fecha_operacion": ahora,
+            "fecha_vencimiento": documento.fecha_vencimiento,
+            "beneficiario_id": documento.beneficiario_id,
+            "centro_costo_id": documento.centro_costo_id,
+            "usuario_creador_id": user_id,
+            "vendedor_id": documento.vendedor_id,
+            "unidad_ph_id": documento.unidad_ph_id,
+            "descuento_global_valor": documento.descuento_global_valor,
+            "cargos_globales_valor": documento.cargos_globales_valor,
+            "documento_referencia_id": documento.documento_referencia_id,
+            "observaciones": documento.observaciones,
+            "anulado": False,
+            "estado": "ACTIVO",
+        })
+    ids = db.execute(
+        insert(models_doc).returning(models_doc.id, sort_by_parameter_order=True), filas_doc
+    ).scalars().all()
+
+    filas_mov = []
+    for indice, documento_id in zip(indices, ids):
+        documento = documentos[indice]
+        for mov_in in documento.movimientos:
+            mov_data = mov_in.model_dump()
+            if mov_data.get('centro_costo_id') is None and documento.centro_costo_id is not None:
+                mov_data['centro_costo_id'] = documento.centro_costo_id
+            mov_data["documento_id"] = documento_id
+            filas_mov.append(mov_data)
+            saldos.append((empresa_id, documento.fecha, mov_data["cuenta_id"], mov_data["centro_costo_id"],
+                           mov_data["debito"], mov_data["credito"]))
+    if filas_mov:
+        db.execute(insert(models_mov), filas_mov)
+        busqueda.indexar(db, "concepto", select(models_mov.id).where(models_mov.documento_id.in_(ids)))
+    return ids
+
+
+def create_documentos_bulk(db: Session, documentos: List[schemas_doc.DocumentoCreate], user_id: int,
+                           empresa_id: int, commit: bool = True, skip_recalculo: bool = False,
+                           conservar_numeros: bool = False, omitir_invalidos: bool = False,
+                           historico: bool = False) -> Dict[str, Any]:
+    """
+    Crea un lote de documentos con las mismas reglas que create_documento.
+    conservar_numeros: respeta el número que traiga cada documento (importaciones
+    históricas); los que no traen número toman el consecutivo.
+    omitir_invalidos: los documentos que no pasan la validación se reportan en
+    `errores` y el resto se crea; sin él, cualquier error rechaza el lote (400).
+    historico: importaciones de contabilidad existente. Se permiten fechas anteriores
+    al inicio de operaciones y empresas en modo auditoría, y no se consumen registros
+    (el importador aplica su propio límite); partida doble y períodos cerrados se validan igual.
+    Retorna {"creados", "ids", "numeros" (alineados con la entrada, None si se
+    omitió), "errores", "cartera_lote_id"}.
+    """
+    try:
+        empresa_info = db.query(models_empresa).filter(models_empresa.id == empresa_id).first()
+        if not empresa_info:
+            raise HTTPException(status_code=404, detail="La empresa especificada no existe.")
+        if empresa_info.modo_operacion == 'AUDITORIA_READONLY' and not historico:
+            raise HTTPException(
+                status_code=403,
+                detail="🚫 Operación restringida: Esta empresa está en modo AUDITORÍA/CLON y no permite asentar nuevos documentos directamente. Use la importación masiva."
+            )
+
+        # Bloqueo de los tipos del lote en orden fijo (evita interbloqueos entre lotes concurrentes).
+        # Si todos los documentos traen su número (ya reservado), no se toma consecutivo ni bloqueo.
+        tipos_ids = sorted({d.tipo_documento_id for d in documentos})
+        query_tipos = db.query(models_tipo).filter(models_tipo.id.in_(tipos_ids)).order_by(models_tipo.id)
+        if not (conservar_numeros and all(d.numero for d in documentos)):
+            query_tipos = query_tipos.with_for_update()
+        tipos = {tipo.id: tipo for tipo in query_tipos.all()}
+
+        errores = _validar_documentos(db, empresa_info, documentos, tipos, historico)
+        if errores and not omitir_invalidos:
+            raise HTTPException(status_code=400, detail={
+                "mensaje": f"{len(errores)} documento(s) del lote no son válidos. No se creó ninguno.",
+                "errores": [{"indice": i, "detalle": d} for i, d in sorted(errores.items())[:_MAX_ERRORES_DETALLE]]
+            })
+        validos = [i for i in range(len(documentos)) if i not in errores]
+
+        total_registros = sum(len(documentos[i].movimientos) for i in validos)
+        consume_registros = not (empresa_info.is_lite_mode or historico)
+        if validos and consume_registros:
+            if not consumo_service.verificar_disponibilidad(db, empresa_id, total_registros):
+                deficit = consumo_service.calcular_deficit(db, empresa_id, total_registros)
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"⛔ Saldo insuficiente. Necesita {deficit} registros adicionales para completar este lote."
+                )
+
+        numeros = _asignar_numeros(documentos, validos, tipos, conservar_numeros)
+
+        ids: Dict[int, int] = {}
+        saldos: List[tuple] = []
+        for inicio in range(0, len(validos), TAMANO_BLOQUE):
+            bloque = validos[inicio:inicio + TAMANO_BLOQUE]
+            ids.update(zip(bloque, _insertar_bloque(db, empresa_id, user_id, documentos, bloque, numeros, saldos)))
+
+        saldos_mensuales_service.aplicar_movimientos(db, saldos)
+        # El INSERT por lotes no pasa por el flush: marcar las unidades PH a mano
+        estado_cuenta_service.marcar_documentos(db, [(documentos[i].unidad_ph_id, documentos[i].fecha) for i in validos])
+        if consume_registros:
+            consumo_service.registrar_consumo_lote(db, empresa_id, [
+                (ids[i], documentos[i].fecha, len(documentos[i].movimientos)) for i in validos
+            ])
+        db.flush()
+
+        resultado = {
+            "creados": len(ids),
+            "ids": [ids.get(i) for i in range(len(documentos))],
+            "numeros": [numeros.get(i) for i in range(len(documentos))],
+            "errores": [{"indice": i, "detalle": d} for i, d in sorted(errores.items())],
+            "cartera_lote_id": None,
+        }
+
+        # Si el llamador ya abrió un lote de recálculo para la empresa, se reutiliza
+        if ids and not skip_recalculo:
+            with cola_cartera.recalculo_diferido(db, empresa_id, descripcion="Creación masiva de documentos",
+                                                 commit=commit) as cola:
+                cola.marcar_documentos(db, ids.values())
+            resultado["cartera_lote_id"] = cola.lote_id
+
+        if commit:
+            db.commit()
+        print(f"[DOCUMENTOS MASIVOS] Empresa {empresa_id}: {len(ids)} documentos, {total_registros} movimientos, "
+              f"{len(errores)} omitidos.")
+        return resultado
+    except Exception as e:
+        if commit:
+            db.rollback()
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -0,0 +1,125 @@
+# app/services/exportacion_streaming.py
+"""
+Exportación CSV / XLSX en streaming para reportes de tamaño libro.
+
+Los CSV armaban la lista completa de resultados (a menudo como objetos
+Pydantic), luego el texto completo del CSV y luego los bytes, todo en memoria
+antes de responder: exportar un año de movimientos de una empresa grande
+consumía gigabytes.
+
+  - iterar_consulta(query): filas con cursor del lado del servidor
+    (yield_per + stream_results; en PostgreSQL es un cursor con nombre).
+  - csv_en_streaming(encabezados, filas): bloques de ~64 KB a medida que se
+    escriben las filas (';' y BOM UTF-8, como los CSV existentes).
+  - xlsx_en_streaming(encabezados, filas): openpyxl en modo write_only (las
+    filas van a un archivo temporal, no a memoria) y el .xlsx se envía por
+    bloques desde ese archivo.
+  - en_sesion_propia(generar): la sesión de get_db se cierra antes de enviar
+    el cuerpo de un StreamingResponse; la exportación abre y cierra la suya.
+  - respuesta_streaming(bloques, nombre, formato): StreamingResponse listo.
+
+La memoria queda acotada por el tamaño del lote, no por el número de filas.
+"""
+
+import csv
+import io
+import tempfile
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query, Session
+
+from app.core.reporting_registry import MEDIA_TYPES, reportar_avance
+
+TAMANO_LOTE = 2000
+_TAMANO_BLOQUE = 64 * 1024
+_FILAS_POR_AVANCE = 10000
+
+
+def iterar_consulta(query: Query, tamano_lote: int = TAMANO_LOTE) -> Iterator[Any]:
+    """Recorre la consulta por lotes con un cursor del lado del servidor."""
+    return iter(query.yield_per(tamano_lote))
+
+
+def csv_en_streaming(encabezados: Optional[Sequence[Any]], filas: Iterable[Sequence[Any]],
+                     delimitador: str = ';', bom: bool = True) -> Iterator[bytes]:
+    """CSV compatible con Excel, emitido por bloques. None se escribe como celda vacía."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimitador, quotechar='"', quoting=csv.QUOTE_MINIMAL)
+    if bom:
+        buffer.write('\ufeff')
+    if encabezados is not None:
+        writer.writerow(encabezados)
+    for numero, fila in enumerate(filas, 1):
+        writer.writerow(['' if valor is None else valor for valor in fila])
+        if numero % _FILAS_POR_AVANCE == 0:
+            reportar_avance(mensaje=f"{numero:,} filas exportadas")
+        if buffer.tell() >= _TAMANO_BLOQUE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+    resto = buffer.getvalue()
+    if resto:
+        yield resto.encode('utf-8')
+
+
+def xlsx_en_streaming(encabezados: Optional[Sequence[Any]], filas: Iterable[Sequence[Any]],
+                      titulo: str = "Reporte") -> Iterator[bytes]:
+    """Libro XLSX de una hoja escrito en modo write_only y enviado por bloques."""
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet(title=titulo[:31])
+    if encabezados is not None:
+        hoja.append(list(encabezados))
+    for numero, fila in enumerate(filas, 1):
+        hoja.append(list(fila))
+        if numero % _FILAS_POR_AVANCE == 0:
+            reportar_avance(mensaje=f"{numero:,} filas exportadas")
+    reportar_avance(mensaje="Comprimiendo el libro XLSX")
+
+    # El zip del .xlsx solo se arma al guardar: se guarda en disco y se lee por bloques
+    with tempfile.TemporaryFile() as archivo:
+        libro.save(archivo)
+        archivo.seek(0)
+        while True:
+            bloque = archivo.read(_TAMANO_BLOQUE)
+            if not bloque:
+                break
+            yield bloque
+
+
+def exportar(formato: str, encabezados: Optional[Sequence[Any]], filas: Iterable[Sequence[Any]],
+             titulo: str = "Reporte") -> Iterator[bytes]:
+    if formato == "csv":
+        return csv_en_streaming(encabezados, filas)
+    if formato == "xlsx":
+        return xlsx_en_streaming(encabezados, filas, titulo=titulo)
+    raise ValueError(f"Formato de exportación no soportado: '{formato}'.")
+
+
+def en_sesion_propia(generar: Callable[[Session], Iterator[bytes]]) -> Iterator[bytes]:
+    """
+    Ejecuta `generar(db)` con una sesión abierta solo para la exportación.
+    FastAPI cierra la sesión de get_db antes de enviar el cuerpo de un
+    StreamingResponse, y la consulta se ejecuta recién al pedir el primer bloque.
+    """
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        yield from generar(db)
+    finally:
+        db.close()
+
+
+def respuesta_streaming(bloques: Iterator[bytes], nombre_archivo: str, formato: str) -> StreamingResponse:
+    return StreamingResponse(
+        bloques,
+        media_type=MEDIA_TYPES[formato],
+        headers={
+            "Content-Disposition": f'attachment; filename="{nombre_archivo}"',
+            "Access-Control-Expose-Headers": "Content-Disposition",
+            "Cache-Control": "no-cache",
+        }
+    )
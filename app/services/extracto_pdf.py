@@ -0,0 +1,216 @@
+# app/services/extracto_pdf.py
+"""
+Extracción de páginas de extractos bancarios en PDF.
+
+ImportEngine abría el PDF con pdfplumber en el hilo de la petición, extraía
+las tablas página por página y luego validación e importación volvían a leer
+el documento completo. Un extracto corporativo de cientos de páginas tomaba
+minutos y mantenía todas las páginas en memoria.
+
+Ahora:
+  - Cada página se extrae una sola vez (tablas con la estrategia de texto y el
+    texto plano para el modo de respaldo) en un pool de procesos, por tareas
+    de EXTRACTO_PDF_PAGINAS_POR_TAREA páginas (cada tarea abre el PDF una vez).
+  - paginas() es un generador: entrega las páginas en orden a medida que
+    terminan, con un número acotado de tareas en vuelo.
+  - Las páginas extraídas se guardan en disco por huella del archivo (contenido
+    + contraseña): validar, previsualizar e importar el mismo extracto (aunque
+    se vuelva a subir) reutiliza lo ya extraído.
+
+Con EXTRACTO_PDF_WORKERS=0, en el ejecutable empaquetado o con una sola tarea,
+la extracción se hace en el mismo proceso.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Configuración especial para extractos bancarios sin cuadrícula
+TABLE_SETTINGS = {
+    "vertical_strategy": "text",
+    "horizontal_strategy": "text",
+    "snap_tolerance": 5,
+    "join_tolerance": 5
+}
+
+
+# ==========================================================
+# 1. EXTRACCIÓN (SE EJECUTA DENTRO DEL WORKER)
+# ==========================================================
+
+def _extraer_paginas(ruta: str, password: Optional[str], indices: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    Tablas y texto de las páginas `indices`. Cada tabla es una lista de filas sin las
+    vacías, con las celdas ya limpias (pdfplumber extrae None si la celda está vacía).
+    """
+    import pdfplumber
+    resultado = []
+    with pdfplumber.open(ruta, password=password) as pdf:
+        for i in indices:
+            page = pdf.pages[i]
+            tablas = []
+            for table in page.extract_tables(TABLE_SETTINGS) or []:
+                tablas.append([
+                    [str(cell).replace('\\n', ' ').strip() if cell else "" for cell in row]
+                    for row in table if any(cell for cell in row)
+                ])
+            resultado.append((i, {"tablas": tablas, "texto": page.extract_text() or ""}))
+            # Libera los objetos de la página: la memoria queda acotada a una página por worker
+            page.close()
+    return resultado
+
+
+def _contar_paginas(ruta: str, password: Optional[str]) -> int:
+    import pdfplumber
+    with pdfplumber.open(ruta, password=password) as pdf:
+        return len(pdf.pages)
+
+
+# ==========================================================
+# 2. CACHÉ EN DISCO POR HUELLA DEL ARCHIVO
+# ==========================================================
+
+def huella_archivo(ruta: str, password: Optional[str] = None) -> str:
+    """SHA256 del contenido y la contraseña (un PDF cifrado no se sirve de caché sin ella)"""
+    hash_sha256 = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hash_sha256.update(chunk)
+    hash_sha256.update(b"\0" + (password or "").encode("utf-8"))
+    return hash_sha256.hexdigest()
+
+
+def _directorio_cache() -> str:
+    from app.core.config import settings
+    return settings.EXTRACTO_PDF_CACHE_DIR or os.path.join(tempfile.gettempdir(), "finaxis_extractos_pdf")
+
+
+def _limpiar_vencidos(directorio: str) -> None:
+    from app.core.config import settings
+    limite = time.time() - settings.EXTRACTO_PDF_CACHE_TTL_MINUTOS * 60
+    for nombre in os.listdir(directorio):
+        carpeta = os.path.join(directorio, nombre)
+        try:
+            if os.path.getmtime(carpeta) < limite:
+                shutil.rmtree(carpeta, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def _carpeta_archivo(huella: str) -> str:
+    directorio = _directorio_cache()
+    os.makedirs(directorio, exist_ok=True)
+    carpeta = os.path.join(directorio, huella)
+    if not os.path.isdir(carpeta):
+        _limpiar_vencidos(directorio)
+        os.makedirs(carpeta, exist_ok=True)
+    else:
+        os.utime(carpeta)  # Vigencia desde el último uso
+    return carpeta
+
+
+def _leer_json(ruta: str) -> Optional[Any]:
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _escribir_json(ruta: str, datos: Any) -> None:
+    # Escritura atómica: otra petición nunca lee una página a medio escribir
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def _archivo_pagina(carpeta: str, indice: int) -> str:
+    return os.path.join(carpeta, f"{indice + 1:05d}.json")
+
+
+# ==========================================================
+# 3. POOL DE PROCESOS
+# ==========================================================
+
+def _usa_pool(tareas: int) -> bool:
+    from app.core.config import settings
+    # El ejecutable empaquetado no puede lanzar procesos (igual que el motor de PDF)
+    return settings.EXTRACTO_PDF_WORKERS > 0 and tareas > 1 and not getattr(sys, "frozen", False)
+
+
+def _extraer(ruta: str, password: Optional[str], tareas: List[List[int]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Páginas de las tareas en orden, con a lo sumo 2 tareas en vuelo por worker"""
+    if not _usa_pool(len(tareas)):
+        for indices in tareas:
+            yield from _extraer_paginas(ruta, password, indices)
+        return
+
+    from app.core.config import settings
+    workers = min(settings.EXTRACTO_PDF_WORKERS, len(tareas))
+    # "spawn": el proceso del API tiene hilos; un fork podría heredar locks tomados
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pendientes = iter(tareas)
+    en_vuelo = deque()
+    try:
+        for indices in pendientes:
+            en_vuelo.append(executor.submit(_extraer_paginas, ruta, password, indices))
+            if len(en_vuelo) >= 2 * workers:
+                break
+        while en_vuelo:
+            resultado = en_vuelo.popleft().result()
+            siguiente = next(pendientes, None)
+            if siguiente is not None:
+                en_vuelo.append(executor.submit(_extraer_paginas, ruta, password, siguiente))
+            yield from resultado
+    finally:
+        # Si el consumidor deja de leer (validación), no se extrae el resto
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# ==========================================================
+# 4. API
+# ==========================================================
+
+def paginas(ruta: str, password: Optional[str] = None, limite: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Páginas del PDF en orden: {"tablas": [[[celda, ...], ...], ...], "texto": str}.
+    limite: solo las primeras N páginas (validación). Las páginas que ya estén en la
+    caché no se vuelven a extraer.
+    """
+    from app.core.config import settings
+    carpeta = _carpeta_archivo(huella_archivo(ruta, password))
+
+    archivo_total = os.path.join(carpeta, "paginas.json")
+    total = _leer_json(archivo_total)
+    if total is None:
+        total = _contar_paginas(ruta, password)
+        _escribir_json(archivo_total, total)
+    if limite is not None:
+        total = min(total, limite)
+
+    faltantes = [i for i in range(total) if not os.path.exists(_archivo_pagina(carpeta, i))]
+    por_tarea = max(1, settings.EXTRACTO_PDF_PAGINAS_POR_TAREA)
+    extraidas = _extraer(ruta, password, [faltantes[k:k + por_tarea] for k in range(0, len(faltantes), por_tarea)])
+    por_extraer = set(faltantes)
+    try:
+        for i in range(total):
+            pagina = None if i in por_extraer else _leer_json(_archivo_pagina(carpeta, i))
+            if pagina is None:
+                if i not in por_extraer:
+                    # Borrada por la limpieza entre el listado y la lectura
+                    pagina = _extraer_paginas(ruta, password, [i])[0][1]
+                else:
+                    _, pagina = next(extraidas)
+                _escribir_json(_archivo_pagina(carpeta, i), pagina)
+            yield pagina
+    finally:
+        extraidas.close()
@@ -223,9 +223,9 @@ class CashFlowService:
     def generate_pdf_statement(db: Session, empresa_id: int, fecha_inicio: date, fecha_fin: date):
         import os
         from app.models.empresa import Empresa
-        from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
-        from weasyprint import HTML
-        from jinja2 import Environment, select_autoescape
+        from app.services.plantillas_html import TEMPLATES_EMPAQUETADOS
+        from app.services import plantillas_html
+        from app.services import motor_pdf
         
         # 1. Obtener Datos
         data = CashFlowService.calculate_statement(db, empresa_id, fecha_inicio, fecha_fin)
@@ -254,8 +254,7 @@ class CashFlowService:
             template_str = CashFlowService._get_inline_template()
         
         # 4. Preparar Contexto
-        env = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
-        template = env.from_string(template_str)
+        template = plantillas_html.compilar(plantillas_html.ENTORNO_BASE, template_str)
         
         context = {
             # Variables de string directo (para template inline)
@@ -280,7 +279,7 @@ class CashFlowService:
         
         # 5. Renderizar PDF
         html_out = template.render(context)
-        return HTML(string=html_out).write_pdf()
+        return motor_pdf.html_a_pdf(html_out)
 
     @staticmethod
     def _get_inline_template():
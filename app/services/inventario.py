@@ -13,7 +13,7 @@ import traceback
 import locale 
 import os # Necesario para la generación de PDF
 from io import BytesIO # Necesario para la generación de PDF
-from weasyprint import HTML # Necesario para la generación de PDF
+from ..services import motor_pdf # Necesario para la generación de PDF
 from jinja2 import Environment, FileSystemLoader # Necesario para la generación de PDF
 
 
@@ -52,6 +52,8 @@ from ..schemas import traslado_inventario as schemas_traslado
 from ..schemas import documento as schemas_doc # FIX: Necesario para DocumentoCreate
 from ..services import documento as service_documento # FIX: Necesario para create_documento
 from ..services import tipo_documento as service_tipo_documento # Necesario para validación de tipo doc
+from ..services import inventario_puntos_control as puntos_control # Puntos de control del costo promedio
+from ..services import busqueda # Autocompletar con índice de texto
 
 # --- INICIO: LÓGICA DE FILTRO DE MILES INYECTADA ---
 # FIX: Estas funciones y configuraciones deben estar definidas antes de usarse
@@ -80,7 +82,7 @@ def _to_float(value):
 
 def generar_pdf_desde_html(html_content: str) -> bytes:
     """Función auxiliar para generar el PDF a partir del contenido HTML."""
-    return HTML(string=html_content).write_pdf(stylesheets=[])
+    return motor_pdf.html_a_pdf(html_content)
 
 
 # ========== Funciones de Movimiento (CRÍTICAS) - Movidas al inicio ==========
@@ -172,42 +174,35 @@ def get_stock_historico(db: Session, producto_id: int, bodega_id: Optional[int],
     return float(saldo_result or Decimal('0.0'))
 
 
-def recalcular_saldos_producto(db: Session, producto_id: int, commit: bool = True, validar_negativos: bool = True):
+def recalcular_saldos_producto(db: Session, producto_id: int, commit: bool = True, validar_negativos: bool = True,
+                               desde_cero: bool = False):
     """
-    Reconstruye TOTALMENTE el Stock y Costo Promedio del producto basándose
-    en todos los movimientos existentes en la base de datos.
+    Reconstruye el Stock y Costo Promedio del producto basándose en los
+    movimientos existentes en la base de datos.
     Crucial para mantener integridad tras eliminación de documentos.
+
+    Arranca desde el último punto de control vigente (ver
+    inventario_puntos_control): solo se repasan los movimientos posteriores.
+    desde_cero=True descarta los puntos y repasa todo el historial.
     """
-    print(f"\n[RECALCULO INVENTARIO] Iniciando para Producto ID {producto_id}")
-    
-    # 1. Obtener Producto 
-    producto = db.query(models_producto.Producto).get(producto_id)
-    if not producto: return
+    # Los cambios pendientes se envían ANTES de marcar el producto: así invalidan
+    # los puntos afectados (incluidas ediciones de costo) antes de elegir desde dónde recalcular.
+    db.flush()
+    with puntos_control.recalculando(db, producto_id):
+        _recalcular_saldos_producto(db, producto_id, commit, validar_negativos, desde_cero)
 
-    # 1.5. PASO CRÍTICO: Resetear TODO el stock existente a 0.0
-    # Esto elimina "saldos fantasma" de bodegas que ya no tienen movimientos asociados.
-    db.query(models_producto.StockBodega).filter(
-        models_producto.StockBodega.producto_id == producto_id
-    ).update({"stock_actual": 0.0, "stock_comprometido": 0.0}, synchronize_session=False)
 
-    # 2. Resetear valores en memoria (Saldos iniciales)
-    # Si tiene historial, lo reconstruiremos. Si no, debería quedar en 0 (o manual).
-    # OJO: Si se maneja saldo inicial manual en otra tabla, habría que sumarlo. 
-    # Por ahora asumimos que 'ENTRADA_INICIAL' es un movimiento más.
-    
-    nuevo_costo_promedio = 0.0
-    stocks_por_bodega = {} # Mapa: bodega_id -> cantidad
-    
-    # 3. Obtener TODOS los movimientos ordenados cronológicamente
-    # El orden es VITAL para el promedio ponderado.
-    # IMPORTANTE: Filtrar movimientos de documentos ANULADOS para que no corrompan el stock.
-    # PRECARGAMOS el documento para detectar referencias rápidamente.
+def _consulta_movimientos_kardex(db: Session, producto_ids: List[int], punto=None):
+    """
+    Movimientos de inventario de los productos en el orden del kárdex
+    (producto, fecha, id), sin los de documentos ANULADOS, con la referencia y
+    la función especial del documento. Con `punto` (un solo producto) solo
+    trae lo posterior al punto de control.
+    """
     from app.models.documento import Documento as models_doc
     from app.models.tipo_documento import TipoDocumento as models_tipo
-    from sqlalchemy import or_
-    from sqlalchemy.orm import contains_eager
 
-    movimientos = db.query(
+    query_movimientos = db.query(
         models_producto.MovimientoInventario,
         models_doc.documento_referencia_id.label('ref_id'),
         models_tipo.funcion_especial
@@ -215,41 +210,127 @@ def recalcular_saldos_producto(db: Session, producto_id: int, commit: bool = Tru
         .outerjoin(models_doc, models_producto.MovimientoInventario.documento_id == models_doc.id)\
         .outerjoin(models_tipo, models_doc.tipo_documento_id == models_tipo.id)\
         .filter(
-            models_producto.MovimientoInventario.producto_id == producto_id,
+            models_producto.MovimientoInventario.producto_id.in_(producto_ids),
             or_(
                 models_producto.MovimientoInventario.documento_id == None,
                 models_doc.anulado == False
             )
-        ).order_by(
-            models_producto.MovimientoInventario.fecha.asc(),
-            models_producto.MovimientoInventario.id.asc()
-        ).all()
+        )
+    if punto:
+        # Solo lo posterior al punto de control, en el mismo orden (fecha, id)
+        query_movimientos = query_movimientos.filter(or_(
+            models_producto.MovimientoInventario.fecha > punto.fecha,
+            and_(
+                models_producto.MovimientoInventario.fecha == punto.fecha,
+                models_producto.MovimientoInventario.id > punto.movimiento_id
+            )
+        ))
+    return query_movimientos.order_by(
+        models_producto.MovimientoInventario.producto_id.asc(),
+        models_producto.MovimientoInventario.fecha.asc(),
+        models_producto.MovimientoInventario.id.asc()
+    ).all()
 
-    stock_total_global = 0.0
-    
-    # --- OPTIMIZACIÓN: Carga masiva de asientos contables ---
-    # Cargamos todos los asientos contables relacionados con este producto para evitar N+1 queries
+
+def _cargar_asientos_kardex(db: Session, productos: List[Any], movimientos) -> Dict[int, Dict[tuple, list]]:
+    """
+    Asientos contables de costo de venta / inventario de los productos, para
+    sincronizarlos con el costo de cada salida sin una consulta por movimiento.
+    Retorna {producto_id: {(documento_id, cuenta_id): [asientos]}}.
+    """
     from app.models.documento import MovimientoContable as models_mov
-    documento_ids = [m[0].documento_id for m in movimientos if m[0].documento_id]
-    asientos_map = {} # Mapa: (documento_id, cuenta_id) -> list of asientos
-    
-    if documento_ids:
-        # Cargamos solo los asientos de las cuentas de inventario/costo para este producto
+    cuentas_por_producto = {}
+    for producto in productos:
         grupo = producto.grupo_inventario
         if grupo and grupo.cuenta_costo_venta_id and grupo.cuenta_inventario_id:
-            asientos_raw = db.query(models_mov).filter(
-                models_mov.documento_id.in_(documento_ids),
-                models_mov.producto_id == producto_id,
-                models_mov.cuenta_id.in_([grupo.cuenta_costo_venta_id, grupo.cuenta_inventario_id])
-            ).all()
-            
-            for a in asientos_raw:
-                k = (a.documento_id, a.cuenta_id)
-                if k not in asientos_map: asientos_map[k] = []
-                asientos_map[k].append(a)
+            cuentas_por_producto[producto.id] = {grupo.cuenta_costo_venta_id, grupo.cuenta_inventario_id}
+
+    documento_ids = {m[0].documento_id for m in movimientos if m[0].documento_id and m[0].producto_id in cuentas_por_producto}
+    asientos_map = {p_id: {} for p_id in cuentas_por_producto}
+    if not documento_ids:
+        return asientos_map
+
+    todas_cuentas = set().union(*cuentas_por_producto.values())
+    documento_ids = list(documento_ids)
+    for i in range(0, len(documento_ids), 1000):
+        asientos_raw = db.query(models_mov).filter(
+            models_mov.documento_id.in_(documento_ids[i:i + 1000]),
+            models_mov.producto_id.in_(list(cuentas_por_producto)),
+            models_mov.cuenta_id.in_(list(todas_cuentas))
+        ).all()
+        for a in asientos_raw:
+            if a.cuenta_id not in cuentas_por_producto[a.producto_id]:
+                continue
+            asientos_map[a.producto_id].setdefault((a.documento_id, a.cuenta_id), []).append(a)
+    return asientos_map
+
+
+def _recalcular_saldos_producto(db: Session, producto_id: int, commit: bool, validar_negativos: bool, desde_cero: bool):
+    print(f"\n[RECALCULO INVENTARIO] Iniciando para Producto ID {producto_id}")
+    
+    # 1. Obtener Producto 
+    producto = db.query(models_producto.Producto).get(producto_id)
+    if not producto: return
+
+    # 1.2. PUNTO DE CONTROL desde el cual recalcular
+    if desde_cero:
+        puntos_control.eliminar_puntos(db, producto_id)
+        punto = None
+    else:
+        punto = puntos_control.ultimo_punto(db, producto_id)
+
+    # 1.5. PASO CRÍTICO: Resetear TODO el stock existente a 0.0
+    # Esto elimina "saldos fantasma" de bodegas que ya no tienen movimientos asociados.
+    db.query(models_producto.StockBodega).filter(
+        models_producto.StockBodega.producto_id == producto_id
+    ).update({"stock_actual": 0.0, "stock_comprometido": 0.0}, synchronize_session=False)
+
+    # 2. Cargar movimientos, asientos y stocks del producto (pocas consultas)
+    movimientos = _consulta_movimientos_kardex(db, [producto_id], punto)
+    print(f"[RECALCULO INVENTARIO] Producto {producto_id}: {len(movimientos)} movimientos a procesar "
+          f"({'desde punto de control del movimiento ' + str(punto.movimiento_id) if punto else 'historial completo'})")
+    asientos_map = _cargar_asientos_kardex(db, [producto], movimientos).get(producto_id, {})
+    # populate_existing: los StockBodega ya cargados en la sesión traen el valor previo al reset
+    stocks_existentes = {
+        sb.bodega_id: sb for sb in db.query(models_producto.StockBodega).filter(
+            models_producto.StockBodega.producto_id == producto_id
+        ).populate_existing().all()
+    }
 
+    stock_total_global, nuevo_costo_promedio = _reprocesar_kardex(
+        db, producto, movimientos, asientos_map, stocks_existentes, punto, validar_negativos
+    )
+
+    if commit:
+        db.commit() # PERSISTENCIA CRÍTICA: Solo si se solicita commit directo
+    else:
+        db.flush() # Importante: Sincronizar cambios en la sesión sin cerrar transacción
+    print(f"[RECALCULO FINALIZADO] ID {producto_id} -> Stock Global: {stock_total_global}, Costo Prom: {nuevo_costo_promedio}")
+
+
+def _reprocesar_kardex(db: Session, producto, movimientos, asientos_map: Dict[tuple, list],
+                       stocks_existentes: Dict[int, Any], punto=None, validar_negativos: bool = True):
+    """
+    Repasa los movimientos (ya cargados, en orden de kárdex) desde el estado del
+    punto de control (o desde cero) y deja en la sesión el costo de cada
+    salida/traslado, sus asientos de costo, el costo promedio del producto, el
+    stock por bodega y los nuevos puntos de control. No hace commit ni flush.
+    Retorna (stock_total_global, costo_promedio).
+    """
+    producto_id = producto.id
+    # 2. Resetear valores en memoria (Saldos iniciales)
+    # Si tiene historial, lo reconstruiremos. Si no, debería quedar en 0 (o manual).
+    # OJO: Si se maneja saldo inicial manual en otra tabla, habría que sumarlo. 
+    # Por ahora asumimos que 'ENTRADA_INICIAL' es un movimiento más.
+    
+    # Estado inicial: el del punto de control (o vacío si se recalcula todo)
+    nuevo_costo_promedio = punto.costo_promedio if punto else 0.0
+    stocks_por_bodega = puntos_control.stocks_de_punto(punto) if punto else {} # Mapa: bodega_id -> cantidad
+    stock_total_global = punto.stock_total if punto else 0.0
+    num_movimientos = punto.num_movimientos if punto else 0
+    nuevos_puntos = []
+    
     # 4. Re-procesar paso a paso
-    nuevo_costo_promedio = 0.0
     for mov_row in movimientos:
         mov = mov_row[0] # El objeto MovimientoInventario
         ref_id = mov_row.ref_id # El ID de referencia directamente de la query
@@ -388,8 +469,16 @@ def recalcular_saldos_producto(db: Session, producto_id: int, commit: bool = Tru
                 fecha=mov.fecha,
                 cantidad_faltante=cantidad_faltante
             )
+
+        # --- PUNTO DE CONTROL PERIÓDICO ---
+        num_movimientos += 1
+        if num_movimientos % puntos_control.INTERVALO_PUNTOS_CONTROL == 0:
+            nuevos_puntos.append(puntos_control.nuevo_punto(
+                producto_id, mov, num_movimientos, stock_total_global, nuevo_costo_promedio, stocks_por_bodega
+            ))
             
     # 5. Aplicar cambios a la Base de Datos
+    db.add_all(nuevos_puntos)
     
     # A. Actualizar Producto
     # Evitamos errores de redondeo infinitesimal
@@ -405,9 +494,7 @@ def recalcular_saldos_producto(db: Session, producto_id: int, commit: bool = Tru
     for b_id, nuevo_stock in stocks_por_bodega.items():
         if abs(nuevo_stock) < 0.00001: nuevo_stock = 0.0
         
-        stock_db = db.query(models_producto.StockBodega).filter_by(
-            producto_id=producto_id, bodega_id=b_id
-        ).first()
+        stock_db = stocks_existentes.get(b_id)
         
         if stock_db:
             stock_db.stock_actual = nuevo_stock
@@ -421,40 +508,34 @@ def recalcular_saldos_producto(db: Session, producto_id: int, commit: bool = Tru
             
     # C. Limpieza de StockBodega huerfanos (opcional, si queremos borrar los q quedaron en 0)
     # Por ahora mejor no borrar para no perder historial de qué bodegas se usaron.
-    
-    if commit:
-        db.commit() # PERSISTENCIA CRÍTICA: Solo si se solicita commit directo
-    else:
-        db.flush() # Importante: Sincronizar cambios en la sesión sin cerrar transacción
-    print(f"[RECALCULO FINALIZADO] ID {producto_id} -> Stock Global: {stock_total_global}, Costo Prom: {nuevo_costo_promedio}")
+
+    return stock_total_global, nuevo_costo_promedio
 
 
 def recalcular_todo_inventario(db: Session, empresa_id: int):
     """
     Ejecuta el recálculo de saldos y costos para TODOS los productos de la empresa.
     Útil para corregir inconsistencias masivas o tras migraciones/eliminaciones.
+
+    Versión síncrona del recálculo por bloques (ver inventario_recalculo): si
+    hay un recálculo abierto (interrumpido) de la empresa, lo retoma.
     """
+    from ..services import inventario_recalculo
+
     print(f"\n[RECALCULO MASIVO] Iniciando para Empresa ID {empresa_id}")
-    productos = db.query(models_producto.Producto).filter(models_producto.Producto.empresa_id == empresa_id).all()
-    count = 0
-    total = len(productos)
-    
-    for prod in productos:
-        # Ignoramos servicios pues no manejan stock
-        if not prod.es_servicio:
-            recalcular_saldos_producto(db, prod.id)
-            count += 1
-            
-            
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print(f"[RECALCULO MASIVO ERROR] Fallo al hacer commit final: {e}")
-        raise e
+    recalculo = inventario_recalculo.iniciar_recalculo(db, empresa_id)
+    progreso = inventario_recalculo.ejecutar_recalculo(recalculo.id, empresa_id)
+    if progreso is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ya hay un recálculo de inventario en ejecución.")
 
-    print(f"[RECALCULO MASIVO] Finalizado. Procesados {count}/{total} productos.")
-    return {"message": f"Recálculo completado. Productos procesados: {count}", "total": count}
+    count = progreso["productos_procesados"]
+    print(f"[RECALCULO MASIVO] Finalizado. Procesados {count}/{progreso['total_productos']} productos.")
+    if progreso["bloques_con_error"]:
+        return {
+            "message": f"Recálculo con errores en {progreso['bloques_con_error']} bloque(s). Productos procesados: {count}",
+            "total": count, "recalculo_id": recalculo.id, "errores": progreso["errores"],
+        }
+    return {"message": f"Recálculo completado. Productos procesados: {count}", "total": count, "recalculo_id": recalculo.id}
 
 
 # --- AJUSTES Y CORRECCIONES DE MOVIMIENTOS (KARDEX ADMIN) ---
@@ -902,10 +983,9 @@ def get_grupo_by_id(db: Session, grupo_id: int, empresa_id: int):
     ).filter(models_grupo.GrupoInventario.id == grupo_id, models_grupo.GrupoInventario.empresa_id == empresa_id).first()
 
 def search_grupos_by_nombre(db: Session, empresa_id: int, search_term: str) -> List[Dict[str, Any]]:
-    grupos = db.query(models_grupo.GrupoInventario).filter(
-        models_grupo.GrupoInventario.empresa_id == empresa_id,
-        models_grupo.GrupoInventario.nombre.ilike(f"%{search_term}%")
-    ).order_by(models_grupo.GrupoInventario.nombre).limit(10).all()
+    query = db.query(models_grupo.GrupoInventario).filter(models_grupo.GrupoInventario.empresa_id == empresa_id)
+    query = busqueda.filtrar(query, "grupo", search_term, aproximada=True, ordenar=True)
+    grupos = query.order_by(models_grupo.GrupoInventario.nombre).limit(10).all()
     return [{"id": g.id, "nombre": g.nombre} for g in grupos]
 
 def update_grupo_inventario(db: Session, grupo_id: int, grupo: schemas.GrupoInventarioUpdate, empresa_id: int):
@@ -1377,14 +1457,8 @@ def search_productos(
     if grupo_ids and len(grupo_ids) > 0:
         query_base = query_base.filter(models_producto.Producto.grupo_id.in_(grupo_ids))
 
-    if search_term:
-         search_like = f"%{search_term}%"
-         query_base = query_base.filter(
-             or_(
-                 models_producto.Producto.codigo.ilike(search_like),
-                 models_producto.Producto.nombre.ilike(search_like)
-             )
-         )
+    # Código o nombre por el índice de búsqueda; relevancia antes que el orden alfabético
+    query_base = busqueda.filtrar(query_base, "producto", search_term, aproximada=True, ordenar=True)
 
     # FIX CRÍTICO: Se corrige la referencia de StockBodega.producto_id a Producto.id
     stock_select_stmt = select(func.sum(models_producto.StockBodega.stock_actual)).where(
@@ -1546,4 +1620,4 @@ def _generar_pdf_renderizado(env_jinja, empresa_id, filtros, productos, db):
     template_name = 'cartilla_inventario_admin_report.html'
     template = env_jinja.get_template(template_name)
     html_out = template.render(context)
-    return HTML(string=html_out).write_pdf(stylesheets=[])
\ No newline at end of file
+    return motor_pdf.html_a_pdf(html_out)
\ No newline at end of file
@@ -0,0 +1,221 @@
+# app/services/inventario_puntos_control.py
+"""
+Puntos de control del kárdex para el recálculo de costo promedio ponderado.
+
+inventario.recalcular_saldos_producto repasaba TODOS los movimientos del
+producto para reconstruir stock y costo promedio. Cada INTERVALO_PUNTOS_CONTROL
+movimientos el recálculo guarda una foto del estado (stock por bodega, stock
+global, costo promedio) en `inventario_puntos_control`, y el siguiente recálculo
+arranca desde la última foto vigente: solo repasa lo posterior.
+
+Invalidación (siempre dentro de la misma transacción del cambio):
+  - listener before_flush: movimientos nuevos, eliminados o con cambios en
+    campos que afectan el kárdex (fecha, cantidad, tipo, bodega, producto,
+    documento, costo); documentos que cambian de anulado o de referencia;
+    tipos de documento que cambian de función especial.
+  - listener do_orm_execute: DELETE/UPDATE masivos sobre movimientos de
+    inventario (eliminación de documentos, restauración de copias).
+  - invalidar_movimientos(db, movimientos): INSERT de varias filas, que no
+    pasan por el flush (restauración por bloques).
+Se eliminan los puntos del producto con fecha >= a la del movimiento afectado.
+Los costos que el propio recálculo reescribe (salidas y traslados adoptan el
+promedio) no invalidan nada.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models.documento import Documento
+from app.models.inventario_punto_control import PuntoControlInventario
+from app.models.producto import MovimientoInventario, Producto
+from app.models.tipo_documento import TipoDocumento
+
+INTERVALO_PUNTOS_CONTROL = 500
+
+_CLAVE_RECALCULANDO = "inventario_recalculando"
+_CAMPOS_KARDEX = ("producto_id", "bodega_id", "documento_id", "fecha", "tipo_movimiento", "cantidad", "costo_unitario")
+# Campos que recalcular_saldos_producto reescribe como resultado (no como entrada)
+_CAMPOS_DERIVADOS = {"costo_unitario"}
+_MARGEN_INVALIDACION = timedelta(days=1)
+
+
+# ==========================================================
+# 1. LECTURA / ESCRITURA DE PUNTOS
+# ==========================================================
+
+def ultimo_punto(db: Session, producto_id: int) -> Optional[PuntoControlInventario]:
+    return db.query(PuntoControlInventario).filter(
+        PuntoControlInventario.producto_id == producto_id
+    ).order_by(
+        PuntoControlInventario.fecha.desc(),
+        PuntoControlInventario.movimiento_id.desc()
+    ).first()
+
+
+def eliminar_puntos(db: Session, producto_id: int) -> int:
+    return db.query(PuntoControlInventario).filter(
+        PuntoControlInventario.producto_id == producto_id
+    ).delete(synchronize_session=False)
+
+
+def nuevo_punto(producto_id: int, movimiento, num_movimientos: int, stock_total: float,
+                costo_promedio: float, stocks_por_bodega: Dict[int, float]) -> PuntoControlInventario:
+    """Estado del kárdex inmediatamente después de `movimiento`."""
+    return PuntoControlInventario(
+        producto_id=producto_id,
+        movimiento_id=movimiento.id,
+        fecha=movimiento.fecha,
+        num_movimientos=num_movimientos,
+        stock_total=stock_total,
+        costo_promedio=costo_promedio,
+        stocks_bodega={str(b_id): cantidad for b_id, cantidad in stocks_por_bodega.items()},
+    )
+
+
+def stocks_de_punto(punto: PuntoControlInventario) -> Dict[int, float]:
+    return {int(b_id): float(cantidad) for b_id, cantidad in (punto.stocks_bodega or {}).items()}
+
+
+@contextmanager
+def recalculando(db: Session, *producto_ids: int):
+    """Marca los productos para que los costos que reescribe el recálculo no invaliden puntos."""
+    activos = db.info.setdefault(_CLAVE_RECALCULANDO, set())
+    activos.update(producto_ids)
+    try:
+        yield
+    finally:
+        activos.difference_update(producto_ids)
+
+
+# ==========================================================
+# 2. INVALIDACIÓN AUTOMÁTICA
+# ==========================================================
+
+def _como_datetime(fecha) -> datetime:
+    """Fechas de movimientos nuevos (date, naive) y de BD (con zona) comparables entre sí."""
+    if not isinstance(fecha, datetime):
+        return datetime.combine(fecha, time.min)
+    return fecha.replace(tzinfo=None)
+
+
+def _acumular_minimo(minimos: Dict[int, datetime], producto_id: Optional[int], fecha) -> None:
+    if producto_id is None or fecha is None:
+        return
+    fecha = _como_datetime(fecha)
+    if producto_id not in minimos or fecha < minimos[producto_id]:
+        minimos[producto_id] = fecha
+
+
+def _invalidar(conn, minimos: Dict[int, datetime]) -> None:
+    # Un día de margen cubre la diferencia de zona horaria entre fechas con y sin zona
+    for producto_id, fecha in minimos.items():
+        conn.execute(
+            delete(PuntoControlInventario).where(
+                PuntoControlInventario.producto_id == producto_id,
+                PuntoControlInventario.fecha >= fecha - _MARGEN_INVALIDACION
+            )
+        )
+
+
+def invalidar_movimientos(db: Session, movimientos) -> None:
+    """Invalida por movimientos insertados sin flush: [(producto_id, fecha)]."""
+    minimos: Dict[int, datetime] = {}
+    for producto_id, fecha in movimientos:
+        _acumular_minimo(minimos, producto_id, fecha)
+    _invalidar(db.connection(), minimos)
+
+
+def _campos_cambiados(obj, campos) -> set:
+    estado = inspect(obj)
+    return {campo for campo in campos if estado.attrs[campo].history.has_changes()}
+
+
+@event.listens_for(Session, "before_flush")
+def _invalidar_por_cambios(session, flush_context, instances):
+    minimos: Dict[int, datetime] = {}
+    persistidos = []
+    documentos = []
+    empresas = set()
+    recalculando_ids = session.info.get(_CLAVE_RECALCULANDO, ())
+
+    for obj in session.new:
+        if isinstance(obj, MovimientoInventario):
+            _acumular_minimo(minimos, obj.producto_id, obj.fecha)
+
+    for obj in session.dirty:
+        if isinstance(obj, MovimientoInventario) and obj.id is not None:
+            cambiados = _campos_cambiados(obj, _CAMPOS_KARDEX)
+            if obj.producto_id in recalculando_ids:
+                cambiados -= _CAMPOS_DERIVADOS
+            if cambiados:
+                _acumular_minimo(minimos, obj.producto_id, obj.fecha)
+                persistidos.append(obj.id)
+        elif isinstance(obj, Documento) and obj.id is not None:
+            if _campos_cambiados(obj, ("anulado", "documento_referencia_id")):
+                documentos.append(obj.id)
+        elif isinstance(obj, TipoDocumento) and obj.id is not None:
+            if _campos_cambiados(obj, ("funcion_especial",)):
+                empresas.add(obj.empresa_id)
+
+    for obj in session.deleted:
+        if isinstance(obj, MovimientoInventario) and obj.id is not None:
+            persistidos.append(obj.id)
+
+    if not (minimos or persistidos or documentos or empresas):
+        return
+
+    conn = session.connection()
+    if persistidos:
+        # Valores en BD (antes del UPDATE/DELETE): fecha y producto originales
+        for producto_id, fecha in conn.execute(
+            select(MovimientoInventario.producto_id, MovimientoInventario.fecha)
+            .where(MovimientoInventario.id.in_(persistidos))
+        ):
+            _acumular_minimo(minimos, producto_id, fecha)
+    if documentos:
+        for producto_id, fecha in conn.execute(
+            select(MovimientoInventario.producto_id, func.min(MovimientoInventario.fecha))
+            .where(MovimientoInventario.documento_id.in_(documentos))
+            .group_by(MovimientoInventario.producto_id)
+        ):
+            _acumular_minimo(minimos, producto_id, fecha)
+    if empresas:
+        conn.execute(
+            delete(PuntoControlInventario).where(
+                PuntoControlInventario.producto_id.in_(
+                    select(Producto.id).where(Producto.empresa_id.in_(empresas))
+                )
+            )
+        )
+    _invalidar(conn, minimos)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidar_por_sentencia_masiva(orm_execute_state):
+    """DELETE/UPDATE masivos (query(...).delete(), delete(MovimientoInventario)) no pasan por el flush."""
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not MovimientoInventario:
+        return
+
+    condicion = orm_execute_state.statement.whereclause
+    consulta = select(MovimientoInventario.producto_id, func.min(MovimientoInventario.fecha)).group_by(
+        MovimientoInventario.producto_id
+    )
+    if condicion is not None:
+        consulta = consulta.where(condicion)
+
+    conn = orm_execute_state.session.connection()
+    filas = conn.execute(consulta).all()
+    if orm_execute_state.is_update:
+        # Un UPDATE masivo puede mover fechas hacia atrás: se descartan todos los puntos del producto
+        productos = [producto_id for producto_id, _ in filas]
+        if productos:
+            conn.execute(delete(PuntoControlInventario).where(PuntoControlInventario.producto_id.in_(productos)))
+        return
+    _invalidar(conn, {producto_id: fecha for producto_id, fecha in filas})
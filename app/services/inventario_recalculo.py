@@ -0,0 +1,334 @@
+# app/services/inventario_recalculo.py
+"""
+Recálculo masivo de saldos y costo promedio de inventario, por bloques.
+
+inventario.recalcular_todo_inventario llamaba recalcular_saldos_producto
+producto por producto: varias consultas y un commit por producto, todo dentro
+de la misma petición HTTP y sin forma de retomar si se caía a mitad de camino.
+
+Ahora cada ejecución queda registrada (RecalculoInventario) con sus productos
+repartidos en bloques (RecalculoInventarioBloque):
+  - cada bloque carga sus movimientos, asientos de costo y stocks con
+    consultas por conjunto, repasa el kárdex de cada producto desde cero y se
+    confirma en UNA transacción junto con la marca de bloque COMPLETADO,
+  - en PostgreSQL los bloques se reparten entre sesiones en paralelo
+    (settings.INVENTARIO_RECALCULO_WORKERS); en SQLite es secuencial,
+  - si el proceso se interrumpe, reanudar_recalculo solo procesa los bloques
+    pendientes o con error,
+  - el avance se consulta con get_progreso / eventos_progreso (SSE).
+"""
+
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session, selectinload
+
+from app.core.config import settings
+from app.models.inventario_punto_control import PuntoControlInventario
+from app.models.inventario_recalculo import RecalculoInventario, RecalculoInventarioBloque
+from app.models.producto import Producto, StockBodega
+from app.services import inventario_puntos_control as puntos_control
+
+ESTADOS_ABIERTOS = ("PENDIENTE", "EN_PROCESO")
+_INTERVALO_EVENTOS = 1.0
+_MAX_ERROR = 2000
+# Un recálculo EN_PROCESO sin avance en este lapso se considera interrumpido
+_MAXIMO_SIN_AVANCE = timedelta(minutes=15)
+
+# Ejecuciones activas en este proceso (evita correr dos veces el mismo recálculo)
+_en_ejecucion = set()
+_lock = threading.Lock()
+
+
+# ==========================================================
+# 1. CREACIÓN / CONSULTA
+# ==========================================================
+
+def iniciar_recalculo(db: Session, empresa_id: int, usuario_id: Optional[int] = None,
+                      tamano_bloque: Optional[int] = None) -> RecalculoInventario:
+    """
+    Registra un recálculo con los productos (no servicios) de la empresa
+    repartidos en bloques. Si ya hay uno abierto para la empresa, lo retorna
+    en lugar de crear otro.
+    """
+    abierto = db.query(RecalculoInventario).filter(
+        RecalculoInventario.empresa_id == empresa_id,
+        RecalculoInventario.estado.in_(ESTADOS_ABIERTOS)
+    ).order_by(RecalculoInventario.id.desc()).first()
+    if abierto:
+        return abierto
+
+    tamano_bloque = max(1, tamano_bloque or settings.INVENTARIO_RECALCULO_TAMANO_BLOQUE)
+    producto_ids = [p_id for (p_id,) in db.query(Producto.id).filter(
+        Producto.empresa_id == empresa_id,
+        Producto.es_servicio == False
+    ).order_by(Producto.id).all()]
+
+    recalculo = RecalculoInventario(
+        empresa_id=empresa_id,
+        usuario_id=usuario_id,
+        estado="PENDIENTE",
+        tamano_bloque=tamano_bloque,
+        workers=max(1, settings.INVENTARIO_RECALCULO_WORKERS),
+        total_productos=len(producto_ids),
+    )
+    for numero, i in enumerate(range(0, len(producto_ids), tamano_bloque), start=1):
+        recalculo.bloques.append(RecalculoInventarioBloque(
+            numero=numero, producto_ids=producto_ids[i:i + tamano_bloque], estado="PENDIENTE"
+        ))
+    recalculo.total_bloques = len(recalculo.bloques)
+    db.add(recalculo)
+    db.commit()
+    db.refresh(recalculo)
+    print(f"[RECALCULO MASIVO] Registrado #{recalculo.id}: {recalculo.total_productos} productos "
+          f"en {recalculo.total_bloques} bloques de {tamano_bloque}")
+    return recalculo
+
+
+def get_recalculo(db: Session, recalculo_id: int, empresa_id: int) -> RecalculoInventario:
+    recalculo = db.query(RecalculoInventario).filter(
+        RecalculoInventario.id == recalculo_id,
+        RecalculoInventario.empresa_id == empresa_id
+    ).first()
+    if not recalculo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recálculo de inventario no encontrado.")
+    return recalculo
+
+
+def get_progreso(db: Session, recalculo_id: int, empresa_id: int) -> Dict[str, Any]:
+    recalculo = get_recalculo(db, recalculo_id, empresa_id)
+    bloques = db.query(
+        RecalculoInventarioBloque.numero, RecalculoInventarioBloque.error,
+        RecalculoInventarioBloque.productos_negativos
+    ).filter(
+        RecalculoInventarioBloque.recalculo_id == recalculo.id
+    ).order_by(RecalculoInventarioBloque.numero).all()
+    return _vista(recalculo, bloques)
+
+
+def listar_recalculos(db: Session, empresa_id: int, limite: int = 20) -> List[Dict[str, Any]]:
+    recalculos = db.query(RecalculoInventario).filter(
+        RecalculoInventario.empresa_id == empresa_id
+    ).order_by(RecalculoInventario.id.desc()).limit(limite).all()
+    return [_vista(r) for r in recalculos]
+
+
+def _vista(recalculo: RecalculoInventario, bloques=None) -> Dict[str, Any]:
+    total = recalculo.total_productos or 0
+    vista = {
+        "id": recalculo.id,
+        "estado": recalculo.estado,
+        "en_ejecucion": recalculo.id in _en_ejecucion,
+        "total_productos": total,
+        "productos_procesados": recalculo.productos_procesados,
+        "porcentaje": round(100.0 * recalculo.productos_procesados / total, 1) if total else 100.0,
+        "total_bloques": recalculo.total_bloques,
+        "bloques_completados": recalculo.bloques_completados,
+        "bloques_con_error": recalculo.bloques_con_error,
+        "tamano_bloque": recalculo.tamano_bloque,
+        "workers": recalculo.workers,
+        "fecha_inicio": recalculo.fecha_inicio.isoformat() if recalculo.fecha_inicio else None,
+        "fecha_actualizacion": recalculo.fecha_actualizacion.isoformat() if recalculo.fecha_actualizacion else None,
+        "fecha_fin": recalculo.fecha_fin.isoformat() if recalculo.fecha_fin else None,
+    }
+    if bloques is not None:
+        vista["errores"] = [{"bloque": numero, "error": error} for numero, error, _ in bloques if error]
+        vista["productos_negativos"] = sorted({p_id for _, _, negativos in bloques for p_id in (negativos or [])})
+    return vista
+
+
+def _sin_avance(progreso: Dict[str, Any]) -> bool:
+    if progreso["en_ejecucion"] or progreso["estado"] != "EN_PROCESO" or not progreso["fecha_actualizacion"]:
+        return False
+    ultima = datetime.fromisoformat(progreso["fecha_actualizacion"])
+    return datetime.utcnow() - ultima > _MAXIMO_SIN_AVANCE
+
+
+def eventos_progreso(recalculo_id: int, empresa_id: int) -> Iterator[str]:
+    """
+    Flujo Server-Sent Events con el avance del recálculo, hasta que termina.
+    Abre una sesión corta por consulta (la petición puede durar minutos).
+    """
+    from app.core.database import SessionLocal, current_empresa_id
+
+    ultimo = None
+    while True:
+        token = current_empresa_id.set(empresa_id)
+        db = SessionLocal()
+        try:
+            progreso = get_progreso(db, recalculo_id, empresa_id)
+        finally:
+            db.close()
+            current_empresa_id.reset(token)
+
+        if progreso != ultimo:
+            yield f"event: progreso\ndata: {json.dumps(progreso)}\n\n"
+            ultimo = progreso
+        if progreso["estado"] not in ESTADOS_ABIERTOS:
+            yield f"event: fin\ndata: {json.dumps(progreso)}\n\n"
+            return
+        if _sin_avance(progreso):
+            # Quedó abierto por un proceso que ya no existe: el cliente debe reanudarlo
+            yield f"event: interrumpido\ndata: {json.dumps(progreso)}\n\n"
+            return
+        time.sleep(_INTERVALO_EVENTOS)
+
+
+# ==========================================================
+# 2. EJECUCIÓN
+# ==========================================================
+
+def ejecutar_recalculo(recalculo_id: int, empresa_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Procesa los bloques pendientes (o con error) del recálculo en sesiones
+    propias. Sirve tanto para la primera ejecución como para reanudar.
+    Retorna el progreso final, o None si ya se está ejecutando en este proceso.
+    """
+    from app.core.database import SessionLocal, current_empresa_id
+
+    with _lock:
+        if recalculo_id in _en_ejecucion:
+            return None
+        _en_ejecucion.add(recalculo_id)
+
+    token = current_empresa_id.set(empresa_id)
+    db = SessionLocal()
+    try:
+        recalculo = get_recalculo(db, recalculo_id, empresa_id)
+        pendientes = [
+            (bloque.id, list(bloque.producto_ids))
+            for bloque in recalculo.bloques if bloque.estado != "COMPLETADO"
+        ]
+        recalculo.estado = "EN_PROCESO"
+        recalculo.bloques_con_error = 0
+        recalculo.fecha_actualizacion = datetime.utcnow()
+        recalculo.fecha_fin = None
+        workers = recalculo.workers
+        db.commit()
+
+        print(f"[RECALCULO MASIVO] #{recalculo_id}: {len(pendientes)} bloques pendientes")
+        es_postgres = db.get_bind().dialect.name == "postgresql"
+        if es_postgres and workers > 1 and len(pendientes) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(
+                    lambda bloque: _procesar_bloque_en_sesion_propia(empresa_id, recalculo_id, *bloque),
+                    pendientes
+                ))
+        else:
+            for bloque_id, producto_ids in pendientes:
+                _procesar_bloque(db, empresa_id, recalculo_id, bloque_id, producto_ids)
+
+        db.expire_all()
+        recalculo = get_recalculo(db, recalculo_id, empresa_id)
+        recalculo.estado = "COMPLETADO_CON_ERRORES" if recalculo.bloques_con_error else "COMPLETADO"
+        recalculo.fecha_fin = datetime.utcnow()
+        recalculo.fecha_actualizacion = recalculo.fecha_fin
+        db.commit()
+        print(f"[RECALCULO MASIVO] #{recalculo_id} {recalculo.estado}: "
+              f"{recalculo.productos_procesados}/{recalculo.total_productos} productos")
+        return get_progreso(db, recalculo_id, empresa_id)
+    finally:
+        db.close()
+        current_empresa_id.reset(token)
+        with _lock:
+            _en_ejecucion.discard(recalculo_id)
+
+
+def reanudar_recalculo(db: Session, recalculo_id: int, empresa_id: int) -> RecalculoInventario:
+    """Valida que el recálculo pueda reanudarse (la ejecución la lanza el caller)."""
+    recalculo = get_recalculo(db, recalculo_id, empresa_id)
+    if recalculo_id in _en_ejecucion:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El recálculo ya se está ejecutando.")
+    if recalculo.estado == "COMPLETADO":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El recálculo ya está completo.")
+    return recalculo
+
+
+def _procesar_bloque_en_sesion_propia(empresa_id: int, recalculo_id: int, bloque_id: int, producto_ids: List[int]) -> None:
+    from app.core.database import SessionLocal, current_empresa_id
+    token = current_empresa_id.set(empresa_id)
+    db = SessionLocal()
+    try:
+        _procesar_bloque(db, empresa_id, recalculo_id, bloque_id, producto_ids)
+    finally:
+        db.close()
+        current_empresa_id.reset(token)
+
+
+def _procesar_bloque(db: Session, empresa_id: int, recalculo_id: int, bloque_id: int, producto_ids: List[int]) -> None:
+    """
+    Recalcula desde cero los productos del bloque y confirma el resultado junto
+    con la marca del bloque (todo o nada). Un error deja el bloque en ERROR para
+    reanudarlo después; no detiene los demás bloques.
+    """
+    from app.services import inventario as inventario_service
+
+    try:
+        productos = db.query(Producto).options(selectinload(Producto.grupo_inventario)).filter(
+            Producto.id.in_(producto_ids),
+            Producto.empresa_id == empresa_id
+        ).all()
+        ids = [p.id for p in productos]
+        negativos = []
+
+        with puntos_control.recalculando(db, *ids):
+            if ids:
+                # Reparación completa: se descartan los puntos de control y se regeneran
+                db.query(PuntoControlInventario).filter(
+                    PuntoControlInventario.producto_id.in_(ids)
+                ).delete(synchronize_session=False)
+                db.query(StockBodega).filter(
+                    StockBodega.producto_id.in_(ids)
+                ).update({"stock_actual": 0.0, "stock_comprometido": 0.0}, synchronize_session=False)
+
+                movimientos = inventario_service._consulta_movimientos_kardex(db, ids)
+                asientos = inventario_service._cargar_asientos_kardex(db, productos, movimientos)
+                stocks: Dict[int, Dict[int, StockBodega]] = {}
+                for sb in db.query(StockBodega).filter(StockBodega.producto_id.in_(ids)).populate_existing():
+                    stocks.setdefault(sb.producto_id, {})[sb.bodega_id] = sb
+                movimientos_por_producto: Dict[int, list] = {}
+                for fila in movimientos:
+                    movimientos_por_producto.setdefault(fila[0].producto_id, []).append(fila)
+
+                for producto in productos:
+                    # Se reconstruye el historial tal como está: un saldo negativo se reporta, no aborta
+                    stock_total, _ = inventario_service._reprocesar_kardex(
+                        db, producto, movimientos_por_producto.get(producto.id, []),
+                        asientos.get(producto.id, {}), stocks.get(producto.id, {}),
+                        validar_negativos=False
+                    )
+                    if stock_total < 0:
+                        negativos.append(producto.id)
+
+            ahora = datetime.utcnow()
+            db.query(RecalculoInventarioBloque).filter(RecalculoInventarioBloque.id == bloque_id).update({
+                "estado": "COMPLETADO",
+                "productos_procesados": len(ids),
+                "productos_negativos": negativos or None,
+                "error": None,
+                "fecha_fin": ahora,
+            }, synchronize_session=False)
+            db.query(RecalculoInventario).filter(RecalculoInventario.id == recalculo_id).update({
+                "productos_procesados": RecalculoInventario.productos_procesados + len(ids),
+                "bloques_completados": RecalculoInventario.bloques_completados + 1,
+                "fecha_actualizacion": ahora,
+            }, synchronize_session=False)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        traceback.print_exc()
+        print(f"[RECALCULO MASIVO ERROR] #{recalculo_id} bloque {bloque_id}: {e}")
+        db.query(RecalculoInventarioBloque).filter(RecalculoInventarioBloque.id == bloque_id).update({
+            "estado": "ERROR", "error": str(e)[:_MAX_ERROR], "fecha_fin": datetime.utcnow(),
+        }, synchronize_session=False)
+        db.query(RecalculoInventario).filter(RecalculoInventario.id == recalculo_id).update({
+            "bloques_con_error": RecalculoInventario.bloques_con_error + 1,
+            "fecha_actualizacion": datetime.utcnow(),
+        }, synchronize_session=False)
+        db.commit()
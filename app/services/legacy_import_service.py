@@ -3,17 +3,18 @@ import struct
 import re
 from datetime import date
 from typing import List, Dict, Any, Optional
+from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.models import (
     PlanCuenta, 
     Tercero, 
-    Documento, 
-    MovimientoContable, 
     Empresa,
     TipoDocumento
 )
+from app.schemas import documento as schemas_doc
 from app.services import documento as documento_service
+from app.services import documento_masivo
 from app.services.import_utils import ImportUtils
 
 class LegacyParsingService:
@@ -698,6 +699,9 @@ def import_legacy_data(
         # D. Process Documents
         # Cache for created/found types
         tipo_doc_cache = {} 
+        cuenta_cache = {}
+        # Documents are prepared here and created at the end in one bulk batch (documento_masivo)
+        pendientes = [] # (DocumentoCreate, ref)
         
         for (ref, fecha_str), lines in grouped_docs.items():
             try:
@@ -804,37 +808,33 @@ def import_legacy_data(
                      # Log error or skip? Skipping.
                      continue
                 
-                new_doc = Documento(
-                    empresa_id=empresa_id,
-                    beneficiario_id=tercero_id,
-                    tipo_documento_id=target_tipo_id,
-                    numero=doc_num if doc_num > 0 else 999999,
-                    fecha=doc_date,
-                    observaciones=f"Ref: {ref} - {lines[0]['concepto']}",
-                    estado="ACTIVO"
-                )
-                db.add(new_doc)
-                db.flush()
-                
+                movimientos = []
                 for line in lines:
-                    acc_obj = db.query(PlanCuenta).filter_by(empresa_id=empresa_id, codigo=line['cuenta']).first()
-                    if acc_obj:
-                         mov = MovimientoContable(
-                            documento_id=new_doc.id,
-                            cuenta_id=acc_obj.id,
+                    if line['cuenta'] not in cuenta_cache:
+                        acc_obj = db.query(PlanCuenta).filter_by(empresa_id=empresa_id, codigo=line['cuenta']).first()
+                        cuenta_cache[line['cuenta']] = acc_obj.id if acc_obj else None
+                    if cuenta_cache[line['cuenta']]:
+                         movimientos.append(schemas_doc.MovimientoContableCreate(
+                            cuenta_id=cuenta_cache[line['cuenta']],
                             debito=line['debito'],
                             credito=line['credito'],
                             concepto=line['concepto']
-                         )
-                         db.add(mov)
+                         ))
                 
-                db.commit()
-                results["transactions"] += 1
+                pendientes.append((schemas_doc.DocumentoCreate(
+                    beneficiario_id=tercero_id,
+                    tipo_documento_id=target_tipo_id,
+                    numero=doc_num if doc_num > 0 else 999999,
+                    fecha=doc_date,
+                    observaciones=f"Ref: {ref} - {lines[0]['concepto']}",
+                    movimientos=movimientos
+                ), ref))
                 
             except Exception as e:
                 # print(f"Error processing doc {ref}: {e}")
                 db.rollback()
         
+        _crear_documentos(db, empresa_id, pendientes, results)
         return results
 
     # 1. Import Accounts (COMA) - OLD LOGIC FALLBACK
@@ -917,37 +917,52 @@ def import_legacy_data(
         for tx in txs:
             grouped[tx["doc_ref"]].append(tx)
             
+        cuentas = {
+            codigo: id_ for id_, codigo in db.query(PlanCuenta.id, PlanCuenta.codigo).filter_by(empresa_id=empresa_id)
+        }
+        pendientes = []
         for doc_ref, entries in grouped.items():
             
-            new_doc = Documento(
-                empresa_id=empresa_id,
+            movimientos = [
+                schemas_doc.MovimientoContableCreate(
+                    cuenta_id=cuentas[entry["cuenta"]],
+                    debito=entry["debito"],
+                    credito=entry["credito"],
+                    concepto=f"Mov Ref {doc_ref}" # Changed descripcion to concepto
+                )
+                for entry in entries if entry["cuenta"] in cuentas
+            ]
+            pendientes.append((schemas_doc.DocumentoCreate(
                 beneficiario_id=default_tercero_id, 
                 tipo_documento_id=target_tipo_doc_id, # Safely determined above
                 numero=999999,
                 fecha=period_date,
                 observaciones=f"Importado Legacy Ref: {doc_ref}",
-                estado="APROBADO"
-            )
-            
-            db.add(new_doc)
-            db.flush()
-            
-            for index, entry in enumerate(entries):
-                # Find Account ID
-                acc_obj = db.query(PlanCuenta).filter_by(empresa_id=empresa_id, codigo=entry["cuenta"]).first()
-                if acc_obj:
-                    mov = MovimientoContable(
-                        documento_id=new_doc.id,
-                        cuenta_id=acc_obj.id,
-                        # tercero_id is not in MovimientoContable, only in Documento
-                        debito=entry["debito"],
-                        credito=entry["credito"],
-                        concepto=f"Mov Ref {doc_ref}" # Changed descripcion to concepto
-                    )
-                    db.add(mov)
-            
-            results["transactions"] += 1
+                movimientos=movimientos
+            ), doc_ref))
             
         db.commit()
+        _crear_documentos(db, empresa_id, pendientes, results)
         
     return results
+
+
+def _crear_documentos(db: Session, empresa_id: int, pendientes, results: Dict[str, Any]) -> None:
+    """
+    Creates the prepared (DocumentoCreate, ref) pairs in one bulk batch, keeping their
+    numbers. Invalid documents (e.g. unbalanced after dropping unknown accounts) are
+    reported in results["errors"] and the rest are created.
+    """
+    if not pendientes:
+        return
+    try:
+        creados = documento_masivo.create_documentos_bulk(
+            db, [doc for doc, _ in pendientes], None, empresa_id,
+            conservar_numeros=True, omitir_invalidos=True, historico=True
+        )
+    except HTTPException as e:
+        results["errors"].append(f"Documents not created: {e.detail}")
+        return
+    for error in creados["errores"]:
+        results["errors"].append(f"Doc {pendientes[error['indice']][1]} skipped: {error['detalle']}")
+    results["transactions"] += creados["creados"]
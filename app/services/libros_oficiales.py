@@ -2,15 +2,20 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 from datetime import date
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List
 from fastapi import HTTPException
-from weasyprint import HTML
-from jinja2 import Environment, select_autoescape
+from app.services import motor_pdf
+from app.core.reporting_registry import reportar_avance
 import itertools
 import operator
 import locale
 
-from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
+from app.services.plantillas_html import TEMPLATES_EMPAQUETADOS
+from app.services import plantillas_html
+from app.services import arbol_puc
+from app.services import exportacion_streaming
+from app.services import paginacion_keyset
+from app.services import busqueda
 from ..models import (
     Documento as models_doc, MovimientoContable as models_mov,
     TipoDocumento as models_tipo, Tercero as models_tercero,
@@ -29,12 +34,131 @@ def format_currency(value):
     numeric_value = float(value or 0.0)
     return f"${numeric_value:,.2f}"
 
-GLOBAL_JINJA_ENV = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
+GLOBAL_JINJA_ENV = plantillas_html.crear_entorno()
 GLOBAL_JINJA_ENV.filters['groupby'] = lambda value, attribute: itertools.groupby(sorted(value, key=operator.itemgetter(attribute)), operator.itemgetter(attribute))
 GLOBAL_JINJA_ENV.globals['list'] = list
 GLOBAL_JINJA_ENV.filters['currency'] = format_currency
 
 # --- FUNCIÓN DE DATOS PARA FRONTEND (YA CORREGIDA Y FUNCIONAL) ---
+def _consulta_libro_diario(
+    db: Session,
+    empresa_id: int,
+    fecha_inicio: date,
+    fecha_fin: date,
+    tipos_documento_ids: Optional[List[int]] = None,
+    cuenta_filtro: Optional[str] = None,
+    numero_documento: Optional[str] = None,
+    beneficiario_filtro: Optional[str] = None,
+    concepto_filtro: Optional[str] = None,
+    valor_filtro: Optional[float] = None,
+    operador_valor: Optional[str] = '>=',
+    centro_costo_filtro: Optional[str] = None,
+    vendedor_filtro: Optional[str] = None,
+    producto_filtro: Optional[str] = None
+):
+    """Consulta (sin ejecutar) de los movimientos del Libro Diario, ya filtrada y ordenada."""
+    from sqlalchemy.orm import aliased
+    from ..models import CentroCosto as models_cc, Producto as models_prod
+
+    TerceroMov = aliased(models_tercero)
+    Vendedor = aliased(models_tercero)
+
+    query = db.query(
+        models_doc.fecha,
+        models_doc.numero.label("numero_documento"),
+        models_tipo.nombre.label("tipo_documento"),
+        models_tipo.codigo.label("tipo_documento_codigo"),
+        models_doc.id.label("documento_id"),
+        # Beneficiario con fallback (Documento -> Movimiento)
+        func.coalesce(models_tercero.razon_social, TerceroMov.razon_social, '').label("beneficiario_nombre"),
+        func.coalesce(models_tercero.nit, TerceroMov.nit, '').label("beneficiario_nit"),
+        models_plan.codigo.label("cuenta_codigo"),
+        models_plan.nombre.label("cuenta_nombre"),
+        models_mov.concepto,
+        models_mov.debito,
+        models_mov.credito,
+        models_mov.id.label("movimiento_id"),
+        # --- NUEVOS CAMPOS ---
+        models_cc.codigo.label("centro_costo_codigo"),
+        Vendedor.razon_social.label("vendedor_nombre"),
+        models_prod.nombre.label("producto_nombre")
+    ).join(models_mov, models_doc.id == models_mov.documento_id)\
+     .outerjoin(models_tipo, models_doc.tipo_documento_id == models_tipo.id)\
+     .join(models_plan, models_mov.cuenta_id == models_plan.id)\
+     .outerjoin(models_tercero, models_doc.beneficiario_id == models_tercero.id)\
+     .outerjoin(TerceroMov, models_mov.tercero_id == TerceroMov.id)\
+     .outerjoin(models_cc, models_mov.centro_costo_id == models_cc.id)\
+     .outerjoin(Vendedor, models_doc.vendedor_id == Vendedor.id)\
+     .outerjoin(models_prod, models_mov.producto_id == models_prod.id)\
+     .filter(
+        models_doc.empresa_id == empresa_id,
+        models_doc.fecha.between(fecha_inicio, fecha_fin),
+        models_doc.anulado == False
+    )
+
+    if tipos_documento_ids:
+        query = query.filter(models_doc.tipo_documento_id.in_(tipos_documento_ids))
+
+    if cuenta_filtro:
+        query = query.filter(busqueda.condicion(db, "cuenta", cuenta_filtro, objetivo=models_plan))
+
+    if numero_documento:
+        query = query.filter(models_doc.numero.ilike(f"%{numero_documento}%"))
+
+    if beneficiario_filtro:
+        # Tercero del documento o, en su defecto, el del movimiento
+        query = query.filter(or_(
+            busqueda.condicion(db, "tercero", beneficiario_filtro, objetivo=models_tercero),
+            busqueda.condicion(db, "tercero", beneficiario_filtro, objetivo=TerceroMov)
+        ))
+
+    if concepto_filtro:
+        query = query.filter(busqueda.condicion(db, "concepto", concepto_filtro, objetivo=models_mov))
+
+    if valor_filtro:
+        # Filtro de valor (se aplica al máximo entre débito y crédito)
+        max_val = func.greatest(models_mov.debito, models_mov.credito)
+        if operador_valor == '>=':
+            query = query.filter(max_val >= valor_filtro)
+        elif operador_valor == '<=':
+            query = query.filter(max_val <= valor_filtro)
+        elif operador_valor == '==':
+            # Margen de error para flotantes
+            query = query.filter(max_val.between(valor_filtro - 0.01, valor_filtro + 0.01))
+
+    if centro_costo_filtro:
+        query = query.filter(models_cc.codigo.ilike(f"%{centro_costo_filtro}%"))
+
+    if vendedor_filtro:
+        query = query.filter(busqueda.condicion(db, "tercero", vendedor_filtro, objetivo=Vendedor, columnas=["razon_social"]))
+
+    if producto_filtro:
+        query = query.filter(busqueda.condicion(db, "producto", producto_filtro, objetivo=models_prod, columnas=["nombre"]))
+
+    return query.order_by(models_doc.fecha, models_doc.numero, models_mov.id)
+
+
+def _fila_libro_diario(mov) -> Dict[str, Any]:
+    return {
+        "id": mov.movimiento_id, # Key única para React
+        "documento_id": mov.documento_id, # ID para impresión
+        "fecha": mov.fecha,
+        "tipo_documento": mov.tipo_documento, 
+        "tipo_documento_codigo": mov.tipo_documento_codigo, 
+        "numero_documento": mov.numero_documento,
+        "beneficiario_nombre": mov.beneficiario_nombre or "N/A",
+        "beneficiario_nit": mov.beneficiario_nit or "N/A",
+        "cuenta_codigo": mov.cuenta_codigo,
+        "cuenta_nombre": mov.cuenta_nombre,
+        "concepto": mov.concepto,
+        "debito": float(mov.debito or 0.0),
+        "credito": float(mov.credito or 0.0),
+        "centro_costo_codigo": mov.centro_costo_codigo or "",
+        "vendedor_nombre": mov.vendedor_nombre or "",
+        "producto_nombre": mov.producto_nombre or ""
+    }
+
+
 def get_data_for_libro_diario(
     db: Session,
     empresa_id: int,
@@ -55,120 +179,52 @@ def get_data_for_libro_diario(
     Obtiene una lista plana de movimientos contables para la tabla del Libro Diario en el frontend.
     """
     try:
-        from sqlalchemy.orm import aliased
-        from ..models import CentroCosto as models_cc, Producto as models_prod
-        
-        TerceroMov = aliased(models_tercero)
-        Vendedor = aliased(models_tercero)
-
-        query = db.query(
-            models_doc.fecha,
-            models_doc.numero.label("numero_documento"),
-            models_tipo.nombre.label("tipo_documento"),
-            models_tipo.codigo.label("tipo_documento_codigo"),
-            models_doc.id.label("documento_id"),
-            # Beneficiario con fallback (Documento -> Movimiento)
-            func.coalesce(models_tercero.razon_social, TerceroMov.razon_social, '').label("beneficiario_nombre"),
-            func.coalesce(models_tercero.nit, TerceroMov.nit, '').label("beneficiario_nit"),
-            models_plan.codigo.label("cuenta_codigo"),
-            models_plan.nombre.label("cuenta_nombre"),
-            models_mov.concepto,
-            models_mov.debito,
-            models_mov.credito,
-            models_mov.id.label("movimiento_id"),
-            # --- NUEVOS CAMPOS ---
-            models_cc.codigo.label("centro_costo_codigo"),
-            Vendedor.razon_social.label("vendedor_nombre"),
-            models_prod.nombre.label("producto_nombre")
-        ).join(models_mov, models_doc.id == models_mov.documento_id)\
-         .outerjoin(models_tipo, models_doc.tipo_documento_id == models_tipo.id)\
-         .join(models_plan, models_mov.cuenta_id == models_plan.id)\
-         .outerjoin(models_tercero, models_doc.beneficiario_id == models_tercero.id)\
-         .outerjoin(TerceroMov, models_mov.tercero_id == TerceroMov.id)\
-         .outerjoin(models_cc, models_mov.centro_costo_id == models_cc.id)\
-         .outerjoin(Vendedor, models_doc.vendedor_id == Vendedor.id)\
-         .outerjoin(models_prod, models_mov.producto_id == models_prod.id)\
-         .filter(
-            models_doc.empresa_id == empresa_id,
-            models_doc.fecha.between(fecha_inicio, fecha_fin),
-            models_doc.anulado == False
+        query = _consulta_libro_diario(
+            db, empresa_id, fecha_inicio, fecha_fin, tipos_documento_ids, cuenta_filtro, numero_documento,
+            beneficiario_filtro, concepto_filtro, valor_filtro, operador_valor, centro_costo_filtro,
+            vendedor_filtro, producto_filtro
         )
-
-        if tipos_documento_ids:
-            query = query.filter(models_doc.tipo_documento_id.in_(tipos_documento_ids))
-            
-        if cuenta_filtro:
-            filtro = f"%{cuenta_filtro}%"
-            query = query.filter(or_(
-                models_plan.codigo.ilike(filtro),
-                models_plan.nombre.ilike(filtro)
-            ))
-
-        if numero_documento:
-            query = query.filter(models_doc.numero.ilike(f"%{numero_documento}%"))
-
-        if beneficiario_filtro:
-            filtro_ben = f"%{beneficiario_filtro}%"
-            query = query.filter(or_(
-                models_tercero.razon_social.ilike(filtro_ben),
-                models_tercero.nit.ilike(filtro_ben),
-                TerceroMov.razon_social.ilike(filtro_ben),
-                TerceroMov.nit.ilike(filtro_ben)
-            ))
-
-        if concepto_filtro:
-            query = query.filter(models_mov.concepto.ilike(f"%{concepto_filtro}%"))
-
-        if valor_filtro:
-            # Filtro de valor (se aplica al máximo entre débito y crédito)
-            max_val = func.greatest(models_mov.debito, models_mov.credito)
-            if operador_valor == '>=':
-                query = query.filter(max_val >= valor_filtro)
-            elif operador_valor == '<=':
-                query = query.filter(max_val <= valor_filtro)
-            elif operador_valor == '==':
-                # Margen de error para flotantes
-                query = query.filter(max_val.between(valor_filtro - 0.01, valor_filtro + 0.01))
-
-        if centro_costo_filtro:
-            query = query.filter(models_cc.codigo.ilike(f"%{centro_costo_filtro}%"))
-
-        if vendedor_filtro:
-            query = query.filter(Vendedor.razon_social.ilike(f"%{vendedor_filtro}%"))
-
-        if producto_filtro:
-            query = query.filter(models_prod.nombre.ilike(f"%{producto_filtro}%"))
-
-        movimientos_raw = query.order_by(models_doc.fecha, models_doc.numero, models_mov.id).all()
-
-        report_data = [
-            {
-                "id": mov.movimiento_id, # Key única para React
-                "documento_id": mov.documento_id, # ID para impresión
-                "fecha": mov.fecha,
-                "tipo_documento": mov.tipo_documento, 
-                "tipo_documento_codigo": mov.tipo_documento_codigo, 
-                "numero_documento": mov.numero_documento,
-                "beneficiario_nombre": mov.beneficiario_nombre or "N/A",
-                "beneficiario_nit": mov.beneficiario_nit or "N/A",
-                "cuenta_codigo": mov.cuenta_codigo,
-                "cuenta_nombre": mov.cuenta_nombre,
-                "concepto": mov.concepto,
-                "debito": float(mov.debito or 0.0),
-                "credito": float(mov.credito or 0.0),
-                "centro_costo_codigo": mov.centro_costo_codigo or "",
-                "vendedor_nombre": mov.vendedor_nombre or "",
-                "producto_nombre": mov.producto_nombre or ""
-            }
-            for mov in movimientos_raw
-        ]
-        
-        return report_data
+        return [_fila_libro_diario(mov) for mov in query.all()]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar datos del Libro Diario: {str(e)}")
 
 
+def iterar_libro_diario(db: Session, empresa_id: int, **filtros) -> Iterator[Dict[str, Any]]:
+    """Mismas filas que get_data_for_libro_diario, leídas por lotes (cursor del lado del servidor)."""
+    query = _consulta_libro_diario(db, empresa_id, **filtros)
+    return (_fila_libro_diario(mov) for mov in exportacion_streaming.iterar_consulta(query))
+
+
+def get_pagina_libro_diario(
+    db: Session,
+    empresa_id: int,
+    cursor: Optional[str] = None,
+    limite: int = 200,
+    acumulados: bool = False,
+    incluir_totales: Optional[bool] = None,
+    **filtros
+) -> Dict[str, Any]:
+    """
+    Una página del Libro Diario ordenada por (fecha, documento_id, movimiento_id),
+    después del cursor de la página anterior (ver paginacion_keyset).
+    Los totales del período se calculan por defecto solo en la primera página.
+    """
+    query = _consulta_libro_diario(db, empresa_id, **filtros)
+    huella = paginacion_keyset.huella_filtros(
+        reporte="libro_diario", empresa_id=empresa_id, acumulados=acumulados, **filtros
+    )
+    pagina = paginacion_keyset.paginar(
+        query,
+        [("fecha", models_doc.fecha), ("documento_id", models_doc.id), ("movimiento_id", models_mov.id)],
+        limite, cursor, huella, acumulados=acumulados
+    )
+    if incluir_totales is None:
+        incluir_totales = cursor is None
+    totales = paginacion_keyset.totales(query, models_mov.id, models_mov.debito, models_mov.credito) if incluir_totales else None
+    return paginacion_keyset.respuesta(pagina, [_fila_libro_diario(mov) for mov in pagina["filas"]], totales)
+
+
 
 # --- FUNCIÓN DE PDF (CORREGIDA Y COMPLETA) ---
 def generate_libro_diario_pdf(
@@ -206,6 +262,8 @@ def generate_libro_diario_pdf(
     )
     
     
+    reportar_avance(40, f"{len(movimientos_planos):,} movimientos consultados")
+
     # Calcular totales globales
     total_debito = sum(m['debito'] for m in movimientos_planos)
     total_credito = sum(m['credito'] for m in movimientos_planos)
@@ -282,10 +340,10 @@ def generate_libro_diario_pdf(
     }
     
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/journal_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/journal_report.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        reportar_avance(60, "Renderizando el PDF")
+        return motor_pdf.html_a_pdf(rendered_html, prioridad=motor_pdf.PRIORIDAD_LIBRO)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/journal_report.html' no fue encontrada.")
     except Exception as e:
@@ -300,103 +358,64 @@ def get_data_for_libro_mayor_y_balances(
     fecha_fin: date
 ) -> Dict[str, Any]:
     try:
-        # 1. Obtener todas las cuentas del PUC (jerarquía completa) para nombres
-        all_accounts = db.query(models_plan).filter(
-            models_plan.empresa_id == empresa_id
-        ).all()
-        # Mapa: '1105' -> 'CAJA', '1' -> 'ACTIVO'
-        mapa_nombres = {c.codigo: c.nombre for c in all_accounts}
-
-        # Asegurar nombres por defecto para niveles superiores si no existen
+        # Nombres por defecto para las clases que no existan en el plan
         defaults = {
             '1': 'ACTIVO', '2': 'PASIVO', '3': 'PATRIMONIO', 
             '4': 'INGRESOS', '5': 'GASTOS', '6': 'COSTOS DE VENTA',
             '7': 'COSTOS DE PRODUCCIÓN', '8': 'CUENTAS DE ORDEN'
         }
-        for code, name in defaults.items():
-            if code not in mapa_nombres:
-                mapa_nombres[code] = name
-
-        # 2. Inicializar diccionario de agregación
-        # Se usará para acumular valores en niveles 1, 2 y 4
-        # data_tree = { '1': {...}, '11': {...}, '1105': {...} }
-        data_tree = {}
 
-        def get_or_create_node(codigo):
-            if codigo not in data_tree:
-                data_tree[codigo] = {
-                    "cuenta_codigo": codigo,
-                    "cuenta_nombre": mapa_nombres.get(codigo, "SIN NOMBRE"),
-                    "saldo_inicial": 0.0,
-                    "total_debito": 0.0,
-                    "total_credito": 0.0,
-                    "nivel": len(codigo)
-                }
-            return data_tree[codigo]
-
-        # 3. Función Helper para acumular en cascada (4 -> 2 -> 1)
-        def acumular_valores(codigo_full, s_ini, deb, cred):
-            # Solo nos interesa hasta nivel 4 (Major)
-            # Ignoramos auxiliares de 6+ dígitos, pero sus valores se suman a los padres 4, 2, 1
-            
-            # Determinar código nivel 4 (si el movimiento es de una cuenta >= 4 dígitos)
-            code_4 = codigo_full[:4] if len(codigo_full) >= 4 else None
-            code_2 = codigo_full[:2] if len(codigo_full) >= 2 else None
-            code_1 = codigo_full[:1] if len(codigo_full) >= 1 else None
-
-            # Acumular en Nivel 4
-            if code_4:
-                node = get_or_create_node(code_4)
-                node["saldo_inicial"] += float(s_ini)
-                node["total_debito"] += float(deb)
-                node["total_credito"] += float(cred)
-            
-            # Acumular en Nivel 2
-            if code_2:
-                node = get_or_create_node(code_2)
-                node["saldo_inicial"] += float(s_ini)
-                node["total_debito"] += float(deb)
-                node["total_credito"] += float(cred)
-
-            # Acumular en Nivel 1
-            if code_1:
-                node = get_or_create_node(code_1)
-                node["saldo_inicial"] += float(s_ini)
-                node["total_debito"] += float(deb)
-                node["total_credito"] += float(cred)
-
-        # 4. Obtener Saldos Iniciales Bulk
+        # 1. Saldos Iniciales Bulk (por cuenta)
         saldos_ini_query = db.query(
-            models_plan.codigo,
+            models_mov.cuenta_id,
             func.sum(models_mov.debito - models_mov.credito).label("saldo")
         ).join(models_doc, models_mov.documento_id == models_doc.id)\
-         .join(models_plan, models_mov.cuenta_id == models_plan.id)\
          .filter(
             models_doc.empresa_id == empresa_id,
             models_doc.fecha < fecha_inicio,
             models_doc.anulado == False
-        ).group_by(models_plan.codigo).all()
+        ).group_by(models_mov.cuenta_id).all()
 
-        for row in saldos_ini_query:
-            acumular_valores(row.codigo, row.saldo or 0, 0, 0)
-
-        # 5. Obtener Movimientos del Periodo Bulk
+        # 2. Movimientos del Periodo Bulk (por cuenta)
         movimientos_query = db.query(
-            models_plan.codigo,
+            models_mov.cuenta_id,
             func.sum(models_mov.debito).label("debito"),
             func.sum(models_mov.credito).label("credito")
         ).join(models_doc, models_mov.documento_id == models_doc.id)\
-         .join(models_plan, models_mov.cuenta_id == models_plan.id)\
          .filter(
             models_doc.empresa_id == empresa_id,
             models_doc.fecha.between(fecha_inicio, fecha_fin),
             models_doc.anulado == False
-        ).group_by(models_plan.codigo).all()
+        ).group_by(models_mov.cuenta_id).all()
 
-        for row in movimientos_query:
-            acumular_valores(row.codigo, 0, row.debito or 0, row.credito or 0)
+        # 3. Mayorización en el árbol del PUC (auxiliares suman a sus cuentas, grupos y clases)
+        arbol = arbol_puc.get_arbol_puc(
+            db, empresa_id, cuenta_ids=[r.cuenta_id for r in saldos_ini_query] + [r.cuenta_id for r in movimientos_query]
+        )
+        valores = arbol.vector({r.cuenta_id: float(r.saldo or 0) for r in saldos_ini_query}, columnas=3)
+        for r in movimientos_query:
+            posicion = arbol.indice.get(r.cuenta_id)
+            if posicion is not None:
+                valores[posicion, 1] = float(r.debito or 0)
+                valores[posicion, 2] = float(r.credito or 0)
+        totales = arbol.acumular(valores)
+
+        # Solo interesan Clase (1), Grupo (2) y Cuenta (4 dígitos)
+        data_tree = {}
+        for i in range(arbol.n):
+            codigo = arbol.codigos[i]
+            if len(codigo) not in (1, 2, 4):
+                continue
+            data_tree[codigo] = {
+                "cuenta_codigo": codigo,
+                "cuenta_nombre": arbol.nombres[i] or defaults.get(codigo, "SIN NOMBRE"),
+                "saldo_inicial": float(totales[i, 0]),
+                "total_debito": float(totales[i, 1]),
+                "total_credito": float(totales[i, 2]),
+                "nivel": len(codigo)
+            }
 
-        # 6. Preparar lista final ordenada
+        # 4. Preparar lista final ordenada
         # Filtramos nodos que tengan algún valor != 0
         lista_final = []
         
@@ -465,10 +484,9 @@ def generate_libro_mayor_y_balances_pdf(
     
     try:
         # USA LA NUEVA VERSIÓN V2 DE LA PLANTILLA
-        template_string = TEMPLATES_EMPAQUETADOS['reports/mayor_y_balances_v2.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/mayor_y_balances_v2.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html, prioridad=motor_pdf.PRIORIDAD_LIBRO)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/mayor_y_balances_v2.html' no fue encontrada.")
     except Exception as e:
@@ -503,10 +521,9 @@ def generate_libro_mayor_y_balances_pdf(
     }
     
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/mayor_y_balances_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/mayor_y_balances_report.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html, prioridad=motor_pdf.PRIORIDAD_LIBRO)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/mayor_y_balances_report.html' no fue encontrada.")
     except Exception as e:
@@ -601,10 +618,9 @@ def generate_inventarios_y_balances_pdf(
         "reporte": report_data
     }
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/inventarios_y_balances_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/inventarios_y_balances_report.html')
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html, prioridad=motor_pdf.PRIORIDAD_LIBRO)
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/inventarios_y_balances_report.html' no fue encontrada.")
     except Exception as e:
@@ -718,9 +734,9 @@ def generate_libro_diario_resumen_pdf(
              with open(template_path, 'r', encoding='utf-8') as f:
                  template_string = f.read()
 
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.compilar(GLOBAL_JINJA_ENV, template_string)
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html, prioridad=motor_pdf.PRIORIDAD_LIBRO)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar el PDF del Resumen Diario: {e}")
 
@@ -864,9 +880,61 @@ def generate_analisis_cuenta_por_documento_pdf(
              with open(template_path, 'r', encoding='utf-8') as f:
                  template_string = f.read()
 
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.compilar(GLOBAL_JINJA_ENV, template_string)
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html, prioridad=motor_pdf.PRIORIDAD_LIBRO)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar el PDF de AnÃ¡lisis de Cuentas: {e}")
     
+
+
+# ==============================================================================
+# === REGISTRY INTEGRATION: LIBRO DIARIO (TRABAJOS EN SEGUNDO PLANO) ===
+# ==============================================================================
+from ..core.reporting_registry import BaseReport, ReportRegistry
+from ..schemas.trabajo_reporte import FiltrosLibroDiario
+
+_COLUMNAS_LIBRO_DIARIO = [
+    ("fecha", "FECHA"), ("tipo_documento_codigo", "TIPO"), ("numero_documento", "NUMERO"),
+    ("beneficiario_nit", "NIT"), ("beneficiario_nombre", "BENEFICIARIO"), ("cuenta_codigo", "CUENTA"),
+    ("cuenta_nombre", "NOMBRE CUENTA"), ("concepto", "CONCEPTO"), ("centro_costo_codigo", "CENTRO COSTO"),
+    ("debito", "DEBITO"), ("credito", "CREDITO"),
+]
+
+
+@ReportRegistry.register
+class LibroDiarioReportService(BaseReport):
+    key = "libro_diario"
+    description = "Libro Diario (movimientos contables del período)"
+    filter_schema = FiltrosLibroDiario
+    formats = ("pdf", "csv", "xlsx")
+
+    def _filtros(self, filtros) -> FiltrosLibroDiario:
+        return filtros if isinstance(filtros, FiltrosLibroDiario) else self.filter_schema(**filtros)
+
+    def get_data(self, db: Session, empresa_id: int, filtros):
+        return get_data_for_libro_diario(db, empresa_id, **self._filtros(filtros).model_dump())
+
+    def generate_pdf(self, db: Session, empresa_id: int, filtros):
+        filtros_obj = self._filtros(filtros)
+        pdf_bytes = generate_libro_diario_pdf(db, empresa_id, **filtros_obj.model_dump())
+        return pdf_bytes, f"Libro_Diario_{filtros_obj.fecha_inicio}_{filtros_obj.fecha_fin}.pdf"
+
+    def _exportar(self, db: Session, empresa_id: int, filtros_obj: FiltrosLibroDiario, formato: str):
+        movimientos = iterar_libro_diario(db, empresa_id, **filtros_obj.model_dump())
+        return exportacion_streaming.exportar(
+            formato,
+            [titulo for _, titulo in _COLUMNAS_LIBRO_DIARIO],
+            ([mov.get(campo) for campo, _ in _COLUMNAS_LIBRO_DIARIO] for mov in movimientos),
+            titulo="Libro Diario"
+        )
+
+    def generate_csv(self, db: Session, empresa_id: int, filtros):
+        filtros_obj = self._filtros(filtros)
+        bloques = self._exportar(db, empresa_id, filtros_obj, "csv")
+        return bloques, f"Libro_Diario_{filtros_obj.fecha_inicio}_{filtros_obj.fecha_fin}.csv"
+
+    def generate_xlsx(self, db: Session, empresa_id: int, filtros):
+        filtros_obj = self._filtros(filtros)
+        bloques = self._exportar(db, empresa_id, filtros_obj, "xlsx")
+        return bloques, f"Libro_Diario_{filtros_obj.fecha_inicio}_{filtros_obj.fecha_fin}.xlsx"
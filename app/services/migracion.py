@@ -1,9 +1,10 @@
 # app/services/migracion.py (Versión Maestra v7.0 - Modo Fusión Segura / Sin Borrado Masivo)
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, delete, select, or_, and_, case, literal, DateTime, Date, TIMESTAMP
+from sqlalchemy import func, delete, insert, update, select, or_, and_, case, literal, DateTime, Date, TIMESTAMP
 from datetime import datetime, date
 from decimal import Decimal
+from itertools import islice
 from fastapi import HTTPException
 import traceback
 import json
@@ -11,6 +12,7 @@ import os
 import sys
 import hmac
 import hashlib
+import zipfile
 from app.core.config import settings
 
 # Modelos
@@ -26,6 +28,13 @@ from ..models import (
 )
 from ..schemas import migracion as schemas_migracion
 from ..services import cartera as services_cartera
+from ..services import saldos_mensuales as saldos_mensuales_service
+from ..services import saldos_cierre as saldos_cierre_service
+from ..services import exportacion_streaming
+from ..services import busqueda
+from ..services import cola_cartera
+from ..services import inventario_puntos_control
+from ..services.propiedad_horizontal import estado_cuenta_service
 
 # --- NUEVOS MODELOS SOPORTADOS (v7.5) ---
 from ..models.propiedad_horizontal import PHConfiguracion, PHConcepto, PHTorre, PHUnidad, PHVehiculo, PHMascota
@@ -157,12 +166,7 @@ def compute_signature(data: dict) -> str:
     ).hexdigest()
     return signature
 
-def generar_backup_json(db: Session, empresa_id: int, filtros: dict = None):
-    """Genera el snapshot completo (JSON) de la empresa, FIRMADO DIGITALMENTE."""
-    
-    print(f"🔍 [EXPORT] Iniciando exportación para Empresa {empresa_id}")
-    # print(f"🔍 [EXPORT] Filtros Recibidos: {filtros}") # Debug
-
+def _normalizar_filtros(filtros: dict = None) -> dict:
     # --- CORRECCIÓN: Manejo de Snapshot de Seguridad (filtros=None) ---
     # Si no se reciben filtros (caso Safety Snapshot), asumimos EXPORTAR TODO.
     if filtros is None:
@@ -182,22 +186,218 @@ def generar_backup_json(db: Session, empresa_id: int, filtros: dict = None):
                 'transacciones': True
             }
         }
+    return filtros
 
-    # Extract flags for easier access
+
+def _flags_transacciones(filtros: dict):
+    """(contabilidad, inventario) según los paquetes pedidos."""
     paquetes = filtros.get('paquetes', {})
-    maestros_flags = paquetes.get('maestros', {})
-    special_flags = paquetes.get('modulos_especializados', {}) 
-    config_flags = paquetes.get('configuraciones', {})
-    
     # Nuevos flags separados de transacciones
     transacciones_conta_flag = paquetes.get('transacciones_contabilidad', False)
     transacciones_inv_flag = paquetes.get('transacciones_inventario', False)
-    
+
     # Retrocompatibilidad o flag "todo"
-    transacciones_legacy_flag = paquetes.get('transacciones', False)
-    if transacciones_legacy_flag:
+    if paquetes.get('transacciones', False):
         transacciones_conta_flag = True
         transacciones_inv_flag = True
+    return transacciones_conta_flag, transacciones_inv_flag
+
+
+# Secciones "planas": una fila por registro, sin enriquecer (serialize_model).
+# (sección, clave, modelo, flag de maestros que la activa)
+_SECCIONES_PLANAS = [
+    ("maestros", "plan_cuentas", PlanCuenta, "plan_cuentas"),
+    ("maestros", "terceros", Tercero, "terceros"),
+    ("maestros", "centros_costo", CentroCosto, "centros_costo"),
+    ("maestros", "tipos_documento", TipoDocumento, "tipos_documento"),
+    ("inventario", "listas_precio", ListaPrecio, "listas_precio"),
+    ("inventario", "bodegas", Bodega, "bodegas"),
+    ("inventario", "tasas_impuesto", TasaImpuesto, "tasas_impuesto"),
+    ("inventario", "productos", Producto, "productos"),
+]
+
+
+def _secciones_planas(filtros: dict):
+    """Secciones planas pedidas en los filtros: [(sección, clave, modelo)]."""
+    maestros_flags = filtros.get('paquetes', {}).get('maestros', {})
+    # --- AUTO-INCLUSIÓN: Si se piden productos o grupos, se deben incluir listas de precio para evitar errores de FK ---
+    flags = dict(maestros_flags)
+    flags['listas_precio'] = maestros_flags.get('listas_precio', False) or maestros_flags.get('productos', False) or maestros_flags.get('grupos_inventario', False)
+    return [(seccion, clave, modelo) for seccion, clave, modelo, flag in _SECCIONES_PLANAS if flags.get(flag, False)]
+
+
+def _iterar_modelo(db: Session, modelo, empresa_id: int):
+    """Filas serializadas de una sección plana, con cursor del lado del servidor."""
+    query = db.query(modelo).filter(modelo.empresa_id == empresa_id).order_by(modelo.id)
+    for obj in exportacion_streaming.iterar_consulta(query):
+        yield serialize_model(obj.__dict__)
+
+
+def _consulta_documentos_backup(db: Session, empresa_id: int, filtros: dict):
+    query_docs = db.query(
+        Documento.id, Documento.tipo_documento_id, Documento.numero, Documento.fecha,
+        Documento.beneficiario_id, Documento.centro_costo_id, Documento.anulado,
+        Documento.observaciones, Documento.unidad_ph_id
+    ).filter(Documento.empresa_id == empresa_id)
+
+    # --- APLICACIÓN DE FILTROS ---
+    if filtros:
+        f_tercero = filtros.get('terceroId')
+        if f_tercero:
+            query_docs = query_docs.filter(Documento.beneficiario_id == f_tercero)
+
+        f_tipo = filtros.get('tipoDocId')
+        if f_tipo:
+            query_docs = query_docs.filter(Documento.tipo_documento_id == f_tipo)
+
+        f_desde = filtros.get('fechaInicio')
+        if f_desde:
+            query_docs = query_docs.filter(Documento.fecha >= f_desde)
+
+        f_hasta = filtros.get('fechaFin')
+        if f_hasta:
+            query_docs = query_docs.filter(Documento.fecha <= f_hasta)
+
+        # --- NUEVO: Filtro por Cuenta Contable (Basado en Movimientos) ---
+        f_cuenta = filtros.get('cuentaId')
+        if f_cuenta:
+            # Usamos una subconsulta EXISTS para mayor robustez
+            query_docs = query_docs.filter(
+                db.query(MovimientoContable.id).filter(
+                    MovimientoContable.documento_id == Documento.id,
+                    MovimientoContable.cuenta_id == f_cuenta
+                ).exists()
+            )
+
+        # --- NUEVO: Filtro por Centro de Costo (Cabecera o Movimientos) ---
+        f_cc = filtros.get('centroCostoId')
+        if f_cc:
+            query_docs = query_docs.filter(
+                or_(
+                    Documento.centro_costo_id == f_cc,
+                    db.query(MovimientoContable.id).filter(
+                        MovimientoContable.documento_id == Documento.id,
+                        MovimientoContable.centro_costo_id == f_cc
+                    ).exists()
+                )
+            )
+
+        # --- NUEVO: Filtro por Palabra Clave (Concepto) ---
+        f_keyword = filtros.get('conceptoKeyword')
+        if f_keyword:
+            search = f"%{f_keyword}%"
+            query_docs = query_docs.filter(
+                or_(
+                    Documento.observaciones.ilike(search),
+                    db.query(MovimientoContable.id).filter(
+                        MovimientoContable.documento_id == Documento.id,
+                        MovimientoContable.concepto.ilike(search)
+                    ).exists()
+                )
+            )
+
+        # --- NUEVO: Filtro por Monto Mínimo (Basado en la suma de Débitos) ---
+        f_monto = filtros.get('montoMinimo')
+        if f_monto:
+            try:
+                monto_float = float(f_monto)
+                # Filtramos documentos donde la suma de débitos sea >= monto
+                sq_doc_monto = db.query(MovimientoContable.documento_id)\
+                    .group_by(MovimientoContable.documento_id)\
+                    .having(func.sum(MovimientoContable.debito) >= monto_float)\
+                    .subquery()
+
+                query_docs = query_docs.filter(Documento.id.in_(select(sq_doc_monto)))
+            except (ValueError, TypeError):
+                pass
+
+    return query_docs.order_by(Documento.id)
+
+
+def _resolver_codigos(db: Session, columna, ids, cache: dict) -> dict:
+    """Completa `cache` (id -> código/nombre) con los ids que falten, en una sola consulta."""
+    modelo = columna.class_
+    faltantes = {i for i in ids if i is not None and i not in cache}
+    if faltantes:
+        cache.update(db.query(modelo.id, columna).filter(modelo.id.in_(faltantes)).all())
+    return cache
+
+
+def _iterar_transacciones(db: Session, empresa_id: int, filtros: dict, conta: bool, inv: bool,
+                          tamano_bloque: int = 1000):
+    """
+    Paquetes de documentos del backup (mismo formato de siempre), por bloques:
+    los documentos salen con cursor del lado del servidor y por cada bloque se
+    consultan una vez sus movimientos y los códigos que referencian.
+    """
+    tipos, terceros, centros, unidades, cuentas, productos, bodegas = {}, {}, {}, {}, {}, {}, {}
+    consulta = _consulta_documentos_backup(db, empresa_id, filtros)
+    docs_iter = exportacion_streaming.iterar_consulta(consulta, tamano_bloque)
+    while True:
+        bloque = list(islice(docs_iter, tamano_bloque))
+        if not bloque:
+            break
+        ids = [d.id for d in bloque]
+        _resolver_codigos(db, TipoDocumento.codigo, {d.tipo_documento_id for d in bloque}, tipos)
+        _resolver_codigos(db, Tercero.nit, {d.beneficiario_id for d in bloque}, terceros)
+        _resolver_codigos(db, CentroCosto.codigo, {d.centro_costo_id for d in bloque}, centros)
+        _resolver_codigos(db, PHUnidad.codigo, {d.unidad_ph_id for d in bloque}, unidades)
+
+        movs_conta, movs_inv = {}, {}
+        # --- SOLO SI SE PIDIÓ CONTABILIDAD ---
+        if conta:
+            filas = db.query(
+                MovimientoContable.documento_id, MovimientoContable.cuenta_id, MovimientoContable.debito,
+                MovimientoContable.credito, MovimientoContable.concepto, MovimientoContable.producto_id,
+                MovimientoContable.cantidad
+            ).filter(MovimientoContable.documento_id.in_(ids)).order_by(MovimientoContable.id).all()
+            _resolver_codigos(db, PlanCuenta.codigo, {m.cuenta_id for m in filas}, cuentas)
+            _resolver_codigos(db, Producto.codigo, {m.producto_id for m in filas}, productos)
+            for m in filas:
+                movs_conta.setdefault(m.documento_id, []).append({
+                    "cuenta_codigo": cuentas.get(m.cuenta_id, "UNK"),
+                    "debito": float(m.debito or 0), "credito": float(m.credito or 0),
+                    "concepto": m.concepto,
+                    "producto_codigo": productos.get(m.producto_id),
+                    "cantidad": float(m.cantidad or 0)
+                })
+
+        # --- SOLO SI SE PIDIÓ INVENTARIO ---
+        if inv:
+            filas = db.query(
+                MovimientoInventario.documento_id, MovimientoInventario.producto_id, MovimientoInventario.bodega_id,
+                MovimientoInventario.tipo_movimiento, MovimientoInventario.cantidad,
+                MovimientoInventario.costo_unitario, MovimientoInventario.costo_total
+            ).filter(MovimientoInventario.documento_id.in_(ids)).order_by(MovimientoInventario.id).all()
+            _resolver_codigos(db, Producto.codigo, {m.producto_id for m in filas}, productos)
+            _resolver_codigos(db, Bodega.nombre, {m.bodega_id for m in filas}, bodegas)
+            for mi in filas:
+                movs_inv.setdefault(mi.documento_id, []).append({
+                    "producto_codigo": productos.get(mi.producto_id, "UNK"), "bodega_nombre": bodegas.get(mi.bodega_id, "UNK"),
+                    "tipo": mi.tipo_movimiento, "cantidad": float(mi.cantidad or 0),
+                    "costo_unitario": float(mi.costo_unitario or 0), "costo_total": float(mi.costo_total or 0)
+                })
+
+        for d in bloque:
+            yield {
+                "tipo_doc_codigo": tipos.get(d.tipo_documento_id, "UNK"), "numero": d.numero,
+                "fecha": d.fecha.isoformat() if d.fecha else None,
+                "tercero_nit": terceros.get(d.beneficiario_id),
+                "centro_costo_codigo": centros.get(d.centro_costo_id),
+                "anulado": d.anulado, "observaciones": d.observaciones,
+                # --- CORRECCIÓN PH: Exportar unidad vinculada ---
+                "unidad_ph_codigo": unidades.get(d.unidad_ph_id),
+                "movimientos_contables": movs_conta.get(d.id, []), "movimientos_inventario": movs_inv.get(d.id, [])
+            }
+
+
+def _contenido_base(db: Session, empresa_id: int, filtros: dict) -> dict:
+    """Secciones que no son planas ni transacciones (se enriquecen con códigos para el mapeo)."""
+    # Extract flags for easier access
+    paquetes = filtros.get('paquetes', {})
+    maestros_flags = paquetes.get('maestros', {})
+    special_flags = paquetes.get('modulos_especializados', {}) 
+    config_flags = paquetes.get('configuraciones', {})
 
     backup_data = {
         "metadata": {
@@ -224,36 +424,7 @@ def generar_backup_json(db: Session, empresa_id: int, filtros: dict = None):
     if config_flags.get('libreria_conceptos', False):
          pass # Futura implementación
 
-    # C. MAESTROS
-    if maestros_flags.get('plan_cuentas', False):
-        cuentas = db.query(PlanCuenta).filter(PlanCuenta.empresa_id == empresa_id).all()
-        backup_data["maestros"]["plan_cuentas"] = [serialize_model(c.__dict__) for c in cuentas]
-
-    if maestros_flags.get('terceros', False):
-        terceros = db.query(Tercero).filter(Tercero.empresa_id == empresa_id).all()
-        backup_data["maestros"]["terceros"] = [serialize_model(t.__dict__) for t in terceros]
-
-    if maestros_flags.get('centros_costo', False):
-        centros = db.query(CentroCosto).filter(CentroCosto.empresa_id == empresa_id).all()
-        backup_data["maestros"]["centros_costo"] = [serialize_model(c.__dict__) for c in centros]
-
-    if maestros_flags.get('tipos_documento', False):
-        tipos = db.query(TipoDocumento).filter(TipoDocumento.empresa_id == empresa_id).all()
-        backup_data["maestros"]["tipos_documento"] = [serialize_model(t.__dict__) for t in tipos]
-
-    # D. INVENTARIO (Maestros)
-    # D. INVENTARIO (Maestros)
-    # --- AUTO-INCLUSIÓN: Si se piden productos o grupos, se deben incluir listas de precio para evitar errores de FK ---
-    should_export_listas = maestros_flags.get('listas_precio', False) or maestros_flags.get('productos', False) or maestros_flags.get('grupos_inventario', False)
-    
-    if should_export_listas:
-        listas = db.query(ListaPrecio).filter(ListaPrecio.empresa_id == empresa_id).all()
-        backup_data["inventario"]["listas_precio"] = [serialize_model(l.__dict__) for l in listas]
-
-    if maestros_flags.get('bodegas', False):
-        bodegas = db.query(Bodega).filter(Bodega.empresa_id == empresa_id).all()
-        backup_data["inventario"]["bodegas"] = [serialize_model(b.__dict__) for b in bodegas]
-
+    # D. INVENTARIO (Grupos; listas, bodegas, tasas y productos son secciones planas)
     if maestros_flags.get('grupos_inventario', False):
         grupos = db.query(GrupoInventario).filter(GrupoInventario.empresa_id == empresa_id).all()
         grupos_list = []
@@ -291,14 +462,6 @@ def generar_backup_json(db: Session, empresa_id: int, filtros: dict = None):
             grupos_list.append(g_dict)
         backup_data["inventario"]["grupos"] = grupos_list
 
-    if maestros_flags.get('tasas_impuesto', False):
-        tasas = db.query(TasaImpuesto).filter(TasaImpuesto.empresa_id == empresa_id).all()
-        backup_data["inventario"]["tasas_impuesto"] = [serialize_model(t.__dict__) for t in tasas]
-
-    if maestros_flags.get('productos', False):
-        productos = db.query(Producto).filter(Producto.empresa_id == empresa_id).all()
-        backup_data["inventario"]["productos"] = [serialize_model(p.__dict__) for p in productos]
-
     # E. MÓDULOS ESPECIALIZADOS
     if special_flags.get('propiedad_horizontal', False):
         # 1. Configuraciones
@@ -480,121 +643,29 @@ def generar_backup_json(db: Session, empresa_id: int, filtros: dict = None):
             n_dict['detalles'] = detalles
             backup_data["nomina"]["documentos"].append(n_dict)
 
+    return backup_data
+
+
+def generar_backup_json(db: Session, empresa_id: int, filtros: dict = None):
+    """Genera el snapshot completo (JSON) de la empresa, FIRMADO DIGITALMENTE."""
+    
+    print(f"🔍 [EXPORT] Iniciando exportación para Empresa {empresa_id}")
+    filtros = _normalizar_filtros(filtros)
+    backup_data = _contenido_base(db, empresa_id, filtros)
+
+    # C. MAESTROS / D. INVENTARIO (secciones planas)
+    for seccion, clave, modelo in _secciones_planas(filtros):
+        backup_data[seccion][clave] = list(_iterar_modelo(db, modelo, empresa_id))
 
     # F. TRANSACCIONES (MODIFICADO: Separación Contabilidad / Inventario)
     # Se exportan documentos SI se pide contabilidad O inventario.
     # Dentro de cada documento, se incluyen las listas correspondientes según los flags.
+    transacciones_conta_flag, transacciones_inv_flag = _flags_transacciones(filtros)
     if transacciones_conta_flag or transacciones_inv_flag:
-        query_docs = db.query(Documento).filter(Documento.empresa_id == empresa_id)
-
-        # --- APLICACIÓN DE FILTROS ---
-        if filtros:
-            f_tercero = filtros.get('terceroId')
-            if f_tercero:
-                query_docs = query_docs.filter(Documento.beneficiario_id == f_tercero)
-            
-            f_tipo = filtros.get('tipoDocId')
-            if f_tipo:
-                query_docs = query_docs.filter(Documento.tipo_documento_id == f_tipo)
-
-            f_desde = filtros.get('fechaInicio')
-            if f_desde:
-                query_docs = query_docs.filter(Documento.fecha >= f_desde)
-                
-            f_hasta = filtros.get('fechaFin')
-            if f_hasta:
-                query_docs = query_docs.filter(Documento.fecha <= f_hasta)
-
-            # --- NUEVO: Filtro por Cuenta Contable (Basado en Movimientos) ---
-            f_cuenta = filtros.get('cuentaId')
-            if f_cuenta:
-                # Usamos una subconsulta EXISTS para mayor robustez
-                query_docs = query_docs.filter(
-                    db.query(MovimientoContable.id).filter(
-                        MovimientoContable.documento_id == Documento.id,
-                        MovimientoContable.cuenta_id == f_cuenta
-                    ).exists()
-                )
-
-            # --- NUEVO: Filtro por Centro de Costo (Cabecera o Movimientos) ---
-            f_cc = filtros.get('centroCostoId')
-            if f_cc:
-                query_docs = query_docs.filter(
-                    or_(
-                        Documento.centro_costo_id == f_cc,
-                        db.query(MovimientoContable.id).filter(
-                            MovimientoContable.documento_id == Documento.id,
-                            MovimientoContable.centro_costo_id == f_cc
-                        ).exists()
-                    )
-                )
-
-            # --- NUEVO: Filtro por Palabra Clave (Concepto) ---
-            f_keyword = filtros.get('conceptoKeyword')
-            if f_keyword:
-                search = f"%{f_keyword}%"
-                query_docs = query_docs.filter(
-                    or_(
-                        Documento.observaciones.ilike(search),
-                        db.query(MovimientoContable.id).filter(
-                            MovimientoContable.documento_id == Documento.id,
-                            MovimientoContable.concepto.ilike(search)
-                        ).exists()
-                    )
-                )
-
-            # --- NUEVO: Filtro por Monto Mínimo (Basado en la suma de Débitos) ---
-            f_monto = filtros.get('montoMinimo')
-            if f_monto:
-                try:
-                    monto_float = float(f_monto)
-                    # Filtramos documentos donde la suma de débitos sea >= monto
-                    sq_doc_monto = db.query(MovimientoContable.documento_id)\
-                        .group_by(MovimientoContable.documento_id)\
-                        .having(func.sum(MovimientoContable.debito) >= monto_float)\
-                        .subquery()
-                    
-                    query_docs = query_docs.filter(Documento.id.in_(select(sq_doc_monto)))
-                except (ValueError, TypeError):
-                    pass
-
-        docs = query_docs.all()
-        print(f"✅ [EXPORT] Documentos encontrados: {len(docs)} (Conta={transacciones_conta_flag}, Inv={transacciones_inv_flag})")
-
-        for d in docs:
-            doc_packet = {
-                "tipo_doc_codigo": d.tipo_documento.codigo if d.tipo_documento else "UNK", "numero": d.numero,
-                "fecha": d.fecha.isoformat() if d.fecha else None,
-                "tercero_nit": d.beneficiario.nit if d.beneficiario else None,
-                "centro_costo_codigo": d.centro_costo.codigo if d.centro_costo else None,
-                "anulado": d.anulado, "observaciones": getattr(d, 'observaciones', None),
-                # --- CORRECCIÓN PH: Exportar unidad vinculada ---
-                "unidad_ph_codigo": d.unidad_ph.codigo if d.unidad_ph else None,
-                "movimientos_contables": [], "movimientos_inventario": []
-            }
-            
-            # --- SOLO SI SE PIDIÓ CONTABILIDAD ---
-            if transacciones_conta_flag:
-                for m in d.movimientos:
-                    doc_packet["movimientos_contables"].append({
-                        "cuenta_codigo": m.cuenta.codigo if m.cuenta else "UNK", 
-                        "debito": float(m.debito or 0), "credito": float(m.credito or 0), 
-                        "concepto": m.concepto,
-                        "producto_codigo": m.producto.codigo if m.producto else None,
-                        "cantidad": float(m.cantidad or 0)
-                    })
-
-            # --- SOLO SI SE PIDIÓ INVENTARIO ---
-            if transacciones_inv_flag:
-                movs_inv = db.query(MovimientoInventario).filter(MovimientoInventario.documento_id == d.id).all()
-                for mi in movs_inv:
-                    doc_packet["movimientos_inventario"].append({
-                        "producto_codigo": mi.producto.codigo if mi.producto else "UNK", "bodega_nombre": mi.bodega.nombre if mi.bodega else "UNK",
-                        "tipo": mi.tipo_movimiento, "cantidad": float(mi.cantidad),
-                        "costo_unitario": float(mi.costo_unitario), "costo_total": float(mi.costo_total)
-                    })
-                    
-            backup_data["transacciones"].append(doc_packet)
+        backup_data["transacciones"] = list(_iterar_transacciones(
+            db, empresa_id, filtros, transacciones_conta_flag, transacciones_inv_flag
+        ))
+        print(f"✅ [EXPORT] Documentos encontrados: {len(backup_data['transacciones'])} (Conta={transacciones_conta_flag}, Inv={transacciones_inv_flag})")
 
     # --- FIRMA DIGITAL ---
     signature = compute_signature(backup_data)
@@ -842,7 +913,7 @@ def analizar_backup(db: Session, analysis_request: schemas_migracion.AnalysisReq
 # =====================================================================================
 # 3. MOTOR DE RESTAURACIÓN (ATOMICIDAD TOTAL v7.0 - Modo Fusión Segura)
 # =====================================================================================
-def ejecutar_restauracion(db: Session, request: schemas_migracion.AnalysisRequest, user_id: int):
+def ejecutar_restauracion(db: Session, request: schemas_migracion.AnalysisRequest, user_id: int, snapshot: bool = True):
     backup_data_wrapper = request.backupData
     target_empresa_id = request.targetEmpresaId
     modules_to_restore = request.modulesToRestore # Lista opcional de módulos seleccionados
@@ -895,37 +966,9 @@ def ejecutar_restauracion(db: Session, request: schemas_migracion.AnalysisReques
         # DEBUG: Ver qué módulos se piden restaurar
         print(f"🔍 [RESTORE] Módulos solicitados: {modules_to_restore}")
 
-        safety_snapshot = generar_backup_json(db, target_empresa_id)
-        fecha_str = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"SAFETY_RESTORE_{target_empresa_id}_{fecha_str}.json"
-        
-        # --- MEJORA SEGURIDAD v7.7: RUTA ABSOLUTA SEGURA ---
-        # Determinamos una base de almacenamiento que sepamos que es escribible.
-        # Por defecto la raíz, pero si es SQLite usamos la carpeta de la DB.
-        base_storage = os.path.abspath(".")
-        if settings.DATABASE_URL.startswith("sqlite"):
-            db_path = settings.DATABASE_URL.replace("sqlite:///", "").split("?")[0]
-            if db_path and not db_path.startswith(":memory:"):
-                try:
-                    base_storage = os.path.dirname(os.path.abspath(db_path))
-                except:
-                    pass
-        
-        # Si es un ejecutable empaquetado, asegurar que no escribimos en carpetas protegidas
-        if getattr(sys, 'frozen', False):
-            appdata = os.getenv('APPDATA')
-            if appdata:
-                base_storage = os.path.join(appdata, "Finaxis")
-
-        safety_dir = os.path.join(base_storage, "backups", "safety")
-        os.makedirs(safety_dir, exist_ok=True)
-        
-        full_path = os.path.join(safety_dir, filename)
-        
-        with open(full_path, "w", encoding="utf-8") as f:
-            json.dump(safety_snapshot, f, cls=AlchemyEncoder)
-            
-        resumen["acciones_realizadas"].append(f"🔒 Snapshot de seguridad creado: {filename}")
+        if snapshot:
+            filename = _snapshot_seguridad(db, target_empresa_id)
+            resumen["acciones_realizadas"].append(f"🔒 Snapshot de seguridad creado: {filename}")
 
         # Helper check function mejorada
         def should_restore(module_keys):
@@ -1891,114 +1934,22 @@ def ejecutar_restauracion(db: Session, request: schemas_migracion.AnalysisReques
         # 7. TRANSACCIONES
         docs_source = backup_data.get("transacciones") or backup_data.get("documentos") or []
         if docs_source and should_restore('Documentos y Movimientos'):
-            map_tipos_final = _get_id_translation_map(db, TipoDocumento, 'codigo', maestros_src, target_empresa_id)
-            tipos_db = db.query(TipoDocumento).filter(TipoDocumento.empresa_id == target_empresa_id).all()
-            for t in tipos_db: map_tipos_final[t.codigo] = t.id
-
-            existing_docs = db.query(Documento).filter(Documento.empresa_id == target_empresa_id).all()
-            map_existing_key_to_obj = {f"{d.tipo_documento_id}-{d.numero}": d for d in existing_docs}
-            
-            deleted_docs = db.query(DocumentoEliminado).filter(DocumentoEliminado.empresa_id == target_empresa_id).all()
-            map_deleted = {f"{d.tipo_documento_id}-{str(d.numero)}": d for d in deleted_docs}
-
-            ids_vivos_en_backup = set()
+            # Mismo camino por lotes que la restauración streaming (INSERT/UPDATE de varias
+            # filas por bloque), sin confirmar: el único commit sigue siendo el del final
+            mapas = _mapas_transacciones(db, target_empresa_id)
             creados_count = 0
             actualizados_count = 0
             exorcizados_count = 0
             terceros_afectados = set()
+            for inicio in range(0, len(docs_source), BACKUP_FILAS_POR_BLOQUE):
+                conteo = _restaurar_bloque_transacciones(
+                    db, docs_source[inicio:inicio + BACKUP_FILAS_POR_BLOQUE], mapas, target_empresa_id, user_id
+                )
+                creados_count += conteo["creados"]
+                actualizados_count += conteo["actualizados"]
+                exorcizados_count += conteo["exorcizados"]
+                terceros_afectados |= conteo["terceros"]
 
-            # Pre-cargar mapa de Unidades PH para eficiencia (si se restauró PH o existen)
-            unidades_db = db.query(PHUnidad).filter(PHUnidad.empresa_id == target_empresa_id).all()
-            map_unidades = {u.codigo: u.id for u in unidades_db}
-
-            for doc_data in docs_source:
-                # REGLA DE ORO: Solo restaurar documentos ACTIVOS del backup.
-                # Los documentos anulados del backup NO se tocan.
-                if doc_data.get('anulado', False):
-                    continue
-
-                tipo_codigo = doc_data.get('tipo_doc_codigo')
-                tipo_id = map_tipos_final.get(tipo_codigo)
-                if not tipo_id: continue
-                
-                natural_key = f"{tipo_id}-{str(doc_data['numero'])}"
-                
-                fantasma = map_deleted.get(natural_key)
-                if fantasma:
-                    db.delete(fantasma)
-                    exorcizados_count += 1
-
-                documento_bd = map_existing_key_to_obj.get(natural_key)
-                tercero_id = map_terceros.get(doc_data.get('tercero_nit'))
-                if tercero_id: terceros_afectados.add(tercero_id)
-                cc_id = map_ccs.get(doc_data.get('centro_costo_codigo'))
-                unidad_ph_id = map_unidades.get(doc_data.get('unidad_ph_codigo')) # <-- MAPEO UNIDAD
-
-                val_anulado = doc_data.get('anulado', False)
-                val_estado = 'ANULADO' if val_anulado else 'ACTIVO'
-                
-                fecha_doc = None
-                if doc_data.get('fecha'):
-                    try:
-                        fecha_doc = datetime.fromisoformat(doc_data['fecha'])
-                    except:
-                        fecha_doc = datetime.utcnow()
-                else:
-                    fecha_doc = datetime.utcnow()
-
-                if documento_bd:
-                    documento_bd.fecha = fecha_doc
-                    documento_bd.beneficiario_id = tercero_id
-                    documento_bd.observaciones = doc_data.get('observaciones')
-                    documento_bd.anulado = val_anulado
-                    documento_bd.estado = val_estado
-                    documento_bd.unidad_ph_id = unidad_ph_id # <-- ACTUALIZAR UNIDAD
-                    
-                    db.execute(delete(MovimientoContable).where(MovimientoContable.documento_id == int(documento_bd.id)))
-                    db.execute(delete(MovimientoInventario).where(MovimientoInventario.documento_id == int(documento_bd.id)))
-                    actualizados_count += 1
-                    ids_vivos_en_backup.add(documento_bd.id)
-                else:
-                    documento_bd = Documento(
-                        empresa_id=target_empresa_id, tipo_documento_id=tipo_id, numero=doc_data['numero'],
-                        fecha=fecha_doc, beneficiario_id=tercero_id, centro_costo_id=cc_id,
-                        anulado=val_anulado, estado=val_estado,
-                        unidad_ph_id=unidad_ph_id, # <-- CREAR CON UNIDAD
-                        usuario_creador_id=user_id, fecha_operacion=datetime.utcnow()
-                    )
-                    db.add(documento_bd)
-                    db.flush()
-                    creados_count += 1
-                    ids_vivos_en_backup.add(documento_bd.id)
-
-                for mov in doc_data.get('movimientos_contables', []):
-                    cta_id = map_cuentas.get(mov['cuenta_codigo'])
-                    prod_id = None
-                    if mov.get('producto_codigo'):
-                        prod_id = map_productos.get(mov['producto_codigo'])
-
-                    if cta_id:
-                        db.add(MovimientoContable(
-                            documento_id=documento_bd.id, 
-                            cuenta_id=cta_id, 
-                            concepto=mov['concepto'], 
-                            debito=mov['debito'], 
-                            credito=mov['credito'],
-                            producto_id=prod_id,
-                            cantidad=mov.get('cantidad', 0)
-                        ))
-                
-                for mov_inv in doc_data.get('movimientos_inventario', []):
-                    prod_id = map_productos.get(mov_inv['producto_codigo'])
-                    bod_id = map_bodegas.get(mov_inv['bodega_nombre'])
-                    if prod_id and bod_id:
-                        db.add(MovimientoInventario(
-                            documento_id=documento_bd.id, producto_id=prod_id, bodega_id=bod_id, 
-                            tipo_movimiento=mov_inv['tipo'], cantidad=mov_inv['cantidad'], 
-                            costo_unitario=mov_inv['costo_unitario'], costo_total=mov_inv['costo_total'], 
-                            fecha=fecha_doc
-                        ))
-            
             if exorcizados_count > 0:
                 resumen["acciones_realizadas"].append(f"👻 EXORCISMO: {exorcizados_count} documentos recuperados.")
 
@@ -2011,6 +1962,10 @@ def ejecutar_restauracion(db: Session, request: schemas_migracion.AnalysisReques
             _reconstruir_saldos_inventario(db, target_empresa_id)
             resumen["acciones_realizadas"].append("📦 Stocks y COSTOS de inventario reconstruidos.")
 
+            saldos_mensuales_service.reconstruir_saldos_mensuales(db, target_empresa_id, commit=False)
+            saldos_cierre_service.regenerar_saldos_cierre(db, target_empresa_id)
+            resumen["acciones_realizadas"].append("📊 Saldos mensuales y de cierre contables reconstruidos.")
+
         # --- ATOMICIDAD: EL ÚNICO COMMIT DE TODA LA OPERACIÓN (Se movió aquí para proteger los documentos) ---
         db.commit()
 
@@ -2060,6 +2015,442 @@ def ejecutar_restauracion(db: Session, request: schemas_migracion.AnalysisReques
             detail=f"Error fatal durante restauración (Operación Revertida Completamente): {error_msg}. Contexto: {error_context}"
         )
 
+# =====================================================================================
+# 4. BACKUP Y RESTAURACIÓN EN STREAMING (v7.8)
+# =====================================================================================
+"""
+generar_backup_json arma la empresa completa (cada documento y movimiento) en
+un solo dict y ejecutar_restauracion lo vuelve a cargar entero: con empresas
+grandes se agota la memoria. El backup en streaming es un .zip con:
+
+  - base.json: empresa, configuración, grupos y módulos especializados.
+  - <sección>/<clave>/00001.jsonl y transacciones/00001.jsonl: secciones planas
+    y documentos, una fila JSON por línea y BACKUP_FILAS_POR_BLOQUE filas por
+    archivo, leídas con cursor del lado del servidor.
+  - manifest.json (al final): archivos, filas y firma HMAC de cada bloque; el
+    manifiesto también va firmado.
+
+La restauración verifica y procesa bloque por bloque:
+  1. Snapshot de seguridad de la empresa destino (en este mismo formato).
+  2. Base y maestros con el motor de siempre (ejecutar_restauracion sin
+     transacciones), en un commit.
+  3. Transacciones: INSERT de varias filas por bloque con mapas de traducción
+     (código -> id en la empresa destino) y un commit por bloque.
+  4. Inventario, saldos mensuales y de cierre y cartera, al final.
+El avance queda en un archivo de progreso (por empresa y manifiesto): si la
+restauración se interrumpe, enviar de nuevo el mismo archivo la reanuda en el
+primer bloque sin confirmar.
+"""
+
+FORMATO_BACKUP_STREAMING = "finaxis-backup-zip-v1"
+BACKUP_FILAS_POR_BLOQUE = 2000
+
+
+def _directorio_backups(subcarpeta: str) -> str:
+    # --- MEJORA SEGURIDAD v7.7: RUTA ABSOLUTA SEGURA ---
+    # Determinamos una base de almacenamiento que sepamos que es escribible.
+    # Por defecto la raíz, pero si es SQLite usamos la carpeta de la DB.
+    base_storage = os.path.abspath(".")
+    if settings.DATABASE_URL.startswith("sqlite"):
+        db_path = settings.DATABASE_URL.replace("sqlite:///", "").split("?")[0]
+        if db_path and not db_path.startswith(":memory:"):
+            try:
+                base_storage = os.path.dirname(os.path.abspath(db_path))
+            except:
+                pass
+
+    # Si es un ejecutable empaquetado, asegurar que no escribimos en carpetas protegidas
+    if getattr(sys, 'frozen', False):
+        appdata = os.getenv('APPDATA')
+        if appdata:
+            base_storage = os.path.join(appdata, "Finaxis")
+
+    carpeta = os.path.join(base_storage, "backups", subcarpeta)
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def _snapshot_seguridad(db: Session, empresa_id: int) -> str:
+    """Copia completa de la empresa antes de restaurar (backups/safety). Retorna el nombre del archivo."""
+    fecha_str = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"SAFETY_RESTORE_{empresa_id}_{fecha_str}.zip"
+    generar_backup_streaming(db, empresa_id, os.path.join(_directorio_backups("safety"), filename))
+    return filename
+
+
+def _firmar_bytes(contenido: bytes) -> str:
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), contenido, hashlib.sha256).hexdigest()
+
+
+def _bloques_jsonl(filas, filas_por_bloque: int):
+    """(cantidad, bytes JSON Lines) por cada bloque de filas."""
+    filas = iter(filas)
+    while True:
+        lote = list(islice(filas, filas_por_bloque))
+        if not lote:
+            return
+        contenido = "".join(json.dumps(fila, cls=AlchemyEncoder, ensure_ascii=False) + "\n" for fila in lote)
+        yield len(lote), contenido.encode('utf-8')
+
+
+def generar_backup_streaming(db: Session, empresa_id: int, destino, filtros: dict = None,
+                             filas_por_bloque: int = BACKUP_FILAS_POR_BLOQUE) -> dict:
+    """
+    Escribe el backup de la empresa en `destino` (ruta o archivo binario) como
+    .zip por bloques firmados. Mismos filtros que generar_backup_json.
+    Retorna el manifiesto.
+    """
+    print(f"🔍 [EXPORT-STREAMING] Iniciando exportación para Empresa {empresa_id}")
+    filtros = _normalizar_filtros(filtros)
+    base = _contenido_base(db, empresa_id, filtros)
+    base.pop("transacciones", None)
+    manifiesto = {"formato": FORMATO_BACKUP_STREAMING, "metadata": base["metadata"], "archivos": []}
+
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zipf:
+        def escribir(archivo, seccion, clave, filas, contenido):
+            zipf.writestr(archivo, contenido)
+            manifiesto["archivos"].append({
+                "archivo": archivo, "seccion": seccion, "clave": clave, "filas": filas, "firma": _firmar_bytes(contenido)
+            })
+
+        escribir("base.json", "base", None, 1, json.dumps(base, cls=AlchemyEncoder, ensure_ascii=False).encode('utf-8'))
+
+        for seccion, clave, modelo in _secciones_planas(filtros):
+            bloques = _bloques_jsonl(_iterar_modelo(db, modelo, empresa_id), filas_por_bloque)
+            for numero, (filas, contenido) in enumerate(bloques, 1):
+                escribir(f"{seccion}/{clave}/{numero:05d}.jsonl", seccion, clave, filas, contenido)
+
+        transacciones_conta_flag, transacciones_inv_flag = _flags_transacciones(filtros)
+        total_docs = 0
+        if transacciones_conta_flag or transacciones_inv_flag:
+            documentos = _iterar_transacciones(db, empresa_id, filtros, transacciones_conta_flag, transacciones_inv_flag)
+            for numero, (filas, contenido) in enumerate(_bloques_jsonl(documentos, filas_por_bloque), 1):
+                escribir(f"transacciones/{numero:05d}.jsonl", "transacciones", None, filas, contenido)
+                total_docs += filas
+
+        # --- FIRMA DIGITAL (del manifiesto, que a su vez firma cada bloque) ---
+        manifiesto["firma"] = compute_signature(manifiesto)
+        zipf.writestr("manifest.json", json.dumps(manifiesto, ensure_ascii=False))
+
+    print(f"✅ [EXPORT-STREAMING] {len(manifiesto['archivos'])} bloques, {total_docs} documentos.")
+    return manifiesto
+
+
+def exportar_datos_streaming(db: Session, export_request: schemas_migracion.ExportRequest, empresa_id: int, destino):
+    filtros = export_request.dict(exclude_none=True)
+    return generar_backup_streaming(db, empresa_id, destino, filtros)
+
+
+def _leer_manifiesto(zipf: zipfile.ZipFile, bypass_signature: bool):
+    """(manifiesto, huella): la huella identifica el backup aunque la firma no sea válida."""
+    try:
+        manifiesto = json.loads(zipf.read("manifest.json"))
+    except KeyError:
+        raise HTTPException(status_code=400, detail="El archivo no es un backup por bloques (falta manifest.json).")
+    if manifiesto.get("formato") != FORMATO_BACKUP_STREAMING:
+        raise HTTPException(status_code=400, detail=f"Formato de backup no soportado: {manifiesto.get('formato')}")
+
+    firma = manifiesto.pop("firma", None)
+    huella = compute_signature(manifiesto)
+    if not firma or not hmac.compare_digest(huella, firma):
+        if not bypass_signature:
+            raise HTTPException(status_code=400, detail="ERROR CRÍTICO: Firma inválida. El archivo ha sido modificado o la llave no coincide. Use permisos de administrador para forzar.")
+    return manifiesto, huella
+
+
+def _leer_bloque(zipf: zipfile.ZipFile, entrada: dict, bypass_signature: bool) -> bytes:
+    contenido = zipf.read(entrada["archivo"])
+    if not hmac.compare_digest(_firmar_bytes(contenido), str(entrada.get("firma"))) and not bypass_signature:
+        raise HTTPException(status_code=400, detail=f"ERROR CRÍTICO: El bloque {entrada['archivo']} no coincide con su firma.")
+    return contenido
+
+
+def _filas_jsonl(contenido: bytes) -> list:
+    return [json.loads(linea) for linea in contenido.decode('utf-8').splitlines() if linea.strip()]
+
+
+def _ruta_progreso(empresa_id: int, huella: str) -> str:
+    return os.path.join(_directorio_backups("restauraciones"), f"progreso_{empresa_id}_{huella[:32]}.json")
+
+
+def _guardar_progreso(ruta: str, progreso: dict) -> None:
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(progreso, f)
+    os.replace(temporal, ruta)
+
+
+def _mapas_transacciones(db: Session, empresa_id: int) -> dict:
+    """Mapas de traducción código -> id en la empresa destino (una consulta por maestro)."""
+    def mapa(columna):
+        modelo = columna.class_
+        filas = db.query(modelo.id, columna).filter(modelo.empresa_id == empresa_id).all()
+        return {str(valor).strip(): id_ for id_, valor in filas if valor is not None}
+
+    return {
+        "tipos": mapa(TipoDocumento.codigo), "terceros": mapa(Tercero.nit), "centros": mapa(CentroCosto.codigo),
+        "cuentas": mapa(PlanCuenta.codigo), "productos": mapa(Producto.codigo), "bodegas": mapa(Bodega.nombre),
+        "unidades": mapa(PHUnidad.codigo),
+    }
+
+
+def _traducir(mapa: dict, valor):
+    if valor is None:
+        return None
+    return mapa.get(str(valor).strip())
+
+
+def _restaurar_bloque_transacciones(db: Session, docs_source: list, mapas: dict, target_empresa_id: int, user_id: int) -> dict:
+    """
+    Un bloque de transacciones con las reglas de ejecutar_restauracion (solo
+    documentos activos, exorcismo de la papelera, corrección de los existentes)
+    pero con sentencias de varias filas.
+    """
+    conteo = {"creados": 0, "actualizados": 0, "exorcizados": 0, "terceros": set()}
+    candidatos = []
+    for doc_data in docs_source:
+        # REGLA DE ORO: Solo restaurar documentos ACTIVOS del backup.
+        if doc_data.get('anulado', False):
+            continue
+        tipo_id = _traducir(mapas["tipos"], doc_data.get('tipo_doc_codigo'))
+        if tipo_id:
+            candidatos.append((tipo_id, doc_data))
+    if not candidatos:
+        return conteo
+
+    tipos_ids = {tipo_id for tipo_id, _ in candidatos}
+    numeros = {doc_data['numero'] for _, doc_data in candidatos}
+    claves = {(tipo_id, str(doc_data['numero'])) for tipo_id, doc_data in candidatos}
+
+    existentes = {
+        (tipo_id, str(numero)): (doc_id, unidad_id, fecha) for doc_id, tipo_id, numero, unidad_id, fecha in db.query(
+            Documento.id, Documento.tipo_documento_id, Documento.numero, Documento.unidad_ph_id, Documento.fecha
+        ).filter(
+            Documento.empresa_id == target_empresa_id,
+            Documento.tipo_documento_id.in_(tipos_ids),
+            Documento.numero.in_(numeros)
+        )
+    }
+
+    fantasmas = db.query(DocumentoEliminado).filter(
+        DocumentoEliminado.empresa_id == target_empresa_id,
+        DocumentoEliminado.tipo_documento_id.in_(tipos_ids),
+        DocumentoEliminado.numero.in_({str(n) for n in numeros})
+    ).all()
+    for fantasma in fantasmas:
+        if (fantasma.tipo_documento_id, str(fantasma.numero)) in claves:
+            db.delete(fantasma)
+            conteo["exorcizados"] += 1
+    db.flush()
+
+    ahora = datetime.utcnow()
+    destinos, actualizaciones, nuevos, unidades = [], [], [], []
+    for tipo_id, doc_data in candidatos:
+        try:
+            fecha_doc = datetime.fromisoformat(doc_data['fecha']) if doc_data.get('fecha') else ahora
+        except (TypeError, ValueError):
+            fecha_doc = ahora
+        tercero_id = _traducir(mapas["terceros"], doc_data.get('tercero_nit'))
+        if tercero_id:
+            conteo["terceros"].add(tercero_id)
+        valores = {
+            "fecha": fecha_doc.date(), "beneficiario_id": tercero_id,
+            "observaciones": doc_data.get('observaciones'), "anulado": False, "estado": 'ACTIVO',
+            "unidad_ph_id": _traducir(mapas["unidades"], doc_data.get('unidad_ph_codigo')),
+        }
+        unidades.append((valores["unidad_ph_id"], valores["fecha"]))
+        doc_id, unidad_anterior, fecha_anterior = existentes.get((tipo_id, str(doc_data['numero'])), (None, None, None))
+        if doc_id:
+            actualizaciones.append({"id": doc_id, **valores})
+            unidades.append((unidad_anterior, fecha_anterior))
+        else:
+            nuevos.append({
+                **valores, "empresa_id": target_empresa_id, "tipo_documento_id": tipo_id, "numero": doc_data['numero'],
+                "centro_costo_id": _traducir(mapas["centros"], doc_data.get('centro_costo_codigo')),
+                "usuario_creador_id": user_id, "fecha_operacion": ahora,
+            })
+        destinos.append([doc_id, doc_data, fecha_doc])
+
+    if actualizaciones:
+        ids_actualizados = [a["id"] for a in actualizaciones]
+        db.execute(update(Documento), actualizaciones)
+        db.execute(delete(MovimientoContable).where(MovimientoContable.documento_id.in_(ids_actualizados)))
+        db.execute(delete(MovimientoInventario).where(MovimientoInventario.documento_id.in_(ids_actualizados)))
+        conteo["actualizados"] = len(actualizaciones)
+    if nuevos:
+        ids_nuevos = iter(db.execute(
+            insert(Documento).returning(Documento.id, sort_by_parameter_order=True), nuevos
+        ).scalars().all())
+        for destino in destinos:
+            if destino[0] is None:
+                destino[0] = next(ids_nuevos)
+        conteo["creados"] = len(nuevos)
+
+    filas_mov, filas_inv = [], []
+    for doc_id, doc_data, fecha_doc in destinos:
+        for mov in doc_data.get('movimientos_contables', []):
+            cta_id = _traducir(mapas["cuentas"], mov.get('cuenta_codigo'))
+            if cta_id:
+                filas_mov.append({
+                    "documento_id": doc_id, "cuenta_id": cta_id, "concepto": mov.get('concepto'),
+                    "debito": mov.get('debito', 0), "credito": mov.get('credito', 0),
+                    "producto_id": _traducir(mapas["productos"], mov.get('producto_codigo')),
+                    "cantidad": mov.get('cantidad', 0),
+                })
+        for mov_inv in doc_data.get('movimientos_inventario', []):
+            prod_id = _traducir(mapas["productos"], mov_inv.get('producto_codigo'))
+            bod_id = _traducir(mapas["bodegas"], mov_inv.get('bodega_nombre'))
+            if prod_id and bod_id:
+                filas_inv.append({
+                    "documento_id": doc_id, "producto_id": prod_id, "bodega_id": bod_id,
+                    "tipo_movimiento": mov_inv['tipo'], "cantidad": mov_inv['cantidad'],
+                    "costo_unitario": mov_inv['costo_unitario'], "costo_total": mov_inv['costo_total'],
+                    "fecha": fecha_doc,
+                })
+
+    # Las sentencias de varias filas no pasan por el flush: índice de conceptos, estado de
+    # cuenta de las unidades PH y puntos de control explícitos
+    estado_cuenta_service.marcar_documentos(db, unidades)
+    if filas_mov:
+        db.execute(insert(MovimientoContable), filas_mov)
+        busqueda.indexar(db, "concepto", select(MovimientoContable.id).where(
+            MovimientoContable.documento_id.in_([d[0] for d in destinos])
+        ))
+    if filas_inv:
+        db.execute(insert(MovimientoInventario), filas_inv)
+        inventario_puntos_control.invalidar_movimientos(db, [(f["producto_id"], f["fecha"]) for f in filas_inv])
+    return conteo
+
+
+def ejecutar_restauracion_streaming(db: Session, archivo, target_empresa_id: int, user_id: int,
+                                    modules_to_restore: list = None, bypass_signature: bool = False):
+    """
+    Restaura un backup generado por generar_backup_streaming (`archivo`: ruta o
+    archivo binario con posicionamiento). Confirma por bloques y se reanuda
+    donde quedó si se vuelve a enviar el mismo backup para la misma empresa.
+    """
+    empresa_exists = db.query(Empresa).filter(Empresa.id == target_empresa_id).first()
+    if not empresa_exists:
+        raise HTTPException(status_code=404, detail=f"La empresa destino con ID {target_empresa_id} no existe. Por favor recargue la página o seleccione una empresa válida.")
+
+    try:
+        zipf = zipfile.ZipFile(archivo)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="El archivo de backup no es un .zip válido.")
+
+    with zipf:
+        manifiesto, huella = _leer_manifiesto(zipf, bypass_signature)
+        version_backup = manifiesto.get("metadata", {}).get("version_sistema", "7.0")
+        compatibilidad = verificar_compatibilidad_version(version_backup)
+        if not compatibilidad['compatible']:
+            raise HTTPException(status_code=400, detail=compatibilidad['mensaje'])
+
+        ruta_progreso = _ruta_progreso(target_empresa_id, huella)
+        if os.path.exists(ruta_progreso):
+            with open(ruta_progreso, encoding="utf-8") as f:
+                progreso = json.load(f)
+            print(f"🔁 [RESTORE-STREAMING] Reanudando restauración en fase '{progreso['fase']}' ({len(progreso['bloques'])} bloques confirmados)")
+        else:
+            progreso = {"fase": "inicio", "bloques": [], "terceros": [], "creados": 0, "actualizados": 0,
+                        "exorcizados": 0, "acciones": []}
+
+        archivos = manifiesto.get("archivos", [])
+        bloques_transacciones = [a for a in archivos if a["seccion"] == "transacciones"]
+        restaurar_documentos = not modules_to_restore or 'Documentos y Movimientos' in modules_to_restore
+
+        try:
+            print(f"🚀 [RESTORE-STREAMING] Empresa {target_empresa_id}: {len(archivos)} bloques en el backup")
+
+            if progreso["fase"] == "inicio":
+                filename = _snapshot_seguridad(db, target_empresa_id)
+                progreso["acciones"].append(f"🔒 Snapshot de seguridad creado: {filename}")
+                progreso["fase"] = "base"
+                _guardar_progreso(ruta_progreso, progreso)
+
+            # --- BASE Y MAESTROS (motor de siempre, sin transacciones) ---
+            if progreso["fase"] == "base":
+                entrada_base = next(a for a in archivos if a["seccion"] == "base")
+                backup_data = json.loads(_leer_bloque(zipf, entrada_base, bypass_signature))
+                for entrada in archivos:
+                    if entrada["seccion"] in ("base", "transacciones"):
+                        continue
+                    filas = _filas_jsonl(_leer_bloque(zipf, entrada, bypass_signature))
+                    backup_data.setdefault(entrada["seccion"], {}).setdefault(entrada["clave"], []).extend(filas)
+                backup_data["transacciones"] = []
+
+                request = schemas_migracion.AnalysisRequest(
+                    backupData={"data": backup_data, "signature": compute_signature(backup_data)},
+                    targetEmpresaId=target_empresa_id, bypass_signature=True, modulesToRestore=modules_to_restore
+                )
+                resultado = ejecutar_restauracion(db, request, user_id, snapshot=False)
+                progreso["acciones"].extend(resultado["resumen"]["acciones_realizadas"])
+                progreso["fase"] = "transacciones"
+                _guardar_progreso(ruta_progreso, progreso)
+
+            # --- TRANSACCIONES: un commit por bloque ---
+            if progreso["fase"] == "transacciones":
+                if restaurar_documentos and bloques_transacciones:
+                    mapas = _mapas_transacciones(db, target_empresa_id)
+                    confirmados = set(progreso["bloques"])
+                    for entrada in bloques_transacciones:
+                        if entrada["archivo"] in confirmados:
+                            continue
+                        docs_source = _filas_jsonl(_leer_bloque(zipf, entrada, bypass_signature))
+                        conteo = _restaurar_bloque_transacciones(db, docs_source, mapas, target_empresa_id, user_id)
+                        db.commit()
+
+                        for clave in ("creados", "actualizados", "exorcizados"):
+                            progreso[clave] += conteo[clave]
+                        progreso["terceros"] = sorted(set(progreso["terceros"]) | conteo["terceros"])
+                        progreso["bloques"].append(entrada["archivo"])
+                        _guardar_progreso(ruta_progreso, progreso)
+                        print(f"📥 [RESTORE-STREAMING] {entrada['archivo']}: {conteo['creados']} creados, {conteo['actualizados']} corregidos")
+                progreso["fase"] = "final"
+                _guardar_progreso(ruta_progreso, progreso)
+
+            # --- RECONSTRUCCIÓN FINAL ---
+            acciones = progreso["acciones"]
+            if progreso["bloques"]:
+                if progreso["exorcizados"] > 0:
+                    acciones.append(f"👻 EXORCISMO: {progreso['exorcizados']} documentos recuperados.")
+                acciones.append(f"📥 {progreso['creados']} Documentos Creados")
+                acciones.append(f"✏️ {progreso['actualizados']} Documentos Corregidos")
+
+                _reconstruir_saldos_inventario(db, target_empresa_id)
+                acciones.append("📦 Stocks y COSTOS de inventario reconstruidos.")
+                saldos_mensuales_service.reconstruir_saldos_mensuales(db, target_empresa_id, commit=False)
+                saldos_cierre_service.regenerar_saldos_cierre(db, target_empresa_id)
+                acciones.append("📊 Saldos mensuales y de cierre contables reconstruidos.")
+                db.commit()
+
+                if progreso["terceros"]:
+                    with cola_cartera.recalculo_diferido(db, target_empresa_id, descripcion="Restauración de copia de seguridad") as cola:
+                        for tid in progreso["terceros"]:
+                            cola.marcar(tid)
+                    acciones.append(f"💰 Saldos de cartera recalculados para {len(progreso['terceros'])} terceros.")
+
+            os.remove(ruta_progreso)
+            resumen = {
+                "acciones_realizadas": acciones,
+                "documentos_procesados": progreso["creados"] + progreso["actualizados"],
+                "bloques_procesados": len(progreso["bloques"]),
+                "version_backup": version_backup,
+                "compatibilidad": compatibilidad['mensaje'],
+            }
+            return {"message": "Restauración por bloques finalizada (Datos existentes preservados)", "resumen": resumen}
+
+        except HTTPException:
+            db.rollback()
+            raise
+        except Exception as e:
+            db.rollback()
+            traceback.print_exc()
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error durante la restauración por bloques: {str(e)}. Los bloques confirmados se conservan: "
+                       f"envíe de nuevo el mismo archivo para reanudar."
+            )
+
 # =====================================================================================
 # AUXILIARES
 # =====================================================================================
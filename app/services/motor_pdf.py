@@ -0,0 +1,372 @@
+# app/services/motor_pdf.py
+"""
+Motor de PDF fuera del proceso del API.
+
+Más de 30 funciones hacían `HTML(string=...).write_pdf()` dentro del hilo de la
+petición: un Libro Diario de 300 páginas ocupaba un hilo del servidor y cientos
+de MB del proceso del API (y con el GIL, frenaba al resto de peticiones).
+
+Ahora WeasyPrint corre en un pool acotado de procesos:
+  - Workers "calientes": importan WeasyPrint, crean UNA FontConfiguration y
+    renderizan un documento mínimo al arrancar (fuentes cargadas).
+  - Límites por trabajo: tiempo (el worker se mata y se reemplaza) y memoria
+    (RLIMIT_AS del worker en Linux/Unix; en Windows no hay límite de memoria).
+    Cada worker atiende un trabajo a la vez, así que el límite es por trabajo.
+  - Cola por prioridad: PRIORIDAD_INTERACTIVA (facturas/documentos) antes que
+    PRIORIDAD_NORMAL (reportes) antes que PRIORIDAD_LIBRO (libros oficiales).
+  - Un worker se recicla cada PDF_TRABAJOS_POR_WORKER trabajos para devolver
+    la memoria fragmentada al sistema.
+
+API:
+  - html_a_pdf(html, prioridad=...): bytes del PDF (bloquea el hilo que llama,
+    pero el render ocurre en otro proceso).
+  - plantilla_a_pdf(env, nombre, contexto, prioridad=...): renderiza la
+    plantilla (plantillas_html) en este proceso y envía el HTML al pool; el
+    contexto suele tener objetos ORM que no se pueden enviar a otro proceso.
+  - enviar(html, ...): Future, para quien quiera esperar por su cuenta.
+
+Con PDF_WORKERS=0, o en el ejecutable empaquetado (.exe, sin soporte de
+multiprocessing), el render se hace en el mismo proceso como antes.
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+PRIORIDAD_INTERACTIVA = 0
+PRIORIDAD_NORMAL = 10
+PRIORIDAD_LIBRO = 20
+
+_ESPERA_ARRANQUE_SEGUNDOS = 120
+
+
+class ErrorRenderPDF(RuntimeError):
+    """El worker falló, excedió el tiempo o la memoria al generar el PDF."""
+
+
+class TiempoPDFAgotado(ErrorRenderPDF):
+    pass
+
+
+# ==========================================================
+# 1. RENDER (SE EJECUTA DENTRO DEL WORKER)
+# ==========================================================
+
+_font_config = None
+
+
+def _calentar_weasyprint() -> None:
+    """Importa WeasyPrint, crea la FontConfiguration y carga las fuentes con un PDF mínimo."""
+    global _font_config
+    from weasyprint import HTML
+    from weasyprint.text.fonts import FontConfiguration
+    _font_config = FontConfiguration()
+    HTML(string="<html><body><p>Finaxis</p></body></html>").write_pdf(font_config=_font_config)
+
+
+def renderizar_weasyprint(html: str, **opciones) -> bytes:
+    if _font_config is None:
+        _calentar_weasyprint()
+    from weasyprint import HTML
+    base_url = opciones.pop("base_url", None)
+    return HTML(string=html, base_url=base_url).write_pdf(font_config=_font_config, **opciones)
+
+
+def _limitar_memoria(memoria_maxima_mb: int) -> None:
+    if not memoria_maxima_mb:
+        return
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    limite = memoria_maxima_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+
+
+def _ciclo_worker(conexion, memoria_maxima_mb: int, renderizador: Callable, calentar: bool) -> None:
+    _limitar_memoria(memoria_maxima_mb)
+    try:
+        if calentar:
+            _calentar_weasyprint()
+        conexion.send(("listo", None))
+    except BaseException as e:
+        conexion.send(("error", f"No se pudo iniciar el worker de PDF: {type(e).__name__}: {e}"))
+        return
+
+    while True:
+        try:
+            trabajo = conexion.recv()
+        except EOFError:
+            return
+        if trabajo is None:
+            return
+        html, opciones = trabajo
+        try:
+            conexion.send(("ok", renderizador(html, **opciones)))
+        except MemoryError:
+            # El proceso queda en mal estado: se informa y se termina para que lo reemplacen
+            conexion.send(("memoria", "El PDF excedió la memoria permitida para el worker."))
+            return
+        except Exception as e:
+            conexion.send(("error", f"{type(e).__name__}: {e}"))
+
+
+# ==========================================================
+# 2. POOL (PROCESO DEL API)
+# ==========================================================
+
+class _Trabajo:
+    __slots__ = ("prioridad", "secuencia", "html", "opciones", "timeout", "futuro")
+
+    def __init__(self, prioridad, secuencia, html, opciones, timeout):
+        self.prioridad = prioridad
+        self.secuencia = secuencia
+        self.html = html
+        self.opciones = opciones
+        self.timeout = timeout
+        self.futuro: Future = Future()
+
+    def __lt__(self, otro: "_Trabajo") -> bool:
+        return (self.prioridad, self.secuencia) < (otro.prioridad, otro.secuencia)
+
+
+class _Worker:
+    """Un proceso de render y el extremo del Pipe para hablarle."""
+
+    def __init__(self, contexto, memoria_maxima_mb: int, renderizador: Callable, calentar: bool):
+        self.conexion, extremo_hijo = contexto.Pipe()
+        self.proceso = contexto.Process(
+            target=_ciclo_worker, args=(extremo_hijo, memoria_maxima_mb, renderizador, calentar),
+            name="finaxis-pdf", daemon=True
+        )
+        self.proceso.start()
+        extremo_hijo.close()
+        self.trabajos = 0
+        if not self.conexion.poll(_ESPERA_ARRANQUE_SEGUNDOS):
+            self.terminar()
+            raise ErrorRenderPDF("El worker de PDF no respondió al iniciar.")
+        estado, detalle = self.conexion.recv()
+        if estado != "listo":
+            self.terminar()
+            raise ErrorRenderPDF(detalle)
+
+    def ejecutar(self, trabajo: _Trabajo) -> bytes:
+        try:
+            self.conexion.send((trabajo.html, trabajo.opciones))
+            if not self.conexion.poll(trabajo.timeout):
+                self.terminar()
+                raise TiempoPDFAgotado(f"El PDF excedió el tiempo máximo ({trabajo.timeout:g} s).")
+            estado, resultado = self.conexion.recv()
+        except (EOFError, OSError) as e:
+            # El proceso murió (p. ej. lo mató el sistema por memoria)
+            self.terminar()
+            raise ErrorRenderPDF(f"El worker de PDF terminó inesperadamente ({type(e).__name__}).")
+        self.trabajos += 1
+        if estado == "ok":
+            return resultado
+        if estado == "memoria":
+            self.terminar()
+        raise ErrorRenderPDF(resultado)
+
+    def vivo(self) -> bool:
+        return self.proceso.is_alive()
+
+    def terminar(self) -> None:
+        try:
+            if self.proceso.is_alive():
+                try:
+                    self.conexion.send(None)
+                except (OSError, EOFError):
+                    pass
+                self.proceso.join(0.5)
+            if self.proceso.is_alive():
+                self.proceso.kill()
+                self.proceso.join(5)
+        finally:
+            self.conexion.close()
+
+
+class PoolPDF:
+    """
+    `workers` hilos despachadores en este proceso, cada uno dueño de un
+    proceso de render. Los hilos toman de una cola de prioridad compartida.
+    """
+
+    def __init__(self, workers: int, timeout: float, memoria_maxima_mb: int, trabajos_por_worker: int,
+                 renderizador: Callable = renderizar_weasyprint, calentar: bool = True):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memoria_maxima_mb = memoria_maxima_mb
+        self.trabajos_por_worker = max(1, trabajos_por_worker)
+        self.renderizador = renderizador
+        self.calentar = calentar
+        self._contexto = multiprocessing.get_context("spawn")
+        self._cola: list = []
+        self._secuencia = itertools.count()
+        self._condicion = threading.Condition()
+        self._hilos: list = []
+        self._cerrado = False
+        self._estadisticas = {"completados": 0, "errores": 0, "tiempos_agotados": 0, "reinicios": 0}
+
+    def iniciar(self) -> None:
+        with self._condicion:
+            if self._hilos:
+                return
+            for i in range(self.workers):
+                hilo = threading.Thread(target=self._despachar, name=f"motor-pdf-{i}", daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def enviar(self, html: str, prioridad: int = PRIORIDAD_NORMAL, timeout: Optional[float] = None, **opciones) -> Future:
+        trabajo = _Trabajo(prioridad, next(self._secuencia), html, opciones, timeout or self.timeout)
+        with self._condicion:
+            if self._cerrado:
+                raise ErrorRenderPDF("El motor de PDF está detenido.")
+            heapq.heappush(self._cola, trabajo)
+            self._condicion.notify()
+        self.iniciar()
+        return trabajo.futuro
+
+    def detener(self) -> None:
+        with self._condicion:
+            self._cerrado = True
+            pendientes, self._cola = self._cola, []
+            self._condicion.notify_all()
+        for trabajo in pendientes:
+            trabajo.futuro.cancel()
+        for hilo in self._hilos:
+            hilo.join(5)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._condicion:
+            return dict(self._estadisticas, en_cola=len(self._cola), workers=self.workers)
+
+    def _contar(self, clave: str) -> None:
+        with self._condicion:
+            self._estadisticas[clave] += 1
+
+    def _nuevo_worker(self) -> Optional[_Worker]:
+        try:
+            return _Worker(self._contexto, self.memoria_maxima_mb, self.renderizador, self.calentar)
+        except Exception as e:
+            print(f"[MOTOR PDF] No se pudo iniciar un worker: {e}")
+            return None
+
+    def _despachar(self) -> None:
+        worker = self._nuevo_worker()  # Arranca caliente, antes del primer trabajo
+        try:
+            while True:
+                with self._condicion:
+                    while not self._cola and not self._cerrado:
+                        self._condicion.wait()
+                    if self._cerrado:
+                        return
+                    trabajo = heapq.heappop(self._cola)
+                if not trabajo.futuro.set_running_or_notify_cancel():
+                    continue
+
+                if worker is None or not worker.vivo():
+                    if worker is not None:
+                        self._contar("reinicios")
+                    worker = self._nuevo_worker()
+                if worker is None:
+                    trabajo.futuro.set_exception(ErrorRenderPDF("No hay workers de PDF disponibles."))
+                    self._contar("errores")
+                    continue
+
+                try:
+                    trabajo.futuro.set_result(worker.ejecutar(trabajo))
+                    self._contar("completados")
+                except ErrorRenderPDF as e:
+                    self._contar("tiempos_agotados" if isinstance(e, TiempoPDFAgotado) else "errores")
+                    trabajo.futuro.set_exception(e)
+
+                if worker.vivo() and worker.trabajos >= self.trabajos_por_worker:
+                    worker.terminar()
+                    self._contar("reinicios")
+                    worker = self._nuevo_worker()
+        finally:
+            if worker is not None:
+                worker.terminar()
+
+
+# ==========================================================
+# 3. API PARA LOS SERVICIOS
+# ==========================================================
+
+_pool: Optional[PoolPDF] = None
+_lock_pool = threading.Lock()
+
+
+def _usa_pool() -> bool:
+    from app.core.config import settings
+    # El ejecutable empaquetado no llama a multiprocessing.freeze_support(): no puede lanzar workers
+    return settings.PDF_WORKERS > 0 and not getattr(sys, "frozen", False)
+
+
+def get_pool() -> Optional[PoolPDF]:
+    global _pool
+    if not _usa_pool():
+        return None
+    if _pool is None:
+        with _lock_pool:
+            if _pool is None:
+                from app.core.config import settings
+                _pool = PoolPDF(
+                    workers=settings.PDF_WORKERS,
+                    timeout=settings.PDF_TIMEOUT_SEGUNDOS,
+                    memoria_maxima_mb=settings.PDF_MEMORIA_MAXIMA_MB,
+                    trabajos_por_worker=settings.PDF_TRABAJOS_POR_WORKER,
+                )
+    return _pool
+
+
+def iniciar_pool() -> None:
+    """Arranca los workers (calientes) al iniciar la aplicación."""
+    pool = get_pool()
+    if pool is not None:
+        pool.iniciar()
+
+
+def detener_pool() -> None:
+    global _pool
+    with _lock_pool:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.detener()
+
+
+def enviar(html: str, prioridad: int = PRIORIDAD_NORMAL, timeout: Optional[float] = None, **opciones) -> Future:
+    pool = get_pool()
+    if pool is not None:
+        return pool.enviar(html, prioridad=prioridad, timeout=timeout, **opciones)
+    futuro: Future = Future()
+    futuro.set_running_or_notify_cancel()
+    try:
+        futuro.set_result(renderizar_weasyprint(html, **opciones))
+    except Exception as e:
+        futuro.set_exception(e)
+    return futuro
+
+
+def html_a_pdf(html: str, prioridad: int = PRIORIDAD_NORMAL, timeout: Optional[float] = None, **opciones) -> bytes:
+    """Equivalente a `HTML(string=html).write_pdf(**opciones)`, ejecutado en el pool."""
+    return enviar(html, prioridad=prioridad, timeout=timeout, **opciones).result()
+
+
+def plantilla_a_pdf(env, nombre: str, contexto: Dict[str, Any], prioridad: int = PRIORIDAD_NORMAL,
+                    timeout: Optional[float] = None, **opciones) -> bytes:
+    from app.services import plantillas_html
+    html = plantillas_html.plantilla(env, nombre).render(contexto)
+    return html_a_pdf(html, prioridad=prioridad, timeout=timeout, **opciones)
+
+
+def estadisticas() -> Dict[str, Any]:
+    pool = _pool
+    if pool is None:
+        return {"modo": "en_proceso" if not _usa_pool() else "sin_iniciar"}
+    return dict(pool.estadisticas(), modo="pool")
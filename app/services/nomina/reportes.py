@@ -1,17 +1,13 @@
 from datetime import date
 from typing import Dict, Any
 from jinja2 import Template
-from weasyprint import HTML
-from weasyprint.text.fonts import FontConfiguration
 from app.models import nomina as models
+from app.services import motor_pdf
 from app.services.nomina.templates import NOMINA_TEMPLATE
 from app.services.nomina.templates_resumen import NOMINA_RESUMEN_TEMPLATE
 from decimal import Decimal
 from datetime import datetime
 
-# Global Font Config Cache
-font_config = FontConfiguration()
-
 class ReportesNominaService:
 
     @staticmethod
@@ -71,7 +67,7 @@ class ReportesNominaService:
         template = Template(NOMINA_TEMPLATE)
         html_content = template.render(**formatted_context)
         
-        pdf_bytes = HTML(string=html_content).write_pdf(font_config=font_config)
+        pdf_bytes = motor_pdf.html_a_pdf(html_content, prioridad=motor_pdf.PRIORIDAD_INTERACTIVA)
         return pdf_bytes, f"Nomina_{empleado.numero_documento}_{nomina.anio}_{nomina.mes}.pdf"
 
     @staticmethod
@@ -156,7 +152,7 @@ class ReportesNominaService:
         template = Template(NOMINA_RESUMEN_TEMPLATE)
         html_content = template.render(**context)
         
-        pdf_bytes = HTML(string=html_content).write_pdf(font_config=font_config)
+        pdf_bytes = motor_pdf.html_a_pdf(html_content)
         return pdf_bytes, f"Resumen_Nomina_{anio}_{mes}.pdf"
 
 
@@ -217,7 +213,7 @@ class ReportesNominaService:
         html_content = template.render(**context)
         
         try:
-            pdf_bytes = HTML(string=html_content).write_pdf(font_config=font_config)
+            pdf_bytes = motor_pdf.html_a_pdf(html_content)
             return pdf_bytes, f"Empleados_{datetime.now().strftime('%Y%m%d')}.pdf"
         except Exception as e:
             print(f"Error WeasyPrint: {e}")
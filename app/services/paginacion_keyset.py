@@ -0,0 +1,158 @@
+# app/services/paginacion_keyset.py
+"""
+Paginación por llave (keyset) para las pantallas de Libro Diario y Super Informe.
+
+El Libro Diario devolvía todo el período y el Super Informe paginaba con
+OFFSET + COUNT(*) en cada página (o traía todo con traerTodo): con cientos de
+miles de líneas la primera página tardaba lo mismo que el período completo y
+las páginas finales recorrían todo lo anterior.
+
+  - La página se pide "después de" la última fila vista: las filas se ordenan
+    por (fecha, documento_id, movimiento_id) y la siguiente página filtra por
+    esa llave, de modo que el costo no depende de qué tan lejos se esté.
+  - El cursor es opaco (JSON en base64) y lleva la llave de la última fila,
+    la huella de los filtros (un cursor no se puede usar con otros filtros) y,
+    si se piden, los acumulados de débito/crédito hasta esa fila.
+  - Los totales del filtro completo salen de una consulta agregada aparte
+    (sin ORDER BY ni filas), y por defecto solo se calculan en la primera página.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, func, or_
+
+LIMITE_MAXIMO = 1000
+
+_CERO = Decimal("0")
+
+
+def huella_filtros(**filtros) -> str:
+    texto = json.dumps(filtros, sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def _valor_a_json(valor):
+    if isinstance(valor, date):
+        return {"fecha": valor.isoformat()}
+    return valor
+
+
+def _valor_desde_json(valor):
+    if isinstance(valor, dict) and "fecha" in valor:
+        return date.fromisoformat(valor["fecha"])
+    return valor
+
+
+def codificar_cursor(huella: str, llave: Sequence[Any], acumulados: Optional[Tuple[Decimal, Decimal]] = None) -> str:
+    datos = {"h": huella, "k": [_valor_a_json(v) for v in llave]}
+    if acumulados is not None:
+        datos["a"] = [str(acumulados[0]), str(acumulados[1])]
+    return base64.urlsafe_b64encode(json.dumps(datos, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decodificar_cursor(cursor: str, huella: str) -> Dict[str, Any]:
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        llave = [_valor_desde_json(v) for v in datos["k"]]
+        acumulados = tuple(Decimal(v) for v in datos["a"]) if "a" in datos else None
+    except (ValueError, KeyError, TypeError, InvalidOperation, binascii.Error):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor de paginación inválido.")
+    if datos.get("h") != huella:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El cursor corresponde a otros filtros. Vuelva a consultar desde la primera página."
+        )
+    return {"llave": llave, "acumulados": acumulados}
+
+
+def condicion_despues_de(columnas: Sequence[Any], llave: Sequence[Any], descendente: bool = False):
+    """
+    (c1, c2, c3) > (v1, v2, v3) expandido, o < si es descendente. La condición
+    redundante sobre la primera columna deja que el índice acote el rango.
+    """
+    mayor = (lambda c, v: c < v) if descendente else (lambda c, v: c > v)
+    opciones = []
+    for i, (columna, valor) in enumerate(zip(columnas, llave)):
+        iguales = [columnas[j] == llave[j] for j in range(i)]
+        opciones.append(and_(*iguales, mayor(columna, valor)))
+    primera = columnas[0] <= llave[0] if descendente else columnas[0] >= llave[0]
+    return and_(primera, or_(*opciones))
+
+
+def paginar(query, orden: Sequence[Tuple[str, Any]], limite: int, cursor: Optional[str], huella: str,
+            descendente: bool = False, acumulados: bool = False) -> Dict[str, Any]:
+    """
+    Una página de `query` después del cursor.
+    orden: pares (etiqueta en la fila, columna) que forman la llave única.
+    Retorna {"filas", "acumulados" (débito, crédito por fila o None), "siguiente_cursor", "tiene_mas", "limite"}.
+    Las filas deben exponer `debito` y `credito` si se piden acumulados.
+    """
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    etiquetas = [etiqueta for etiqueta, _ in orden]
+    columnas = [columna for _, columna in orden]
+
+    estado = decodificar_cursor(cursor, huella) if cursor else None
+    if estado:
+        query = query.filter(condicion_despues_de(columnas, estado["llave"], descendente))
+
+    criterios = [c.desc() if descendente else c.asc() for c in columnas]
+    filas = query.order_by(None).order_by(*criterios).limit(limite + 1).all()
+    tiene_mas = len(filas) > limite
+    filas = filas[:limite]
+
+    por_fila = None
+    ultimo_acumulado = None
+    if acumulados:
+        debito, credito = (estado["acumulados"] if estado and estado["acumulados"] else (_CERO, _CERO))
+        por_fila = []
+        for fila in filas:
+            debito += Decimal(str(fila.debito or 0))
+            credito += Decimal(str(fila.credito or 0))
+            por_fila.append((debito, credito))
+        ultimo_acumulado = (debito, credito)
+
+    siguiente = None
+    if tiene_mas:
+        ultima = filas[-1]
+        siguiente = codificar_cursor(huella, [getattr(ultima, e) for e in etiquetas], ultimo_acumulado)
+
+    return {
+        "filas": filas, "acumulados": por_fila, "siguiente_cursor": siguiente,
+        "tiene_mas": tiene_mas, "limite": limite
+    }
+
+
+def totales(query, columna_conteo, columna_debito, columna_credito) -> Dict[str, Any]:
+    """Conteo y sumas del filtro completo en una sola consulta agregada."""
+    conteo, debito, credito = query.order_by(None).with_entities(
+        func.count(columna_conteo),
+        func.coalesce(func.sum(columna_debito), 0),
+        func.coalesce(func.sum(columna_credito), 0)
+    ).one()
+    return {
+        "total_registros": int(conteo or 0),
+        "total_debito": float(debito or 0),
+        "total_credito": float(credito or 0),
+    }
+
+
+def respuesta(pagina: Dict[str, Any], items: List[Dict[str, Any]],
+              totales_filtro: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if pagina["acumulados"] is not None:
+        for item, (debito, credito) in zip(items, pagina["acumulados"]):
+            item["debito_acumulado"] = float(debito)
+            item["credito_acumulado"] = float(credito)
+    return {
+        "items": items,
+        "siguiente_cursor": pagina["siguiente_cursor"],
+        "tiene_mas": pagina["tiene_mas"],
+        "limite": pagina["limite"],
+        "totales": totales_filtro,
+    }
@@ -107,8 +107,10 @@ def restaurar_documento(db: Session, doc_eliminado_id: int, empresa_id: int):
             )
             nuevo_doc_activo.movimientos.append(nuevo_mov_activo)
         
+        # El flush suma los movimientos restaurados en los saldos mensuales
         db.add(nuevo_doc_activo)
         db.delete(doc_para_restaurar)
+        db.flush()
         
         db.commit()
         db.refresh(nuevo_doc_activo)
@@ -10,6 +10,7 @@ from ..models.periodo_contable_cerrado import PeriodoContableCerrado
 from ..models.empresa import Empresa
 from ..schemas import periodo as schemas
 from app.services.consumo.cierre_mensual_service import ejecutar_cierre_mensual, revertir_cierre_mensual
+from app.services import saldos_cierre as saldos_cierre_service
 
 def cerrar_periodo(db: Session, empresa_id: int, ano: int, mes: int, user_id: int):
     """
@@ -71,6 +72,11 @@ def cerrar_periodo(db: Session, empresa_id: int, ano: int, mes: int, user_id: in
         cerrado_por_usuario_id=user_id  # <--- Usamos el user_id que ahora pasamos como parámetro
     )
     db.add(db_periodo)
+    db.flush()
+
+    # --- SALDOS CONGELADOS: foto inmutable de saldos acumulados al cierre ---
+    saldos_cierre_service.congelar_saldos_periodo(db, empresa_id, ano, mes, periodo_cerrado_id=db_periodo.id)
+
     db.commit()
     db.refresh(db_periodo)
     return db_periodo
@@ -106,6 +112,9 @@ def reabrir_periodo(db: Session, empresa_id: int, ano: int, mes: int):
     # --- PROCESO DE REVERSION CONSUMO ---
     revertir_cierre_mensual(db, empresa_id, ano, mes)
 
+    # El período vuelve a ser editable: su foto de saldos deja de ser válida
+    saldos_cierre_service.eliminar_saldos_periodo(db, empresa_id, ano, mes)
+
     db.delete(db_periodo)
     db.commit()
     return {"message": f"Período {mes}/{ano} reabierto exitosamente."}
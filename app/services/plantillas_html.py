@@ -0,0 +1,169 @@
+# app/services/plantillas_html.py
+"""
+Registro único de plantillas HTML (PDF de documentos y reportes).
+
+Antes cada ruta de PDF hacía `GLOBAL_JINJA_ENV.from_string(TEMPLATES_EMPAQUETADOS[...])`:
+Jinja volvía a parsear y compilar la misma plantilla en cada petición, y el
+módulo `_templates_empaquetados` (todas las plantillas como literales, ~10k
+líneas) se importaba al arrancar aunque no se generara ningún PDF.
+
+  - `TEMPLATES_EMPAQUETADOS`: vista de solo lectura que importa el módulo
+    empaquetado la primera vez que se consulta.
+  - `CargadorEmpaquetado`: loader de Jinja sobre ese diccionario; los entornos
+    creados con `crear_entorno` resuelven `get_template`, `include` y `extends`.
+  - `plantilla(env, nombre)`: plantilla empaquetada compilada (caché por
+    nombre + hash del fuente).
+  - `compilar(env, fuente)`: reemplazo de `env.from_string` con la misma caché
+    (plantillas armadas en código o leídas de disco).
+  - `compilar_formato(env, formato)`: FormatoImpresion del usuario, en caché
+    por id + ultima_modificacion (editar el formato genera otra entrada).
+
+Cada módulo conserva su propio entorno porque los filtros no coinciden
+(p. ej. `format_decimal` usa separadores distintos en documento.py y en
+reportes_facturacion.py); la caché se lleva por entorno.
+"""
+
+import hashlib
+import importlib
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Dict, Hashable, Optional
+
+from jinja2 import BaseLoader, Environment, Template, TemplateNotFound, select_autoescape
+
+MAX_PLANTILLAS_POR_ENTORNO = 256
+
+
+# ==========================================================
+# 1. PLANTILLAS EMPAQUETADAS (CARGA PEREZOSA)
+# ==========================================================
+
+class _PlantillasEmpaquetadas(Mapping):
+    """Dict de plantillas empaquetadas que se importa en el primer acceso."""
+
+    def __init__(self, modulo: str):
+        self._modulo = modulo
+        self._datos: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def _cargar(self) -> Dict[str, str]:
+        if self._datos is None:
+            with self._lock:
+                if self._datos is None:
+                    self._datos = importlib.import_module(self._modulo).TEMPLATES_EMPAQUETADOS
+        return self._datos
+
+    def __getitem__(self, nombre: str) -> str:
+        return self._cargar()[nombre]
+
+    def __iter__(self):
+        return iter(self._cargar())
+
+    def __len__(self) -> int:
+        return len(self._cargar())
+
+    def __contains__(self, nombre) -> bool:
+        return nombre in self._cargar()
+
+    def get(self, nombre, default=None):
+        return self._cargar().get(nombre, default)
+
+
+TEMPLATES_EMPAQUETADOS = _PlantillasEmpaquetadas("app.services._templates_empaquetados")
+
+
+class CargadorEmpaquetado(BaseLoader):
+    """Loader de Jinja sobre TEMPLATES_EMPAQUETADOS (el contenido no cambia en el proceso)."""
+
+    def __init__(self, plantillas: Mapping = TEMPLATES_EMPAQUETADOS):
+        self.plantillas = plantillas
+
+    def get_source(self, environment, template):
+        fuente = self.plantillas.get(template)
+        if fuente is None:
+            raise TemplateNotFound(template)
+        return fuente, None, lambda: True
+
+    def list_templates(self):
+        return sorted(self.plantillas)
+
+
+def crear_entorno(**opciones) -> Environment:
+    """Entorno con el cargador empaquetado y autoescape HTML (como los GLOBAL_JINJA_ENV existentes)."""
+    opciones.setdefault("loader", CargadorEmpaquetado())
+    opciones.setdefault("autoescape", select_autoescape(['html', 'xml']))
+    return Environment(**opciones)
+
+
+# Entorno compartido para las plantillas que no usan filtros propios
+ENTORNO_BASE = crear_entorno()
+
+
+# ==========================================================
+# 2. CACHÉ DE PLANTILLAS COMPILADAS
+# ==========================================================
+
+_compiladas: "weakref.WeakKeyDictionary[Environment, OrderedDict]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+_estadisticas = {"aciertos": 0, "compilaciones": 0}
+_hashes_empaquetados: Dict[str, str] = {}
+
+
+def _hash_fuente(fuente: str) -> str:
+    return hashlib.sha1(fuente.encode("utf-8")).hexdigest()
+
+
+def _obtener_o_compilar(env: Environment, clave: Hashable, fuente: str) -> Template:
+    with _lock:
+        cache_env = _compiladas.get(env)
+        if cache_env is None:
+            cache_env = _compiladas[env] = OrderedDict()
+        template = cache_env.get(clave)
+        if template is not None:
+            cache_env.move_to_end(clave)
+            _estadisticas["aciertos"] += 1
+            return template
+
+    # Se compila fuera del lock; si dos hilos compilan la misma plantilla, gana el último
+    template = env.from_string(fuente)
+    with _lock:
+        cache_env[clave] = template
+        while len(cache_env) > MAX_PLANTILLAS_POR_ENTORNO:
+            cache_env.popitem(last=False)
+        _estadisticas["compilaciones"] += 1
+    return template
+
+
+def compilar(env: Environment, fuente: str, nombre: Optional[str] = None) -> Template:
+    """`env.from_string(fuente)` con caché por (nombre, hash del fuente)."""
+    return _obtener_o_compilar(env, (nombre, _hash_fuente(fuente)), fuente)
+
+
+def plantilla(env: Environment, nombre: str) -> Template:
+    """Plantilla empaquetada compilada. KeyError si no existe (igual que TEMPLATES_EMPAQUETADOS[nombre])."""
+    fuente = TEMPLATES_EMPAQUETADOS[nombre]
+    # El contenido empaquetado no cambia en el proceso: su hash se calcula una sola vez
+    hash_fuente = _hashes_empaquetados.get(nombre)
+    if hash_fuente is None:
+        hash_fuente = _hashes_empaquetados[nombre] = _hash_fuente(fuente)
+    return _obtener_o_compilar(env, (nombre, hash_fuente), fuente)
+
+
+def compilar_formato(env: Environment, formato: Any) -> Template:
+    """FormatoImpresion del usuario: la caché se invalida sola al cambiar ultima_modificacion."""
+    if formato.ultima_modificacion is None:
+        return compilar(env, formato.contenido_html)
+    clave = ("formato_impresion", formato.id, formato.ultima_modificacion)
+    return _obtener_o_compilar(env, clave, formato.contenido_html)
+
+
+def estadisticas() -> Dict[str, int]:
+    with _lock:
+        return dict(_estadisticas, plantillas=sum(len(c) for c in _compiladas.values()))
+
+
+def limpiar_cache() -> None:
+    with _lock:
+        _compiladas.clear()
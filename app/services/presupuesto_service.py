@@ -327,7 +327,8 @@ class PresupuestoService:
         empresa_info = db.query(models_empresa).filter(models_empresa.id == empresa_id).first()
         
         from app.services.reports import GLOBAL_JINJA_ENV
-        from weasyprint import HTML
+        from app.services import plantillas_html
+        from app.services import motor_pdf
         from fastapi import Response
         
         meses_nombres = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
@@ -405,9 +406,9 @@ class PresupuestoService:
         </html>
         """
         
-        template = GLOBAL_JINJA_ENV.from_string(html_template)
+        template = plantillas_html.compilar(GLOBAL_JINJA_ENV, html_template)
         html_string = template.render(context)
-        pdf_content = HTML(string=html_string).write_pdf()
+        pdf_content = motor_pdf.html_a_pdf(html_string)
         return Response(content=pdf_content, media_type="application/pdf")
     @staticmethod
     def bulk_import_budget(db: Session, empresa_id: int, anio: int, file_content: bytes, filename: str):
@@ -533,7 +534,8 @@ class PresupuestoService:
         empresa_info = db.query(models_empresa).filter(models_empresa.id == empresa_id).first()
         
         from app.services.reports import GLOBAL_JINJA_ENV
-        from weasyprint import HTML
+        from app.services import plantillas_html
+        from app.services import motor_pdf
         from fastapi import Response
         
         meses_nombres = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
@@ -653,7 +655,7 @@ class PresupuestoService:
         </html>
         """
         
-        template = GLOBAL_JINJA_ENV.from_string(html_template)
+        template = plantillas_html.compilar(GLOBAL_JINJA_ENV, html_template)
         html_string = template.render(context)
-        pdf_content = HTML(string=html_string).write_pdf()
+        pdf_content = motor_pdf.html_a_pdf(html_string)
         return Response(content=pdf_content, media_type="application/pdf")
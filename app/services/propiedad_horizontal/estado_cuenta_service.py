@@ -0,0 +1,445 @@
+# app/services/propiedad_horizontal/estado_cuenta_service.py
+"""
+Estado de cuenta materializado por unidad de Propiedad Horizontal.
+
+pago_service._simular_cronologia_pagos repite todos los documentos de una
+unidad desde el principio para saber qué deudas siguen pendientes (por
+concepto y en el orden de prelación) y cuál es el saldo a favor. La cartera
+por edades y el reporte de saldos lo hacían para todas las unidades del
+conjunto en cada consulta.
+
+Ahora el resultado se guarda por unidad (ph_estado_cuenta_unidad) junto con
+una foto al inicio de cada mes con movimiento (ph_estado_cuenta_cortes):
+  - Documentos nuevos posteriores al último procesado: se simulan solo ellos a
+    partir del estado guardado.
+  - Ediciones, anulaciones y documentos con fecha anterior: un listener de
+    flush marca `recalcular_desde` y la unidad se retoma desde la última foto
+    anterior a esa fecha. La creación masiva (INSERT por lotes) llama a
+    marcar_documentos() explícitamente.
+  - Consultas a una fecha de corte: última foto <= corte + documentos del mes.
+  - Si cambian los conceptos PH o las cuentas de cartera (la firma), la unidad
+    se reconstruye completa; si cambia el número de documentos sin marca
+    (inserción por fuera del ORM), también.
+
+El motor de simulación es el mismo (estado_inicial), así que el resultado es
+idéntico al replay completo. Los documentos a simular se leen con una sola
+consulta por columnas (sin entidades ORM) y el concepto PH de cada texto de
+movimiento se identifica una sola vez por consulta.
+"""
+import hashlib
+import json
+from datetime import date, datetime
+from itertools import chain, groupby
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, case, delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models.documento import Documento
+from app.models.movimiento_contable import MovimientoContable
+from app.models.propiedad_horizontal.concepto import PHConcepto
+from app.models.propiedad_horizontal.estado_cuenta import PHEstadoCuentaCorte, PHEstadoCuentaUnidad
+
+# Cambiar al modificar las reglas del motor de simulación: invalida todos los estados guardados
+_VERSION_MOTOR = 1
+
+ESTADOS_DOCUMENTO = ('ACTIVO', 'PROCESADO')
+_BLOQUE_UNIDADES = 500
+
+# Campos que alteran el replay
+_CAMPOS_DOCUMENTO = ("fecha", "estado", "anulado", "unidad_ph_id")
+_CAMPOS_MOVIMIENTO = ("debito", "credito", "cuenta_id", "concepto", "documento_id")
+
+
+# ==========================================================
+# 1. CONTEXTO Y SERIALIZACIÓN
+# ==========================================================
+
+def _contexto(db: Session, empresa_id: int) -> Dict[str, Any]:
+    """Conceptos, cuentas y firma con que se clasifican los movimientos de la empresa"""
+    from app.services import cartera as cartera_service
+    from app.services.propiedad_horizontal import configuracion_service
+
+    config = configuracion_service.get_configuracion(db, empresa_id)
+    conceptos = db.query(PHConcepto).filter(
+        PHConcepto.empresa_id == empresa_id,
+        PHConcepto.activo == True
+    ).order_by(func.coalesce(PHConcepto.orden, 999).asc(), PHConcepto.id.asc()).all()
+    cuentas_cxc = cartera_service.get_cuentas_especiales_ids(db, empresa_id, 'cxc')
+    cuentas_interes = [config.cuenta_ingreso_intereses_id] if config and config.cuenta_ingreso_intereses_id else []
+
+    firma = hashlib.sha256(json.dumps([
+        _VERSION_MOTOR, cuentas_interes, sorted(cuentas_cxc),
+        [[c.id, c.nombre, bool(c.es_interes), c.cuenta_interes_id, c.cuenta_ingreso_id] for c in conceptos]
+    ]).encode("utf-8")).hexdigest()
+    return {"conceptos": conceptos, "cuentas_cxc": cuentas_cxc, "cuentas_interes": cuentas_interes, "firma": firma}
+
+
+def _estado_vacio() -> Dict[str, Any]:
+    return {"deudas": [], "saldo_a_favor": 0, "saldo_acumulado": 0}
+
+
+def _serializar(estado: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "deudas": [{**d, "fecha": d["fecha"].isoformat()} for d in estado["deudas"]],
+        "saldo_a_favor": estado["saldo_a_favor"],
+        "saldo_acumulado": estado["saldo_acumulado"],
+    }
+
+
+def _deserializar(datos) -> Dict[str, Any]:
+    if isinstance(datos, str):
+        datos = json.loads(datos)
+    return {
+        "deudas": [{**d, "fecha": date.fromisoformat(d["fecha"])} for d in datos["deudas"]],
+        "saldo_a_favor": datos["saldo_a_favor"],
+        "saldo_acumulado": datos["saldo_acumulado"],
+    }
+
+
+class _Movimiento(NamedTuple):
+    cuenta_id: int
+    debito: Any
+    credito: Any
+    concepto: Optional[str]
+
+
+class _Documento:
+    """Lo que el motor de simulación lee de un documento, sin el grafo ORM"""
+    __slots__ = ("id", "fecha", "numero", "movimientos")
+    tipo_documento = None
+    unidad_ph = None
+    observaciones = None
+
+    def __init__(self, id, fecha, numero):
+        self.id = id
+        self.fecha = fecha
+        self.numero = numero
+        self.movimientos: List[_Movimiento] = []
+
+
+def _simular(db: Session, empresa_id: int, contexto: Dict[str, Any], docs: List[_Documento],
+             estado: Dict[str, Any]) -> Dict[str, Any]:
+    """Avanza `estado` con `docs` usando el motor de pago_service"""
+    from app.services.propiedad_horizontal import pago_service
+
+    deudas, transacciones, _, saldo_a_favor, _ = pago_service._simular_cronologia_pagos(
+        db, docs, empresa_id,
+        injected_cuentas_interes=set(contexto["cuentas_interes"]),
+        injected_cuentas_cxc=contexto["cuentas_cxc"],
+        injected_conceptos_ph=contexto["conceptos"],
+        injected_cache_conceptos=contexto.setdefault("cache_conceptos", {}),
+        estado_inicial=estado
+    )
+    return {
+        "deudas": deudas,
+        "saldo_a_favor": saldo_a_favor,
+        "saldo_acumulado": transacciones[-1]["saldo_acumulado"] if transacciones else estado["saldo_acumulado"],
+    }
+
+
+def _documentos(db: Session, empresa_id: int, unidad_ids: List[int], desde: Optional[date] = None,
+                hasta: Optional[date] = None) -> Dict[int, List[_Documento]]:
+    """
+    Documentos vigentes por unidad en orden cronológico (hasta es excluyente), en una sola
+    consulta por columnas: solo lo que usa la simulación, sin cargar entidades ni relaciones.
+    """
+    consulta = select(
+        Documento.unidad_ph_id, Documento.id, Documento.fecha, Documento.numero,
+        MovimientoContable.cuenta_id, MovimientoContable.debito, MovimientoContable.credito,
+        MovimientoContable.concepto
+    ).outerjoin(MovimientoContable, MovimientoContable.documento_id == Documento.id).where(
+        Documento.empresa_id == empresa_id,
+        Documento.unidad_ph_id.in_(unidad_ids),
+        Documento.estado.in_(ESTADOS_DOCUMENTO)
+    )
+    if desde is not None:
+        consulta = consulta.where(Documento.fecha >= desde)
+    if hasta is not None:
+        consulta = consulta.where(Documento.fecha < hasta)
+    consulta = consulta.order_by(Documento.unidad_ph_id, Documento.fecha, Documento.id, MovimientoContable.id)
+
+    docs_por_unidad: Dict[int, List[_Documento]] = {}
+    doc = None
+    for unidad_id, doc_id, fecha, numero, cuenta_id, debito, credito, concepto in db.execute(consulta):
+        if doc is None or doc.id != doc_id:
+            doc = _Documento(doc_id, fecha, numero)
+            docs_por_unidad.setdefault(unidad_id, []).append(doc)
+        if cuenta_id is not None:
+            doc.movimientos.append(_Movimiento(cuenta_id, debito or 0, credito or 0, concepto))
+    return docs_por_unidad
+
+
+def _bloques(valores: List[int]) -> Iterable[List[int]]:
+    for inicio in range(0, len(valores), _BLOQUE_UNIDADES):
+        yield valores[inicio:inicio + _BLOQUE_UNIDADES]
+
+
+# ==========================================================
+# 2. ACTUALIZACIÓN INCREMENTAL
+# ==========================================================
+
+def _plan(filas: Dict[int, Any], conteos: Dict[int, int], firma: str) -> Dict[int, Optional[date]]:
+    """Unidades a actualizar -> fecha desde la que cambió algo (None = reconstruir completa)"""
+    plan = {}
+    for unidad_id in set(conteos) | set(filas):
+        fila = filas.get(unidad_id)
+        if fila is None or fila.firma != firma:
+            plan[unidad_id] = None
+        elif fila.recalcular_desde is not None:
+            plan[unidad_id] = fila.recalcular_desde
+        elif fila.documentos != conteos.get(unidad_id, 0):
+            plan[unidad_id] = None
+    return plan
+
+
+def actualizar(db: Session, empresa_id: int, unidad_ids: Optional[List[int]] = None,
+               contexto: Optional[Dict[str, Any]] = None, commit: bool = True) -> Dict[int, Dict[str, Any]]:
+    """
+    Pone al día el estado guardado de las unidades (todas las de la empresa si unidad_ids es None).
+    Retorna {unidad_id: {"estado", "ultima_fecha", "documentos"}} de las unidades con documentos.
+    """
+    contexto = contexto or _contexto(db, empresa_id)
+    conn = db.connection()
+
+    consulta_conteos = select(Documento.unidad_ph_id, func.count(Documento.id)).where(
+        Documento.empresa_id == empresa_id,
+        Documento.unidad_ph_id.isnot(None),
+        Documento.estado.in_(ESTADOS_DOCUMENTO)
+    ).group_by(Documento.unidad_ph_id)
+    consulta_filas = select(PHEstadoCuentaUnidad).where(PHEstadoCuentaUnidad.empresa_id == empresa_id)
+    if unidad_ids is not None:
+        consulta_conteos = consulta_conteos.where(Documento.unidad_ph_id.in_(unidad_ids))
+        consulta_filas = consulta_filas.where(PHEstadoCuentaUnidad.unidad_id.in_(unidad_ids))
+    conteos = dict(conn.execute(consulta_conteos).all())
+    filas = {fila.unidad_id: fila for fila in conn.execute(consulta_filas)}
+
+    resultado = {
+        unidad_id: {"estado": fila.estado, "ultima_fecha": fila.ultima_fecha, "documentos": fila.documentos}
+        for unidad_id, fila in filas.items()
+    }
+    plan = _plan(filas, conteos, contexto["firma"])
+    if not plan:
+        return {u: {**r, "estado": _deserializar(r["estado"])} for u, r in resultado.items() if r["documentos"]}
+
+    # Punto de partida de cada unidad: (estado, fecha base, la base ya tiene foto)
+    partidas: Dict[int, Tuple[Dict[str, Any], Optional[date], bool]] = {}
+    retomar = {}
+    for unidad_id, desde in plan.items():
+        fila = filas.get(unidad_id)
+        if desde is None:
+            partidas[unidad_id] = (_estado_vacio(), None, False)
+        elif fila.ultima_fecha is not None and desde > fila.ultima_fecha:
+            # Solo documentos posteriores al último procesado
+            partidas[unidad_id] = (_deserializar(fila.estado), desde, False)
+        else:
+            retomar[unidad_id] = desde
+    for bloque in _bloques(sorted(retomar)):
+        fotos = conn.execute(
+            select(PHEstadoCuentaCorte.unidad_id, PHEstadoCuentaCorte.fecha, PHEstadoCuentaCorte.estado)
+            .where(PHEstadoCuentaCorte.unidad_id.in_(bloque))
+            .order_by(PHEstadoCuentaCorte.unidad_id, PHEstadoCuentaCorte.fecha)
+        ).all()
+        ultima_foto = {}
+        for unidad_id, fecha, estado in fotos:
+            if fecha <= retomar[unidad_id]:
+                ultima_foto[unidad_id] = (fecha, estado)
+        for unidad_id in bloque:
+            if unidad_id in ultima_foto:
+                fecha, estado = ultima_foto[unidad_id]
+                partidas[unidad_id] = (_deserializar(estado), fecha, True)
+            else:
+                partidas[unidad_id] = (_estado_vacio(), None, False)
+
+    ahora = datetime.utcnow()
+    for bloque in _bloques(sorted(partidas)):
+        # Las fotos posteriores a la base dejan de valer
+        completas = [u for u in bloque if partidas[u][1] is None]
+        if completas:
+            conn.execute(delete(PHEstadoCuentaCorte).where(PHEstadoCuentaCorte.unidad_id.in_(completas)))
+        for unidad_id in bloque:
+            _, base, _ = partidas[unidad_id]
+            if base is not None:
+                conn.execute(delete(PHEstadoCuentaCorte).where(
+                    PHEstadoCuentaCorte.unidad_id == unidad_id, PHEstadoCuentaCorte.fecha > base
+                ))
+
+        bases = [partidas[u][1] for u in bloque]
+        docs_por_unidad = _documentos(db, empresa_id, bloque, None if None in bases else min(bases))
+        fotos_nuevas, actualizaciones, nuevas = [], [], []
+        for unidad_id in bloque:
+            estado, base, base_con_foto = partidas[unidad_id]
+            docs = [d for d in docs_por_unidad.get(unidad_id, []) if base is None or d.fecha >= base]
+            for (ano, mes), docs_mes in groupby(docs, key=lambda d: (d.fecha.year, d.fecha.month)):
+                inicio_mes = date(ano, mes, 1)
+                if base is None or inicio_mes > base or (inicio_mes == base and not base_con_foto):
+                    fotos_nuevas.append({"unidad_id": unidad_id, "fecha": inicio_mes, "estado": _serializar(estado)})
+                estado = _simular(db, empresa_id, contexto, list(docs_mes), estado)
+
+            fila = filas.get(unidad_id)
+            valores = {
+                "firma": contexto["firma"],
+                "estado": _serializar(estado),
+                "ultima_fecha": docs[-1].fecha if docs else (fila.ultima_fecha if fila is not None and base is not None else None),
+                "ultimo_documento_id": docs[-1].id if docs else (fila.ultimo_documento_id if fila is not None and base is not None else None),
+                "documentos": conteos.get(unidad_id, 0),
+                "actualizado_en": ahora,
+            }
+            resultado[unidad_id] = {"estado": valores["estado"], "ultima_fecha": valores["ultima_fecha"],
+                                    "documentos": valores["documentos"]}
+            if fila is None:
+                nuevas.append({"unidad_id": unidad_id, "empresa_id": empresa_id, **valores})
+            else:
+                actualizaciones.append({"b_unidad_id": unidad_id, "b_previo": fila.recalcular_desde,
+                                        **{f"b_{k}": v for k, v in valores.items()}})
+
+        if fotos_nuevas:
+            conn.execute(insert(PHEstadoCuentaCorte), fotos_nuevas)
+        if nuevas:
+            conn.execute(insert(PHEstadoCuentaUnidad), nuevas)
+        if actualizaciones:
+            # La marca solo se limpia si nadie la movió mientras se recalculaba
+            conn.execute(
+                update(PHEstadoCuentaUnidad)
+                .where(PHEstadoCuentaUnidad.unidad_id == bindparam("b_unidad_id"))
+                .values(
+                    recalcular_desde=case(
+                        (PHEstadoCuentaUnidad.recalcular_desde == bindparam("b_previo", type_=PHEstadoCuentaUnidad.recalcular_desde.type), None),
+                        else_=PHEstadoCuentaUnidad.recalcular_desde
+                    ),
+                    **{k: bindparam(f"b_{k}") for k in ("firma", "estado", "ultima_fecha", "ultimo_documento_id",
+                                                          "documentos", "actualizado_en")}
+                ),
+                actualizaciones
+            )
+
+    if commit:
+        db.commit()
+    print(f"[ESTADO CUENTA PH] Empresa {empresa_id}: {len(plan)} unidades actualizadas.")
+    return {u: {**r, "estado": _deserializar(r["estado"])} for u, r in resultado.items() if r["documentos"]}
+
+
+def estados(db: Session, empresa_id: int, unidad_ids: Optional[List[int]] = None,
+            fecha_corte: Optional[date] = None, commit: bool = True) -> Dict[int, Dict[str, Any]]:
+    """
+    Deudas pendientes y saldo a favor por unidad: {unidad_id: {"deudas", "saldo_a_favor", "saldo_acumulado"}}.
+    Con fecha_corte, el estado justo antes del primer documento con fecha >= corte (lo mismo que
+    fecha_corte_snapshot del motor). Las unidades sin documentos no aparecen.
+    """
+    contexto = _contexto(db, empresa_id)
+    actuales = actualizar(db, empresa_id, unidad_ids, contexto, commit=commit)
+    resultado = {unidad_id: datos["estado"] for unidad_id, datos in actuales.items()}
+    if fecha_corte is None:
+        return resultado
+
+    # Unidades con documentos desde el corte: foto del mes + documentos hasta el corte
+    afectadas = sorted(u for u, datos in actuales.items() if datos["ultima_fecha"] >= fecha_corte)
+    for bloque in _bloques(afectadas):
+        ultima = select(
+            PHEstadoCuentaCorte.unidad_id, func.max(PHEstadoCuentaCorte.fecha).label("fecha")
+        ).where(
+            PHEstadoCuentaCorte.unidad_id.in_(bloque),
+            PHEstadoCuentaCorte.fecha <= fecha_corte
+        ).group_by(PHEstadoCuentaCorte.unidad_id).subquery()
+        fotos = {
+            unidad_id: (fecha, _deserializar(estado)) for unidad_id, fecha, estado in db.execute(
+                select(PHEstadoCuentaCorte.unidad_id, PHEstadoCuentaCorte.fecha, PHEstadoCuentaCorte.estado)
+                .join(ultima, and_(ultima.c.unidad_id == PHEstadoCuentaCorte.unidad_id,
+                                   ultima.c.fecha == PHEstadoCuentaCorte.fecha))
+            )
+        }
+        bases = [fotos[u][0] if u in fotos else None for u in bloque]
+        docs_por_unidad = _documentos(db, empresa_id, bloque, None if None in bases else min(bases), fecha_corte)
+        for unidad_id in bloque:
+            base, estado = fotos.get(unidad_id, (None, _estado_vacio()))
+            docs = [d for d in docs_por_unidad.get(unidad_id, []) if base is None or d.fecha >= base]
+            resultado[unidad_id] = _simular(db, empresa_id, contexto, docs, estado) if docs else estado
+    return resultado
+
+
+# ==========================================================
+# 3. MARCAS DE RECÁLCULO
+# ==========================================================
+
+def _marcar(conn, marcas: Dict[int, date]) -> None:
+    if not marcas:
+        return
+    conn.execute(
+        update(PHEstadoCuentaUnidad)
+        .where(
+            PHEstadoCuentaUnidad.unidad_id == bindparam("b_unidad_id"),
+            or_(PHEstadoCuentaUnidad.recalcular_desde.is_(None),
+                PHEstadoCuentaUnidad.recalcular_desde > bindparam("b_fecha"))
+        )
+        .values(recalcular_desde=bindparam("b_fecha")),
+        [{"b_unidad_id": unidad_id, "b_fecha": fecha} for unidad_id, fecha in marcas.items()]
+    )
+
+
+def _acumular_marca(marcas: Dict[int, date], unidad_id: Optional[int], fecha: Optional[date]) -> None:
+    if unidad_id is None or fecha is None:
+        return
+    if unidad_id not in marcas or fecha < marcas[unidad_id]:
+        marcas[unidad_id] = fecha
+
+
+def marcar_documentos(db: Session, documentos: Iterable[Tuple[Optional[int], Optional[date]]]) -> None:
+    """
+    Marca para recálculo las unidades de documentos escritos sin pasar por el flush del ORM
+    (creación masiva con INSERT por lotes). documentos: (unidad_ph_id, fecha).
+    """
+    marcas: Dict[int, date] = {}
+    for unidad_id, fecha in documentos:
+        _acumular_marca(marcas, unidad_id, fecha)
+    _marcar(db.connection(), marcas)
+
+
+def _valores(obj, campo: str) -> List[Any]:
+    """Valor anterior y nuevo de un atributo (sin disparar cargas perezosas)"""
+    historia = inspect(obj).attrs[campo].history
+    return [v for v in chain(historia.added or (), historia.unchanged or (), historia.deleted or ()) if v is not None]
+
+
+def _cambio(obj, campos: Tuple[str, ...]) -> bool:
+    estado = inspect(obj)
+    return any(estado.attrs[campo].history.has_changes() for campo in campos)
+
+
+@event.listens_for(Session, "before_flush")
+def _marcar_cambios(session, flush_context, instances):
+    """
+    Cualquier documento de una unidad que se cree, edite, anule o elimine (o cuyos
+    movimientos cambien) marca la unidad para recálculo desde su fecha más antigua.
+    """
+    marcas: Dict[int, date] = {}
+    documentos_movimientos = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Documento):
+            if obj in session.dirty and obj not in session.deleted and not _cambio(obj, _CAMPOS_DOCUMENTO):
+                continue
+            fechas = _valores(obj, "fecha")
+            for unidad_id in _valores(obj, "unidad_ph_id"):
+                _acumular_marca(marcas, unidad_id, min(fechas) if fechas else None)
+        elif isinstance(obj, MovimientoContable):
+            if obj in session.dirty and obj not in session.deleted and not _cambio(obj, _CAMPOS_MOVIMIENTO):
+                continue
+            documento = inspect(obj).attrs.documento.loaded_value
+            if isinstance(documento, Documento):
+                # Documento ya cargado (o nuevo): sus valores vienen del objeto
+                fechas = _valores(documento, "fecha")
+                for unidad_id in _valores(documento, "unidad_ph_id"):
+                    _acumular_marca(marcas, unidad_id, min(fechas) if fechas else None)
+            documentos_movimientos.update(_valores(obj, "documento_id"))
+
+    if not marcas and not documentos_movimientos:
+        return
+    conn = session.connection()
+    if documentos_movimientos:
+        for documento_id, unidad_id, fecha in conn.execute(
+            select(Documento.id, Documento.unidad_ph_id, Documento.fecha).where(
+                Documento.id.in_(documentos_movimientos),
+                Documento.unidad_ph_id.isnot(None)
+            )
+        ):
+            _acumular_marca(marcas, unidad_id, fecha)
+    _marcar(conn, marcas)
@@ -0,0 +1,433 @@
+# app/services/propiedad_horizontal/facturacion_lote_service.py
+"""
+Facturación masiva de Propiedad Horizontal por lotes reanudables.
+
+facturacion_service.generar_facturacion_masiva creaba la factura de cada
+unidad con create_documento, una por una, dentro de la misma transacción y
+con el consecutivo del tipo de documento bloqueado todo el tiempo. Un error
+en la unidad 1.800 deshacía lo pendiente de confirmar y no había forma de
+retomar sin riesgo de duplicar.
+
+Ahora cada facturación queda registrada (PHFacturacionLote):
+  - las facturas de todas las unidades se calculan primero en memoria con los
+    mapas delta de siempre (calcular_facturacion_masiva) y se guardan por
+    unidad (PHFacturacionLoteUnidad) con su número,
+  - los consecutivos (facturas y notas de cruce) se reservan de una vez: el
+    tipo de documento solo queda bloqueado mientras se registra el lote,
+  - las unidades se crean por bloques con documento_masivo (INSERT por lotes);
+    cada bloque se confirma en UNA transacción junto con el estado FACTURADA
+    de sus unidades. Si el bloque falla, sus unidades se reintentan una a una
+    para que solo la que falla quede en ERROR,
+  - en PostgreSQL los bloques se reparten entre sesiones en paralelo
+    (settings.PH_FACTURACION_WORKERS); en SQLite es secuencial,
+  - reanudar_facturacion solo procesa las unidades pendientes o con error, con
+    los mismos números: nunca duplica una factura,
+  - el avance se consulta con get_progreso / eventos_progreso (SSE).
+"""
+
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.aplicacion_pago import AplicacionPago
+from app.models.propiedad_horizontal.facturacion_lote import PHFacturacionLote, PHFacturacionLoteUnidad
+from app.schemas import documento as doc_schemas
+from app.services import documento_masivo
+
+ESTADOS_ABIERTOS = ("PENDIENTE", "EN_PROCESO")
+_INTERVALO_EVENTOS = 1.0
+_MAX_ERROR = 2000
+# Un lote EN_PROCESO sin avance en este lapso se considera interrumpido
+_MAXIMO_SIN_AVANCE = timedelta(minutes=15)
+
+# Lotes en ejecución en este proceso (evita correr dos veces el mismo lote)
+_en_ejecucion = set()
+_lock = threading.Lock()
+
+
+# ==========================================================
+# 1. CREACIÓN / CONSULTA
+# ==========================================================
+
+def iniciar_facturacion(db: Session, empresa_id: int, fecha_factura: date, usuario_id: Optional[int] = None,
+                        conceptos_ids: List[int] = None, configuracion_conceptos: List[Any] = None,
+                        tamano_bloque: Optional[int] = None) -> PHFacturacionLote:
+    """
+    Calcula las facturas del periodo, reserva sus consecutivos y registra el lote
+    repartido en bloques. Si ya hay un lote abierto de la empresa para el periodo,
+    lo retorna en lugar de crear otro.
+    """
+    from app.services.propiedad_horizontal import facturacion_service
+
+    periodo = fecha_factura.strftime('%Y-%m')
+    abierto = db.query(PHFacturacionLote).filter(
+        PHFacturacionLote.empresa_id == empresa_id,
+        PHFacturacionLote.periodo == periodo,
+        PHFacturacionLote.estado.in_(ESTADOS_ABIERTOS)
+    ).order_by(PHFacturacionLote.id.desc()).first()
+    if abierto:
+        return abierto
+
+    calculo = facturacion_service.calcular_facturacion_masiva(
+        db, empresa_id, fecha_factura, conceptos_ids=conceptos_ids, configuracion_conceptos=configuracion_conceptos
+    )
+    facturas = calculo["facturas"]
+    tamano_bloque = max(1, tamano_bloque or settings.PH_FACTURACION_TAMANO_BLOQUE)
+
+    # Reserva única de consecutivos: el tipo se libera al confirmar el registro del lote
+    numero_inicial = documento_masivo.reservar_consecutivos(db, calculo["tipo_documento_id"], len(facturas)) if facturas else None
+    con_cruce = [f for f in facturas if f["valor_cruce"] > 0.01]
+    numero_cruce = documento_masivo.reservar_consecutivos(db, calculo["tipo_cruce_id"], len(con_cruce)) if con_cruce else None
+
+    lote = PHFacturacionLote(
+        empresa_id=empresa_id,
+        usuario_id=usuario_id,
+        periodo=periodo,
+        fecha_factura=fecha_factura,
+        tipo_documento_id=calculo["tipo_documento_id"],
+        numero_inicial=numero_inicial,
+        numero_final=numero_inicial + len(facturas) - 1 if facturas else None,
+        estado="PENDIENTE",
+        tamano_bloque=tamano_bloque,
+        workers=max(1, settings.PH_FACTURACION_WORKERS),
+        total_unidades=len(facturas),
+        total_bloques=(len(facturas) + tamano_bloque - 1) // tamano_bloque,
+        detalles=calculo["errores"] or None,
+    )
+    for i, factura in enumerate(facturas):
+        documento = factura["documento"]
+        documento.numero = numero_inicial + i
+        cruce = None
+        if factura["valor_cruce"] > 0.01:
+            cruce = facturacion_service.documento_cruce_anticipo(
+                empresa_id, fecha_factura, calculo["tipo_cruce_id"], calculo["cuenta_anticipos_id"],
+                calculo["cuenta_cruce_cartera_id"], factura, documento.numero
+            )
+            cruce.numero = numero_cruce
+            numero_cruce += 1
+        lote.unidades.append(PHFacturacionLoteUnidad(
+            unidad_id=factura["unidad_id"],
+            unidad_codigo=factura["unidad_codigo"],
+            bloque=i // tamano_bloque,
+            numero=documento.numero,
+            total=factura["total"],
+            factura=documento.model_dump(mode="json"),
+            cruce=cruce.model_dump(mode="json") if cruce else None,
+            valor_cruce=factura["valor_cruce"] if cruce else 0,
+            estado="PENDIENTE",
+        ))
+    db.add(lote)
+    db.commit()
+    db.refresh(lote)
+    print(f"[FACTURACION MASIVA] Lote #{lote.id} ({periodo}): {lote.total_unidades} facturas "
+          f"en {lote.total_bloques} bloques de {tamano_bloque}, números {lote.numero_inicial}-{lote.numero_final}")
+    return lote
+
+
+def get_lote(db: Session, lote_id: int, empresa_id: int) -> PHFacturacionLote:
+    lote = db.query(PHFacturacionLote).filter(
+        PHFacturacionLote.id == lote_id,
+        PHFacturacionLote.empresa_id == empresa_id
+    ).first()
+    if not lote:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lote de facturación no encontrado.")
+    return lote
+
+
+def _conteos(db: Session, lote_ids: List[int]) -> Dict[int, Dict[str, int]]:
+    conteos: Dict[int, Dict[str, int]] = {lote_id: {} for lote_id in lote_ids}
+    for lote_id, estado, cantidad in db.query(
+        PHFacturacionLoteUnidad.lote_id, PHFacturacionLoteUnidad.estado, func.count(PHFacturacionLoteUnidad.id)
+    ).filter(PHFacturacionLoteUnidad.lote_id.in_(lote_ids)).group_by(
+        PHFacturacionLoteUnidad.lote_id, PHFacturacionLoteUnidad.estado
+    ):
+        conteos[lote_id][estado] = cantidad
+    return conteos
+
+
+def get_progreso(db: Session, lote_id: int, empresa_id: int) -> Dict[str, Any]:
+    lote = get_lote(db, lote_id, empresa_id)
+    errores = db.query(PHFacturacionLoteUnidad.unidad_codigo, PHFacturacionLoteUnidad.error).filter(
+        PHFacturacionLoteUnidad.lote_id == lote.id,
+        PHFacturacionLoteUnidad.estado == "ERROR"
+    ).order_by(PHFacturacionLoteUnidad.id).all()
+    vista = _vista(lote, _conteos(db, [lote.id])[lote.id])
+    vista["errores"] = [{"unidad": codigo, "error": error} for codigo, error in errores]
+    vista["detalles"] = lote.detalles or []
+    return vista
+
+
+def listar_lotes(db: Session, empresa_id: int, limite: int = 20) -> List[Dict[str, Any]]:
+    lotes = db.query(PHFacturacionLote).filter(
+        PHFacturacionLote.empresa_id == empresa_id
+    ).order_by(PHFacturacionLote.id.desc()).limit(limite).all()
+    conteos = _conteos(db, [l.id for l in lotes])
+    return [_vista(l, conteos[l.id]) for l in lotes]
+
+
+def _vista(lote: PHFacturacionLote, conteos: Dict[str, int]) -> Dict[str, Any]:
+    total = lote.total_unidades or 0
+    facturadas = conteos.get("FACTURADA", 0)
+    return {
+        "id": lote.id,
+        "periodo": lote.periodo,
+        "fecha_factura": lote.fecha_factura.isoformat() if lote.fecha_factura else None,
+        "estado": lote.estado,
+        "en_ejecucion": lote.id in _en_ejecucion,
+        "total_unidades": total,
+        "unidades_facturadas": facturadas,
+        "unidades_pendientes": conteos.get("PENDIENTE", 0),
+        "unidades_con_error": conteos.get("ERROR", 0),
+        "porcentaje": round(100.0 * facturadas / total, 1) if total else 100.0,
+        "total_bloques": lote.total_bloques,
+        "tamano_bloque": lote.tamano_bloque,
+        "workers": lote.workers,
+        "numero_inicial": lote.numero_inicial,
+        "numero_final": lote.numero_final,
+        "fecha_inicio": lote.fecha_inicio.isoformat() if lote.fecha_inicio else None,
+        "fecha_actualizacion": lote.fecha_actualizacion.isoformat() if lote.fecha_actualizacion else None,
+        "fecha_fin": lote.fecha_fin.isoformat() if lote.fecha_fin else None,
+    }
+
+
+def get_resultado(db: Session, lote_id: int, empresa_id: int) -> Dict[str, Any]:
+    """Resumen con el formato de la facturación masiva síncrona: {"generadas", "errores", "detalles"}"""
+    lote = get_lote(db, lote_id, empresa_id)
+    unidades = db.query(
+        PHFacturacionLoteUnidad.unidad_codigo, PHFacturacionLoteUnidad.estado, PHFacturacionLoteUnidad.numero,
+        PHFacturacionLoteUnidad.total, PHFacturacionLoteUnidad.valor_cruce, PHFacturacionLoteUnidad.cruce,
+        PHFacturacionLoteUnidad.error
+    ).filter(PHFacturacionLoteUnidad.lote_id == lote.id).order_by(PHFacturacionLoteUnidad.id).all()
+
+    detalles = list(lote.detalles or [])
+    generadas = 0
+    errores = len(detalles)
+    for codigo, estado, numero, total, valor_cruce, cruce, error in unidades:
+        if estado == "FACTURADA":
+            generadas += 1
+            detalles.append(f"Unidad {codigo}: Doc {numero} por ${total:,.0f}")
+            if cruce:
+                detalles.append(f"   ↳ Cruce automático aplicado: ${valor_cruce:,.0f} (NC {cruce['numero']})")
+        elif estado == "ERROR":
+            errores += 1
+            detalles.append(f"Unidad {codigo}: Error - {error}")
+    return {"lote_id": lote.id, "estado": lote.estado, "generadas": generadas, "errores": errores, "detalles": detalles}
+
+
+def _sin_avance(progreso: Dict[str, Any]) -> bool:
+    if progreso["en_ejecucion"] or progreso["estado"] != "EN_PROCESO" or not progreso["fecha_actualizacion"]:
+        return False
+    ultima = datetime.fromisoformat(progreso["fecha_actualizacion"])
+    return datetime.utcnow() - ultima > _MAXIMO_SIN_AVANCE
+
+
+def eventos_progreso(lote_id: int, empresa_id: int) -> Iterator[str]:
+    """
+    Flujo Server-Sent Events con el avance del lote, hasta que termina.
+    Abre una sesión corta por consulta (la petición puede durar minutos).
+    """
+    from app.core.database import SessionLocal, current_empresa_id
+
+    ultimo = None
+    while True:
+        token = current_empresa_id.set(empresa_id)
+        db = SessionLocal()
+        try:
+            progreso = get_progreso(db, lote_id, empresa_id)
+        finally:
+            db.close()
+            current_empresa_id.reset(token)
+
+        if progreso != ultimo:
+            yield f"event: progreso\ndata: {json.dumps(progreso)}\n\n"
+            ultimo = progreso
+        if progreso["estado"] not in ESTADOS_ABIERTOS:
+            yield f"event: fin\ndata: {json.dumps(progreso)}\n\n"
+            return
+        if _sin_avance(progreso):
+            # Quedó abierto por un proceso que ya no existe: el cliente debe reanudarlo
+            yield f"event: interrumpido\ndata: {json.dumps(progreso)}\n\n"
+            return
+        time.sleep(_INTERVALO_EVENTOS)
+
+
+# ==========================================================
+# 2. EJECUCIÓN
+# ==========================================================
+
+def ejecutar_facturacion(lote_id: int, empresa_id: int) -> Optional[Dict[str, Any]]:
+    """Ejecución en segundo plano con sesión propia (BackgroundTasks)."""
+    from app.core.database import SessionLocal, current_empresa_id
+
+    token = current_empresa_id.set(empresa_id)
+    db = SessionLocal()
+    try:
+        return ejecutar_facturacion_en_sesion(db, lote_id, empresa_id)
+    finally:
+        db.close()
+        current_empresa_id.reset(token)
+
+
+def ejecutar_facturacion_en_sesion(db: Session, lote_id: int, empresa_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Procesa los bloques con unidades pendientes (o con error) del lote. Sirve tanto
+    para la primera ejecución como para reanudar. Retorna el progreso final, o None
+    si el lote ya se está ejecutando en este proceso.
+    """
+    with _lock:
+        if lote_id in _en_ejecucion:
+            return None
+        _en_ejecucion.add(lote_id)
+
+    try:
+        lote = get_lote(db, lote_id, empresa_id)
+        bloques = [bloque for (bloque,) in db.query(PHFacturacionLoteUnidad.bloque).filter(
+            PHFacturacionLoteUnidad.lote_id == lote.id,
+            PHFacturacionLoteUnidad.estado != "FACTURADA"
+        ).distinct().order_by(PHFacturacionLoteUnidad.bloque)]
+        lote.estado = "EN_PROCESO"
+        lote.fecha_actualizacion = datetime.utcnow()
+        lote.fecha_fin = None
+        workers = lote.workers
+        usuario_id = lote.usuario_id
+        db.commit()
+
+        print(f"[FACTURACION MASIVA] Lote #{lote_id}: {len(bloques)} bloques pendientes")
+        es_postgres = db.get_bind().dialect.name == "postgresql"
+        if es_postgres and workers > 1 and len(bloques) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(
+                    lambda bloque: _procesar_bloque_en_sesion_propia(empresa_id, lote_id, usuario_id, bloque),
+                    bloques
+                ))
+        else:
+            for bloque in bloques:
+                _procesar_bloque(db, empresa_id, lote_id, usuario_id, bloque)
+
+        db.expire_all()
+        lote = get_lote(db, lote_id, empresa_id)
+        con_error = db.query(func.count(PHFacturacionLoteUnidad.id)).filter(
+            PHFacturacionLoteUnidad.lote_id == lote.id,
+            PHFacturacionLoteUnidad.estado != "FACTURADA"
+        ).scalar()
+        lote.estado = "COMPLETADO_CON_ERRORES" if con_error else "COMPLETADO"
+        lote.fecha_fin = datetime.utcnow()
+        lote.fecha_actualizacion = lote.fecha_fin
+        db.commit()
+        print(f"[FACTURACION MASIVA] Lote #{lote_id} {lote.estado}: "
+              f"{lote.total_unidades - con_error}/{lote.total_unidades} facturas")
+        return get_progreso(db, lote_id, empresa_id)
+    finally:
+        with _lock:
+            _en_ejecucion.discard(lote_id)
+
+
+def reanudar_facturacion(db: Session, lote_id: int, empresa_id: int) -> PHFacturacionLote:
+    """Valida que el lote pueda reanudarse (la ejecución la lanza el caller)."""
+    lote = get_lote(db, lote_id, empresa_id)
+    if lote_id in _en_ejecucion:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El lote de facturación ya se está ejecutando.")
+    if lote.estado == "COMPLETADO":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El lote de facturación ya está completo.")
+    return lote
+
+
+def _procesar_bloque_en_sesion_propia(empresa_id: int, lote_id: int, usuario_id: Optional[int], bloque: int) -> None:
+    from app.core.database import SessionLocal, current_empresa_id
+    token = current_empresa_id.set(empresa_id)
+    db = SessionLocal()
+    try:
+        _procesar_bloque(db, empresa_id, lote_id, usuario_id, bloque)
+    finally:
+        db.close()
+        current_empresa_id.reset(token)
+
+
+def _procesar_bloque(db: Session, empresa_id: int, lote_id: int, usuario_id: Optional[int], bloque: int) -> None:
+    """
+    Crea las facturas pendientes del bloque y confirma junto con su estado (todo o
+    nada). Si el bloque falla, reintenta unidad por unidad: solo las que fallan
+    quedan en ERROR para reanudarlas después.
+    """
+    filas = db.query(PHFacturacionLoteUnidad).filter(
+        PHFacturacionLoteUnidad.lote_id == lote_id,
+        PHFacturacionLoteUnidad.bloque == bloque,
+        PHFacturacionLoteUnidad.estado != "FACTURADA"
+    ).order_by(PHFacturacionLoteUnidad.id).all()
+    pendientes = [(fila.id, fila.factura, fila.cruce, fila.valor_cruce) for fila in filas]
+    if not pendientes:
+        return
+
+    try:
+        _persistir(db, empresa_id, lote_id, usuario_id, pendientes)
+        return
+    except Exception as e:
+        db.rollback()
+        print(f"[FACTURACION MASIVA] Lote #{lote_id} bloque {bloque}: {_mensaje(e)}. Reintentando por unidad.")
+
+    for pendiente in pendientes:
+        try:
+            _persistir(db, empresa_id, lote_id, usuario_id, [pendiente])
+        except Exception as e:
+            db.rollback()
+            traceback.print_exc()
+            print(f"[FACTURACION MASIVA ERROR] Lote #{lote_id} unidad {pendiente[0]}: {_mensaje(e)}")
+            db.query(PHFacturacionLoteUnidad).filter(PHFacturacionLoteUnidad.id == pendiente[0]).update({
+                "estado": "ERROR", "error": _mensaje(e)[:_MAX_ERROR], "fecha_fin": datetime.utcnow(),
+            }, synchronize_session=False)
+            db.query(PHFacturacionLote).filter(PHFacturacionLote.id == lote_id).update({
+                "fecha_actualizacion": datetime.utcnow(),
+            }, synchronize_session=False)
+            db.commit()
+
+
+def _persistir(db: Session, empresa_id: int, lote_id: int, usuario_id: Optional[int], pendientes: List[tuple]) -> None:
+    """Facturas (y notas de cruce) de `pendientes` con sus números reservados, en una transacción"""
+    facturas = [doc_schemas.DocumentoCreate.model_validate(factura) for _, factura, _, _ in pendientes]
+    creadas = documento_masivo.create_documentos_bulk(
+        db, facturas, user_id=usuario_id, empresa_id=empresa_id,
+        commit=False, skip_recalculo=True, conservar_numeros=True
+    )
+    documento_ids = creadas["ids"]
+
+    con_cruce = [i for i, (_, _, cruce, _) in enumerate(pendientes) if cruce]
+    cruce_ids: Dict[int, int] = {}
+    if con_cruce:
+        cruces = [doc_schemas.DocumentoCreate.model_validate(pendientes[i][2]) for i in con_cruce]
+        creados = documento_masivo.create_documentos_bulk(
+            db, cruces, user_id=usuario_id, empresa_id=empresa_id,
+            commit=False, skip_recalculo=True, conservar_numeros=True
+        )
+        cruce_ids = dict(zip(con_cruce, creados["ids"]))
+        # Aplicación directa del cruce a su factura (sin recálculo completo de cartera)
+        db.execute(insert(AplicacionPago), [
+            {"documento_factura_id": documento_ids[i], "documento_pago_id": cruce_ids[i],
+             "valor_aplicado": pendientes[i][3], "empresa_id": empresa_id}
+            for i in con_cruce
+        ])
+
+    ahora = datetime.utcnow()
+    for i, (fila_id, _, _, _) in enumerate(pendientes):
+        db.query(PHFacturacionLoteUnidad).filter(PHFacturacionLoteUnidad.id == fila_id).update({
+            "estado": "FACTURADA", "documento_id": documento_ids[i], "cruce_documento_id": cruce_ids.get(i),
+            "error": None, "fecha_fin": ahora,
+        }, synchronize_session=False)
+    db.query(PHFacturacionLote).filter(PHFacturacionLote.id == lote_id).update({
+        "fecha_actualizacion": ahora,
+    }, synchronize_session=False)
+    db.commit()
+
+
+def _mensaje(e: Exception) -> str:
+    if isinstance(e, HTTPException):
+        return e.detail if isinstance(e.detail, str) else json.dumps(e.detail, ensure_ascii=False, default=str)
+    return str(e)
@@ -11,13 +11,36 @@ from app.models.plan_cuenta import PlanCuenta
 from app.services import documento as documento_service
 from app.schemas import documento as doc_schemas
 from fastapi import HTTPException
-from weasyprint import HTML
-from jinja2 import Environment, select_autoescape
+from app.services import motor_pdf
 from app.models.empresa import Empresa
-from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
+from app.services.plantillas_html import TEMPLATES_EMPAQUETADOS
+from app.services import plantillas_html
 from app.core.database import sql_periodo_mes
 
 def generar_facturacion_masiva(db: Session, empresa_id: int, fecha_factura: date, usuario_id: int, conceptos_ids: List[int] = None, configuracion_conceptos: List[Any] = None):
+    """
+    Facturación masiva del periodo en la misma petición: registra el lote (facturas
+    calculadas y consecutivos reservados) y lo ejecuta por bloques confirmados.
+    Para ejecutarla en segundo plano y consultar el avance ver facturacion_lote_service.
+    """
+    from app.services.propiedad_horizontal import facturacion_lote_service
+
+    lote = facturacion_lote_service.iniciar_facturacion(
+        db, empresa_id, fecha_factura, usuario_id,
+        conceptos_ids=conceptos_ids, configuracion_conceptos=configuracion_conceptos
+    )
+    facturacion_lote_service.ejecutar_facturacion_en_sesion(db, lote.id, empresa_id)
+    return facturacion_lote_service.get_resultado(db, lote.id, empresa_id)
+
+
+def calcular_facturacion_masiva(db: Session, empresa_id: int, fecha_factura: date, conceptos_ids: List[int] = None, configuracion_conceptos: List[Any] = None) -> Dict[str, Any]:
+    """
+    Calcula en memoria las facturas del periodo para todas las unidades activas (lógica
+    delta: solo conceptos aún no cobrados en el periodo), sin crear documentos.
+    Retorna {"tipo_documento_id", "tipo_cruce_id", "facturas": [{"unidad_id", "unidad_codigo",
+    "total", "documento" (DocumentoCreate sin número), "valor_cruce", "propietario_id"}],
+    "errores": [str], "cuenta_anticipos_id", "cuenta_cruce_cartera_id"}.
+    """
     # 1. Obtener Configuración
     print(f"--- SUPER DEBUG: Iniciando Facturacion Masiva. Empresa: {empresa_id}, Fecha: {fecha_factura}, Conceptos IDs Seleccionados: {conceptos_ids} ---")
     from app.services.propiedad_horizontal import configuracion_service
@@ -60,11 +83,8 @@ def generar_facturacion_masiva(db: Session, empresa_id: int, fecha_factura: date
     print(f"--- DEBUG: Conceptos encontrados: {len(conceptos)}")
     print(f"--- DEBUG: Unidades encontradas: {len(unidades)}")
     
-    resultados = {
-        "generadas": 0,
-        "errores": 0,
-        "detalles": []
-    }
+    facturas = []
+    errores = []
 
     if not config or not config.tipo_documento_factura_id:
              raise HTTPException(status_code=400, detail="No se ha configurado el Tipo de Documento de Facturación en /ph/configuracion.")
@@ -75,9 +95,6 @@ def generar_facturacion_masiva(db: Session, empresa_id: int, fecha_factura: date
     if not tipo_doc_obj:
          raise HTTPException(status_code=400, detail="El Tipo de Documento configurado no existe.")
 
-    # --- OPTIMIZACIÓN EMPRESA (Inyectar para evitar N+1 en create_documento) ---
-    empresa_info_obj = db.query(Empresa).filter(Empresa.id == empresa_id).first()
-         
     # --- LÓGICA DE GENERACIÓN DELTA (EVITAR DUPLICADOS) ---
     from sqlalchemy import func as sa_func
     periodo_str = fecha_factura.strftime('%Y-%m')
@@ -244,8 +261,7 @@ def generar_facturacion_masiva(db: Session, empresa_id: int, fecha_factura: date
     for unidad in unidades:
         try:
             if not unidad.propietario_principal_id:
-                resultados["errores"] += 1
-                resultados["detalles"].append(f"Unidad {unidad.codigo}: Sin propietario asignado.")
+                errores.append(f"Unidad {unidad.codigo}: Sin propietario asignado.")
                 continue
             
             # Lógica Delta Inteligente:
@@ -474,97 +490,73 @@ def generar_facturacion_masiva(db: Session, empresa_id: int, fecha_factura: date
                     unidad_ph_id=unidad.id
                 )
 
-                new_doc = documento_service.create_documento(
-                    db, doc_create, user_id=usuario_id, 
-                    skip_recalculo=True, commit=False,
-                    injected_empresa_info=empresa_info_obj
-                )
-                db.flush()  # Forzar asignación de ID sin confirmar transacción
-                resultados["generadas"] += 1
-                resultados["detalles"].append(f"Unidad {unidad.codigo}: Doc {new_doc.numero} por ${total_factura:,.0f}")
-
                 # --- LÓGICA DE AUTO-CRUCE DE ANTICIPOS ---
-                # Si el propietario tiene saldo a favor en pasivo, aplicamos el cruce inmediatamente
+                # Si el propietario tiene saldo a favor en pasivo, la factura se cruza al crearla
+                valor_cruce = 0
                 id_propietario = unidad.propietario_principal_id
                 if config.cuenta_anticipos_id and id_propietario in mapa_anticipos and tipo_nc:
                     saldo_disponible = mapa_anticipos[id_propietario]
                     if saldo_disponible > 0.01:
-                        monto_cruce = min(total_factura, saldo_disponible)
-                        
-                        # Crear movimientos del cruce
-                        movs_cruce = [
-                            # 1. Debito al Pasivo (Reducción de Anticipo)
-                            doc_schemas.MovimientoContableCreate(
-                                cuenta_id=config.cuenta_anticipos_id,
-                                concepto=f"Cruce Anticipo - Pago Factura {new_doc.numero} - {unidad.codigo}",
-                                debito=monto_cruce,
-                                credito=0
-                            ),
-                            # 2. Credito a la Cartera (Pago de la Factura)
-                            doc_schemas.MovimientoContableCreate(
-                                cuenta_id=config.cuenta_cartera_id or tipo_doc_obj.cuenta_debito_cxc_id,
-                                concepto=f"Cruce Anticipo - Aplicación Factura {new_doc.numero} - {unidad.codigo}",
-                                debito=0,
-                                credito=monto_cruce
-                            )
-                        ]
-                        
-                        doc_cruce = doc_schemas.DocumentoCreate(
-                            empresa_id=empresa_id,
-                            tipo_documento_id=tipo_nc.id,
-                            numero=0,
-                            fecha=fecha_factura,
-                            fecha_vencimiento=fecha_factura,
-                            beneficiario_id=id_propietario,
-                            observaciones=f"Auto-cruce masivo de anticipo contra Factura {new_doc.numero}",
-                            movimientos=movs_cruce,
-                            unidad_ph_id=unidad.id
-                        )
-                        
-                        cruce_obj = documento_service.create_documento(
-                            db, doc_create, user_id=usuario_id, 
-                            skip_recalculo=True, commit=False,
-                            injected_empresa_info=empresa_info_obj
-                        )
-                        db.flush()
-                        
-                        # --- APLICACION DIRECTA DE PAGO (ALTO RENDIMIENTO) ---
-                        # Vincula la NC de cruce a la factura directamente en la tabla de aplicaciones.
-                        # Sin recálculo completo → el saldo baja de inmediato en la pantalla de recaudos.
-                        nueva_aplicacion = AplicacionPago(
-                            documento_factura_id=new_doc.id,
-                            documento_pago_id=cruce_obj.id,
-                            valor_aplicado=monto_cruce,
-                            empresa_id=empresa_id
-                        )
-                        db.add(nueva_aplicacion)
-                        
+                        valor_cruce = min(total_factura, saldo_disponible)
                         # Actualizar el mapa RAM para siguientes unidades del mismo dueño
-                        mapa_anticipos[id_propietario] -= monto_cruce
-                        resultados["detalles"].append(f"   ↳ Cruce automático aplicado: ${monto_cruce:,.0f} (NC {cruce_obj.numero})")
-                # -----------------------------------------
+                        mapa_anticipos[id_propietario] -= valor_cruce
 
-                # Commit por lotes de 50 para liberar memoria sin saturar la BD
-                if resultados["generadas"] % 50 == 0:
-                    db.commit()
-                    print(f"--- BATCH COMMIT: {resultados['generadas']} facturas confirmadas ---")
+                facturas.append({
+                    "unidad_id": unidad.id,
+                    "unidad_codigo": unidad.codigo,
+                    "propietario_id": id_propietario,
+                    "total": total_factura,
+                    "documento": doc_create,
+                    "valor_cruce": valor_cruce
+                })
 
         except Exception as e:
-            resultados["errores"] += 1
-            resultados["detalles"].append(f"Unidad {unidad.codigo}: Error - {str(e)}")
-            # El rollback parcial de SQLAlchemy mantiene el estado limpio para la siguiente iteración
-            db.rollback()
+            errores.append(f"Unidad {unidad.codigo}: Error - {str(e)}")
             continue
 
-    # Commit final para confirmar las últimas facturas del lote
-    try:
-        db.commit()
-        print(f"--- COMMIT FINAL: Proceso completado. {resultados['generadas']} generadas, {resultados['errores']} errores ---")
-    except Exception as e_final:
-        db.rollback()
-        print(f"--- ERROR EN COMMIT FINAL: {str(e_final)} ---")
+    print(f"--- CALCULO FACTURACION: {len(facturas)} facturas calculadas, {len(errores)} unidades con error ---")
+    return {
+        "tipo_documento_id": global_doc_id,
+        "tipo_cruce_id": tipo_nc.id if tipo_nc else None,
+        "cuenta_anticipos_id": config.cuenta_anticipos_id,
+        "cuenta_cruce_cartera_id": config.cuenta_cartera_id or tipo_doc_obj.cuenta_debito_cxc_id,
+        "facturas": facturas,
+        "errores": errores
+    }
+
 
-    return resultados
+def documento_cruce_anticipo(empresa_id: int, fecha_factura: date, tipo_cruce_id: int, cuenta_anticipos_id: int,
+                             cuenta_cartera_id: int, factura: Dict[str, Any], numero_factura: int) -> doc_schemas.DocumentoCreate:
+    """Nota de cruce del anticipo del propietario contra la factura `numero_factura` de la unidad"""
+    unidad_codigo = factura["unidad_codigo"]
+    monto_cruce = factura["valor_cruce"]
+    movs_cruce = [
+        # 1. Debito al Pasivo (Reducción de Anticipo)
+        doc_schemas.MovimientoContableCreate(
+            cuenta_id=cuenta_anticipos_id,
+            concepto=f"Cruce Anticipo - Pago Factura {numero_factura} - {unidad_codigo}",
+            debito=monto_cruce,
+            credito=0
+        ),
+        # 2. Credito a la Cartera (Pago de la Factura)
+        doc_schemas.MovimientoContableCreate(
+            cuenta_id=cuenta_cartera_id,
+            concepto=f"Cruce Anticipo - Aplicación Factura {numero_factura} - {unidad_codigo}",
+            debito=0,
+            credito=monto_cruce
+        )
+    ]
+    return doc_schemas.DocumentoCreate(
+        empresa_id=empresa_id,
+        tipo_documento_id=tipo_cruce_id,
+        numero=0,
+        fecha=fecha_factura,
+        fecha_vencimiento=fecha_factura,
+        beneficiario_id=factura["propietario_id"],
+        observaciones=f"Auto-cruce masivo de anticipo contra Factura {numero_factura}",
+        movimientos=movs_cruce,
+        unidad_ph_id=factura["unidad_id"]
+    )
 
 def get_historial_facturacion(db: Session, empresa_id: int):
     """
@@ -642,14 +634,8 @@ def eliminar_facturacion_masiva(db: Session, empresa_id: int, periodo: str, usua
 
     count = 0
     errores = 0
-    terceros_a_recalcular = set()  # Acumular terceros ANTES de eliminar, para recálculo único al final
     from app.services.documento import eliminar_documento
-    from app.services import cartera as cartera_service
-
-    # Recolectar todos los propietarios afectados antes de empezar
-    for doc in docs:
-        if doc.beneficiario_id:
-            terceros_a_recalcular.add(doc.beneficiario_id)
+    from app.services import cola_cartera
 
     # --- OPTIMIZACIÓN LOTE (Precarga de metadatos) ---
     from app.services.documento import _get_cuentas_especiales_ids
@@ -664,52 +650,47 @@ def eliminar_facturacion_masiva(db: Session, empresa_id: int, periodo: str, usua
     ).order_by(sa_func.coalesce(models_ph_concepto.orden, 999).asc(), models_ph_concepto.id.asc()).all()
     # -------------------------------------------------
 
-    # BUCLE DE ELIMINACIÓN: Sin commit ni recálculo de cartera por iteración
+    # BUCLE DE ELIMINACIÓN: Sin recálculo de cartera por iteración
     # commit=True es necesario por la arquitectura de eliminar_documento (maneja su propia transacción)
     # pero le decimos recalc=False para que NO recalcule inventario (las facturas PH no tienen inventario)
-    for doc in docs:
-        try:
-            eliminar_documento(
-                db,
-                doc.id,
-                empresa_id,
-                usuario_id,
-                "Eliminacion Masiva Facturacion PH",
-                commit=True,
-                recalc=False,  # CLAVE: Evita X recálculos de inventario (no aplica aquí)
-                skip_recalc_cartera=True, # Lo haremos al final en lote
-                injected_cuentas_cxc=cuentas_cxc_batch,
-                injected_cuentas_cxp=cuentas_cxp_batch,
-                injected_conceptos_ph=conceptos_ph_batch
-            )
-            count += 1
-            if count % 20 == 0:
-                print(f"[ELIMINACION PH] Progreso: {count}/{len(docs)} facturas eliminadas...")
-        except Exception as e_del:
-            errores += 1
-            print(f"[ELIMINACION PH] Error eliminando doc {doc.id}: {str(e_del)}")
+    # RECÁLCULO ÚNICO DE CARTERA: eliminar_documento solo marca a los terceros en la cola
+    # y al cerrar el lote se recalcula una sola vez por tercero (ver cola_cartera)
+    with cola_cartera.recalculo_diferido(
+        db, empresa_id, descripcion=f"Eliminación facturación PH {periodo}",
+        injected_cuentas_cxc=cuentas_cxc_batch,
+        injected_cuentas_cxp=cuentas_cxp_batch,
+        injected_conceptos_ph=conceptos_ph_batch
+    ) as cola:
+        for doc in docs:
             try:
-                db.rollback()
-            except:
-                pass
-            continue
+                eliminar_documento(
+                    db,
+                    doc.id,
+                    empresa_id,
+                    usuario_id,
+                    "Eliminacion Masiva Facturacion PH",
+                    commit=True,
+                    recalc=False,  # CLAVE: Evita X recálculos de inventario (no aplica aquí)
+                    skip_recalc_cartera=False, # Solo marca al propietario en la cola del lote
+                    injected_cuentas_cxc=cuentas_cxc_batch,
+                    injected_cuentas_cxp=cuentas_cxp_batch,
+                    injected_conceptos_ph=conceptos_ph_batch
+                )
+                count += 1
+                if count % 20 == 0:
+                    print(f"[ELIMINACION PH] Progreso: {count}/{len(docs)} facturas eliminadas...")
+            except Exception as e_del:
+                errores += 1
+                print(f"[ELIMINACION PH] Error eliminando doc {doc.id}: {str(e_del)}")
+                try:
+                    db.rollback()
+                except:
+                    pass
+                continue
 
-    # RECÁLCULO ÚNICO DE CARTERA: Una sola vez por propietario, al final de todo
-    # Esto reemplaza los N recálculos que antes ocurrían dentro de eliminar_documento
-    print(f"[ELIMINACION PH] Iniciando recálculo de cartera para {len(terceros_a_recalcular)} propietarios únicos...")
-    for t_id in terceros_a_recalcular:
-        try:
-            cartera_service.recalcular_aplicaciones_tercero(
-                db, 
-                tercero_id=t_id, 
-                empresa_id=empresa_id, 
-                commit=True,
-                injected_cuentas_cxc=cuentas_cxc_batch,
-                injected_cuentas_cxp=cuentas_cxp_batch,
-                injected_conceptos_ph=conceptos_ph_batch
-            )
-        except Exception as e_recalc:
-            print(f"[ELIMINACION PH] Error recalculando cartera tercero {t_id}: {str(e_recalc)}")
+    if cola.resumen:
+        for err in cola.resumen["errores"]:
+            print(f"[ELIMINACION PH] Error recalculando cartera {err}")
 
     print(f"[ELIMINACION PH] Completado: {count} eliminadas, {errores} errores.")
     return {
@@ -830,7 +811,7 @@ def generar_pdf_detalle_facturacion(db: Session, empresa_id: int, periodo: str):
     if not datos:
         # Retornar PDF con mensaje de vacio
         html_string = "<html><body><h1>Detalle de Facturación</h1><p>No se encontraron facturas para el periodo seleccionado.</p></body></html>"
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
         
     # 2. Obtener Empresa
     empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
@@ -858,12 +839,11 @@ def generar_pdf_detalle_facturacion(db: Session, empresa_id: int, periodo: str):
     if template_name not in TEMPLATES_EMPAQUETADOS:
         raise HTTPException(status_code=500, detail="Plantilla de reporte no encontrada.")
         
-    env = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
-    template = env.from_string(TEMPLATES_EMPAQUETADOS[template_name])
+    template = plantillas_html.plantilla(plantillas_html.ENTORNO_BASE, template_name)
     html_content = template.render(context)
     
     # 6. Generar PDF
-    return HTML(string=html_content).write_pdf()
+    return motor_pdf.html_a_pdf(html_content)
 
 def recalcular_intereses_posteriores(db: Session, empresa_id: int, unidad_id: int, fecha_corte: date, usuario_id: int):
     """
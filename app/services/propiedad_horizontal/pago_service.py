@@ -2260,19 +2260,14 @@ def generar_pdf_estado_cuenta(db: Session, empresa_id: int, unidad_id: int = Non
 
 
 
-    from weasyprint import HTML
+    from app.services import motor_pdf
 
 
 
 
 
-    from jinja2 import Environment, select_autoescape
-
-
-
-
-
-    from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
+    from app.services.plantillas_html import TEMPLATES_EMPAQUETADOS
+    from app.services import plantillas_html
 
 
 
@@ -2988,13 +2983,7 @@ def generar_pdf_estado_cuenta(db: Session, empresa_id: int, unidad_id: int = Non
 
 
 
-        env = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
-
-
-
-
-
-        template = env.from_string(TEMPLATES_EMPAQUETADOS[template_name])
+        template = plantillas_html.plantilla(plantillas_html.ENTORNO_BASE, template_name)
 
 
 
@@ -3006,7 +2995,7 @@ def generar_pdf_estado_cuenta(db: Session, empresa_id: int, unidad_id: int = Non
 
 
 
-        return HTML(string=html_content).write_pdf()
+        return motor_pdf.html_a_pdf(html_content)
 
 
 
@@ -3030,7 +3019,7 @@ def generar_pdf_estado_cuenta(db: Session, empresa_id: int, unidad_id: int = Non
 
 
 
-        return HTML(string=f"<h1>Error generando reporte</h1><p>{str(e)}</p>").write_pdf()
+        return motor_pdf.html_a_pdf(f"<h1>Error generando reporte</h1><p>{str(e)}</p>")
 
 
 
@@ -3045,10 +3034,15 @@ def generar_pdf_estado_cuenta(db: Session, empresa_id: int, unidad_id: int = Non
 
 def _simular_cronologia_pagos(db: Session, docs: list, empresa_id: int, fecha_corte_snapshot: date = None, 
                               injected_cuentas_interes=None, injected_cuentas_multa=None, injected_cuentas_cxc=None,
-                              injected_conceptos_ph=None, injected_config=None):
+                              injected_conceptos_ph=None, injected_config=None, estado_inicial=None,
+                              injected_cache_conceptos=None):
     """
     Motor Central de Simulación de Pagos (Replay).
     Si fecha_corte_snapshot es provista, captura el estado de pending_debts justo antes del primer movimiento >= fecha.
+    estado_inicial: {"deudas", "saldo_a_favor", "saldo_acumulado"} desde el que se continúa en lugar de
+    empezar en cero (estado persistido de estado_cuenta_service); sus deudas se modifican en sitio.
+    injected_cache_conceptos: dict texto -> concepto PH reutilizable entre llamadas con los mismos
+    conceptos (evita normalizar todos los nombres por cada movimiento).
     """
     from collections import defaultdict
     import copy
@@ -3096,6 +3090,10 @@ def _simular_cronologia_pagos(db: Session, docs: list, empresa_id: int, fecha_co
     transacciones_simuladas = []
     saldo_acumulado = 0
     saldo_a_favor = 0 # Billetera para anticipos
+    if estado_inicial is not None:
+        pending_debts = list(estado_inicial['deudas'])
+        saldo_acumulado = estado_inicial['saldo_acumulado']
+        saldo_a_favor = estado_inicial['saldo_a_favor']
     
     
     snapshot_pending_debts = None
@@ -3121,7 +3119,12 @@ def _simular_cronologia_pagos(db: Session, docs: list, empresa_id: int, fecha_co
                 credito_cxc += float(mov.credito)
             else:
                 # Clasificar concepto usando identificación inteligente
-                co = cartera_service.identificar_concepto_ph(mov.concepto, conceptos_ph)
+                if injected_cache_conceptos is None:
+                    co = cartera_service.identificar_concepto_ph(mov.concepto, conceptos_ph)
+                else:
+                    if mov.concepto not in injected_cache_conceptos:
+                        injected_cache_conceptos[mov.concepto] = cartera_service.identificar_concepto_ph(mov.concepto, conceptos_ph)
+                    co = injected_cache_conceptos[mov.concepto]
                 
                 if co:
                     prio = concepto_prio_map.get(co.id, 9999)
@@ -3929,29 +3932,16 @@ def registrar_pago_consolidado(db: Session, propietario_id: int, monto_total: fl
 from collections import defaultdict
 
 def get_cartera_ph_pendientes_detallada(db: Session, empresa_id: int, unidad_id: int):
-    from sqlalchemy.orm import selectinload, joinedload
+    from app.services.propiedad_horizontal import estado_cuenta_service
     from collections import defaultdict
     
-    # 1. OBTENER TODO EL HISTORIAL (Cronológico)
-    # Es fundamental procesar desde el principio para que los pagos solo afecten a deudas EXISTENTES en ese momento.
-    query = db.query(Documento).options(
-        selectinload(Documento.movimientos).joinedload(MovimientoContable.cuenta),
-        joinedload(Documento.tipo_documento),
-        joinedload(Documento.unidad_ph)
-    ).filter(
-        Documento.empresa_id == empresa_id,
-        Documento.unidad_ph_id == unidad_id,
-        Documento.estado.in_(['ACTIVO', 'PROCESADO'])
-    ).order_by(Documento.fecha.asc(), Documento.id.asc())
-    
-    docs = query.all()
+    # 1. ESTADO DE CUENTA MATERIALIZADO (solo se simulan los documentos nuevos o modificados)
+    estado = estado_cuenta_service.estados(db, empresa_id, unidad_ids=[unidad_id]).get(unidad_id)
     
-    if not docs:
+    if not estado:
         return []
 
-    # 2. REPLAY SIMULATION (Delegada)
-    # 2. REPLAY SIMULATION (Delegada)
-    pending_debts, _, _, saldo_a_favor_rem, _ = _simular_cronologia_pagos(db, docs, empresa_id)
+    pending_debts = estado["deudas"]
 
     # 3. AGRUPAR Y RETORNAR
     resultado_por_concepto = defaultdict(float)
@@ -3978,9 +3968,9 @@ def get_cartera_ph_pendientes_detallada(db: Session, empresa_id: int, unidad_id:
     return lista_final
 
 def generar_pdf_cartera_detallada(db: Session, empresa_id: int, unidad_id: int):
-    from weasyprint import HTML
-    from jinja2 import Environment, select_autoescape
-    from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
+    from app.services import motor_pdf
+    from app.services.plantillas_html import TEMPLATES_EMPAQUETADOS
+    from app.services import plantillas_html
     from app.models.empresa import Empresa
     from datetime import date
     
@@ -3994,11 +3984,10 @@ def generar_pdf_cartera_detallada(db: Session, empresa_id: int, unidad_id: int):
         template_name = 'reports/cartera_detallada_ph_report.html'
         
         if template_name not in TEMPLATES_EMPAQUETADOS:
-            return HTML(string=f"<h1>Error: Plantilla {template_name} no encontrada.</h1>").write_pdf()
+            return motor_pdf.html_a_pdf(f"<h1>Error: Plantilla {template_name} no encontrada.</h1>")
 
         # Renderizar con Jinja2
-        env = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
-        template = env.from_string(TEMPLATES_EMPAQUETADOS[template_name])
+        template = plantillas_html.plantilla(plantillas_html.ENTORNO_BASE, template_name)
         
         html_rendered = template.render(
             empresa=empresa,
@@ -4008,13 +3997,13 @@ def generar_pdf_cartera_detallada(db: Session, empresa_id: int, unidad_id: int):
             fecha_impresion=fecha_impresion
         )
         
-        return HTML(string=html_rendered).write_pdf()
+        return motor_pdf.html_a_pdf(html_rendered)
 
     except Exception as e:
         import traceback
         error_msg = f"Error generando PDF de Cartera Detallada: {str(e)}\n{traceback.format_exc()}"
         print(error_msg)
-        return HTML(string=f"<html><body><h1>Error en PDF</h1><pre>{error_msg}</pre></body></html>").write_pdf()
+        return motor_pdf.html_a_pdf(f"<html><body><h1>Error en PDF</h1><pre>{error_msg}</pre></body></html>")
 
 def registrar_pago_masivo(
     db: Session, 
@@ -4031,7 +4020,7 @@ def registrar_pago_masivo(
     Registra pagos para múltiples unidades de forma optimizada.
     Implementa recálculo diferido de cartera para evitar saturación de la BD.
     """
-    from app.services import cartera as cartera_service
+    from app.services import cartera as cartera_service, cola_cartera
     from app.models.propiedad_horizontal.unidad import PHUnidad
     
     resultados = {
@@ -4040,7 +4029,6 @@ def registrar_pago_masivo(
         "detalles": []
     }
     
-    terceros_a_recalcular = set()
     total_unidades = len(unidades_ids)
     
     print(f"--- INICIANDO PAGO MASIVO: {total_unidades} unidades ---")
@@ -4098,83 +4086,79 @@ def registrar_pago_masivo(
     # ESTRATEGIA: Llamar get_estado_cuenta_unidad por unidad (con skip_recalculo=True para velocidad).
     # Esto garantiza que el monto que enviamos a registrar_pago_unidad coincide EXACTAMENTE
     # con el saldo que esa funcion ve internamente, eliminando el bug de discrepancia.
-    for index, u_id in enumerate(unidades_ids):
-        try:
-            unidad = mapa_unidades.get(u_id)
-            if not unidad:
-                continue
-
-            monto_final = 0
-            if pagar_saldo_total:
-                # Usamos el mapa de saldos precargado en lugar de llamar a la base de datos por cada unidad
-                saldo = mapa_saldos.get(u_id, 0)
-                if saldo <= 0:
-                    resultados["detalles"].append(f"Unidad {unidad.codigo}: Sin deuda pendiente. Omitido.")
+    # Recálculo diferido de cartera: una sola vez por propietario al cerrar el lote
+    with cola_cartera.recalculo_diferido(
+        db, empresa_id, descripcion="Pago masivo PH",
+        injected_cuentas_cxc=cuentas_cxc_batch,
+        injected_cuentas_cxp=cuentas_cxp_batch,
+        injected_conceptos_ph=conceptos_ph_batch
+    ) as cola:
+        for index, u_id in enumerate(unidades_ids):
+            try:
+                unidad = mapa_unidades.get(u_id)
+                if not unidad:
                     continue
-                monto_final = saldo
-            else:
-                monto_final = monto_fijo or 0
-
-            if monto_final <= 0:
-                resultados["detalles"].append(f"Unidad {unidad.codigo}: Monto 0. Omitido.")
-                continue
-
-            # Registrar pago con recalculo diferido e inyección de dependencias
-            registrar_pago_unidad(
-                db,
-                unidad_id=u_id,
-                empresa_id=empresa_id,
-                usuario_id=usuario_id,
-                monto=monto_final,
-                fecha_pago=fecha_pago,
-                forma_pago_id=forma_pago_id,
-                skip_recalculo=True,
-                commit=False,
-                injected_config=config,
-                injected_tipo_doc=tipo_doc_recibo,
-                injected_unidad=unidad,
-                injected_empresa_info=empresa_info_obj
-            )
-
-            if unidad.propietario_principal_id:
-                terceros_a_recalcular.add(unidad.propietario_principal_id)
-
-            resultados["procesados"] += 1
-            print(f"DEBUG MASIVO: Unidad {unidad.codigo} -> OK (${monto_final})")
-
-            # Commit por lotes de 50 para liberar memoria
-            if resultados["procesados"] % 50 == 0:
-                db.commit()
-                print(f"--- BATCH COMMIT PAGO: {resultados['procesados']} procesados ---")
-
-        except Exception as e:
-            db.rollback()
-            resultados["errores"] += 1
-            resultados["detalles"].append(f"Unidad {u_id}: Error - {str(e)}")
-            print(f"ERROR pagando unidad {u_id}: {e}")
 
-        # 4. Commit final de pagos
-    try:
-        db.commit()
-    except Exception as e_final:
-        db.rollback()
-        return {"error": f"Error final en transacción: {str(e_final)}"}
+                monto_final = 0
+                if pagar_saldo_total:
+                    # Usamos el mapa de saldos precargado en lugar de llamar a la base de datos por cada unidad
+                    saldo = mapa_saldos.get(u_id, 0)
+                    if saldo <= 0:
+                        resultados["detalles"].append(f"Unidad {unidad.codigo}: Sin deuda pendiente. Omitido.")
+                        continue
+                    monto_final = saldo
+                else:
+                    monto_final = monto_fijo or 0
+
+                if monto_final <= 0:
+                    resultados["detalles"].append(f"Unidad {unidad.codigo}: Monto 0. Omitido.")
+                    continue
 
-    # 4. RECÁLCULO DIFERIDO DE CARTERA
-    print(f"--- INICIANDO RECALCULO DE CARTERA PARA {len(terceros_a_recalcular)} PROPIETARIOS ---")
-    for t_id in terceros_a_recalcular:
+                # Registrar pago con recalculo diferido e inyección de dependencias
+                registrar_pago_unidad(
+                    db,
+                    unidad_id=u_id,
+                    empresa_id=empresa_id,
+                    usuario_id=usuario_id,
+                    monto=monto_final,
+                    fecha_pago=fecha_pago,
+                    forma_pago_id=forma_pago_id,
+                    skip_recalculo=True,
+                    commit=False,
+                    injected_config=config,
+                    injected_tipo_doc=tipo_doc_recibo,
+                    injected_unidad=unidad,
+                    injected_empresa_info=empresa_info_obj
+                )
+
+                cola.marcar(unidad.propietario_principal_id)
+
+                resultados["procesados"] += 1
+                print(f"DEBUG MASIVO: Unidad {unidad.codigo} -> OK (${monto_final})")
+
+                # Commit por lotes de 50 para liberar memoria
+                if resultados["procesados"] % 50 == 0:
+                    db.commit()
+                    print(f"--- BATCH COMMIT PAGO: {resultados['procesados']} procesados ---")
+
+            except Exception as e:
+                db.rollback()
+                resultados["errores"] += 1
+                resultados["detalles"].append(f"Unidad {u_id}: Error - {str(e)}")
+                print(f"ERROR pagando unidad {u_id}: {e}")
+
+        # 4. Commit final de pagos
         try:
-            cartera_service.recalcular_aplicaciones_tercero(
-                db, 
-                tercero_id=t_id, 
-                empresa_id=empresa_id, 
-                commit=True,
-                injected_cuentas_cxc=cuentas_cxc_batch,
-                injected_cuentas_cxp=cuentas_cxp_batch,
-                injected_conceptos_ph=conceptos_ph_batch
-            )
-        except Exception as e_recalc:
-            print(f"WARN: Error recalculando cartera tercero {t_id}: {e_recalc}")
+            db.commit()
+        except Exception as e_final:
+            db.rollback()
+            cola.pendientes.clear()
+            return {"error": f"Error final en transacción: {str(e_final)}"}
+
+    resultados["lote_recalculo_id"] = cola.lote_id
+    if cola.resumen:
+        for err in cola.resumen["errores"]:
+            print(f"WARN: Error recalculando cartera {err}")
 
     print(f"--- PAGO MASIVO FINALIZADO: {resultados['procesados']} exitos ---")
     return resultados
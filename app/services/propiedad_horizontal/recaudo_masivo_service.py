@@ -12,7 +12,8 @@ from app.schemas.propiedad_horizontal import recaudo_masivo as schemas_rm
 from app.services.propiedad_horizontal import pago_service, configuracion_service
 from app.models import TipoDocumento, Documento, MovimientoContable
 from app.schemas import documento as doc_schemas
-from app.services import documento as documento_service, cartera as cartera_service
+from app.services import cartera as cartera_service, cola_cartera
+from app.services import documento_masivo
 from app.utils.sorting import natural_sort_key
 
 def parse_asobancaria_2001(file_content: bytes) -> List[schemas_rm.RecaudoFila]:
@@ -241,94 +242,105 @@ def procesar_lote_pagos(db: Session, empresa_id: int, request: schemas_rm.Recaud
         PHConcepto.activo == True
     ).order_by(func.coalesce(PHConcepto.orden, 999).asc(), PHConcepto.id.asc()).all()
     # -------------------------
-    terceros_a_recalcular = set()
-
-    for fila in filas_a_procesar:
-        try:
-            unidad = unidades_map.get(fila.unidad_id)
-            if not unidad: continue
-            
-            monto_cartera = fila.monto_a_aplicar
-            monto_anticipo = fila.excedente_anticipo
+    # Recálculo de cartera diferido: cada propietario se recalcula una sola vez al cerrar el lote
+    with cola_cartera.recalculo_diferido(
+        db, empresa_id, descripcion="Recaudo masivo PH",
+        injected_cuentas_cxc=cuentas_cxc_batch,
+        injected_cuentas_cxp=cuentas_cxp_batch,
+        injected_conceptos_ph=conceptos_ph_batch
+    ) as cola:
+        # Los recibos se arman fila por fila y se crean juntos con la ruta masiva
+        documentos = []
+        filas_documentos = []
+        for fila in filas_a_procesar:
+            try:
+                unidad = unidades_map.get(fila.unidad_id)
+                if not unidad: continue
             
-            movimientos = []
-            # 1. Entrada a Banco
-            movimientos.append(doc_schemas.MovimientoContableCreate(
-                cuenta_id=request.cuenta_bancaria_id,
-                concepto=f"Recaudo Masivo {unidad.codigo} - {fila.referencia}",
-                debito=fila.monto_recibido,
-                credito=0
-            ))
+                monto_cartera = fila.monto_a_aplicar
+                monto_anticipo = fila.excedente_anticipo
             
-            # 2. Crédito a Cartera
-            if monto_cartera > 0:
+                movimientos = []
+                # 1. Entrada a Banco
                 movimientos.append(doc_schemas.MovimientoContableCreate(
-                    cuenta_id=cuenta_cxc_global,
-                    concepto=f"Abono Cartera {unidad.codigo}",
-                    debito=0,
-                    credito=monto_cartera
+                    cuenta_id=request.cuenta_bancaria_id,
+                    concepto=f"Recaudo Masivo {unidad.codigo} - {fila.referencia}",
+                    debito=fila.monto_recibido,
+                    credito=0
                 ))
             
-            # 3. Crédito a Anticipos (El excedente)
-            if monto_anticipo > 0:
-                if not cuenta_anticipos_global:
-                    # Si no hay cuenta de anticipos, todo va a cartera
-                    if movimientos[-1].cuenta_id == cuenta_cxc_global:
-                        movimientos[-1].credito += monto_anticipo
+                # 2. Crédito a Cartera
+                if monto_cartera > 0:
+                    movimientos.append(doc_schemas.MovimientoContableCreate(
+                        cuenta_id=cuenta_cxc_global,
+                        concepto=f"Abono Cartera {unidad.codigo}",
+                        debito=0,
+                        credito=monto_cartera
+                    ))
+            
+                # 3. Crédito a Anticipos (El excedente)
+                if monto_anticipo > 0:
+                    if not cuenta_anticipos_global:
+                        # Si no hay cuenta de anticipos, todo va a cartera
+                        if movimientos[-1].cuenta_id == cuenta_cxc_global:
+                            movimientos[-1].credito += monto_anticipo
+                        else:
+                            movimientos.append(doc_schemas.MovimientoContableCreate(
+                                cuenta_id=cuenta_cxc_global,
+                                concepto=f"Excedente Cartera {unidad.codigo}",
+                                debito=0,
+                                credito=monto_anticipo
+                            ))
                     else:
                         movimientos.append(doc_schemas.MovimientoContableCreate(
-                            cuenta_id=cuenta_cxc_global,
-                            concepto=f"Excedente Cartera {unidad.codigo}",
+                            cuenta_id=cuenta_anticipos_global,
+                            concepto=f"Excedente Recaudo -> Anticipo {unidad.codigo}",
                             debito=0,
                             credito=monto_anticipo
                         ))
-                else:
-                    movimientos.append(doc_schemas.MovimientoContableCreate(
-                        cuenta_id=cuenta_anticipos_global,
-                        concepto=f"Excedente Recaudo -> Anticipo {unidad.codigo}",
-                        debito=0,
-                        credito=monto_anticipo
-                    ))
-            
-            # Crear el documento
-            doc_create = doc_schemas.DocumentoCreate(
-                empresa_id=empresa_id,
-                tipo_documento_id=config.tipo_documento_recibo_id,
-                numero=0,
-                fecha=fila.fecha_pago,
-                fecha_vencimiento=fila.fecha_pago,
-                beneficiario_id=unidad.propietario_principal_id,
-                observaciones=f"Recaudo Masivo Automatizado - Unidad {unidad.codigo}",
-                movimientos=movimientos,
-                unidad_ph_id=unidad.id
-            )
-            
-            # skip_recalculo=True es CLAVE aquí para que no se dispare el motor contable en cada inserción
-            new_doc = documento_service.create_documento(db, doc_create, user_id=usuario_id, skip_recalculo=True)
             
-            # Guardamos el tercero para procesarlo al final
-            if unidad.propietario_principal_id:
-                terceros_a_recalcular.add(unidad.propietario_principal_id)
+                # Crear el documento
+                doc_create = doc_schemas.DocumentoCreate(
+                    empresa_id=empresa_id,
+                    tipo_documento_id=config.tipo_documento_recibo_id,
+                    numero=0,
+                    fecha=fila.fecha_pago,
+                    fecha_vencimiento=fila.fecha_pago,
+                    beneficiario_id=unidad.propietario_principal_id,
+                    observaciones=f"Recaudo Masivo Automatizado - Unidad {unidad.codigo}",
+                    movimientos=movimientos,
+                    unidad_ph_id=unidad.id
+                )
             
-            exitosos += 1
-        except Exception as e:
-            fallidos += 1
-            errores.append(f"Fila {fila.line_number}: {str(e)}")
-            
-    # --- PROCESAMIENTO FINAL (FUERA DEL BUCLE) ---
-    # Ahora sí, recalculamos una sola vez por cada tercero involucrado
-    for t_id in terceros_a_recalcular:
-        try:
-            cartera_service.recalcular_aplicaciones_tercero(
-                db, 
-                t_id, 
-                empresa_id,
-                injected_cuentas_cxc=cuentas_cxc_batch,
-                injected_cuentas_cxp=cuentas_cxp_batch,
-                injected_conceptos_ph=conceptos_ph_batch
-            )
-        except:
-            pass # No bloqueamos el commit por un error de aplicación
+                documentos.append(doc_create)
+                filas_documentos.append((fila, unidad))
+            except Exception as e:
+                fallidos += 1
+                errores.append(f"Fila {fila.line_number}: {str(e)}")
+
+        if documentos:
+            try:
+                # skip_recalculo=True: el recálculo lo hace la cola al cerrar el lote
+                resultado = documento_masivo.create_documentos_bulk(
+                    db, documentos, user_id=usuario_id, empresa_id=empresa_id,
+                    commit=False, skip_recalculo=True, omitir_invalidos=True
+                )
+                for error in resultado["errores"]:
+                    fila, _ = filas_documentos[error["indice"]]
+                    fallidos += 1
+                    errores.append(f"Fila {fila.line_number}: {error['detalle']}")
+                for (fila, unidad), documento_id in zip(filas_documentos, resultado["ids"]):
+                    if documento_id is None:
+                        continue
+                    # Marcamos el tercero (con el recibo como pista) para procesarlo al final
+                    cola.marcar(unidad.propietario_principal_id, documento_id)
+                    exitosos += 1
+            except Exception as e:
+                db.rollback()
+                detalle = e.detail if hasattr(e, "detail") else str(e)
+                for fila, _ in filas_documentos:
+                    fallidos += 1
+                    errores.append(f"Fila {fila.line_number}: {detalle}")
 
     db.commit()
     mensaje = f"Lote procesado: {exitosos} exitosos, {fallidos} fallidos."
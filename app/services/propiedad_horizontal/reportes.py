@@ -164,10 +164,10 @@ def get_cartera_edades(db: Session, empresa_id: int, fecha_corte: date = None, f
     Soporta Fecha de Corte (Historico) y Prelación de Pagos.
     """
     from datetime import date
-    from app.services.propiedad_horizontal import pago_service
+    from app.services.propiedad_horizontal import estado_cuenta_service
     from app.models.propiedad_horizontal.unidad import PHUnidad
-    from app.models.documento import Documento, MovimientoContable
-    from sqlalchemy.orm import joinedload, selectinload
+    from sqlalchemy.orm import joinedload
+    from collections import defaultdict
     
     # 1. Obtener Unidades
     query_unidades = db.query(PHUnidad).options(joinedload(PHUnidad.propietario_principal))\
@@ -180,89 +180,14 @@ def get_cartera_edades(db: Session, empresa_id: int, fecha_corte: date = None, f
         
     unidades_db = query_unidades.all()
         
-    # --- OPTIMIZACIÓN: Pre-cargar Metadatos para Simulación Masiva ---
-    from app.services.propiedad_horizontal import configuracion_service
-    from app.services import cartera as cartera_service
-    config_ph = configuracion_service.get_configuracion(db, empresa_id)
-    conceptos_ph = db.query(PHConcepto).filter(
-        PHConcepto.empresa_id == empresa_id,
-        PHConcepto.activo == True
-    ).order_by(PHConcepto.orden.asc(), PHConcepto.id.asc()).all()
-    cuentas_cxc_ids = cartera_service.get_cuentas_especiales_ids(db, empresa_id, 'cxc')
-    # ---------------------------------------------------------------
-
     mapa_unidades = {u.id: u for u in unidades_db}
     
-    # 2. Obtener TODOS los documentos relevantes (para poder simular)
-    # Optimización: Un solo query grande ordenado por Unidad
-    docs = db.query(Documento).options(
-        selectinload(Documento.movimientos).joinedload(MovimientoContable.cuenta),
-        joinedload(Documento.tipo_documento),
-        joinedload(Documento.unidad_ph)
-    ).filter(
-        Documento.empresa_id == empresa_id,
-        Documento.unidad_ph_id != None,
-        Documento.estado.in_(['ACTIVO', 'PROCESADO'])
-    ).order_by(Documento.unidad_ph_id, Documento.fecha.asc(), Documento.id.asc()).all()
-    
-    # Agrupar docs por unidad
-    from collections import defaultdict
-    docs_por_unidad = defaultdict(list)
-    for d in docs:
-        docs_por_unidad[d.unidad_ph_id].append(d)
-        
-    pendientes = []
-    
-    # 3. Simular por Unidad
-    for unidad_id, unidad_docs in docs_por_unidad.items():
-        # Ejecutar simulación con corte (Inyectando metadatos pre-cargados)
-        pending_current, _, pending_snapshot, saf_current, saf_snapshot = pago_service._simular_cronologia_pagos(
-            db, unidad_docs, empresa_id, 
-            fecha_corte_snapshot=fecha_corte,
-            injected_config=config_ph,
-            injected_conceptos_ph=conceptos_ph,
-            injected_cuentas_cxc=cuentas_cxc_ids
-        )
-        
-        # Determinar qué set de datos usar
-        use_snapshot = fecha_corte is not None
-        
-        active_debts = pending_snapshot if use_snapshot and pending_snapshot is not None else pending_current
-        active_saf = saf_snapshot if use_snapshot and pending_snapshot is not None else saf_current
-        
-        # Si fecha_corte es futuro o hoy, snapshot podría ser None si no hay docs futuros, 
-        # en cuyo caso pending_current es lo correcto.
-        if use_snapshot and pending_snapshot is None:
-             # Fallback
-             active_debts = pending_current
-             active_saf = saf_current
+    # 2. Estado de cuenta materializado por unidad (solo se simulan los documentos nuevos)
+    filtrar_unidades = bool(filtro_metadato_llave and filtro_metadato_valor)
+    estados_unidades = estado_cuenta_service.estados(
+        db, empresa_id, unidad_ids=list(mapa_unidades) if filtrar_unidades else None, fecha_corte=fecha_corte
+    )
         
-        # Procesar Deudas
-        u_info = mapa_unidades.get(unidad_id)
-        u_codigo = u_info.codigo if u_info else "N/A"
-        
-        for d in active_debts:
-            pendientes.append({
-                'id': d.get('doc_id'),
-                'fecha': d['fecha'].isoformat() if isinstance(d['fecha'], date) else d['fecha'],
-                'saldo_pendiente': d['saldo'],
-                'unidad_codigo': u_codigo,
-                'tipo': d['tipo'],
-                'concepto': d.get('concepto', 'Concepto General')
-            })
-            
-        # Procesar Saldo a Favor (Como saldo negativo corriente)
-        if active_saf > 0.001:
-            pendientes.append({
-                'id': 0,
-                'fecha': fecha_corte.isoformat() if fecha_corte else date.today().isoformat(),
-                'saldo_pendiente': -active_saf,
-                'unidad_codigo': u_codigo,
-                'tipo': 'ANTICIPO'
-            })
-
-    
-    
     # Reutilizar unidades_db para mapa por codigo (Legacy loop support)
     mapa_codigo = {}
     for u in unidades_db:
@@ -272,33 +197,25 @@ def get_cartera_edades(db: Session, empresa_id: int, fecha_corte: date = None, f
             "propietario_nombre": nombre_prop
         }
         
-    # 3. Agrupacion
+    # 3. Clasificación por edades en una sola pasada sobre las deudas de cada unidad
+    # Edad en días -> rango: bisect sobre los límites (0-30, 31-60, 61-90, >90)
+    from bisect import bisect_left
+    limites = (30, 60, 90)
+    rangos = ("0_30", "31_60", "61_90", "mas_90")
+    totales_rango = [0, 0, 0, 0]
     grupos = {} # codigo_unidad -> Objeto CarteraItem
     
     hoy = fecha_corte if fecha_corte else date.today()
-    
+    ordinal_hoy = hoy.toordinal()
     total_corriente = 0
-    total_0_30 = 0
-    total_31_60 = 0
-    total_61_90 = 0
-    total_mas_90 = 0
-    total_general = 0
-
-    for item in pendientes:
-        # item es un dict: { 'id', 'fecha': ISOStr, 'saldo_pendiente', 'unidad_codigo', 'tipo' }
-        
-        saldo = item['saldo_pendiente']
-        unidad_codigo = item['unidad_codigo']
-        
-        # Parse timestamp safely
-        try:
-             fecha_doc = date.fromisoformat(item['fecha'])
-        except:
-             # Fallback if already date obj or other format
-             fecha_doc = item['fecha']
-             if isinstance(fecha_doc, str):
-                  fecha_doc = date.fromisoformat(fecha_doc[:10])
 
+    for unidad_id, estado in estados_unidades.items():
+        u_info = mapa_unidades.get(unidad_id)
+        unidad_codigo = u_info.codigo if u_info else "N/A"
+        active_debts = estado["deudas"]
+        active_saf = estado["saldo_a_favor"]
+        if not active_debts and active_saf <= 0.001:
+            continue
         
         # Inicializar grupo si no existe
         if unidad_codigo not in grupos:
@@ -308,47 +225,36 @@ def get_cartera_edades(db: Session, empresa_id: int, fecha_corte: date = None, f
                 "unidad_codigo": unidad_codigo,
                 "propietario_nombre": info_u['propietario_nombre'],
                 "saldo_corriente": 0,
-                "edad_0_30": 0,
-                "edad_31_60": 0,
-                "edad_61_90": 0,
-                "edad_mas_90": 0,
-                "saldo_total": 0,
-                # Desgloses
-                "_desc_0_30": defaultdict(float),
-                "_desc_31_60": defaultdict(float),
-                "_desc_61_90": defaultdict(float),
-                "_desc_mas_90": defaultdict(float)
+                "_rangos": [0, 0, 0, 0],
+                # Desgloses por rango
+                "_desc": [defaultdict(float) for _ in rangos]
             }
-            
         bucket = grupos[unidad_codigo]
-        
-        if saldo < 0:
-            # Saldo a favor -> Resta a corriente
-            bucket["saldo_corriente"] += saldo
-            total_corriente += saldo
-        else:
-            # Deuda -> Calcular edad
-            dias = (hoy - fecha_doc).days
+        acumulado = bucket["_rangos"]
+        desglose = bucket["_desc"]
             
-            if dias <= 30:
-                bucket["edad_0_30"] += saldo
-                bucket["_desc_0_30"][item['concepto']] += saldo
-                total_0_30 += saldo
-            elif dias <= 60:
-                bucket["edad_31_60"] += saldo
-                bucket["_desc_31_60"][item['concepto']] += saldo
-                total_31_60 += saldo
-            elif dias <= 90:
-                bucket["edad_61_90"] += saldo
-                bucket["_desc_61_90"][item['concepto']] += saldo
-                total_61_90 += saldo
-            else:
-                bucket["edad_mas_90"] += saldo
-                bucket["_desc_mas_90"][item['concepto']] += saldo
-                total_mas_90 += saldo
-                
-        bucket["saldo_total"] += saldo
-        total_general += saldo
+        # Deudas -> rango por antigüedad
+        for d in active_debts:
+            saldo = d['saldo']
+            k = bisect_left(limites, ordinal_hoy - d['fecha'].toordinal())
+            acumulado[k] += saldo
+            desglose[k][d.get('concepto', 'Concepto General')] += saldo
+            totales_rango[k] += saldo
+            
+        # Saldo a Favor -> Resta a corriente
+        if active_saf > 0.001:
+            bucket["saldo_corriente"] -= active_saf
+            total_corriente -= active_saf
+
+    for g in grupos.values():
+        acumulado = g.pop("_rangos")
+        desglose = g.pop("_desc")
+        for k, key in enumerate(rangos):
+            g[f"edad_{key}"] = acumulado[k]
+            g[f"_desc_{key}"] = desglose[k]
+        g["saldo_total"] = g["saldo_corriente"] + sum(acumulado)
+    total_0_30, total_31_60, total_61_90, total_mas_90 = totales_rango
+    total_general = total_corriente + sum(totales_rango)
 
     # 4. Formatear Respuesta y Convertir desgloses a strings
     items_lista = []
@@ -395,7 +301,7 @@ def get_reporte_saldos(
     Reporte de Saldos (Balance General) detallado.
     Calcula la deuda actual o histórica de cada unidad y permite filtrar.
     """
-    from app.services.propiedad_horizontal import pago_service
+    from app.services.propiedad_horizontal import estado_cuenta_service
     from datetime import date
     
     # 1. Obtener Unidades (Filtrado Previo)
@@ -424,66 +330,23 @@ def get_reporte_saldos(
         
     unidades_db = query_unidades.all()
     
-    # --- OPTIMIZACIÓN: Pre-cargar Metadatos para Simulación Masiva ---
-    from app.services.propiedad_horizontal import configuracion_service
-    from app.services import cartera as cartera_service
-    config_ph = configuracion_service.get_configuracion(db, empresa_id)
-    conceptos_ph = db.query(PHConcepto).filter(
-        PHConcepto.empresa_id == empresa_id,
-        PHConcepto.activo == True
-    ).order_by(PHConcepto.orden.asc(), PHConcepto.id.asc()).all()
-    cuentas_cxc_ids = cartera_service.get_cuentas_especiales_ids(db, empresa_id, 'cxc')
-    # ---------------------------------------------------------------
-    
-    # 2. Obtener Documentos (Optimización: Traer todo y filtrar en memoria o traer por lotes?)
-    # Para consistencia con 'edades', traemos todo lo de la empresa.
-    # Si la empresa es muy grande, esto podría optimizarse filtrando docs por unidad_ids seleccionados.
     unidades_ids = [u.id for u in unidades_db]
     if not unidades_ids:
         return {"items": [], "total_general": 0}
 
-    docs = db.query(Documento).options(
-        selectinload(Documento.movimientos).joinedload(MovimientoContable.cuenta),
-        joinedload(Documento.tipo_documento),
-        joinedload(Documento.unidad_ph)
-    ).filter(
-        Documento.empresa_id == empresa_id,
-        Documento.unidad_ph_id.in_(unidades_ids),
-        Documento.estado.in_(['ACTIVO', 'PROCESADO'])
-    ).order_by(Documento.unidad_ph_id, Documento.fecha.asc(), Documento.id.asc()).all()
-
-    # Agrupar docs por unidad
-    from collections import defaultdict
-    docs_por_unidad = defaultdict(list)
-    for d in docs:
-        docs_por_unidad[d.unidad_ph_id].append(d)
+    # 2. Estado de cuenta materializado de las unidades seleccionadas
+    estados_unidades = estado_cuenta_service.estados(db, empresa_id, unidad_ids=unidades_ids, fecha_corte=fecha_corte)
 
     reporte_items = []
     total_general = 0
 
-    # 3. Simulación y Filtrado
+    # 3. Filtrado
     hoy = fecha_corte if fecha_corte else date.today()
 
     for u in unidades_db:
-        udocs = docs_por_unidad.get(u.id, [])
-        
-        # Simular (Inyectando metadatos pre-cargados)
-        pending_current, _, pending_snapshot, saf_current, saf_snapshot = pago_service._simular_cronologia_pagos(
-            db, udocs, empresa_id, 
-            fecha_corte_snapshot=fecha_corte,
-            injected_config=config_ph,
-            injected_conceptos_ph=conceptos_ph,
-            injected_cuentas_cxc=cuentas_cxc_ids
-        )
-        
-        use_snapshot = fecha_corte is not None
-        active_debts = pending_snapshot if use_snapshot and pending_snapshot is not None else pending_current
-        active_saf = saf_snapshot if use_snapshot and pending_snapshot is not None else saf_current
-        
-        # Fallback snapshot
-        if use_snapshot and pending_snapshot is None:
-            active_debts = pending_current
-            active_saf = saf_current
+        estado = estados_unidades.get(u.id)
+        active_debts = estado["deudas"] if estado else []
+        active_saf = estado["saldo_a_favor"] if estado else 0
             
         # Filtrado por Concepto (Texto)
         deudas_filtradas = []
@@ -604,3 +467,47 @@ def get_reporte_saldos(
         "fecha_corte": hoy.isoformat(),
         "is_grouped": False
     }
+
+
+# ==============================================================================
+# === REGISTRY INTEGRATION: CARTERA POR EDADES (TRABAJOS EN SEGUNDO PLANO) ===
+# ==============================================================================
+from app.core.reporting_registry import BaseReport, ReportRegistry
+from app.services import exportacion_streaming
+from app.schemas.propiedad_horizontal.recaudos import FiltrosCarteraEdades
+
+_COLUMNAS_CARTERA_EDADES = [
+    ("unidad_codigo", "UNIDAD"), ("propietario_nombre", "PROPIETARIO"), ("edad_0_30", "0-30"),
+    ("edad_31_60", "31-60"), ("edad_61_90", "61-90"), ("edad_mas_90", "MAS DE 90"), ("saldo_total", "SALDO TOTAL"),
+    ("detalle_0_30", "DETALLE 0-30"), ("detalle_31_60", "DETALLE 31-60"), ("detalle_61_90", "DETALLE 61-90"),
+    ("detalle_mas_90", "DETALLE MAS DE 90"),
+]
+
+
+@ReportRegistry.register
+class CarteraEdadesPHReportService(BaseReport):
+    key = "ph_cartera_edades"
+    description = "Propiedad Horizontal: cartera por edades de todas las unidades"
+    filter_schema = FiltrosCarteraEdades
+    formats = ("csv", "xlsx")
+
+    def _filtros(self, filtros) -> FiltrosCarteraEdades:
+        return filtros if isinstance(filtros, FiltrosCarteraEdades) else self.filter_schema(**filtros)
+
+    def get_data(self, db: Session, empresa_id: int, filtros):
+        return get_cartera_edades(db, empresa_id, **self._filtros(filtros).model_dump())
+
+    def _tabla(self, db: Session, empresa_id: int, filtros):
+        data = self.get_data(db, empresa_id, filtros)
+        filas = [[item.get(campo) for campo, _ in _COLUMNAS_CARTERA_EDADES] for item in data["items"]]
+        filas.append(["TOTAL", "", data["total_0_30"], data["total_31_60"], data["total_61_90"],
+                      data["total_mas_90"], data["total_general"], "", "", "", ""])
+        return [titulo for _, titulo in _COLUMNAS_CARTERA_EDADES], filas
+
+    def generate_csv(self, db: Session, empresa_id: int, filtros):
+        encabezados, filas = self._tabla(db, empresa_id, filtros)
+        return exportacion_streaming.csv_en_streaming(encabezados, filas), f"Cartera_Edades_{date.today().strftime('%Y%m%d')}.csv"
+
+    def generate_xlsx(self, db: Session, empresa_id: int, filtros):
+        encabezados, filas = self._tabla(db, empresa_id, filtros)
+        return exportacion_streaming.xlsx_en_streaming(encabezados, filas, titulo="Cartera por Edades"), f"Cartera_Edades_{date.today().strftime('%Y%m%d')}.xlsx"
@@ -3,6 +3,8 @@ from sqlalchemy import text
 from fastapi import HTTPException
 
 from ..schemas import recodificacion as schemas
+from . import saldos_mensuales as saldos_mensuales_service
+from . import saldos_cierre as saldos_cierre_service
 
 def recodificar_datos(
     db: Session, 
@@ -63,6 +65,17 @@ def recodificar_datos(
 
     try:
         result = db.execute(update_query, params)
+
+        # Cambiar cuenta o centro de costo de movimientos mueve valores entre
+        # filas de los saldos mensuales: se reconstruyen para la empresa.
+        if tabla_afectada == 'movimientos_contables' and campo_afectado in ('cuenta_id', 'centro_costo_id') \
+                and result.rowcount and saldos_mensuales_service.usa_saldos_mensuales(db, empresa_id):
+            saldos_mensuales_service.reconstruir_saldos_mensuales(db, empresa_id, commit=False)
+
+        # Las fotos de períodos cerrados guardan cuenta, tercero y centro de costo
+        if result.rowcount and (tabla_afectada == 'movimientos_contables' or campo_afectado == 'beneficiario_id'):
+            saldos_cierre_service.regenerar_saldos_cierre(db, empresa_id)
+
         db.commit()
         
         tabla_nombre = 'movimientos' if tabla_afectada == 'movimientos_contables' else 'documentos'
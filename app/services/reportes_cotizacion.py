@@ -1,10 +1,11 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
-from weasyprint import HTML
+from app.services import motor_pdf
 from jinja2 import Environment, select_autoescape
 from app.models.cotizacion import Cotizacion
 from app.models.empresa import Empresa
 from datetime import datetime
+from app.services import plantillas_html
 
 # --- TEMPLATE HTML INLINE ---
 COTIZACION_TEMPLATE = """
@@ -105,6 +106,9 @@ COTIZACION_TEMPLATE = """
 </html>
 """
 
+COTIZACION_JINJA_ENV = Environment(autoescape=select_autoescape(['html', 'xml']))
+COTIZACION_JINJA_ENV.globals['now'] = datetime.now
+
 def generar_pdf_cotizacion(db: Session, cotizacion_id: int, empresa_id: int):
     # 1. Obtener Datos
     cotizacion = db.query(Cotizacion).filter(Cotizacion.id == cotizacion_id, Cotizacion.empresa_id == empresa_id).first()
@@ -116,11 +120,9 @@ def generar_pdf_cotizacion(db: Session, cotizacion_id: int, empresa_id: int):
         raise HTTPException(status_code=404, detail="Empresa no encontrada.")
 
     # 2. Renderizar Template
-    env = Environment(autoescape=select_autoescape(['html', 'xml']))
-    env.globals['now'] = datetime.now
-    template = env.from_string(COTIZACION_TEMPLATE)
+    template = plantillas_html.compilar(COTIZACION_JINJA_ENV, COTIZACION_TEMPLATE)
     
     html_content = template.render(cotizacion=cotizacion, empresa=empresa)
     
     # 3. Generar PDF
-    return HTML(string=html_content).write_pdf()
+    return motor_pdf.html_a_pdf(html_content, prioridad=motor_pdf.PRIORIDAD_INTERACTIVA)
@@ -3,7 +3,7 @@
 
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, case, and_, select, literal_column, or_, cast, String as SAString, desc
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 from fastapi import HTTPException, status
 import json
 from decimal import Decimal, ROUND_HALF_UP
@@ -13,13 +13,14 @@ import traceback
 
 
 # WeasyPrint y Jinja
-from weasyprint import HTML
-from ..services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
-from jinja2 import Environment, select_autoescape
+from ..services import motor_pdf
+from ..services import exportacion_streaming
+from ..services.plantillas_html import TEMPLATES_EMPAQUETADOS
+from ..services import plantillas_html
 from datetime import datetime
 
 # 1. Inicializamos el entorno
-GLOBAL_JINJA_ENV = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
+GLOBAL_JINJA_ENV = plantillas_html.crear_entorno()
 
 # --- DEFINICIÓN DE HERRAMIENTAS (FILTROS) ---
 
@@ -202,7 +203,7 @@ def generar_pdf_rentabilidad_producto(db: Session, empresa_id: int, filtros: sch
     
     if not report_data or not report_data.items:
         html_string = "<html><body><h1>Rentabilidad por Producto</h1><p>No se encontraron datos para los filtros seleccionados.</p></body></html>"
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
 
     # 2. Obtener la empresa para el encabezado del PDF
     empresa = db.query(models_empresa).filter(models_empresa.id == empresa_id).first()
@@ -239,10 +240,9 @@ def generar_pdf_rentabilidad_producto(db: Session, empresa_id: int, filtros: sch
              template_name = template_name_fallback
         # --- Fin Lógica de Fallback ---
 
-        template_string = TEMPLATES_EMPAQUETADOS[template_name]
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, template_name)
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
 
     except Exception as e:
         print(f"ERROR FATAL generando PDF rentabilidad producto: {e}"); traceback.print_exc()
@@ -378,7 +378,7 @@ def generar_pdf_reporte_facturacion(db: Session, empresa_id: int, filtros: schem
     
     if not report_data or not report_data.items:
         html_string = "<html><body><h1>Reporte Detallado</h1><p>No se encontraron datos para los filtros seleccionados.</p></body></html>"
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
 
     empresa = db.query(models_empresa).filter(models_empresa.id == empresa_id).first()
     if not empresa: raise HTTPException(status_code=404, detail="Empresa no encontrada.")
@@ -409,10 +409,9 @@ def generar_pdf_reporte_facturacion(db: Session, empresa_id: int, filtros: schem
              template_name = template_name_fallback
         # --- Fin Lógica de Fallback ---
 
-        template_string = TEMPLATES_EMPAQUETADOS[template_name]
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, template_name)
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except KeyError: raise HTTPException(status_code=500, detail=f"Plantilla '{template_name}' no encontrada en _templates_empaquetados.")
     except Exception as e:
         print(f"Error generando PDF reporte facturación: {e}"); traceback.print_exc()
@@ -688,66 +687,59 @@ def get_rentabilidad_por_producto(db: Session, empresa_id: int, filtros: schemas
 # === NUEVA FUNCIÓN: GENERADOR DE CSV PARA EL REPORTE DE RENTABILIDAD ===
 # =================================================================================
 
-def generar_csv_rentabilidad_producto(db: Session, empresa_id: int, filtros: schemas_rentabilidad.RentabilidadProductoFiltros) -> bytes:
+def generar_csv_rentabilidad_producto(db: Session, empresa_id: int, filtros: schemas_rentabilidad.RentabilidadProductoFiltros) -> Iterator[bytes]:
     """
     Genera un archivo CSV con los datos de rentabilidad por producto.
     Reutiliza get_rentabilidad_por_grupo y serializa a CSV.
-    Devuelve bytes con BOM UTF-8 para compatibilidad con Excel en español (Colombia).
+    Devuelve los bloques del CSV (BOM UTF-8 para compatibilidad con Excel en español, Colombia).
     """
-    import csv
-    import io as _io
-
     # 1. Obtener los datos usando el motor de BI existente
     report_data = get_rentabilidad_por_grupo(db=db, empresa_id=empresa_id, filtros=filtros)
 
-    # 2. Construir el CSV en memoria
-    output = _io.StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-
-    # 3. Encabezados del reporte
-    writer.writerow([f"Reporte de Rentabilidad por Producto"])
-    writer.writerow([f"Período: {filtros.fecha_inicio} al {filtros.fecha_fin}"])
-    writer.writerow([])  # Línea en blanco
-
-    # 4. Encabezados de columnas
-    writer.writerow([
-        "Código",
-        "Producto",
-        "Cantidad Vendida",
-        "Venta Total",
-        "Costo Total",
-        "Utilidad Bruta",
-        "Margen %",
-    ])
-
-    # 5. Filas de datos
-    for item in report_data.items:
-        writer.writerow([
-            item.producto_codigo,
-            item.producto_nombre,
-            f"{item.total_cantidad:.2f}".replace('.', ','),
-            f"{item.total_venta:.2f}".replace('.', ','),
-            f"{item.total_costo:.2f}".replace('.', ','),
-            f"{item.total_utilidad:.2f}".replace('.', ','),
-            f"{item.margen_rentabilidad_porcentaje:.2f}".replace('.', ','),
-        ])
-
-    # 6. Línea de totales
-    totales = report_data.totales
-    writer.writerow([])
-    writer.writerow([
-        "TOTALES",
-        "",
-        "",
-        f"{totales.total_venta_general:.2f}".replace('.', ','),
-        f"{totales.total_costo_general:.2f}".replace('.', ','),
-        f"{totales.total_utilidad_general:.2f}".replace('.', ','),
-        f"{totales.margen_general_porcentaje:.2f}".replace('.', ','),
-    ])
-
-    # 7. Retornar bytes con BOM UTF-8 (para Excel en español)
-    csv_string = output.getvalue()
-    return ('\ufeff' + csv_string).encode('utf-8')
+    # 2. Filas del CSV, escritas por bloques
+    def filas():
+        # 3. Encabezados del reporte
+        yield [f"Reporte de Rentabilidad por Producto"]
+        yield [f"Período: {filtros.fecha_inicio} al {filtros.fecha_fin}"]
+        yield []  # Línea en blanco
+
+        # 4. Encabezados de columnas
+        yield [
+            "Código",
+            "Producto",
+            "Cantidad Vendida",
+            "Venta Total",
+            "Costo Total",
+            "Utilidad Bruta",
+            "Margen %",
+        ]
+
+        # 5. Filas de datos
+        for item in report_data.items:
+            yield [
+                item.producto_codigo,
+                item.producto_nombre,
+                f"{item.total_cantidad:.2f}".replace('.', ','),
+                f"{item.total_venta:.2f}".replace('.', ','),
+                f"{item.total_costo:.2f}".replace('.', ','),
+                f"{item.total_utilidad:.2f}".replace('.', ','),
+                f"{item.margen_rentabilidad_porcentaje:.2f}".replace('.', ','),
+            ]
+
+        # 6. Línea de totales
+        totales = report_data.totales
+        yield []
+        yield [
+            "TOTALES",
+            "",
+            "",
+            f"{totales.total_venta_general:.2f}".replace('.', ','),
+            f"{totales.total_costo_general:.2f}".replace('.', ','),
+            f"{totales.total_utilidad_general:.2f}".replace('.', ','),
+            f"{totales.margen_general_porcentaje:.2f}".replace('.', ','),
+        ]
+
+    return exportacion_streaming.csv_en_streaming(None, filas())
 
 
 def generar_pdf_rentabilidad_documento(db: Session, empresa_id: int, filtros: schemas_reportes.ReporteRentabilidadDocumentoFiltros):
@@ -757,7 +749,7 @@ def generar_pdf_rentabilidad_documento(db: Session, empresa_id: int, filtros: sc
 
     if not report_data or not report_data.detalle:
         html_string = "<html><body><h1>Rentabilidad por Documento</h1><p>No se encontraron datos para el documento seleccionado.</p></body></html>"
-        return HTML(string=html_string).write_pdf()
+        return motor_pdf.html_a_pdf(html_string)
 
     # Obtener la empresa para el encabezado del PDF
     empresa = db.query(models_empresa).filter(models_empresa.id == empresa_id).first()
@@ -786,10 +778,9 @@ def generar_pdf_rentabilidad_documento(db: Session, empresa_id: int, filtros: sc
              template_name = template_name_fallback
         # --- Fin Lógica de Fallback ---
 
-        template_string = TEMPLATES_EMPAQUETADOS[template_name]
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, template_name)
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
 
     except Exception as e:
         print(f"ERROR FATAL generando PDF rentabilidad por documento: {e}"); traceback.print_exc()
@@ -1411,78 +1402,73 @@ def generar_pdf_ventas_cliente(db: Session, empresa_id: int, filtros: schemas_ve
     
     # 4. Renderizar
     try:
-        template_string = TEMPLATES_EMPAQUETADOS['reports/ventas_cliente_report.html']
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/ventas_cliente_report.html')
         html_content = template.render(context)
-        return HTML(string=html_content).write_pdf()
+        return motor_pdf.html_a_pdf(html_content)
     except KeyError:
         raise HTTPException(status_code=500, detail="Plantilla de reporte no encontrada.")
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error generando PDF: {str(e)}")
 
-def generar_csv_ventas_cliente(db: Session, empresa_id: int, filtros: schemas_ventas_cliente.ReporteVentasClienteFiltros) -> bytes:
+def generar_csv_ventas_cliente(db: Session, empresa_id: int, filtros: schemas_ventas_cliente.ReporteVentasClienteFiltros) -> Iterator[bytes]:
     """
     Genera un archivo CSV con los datos del reporte de ventas por cliente.
+    Devuelve los bloques del CSV (para StreamingResponse).
     """
-    import csv
-    import io as _io
-
     # 1. Obtener Datos
     report_data = get_analisis_ventas_por_cliente(db, empresa_id, filtros)
 
-    # 2. Construir CSV
-    output = _io.StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-
-    # 3. Encabezados
-    writer.writerow(["Reporte de Rentabilidad por Cliente"])
-    writer.writerow([f"Período: {filtros.fecha_inicio} al {filtros.fecha_fin}"])
-    writer.writerow([])
-
-    writer.writerow([
-        "Identificación",
-        "Cliente",
-        "Facturas",
-        "ABC",
-        "Venta Total",
-        "% Vta Part.",
-        "% Util Part.",
-        "% Util Acum (Pareto)",
-        "Costo Total",
-        "Utilidad Bruta",
-        "Margen %"
-    ])
-
-    # 4. Datos
-    for item in report_data.items:
-        writer.writerow([
-            item.tercero_identificacion,
-            item.tercero_nombre,
-            item.conteo_documentos,
-            item.categoria_abc,
-            f"{float(item.total_venta):.2f}".replace('.', ','),
-            f"{float(item.participacion_porcentaje):.2f}%", # Este campo lo agregamos al schema
-            f"{float(item.participacion_porcentaje):.2f}%", 
-            f"{float(item.participacion_acumulada):.2f}%",
-            f"{float(item.total_costo):.2f}".replace('.', ','),
-            f"{float(item.total_utilidad):.2f}".replace('.', ','),
-            f"{float(item.margen_porcentaje):.2f}".replace('.', ',')
-        ])
-
-    # 5. Totales
-    writer.writerow([])
-    writer.writerow([
-        "TOTALES",
-        "",
-        "",
-        f"{report_data.gran_total_venta:.2f}".replace('.', ','),
-        f"{report_data.gran_total_costo:.2f}".replace('.', ','),
-        f"{report_data.gran_total_utilidad:.2f}".replace('.', ','),
-        f"{report_data.margen_global_porcentaje:.2f}".replace('.', ',')
-    ])
-
-    return ('\ufeff' + output.getvalue()).encode('utf-8')
+    # 2. Filas del CSV, escritas por bloques
+    def filas():
+        # 3. Encabezados
+        yield ["Reporte de Rentabilidad por Cliente"]
+        yield [f"Período: {filtros.fecha_inicio} al {filtros.fecha_fin}"]
+        yield []
+
+        yield [
+            "Identificación",
+            "Cliente",
+            "Facturas",
+            "ABC",
+            "Venta Total",
+            "% Vta Part.",
+            "% Util Part.",
+            "% Util Acum (Pareto)",
+            "Costo Total",
+            "Utilidad Bruta",
+            "Margen %"
+        ]
+
+        # 4. Datos
+        for item in report_data.items:
+            yield [
+                item.tercero_identificacion,
+                item.tercero_nombre,
+                item.conteo_documentos,
+                item.categoria_abc,
+                f"{float(item.total_venta):.2f}".replace('.', ','),
+                f"{float(item.participacion_porcentaje):.2f}%", # Este campo lo agregamos al schema
+                f"{float(item.participacion_porcentaje):.2f}%", 
+                f"{float(item.participacion_acumulada):.2f}%",
+                f"{float(item.total_costo):.2f}".replace('.', ','),
+                f"{float(item.total_utilidad):.2f}".replace('.', ','),
+                f"{float(item.margen_porcentaje):.2f}".replace('.', ',')
+            ]
+
+        # 5. Totales
+        yield []
+        yield [
+            "TOTALES",
+            "",
+            "",
+            f"{report_data.gran_total_venta:.2f}".replace('.', ','),
+            f"{report_data.gran_total_costo:.2f}".replace('.', ','),
+            f"{report_data.gran_total_utilidad:.2f}".replace('.', ','),
+            f"{report_data.margen_global_porcentaje:.2f}".replace('.', ',')
+        ]
+
+    return exportacion_streaming.csv_en_streaming(None, filas())
 
 
 def get_analisis_desempeno_vendedores(db: Session, empresa_id: int, fecha_inicio: date, fecha_fin: date):
@@ -1693,68 +1679,63 @@ def generar_pdf_desempeno_vendedores(db: Session, empresa_id: int, fecha_inicio:
     """
     
     try:
-        template = GLOBAL_JINJA_ENV.from_string(template_html)
+        template = plantillas_html.compilar(GLOBAL_JINJA_ENV, template_html)
         rendered_html = template.render(context)
-        return HTML(string=rendered_html).write_pdf()
+        return motor_pdf.html_a_pdf(rendered_html)
     except Exception as e:
         print(f"Error generando PDF desempeño vendedores: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
-def generar_csv_desempeno_vendedores(db: Session, empresa_id: int, fecha_inicio: date, fecha_fin: date) -> bytes:
-    """Genera el reporte de desempeño de vendedores en formato CSV."""
-    import csv
-    
+def generar_csv_desempeno_vendedores(db: Session, empresa_id: int, fecha_inicio: date, fecha_fin: date) -> Iterator[bytes]:
+    """Genera el reporte de desempeño de vendedores en formato CSV (por bloques)."""
     report_data = get_analisis_desempeno_vendedores(db, empresa_id, fecha_inicio, fecha_fin)
+
+    def filas():
+        # Encabezados
+        yield ["Ranking Desempeño Vendedores"]
+        yield [f"Periodo: {fecha_inicio} a {fecha_fin}"]
+        yield []
     
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    # Encabezados
-    writer.writerow(["Ranking Desempeño Vendedores"])
-    writer.writerow([f"Periodo: {fecha_inicio} a {fecha_fin}"])
-    writer.writerow([])
-    
-    writer.writerow([
-        "Puesto",
-        "Vendedor",
-        "Cant. Facturas",
-        "Venta Bruta",
-        "Descuentos",
-        "Venta Neta",
-        "Costo Mercancia",
-        "Utilidad Real",
-        "Margen %"
-    ])
+        yield [
+            "Puesto",
+            "Vendedor",
+            "Cant. Facturas",
+            "Venta Bruta",
+            "Descuentos",
+            "Venta Neta",
+            "Costo Mercancia",
+            "Utilidad Real",
+            "Margen %"
+        ]
     
-    for idx, v in enumerate(report_data.ranking):
-        writer.writerow([
-            idx + 1,
-            v.vendedor_nombre,
-            v.cantidad_facturas,
-            f"{v.total_ventas_brutas:.2f}".replace('.', ','),
-            f"{v.total_descuentos:.2f}".replace('.', ','),
-            f"{v.total_neto:.2f}".replace('.', ','),
-            f"{v.costo_total:.2f}".replace('.', ','),
-            f"{v.utilidad_bruta:.2f}".replace('.', ','),
-            f"{v.margen_porcentaje:.2f}".replace('.', ',')
-        ])
+        for idx, v in enumerate(report_data.ranking):
+            yield [
+                idx + 1,
+                v.vendedor_nombre,
+                v.cantidad_facturas,
+                f"{v.total_ventas_brutas:.2f}".replace('.', ','),
+                f"{v.total_descuentos:.2f}".replace('.', ','),
+                f"{v.total_neto:.2f}".replace('.', ','),
+                f"{v.costo_total:.2f}".replace('.', ','),
+                f"{v.utilidad_bruta:.2f}".replace('.', ','),
+                f"{v.margen_porcentaje:.2f}".replace('.', ',')
+            ]
         
-    # Totales
-    t = report_data.totales_globales
-    writer.writerow([])
-    writer.writerow([
-        "TOTALES",
-        "",
-        t["cantidad_facturas"],
-        f"{t['ventas_brutas']:.2f}".replace('.', ','),
-        f"{t['descuentos']:.2f}".replace('.', ','),
-        f"{t['neto']:.2f}".replace('.', ','),
-        f"{t['costo']:.2f}".replace('.', ','),
-        f"{t['utilidad']:.2f}".replace('.', ','),
-        f"{( (t['utilidad']/t['neto']*100) if t['neto']>0 else 0 ):.2f}".replace('.', ',')
-    ])
-    
-    csv_string = output.getvalue()
-    return ('\ufeff' + csv_string).encode('utf-8')
+        # Totales
+        t = report_data.totales_globales
+        yield []
+        yield [
+            "TOTALES",
+            "",
+            t["cantidad_facturas"],
+            f"{t['ventas_brutas']:.2f}".replace('.', ','),
+            f"{t['descuentos']:.2f}".replace('.', ','),
+            f"{t['neto']:.2f}".replace('.', ','),
+            f"{t['costo']:.2f}".replace('.', ','),
+            f"{t['utilidad']:.2f}".replace('.', ','),
+            f"{( (t['utilidad']/t['neto']*100) if t['neto']>0 else 0 ):.2f}".replace('.', ',')
+        ]
+
+    return exportacion_streaming.csv_en_streaming(None, filas())
 
@@ -10,9 +10,10 @@ import traceback
 from sqlalchemy.dialects import postgresql 
 from jinja2 import Environment, FileSystemLoader
 from io import BytesIO
-from weasyprint import HTML
+from ..services import motor_pdf
 
-from ..services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
+from ..services.plantillas_html import TEMPLATES_EMPAQUETADOS
+from ..services import plantillas_html
 
 
 import os
@@ -118,7 +119,7 @@ env.filters['format_value'] = format_value_filter  # <--- ESTE ES EL QUE FALTABA
 def generar_pdf_desde_html(html_content: str) -> bytes:
     """Genera bytes de PDF a partir de contenido HTML usando WeasyPrint."""
     try:
-        pdf_bytes = HTML(string=html_content).write_pdf(stylesheets=[])
+        pdf_bytes = motor_pdf.html_a_pdf(html_content)
         return pdf_bytes
     except Exception as e:
         print(f"Error WeasyPrint: {e}")
@@ -1725,25 +1726,26 @@ def generar_pdf_movimiento_analitico(
         template_name = 'movimiento_analitico_report.html'
         
         try:
-            # FIX: Leemos el archivo MANUALMENTE para evitar el caché de Jinja2 (ya que auto_reload suele estar off)
+            # FIX: Leemos el archivo MANUALMENTE para evitar el caché de Jinja2 (ya que auto_reload suele estar off);
+            # plantillas_html compila de nuevo solo si el contenido cambió
             full_path = os.path.join(TEMPLATES_DIR, template_name)
             with open(full_path, 'r', encoding='utf-8') as f:
                 template_content = f.read()
-            template = env.from_string(template_content)
+            template = plantillas_html.compilar(env, template_content)
         except Exception as e_load:
             # Fallback a empaquetados si no existe el archivo
             print(f"⚠️ Plantilla {template_name} no encontrada en disco. Buscando en empaquetados.")
             key_empaquetado = f"reports/{template_name}"
             
             if key_empaquetado in TEMPLATES_EMPAQUETADOS:
-                template = env.from_string(TEMPLATES_EMPAQUETADOS[key_empaquetado])
+                template = plantillas_html.plantilla(env, key_empaquetado)
             else:
                 # Fallback final a super informe genérico
                 print(f"⚠️ Plantilla {key_empaquetado} no en empaquetados. Usando fallback general.")
                 template_name_fallback = 'reports/super_informe_inventarios_report.html'
                 if template_name_fallback in TEMPLATES_EMPAQUETADOS:
                      context['data']['vista_reporte'] = 'ESTADO_GENERAL'
-                     template = env.from_string(TEMPLATES_EMPAQUETADOS[template_name_fallback])
+                     template = plantillas_html.plantilla(env, template_name_fallback)
                 else:
                      raise HTTPException(status_code=500, detail="No se encontró ninguna plantilla válida.")
         
@@ -1787,3 +1789,25 @@ class InventoryReportService(BaseReport):
              filtros_obj = filtros
              
         return generar_pdf_super_informe(db, empresa_id, filtros_obj)
+
+
+@ReportRegistry.register
+class KardexReportService(BaseReport):
+    key = "kardex"
+    description = "Kardex (movimientos y costo promedio) de un producto"
+    filter_schema = schemas_reportes.KardexFiltrosPDF
+
+    def generate_pdf(self, db: Session, empresa_id: int, filtros: Dict[str, Any]) -> Tuple[bytes, str]:
+        if isinstance(filtros, dict):
+             filtros_obj = schemas_reportes.KardexFiltrosPDF(**filtros)
+        else:
+             filtros_obj = filtros
+
+        producto = db.query(models_producto.Producto.id).filter(
+            models_producto.Producto.id == filtros_obj.producto_id,
+            models_producto.Producto.empresa_id == empresa_id
+        ).first()
+        if not producto:
+            raise HTTPException(status_code=404, detail="Producto no encontrado.")
+
+        return generar_kardex_pdf(db, filtros_obj.producto_id, filtros_obj.fecha_inicio, filtros_obj.fecha_fin, filtros_obj.bodega_id)
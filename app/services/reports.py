@@ -6,6 +6,7 @@ import os
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 import math
+import numpy as np
 
 # --- INICIO: CORRECCIÓN ---
 # Se añade la importación faltante de HTTPException
@@ -13,12 +14,12 @@ from fastapi import HTTPException
 # --- FIN: CORRECCIÓN ---
 
 from fastapi.responses import Response
-from weasyprint import HTML
+from app.services import motor_pdf
 
-from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
-from jinja2 import Environment, select_autoescape
+from app.services.plantillas_html import TEMPLATES_EMPAQUETADOS
+from app.services import plantillas_html
 
-GLOBAL_JINJA_ENV = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
+GLOBAL_JINJA_ENV = plantillas_html.crear_entorno()
 
 from ..models import PlanCuenta, MovimientoContable, Documento, Empresa as models_empresa, Tercero
 from ..schemas import reporte_balance_prueba as schemas_bce
@@ -27,6 +28,9 @@ from ..models import CentroCosto
 from ..schemas import reporte_balance_prueba_cc as schemas_bce_cc
 from sqlalchemy import text, and_, literal
 
+from app.services import saldos_mensuales as saldos_mensuales_service
+from app.services import arbol_puc
+
 
 SECRET_KEY_REPORTS = os.environ.get("SECRET_KEY_REPORTS", "un-secret-muy-largo-y-seguro-para-reportes-pdf-que-cambia-en-prod-1234567890abcdef")
 url_signer = URLSafeTimedSerializer(SECRET_KEY_REPORTS)
@@ -73,97 +77,44 @@ def decode_signed_report_token(signed_token: str, max_age_seconds: int = 300) ->
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Token inválido: {str(e)}")
 
-# --- LÓGICA PARA EL BALANCE DE PRUEBA POR CUENTAS (Sin cambios) ---
-def generate_balance_de_prueba_report(db: Session, empresa_id: int, filtros: schemas_bce.FiltrosBalancePrueba) -> Dict[str, Any]:
-    # Filtrar cuentas base si hay prefijo
-    q_cuentas = db.query(PlanCuenta).filter(PlanCuenta.empresa_id == empresa_id)
-    if getattr(filtros, 'cuenta_prefijo', None):
-        q_cuentas = q_cuentas.filter(PlanCuenta.codigo.startswith(filtros.cuenta_prefijo))
-    cuentas = q_cuentas.order_by(PlanCuenta.codigo).all()
-
-    cuentas_map = {c.id: {
-        "data": schemas_bce.CuentaBalancePrueba(
-            codigo=c.codigo, nombre=c.nombre, nivel=c.nivel,
-            saldo_inicial=0.0, debito=0.0, credito=0.0, nuevo_saldo=0.0
-        ),
-        "children": [],
-        "parent_id": c.cuenta_padre_id
-    } for c in cuentas}
-    root_cuentas = []
-    for c_id, c_node in cuentas_map.items():
-        if c_node['parent_id'] and c_node['parent_id'] in cuentas_map:
-            cuentas_map[c_node['parent_id']]['children'].append(c_id)
-        else:
-            root_cuentas.append(c_id)
-    saldos_iniciales_q = db.query(
-        MovimientoContable.cuenta_id,
-        func.sum(MovimientoContable.debito - MovimientoContable.credito).label("saldo_inicial")
-    ).join(Documento).filter(
-        Documento.empresa_id == empresa_id,
-        Documento.fecha < filtros.fecha_inicio,
-        Documento.anulado == False
-    )
-    if getattr(filtros, 'cuenta_prefijo', None):
-        saldos_iniciales_q = saldos_iniciales_q.join(PlanCuenta, MovimientoContable.cuenta_id == PlanCuenta.id).filter(PlanCuenta.codigo.startswith(filtros.cuenta_prefijo))
-    if filtros.centro_costo_id:
-        saldos_iniciales_q = saldos_iniciales_q.filter(MovimientoContable.centro_costo_id == filtros.centro_costo_id)
-    saldos_iniciales_q = saldos_iniciales_q.group_by(MovimientoContable.cuenta_id).all()
-    for row in saldos_iniciales_q:
-        if row.cuenta_id in cuentas_map:
-            cuentas_map[row.cuenta_id]['data'].saldo_inicial = float(row.saldo_inicial or 0.0)
-    movimientos_periodo_q = db.query(
-        MovimientoContable.cuenta_id,
-        func.sum(MovimientoContable.debito).label("debito"),
-        func.sum(MovimientoContable.credito).label("credito")
-    ).join(Documento).filter(
-        Documento.empresa_id == empresa_id,
-        Documento.fecha.between(filtros.fecha_inicio, filtros.fecha_fin),
-        Documento.anulado == False
-    )
-    if getattr(filtros, 'cuenta_prefijo', None):
-        movimientos_periodo_q = movimientos_periodo_q.join(PlanCuenta, MovimientoContable.cuenta_id == PlanCuenta.id).filter(PlanCuenta.codigo.startswith(filtros.cuenta_prefijo))
-    if filtros.centro_costo_id:
-        movimientos_periodo_q = movimientos_periodo_q.filter(MovimientoContable.centro_costo_id == filtros.centro_costo_id)
-    movimientos_periodo_q = movimientos_periodo_q.group_by(MovimientoContable.cuenta_id).all()
-    for row in movimientos_periodo_q:
-        if row.cuenta_id in cuentas_map:
-            cuentas_map[row.cuenta_id]['data'].debito = float(row.debito or 0.0)
-            cuentas_map[row.cuenta_id]['data'].credito = float(row.credito or 0.0)
-    def sumar_hacia_padre(cuenta_id):
-        cuenta_node = cuentas_map[cuenta_id]
-        if not cuenta_node['children']:
-            cuenta_node['data'].nuevo_saldo = cuenta_node['data'].saldo_inicial + cuenta_node['data'].debito - cuenta_node['data'].credito
-            return
-        for child_id in cuenta_node['children']:
-            sumar_hacia_padre(child_id)
-        for child_id in cuenta_node['children']:
-            child_node = cuentas_map[child_id]
-            cuenta_node['data'].saldo_inicial += child_node['data'].saldo_inicial
-            cuenta_node['data'].debito += child_node['data'].debito
-            cuenta_node['data'].credito += child_node['data'].credito
-        cuenta_node['data'].nuevo_saldo = cuenta_node['data'].saldo_inicial + cuenta_node['data'].debito - cuenta_node['data'].credito
-    for root_id in root_cuentas:
-        sumar_hacia_padre(root_id)
+# --- MAYORIZACIÓN COMÚN DE LOS BALANCES DE PRUEBA (ver arbol_puc) ---
+def _filas_balance_jerarquico(arbol, visibles, saldos_iniciales: Dict[int, float], movimientos: Dict[int, tuple],
+                              filtro: str, nivel_maximo: int, modelo_fila, modelo_totales) -> Dict[str, Any]:
+    """
+    Suma saldo inicial, débito y crédito hacia los padres en una sola pasada
+    sobre el árbol y arma las filas visibles en orden jerárquico.
+    `visibles`: máscara de nodos que pueden aparecer en el reporte.
+    """
+    valores = arbol.vector(saldos_iniciales, columnas=3)
+    for nodo_id, (debito, credito) in movimientos.items():
+        posicion = arbol.indice.get(nodo_id)
+        if posicion is not None:
+            valores[posicion, 1] = debito
+            valores[posicion, 2] = credito
+    totales_arbol = arbol.acumular(valores)
+    saldo_inicial, debito, credito = totales_arbol[:, 0], totales_arbol[:, 1], totales_arbol[:, 2]
+    nuevo_saldo = saldo_inicial + debito - credito
+
+    tiene_movimiento = (debito != 0) | (credito != 0)
+    if filtro == 'TODAS':
+        mostrar = np.ones(arbol.n, dtype=bool)
+    elif filtro == 'CON_MOVIMIENTO':
+        mostrar = tiene_movimiento
+    elif filtro == 'CON_SALDO_O_MOVIMIENTO':
+        mostrar = tiene_movimiento | (saldo_inicial != 0) | (nuevo_saldo != 0)
+    else:
+        mostrar = np.zeros(arbol.n, dtype=bool)
+    mostrar = mostrar & visibles & (arbol.niveles <= nivel_maximo)
+
     filas_reporte = []
-    def aplanar(cuenta_id):
-        cuenta_node = cuentas_map[cuenta_id]
-        tiene_movimiento = cuenta_node['data'].debito != 0 or cuenta_node['data'].credito != 0
-        tiene_saldo = cuenta_node['data'].saldo_inicial != 0 or cuenta_node['data'].nuevo_saldo != 0
-        mostrar = False
-        if filtros.filtro_cuentas == 'TODAS':
-            mostrar = True
-        elif filtros.filtro_cuentas == 'CON_MOVIMIENTO':
-            if tiene_movimiento: mostrar = True
-        elif filtros.filtro_cuentas == 'CON_SALDO_O_MOVIMIENTO':
-            if tiene_movimiento or tiene_saldo: mostrar = True
-        if mostrar and cuenta_node['data'].nivel <= filtros.nivel_maximo:
-            filas_reporte.append(cuenta_node['data'])
-        for child_id in sorted(cuenta_node['children'], key=lambda id: cuentas_map[id]['data'].codigo):
-            aplanar(child_id)
-    for root_id in sorted(root_cuentas, key=lambda id: cuentas_map[id]['data'].codigo):
-        aplanar(root_id)
-    totales = schemas_bce.TotalesBalancePrueba(saldo_inicial=0, debito=0, credito=0, nuevo_saldo=0)
-    for fila in filas_reporte:
+    totales = modelo_totales(saldo_inicial=0, debito=0, credito=0, nuevo_saldo=0)
+    for i in arbol.orden[mostrar[arbol.orden]].tolist():
+        fila = modelo_fila(
+            codigo=arbol.codigos[i], nombre=arbol.nombres[i], nivel=int(arbol.niveles[i]),
+            saldo_inicial=float(saldo_inicial[i]), debito=float(debito[i]), credito=float(credito[i]),
+            nuevo_saldo=float(nuevo_saldo[i])
+        )
+        filas_reporte.append(fila)
         if fila.nivel == 1:
             totales.saldo_inicial += fila.saldo_inicial
             totales.debito += fila.debito
@@ -172,25 +123,42 @@ def generate_balance_de_prueba_report(db: Session, empresa_id: int, filtros: sch
     return {"filas": filas_reporte, "totales": totales}
 
 
-# --- LÓGICA PARA EL BALANCE DE PRUEBA POR CC (Sin cambios) ---
+# --- LÓGICA PARA EL BALANCE DE PRUEBA POR CUENTAS ---
+def generate_balance_de_prueba_report(db: Session, empresa_id: int, filtros: schemas_bce.FiltrosBalancePrueba) -> Dict[str, Any]:
+    arbol = arbol_puc.get_arbol_puc(db, empresa_id)
+    # Filtrar cuentas base si hay prefijo
+    prefijo = getattr(filtros, 'cuenta_prefijo', None)
+    cuenta_ids = None
+    if prefijo:
+        cuenta_ids = [arbol.ids[i] for i in np.flatnonzero(arbol.posiciones_con_prefijo([prefijo]) & ~arbol.virtual)]
+
+    # Saldos desde la tabla materializada de saldos mensuales (meses completos)
+    # + consulta en vivo solo de los días sueltos de los meses borde.
+    saldos_iniciales = saldos_mensuales_service.sumas_por_cuenta(
+        db, empresa_id, filtros.fecha_inicio - timedelta(days=1),
+        centro_costo_id=filtros.centro_costo_id, cuenta_ids=cuenta_ids
+    )
+    movimientos_periodo = saldos_mensuales_service.sumas_por_cuenta(
+        db, empresa_id, filtros.fecha_fin, fecha_desde=filtros.fecha_inicio,
+        centro_costo_id=filtros.centro_costo_id, cuenta_ids=cuenta_ids
+    )
+    # Se rearma si aparecen cuentas creadas después de guardar el árbol (otro proceso)
+    arbol = arbol_puc.get_arbol_puc(db, empresa_id, cuenta_ids=list(saldos_iniciales) + list(movimientos_periodo))
+    visibles = ~arbol.virtual
+    if prefijo:
+        visibles = visibles & arbol.posiciones_con_prefijo([prefijo])
+
+    return _filas_balance_jerarquico(
+        arbol, visibles,
+        {cuenta_id: float(debito - credito) for cuenta_id, (debito, credito) in saldos_iniciales.items()},
+        {cuenta_id: (float(debito), float(credito)) for cuenta_id, (debito, credito) in movimientos_periodo.items()},
+        filtros.filtro_cuentas, filtros.nivel_maximo,
+        schemas_bce.CuentaBalancePrueba, schemas_bce.TotalesBalancePrueba
+    )
+
+
+# --- LÓGICA PARA EL BALANCE DE PRUEBA POR CC ---
 def generate_balance_de_prueba_cc_report(db: Session, empresa_id: int, filtros: schemas_bce_cc.FiltrosBalancePruebaCC) -> Dict[str, Any]:
-    # (El código de esta función no necesita cambios, ya que solo prepara datos)
-    centros_costo = db.query(CentroCosto).filter(CentroCosto.empresa_id == empresa_id).order_by(CentroCosto.codigo).all()
-    cc_map = {cc.id: {
-        "data": schemas_bce_cc.CentroCostoBalancePrueba(
-            codigo=cc.codigo, nombre=cc.nombre, nivel=cc.nivel,
-            saldo_inicial=0.0, debito=0.0, credito=0.0, nuevo_saldo=0.0
-        ),
-        "children": [],
-        "parent_id": cc.centro_costo_padre_id
-    } for cc in centros_costo}
-    root_ccs = []
-    for cc_id, cc_node in cc_map.items():
-        if cc_node['parent_id']:
-            if cc_node['parent_id'] in cc_map:
-                cc_map[cc_node['parent_id']]['children'].append(cc_id)
-        else:
-            root_ccs.append(cc_id)
     saldos_iniciales_q = db.query(
         MovimientoContable.centro_costo_id,
         func.sum(MovimientoContable.debito - MovimientoContable.credito).label("saldo_inicial")
@@ -203,9 +171,6 @@ def generate_balance_de_prueba_cc_report(db: Session, empresa_id: int, filtros:
     if filtros.cuenta_id:
         saldos_iniciales_q = saldos_iniciales_q.filter(MovimientoContable.cuenta_id == filtros.cuenta_id)
     saldos_iniciales_q = saldos_iniciales_q.group_by(MovimientoContable.centro_costo_id).all()
-    for row in saldos_iniciales_q:
-        if row.centro_costo_id in cc_map:
-            cc_map[row.centro_costo_id]['data'].saldo_inicial = float(row.saldo_inicial or 0.0)
     movimientos_periodo_q = db.query(
         MovimientoContable.centro_costo_id,
         func.sum(MovimientoContable.debito).label("debito"),
@@ -219,51 +184,17 @@ def generate_balance_de_prueba_cc_report(db: Session, empresa_id: int, filtros:
     if filtros.cuenta_id:
         movimientos_periodo_q = movimientos_periodo_q.filter(MovimientoContable.cuenta_id == filtros.cuenta_id)
     movimientos_periodo_q = movimientos_periodo_q.group_by(MovimientoContable.centro_costo_id).all()
-    for row in movimientos_periodo_q:
-        if row.centro_costo_id in cc_map:
-            cc_map[row.centro_costo_id]['data'].debito = float(row.debito or 0.0)
-            cc_map[row.centro_costo_id]['data'].credito = float(row.credito or 0.0)
-    def sumar_hacia_padre(cc_id):
-        cc_node = cc_map[cc_id]
-        if not cc_node['children']:
-            cc_node['data'].nuevo_saldo = cc_node['data'].saldo_inicial + cc_node['data'].debito - cc_node['data'].credito
-            return
-        for child_id in cc_node['children']:
-            sumar_hacia_padre(child_id)
-        for child_id in cc_node['children']:
-            child_node = cc_map[child_id]
-            cc_node['data'].saldo_inicial += child_node['data'].saldo_inicial
-            cc_node['data'].debito += child_node['data'].debito
-            cc_node['data'].credito += child_node['data'].credito
-        cc_node['data'].nuevo_saldo = cc_node['data'].saldo_inicial + cc_node['data'].debito - cc_node['data'].credito
-    for root_id in root_ccs:
-        sumar_hacia_padre(root_id)
-    filas_reporte = []
-    def aplanar(cc_id):
-        cc_node = cc_map[cc_id]
-        tiene_movimiento = cc_node['data'].debito != 0 or cc_node['data'].credito != 0
-        tiene_saldo = cc_node['data'].saldo_inicial != 0 or cc_node['data'].nuevo_saldo != 0
-        mostrar = False
-        if filtros.filtro_centros_costo == 'TODAS':
-            mostrar = True
-        elif filtros.filtro_centros_costo == 'CON_MOVIMIENTO':
-            if tiene_movimiento: mostrar = True
-        elif filtros.filtro_centros_costo == 'CON_SALDO_O_MOVIMIENTO':
-            if tiene_movimiento or tiene_saldo: mostrar = True
-        if mostrar and cc_node['data'].nivel <= filtros.nivel_maximo:
-            filas_reporte.append(cc_node['data'])
-        for child_id in sorted(cc_node['children'], key=lambda id: cc_map[id]['data'].codigo):
-            aplanar(child_id)
-    for root_id in sorted(root_ccs, key=lambda id: cc_map[id]['data'].codigo):
-        aplanar(root_id)
-    totales = schemas_bce_cc.TotalesBalancePruebaCC(saldo_inicial=0, debito=0, credito=0, nuevo_saldo=0)
-    for fila in filas_reporte:
-        if fila.nivel == 1:
-            totales.saldo_inicial += fila.saldo_inicial
-            totales.debito += fila.debito
-            totales.credito += fila.credito
-    totales.nuevo_saldo = totales.saldo_inicial + totales.debito - totales.credito
-    return {"filas": filas_reporte, "totales": totales}
+
+    arbol = arbol_puc.get_arbol_centros_costo(
+        db, empresa_id, centro_costo_ids=[row.centro_costo_id for row in saldos_iniciales_q + movimientos_periodo_q]
+    )
+    return _filas_balance_jerarquico(
+        arbol, ~arbol.virtual,
+        {row.centro_costo_id: float(row.saldo_inicial or 0.0) for row in saldos_iniciales_q},
+        {row.centro_costo_id: (float(row.debito or 0.0), float(row.credito or 0.0)) for row in movimientos_periodo_q},
+        filtros.filtro_centros_costo, filtros.nivel_maximo,
+        schemas_bce_cc.CentroCostoBalancePrueba, schemas_bce_cc.TotalesBalancePruebaCC
+    )
 
 
 # --- FUNCIÓN PDF PARA BALANCE DE PRUEBA POR CUENTAS (REFACTORIZADA) ---
@@ -282,10 +213,9 @@ def generate_balance_de_prueba_pdf(db: Session, empresa_id: int, filtros: schema
     }
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS["reports/balance_de_prueba_report.html"]
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/balance_de_prueba_report.html')
         html_string = template.render(context)
-        pdf_content = HTML(string=html_string).write_pdf()
+        pdf_content = motor_pdf.html_a_pdf(html_string)
         return Response(content=pdf_content, media_type="application/pdf")
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/balance_de_prueba_report.html' no fue encontrada en el paquete.")
@@ -319,10 +249,9 @@ def generate_balance_de_prueba_cc_pdf(db: Session, empresa_id: int, filtros: sch
     }
 
     try:
-        template_string = TEMPLATES_EMPAQUETADOS["reports/balance_de_prueba_cc_report.html"]
-        template = GLOBAL_JINJA_ENV.from_string(template_string)
+        template = plantillas_html.plantilla(GLOBAL_JINJA_ENV, 'reports/balance_de_prueba_cc_report.html')
         html_string = template.render(context)
-        pdf_content = HTML(string=html_string).write_pdf()
+        pdf_content = motor_pdf.html_a_pdf(html_string)
         return Response(content=pdf_content, media_type="application/pdf")
     except KeyError:
         raise HTTPException(status_code=500, detail="La plantilla 'reports/balance_de_prueba_cc_report.html' no fue encontrada en el paquete.")
@@ -661,9 +590,9 @@ def generate_relacion_saldos_pdf(db: Session, empresa_id: int, filtros: Dict[str
     """
     
     try:
-        template = GLOBAL_JINJA_ENV.from_string(html_template)
+        template = plantillas_html.compilar(GLOBAL_JINJA_ENV, html_template)
         html_string = template.render(context)
-        pdf_content = HTML(string=html_string).write_pdf()
+        pdf_content = motor_pdf.html_a_pdf(html_string)
         return pdf_content
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generando PDF Relación Saldos: {e}")
@@ -954,9 +883,9 @@ def generate_auxiliar_inverso_pdf(db: Session, empresa_id: int, filtros: Dict[st
     """
     
     try:
-        template = GLOBAL_JINJA_ENV.from_string(html_template)
+        template = plantillas_html.compilar(GLOBAL_JINJA_ENV, html_template)
         html_string = template.render(context)
-        pdf_content = HTML(string=html_string).write_pdf()
+        pdf_content = motor_pdf.html_a_pdf(html_string)
         return pdf_content
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generando PDF inverso: {e}")
\ No newline at end of file
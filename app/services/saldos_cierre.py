@@ -0,0 +1,325 @@
+# app/services/saldos_cierre.py
+"""
+Saldos congelados de períodos cerrados.
+
+Al cerrar un período (periodo.cerrar_periodo) se guarda una foto inmutable de
+los saldos acumulados por cuenta / tercero / centro de costo al último día del
+mes, protegida con un checksum SHA-256. Los reportes que necesitan saldos
+anteriores a una fecha (saldo inicial de auxiliares, balance de prueba, etc.)
+parten de la foto más reciente y solo leen los movimientos posteriores a ella.
+
+La foto se elimina al reabrir el período y también si algún proceso llega a
+modificar movimientos de un mes igual o anterior (p.ej. recálculo de costos
+de inventario), de modo que nunca se sirven saldos desactualizados.
+"""
+import hashlib
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, or_, and_, select
+from sqlalchemy.orm import Session
+
+from app.models.documento import Documento
+from app.models.movimiento_contable import MovimientoContable
+from app.models.saldo_cierre_periodo import SaldoCierrePeriodo, SaldoCierrePeriodoDetalle
+
+CENTAVO = Decimal("0.01")
+CERO = Decimal("0")
+
+# Fotos cuyo checksum ya fue verificado en este proceso {cierre_id: checksum}.
+# Las fotos son inmutables (solo se crean o se eliminan), así que basta verificarlas una vez.
+_CHECKSUMS_VERIFICADOS: Dict[int, str] = {}
+
+
+def _fin_de_mes(ano: int, mes: int) -> date:
+    siguiente = date(ano + (mes // 12), (mes % 12) + 1, 1)
+    return siguiente - timedelta(days=1)
+
+
+def _calcular_checksum(filas: Iterable[Tuple[int, int, int, Decimal, Decimal]]) -> str:
+    h = hashlib.sha256()
+    for cuenta_id, tercero_id, cc_id, debito, credito in sorted(filas, key=lambda f: (f[0], f[1], f[2])):
+        h.update(
+            f"{cuenta_id}|{tercero_id}|{cc_id}|"
+            f"{Decimal(debito).quantize(CENTAVO)}|{Decimal(credito).quantize(CENTAVO)}\n".encode()
+        )
+    return h.hexdigest()
+
+
+# ==========================================================
+# 1. CONGELAR / ELIMINAR
+# ==========================================================
+
+def congelar_saldos_periodo(db: Session, empresa_id: int, ano: int, mes: int,
+                            periodo_cerrado_id: Optional[int] = None) -> SaldoCierrePeriodo:
+    """
+    Calcula y guarda los saldos acumulados al cierre de ano/mes.
+    Si existe la foto válida del mes anterior, solo se leen los movimientos del mes.
+    No hace commit: participa en la transacción del cierre.
+    """
+    fin_mes = _fin_de_mes(ano, mes)
+    inicio_mes = date(ano, mes, 1)
+
+    acumulado: Dict[Tuple[int, int, int], list] = {}
+
+    anterior_fecha = inicio_mes - timedelta(days=1)
+    anterior = db.query(SaldoCierrePeriodo).filter(
+        SaldoCierrePeriodo.empresa_id == empresa_id,
+        SaldoCierrePeriodo.ano == anterior_fecha.year,
+        SaldoCierrePeriodo.mes == anterior_fecha.month
+    ).first()
+    filas_anteriores = None
+    if anterior:
+        filas_anteriores = _detalle(db, anterior)
+        if not _checksum_valido(db, anterior, filas_anteriores):
+            filas_anteriores = None
+
+    if filas_anteriores is not None:
+        for f in filas_anteriores:
+            acumulado[(f.cuenta_id, f.tercero_id, f.centro_costo_id)] = [Decimal(f.debito), Decimal(f.credito)]
+        desde = inicio_mes
+    else:
+        desde = None
+
+    tercero = func.coalesce(MovimientoContable.tercero_id, Documento.beneficiario_id, 0)
+    cc = func.coalesce(MovimientoContable.centro_costo_id, 0)
+    q = db.query(
+        MovimientoContable.cuenta_id,
+        tercero.label("tercero_id"),
+        cc.label("centro_costo_id"),
+        func.sum(MovimientoContable.debito).label("debito"),
+        func.sum(MovimientoContable.credito).label("credito"),
+    ).join(Documento, Documento.id == MovimientoContable.documento_id).filter(
+        Documento.empresa_id == empresa_id,
+        Documento.anulado == False,
+        Documento.fecha <= fin_mes
+    )
+    if desde is not None:
+        q = q.filter(Documento.fecha >= desde)
+    for r in q.group_by(MovimientoContable.cuenta_id, tercero, cc).all():
+        par = acumulado.setdefault((r.cuenta_id, int(r.tercero_id or 0), int(r.centro_costo_id or 0)), [CERO, CERO])
+        par[0] += Decimal(r.debito or 0)
+        par[1] += Decimal(r.credito or 0)
+
+    filas = [
+        (k[0], k[1], k[2], v[0].quantize(CENTAVO), v[1].quantize(CENTAVO))
+        for k, v in acumulado.items()
+        if v[0] != 0 or v[1] != 0
+    ]
+
+    eliminar_saldos_periodo(db, empresa_id, ano, mes)
+
+    cierre = SaldoCierrePeriodo(
+        empresa_id=empresa_id,
+        periodo_cerrado_id=periodo_cerrado_id,
+        ano=ano,
+        mes=mes,
+        checksum=_calcular_checksum(filas),
+        cantidad_filas=len(filas)
+    )
+    db.add(cierre)
+    db.flush()
+
+    if filas:
+        db.execute(
+            SaldoCierrePeriodoDetalle.__table__.insert(),
+            [
+                {"cierre_id": cierre.id, "cuenta_id": f[0], "tercero_id": f[1], "centro_costo_id": f[2],
+                 "debito": f[3], "credito": f[4]}
+                for f in filas
+            ]
+        )
+    _CHECKSUMS_VERIFICADOS[cierre.id] = cierre.checksum
+    return cierre
+
+
+def eliminar_saldos_periodo(db: Session, empresa_id: int, ano: int, mes: int) -> None:
+    """Elimina la foto congelada de un período (usado al reabrirlo)."""
+    ids = [r.id for r in db.query(SaldoCierrePeriodo.id).filter(
+        SaldoCierrePeriodo.empresa_id == empresa_id,
+        SaldoCierrePeriodo.ano == ano,
+        SaldoCierrePeriodo.mes == mes
+    ).all()]
+    _eliminar_fotos(db.connection(), ids)
+
+
+def _eliminar_fotos(conn, ids) -> None:
+    if not ids:
+        return
+    conn.execute(delete(SaldoCierrePeriodoDetalle).where(SaldoCierrePeriodoDetalle.cierre_id.in_(ids)))
+    conn.execute(delete(SaldoCierrePeriodo).where(SaldoCierrePeriodo.id.in_(ids)))
+    for cierre_id in ids:
+        _CHECKSUMS_VERIFICADOS.pop(cierre_id, None)
+
+
+def invalidar_desde(conn, empresa_id: int, ano: int, mes: int) -> None:
+    """
+    Elimina las fotos de la empresa desde ano/mes en adelante. Se invoca cuando
+    cambian movimientos de ese mes: las fotos posteriores ya no son exactas.
+    """
+    periodo = SaldoCierrePeriodo.ano * 100 + SaldoCierrePeriodo.mes
+    ids = [r[0] for r in conn.execute(
+        select(SaldoCierrePeriodo.id).where(
+            SaldoCierrePeriodo.empresa_id == empresa_id,
+            periodo >= ano * 100 + mes
+        )
+    ).all()]
+    if ids:
+        print(f"[SALDOS CIERRE] Empresa {empresa_id}: cambios en {mes}/{ano}, se invalidan {len(ids)} foto(s) de cierre.")
+        _eliminar_fotos(conn, ids)
+
+
+# ==========================================================
+# 2. LECTURA
+# ==========================================================
+
+def _detalle(db: Session, cierre: SaldoCierrePeriodo) -> List[SaldoCierrePeriodoDetalle]:
+    return db.query(SaldoCierrePeriodoDetalle).filter(SaldoCierrePeriodoDetalle.cierre_id == cierre.id).all()
+
+
+def _checksum_valido(db: Session, cierre: SaldoCierrePeriodo,
+                     filas: Optional[List[SaldoCierrePeriodoDetalle]] = None) -> bool:
+    """
+    True si el checksum de la foto es válido. Una foto ya verificada (en este
+    proceso) no vuelve a leer su detalle; si el llamador ya lo cargó, se usa `filas`.
+    """
+    if _CHECKSUMS_VERIFICADOS.get(cierre.id) == cierre.checksum:
+        return True
+    if filas is None:
+        filas = _detalle(db, cierre)
+    calculado = _calcular_checksum(
+        (f.cuenta_id, f.tercero_id, f.centro_costo_id, Decimal(f.debito), Decimal(f.credito)) for f in filas
+    )
+    if calculado != cierre.checksum or len(filas) != cierre.cantidad_filas:
+        print(f"[SALDOS CIERRE] ⚠️ Checksum inválido en foto {cierre.id} ({cierre.mes}/{cierre.ano}). Se ignora.")
+        return False
+    _CHECKSUMS_VERIFICADOS[cierre.id] = cierre.checksum
+    return True
+
+
+def ultimo_cierre_valido(db: Session, empresa_id: int, fecha_corte: date) -> Optional[SaldoCierrePeriodo]:
+    """
+    Foto más reciente cuyo último día de mes es <= fecha_corte y cuyo checksum es válido.
+    """
+    periodo = SaldoCierrePeriodo.ano * 100 + SaldoCierrePeriodo.mes
+    candidatos = db.query(SaldoCierrePeriodo).filter(
+        SaldoCierrePeriodo.empresa_id == empresa_id,
+        periodo <= fecha_corte.year * 100 + fecha_corte.month
+    ).order_by(periodo.desc()).limit(2).all()
+
+    for cierre in candidatos:
+        if _fin_de_mes(cierre.ano, cierre.mes) > fecha_corte:
+            continue
+        return cierre if _checksum_valido(db, cierre) else None
+    return None
+
+
+def fecha_fin_cierre(cierre: SaldoCierrePeriodo) -> date:
+    return _fin_de_mes(cierre.ano, cierre.mes)
+
+
+def sumas_congeladas_por_cuenta(
+    db: Session,
+    cierre: SaldoCierrePeriodo,
+    cuenta_ids: Optional[Iterable[int]] = None,
+    tercero_id: Optional[int] = None,
+    centro_costo_id: Optional[int] = None,
+) -> Dict[int, Tuple[Decimal, Decimal]]:
+    """{cuenta_id: (debito, credito)} acumulados de la foto, con filtros opcionales."""
+    q = db.query(
+        SaldoCierrePeriodoDetalle.cuenta_id,
+        func.sum(SaldoCierrePeriodoDetalle.debito).label("debito"),
+        func.sum(SaldoCierrePeriodoDetalle.credito).label("credito"),
+    ).filter(SaldoCierrePeriodoDetalle.cierre_id == cierre.id)
+    if cuenta_ids is not None:
+        q = q.filter(SaldoCierrePeriodoDetalle.cuenta_id.in_(list(cuenta_ids)))
+    if tercero_id:
+        q = q.filter(SaldoCierrePeriodoDetalle.tercero_id == tercero_id)
+    if centro_costo_id:
+        q = q.filter(SaldoCierrePeriodoDetalle.centro_costo_id == centro_costo_id)
+    return {
+        r.cuenta_id: (Decimal(r.debito or 0), Decimal(r.credito or 0))
+        for r in q.group_by(SaldoCierrePeriodoDetalle.cuenta_id).all()
+    }
+
+
+def saldos_anteriores_por_cuenta(
+    db: Session,
+    empresa_id: int,
+    fecha_inicio: date,
+    cuenta_ids: Optional[Iterable[int]] = None,
+    tercero_id: Optional[int] = None,
+    centro_costo_id: Optional[int] = None,
+) -> Dict[int, Tuple[Decimal, Decimal]]:
+    """
+    {cuenta_id: (debito, credito)} de todos los movimientos no anulados con
+    fecha < fecha_inicio. Parte de la foto congelada más reciente y solo lee
+    los movimientos posteriores a ella (o todos, si no hay foto válida).
+    El tercero se compara contra el tercero efectivo del movimiento
+    (tercero del movimiento o beneficiario del documento).
+    """
+    if cuenta_ids is not None:
+        cuenta_ids = list(cuenta_ids)
+        if not cuenta_ids:
+            return {}
+
+    fecha_corte = fecha_inicio - timedelta(days=1)
+    resultado: Dict[int, list] = {}
+
+    cierre = ultimo_cierre_valido(db, empresa_id, fecha_corte)
+    desde = None
+    if cierre:
+        for cuenta_id, (debito, credito) in sumas_congeladas_por_cuenta(
+            db, cierre, cuenta_ids=cuenta_ids, tercero_id=tercero_id, centro_costo_id=centro_costo_id
+        ).items():
+            resultado[cuenta_id] = [debito, credito]
+        desde = fecha_fin_cierre(cierre) + timedelta(days=1)
+
+    if desde is None or desde <= fecha_corte:
+        q = db.query(
+            MovimientoContable.cuenta_id,
+            func.sum(MovimientoContable.debito).label("debito"),
+            func.sum(MovimientoContable.credito).label("credito"),
+        ).join(Documento, Documento.id == MovimientoContable.documento_id).filter(
+            Documento.empresa_id == empresa_id,
+            Documento.anulado == False,
+            Documento.fecha < fecha_inicio
+        )
+        if desde is not None:
+            q = q.filter(Documento.fecha >= desde)
+        if cuenta_ids is not None:
+            q = q.filter(MovimientoContable.cuenta_id.in_(cuenta_ids))
+        if tercero_id:
+            q = q.filter(or_(
+                MovimientoContable.tercero_id == tercero_id,
+                and_(MovimientoContable.tercero_id.is_(None), Documento.beneficiario_id == tercero_id)
+            ))
+        if centro_costo_id:
+            q = q.filter(MovimientoContable.centro_costo_id == centro_costo_id)
+        for r in q.group_by(MovimientoContable.cuenta_id).all():
+            par = resultado.setdefault(r.cuenta_id, [CERO, CERO])
+            par[0] += Decimal(r.debito or 0)
+            par[1] += Decimal(r.credito or 0)
+
+    return {k: (v[0], v[1]) for k, v in resultado.items()}
+
+
+def regenerar_saldos_cierre(db: Session, empresa_id: int) -> int:
+    """
+    Vuelve a congelar, en orden, todos los períodos cerrados de la empresa.
+    Útil para poblar fotos de cierres antiguos o tras procesos masivos
+    (restauración de copias, recodificación). No hace commit.
+    """
+    from app.models.periodo_contable_cerrado import PeriodoContableCerrado
+
+    periodos = db.query(PeriodoContableCerrado).filter(
+        PeriodoContableCerrado.empresa_id == empresa_id
+    ).order_by(PeriodoContableCerrado.ano, PeriodoContableCerrado.mes).all()
+
+    _eliminar_fotos(db.connection(), [r.id for r in db.query(SaldoCierrePeriodo.id).filter(
+        SaldoCierrePeriodo.empresa_id == empresa_id
+    ).all()])
+    for p in periodos:
+        congelar_saldos_periodo(db, empresa_id, p.ano, p.mes, periodo_cerrado_id=p.id)
+    return len(periodos)
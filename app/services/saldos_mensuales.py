@@ -0,0 +1,587 @@
+# app/services/saldos_mensuales.py
+"""
+Motor de saldos mensuales materializados.
+
+Mantiene la tabla `saldos_mensuales_cuenta` (débito, crédito y cantidad de
+movimientos por empresa / cuenta / centro de costo / mes) para que los reportes
+de saldos no tengan que re-agregar `movimientos_contables` desde el inicio de
+los tiempos en cada llamada.
+
+Flujo:
+  - Todo movimiento NUEVO (creación y edición de documentos, papelera, nómina,
+    activos fijos, importaciones...) se suma con un listener after_flush, sin
+    importar qué servicio lo inserte.
+  - documento.anular/eliminar/update/reactivar llaman a aplicar_documento() /
+    retirar_documento() dentro de su misma transacción para los movimientos
+    que ya existían (la edición retira los originales antes de borrarlos).
+  - Los ajustes directos de débito/crédito sobre movimientos ya persistidos
+    (sincronización de costos del kárdex) y los movimientos borrados con
+    session.delete() (recálculo de intereses PH) se capturan con un listener de flush.
+  - Cambiar el tercero de un movimiento o el beneficiario de un documento (en el
+    flush o con UPDATE masivo, p.ej. la fusión de terceros) invalida las fotos de
+    cierre desde su mes: están agrupadas por tercero.
+  - reconstruir_saldos_mensuales() regenera la tabla de una empresa completa.
+
+Consulta:
+  sumas_por_cuenta() resuelve un rango de fechas como
+  [meses completos desde la tabla] + [días sueltos de los meses borde en vivo].
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, cast, delete, event, extract, func, insert, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models.documento import Documento
+from app.models.movimiento_contable import MovimientoContable
+from app.models.plan_cuenta import PlanCuenta
+from app.models.saldo_mensual import SaldoMensualCuenta, SaldoMensualEstado
+
+CERO = Decimal("0")
+
+# Campos del movimiento que alteran el acumulado mensual. tercero_id no cambia el
+# acumulado (se compensa en la misma llave) pero sí las fotos de cierre por tercero.
+_CAMPOS_SALDO = ("debito", "credito", "cuenta_id", "centro_costo_id", "tercero_id")
+
+SumaCuenta = namedtuple("SumaCuenta", ["cuenta_id", "codigo", "nombre", "total_debito", "total_credito"])
+
+
+# ==========================================================
+# 1. ESCRITURA INCREMENTAL
+# ==========================================================
+
+def _dec(valor) -> Decimal:
+    if valor is None:
+        return CERO
+    if isinstance(valor, Decimal):
+        return valor
+    return Decimal(str(valor))
+
+
+def _acumular(deltas: Dict[tuple, list], empresa_id: int, cuenta_id: int, centro_costo_id: Optional[int],
+              fecha: date, debito, credito, cantidad: int):
+    llave = (empresa_id, cuenta_id, centro_costo_id or 0, fecha.year, fecha.month)
+    acumulado = deltas.setdefault(llave, [CERO, CERO, 0])
+    acumulado[0] += _dec(debito)
+    acumulado[1] += _dec(credito)
+    acumulado[2] += cantidad
+
+
+def _upsert_deltas(conn, deltas: Dict[tuple, list]) -> None:
+    """
+    Suma los deltas sobre la tabla de saldos mensuales (INSERT ... ON CONFLICT
+    DO UPDATE en PostgreSQL/SQLite; UPDATE + INSERT en otros motores).
+    """
+    filas = [
+        {
+            "empresa_id": k[0], "cuenta_id": k[1], "centro_costo_id": k[2], "ano": k[3], "mes": k[4],
+            "debito": v[0], "credito": v[1], "cantidad_movimientos": v[2],
+        }
+        # Orden fijo de llaves: sesiones concurrentes toman los bloqueos de fila en el mismo orden
+        for k, v in sorted(deltas.items())
+        if v[0] != 0 or v[1] != 0 or v[2] != 0
+    ]
+    if not filas:
+        return
+
+    tabla = SaldoMensualCuenta.__table__
+    llave = ["empresa_id", "cuenta_id", "centro_costo_id", "ano", "mes"]
+    dialecto = conn.dialect.name
+
+    if dialecto in ("postgresql", "sqlite"):
+        if dialecto == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(tabla)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=llave,
+            set_={
+                "debito": tabla.c.debito + stmt.excluded.debito,
+                "credito": tabla.c.credito + stmt.excluded.credito,
+                "cantidad_movimientos": tabla.c.cantidad_movimientos + stmt.excluded.cantidad_movimientos,
+            },
+        )
+        conn.execute(stmt, filas)
+        _invalidar_cierres(conn, filas)
+        return
+
+    # Fallback genérico
+    for fila in filas:
+        res = conn.execute(
+            update(tabla)
+            .where(*[tabla.c[c] == fila[c] for c in llave])
+            .values(
+                debito=tabla.c.debito + fila["debito"],
+                credito=tabla.c.credito + fila["credito"],
+                cantidad_movimientos=tabla.c.cantidad_movimientos + fila["cantidad_movimientos"],
+            )
+        )
+        if res.rowcount == 0:
+            conn.execute(insert(tabla).values(**fila))
+    _invalidar_cierres(conn, filas)
+
+
+def _invalidar_cierres(conn, filas: List[dict]) -> None:
+    """Las fotos de períodos cerrados desde el mes más antiguo afectado dejan de ser exactas."""
+    from app.services import saldos_cierre as saldos_cierre_service
+
+    minimo: Dict[int, int] = {}
+    for fila in filas:
+        periodo = fila["ano"] * 100 + fila["mes"]
+        if fila["empresa_id"] not in minimo or periodo < minimo[fila["empresa_id"]]:
+            minimo[fila["empresa_id"]] = periodo
+    for empresa_id, periodo in minimo.items():
+        saldos_cierre_service.invalidar_desde(conn, empresa_id, periodo // 100, periodo % 100)
+
+
+def aplicar_documento(db: Session, documento_id: int, signo: int = 1) -> None:
+    """
+    Suma (signo=1) o resta (signo=-1) los movimientos PERSISTIDOS de un documento
+    en la tabla de saldos mensuales. Debe llamarse después del flush de los
+    movimientos (creación) o antes de borrarlos (eliminación / edición).
+    El llamador decide si el documento cuenta (no anulado).
+    """
+    conn = db.connection()
+    filas = conn.execute(
+        select(
+            Documento.empresa_id,
+            Documento.fecha,
+            MovimientoContable.cuenta_id,
+            MovimientoContable.centro_costo_id,
+            func.sum(MovimientoContable.debito),
+            func.sum(MovimientoContable.credito),
+            func.count(MovimientoContable.id),
+        )
+        .join(Documento, Documento.id == MovimientoContable.documento_id)
+        .where(MovimientoContable.documento_id == documento_id)
+        .group_by(Documento.empresa_id, Documento.fecha, MovimientoContable.cuenta_id, MovimientoContable.centro_costo_id)
+    ).all()
+
+    deltas: Dict[tuple, list] = {}
+    for empresa_id, fecha, cuenta_id, cc_id, debito, credito, cantidad in filas:
+        _acumular(deltas, empresa_id, cuenta_id, cc_id, fecha,
+                  _dec(debito) * signo, _dec(credito) * signo, int(cantidad) * signo)
+    _upsert_deltas(conn, deltas)
+
+
+def retirar_documento(db: Session, documento_id: int) -> None:
+    """Atajo de aplicar_documento(signo=-1)."""
+    aplicar_documento(db, documento_id, signo=-1)
+
+
+def aplicar_movimientos(db: Session, movimientos: Iterable[tuple]) -> None:
+    """
+    Suma movimientos insertados sin pasar por el flush del ORM (creación masiva
+    con INSERT por lotes), en un solo upsert.
+    movimientos: (empresa_id, fecha, cuenta_id, centro_costo_id, debito, credito).
+    """
+    deltas: Dict[tuple, list] = {}
+    for empresa_id, fecha, cuenta_id, cc_id, debito, credito in movimientos:
+        _acumular(deltas, empresa_id, cuenta_id, cc_id, fecha, debito, credito, 1)
+    _upsert_deltas(db.connection(), deltas)
+
+
+def _valores_actuales(obj: MovimientoContable) -> Tuple[int, Optional[int], Decimal, Decimal]:
+    return obj.cuenta_id, obj.centro_costo_id, _dec(obj.debito), _dec(obj.credito)
+
+
+def _cambio_saldo(obj) -> bool:
+    estado = inspect(obj)
+    return any(estado.attrs[campo].history.has_changes() for campo in _CAMPOS_SALDO)
+
+
+@event.listens_for(Session, "before_flush")
+def _capturar_ajustes_movimientos(session, flush_context, instances):
+    """
+    Ajustes directos sobre movimientos ya persistidos (p.ej. la sincronización de
+    costo de venta del recálculo de inventario o la edición de kárdex) no pasan
+    por los ganchos del servicio de documentos. Aquí se comparan contra su valor
+    en BD (antes del UPDATE) y se aplica la diferencia a los saldos mensuales.
+    Los movimientos borrados con session.delete() retiran su valor en BD; los que
+    ya se borraron con un DELETE masivo (tras retirar_documento) no aparecen en la
+    consulta y no se descuentan dos veces.
+    """
+    modificados = [
+        obj for obj in session.dirty
+        if isinstance(obj, MovimientoContable)
+        and obj.id is not None
+        and obj not in session.deleted
+        and _cambio_saldo(obj)
+    ]
+    borrados = [obj for obj in session.deleted if isinstance(obj, MovimientoContable) and obj.id is not None]
+    cierres = _cierres_por_beneficiario(session)
+    if not modificados and not borrados and not cierres:
+        return
+
+    conn = session.connection()
+    anteriores = {
+        fila.id: fila for fila in conn.execute(
+            select(
+                MovimientoContable.id,
+                MovimientoContable.cuenta_id,
+                MovimientoContable.centro_costo_id,
+                MovimientoContable.debito,
+                MovimientoContable.credito,
+                Documento.empresa_id,
+                Documento.fecha,
+            )
+            .join(Documento, Documento.id == MovimientoContable.documento_id)
+            .where(
+                MovimientoContable.id.in_([m.id for m in modificados + borrados]),
+                Documento.anulado == False,
+            )
+        )
+    }
+
+    deltas: Dict[tuple, list] = {}
+    for obj in modificados:
+        previo = anteriores.get(obj.id)
+        if previo is None:
+            continue  # Documento anulado: no participa en los saldos
+        cuenta_id, cc_id, debito, credito = _valores_actuales(obj)
+        _acumular(deltas, previo.empresa_id, previo.cuenta_id, previo.centro_costo_id, previo.fecha,
+                  -_dec(previo.debito), -_dec(previo.credito), -1)
+        _acumular(deltas, previo.empresa_id, cuenta_id, cc_id, previo.fecha, debito, credito, 1)
+        if inspect(obj).attrs.tercero_id.history.has_changes():
+            cierres.append(_periodo(previo.empresa_id, previo.fecha))
+    for obj in borrados:
+        previo = anteriores.get(obj.id)
+        if previo is not None:
+            _acumular(deltas, previo.empresa_id, previo.cuenta_id, previo.centro_costo_id, previo.fecha,
+                      -_dec(previo.debito), -_dec(previo.credito), -1)
+    _upsert_deltas(conn, deltas)
+    _invalidar_cierres(conn, cierres)
+
+
+def _periodo(empresa_id: int, fecha: date) -> dict:
+    return {"empresa_id": empresa_id, "ano": fecha.year, "mes": fecha.month}
+
+
+def _cierres_por_beneficiario(session) -> List[dict]:
+    """Períodos (fecha más antigua, anterior o nueva) de documentos cuyo beneficiario cambia."""
+    periodos = []
+    for obj in session.dirty:
+        if not isinstance(obj, Documento) or obj in session.deleted or obj.id is None:
+            continue
+        estado = inspect(obj)
+        if not estado.attrs.beneficiario_id.history.has_changes():
+            continue
+        historia = estado.attrs.fecha.history
+        fechas = [f for f in (*historia.added, *historia.unchanged, *historia.deleted) if f is not None]
+        if fechas:
+            periodos.append(_periodo(obj.empresa_id, min(fechas)))
+    return periodos
+
+
+# Columnas que, cambiadas con UPDATE masivo, invalidan las fotos de cierre por tercero
+_COLUMNAS_TERCERO = {Documento: "beneficiario_id", MovimientoContable: "tercero_id"}
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidar_cierres_update_masivo(orm_execute_state):
+    """
+    Un UPDATE masivo del beneficiario o del tercero (fusión de terceros) no pasa por
+    el flush: antes de ejecutarlo se invalidan las fotos desde el mes más antiguo
+    de las filas que cumple su WHERE.
+    """
+    if not orm_execute_state.is_update or orm_execute_state.bind_mapper is None:
+        return
+    modelo = orm_execute_state.bind_mapper.class_
+    columna = _COLUMNAS_TERCERO.get(modelo)
+    if columna is None:
+        return
+    sentencia = orm_execute_state.statement
+    parametros = orm_execute_state.parameters
+    valores = sentencia._values or dict(sentencia._ordered_values or ())
+    if valores:
+        asignadas = {getattr(clave, "key", clave) for clave in valores}
+    elif isinstance(parametros, list):
+        asignadas = {clave for fila in parametros for clave in fila}
+    else:
+        asignadas = set()
+    if columna not in asignadas:
+        return
+
+    consulta = select(Documento.empresa_id, func.min(Documento.fecha)).group_by(Documento.empresa_id)
+    if modelo is MovimientoContable:
+        consulta = consulta.select_from(MovimientoContable).join(
+            Documento, Documento.id == MovimientoContable.documento_id
+        )
+    if isinstance(parametros, list):
+        consulta = consulta.where(modelo.id.in_([fila["id"] for fila in parametros if "id" in fila]))
+        parametros = {}
+    elif sentencia.whereclause is not None:
+        consulta = consulta.where(sentencia.whereclause)
+    conn = orm_execute_state.session.connection()
+    _invalidar_cierres(conn, [
+        _periodo(empresa_id, fecha) for empresa_id, fecha in conn.execute(consulta, parametros or {}) if fecha is not None
+    ])
+
+
+@event.listens_for(Session, "after_flush")
+def _capturar_movimientos_nuevos(session, flush_context):
+    """
+    Suma los movimientos recién insertados de documentos activos. Cubre a todos
+    los servicios que crean documentos (no solo documento.create_documento).
+    """
+    nuevos = [obj for obj in session.new if isinstance(obj, MovimientoContable)]
+    if not nuevos:
+        return
+
+    conn = session.connection()
+    documentos = {
+        fila.id: fila for fila in conn.execute(
+            select(Documento.id, Documento.empresa_id, Documento.fecha)
+            .where(
+                Documento.id.in_({m.documento_id for m in nuevos}),
+                Documento.anulado == False,
+            )
+        )
+    }
+
+    deltas: Dict[tuple, list] = {}
+    for obj in nuevos:
+        doc = documentos.get(obj.documento_id)
+        if doc is None or doc.fecha is None:
+            continue  # Documento anulado: no participa en los saldos
+        cuenta_id, cc_id, debito, credito = _valores_actuales(obj)
+        _acumular(deltas, doc.empresa_id, cuenta_id, cc_id, doc.fecha, debito, credito, 1)
+    _upsert_deltas(conn, deltas)
+
+
+# ==========================================================
+# 2. RECONSTRUCCIÓN
+# ==========================================================
+
+def reconstruir_saldos_mensuales(db: Session, empresa_id: int, commit: bool = True) -> Dict[str, int]:
+    """
+    Regenera desde cero los saldos mensuales de una empresa a partir de
+    movimientos_contables y marca la empresa como lista para consulta.
+    """
+    db.execute(delete(SaldoMensualCuenta).where(SaldoMensualCuenta.empresa_id == empresa_id))
+
+    ano = cast(extract("year", Documento.fecha), Integer)
+    mes = cast(extract("month", Documento.fecha), Integer)
+    cc = func.coalesce(MovimientoContable.centro_costo_id, 0)
+    origen = (
+        select(
+            Documento.empresa_id,
+            MovimientoContable.cuenta_id,
+            cc,
+            ano,
+            mes,
+            func.coalesce(func.sum(MovimientoContable.debito), 0),
+            func.coalesce(func.sum(MovimientoContable.credito), 0),
+            func.count(MovimientoContable.id),
+        )
+        .join(Documento, Documento.id == MovimientoContable.documento_id)
+        .where(Documento.empresa_id == empresa_id, Documento.anulado == False)
+        .group_by(Documento.empresa_id, MovimientoContable.cuenta_id, cc, ano, mes)
+    )
+    db.execute(
+        insert(SaldoMensualCuenta.__table__).from_select(
+            ["empresa_id", "cuenta_id", "centro_costo_id", "ano", "mes", "debito", "credito", "cantidad_movimientos"],
+            origen,
+        )
+    )
+
+    estado = db.get(SaldoMensualEstado, empresa_id)
+    if estado:
+        estado.fecha_reconstruccion = datetime.utcnow()
+    else:
+        db.add(SaldoMensualEstado(empresa_id=empresa_id, fecha_reconstruccion=datetime.utcnow()))
+
+    total = db.query(func.count(SaldoMensualCuenta.id)).filter(SaldoMensualCuenta.empresa_id == empresa_id).scalar() or 0
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return {"empresa_id": empresa_id, "filas": int(total)}
+
+
+def usa_saldos_mensuales(db: Session, empresa_id: int) -> bool:
+    """True si la empresa ya tiene la tabla de saldos reconstruida."""
+    return db.query(SaldoMensualEstado.empresa_id).filter(SaldoMensualEstado.empresa_id == empresa_id).first() is not None
+
+
+# ==========================================================
+# 3. CONSULTA
+# ==========================================================
+
+def _fin_de_mes(d: date) -> date:
+    siguiente = date(d.year + (d.month // 12), (d.month % 12) + 1, 1)
+    return siguiente - timedelta(days=1)
+
+
+def _segmentar_rango(fecha_desde: Optional[date], fecha_hasta: Optional[date]):
+    """
+    Divide [fecha_desde, fecha_hasta] en:
+      - un rango de meses completos (periodo AAAAMM inicial, periodo final) o None
+      - una lista de rangos de días que deben consultarse en vivo
+    fecha_desde=None significa "desde el inicio de los tiempos" y
+    fecha_hasta=None "sin fecha de corte".
+    """
+    if fecha_desde is not None and fecha_hasta is not None and fecha_desde > fecha_hasta:
+        return None, []
+
+    if fecha_desde is None:
+        primer_mes = None
+    elif fecha_desde.day == 1:
+        primer_mes = fecha_desde
+    else:
+        primer_mes = _fin_de_mes(fecha_desde) + timedelta(days=1)
+
+    if fecha_hasta is None:
+        ultimo_mes = None
+    elif fecha_hasta == _fin_de_mes(fecha_hasta):
+        ultimo_mes = fecha_hasta.replace(day=1)
+    else:
+        ultimo_mes = fecha_hasta.replace(day=1) - timedelta(days=1)
+        ultimo_mes = ultimo_mes.replace(day=1)
+
+    if primer_mes is not None and ultimo_mes is not None and primer_mes > ultimo_mes:
+        return None, [(fecha_desde, fecha_hasta)]
+
+    meses = (
+        primer_mes.year * 100 + primer_mes.month if primer_mes else None,
+        ultimo_mes.year * 100 + ultimo_mes.month if ultimo_mes else None,
+    )
+    en_vivo = []
+    if primer_mes is not None and fecha_desde < primer_mes:
+        en_vivo.append((fecha_desde, primer_mes - timedelta(days=1)))
+    if ultimo_mes is not None:
+        despues = _fin_de_mes(ultimo_mes) + timedelta(days=1)
+        if despues <= fecha_hasta:
+            en_vivo.append((despues, fecha_hasta))
+    return meses, en_vivo
+
+
+def _sumas_en_vivo(db: Session, empresa_id: int, fecha_desde: Optional[date], fecha_hasta: Optional[date],
+                   centro_costo_id: Optional[int], cuenta_ids: Optional[Iterable[int]]):
+    q = db.query(
+        MovimientoContable.cuenta_id,
+        func.sum(MovimientoContable.debito).label("debito"),
+        func.sum(MovimientoContable.credito).label("credito"),
+    ).join(Documento, Documento.id == MovimientoContable.documento_id).filter(
+        Documento.empresa_id == empresa_id,
+        Documento.anulado == False,
+    )
+    if fecha_hasta is not None:
+        q = q.filter(Documento.fecha <= fecha_hasta)
+    if fecha_desde is not None:
+        q = q.filter(Documento.fecha >= fecha_desde)
+    if centro_costo_id:
+        q = q.filter(MovimientoContable.centro_costo_id == centro_costo_id)
+    if cuenta_ids is not None:
+        q = q.filter(MovimientoContable.cuenta_id.in_(list(cuenta_ids)))
+    return q.group_by(MovimientoContable.cuenta_id).all()
+
+
+def sumas_por_cuenta(
+    db: Session,
+    empresa_id: int,
+    fecha_hasta: Optional[date],
+    fecha_desde: Optional[date] = None,
+    centro_costo_id: Optional[int] = None,
+    cuenta_ids: Optional[Iterable[int]] = None,
+) -> Dict[int, Tuple[Decimal, Decimal]]:
+    """
+    Retorna {cuenta_id: (debito, credito)} de documentos no anulados entre
+    fecha_desde (None = desde el inicio) y fecha_hasta (None = sin corte), inclusive.
+    Usa la tabla materializada para meses completos y consulta en vivo solo los
+    días de los meses borde. Si la empresa aún no tiene la tabla reconstruida,
+    todo el rango se consulta en vivo. Cuando el rango empieza en el inicio de
+    los tiempos, se parte de la foto del último período cerrado (saldos_cierre).
+    """
+    if isinstance(fecha_hasta, datetime):
+        fecha_hasta = fecha_hasta.date()
+    if isinstance(fecha_desde, datetime):
+        fecha_desde = fecha_desde.date()
+    if cuenta_ids is not None:
+        cuenta_ids = list(cuenta_ids)
+        if not cuenta_ids:
+            return {}
+
+    resultado: Dict[int, List[Decimal]] = {}
+
+    def _sumar(cuenta_id, debito, credito):
+        par = resultado.setdefault(cuenta_id, [CERO, CERO])
+        par[0] += _dec(debito)
+        par[1] += _dec(credito)
+
+    # Saldos acumulados desde el inicio: partimos de la foto congelada del
+    # último período cerrado y seguimos desde el día siguiente.
+    if fecha_desde is None and fecha_hasta is not None:
+        from app.services import saldos_cierre as saldos_cierre_service
+        cierre = saldos_cierre_service.ultimo_cierre_valido(db, empresa_id, fecha_hasta)
+        if cierre:
+            for cuenta_id, (debito, credito) in saldos_cierre_service.sumas_congeladas_por_cuenta(
+                db, cierre, cuenta_ids=cuenta_ids, centro_costo_id=centro_costo_id
+            ).items():
+                _sumar(cuenta_id, debito, credito)
+            fecha_desde = saldos_cierre_service.fecha_fin_cierre(cierre) + timedelta(days=1)
+            if fecha_desde > fecha_hasta:
+                return {k: (v[0], v[1]) for k, v in resultado.items()}
+
+    if usa_saldos_mensuales(db, empresa_id):
+        meses, en_vivo = _segmentar_rango(fecha_desde, fecha_hasta)
+    else:
+        meses, en_vivo = None, [(fecha_desde, fecha_hasta)]
+
+    if meses:
+        periodo = SaldoMensualCuenta.ano * 100 + SaldoMensualCuenta.mes
+        q = db.query(
+            SaldoMensualCuenta.cuenta_id,
+            func.sum(SaldoMensualCuenta.debito).label("debito"),
+            func.sum(SaldoMensualCuenta.credito).label("credito"),
+        ).filter(SaldoMensualCuenta.empresa_id == empresa_id)
+        if meses[1] is not None:
+            q = q.filter(periodo <= meses[1])
+        if meses[0] is not None:
+            q = q.filter(periodo >= meses[0])
+        if centro_costo_id:
+            q = q.filter(SaldoMensualCuenta.centro_costo_id == centro_costo_id)
+        if cuenta_ids is not None:
+            q = q.filter(SaldoMensualCuenta.cuenta_id.in_(cuenta_ids))
+        for fila in q.group_by(SaldoMensualCuenta.cuenta_id).all():
+            _sumar(fila.cuenta_id, fila.debito, fila.credito)
+
+    for desde, hasta in en_vivo:
+        for fila in _sumas_en_vivo(db, empresa_id, desde, hasta, centro_costo_id, cuenta_ids):
+            _sumar(fila.cuenta_id, fila.debito, fila.credito)
+
+    return {k: (v[0], v[1]) for k, v in resultado.items()}
+
+
+def sumas_por_codigo(
+    db: Session,
+    empresa_id: int,
+    fecha_hasta: Optional[date],
+    fecha_desde: Optional[date] = None,
+    prefijos: Optional[Iterable[str]] = None,
+    centro_costo_id: Optional[int] = None,
+) -> List[SumaCuenta]:
+    """
+    Igual que sumas_por_cuenta pero resuelto contra el PUC: retorna filas
+    (cuenta_id, codigo, nombre, total_debito, total_credito) de las cuentas con
+    movimiento, opcionalmente filtradas por prefijos de código ('1', '2', ...).
+    """
+    q_cuentas = db.query(PlanCuenta.id, PlanCuenta.codigo, PlanCuenta.nombre).filter(PlanCuenta.empresa_id == empresa_id)
+    if prefijos:
+        q_cuentas = q_cuentas.filter(or_(*[PlanCuenta.codigo.startswith(p) for p in prefijos]))
+    cuentas = {c.id: c for c in q_cuentas.all()}
+    if not cuentas:
+        return []
+
+    sumas = sumas_por_cuenta(
+        db, empresa_id, fecha_hasta, fecha_desde=fecha_desde, centro_costo_id=centro_costo_id,
+        cuenta_ids=cuentas.keys() if prefijos else None,
+    )
+    return [
+        SumaCuenta(cuenta_id, cuentas[cuenta_id].codigo, cuentas[cuenta_id].nombre, debito, credito)
+        for cuenta_id, (debito, credito) in sumas.items()
+        if cuenta_id in cuentas
+    ]
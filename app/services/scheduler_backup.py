@@ -6,6 +6,8 @@ import zipfile
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.executors.pool import ThreadPoolExecutor
 from sqlalchemy.orm import Session
 import pytz
 
@@ -13,6 +15,7 @@ import pytz
 BOGOTA_TZ = pytz.timezone('America/Bogota')
 
 from app.core.database import SessionLocal
+from app.core.config import settings
 from app.services import migracion as migracion_service
 from app.models.empresa import Empresa
 
@@ -40,7 +43,13 @@ def _save_to_db(full_config):
     finally:
         db.close()
 
-scheduler = BackgroundScheduler(timezone=BOGOTA_TZ)
+# Los trabajos de reportes (app/services/trabajos_reportes.py) usan su propio jobstore y executor:
+# recargar la programación de backups no los borra y no compiten por los hilos de los backups.
+scheduler = BackgroundScheduler(
+    timezone=BOGOTA_TZ,
+    jobstores={"default": MemoryJobStore(), "reportes": MemoryJobStore()},
+    executors={"default": ThreadPoolExecutor(10), "reportes": ThreadPoolExecutor(max(1, settings.REPORTES_WORKERS))},
+)
 
 def get_global_backup_path() -> str:
     """Devuelve la ruta configurada para los backups globales"""
@@ -478,7 +487,7 @@ def schedule_backup_jobs():
     config = load_config(empresa_id=None)
     companies = config.get("companies", {})
     
-    scheduler.remove_all_jobs()
+    scheduler.remove_all_jobs(jobstore="default")
     
     for str_id, cfg in companies.items():
         if cfg.get("enabled", False):
@@ -3,7 +3,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_, cast, String, Boolean
 from fastapi import HTTPException
 from datetime import date
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
+import itertools
 import math
 
 from app.models import (
@@ -21,6 +22,9 @@ from app.models import (
     Producto as models_producto # Importamos modelo Producto
 )
 from app.schemas import documento as schemas_doc
+from app.services import exportacion_streaming
+from app.services import paginacion_keyset
+from app.services import busqueda
 # ReportLab Imports
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import landscape, letter
@@ -31,7 +35,6 @@ from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 from io import BytesIO
 import time as time_module
 from datetime import datetime
-from weasyprint import HTML
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import landscape, letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, LongTable
@@ -43,17 +46,182 @@ import time as time_module
 from datetime import datetime
 
 # --- INICIO: ARQUITECTURA DE PLANTILLAS REFACTORIZADA ---
-# 1. Importamos el nuevo diccionario con las plantillas pre-compiladas.
-from app.services._templates_empaquetados import TEMPLATES_EMPAQUETADOS
+# 1. Plantillas empaquetadas (carga perezosa) y registro de plantillas compiladas.
+from app.services.plantillas_html import TEMPLATES_EMPAQUETADOS
+from app.services import plantillas_html
 
-# 2. Importamos Jinja2 Environment.
-from jinja2 import Environment, select_autoescape
-
-# 3. Creamos una instancia del entorno de Jinja2 para este módulo.
-GLOBAL_JINJA_ENV = Environment(loader=None, autoescape=select_autoescape(['html', 'xml']))
+# 2. Entorno de Jinja2 de este módulo (con el cargador de plantillas empaquetadas).
+GLOBAL_JINJA_ENV = plantillas_html.crear_entorno()
 # --- FIN: ARQUITECTURA DE PLANTILLAS REFACTORIZADA ---
 
 
+def _consulta_movimientos(db: Session, filtros: schemas_doc.DocumentoGestionFiltros, empresa_id: int):
+    """
+    Construye (sin ejecutar) la consulta de movimientos del Super Informe con
+    todos los filtros aplicados. Retorna (query, tabla_documento, tabla_movimiento);
+    query es None si el estado de documento no es válido.
+    """
+    # Alias para joins
+    from sqlalchemy.orm import aliased
+    TerceroMov = aliased(models_tercero)
+    UsuarioCreator = aliased(models_usuario)
+    UsuarioOperator = aliased(models_usuario)
+
+    query = None
+    if filtros.estadoDocumento in ['activos', 'anulados']:
+        base_query = db.query(
+            models_mov.id.label('movimiento_id'),
+            models_doc.id.label('documento_id'),
+            models_doc.fecha,
+            models_tipo.nombre.label("tipo_documento"),
+            models_doc.numero,
+            func.coalesce(models_tercero.razon_social, '').label("beneficiario_doc"),
+            func.coalesce(TerceroMov.razon_social, '').label("beneficiario_mov"),
+            models_plan.codigo.label("cuenta_codigo"),
+            models_plan.nombre.label("cuenta_nombre"),
+            models_centro_costo.nombre.label("centro_costo"),
+            models_mov.concepto,
+            models_mov.debito,
+            models_mov.credito,
+            models_doc.anulado,
+            models_doc.estado,
+            models_doc.usuario_creador_id,
+            models_log.razon.label('justificacion'),
+            models_log.usuario_id.label('usuario_operacion_id'),
+            # --- NUEVAS COLUMNAS DE USUARIO (Optimize joins) ---
+            func.coalesce(UsuarioCreator.nombre_completo, UsuarioCreator.email, 'N/A').label('usuario_creador_nombre'),
+            func.coalesce(UsuarioOperator.nombre_completo, UsuarioOperator.email, 'N/A').label('usuario_operacion_nombre'),
+            # --- COLUMNAS DE PRODUCTO ---
+            models_producto.codigo.label("producto_codigo"),
+            models_producto.nombre.label("producto_nombre"),
+            models_mov.cantidad.label("cantidad_movimiento")
+        ).join(models_doc, models_mov.documento_id == models_doc.id)\
+        .join(models_plan, models_mov.cuenta_id == models_plan.id)\
+        .join(models_tipo, models_doc.tipo_documento_id == models_tipo.id)\
+        .outerjoin(models_tercero, models_doc.beneficiario_id == models_tercero.id)\
+        .outerjoin(TerceroMov, models_mov.tercero_id == TerceroMov.id)\
+        .outerjoin(models_centro_costo, models_mov.centro_costo_id == models_centro_costo.id)\
+        .outerjoin(models_producto, models_mov.producto_id == models_producto.id)\
+        .outerjoin(models_log, and_(
+            models_log.tipo_operacion == 'ANULACION',
+            models_log.documento_id_asociado == models_doc.id
+        ))\
+        .outerjoin(UsuarioCreator, models_doc.usuario_creador_id == UsuarioCreator.id)\
+        .outerjoin(UsuarioOperator, models_log.usuario_id == UsuarioOperator.id)\
+        .filter(models_doc.empresa_id == empresa_id)
+
+        if filtros.estadoDocumento == 'activos':
+            query = base_query.filter(models_doc.anulado == False, models_doc.estado == 'ACTIVO')
+        elif filtros.estadoDocumento == 'anulados':
+            query = base_query.filter(models_doc.anulado == True, models_doc.estado == 'ANULADO')
+
+    elif filtros.estadoDocumento == 'eliminados':
+         query = db.query(
+            models_mov_elim.id.label('movimiento_id'),
+            models_doc_elim.id.label('documento_id'),
+            models_doc_elim.fecha,
+            models_tipo.nombre.label("tipo_documento"),
+            models_doc_elim.numero,
+            models_tercero.razon_social.label("beneficiario"),
+            models_plan.codigo.label("cuenta_codigo"),
+            models_plan.nombre.label("cuenta_nombre"),
+            models_centro_costo.nombre.label("centro_costo"),
+            models_mov_elim.concepto,
+            models_mov_elim.debito,
+            models_mov_elim.credito,
+            cast(True, Boolean).label('anulado'),
+            cast('ELIMINADO', String).label('estado'),
+            models_doc_elim.usuario_creador_id,
+            models_log.razon.label('justificacion'),
+            models_log.usuario_id.label('usuario_operacion_id'),
+            # --- NUEVAS COLUMNAS DE USUARIO (Optimizadas) ---
+            func.coalesce(UsuarioCreator.nombre_completo, UsuarioCreator.email, 'N/A').label('usuario_creador_nombre'),
+            func.coalesce(UsuarioOperator.nombre_completo, UsuarioOperator.email, 'N/A').label('usuario_operacion_nombre')
+        ).join(models_doc_elim, models_mov_elim.documento_eliminado_id == models_doc_elim.id)\
+        .join(models_log, models_doc_elim.log_eliminacion_id == models_log.id)\
+        .join(models_plan, models_mov_elim.cuenta_id == models_plan.id)\
+        .join(models_tipo, models_doc_elim.tipo_documento_id == models_tipo.id)\
+        .outerjoin(models_tercero, models_doc_elim.beneficiario_id == models_tercero.id)\
+        .outerjoin(models_centro_costo, models_mov_elim.centro_costo_id == models_centro_costo.id)\
+        .outerjoin(UsuarioCreator, models_doc_elim.usuario_creador_id == UsuarioCreator.id)\
+        .outerjoin(UsuarioOperator, models_log.usuario_id == UsuarioOperator.id)\
+        .filter(models_doc_elim.empresa_id == empresa_id)
+
+    if query is None:
+        return None, None, None
+
+    table_doc = models_doc_elim if filtros.estadoDocumento == 'eliminados' else models_doc
+    table_mov = models_mov_elim if filtros.estadoDocumento == 'eliminados' else models_mov
+
+    if filtros.fechaInicio: query = query.filter(table_doc.fecha >= filtros.fechaInicio)
+    if filtros.fechaFin: query = query.filter(table_doc.fecha <= filtros.fechaFin)
+    if filtros.tipoDocIds: query = query.filter(table_doc.tipo_documento_id.in_(filtros.tipoDocIds))
+
+    if filtros.numero:
+        try:
+            raw_nums = str(filtros.numero).replace(' ', '').split(',')
+
+            if filtros.estadoDocumento == 'eliminados':
+                if len(raw_nums) > 1:
+                    query = query.filter(table_doc.numero.in_(raw_nums))
+                else:
+                    query = query.filter(table_doc.numero == raw_nums[0])
+            else:
+                parsed_nums = [int(n) for n in raw_nums if n.isdigit()]
+                if parsed_nums:
+                    if len(parsed_nums) > 1:
+                        query = query.filter(table_doc.numero.in_(parsed_nums))
+                    else:
+                        query = query.filter(table_doc.numero == parsed_nums[0])
+
+        except (ValueError, TypeError):
+            pass
+
+    if filtros.terceroIds: query = query.filter(table_doc.beneficiario_id.in_(filtros.terceroIds))
+    if filtros.cuentaIds: query = query.filter(table_mov.cuenta_id.in_(filtros.cuentaIds))
+    if filtros.centroCostoIds: query = query.filter(table_mov.centro_costo_id.in_(filtros.centroCostoIds))
+
+    if filtros.productoIds and filtros.estadoDocumento != 'eliminados':
+         query = query.filter(table_mov.producto_id.in_(filtros.productoIds))
+
+    if filtros.conceptoKeyword: query = query.filter(busqueda.condicion(db, "concepto", filtros.conceptoKeyword, objetivo=table_mov))
+
+    if filtros.valorOperador and filtros.valorMonto is not None:
+        monto = filtros.valorMonto
+        if filtros.valorOperador == 'mayor':
+            query = query.filter(or_(table_mov.debito > monto, table_mov.credito > monto))
+        elif filtros.valorOperador == 'menor':
+            query = query.filter(or_(
+                and_(table_mov.debito < monto, table_mov.debito > 0),
+                and_(table_mov.credito < monto, table_mov.credito > 0)
+            ))
+        elif filtros.valorOperador == 'igual':
+            query = query.filter(or_(table_mov.debito == monto, table_mov.credito == monto))
+        elif filtros.valorOperador == 'entre' and filtros.valorMontoFin is not None:
+            monto_fin = filtros.valorMontoFin
+            query = query.filter(or_(
+                and_(table_mov.debito >= monto, table_mov.debito <= monto_fin),
+                and_(table_mov.credito >= monto, table_mov.credito <= monto_fin)
+            ))
+
+    return query, table_doc, table_mov
+
+
+def _fila_super_informe(r) -> Dict[str, Any]:
+    fila = r._asdict()
+
+    # Fallback lógica de beneficiario
+    if fila.get('beneficiario_mov'):
+        fila['beneficiario'] = fila['beneficiario_mov']
+    elif fila.get('beneficiario_doc'):
+        fila['beneficiario'] = fila['beneficiario_doc']
+
+    # Mapear nombres directos
+    fila['usuario_creador'] = fila.get('usuario_creador_nombre', 'N/A')
+    fila['usuario_operacion'] = fila.get('usuario_operacion_nombre', 'N/A')
+    return fila
+
+
 def generate_super_informe(db: Session, filtros: schemas_doc.DocumentoGestionFiltros, empresa_id: int) -> Dict[str, Any]:
     """
     Motor de búsqueda dinámico para el Super Informe, con lógica de paginación completa
@@ -64,149 +232,11 @@ def generate_super_informe(db: Session, filtros: schemas_doc.DocumentoGestionFil
 
     try:
         tipo_entidad = filtros.tipoEntidad
-        query = None
-
-        # Alias para joins
-        from sqlalchemy.orm import aliased
-        TerceroMov = aliased(models_tercero)
-        UsuarioCreator = aliased(models_usuario)
-        UsuarioOperator = aliased(models_usuario)
 
         if tipo_entidad == 'movimientos':
-            if filtros.estadoDocumento in ['activos', 'anulados']:
-                base_query = db.query(
-                    models_mov.id.label('movimiento_id'),
-                    models_doc.id.label('documento_id'),
-                    models_doc.fecha,
-                    models_tipo.nombre.label("tipo_documento"),
-                    models_doc.numero,
-                    func.coalesce(models_tercero.razon_social, '').label("beneficiario_doc"),
-                    func.coalesce(TerceroMov.razon_social, '').label("beneficiario_mov"),
-                    models_plan.codigo.label("cuenta_codigo"),
-                    models_plan.nombre.label("cuenta_nombre"),
-                    models_centro_costo.nombre.label("centro_costo"),
-                    models_mov.concepto,
-                    models_mov.debito,
-                    models_mov.credito,
-                    models_doc.anulado,
-                    models_doc.estado,
-                    models_doc.usuario_creador_id,
-                    models_log.razon.label('justificacion'),
-                    models_log.usuario_id.label('usuario_operacion_id'),
-                    # --- NUEVAS COLUMNAS DE USUARIO (Optimize joins) ---
-                    func.coalesce(UsuarioCreator.nombre_completo, UsuarioCreator.email, 'N/A').label('usuario_creador_nombre'),
-                    func.coalesce(UsuarioOperator.nombre_completo, UsuarioOperator.email, 'N/A').label('usuario_operacion_nombre'),
-                    # --- COLUMNAS DE PRODUCTO ---
-                    models_producto.codigo.label("producto_codigo"),
-                    models_producto.nombre.label("producto_nombre"),
-                    models_mov.cantidad.label("cantidad_movimiento")
-                ).join(models_doc, models_mov.documento_id == models_doc.id)\
-                .join(models_plan, models_mov.cuenta_id == models_plan.id)\
-                .join(models_tipo, models_doc.tipo_documento_id == models_tipo.id)\
-                .outerjoin(models_tercero, models_doc.beneficiario_id == models_tercero.id)\
-                .outerjoin(TerceroMov, models_mov.tercero_id == TerceroMov.id)\
-                .outerjoin(models_centro_costo, models_mov.centro_costo_id == models_centro_costo.id)\
-                .outerjoin(models_producto, models_mov.producto_id == models_producto.id)\
-                .outerjoin(models_log, and_(
-                    models_log.tipo_operacion == 'ANULACION',
-                    models_log.documento_id_asociado == models_doc.id
-                ))\
-                .outerjoin(UsuarioCreator, models_doc.usuario_creador_id == UsuarioCreator.id)\
-                .outerjoin(UsuarioOperator, models_log.usuario_id == UsuarioOperator.id)\
-                .filter(models_doc.empresa_id == empresa_id)
-
-                if filtros.estadoDocumento == 'activos':
-                    query = base_query.filter(models_doc.anulado == False, models_doc.estado == 'ACTIVO')
-                elif filtros.estadoDocumento == 'anulados':
-                    query = base_query.filter(models_doc.anulado == True, models_doc.estado == 'ANULADO')
-
-            elif filtros.estadoDocumento == 'eliminados':
-                 query = db.query(
-                    models_mov_elim.id.label('movimiento_id'),
-                    models_doc_elim.id.label('documento_id'),
-                    models_doc_elim.fecha,
-                    models_tipo.nombre.label("tipo_documento"),
-                    models_doc_elim.numero,
-                    models_tercero.razon_social.label("beneficiario"),
-                    models_plan.codigo.label("cuenta_codigo"),
-                    models_plan.nombre.label("cuenta_nombre"),
-                    models_centro_costo.nombre.label("centro_costo"),
-                    models_mov_elim.concepto,
-                    models_mov_elim.debito,
-                    models_mov_elim.credito,
-                    cast(True, Boolean).label('anulado'),
-                    cast('ELIMINADO', String).label('estado'),
-                    models_doc_elim.usuario_creador_id,
-                    models_log.razon.label('justificacion'),
-                    models_log.usuario_id.label('usuario_operacion_id'),
-                    # --- NUEVAS COLUMNAS DE USUARIO (Optimizadas) ---
-                    func.coalesce(UsuarioCreator.nombre_completo, UsuarioCreator.email, 'N/A').label('usuario_creador_nombre'),
-                    func.coalesce(UsuarioOperator.nombre_completo, UsuarioOperator.email, 'N/A').label('usuario_operacion_nombre')
-                ).join(models_doc_elim, models_mov_elim.documento_eliminado_id == models_doc_elim.id)\
-                .join(models_log, models_doc_elim.log_eliminacion_id == models_log.id)\
-                .join(models_plan, models_mov_elim.cuenta_id == models_plan.id)\
-                .join(models_tipo, models_doc_elim.tipo_documento_id == models_tipo.id)\
-                .outerjoin(models_tercero, models_doc_elim.beneficiario_id == models_tercero.id)\
-                .outerjoin(models_centro_costo, models_mov_elim.centro_costo_id == models_centro_costo.id)\
-                .outerjoin(UsuarioCreator, models_doc_elim.usuario_creador_id == UsuarioCreator.id)\
-                .outerjoin(UsuarioOperator, models_log.usuario_id == UsuarioOperator.id)\
-                .filter(models_doc_elim.empresa_id == empresa_id)
-
-            if query:
-                table_doc = models_doc_elim if filtros.estadoDocumento == 'eliminados' else models_doc
-                table_mov = models_mov_elim if filtros.estadoDocumento == 'eliminados' else models_mov
-
-                if filtros.fechaInicio: query = query.filter(table_doc.fecha >= filtros.fechaInicio)
-                if filtros.fechaFin: query = query.filter(table_doc.fecha <= filtros.fechaFin)
-                if filtros.tipoDocIds: query = query.filter(table_doc.tipo_documento_id.in_(filtros.tipoDocIds))
-
-                if filtros.numero:
-                    try:
-                        raw_nums = str(filtros.numero).replace(' ', '').split(',')
-                        
-                        if filtros.estadoDocumento == 'eliminados':
-                            if len(raw_nums) > 1:
-                                query = query.filter(table_doc.numero.in_(raw_nums))
-                            else:
-                                query = query.filter(table_doc.numero == raw_nums[0])
-                        else:
-                            parsed_nums = [int(n) for n in raw_nums if n.isdigit()]
-                            if parsed_nums:
-                                if len(parsed_nums) > 1:
-                                    query = query.filter(table_doc.numero.in_(parsed_nums))
-                                else:
-                                    query = query.filter(table_doc.numero == parsed_nums[0])
-                            
-                    except (ValueError, TypeError):
-                        pass
-
-                if filtros.terceroIds: query = query.filter(table_doc.beneficiario_id.in_(filtros.terceroIds))
-                if filtros.cuentaIds: query = query.filter(table_mov.cuenta_id.in_(filtros.cuentaIds))
-                if filtros.centroCostoIds: query = query.filter(table_mov.centro_costo_id.in_(filtros.centroCostoIds))
-                
-                if filtros.productoIds and filtros.estadoDocumento != 'eliminados':
-                     query = query.filter(table_mov.producto_id.in_(filtros.productoIds))
-                
-                if filtros.conceptoKeyword: query = query.filter(table_mov.concepto.ilike(f"%{filtros.conceptoKeyword}%"))
-
-                if filtros.valorOperador and filtros.valorMonto is not None:
-                    monto = filtros.valorMonto
-                    if filtros.valorOperador == 'mayor':
-                        query = query.filter(or_(table_mov.debito > monto, table_mov.credito > monto))
-                    elif filtros.valorOperador == 'menor':
-                        query = query.filter(or_(
-                            and_(table_mov.debito < monto, table_mov.debito > 0),
-                            and_(table_mov.credito < monto, table_mov.credito > 0)
-                        ))
-                    elif filtros.valorOperador == 'igual':
-                        query = query.filter(or_(table_mov.debito == monto, table_mov.credito == monto))
-                    elif filtros.valorOperador == 'entre' and filtros.valorMontoFin is not None:
-                        monto_fin = filtros.valorMontoFin
-                        query = query.filter(or_(
-                            and_(table_mov.debito >= monto, table_mov.debito <= monto_fin),
-                            and_(table_mov.credito >= monto, table_mov.credito <= monto_fin)
-                        ))
+            query, table_doc, table_mov = _consulta_movimientos(db, filtros, empresa_id)
 
+            if query is not None:
                 total_count_query = query.with_entities(func.count(table_mov.id))
                 total_registros = total_count_query.scalar() or 0
 
@@ -219,21 +249,7 @@ def generate_super_informe(db: Session, filtros: schemas_doc.DocumentoGestionFil
                     resultados_orm = query.order_by(table_doc.fecha.desc(), table_doc.numero.desc()).offset(offset).limit(limite).all()
 
                 # --- RESULTADOS DIRECTOS SIN BUCLE DE MAPEO ---
-                resultados_finales = []
-                for r in resultados_orm:
-                    fila = r._asdict()
-
-                    # Fallback lógica de beneficiario
-                    if fila.get('beneficiario_mov'):
-                        fila['beneficiario'] = fila['beneficiario_mov']
-                    elif fila.get('beneficiario_doc'):
-                         fila['beneficiario'] = fila['beneficiario_doc']
-
-                    # Mapear nombres directos
-                    fila['usuario_creador'] = fila.get('usuario_creador_nombre', 'N/A')
-                    fila['usuario_operacion'] = fila.get('usuario_operacion_nombre', 'N/A')
-
-                    resultados_finales.append(fila)
+                resultados_finales = [_fila_super_informe(r) for r in resultados_orm]
 
                 total_paginas = 1 if filtros.traerTodo else (math.ceil(total_registros / filtros.limite) if total_registros > 0 else 1)
 
@@ -367,7 +383,7 @@ def generate_super_informe_pdf(db: Session, filtros: schemas_doc.DocumentoGestio
         if filtros.centroCostoIds: query = query.filter(table_mov.centro_costo_id.in_(filtros.centroCostoIds))
         if filtros.productoIds and filtros.estadoDocumento != 'eliminados':
              query = query.filter(table_mov.producto_id.in_(filtros.productoIds))
-        if filtros.conceptoKeyword: query = query.filter(table_mov.concepto.ilike(f"%{filtros.conceptoKeyword}%"))
+        if filtros.conceptoKeyword: query = query.filter(busqueda.condicion(db, "concepto", filtros.conceptoKeyword, objetivo=table_mov))
         
         # Filtro Montos
         if filtros.valorOperador and filtros.valorMonto is not None:
@@ -508,66 +524,136 @@ def generate_super_informe_pdf(db: Session, filtros: schemas_doc.DocumentoGestio
     return pdf_bytes
 
 
-def generate_super_informe_csv(db: Session, filtros: schemas_doc.DocumentoGestionFiltros, empresa_id: int):
+def get_pagina_super_informe(db: Session, filtros: schemas_doc.SuperInformeCursorFiltros, empresa_id: int) -> Dict[str, Any]:
     """
-    Genera un archivo CSV con los resultados del Super Informe.
-    Compatible con Excel (Delimitador ';' y UTF-8 con BOM).
+    Una página del Super Informe (movimientos) por cursor, de la más reciente a la
+    más antigua por (fecha, documento_id, movimiento_id). A diferencia de
+    generate_super_informe, no cuenta el total en cada página ni usa OFFSET.
     """
-    import csv
-    import io
+    validar_filtros_movimientos(filtros)
+    query, table_doc, table_mov = _consulta_movimientos(db, filtros, empresa_id)
+
+    datos_filtro = filtros.model_dump(mode="json", exclude={"cursor", "limite", "pagina", "traerTodo", "incluirTotales"})
+    huella = paginacion_keyset.huella_filtros(reporte="super_informe", empresa_id=empresa_id, **datos_filtro)
+    pagina = paginacion_keyset.paginar(
+        query,
+        [("fecha", table_doc.fecha), ("documento_id", table_doc.id), ("movimiento_id", table_mov.id)],
+        filtros.limite, filtros.cursor, huella, descendente=True, acumulados=filtros.acumulados
+    )
+
+    incluir_totales = filtros.cursor is None if filtros.incluirTotales is None else filtros.incluirTotales
+    totales = paginacion_keyset.totales(query, table_mov.id, table_mov.debito, table_mov.credito) if incluir_totales else None
+    return paginacion_keyset.respuesta(pagina, [_fila_super_informe(r) for r in pagina["filas"]], totales)
+
+
+# --- EXPORTACIÓN EN STREAMING (CSV / XLSX) ---
+# Las filas se leen con cursor del lado del servidor (yield_per) y se escriben
+# a medida que llegan: la memoria no crece con el tamaño del período.
+
+_CLAVES_TECNICAS = [
+    'estado', 'anulado', 'documento_id', 'movimiento_id', 'usuario_creador_id', 'usuario_operacion_id',
+    'producto_codigo', 'producto_nombre', 'cantidad_movimiento', 'beneficiario_doc', 'beneficiario_mov',
+    'usuario_creador_nombre', 'usuario_operacion_nombre'
+]
+
+
+def validar_filtros_movimientos(filtros: schemas_doc.DocumentoGestionFiltros) -> None:
+    """
+    Valida los filtros de las consultas de movimientos (exportación y paginación).
+    En la exportación se llama antes de enviar el archivo: después ya no se puede responder un error.
+    """
+    if filtros.tipoEntidad != 'movimientos':
+        raise HTTPException(status_code=400, detail=f"Tipo de entidad '{filtros.tipoEntidad}' no soportado.")
+    if filtros.estadoDocumento not in ['activos', 'anulados', 'eliminados']:
+        raise HTTPException(status_code=400, detail="Criterios de búsqueda inválidos o estado de documento no especificado.")
+
+
+def iterar_super_informe(db: Session, filtros: schemas_doc.DocumentoGestionFiltros, empresa_id: int) -> Iterator[Dict[str, Any]]:
+    """Filas del Super Informe (mismo orden y forma que generate_super_informe) leídas por lotes."""
+    validar_filtros_movimientos(filtros)
+    query, table_doc, _ = _consulta_movimientos(db, filtros, empresa_id)
+    query = query.order_by(table_doc.fecha.desc(), table_doc.numero.desc())
+    return (_fila_super_informe(r) for r in exportacion_streaming.iterar_consulta(query))
+
+
+def _encabezados_exportacion(primera_fila: Dict[str, Any]) -> List[str]:
+    # Encabezados dinámicos basándose en la primera fila (como en el frontend)
+    headers = [key for key in primera_fila.keys() if key not in _CLAVES_TECNICAS]
+    if 'beneficiario' not in headers:
+        headers.append('beneficiario')
 
-    # Forzamos traer todos los datos para el informe
-    filtros.traerTodo = True
-    
-    # Obtenemos los datos JSON del informe
-    # Usamos la función interna de generación de datos
-    inf_data = generate_super_informe(db, filtros, empresa_id)
-    resultados = inf_data.get('resultados', [])
-
-    # Preparar el archivo CSV en memoria
-    output = io.StringIO()
-    output.write('\ufeff') # UTF-8 BOM para Excel
-    writer = csv.writer(output, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-
-    if not resultados:
-        writer.writerow(["No se encontraron resultados"])
-        return output.getvalue().encode('utf-8-sig')
-
-    # Identificar encabezados dinámicos basándose en la primera fila (como en el frontend)
-    technical_keys = [
-        'estado', 'anulado', 'documento_id', 'movimiento_id', 'usuario_creador_id', 'usuario_operacion_id',
-        'producto_codigo', 'producto_nombre', 'cantidad_movimiento', 'beneficiario_doc', 'beneficiario_mov',
-        'usuario_creador_nombre', 'usuario_operacion_nombre'
-    ]
-    
-    headers = [key for key in resultados[0].keys() if key not in technical_keys]
-    
     # Reordenar beneficiario después de cuenta_nombre para mayor claridad
-    if 'beneficiario' in headers and 'cuenta_nombre' in headers:
+    if 'cuenta_nombre' in headers:
         headers.remove('beneficiario')
         idx = headers.index('cuenta_nombre') + 1
         headers.insert(idx, 'beneficiario')
+    return headers
 
-    # Escribir encabezados human-readable (Uppercase y sin guiones bajos)
-    writer.writerow([h.replace('_', ' ').upper() for h in headers])
-    
-    # Escribir filas decorando valores según tipo
-    for r in resultados:
-        row = []
-        for h in headers:
-            val = r.get(h)
-            if val is None:
-                row.append('')
-            elif isinstance(val, bool):
-                row.append('SÍ' if val else 'NO')
-            elif isinstance(val, (int, float)):
-                # Para Excel, evitar formateo con miles (,) para que sea tratable como número
-                row.append(str(val))
-            else:
-                row.append(str(val))
-        writer.writerow(row)
 
-    csv_text = output.getvalue()
-    output.close()
-    
-    return csv_text.encode('utf-8-sig')
\ No newline at end of file
+def _valor_exportacion(val):
+    if isinstance(val, bool):
+        return 'SÍ' if val else 'NO'
+    # Números sin formato de miles para que Excel los trate como números
+    return val
+
+
+def _exportar_super_informe(db: Session, filtros: schemas_doc.DocumentoGestionFiltros, empresa_id: int, formato: str) -> Iterator[bytes]:
+    filas = iterar_super_informe(db, filtros, empresa_id)
+    primera = next(filas, None)
+    if primera is None:
+        yield from exportacion_streaming.exportar(formato, None, [["No se encontraron resultados"]], titulo="Super Informe")
+        return
+
+    headers = _encabezados_exportacion(primera)
+    valores = (
+        [_valor_exportacion(r.get(h)) for h in headers]
+        for r in itertools.chain([primera], filas)
+    )
+    # Encabezados human-readable (Uppercase y sin guiones bajos)
+    yield from exportacion_streaming.exportar(
+        formato, [h.replace('_', ' ').upper() for h in headers], valores, titulo="Super Informe"
+    )
+
+
+def generate_super_informe_csv(db: Session, filtros: schemas_doc.DocumentoGestionFiltros, empresa_id: int) -> Iterator[bytes]:
+    """
+    Genera el CSV del Super Informe por bloques (para StreamingResponse).
+    Compatible con Excel (Delimitador ';' y UTF-8 con BOM).
+    """
+    return _exportar_super_informe(db, filtros, empresa_id, "csv")
+
+
+def generate_super_informe_xlsx(db: Session, filtros: schemas_doc.DocumentoGestionFiltros, empresa_id: int) -> Iterator[bytes]:
+    """Genera el XLSX del Super Informe por bloques (openpyxl en modo write_only)."""
+    return _exportar_super_informe(db, filtros, empresa_id, "xlsx")
+
+# ==============================================================================
+# === REGISTRY INTEGRATION: SUPER INFORME (TRABAJOS EN SEGUNDO PLANO) ===
+# ==============================================================================
+from app.core.reporting_registry import BaseReport, ReportRegistry
+
+
+@ReportRegistry.register
+class SuperInformeReportService(BaseReport):
+    key = "super_informe"
+    description = "Super Informe de movimientos contables"
+    filter_schema = schemas_doc.DocumentoGestionFiltros
+    formats = ("pdf", "csv", "xlsx")
+
+    def _filtros(self, filtros) -> schemas_doc.DocumentoGestionFiltros:
+        return filtros if isinstance(filtros, schemas_doc.DocumentoGestionFiltros) else self.filter_schema(**filtros)
+
+    def get_data(self, db: Session, empresa_id: int, filtros):
+        return generate_super_informe(db, self._filtros(filtros), empresa_id)
+
+    def generate_pdf(self, db: Session, empresa_id: int, filtros):
+        pdf_bytes = generate_super_informe_pdf(db, self._filtros(filtros), empresa_id)
+        return pdf_bytes, f"Super_Informe_{date.today().strftime('%Y%m%d')}.pdf"
+
+    def generate_csv(self, db: Session, empresa_id: int, filtros):
+        bloques = generate_super_informe_csv(db, self._filtros(filtros), empresa_id)
+        return bloques, f"Super_Informe_{date.today().strftime('%Y%m%d')}.csv"
+
+    def generate_xlsx(self, db: Session, empresa_id: int, filtros):
+        bloques = generate_super_informe_xlsx(db, self._filtros(filtros), empresa_id)
+        return bloques, f"Super_Informe_{date.today().strftime('%Y%m%d')}.xlsx"
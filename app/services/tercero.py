@@ -1,18 +1,21 @@
 # app/services/tercero.py (Versión con manejo de lista_precio_id)
 
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func, distinct
+from sqlalchemy import func, distinct
 from typing import List, Optional, Dict, Any
 from fastapi import HTTPException, status
 
 # Modelos
 from app.models import tercero as models_tercero
 from app.models.documento import Documento, DocumentoEliminado # Añadido DocumentoEliminado
+from app.models.movimiento_contable import MovimientoContable
 from app.models.plantilla_maestra import PlantillaMaestra
 from app.models.lista_precio import ListaPrecio # Necesario para validación
 
 # Schemas
 from app.schemas import tercero as schemas
+from app.services import busqueda
+from app.services import saldos_cierre as saldos_cierre_service
 
 def create_tercero(db: Session, tercero: schemas.TerceroCreate, user_id: int):
     # --- INICIO VALIDACIÓN LISTA PRECIO ---
@@ -156,13 +159,8 @@ def get_terceros(db: Session, empresa_id: int, filtro: Optional[str] = None, es_
     if es_vendedor is not None:
         query = query.filter(models_tercero.Tercero.es_vendedor == es_vendedor)
 
-    if filtro:
-        # Asegurarse que el filtro busca en las columnas correctas del modelo Tercero
-        query = query.filter(or_(
-            models_tercero.Tercero.razon_social.ilike(f"%{filtro}%"),
-            models_tercero.Tercero.nit.ilike(f"%{filtro}%")
-        ))
-
+    # Razón social o NIT por el índice de búsqueda; los más relevantes primero
+    query = busqueda.filtrar(query, "tercero", filtro, aproximada=True, ordenar=True)
 
     # Aplicar ordenamiento, offset y limit al query final
     results = query.order_by(models_tercero.Tercero.razon_social).offset(skip).limit(limit).all()
@@ -233,10 +231,19 @@ def fusionar_terceros(db: Session, origen_id: int, destino_id: int, empresa_id:
             {"beneficiario_id": destino_id},
             synchronize_session=False
         )
+        # Movimientos con tercero propio (el documento puede ser de otro beneficiario)
+        db.query(MovimientoContable).filter(MovimientoContable.tercero_id == origen_id).update(
+            {"tercero_id": destino_id},
+            synchronize_session=False
+        )
 
         # 3. Eliminar el tercero de origen
         db.delete(tercero_origen)
 
+        # 3b. Las fotos de períodos cerrados agrupan por tercero: los UPDATE anteriores
+        # las invalidaron (saldos_mensuales); se vuelven a congelar con el destino
+        saldos_cierre_service.regenerar_saldos_cierre(db, empresa_id)
+
         # 4. Confirmar explícitamente la transacción
         db.commit()
 
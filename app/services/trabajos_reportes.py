@@ -0,0 +1,567 @@
+# app/services/trabajos_reportes.py
+"""
+Reportes pesados en segundo plano, con el resultado guardado en disco.
+
+El flujo de URL firmada (generate_signed_report_url + endpoints */imprimir)
+regenera el reporte completo dentro de la petición cada vez que se abre el
+enlace: Libro Diario, Super Informe, kárdex, cartera por edades o Fuentes y
+Usos superan el tiempo máximo de los proxies.
+
+Ahora:
+  - crear_trabajo(reporte_key, formato, filtros): valida contra ReportRegistry
+    (filter_schema y formats) y registra un TrabajoReporte. Si ya hay uno
+    abierto con la misma huella (empresa + reporte + formato + filtros), lo
+    retorna en lugar de crear otro.
+  - programar(): lo encola en el scheduler de scheduler_backup (jobstore y
+    executor "reportes", con settings.REPORTES_WORKERS hilos).
+  - get_progreso / eventos_progreso (SSE): estado, porcentaje y posición en cola.
+    Los reportes informan su avance con reporting_registry.reportar_avance y
+    un latido periódico mantiene viva la fecha_actualizacion del trabajo.
+  - recuperar_trabajos (al iniciar): el jobstore "reportes" vive en memoria,
+    así que los trabajos abiertos que ningún proceso tiene se vuelven a encolar.
+    Un trabajo pasa a EN_PROCESO con un UPDATE condicionado: si varios
+    workers de uvicorn lo encolan, solo uno lo ejecuta.
+  - get_archivo: resultado (PDF/CSV/XLSX) del almacén local, vigente durante
+    settings.REPORTES_RESULTADOS_TTL_MINUTOS; limpiar_expirados (programada
+    por iniciar()) borra los archivos vencidos.
+
+El estado vive en la base de datos: cualquier worker de uvicorn puede responder
+la consulta o la descarga (con varios servidores, REPORTES_RESULTADOS_DIR debe
+ser una carpeta compartida).
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.reporting_registry import MEDIA_TYPES, BaseReport, Progreso, ReportRegistry
+from app.models.trabajo_reporte import TrabajoReporte
+
+ESTADOS_ABIERTOS = ("PENDIENTE", "EN_PROCESO")
+_INTERVALO_EVENTOS = 1.0
+_INTERVALO_LIMPIEZA_MINUTOS = 10
+_MAX_ERROR = 2000
+# Un trabajo EN_PROCESO sin actualización en este lapso quedó huérfano (el proceso que lo tenía murió).
+# Mientras se ejecuta, el latido lo actualiza cada _INTERVALO_LATIDO segundos. Un PENDIENTE no
+# tiene latido: puede llevar más tiempo en la cola de otro worker y solo se recupera al iniciar.
+_MAXIMO_SIN_AVANCE = timedelta(minutes=5)
+_INTERVALO_LATIDO = 60
+# Mínimo entre dos escrituras del avance informado por el reporte
+_INTERVALO_AVANCE = 2.0
+# Los registros terminados se conservan este tiempo como historial
+_HISTORIAL = timedelta(days=30)
+
+# Módulos que registran reportes en ReportRegistry al importarse
+_MODULOS_REPORTES = (
+    "app.services.libros_oficiales",
+    "app.services.super_informe",
+    "app.services.analisis_financiero",
+    "app.services.reportes_inventario",
+    "app.services.reportes_facturacion",
+    "app.services.propiedad_horizontal.reportes",
+)
+
+# Trabajos encolados o en ejecución en este proceso
+_activos = set()
+_en_ejecucion = set()
+_lock = threading.Lock()
+
+
+# ==========================================================
+# 1. CATÁLOGO Y CREACIÓN
+# ==========================================================
+
+def _cargar_reportes() -> None:
+    for modulo in _MODULOS_REPORTES:
+        importlib.import_module(modulo)
+
+
+def get_reporte(reporte_key: str) -> BaseReport:
+    _cargar_reportes()
+    reporte = ReportRegistry.get(reporte_key)
+    if not reporte:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Reporte '{reporte_key}' no registrado.")
+    return reporte
+
+
+def listar_reportes() -> List[Dict[str, Any]]:
+    _cargar_reportes()
+    return [
+        {"key": reporte.key, "description": reporte.description, "formats": list(reporte.formats)}
+        for reporte in sorted(ReportRegistry.get_all().values(), key=lambda r: r.key)
+    ]
+
+
+def _normalizar_filtros(reporte: BaseReport, filtros: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Filtros validados y en forma JSON (fechas como texto) para guardarlos y calcular la huella."""
+    if reporte.filter_schema is None:
+        return json.loads(json.dumps(filtros or {}, default=str))
+    try:
+        return reporte.filter_schema(**(filtros or {})).model_dump(mode="json")
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Filtros inválidos para '{reporte.key}': {e}")
+
+
+def calcular_huella(empresa_id: int, reporte_key: str, formato: str, filtros: Dict[str, Any]) -> str:
+    contenido = json.dumps([empresa_id, reporte_key, formato, filtros], sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def _huerfano(trabajo: TrabajoReporte, ahora: datetime) -> bool:
+    if trabajo.estado != "EN_PROCESO" or trabajo.id in _activos:
+        return False
+    ultima = trabajo.fecha_actualizacion or trabajo.fecha_creacion
+    return ultima is not None and ahora - ultima > _MAXIMO_SIN_AVANCE
+
+
+def crear_trabajo(db: Session, empresa_id: int, reporte_key: str, formato: str = "pdf",
+                  filtros: Optional[Dict[str, Any]] = None, usuario_id: Optional[int] = None) -> Tuple[TrabajoReporte, bool]:
+    """
+    Registra el trabajo (la ejecución la lanza el caller con programar()).
+    Retorna (trabajo, nuevo); nuevo=False si se reutilizó uno idéntico en curso.
+    """
+    reporte = get_reporte(reporte_key)
+    formato = (formato or "pdf").lower()
+    if formato not in reporte.formats:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El reporte '{reporte_key}' se genera en: {', '.join(reporte.formats)}."
+        )
+    filtros_normalizados = _normalizar_filtros(reporte, filtros)
+    huella = calcular_huella(empresa_id, reporte_key, formato, filtros_normalizados)
+
+    with _lock:
+        abierto = db.query(TrabajoReporte).filter(
+            TrabajoReporte.empresa_id == empresa_id,
+            TrabajoReporte.huella == huella,
+            TrabajoReporte.estado.in_(ESTADOS_ABIERTOS)
+        ).order_by(TrabajoReporte.id.desc()).first()
+        if abierto and not _huerfano(abierto, datetime.utcnow()):
+            return abierto, False
+
+        trabajo = TrabajoReporte(
+            empresa_id=empresa_id,
+            usuario_id=usuario_id,
+            reporte_key=reporte_key,
+            formato=formato,
+            filtros=filtros_normalizados,
+            huella=huella,
+            estado="PENDIENTE",
+            porcentaje=0,
+            mensaje="En cola",
+        )
+        db.add(trabajo)
+        db.commit()
+        db.refresh(trabajo)
+        return trabajo, True
+
+
+def programar(trabajo_id: int, empresa_id: int) -> None:
+    """Encola la ejecución en el scheduler (o en un hilo propio si el scheduler no está corriendo)."""
+    from app.services.scheduler_backup import scheduler
+
+    with _lock:
+        _activos.add(trabajo_id)
+    if scheduler.running:
+        scheduler.add_job(
+            ejecutar_trabajo,
+            args=[trabajo_id, empresa_id],
+            id=f"reporte_{trabajo_id}",
+            jobstore="reportes",
+            executor="reportes",
+            replace_existing=True,
+            misfire_grace_time=None,
+        )
+    else:
+        # Sin scheduler (despliegue serverless, scripts): se ejecuta en un hilo aparte
+        threading.Thread(target=ejecutar_trabajo, args=(trabajo_id, empresa_id),
+                         name=f"reporte-{trabajo_id}", daemon=True).start()
+
+
+# ==========================================================
+# 2. CONSULTA
+# ==========================================================
+
+def get_trabajo(db: Session, trabajo_id: int, empresa_id: int) -> TrabajoReporte:
+    trabajo = db.query(TrabajoReporte).filter(
+        TrabajoReporte.id == trabajo_id,
+        TrabajoReporte.empresa_id == empresa_id
+    ).first()
+    if not trabajo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trabajo de reporte no encontrado.")
+    return trabajo
+
+
+def _posicion_en_cola(db: Session, trabajo: TrabajoReporte) -> Optional[int]:
+    if trabajo.estado != "PENDIENTE":
+        return None
+    # La cola es común a todas las empresas
+    anteriores = db.query(TrabajoReporte.id).execution_options(ignore_tenant=True).filter(
+        TrabajoReporte.estado == "PENDIENTE",
+        TrabajoReporte.id < trabajo.id
+    ).count()
+    return anteriores + 1
+
+
+def _vista(trabajo: TrabajoReporte, posicion_en_cola: Optional[int] = None) -> Dict[str, Any]:
+    return {
+        "id": trabajo.id,
+        "reporte_key": trabajo.reporte_key,
+        "formato": trabajo.formato,
+        "filtros": trabajo.filtros,
+        "estado": trabajo.estado,
+        "porcentaje": trabajo.porcentaje,
+        "mensaje": trabajo.mensaje,
+        "error": trabajo.error,
+        "en_ejecucion": trabajo.id in _en_ejecucion,
+        "posicion_en_cola": posicion_en_cola,
+        "nombre_archivo": trabajo.nombre_archivo,
+        "tamano_bytes": trabajo.tamano_bytes,
+        "fecha_creacion": trabajo.fecha_creacion.isoformat() if trabajo.fecha_creacion else None,
+        "fecha_inicio": trabajo.fecha_inicio.isoformat() if trabajo.fecha_inicio else None,
+        "fecha_fin": trabajo.fecha_fin.isoformat() if trabajo.fecha_fin else None,
+        "fecha_expiracion": trabajo.fecha_expiracion.isoformat() if trabajo.fecha_expiracion else None,
+    }
+
+
+def get_progreso(db: Session, trabajo_id: int, empresa_id: int) -> Dict[str, Any]:
+    trabajo = get_trabajo(db, trabajo_id, empresa_id)
+    return _vista(trabajo, _posicion_en_cola(db, trabajo))
+
+
+def listar_trabajos(db: Session, empresa_id: int, limite: int = 20) -> List[Dict[str, Any]]:
+    trabajos = db.query(TrabajoReporte).filter(
+        TrabajoReporte.empresa_id == empresa_id
+    ).order_by(TrabajoReporte.id.desc()).limit(limite).all()
+    return [_vista(t) for t in trabajos]
+
+
+def eventos_progreso(trabajo_id: int, empresa_id: int) -> Iterator[str]:
+    """
+    Flujo Server-Sent Events con el avance del trabajo, hasta que termina.
+    Abre una sesión corta por consulta (la generación puede durar minutos).
+    """
+    from app.core.database import SessionLocal, current_empresa_id
+
+    ultimo = None
+    while True:
+        token = current_empresa_id.set(empresa_id)
+        db = SessionLocal()
+        try:
+            progreso = get_progreso(db, trabajo_id, empresa_id)
+        finally:
+            db.close()
+            current_empresa_id.reset(token)
+
+        if progreso != ultimo:
+            yield f"event: progreso\ndata: {json.dumps(progreso)}\n\n"
+            ultimo = progreso
+        if progreso["estado"] not in ESTADOS_ABIERTOS:
+            yield f"event: fin\ndata: {json.dumps(progreso)}\n\n"
+            return
+        time.sleep(_INTERVALO_EVENTOS)
+
+
+def get_archivo(db: Session, trabajo_id: int, empresa_id: int) -> Tuple[str, str, str]:
+    """Retorna (ruta, nombre_archivo, media_type) del resultado vigente."""
+    trabajo = get_trabajo(db, trabajo_id, empresa_id)
+    if trabajo.estado in ESTADOS_ABIERTOS:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El reporte aún se está generando.")
+    if trabajo.estado == "ERROR":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El reporte falló: {trabajo.error}")
+    vencido = trabajo.fecha_expiracion is not None and trabajo.fecha_expiracion < datetime.utcnow()
+    if trabajo.estado != "COMPLETADO" or vencido or not trabajo.ruta_archivo or not os.path.exists(trabajo.ruta_archivo):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="El resultado expiró. Solicite el reporte de nuevo.")
+    return trabajo.ruta_archivo, trabajo.nombre_archivo, MEDIA_TYPES.get(trabajo.formato, "application/octet-stream")
+
+
+# ==========================================================
+# 3. EJECUCIÓN Y ALMACÉN DE RESULTADOS
+# ==========================================================
+
+def _directorio_resultados() -> str:
+    return settings.REPORTES_RESULTADOS_DIR or os.path.join(tempfile.gettempdir(), "finaxis_reportes")
+
+
+def _guardar_resultado(empresa_id: int, trabajo_id: int, formato: str, bloques: Iterable[bytes]) -> str:
+    carpeta = os.path.join(_directorio_resultados(), str(empresa_id))
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, f"{trabajo_id}.{formato}")
+    # Se escribe aparte y se renombra: una descarga nunca ve un archivo a medias.
+    # Los reportes en streaming se generan mientras se escriben los bloques.
+    temporal = f"{ruta}.tmp"
+    try:
+        with open(temporal, "wb") as archivo:
+            for bloque in bloques:
+                archivo.write(bloque)
+    except BaseException:
+        _borrar_archivo(temporal)
+        raise
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def _borrar_archivo(ruta: Optional[str]) -> None:
+    if not ruta:
+        return
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[TRABAJOS REPORTES] No se pudo borrar {ruta}: {e}")
+
+
+def _actualizar(db: Session, trabajo: TrabajoReporte, **campos) -> None:
+    for campo, valor in campos.items():
+        setattr(trabajo, campo, valor)
+    trabajo.fecha_actualizacion = datetime.utcnow()
+    db.commit()
+
+
+def _guardar_avance(trabajo_id: int, empresa_id: int, porcentaje: Optional[int] = None,
+                    mensaje: Optional[str] = None) -> None:
+    """
+    Escribe avance y latido en una sesión corta: la del trabajo puede estar a
+    mitad de una consulta en streaming y no se debe confirmar desde aquí.
+    """
+    from app.core.database import SessionLocal, current_empresa_id
+
+    campos = {TrabajoReporte.fecha_actualizacion: datetime.utcnow()}
+    if porcentaje is not None:
+        # El 10% es el arranque y el 100% lo marca el final
+        campos[TrabajoReporte.porcentaje] = 10 + max(0, min(100, int(porcentaje))) * 85 // 100
+    if mensaje:
+        campos[TrabajoReporte.mensaje] = mensaje[:255]
+
+    token = current_empresa_id.set(empresa_id)
+    db = SessionLocal()
+    try:
+        db.query(TrabajoReporte).filter(
+            TrabajoReporte.id == trabajo_id,
+            TrabajoReporte.estado == "EN_PROCESO"
+        ).update(campos, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[TRABAJOS REPORTES] No se pudo registrar el avance de #{trabajo_id}: {e}")
+    finally:
+        db.close()
+        current_empresa_id.reset(token)
+
+
+def _progreso_trabajo(trabajo_id: int, empresa_id: int) -> Progreso:
+    """Callback para generate_file: guarda el avance como máximo cada _INTERVALO_AVANCE segundos."""
+    ultimo = {"momento": 0.0}
+
+    def progreso(porcentaje: Optional[int] = None, mensaje: Optional[str] = None) -> None:
+        ahora = time.monotonic()
+        if ahora - ultimo["momento"] < _INTERVALO_AVANCE:
+            return
+        ultimo["momento"] = ahora
+        _guardar_avance(trabajo_id, empresa_id, porcentaje, mensaje)
+
+    return progreso
+
+
+def _latido(trabajo_id: int, empresa_id: int, detener: threading.Event) -> None:
+    while not detener.wait(_INTERVALO_LATIDO):
+        _guardar_avance(trabajo_id, empresa_id)
+
+
+def _reclamar(db: Session, trabajo_id: int) -> bool:
+    """PENDIENTE -> EN_PROCESO en un solo UPDATE; False si otro proceso ya lo tomó."""
+    ahora = datetime.utcnow()
+    tomados = db.query(TrabajoReporte).filter(
+        TrabajoReporte.id == trabajo_id,
+        TrabajoReporte.estado == "PENDIENTE"
+    ).update({
+        TrabajoReporte.estado: "EN_PROCESO",
+        TrabajoReporte.porcentaje: 10,
+        TrabajoReporte.mensaje: "Generando reporte",
+        TrabajoReporte.fecha_inicio: ahora,
+        TrabajoReporte.fecha_actualizacion: ahora,
+    }, synchronize_session=False)
+    db.commit()
+    return tomados == 1
+
+
+def ejecutar_trabajo(trabajo_id: int, empresa_id: int) -> None:
+    """Genera el archivo del trabajo en una sesión propia y lo deja en el almacén."""
+    from app.core.database import SessionLocal, current_empresa_id
+
+    with _lock:
+        if trabajo_id in _en_ejecucion:
+            return
+        _en_ejecucion.add(trabajo_id)
+
+    token = current_empresa_id.set(empresa_id)
+    db = SessionLocal()
+    detener_latido = threading.Event()
+    try:
+        if not _reclamar(db, trabajo_id):
+            return
+        trabajo = get_trabajo(db, trabajo_id, empresa_id)
+        threading.Thread(target=_latido, args=(trabajo_id, empresa_id, detener_latido),
+                         name=f"reporte-latido-{trabajo_id}", daemon=True).start()
+
+        inicio = time.time()
+        try:
+            reporte = get_reporte(trabajo.reporte_key)
+            contenido, nombre_archivo = reporte.generate_file(
+                db, empresa_id, dict(trabajo.filtros or {}), trabajo.formato,
+                progreso=_progreso_trabajo(trabajo_id, empresa_id)
+            )
+            if isinstance(contenido, (bytes, bytearray)):
+                contenido = (contenido,)
+            elif isinstance(contenido, str) or not isinstance(contenido, Iterable):
+                raise TypeError(f"generate_{trabajo.formato} debe retornar bytes o bloques de bytes, no {type(contenido).__name__}")
+            ruta = _guardar_resultado(empresa_id, trabajo_id, trabajo.formato, contenido)
+        except Exception as e:
+            traceback.print_exc()
+            db.rollback()
+            detalle = e.detail if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+            trabajo = get_trabajo(db, trabajo_id, empresa_id)
+            _actualizar(db, trabajo, estado="ERROR", mensaje="Error al generar el reporte",
+                        error=str(detalle)[:_MAX_ERROR], fecha_fin=datetime.utcnow())
+            return
+
+        tamano = os.path.getsize(ruta)
+        ahora = datetime.utcnow()
+        _actualizar(
+            db, trabajo, estado="COMPLETADO", porcentaje=100, mensaje="Listo para descargar",
+            nombre_archivo=nombre_archivo, ruta_archivo=ruta, tamano_bytes=tamano, fecha_fin=ahora,
+            fecha_expiracion=ahora + timedelta(minutes=settings.REPORTES_RESULTADOS_TTL_MINUTOS)
+        )
+        print(f"[TRABAJOS REPORTES] #{trabajo_id} {trabajo.reporte_key}.{trabajo.formato}: "
+              f"{tamano} bytes en {time.time() - inicio:.1f}s")
+    finally:
+        detener_latido.set()
+        db.close()
+        current_empresa_id.reset(token)
+        with _lock:
+            _en_ejecucion.discard(trabajo_id)
+            _activos.discard(trabajo_id)
+
+
+def limpiar_expirados() -> Dict[str, int]:
+    """
+    Borra los archivos vencidos (estado EXPIRADO), cierra como ERROR los
+    trabajos EN_PROCESO huérfanos y elimina el historial antiguo. Los PENDIENTE
+    se dejan: pueden estar en la cola de otro worker (recuperar_trabajos los
+    vuelve a encolar si el proceso que los tenía se reinició).
+    """
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        ahora = datetime.utcnow()
+        vencidos = db.query(TrabajoReporte).filter(
+            TrabajoReporte.estado == "COMPLETADO",
+            TrabajoReporte.fecha_expiracion < ahora
+        ).all()
+        for trabajo in vencidos:
+            _borrar_archivo(trabajo.ruta_archivo)
+            trabajo.estado = "EXPIRADO"
+            trabajo.ruta_archivo = None
+
+        en_proceso = db.query(TrabajoReporte).filter(TrabajoReporte.estado == "EN_PROCESO").all()
+        huerfanos = [t for t in en_proceso if _huerfano(t, ahora)]
+        for trabajo in huerfanos:
+            trabajo.estado = "ERROR"
+            trabajo.error = "El trabajo se interrumpió (reinicio del servidor). Solicite el reporte de nuevo."
+            trabajo.fecha_fin = ahora
+
+        antiguos = db.query(TrabajoReporte).filter(
+            TrabajoReporte.estado.notin_(ESTADOS_ABIERTOS),
+            TrabajoReporte.fecha_creacion < ahora - _HISTORIAL
+        ).all()
+        for trabajo in antiguos:
+            _borrar_archivo(trabajo.ruta_archivo)
+            db.delete(trabajo)
+
+        db.commit()
+        resumen = {"expirados": len(vencidos), "interrumpidos": len(huerfanos), "eliminados": len(antiguos)}
+        if any(resumen.values()):
+            print(f"[TRABAJOS REPORTES] Limpieza: {resumen}")
+        return resumen
+    except Exception as e:
+        db.rollback()
+        print(f"[TRABAJOS REPORTES] Error en la limpieza: {e}")
+        return {"expirados": 0, "interrumpidos": 0, "eliminados": 0}
+    finally:
+        db.close()
+
+
+def recuperar_trabajos() -> int:
+    """
+    Vuelve a encolar los trabajos abiertos que este proceso no tiene: los
+    PENDIENTE (el jobstore en memoria se perdió con el reinicio) y los
+    EN_PROCESO sin latido reciente (su proceso murió). Los EN_PROCESO con
+    latido son de otro worker vivo y se dejan quietos. Retorna cuántos encoló.
+    """
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        limite = datetime.utcnow() - _MAXIMO_SIN_AVANCE
+        abiertos = db.query(TrabajoReporte).execution_options(ignore_tenant=True).filter(
+            TrabajoReporte.estado.in_(ESTADOS_ABIERTOS)
+        ).order_by(TrabajoReporte.id).all()
+        recuperar = []
+        for trabajo in abiertos:
+            if trabajo.id in _activos:
+                continue
+            if trabajo.estado == "EN_PROCESO":
+                ultima = trabajo.fecha_actualizacion or trabajo.fecha_creacion
+                if ultima is not None and ultima > limite:
+                    continue
+                trabajo.estado = "PENDIENTE"
+                trabajo.porcentaje = 0
+            trabajo.mensaje = "En cola (reanudado tras reinicio)"
+            trabajo.fecha_actualizacion = datetime.utcnow()
+            recuperar.append((trabajo.id, trabajo.empresa_id))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[TRABAJOS REPORTES] Error recuperando trabajos abiertos: {e}")
+        return 0
+    finally:
+        db.close()
+
+    for trabajo_id, empresa_id in recuperar:
+        programar(trabajo_id, empresa_id)
+    if recuperar:
+        print(f"[TRABAJOS REPORTES] {len(recuperar)} trabajo(s) abiertos encolados de nuevo.")
+    return len(recuperar)
+
+
+def iniciar() -> None:
+    """
+    Vuelve a encolar los trabajos abiertos y programa la limpieza periódica
+    del almacén en el scheduler de scheduler_backup.
+    """
+    from app.services.scheduler_backup import scheduler
+
+    recuperar_trabajos()
+    scheduler.add_job(
+        limpiar_expirados,
+        "interval",
+        minutes=_INTERVALO_LIMPIEZA_MINUTOS,
+        id="reportes_limpieza",
+        jobstore="reportes",
+        replace_existing=True,
+    )
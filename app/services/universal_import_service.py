@@ -1,8 +1,11 @@
 import openpyxl
 from datetime import date, datetime
 from typing import List, Dict, Any, Optional
+from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from app.models import Documento, MovimientoContable, PlanCuenta, Tercero, TipoDocumento
+from app.schemas import documento as schemas_doc
+from app.services import documento_masivo
 from app.services.import_utils import ImportUtils
 
 class UniversalImportService:
@@ -457,8 +460,14 @@ class UniversalImportService:
             if key not in grouped_docs: grouped_docs[key] = []
             grouped_docs[key].append(e)
               
+        # Cada grupo solo prepara su documento (maestros dentro de un savepoint); todos se
+        # crean al final con documento_masivo: numeración, validación e INSERT por lotes
+        pendientes = [] # (DocumentoCreate, etiqueta, filas del resumen)
+        claves_preparadas = set() # (tipo_id, numero) ya tomados en este archivo
+
         # 3. Procesar Documentos
         for (tipo_code, num_str, doc_date), lines in grouped_docs.items():
+            savepoint = db.begin_nested()
             try:
                 # Z. Verificar Cupo Disponible
                 doc_cost = len(lines)
@@ -529,7 +538,7 @@ class UniversalImportService:
                 # C2. Verificar Duplicidad (Idempotencia)
                 # SOLO verificamos si existe un documento ACTIVO (no anulado).
                 # Esto permite re-importar (reutilizar número) si el anterior fue anulado/eliminado soft.
-                exists = db.query(Documento).filter_by(
+                exists = (tipo_id, doc_num) in claves_preparadas or db.query(Documento).filter_by(
                     empresa_id=empresa_id,
                     tipo_documento_id=tipo_id,
                     numero=doc_num,
@@ -539,21 +548,8 @@ class UniversalImportService:
                     results["errors"].append(f"Doc {tipo_code}-{doc_num} saltado: Ya existe (Activo).")
                     continue
 
-                # D. Crear Documento
-                new_doc = Documento(
-                    empresa_id=empresa_id,
-                    beneficiario_id=beneficiario_id,
-                    tipo_documento_id=tipo_id,
-                    numero=doc_num,
-                    fecha=doc_date,
-                    observaciones=f"Import Universal: {first_line['detalle']}",
-                    estado="ACTIVO"
-                )
-                db.add(new_doc)
-                db.flush()
-                results["documents"] += 1
-                
-                # E. Procesar Movimientos
+                # D. Procesar Movimientos
+                movimientos = []
                 for line in lines:
                     # 1. Cuenta
                     c_code = line['cuenta']
@@ -582,23 +578,30 @@ class UniversalImportService:
                               tercero_cache[row_nit] = tid
                          mov_tercero_id = tercero_cache[row_nit]
 
-                    # 3. Crear Movimiento
-                    mov = MovimientoContable(
-                        documento_id=new_doc.id,
+                    # 3. Movimiento
+                    movimientos.append(schemas_doc.MovimientoContableCreate(
                         cuenta_id=acc_id,
                         tercero_id=mov_tercero_id, # ASIGNANDO EL TERCERO AL MOVIMIENTO
                         concepto=line['detalle'],
                         debito=line['debito'],
                         credito=line['credito'],
-                    )
-                    db.add(mov)
-                    results["transactions"] += 1
-                
-                db.commit()
+                    ))
+
+                # E. Documento (se crea con el lote)
+                documento = schemas_doc.DocumentoCreate(
+                    beneficiario_id=beneficiario_id,
+                    tipo_documento_id=tipo_id,
+                    numero=doc_num,
+                    fecha=doc_date,
+                    observaciones=f"Import Universal: {first_line['detalle']}",
+                    movimientos=movimientos
+                )
+                claves_preparadas.add((tipo_id, doc_num))
                 remaining_quota -= doc_cost
                 
-                # --- NEW: Append to Created Documents Summary ---
+                # --- NEW: Created Documents Summary (se publica si el documento se crea) ---
                 # We will now collect detailed movements for the report
+                resumen_doc = []
                 for line in lines:
                     c_code = line.get('cuenta')
                     c_name = line.get('nombre_cuenta') or "" # We might need to fetch the actual name if not in line
@@ -607,7 +610,7 @@ class UniversalImportService:
                     row_nit = line.get('nit') or header_nit
                     row_tercero = line.get('nombre_tercero') or header_name
                     
-                    results["created_documents"].append({
+                    resumen_doc.append({
                         "fecha": doc_date.strftime("%Y-%m-%d"),
                         "tipo_doc": tipo_code,
                         "nombre_tipo_doc": tipo_name_sugerido or tipo_code, # Use the suggested name or code
@@ -620,15 +623,51 @@ class UniversalImportService:
                         "credito": line['credito'],
                         "detalle": line['detalle']
                     })
-                # ------------------------------------------------
+                pendientes.append((documento, f"{tipo_code}-{doc_num}", resumen_doc))
                 # ------------------------------------------------
                 
             except Exception as e:
-                db.rollback()
+                savepoint.rollback()
                 # Limpiar cachés para evitar usar IDs muertos (eliminados por el rollback)
                 acc_cache.clear()
                 tercero_cache.clear()
                 tipo_doc_cache.clear()
                 results["errors"].append(f"Error en Doc {tipo_code}-{num_str}: {str(e)}")
-        
+            finally:
+                if savepoint.is_active:
+                    savepoint.commit()
+
+        # 4. Crear los documentos preparados en lote (conserva los números del archivo)
+        documentos_importados = []
+        if pendientes:
+            try:
+                creados = documento_masivo.create_documentos_bulk(
+                    db, [doc for doc, _, _ in pendientes], None, empresa_id,
+                    skip_recalculo=True, conservar_numeros=True, omitir_invalidos=True, historico=True
+                )
+            except HTTPException as e:
+                db.rollback()
+                results["errors"].append(f"Error creando los documentos: {e.detail}")
+                return results
+            omitidos = {err["indice"]: err["detalle"] for err in creados["errores"]}
+            for indice, (doc, etiqueta, resumen_doc) in enumerate(pendientes):
+                if indice in omitidos:
+                    results["errors"].append(f"Doc {etiqueta} saltado: {omitidos[indice]}")
+                    continue
+                documentos_importados.append(creados["ids"][indice])
+                results["documents"] += 1
+                results["transactions"] += len(doc.movimientos)
+                results["created_documents"].extend(resumen_doc)
+
+        # 5. Cartera/Proveedores: los terceros de los documentos que tocan CXC/CXP se
+        # recalculan una sola vez (ver cola_cartera) en lugar de quedar sin cruce
+        if documentos_importados:
+            from app.services.cola_cartera import ColaRecalculoCartera
+            cola = ColaRecalculoCartera(empresa_id, descripcion="Importación universal")
+            cola.marcar_documentos(db, documentos_importados)
+            resumen = cola.procesar(db)
+            results["cartera_lote_id"] = resumen["lote_id"]
+            for err in resumen["errores"]:
+                results["errors"].append(f"Cartera: {err}")
+
         return results
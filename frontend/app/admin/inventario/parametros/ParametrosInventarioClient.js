@@ -730,8 +730,18 @@ function ParametrosInventarioContent() {
                                 if (!confirm("ADVERTENCIA: ¿Está seguro? Este proceso puede tardar unos segundos y reescribirá los saldos actuales.")) return;
                                 const toastId = toast.loading("Recalculando inventario, por favor espere...");
                                 try {
-                                    const res = await apiService.post('/inventario/recalcular-saldos');
-                                    toast.update(toastId, { render: `¡Éxito! ${res.data.message}`, type: "success", isLoading: false, autoClose: 5000 });
+                                    // Recálculo en segundo plano por bloques: se consulta el avance hasta que termina
+                                    let { data: progreso } = await apiService.post('/inventario/recalcular-saldos/trabajos');
+                                    while (progreso.estado === 'PENDIENTE' || progreso.estado === 'EN_PROCESO') {
+                                        toast.update(toastId, { render: `Recalculando inventario... ${progreso.productos_procesados}/${progreso.total_productos} productos (${progreso.porcentaje}%)` });
+                                        await new Promise((r) => setTimeout(r, 1500));
+                                        ({ data: progreso } = await apiService.get(`/inventario/recalcular-saldos/trabajos/${progreso.id}`));
+                                    }
+                                    if (progreso.bloques_con_error > 0) {
+                                        toast.update(toastId, { render: `Recálculo con errores en ${progreso.bloques_con_error} bloque(s). Productos procesados: ${progreso.productos_procesados}`, type: "warning", isLoading: false, autoClose: 8000 });
+                                    } else {
+                                        toast.update(toastId, { render: `¡Éxito! Recálculo completado. Productos procesados: ${progreso.productos_procesados}`, type: "success", isLoading: false, autoClose: 5000 });
+                                    }
                                 } catch (err) {
                                     toast.update(toastId, { render: "Error al recalcular.", type: "error", isLoading: false, autoClose: 5000 });
                                 }
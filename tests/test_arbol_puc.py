@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.arbol_puc import ArbolCuentas, codigo_padre_puc
+
+
+def _mayorizar_por_recorte(saldos):
+    """Versión anterior (dashboard.build_hierarchical_data) como referencia."""
+    expandidos = dict(saldos)
+    for codigo, valor in saldos.items():
+        if not valor:
+            continue
+        actual = codigo_padre_puc(str(codigo))
+        while actual is not None:
+            expandidos[actual] = expandidos.get(actual, 0.0) + valor
+            actual = codigo_padre_puc(actual)
+    return expandidos
+
+
+# (id, codigo, nombre, nivel, padre_id)
+PLAN = [
+    (1, "1", "ACTIVO", 1, None),
+    (2, "11", "DISPONIBLE", 2, 1),
+    (3, "1105", "CAJA", 3, 2),
+    (4, "110505", "CAJA GENERAL", 4, 3),
+    (5, "1110", "BANCOS", 3, 2),
+    (6, "111005", "MONEDA NACIONAL", 4, 5),
+    (7, "2", "PASIVO", 1, None),
+    (8, "2205", "PROVEEDORES NACIONALES", 3, None),  # sin grupo 22 en el plan
+]
+
+
+class TestArbolPuc(unittest.TestCase):
+
+    def test_acumular_suma_descendientes(self):
+        arbol = ArbolCuentas(PLAN)
+        propios = arbol.vector({4: 100.0, 6: 50.0, 5: 7.0, 8: -30.0})
+        total = arbol.acumular(propios)
+
+        def saldo(codigo):
+            return total[arbol.indice_codigo[codigo]]
+
+        self.assertEqual(saldo("110505"), 100.0)
+        self.assertEqual(saldo("1110"), 57.0)  # movimiento propio + hijo
+        self.assertEqual(saldo("11"), 157.0)
+        self.assertEqual(saldo("1"), 157.0)
+        self.assertEqual(saldo("2"), -30.0)
+
+    def test_acumular_varias_columnas(self):
+        arbol = ArbolCuentas(PLAN)
+        propios = arbol.vector({4: (1.0, 2.0, 3.0), 6: (10.0, 20.0, 30.0)}, columnas=3)
+        total = arbol.acumular(propios)
+        np.testing.assert_array_equal(total[arbol.indice_codigo["1"]], [11.0, 22.0, 33.0])
+        # Un escalar solo ocupa la primera columna
+        np.testing.assert_array_equal(arbol.vector({4: 5.0}, columnas=3)[arbol.indice[4]], [5.0, 0.0, 0.0])
+
+    def test_sintetiza_padres_faltantes(self):
+        arbol = ArbolCuentas(PLAN)
+        posicion = arbol.indice_codigo["22"]
+        self.assertTrue(arbol.virtual[posicion])
+        self.assertIsNone(arbol.ids[posicion])
+        self.assertEqual(arbol.padre[arbol.indice_codigo["2205"]], posicion)
+        self.assertEqual(arbol.padre[posicion], arbol.indice_codigo["2"])
+
+    def test_sin_sintetizar_sube_al_ancestro_existente(self):
+        arbol = ArbolCuentas(PLAN, sintetizar_padres=False)
+        self.assertNotIn("22", arbol.indice_codigo)
+        self.assertEqual(arbol.padre[arbol.indice_codigo["2205"]], arbol.indice_codigo["2"])
+
+    def test_orden_preorden_por_codigo(self):
+        arbol = ArbolCuentas(list(reversed(PLAN)))
+        codigos = [arbol.codigos[i] for i in arbol.orden]
+        self.assertEqual(codigos, ["1", "11", "1105", "110505", "1110", "111005", "2", "22", "2205"])
+
+    def test_ciclo_en_cuenta_padre_id(self):
+        plan = [
+            (1, "1", "ACTIVO", 1, 2),
+            (2, "11", "DISPONIBLE", 2, 1),
+            (3, "1105", "CAJA", 3, 2),
+        ]
+        arbol = ArbolCuentas(plan)
+        self.assertEqual(sorted(arbol.orden.tolist()), [0, 1, 2])
+        total = arbol.acumular(arbol.vector({3: 5.0}))
+        self.assertEqual(total[arbol.indice_codigo["1"]], 5.0)
+
+    def test_acumular_por_codigo_equivale_a_recorte(self):
+        arbol = ArbolCuentas(PLAN)
+        saldos = {"110505": 100.0, "111005": 50.0, "2205": -30.0, "1110": 0.0, "41": 12.0, "4135": 8.0}
+        esperado = _mayorizar_por_recorte(saldos)
+        obtenido = arbol.acumular_por_codigo(saldos)
+        self.assertEqual(set(obtenido), set(esperado))
+        for codigo, valor in esperado.items():
+            self.assertAlmostEqual(obtenido[codigo], valor)
+        # Códigos que no están en el plan también se mayorizan por recorte
+        self.assertEqual(obtenido["4"], 20.0)
+
+    def test_descendientes(self):
+        arbol = ArbolCuentas(PLAN)
+        self.assertEqual(sorted(arbol.descendientes(["11"])), [2, 3, 4, 5, 6])
+        self.assertEqual(sorted(arbol.descendientes(["1105", "22"])), [3, 4, 8])
+        self.assertEqual(arbol.descendientes(["99"]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
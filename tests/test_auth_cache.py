@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+import sys
+import os
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core import auth_cache, licencia, security
+from app.core.database import Base, current_empresa_id
+from app.models import Empresa, Usuario
+from app.models.permiso import Permiso, Rol
+
+
+class TestCachePrincipal(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine)()
+        self.rol = Rol(id=1, nombre="Contador", permisos=[Permiso(id=1, nombre="ver_reportes")])
+        empresas = [Empresa(id=1, razon_social="Holding", nit="900"), Empresa(id=2, razon_social="Filial", nit="901")]
+        self.db.add_all(empresas + [
+            Usuario(id=1, empresa_id=1, email="ana@example.com", password_hash="x",
+                    roles=[self.rol], empresas_asignadas=empresas),
+        ])
+        self.db.commit()
+
+        auth_cache.invalidar_principales()
+        # El token trabaja sobre la filial: get_current_user cambia el contexto del usuario
+        self.token = security.create_access_token({"sub": "ana@example.com", "empresa_id": 2})
+        self.iat = security.jwt.decode(self.token, security.settings.SECRET_KEY,
+                                       algorithms=[security.settings.ALGORITHM])["iat"]
+        self.licencia = mock.patch.object(licencia, "obtener_estado_licencia", return_value={"modo": "FULL"})
+        self.estado_licencia = self.licencia.start()
+        self.contexto = current_empresa_id.set(None)
+
+    def tearDown(self):
+        current_empresa_id.reset(self.contexto)
+        self.licencia.stop()
+        auth_cache.invalidar_principales()
+        self.db.close()
+
+    def _autenticar(self):
+        return asyncio.run(security.get_current_user(self.token, self.db))
+
+    def _principal(self):
+        return auth_cache.obtener_principal("ana@example.com", 2, self.iat)
+
+    def test_segunda_peticion_usa_el_principal_cacheado(self):
+        usuario = self._autenticar()
+        self.assertEqual(usuario.empresa_id, 2)
+        self.assertEqual(set(usuario.permisos_efectivos), {"ver_reportes"})
+        self.assertIsNotNone(self._principal())
+
+        usuario = self._autenticar()
+        self.assertEqual(set(usuario.permisos_efectivos), {"ver_reportes"})
+        self.assertEqual(self.estado_licencia.call_count, 1)
+
+    def test_cambio_de_permisos_invalida_el_principal(self):
+        self._autenticar()
+        self.rol.permisos.append(Permiso(id=2, nombre="crear_documento"))
+        self.db.commit()
+        self.assertIsNone(self._principal())
+
+        usuario = self._autenticar()
+        self.assertEqual(set(usuario.permisos_efectivos), {"ver_reportes", "crear_documento"})
+
+    def test_cambio_de_roles_del_usuario_invalida_el_principal(self):
+        usuario = self._autenticar()
+        usuario.roles = []
+        self.db.commit()
+        self.assertIsNone(self._principal())
+
+    def test_contexto_de_empresa_del_token_no_invalida(self):
+        # Una petición que confirma cambios (en la misma sesión) tras autenticarse
+        usuario = self._autenticar()
+        self.assertIn(usuario, self.db.dirty)
+        self.db.commit()
+        self.assertIsNotNone(self._principal())
+
+        self._autenticar()
+        self.assertEqual(self.estado_licencia.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
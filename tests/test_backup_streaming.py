@@ -0,0 +1,185 @@
+import unittest
+import sys
+import os
+import io
+import json
+import zipfile
+import tempfile
+import contextlib
+from datetime import date, datetime
+from unittest import mock
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import (
+    Bodega, CentroCosto, Documento, Empresa, MovimientoContable, MovimientoInventario, PlanCuenta, Producto,
+    Tercero, TipoDocumento, GrupoInventario
+)
+from app.models.saldo_mensual import SaldoMensualCuenta
+from app.services import migracion
+
+
+class TestBackupStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.directorio = mock.patch.object(
+            migracion, "_directorio_backups",
+            side_effect=lambda sub: os.makedirs(os.path.join(self.carpeta.name, sub), exist_ok=True) or os.path.join(self.carpeta.name, sub)
+        )
+        self.directorio.start()
+
+        self.db.add_all([
+            Empresa(id=1, razon_social="Origen", nit="900", is_lite_mode=True),
+            Empresa(id=2, razon_social="Destino", nit="901", is_lite_mode=True),
+            TipoDocumento(id=1, empresa_id=1, codigo="RC", nombre="Recibo"),
+            PlanCuenta(id=1, empresa_id=1, codigo="110505", nombre="Caja", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=2, empresa_id=1, codigo="413505", nombre="Ingresos", nivel=4, permite_movimiento=True),
+            Tercero(id=1, empresa_id=1, nit="800", razon_social="Cliente"),
+            CentroCosto(id=1, empresa_id=1, codigo="01", nombre="General", nivel=1),
+            Bodega(id=1, empresa_id=1, nombre="Principal"),
+            GrupoInventario(id=1, empresa_id=1, nombre="G1"),
+            Producto(id=1, empresa_id=1, codigo="P1", nombre="Producto", grupo_id=1),
+        ])
+        self.db.flush()
+        for i in range(30):
+            documento = Documento(empresa_id=1, tipo_documento_id=1, numero=i + 1, fecha=date(2025, 1 + i % 12, 5),
+                                  beneficiario_id=1, anulado=(i == 7), estado="ACTIVO", observaciones=f"obs {i}")
+            self.db.add(documento)
+            self.db.flush()
+            self.db.add(MovimientoContable(documento_id=documento.id, cuenta_id=1, concepto=f"pago {i}", debito=10, credito=0))
+            self.db.add(MovimientoContable(documento_id=documento.id, cuenta_id=2, concepto="ingreso", debito=0, credito=10))
+            if i % 4 == 0:
+                self.db.add(MovimientoInventario(documento_id=documento.id, producto_id=1, bodega_id=1,
+                                                 tipo_movimiento="ENTRADA_COMPRA", cantidad=3, costo_unitario=5,
+                                                 costo_total=15, fecha=datetime(2025, 1 + i % 12, 5)))
+        self.db.commit()
+
+        self.backup = io.BytesIO()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.manifiesto = migracion.generar_backup_streaming(self.db, 1, self.backup, filas_por_bloque=7)
+
+    def tearDown(self):
+        self.directorio.stop()
+        self.carpeta.cleanup()
+        self.db.close()
+
+    def _restaurar(self, archivo=None, **kwargs):
+        archivo = archivo or io.BytesIO(self.backup.getvalue())
+        with contextlib.redirect_stdout(io.StringIO()):
+            return migracion.ejecutar_restauracion_streaming(self.db, archivo, 2, user_id=None, **kwargs)
+
+    def _contar(self, modelo, empresa_id=2):
+        consulta = self.db.query(func.count(modelo.id))
+        if modelo is Documento:
+            return consulta.filter(Documento.empresa_id == empresa_id).scalar()
+        return consulta.join(Documento, modelo.documento_id == Documento.id).filter(Documento.empresa_id == empresa_id).scalar()
+
+    def test_formato_por_bloques_firmados(self):
+        archivos = {a["archivo"]: a for a in self.manifiesto["archivos"]}
+        self.assertIn("maestros/terceros/00001.jsonl", archivos)
+        transacciones = [a for a in self.manifiesto["archivos"] if a["seccion"] == "transacciones"]
+        self.assertEqual([a["filas"] for a in transacciones], [7, 7, 7, 7, 2])
+
+        with zipfile.ZipFile(io.BytesIO(self.backup.getvalue())) as zipf:
+            primero = migracion._filas_jsonl(zipf.read("transacciones/00001.jsonl"))
+        self.assertEqual(primero[0]["tipo_doc_codigo"], "RC")
+        self.assertEqual(len(primero[0]["movimientos_contables"]), 2)
+
+        # Mismo contenido que el backup JSON de siempre
+        with contextlib.redirect_stdout(io.StringIO()):
+            completo = migracion.generar_backup_json(self.db, 1)["data"]["transacciones"]
+        self.assertEqual(primero, completo[:7])
+
+    def test_restaura_por_bloques(self):
+        resultado = self._restaurar()
+        self.assertEqual(resultado["resumen"]["bloques_procesados"], 5)
+        self.assertEqual(self._contar(Documento), 29)
+        self.assertEqual(self._contar(MovimientoContable), 58)
+        self.assertEqual(self._contar(MovimientoInventario), 8)
+
+        cuenta_caja = self.db.query(PlanCuenta.id).filter(PlanCuenta.empresa_id == 2, PlanCuenta.codigo == "110505").scalar()
+        documento = self.db.query(Documento).filter(Documento.empresa_id == 2, Documento.numero == 1).one()
+        self.assertEqual(documento.movimientos[0].cuenta_id, cuenta_caja)
+        self.assertEqual(documento.observaciones, "obs 0")
+        debito = self.db.query(func.sum(SaldoMensualCuenta.debito)).filter(
+            SaldoMensualCuenta.empresa_id == 2, SaldoMensualCuenta.cuenta_id == cuenta_caja
+        ).scalar()
+        self.assertEqual(float(debito), 290.0)
+        self.assertEqual(os.listdir(os.path.join(self.carpeta.name, "restauraciones")), [])
+
+        # Restaurar de nuevo corrige los existentes sin duplicar
+        self._restaurar()
+        self.assertEqual(self._contar(Documento), 29)
+        self.assertEqual(self._contar(MovimientoContable), 58)
+
+    def test_restauracion_json_usa_los_bloques(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            backup = migracion.generar_backup_json(self.db, 1)
+        request = migracion.schemas_migracion.AnalysisRequest(backupData=backup, targetEmpresaId=2)
+        original = migracion._restaurar_bloque_transacciones
+        with mock.patch.object(migracion, "BACKUP_FILAS_POR_BLOQUE", 7), \
+                mock.patch.object(migracion, "_restaurar_bloque_transacciones", side_effect=original) as restaurar, \
+                contextlib.redirect_stdout(io.StringIO()):
+            resultado = migracion.ejecutar_restauracion(self.db, request, None, snapshot=False)
+        self.assertEqual(restaurar.call_count, 5)
+        self.assertIn("📥 29 Documentos Creados", resultado["resumen"]["acciones_realizadas"])
+        self.assertEqual(self._contar(Documento), 29)
+        self.assertEqual(self._contar(MovimientoContable), 58)
+        self.assertEqual(self._contar(MovimientoInventario), 8)
+
+    def test_bloque_alterado_se_rechaza(self):
+        alterado = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(self.backup.getvalue())) as origen, zipfile.ZipFile(alterado, "w") as destino:
+            for nombre in origen.namelist():
+                contenido = origen.read(nombre)
+                if nombre == "transacciones/00002.jsonl":
+                    contenido = contenido.replace(b'"debito": 10.0', b'"debito": 99.0')
+                destino.writestr(nombre, contenido)
+        with self.assertRaises(HTTPException) as ctx:
+            self._restaurar(alterado)
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertIn("00002", ctx.exception.detail)
+
+    def test_reanuda_en_el_primer_bloque_sin_confirmar(self):
+        original = migracion._restaurar_bloque_transacciones
+        llamadas = []
+
+        def falla_en_el_tercero(*args, **kwargs):
+            llamadas.append(1)
+            if len(llamadas) == 3:
+                raise RuntimeError("conexión perdida")
+            return original(*args, **kwargs)
+
+        with mock.patch.object(migracion, "_restaurar_bloque_transacciones", side_effect=falla_en_el_tercero):
+            with self.assertRaises(HTTPException) as ctx:
+                self._restaurar()
+        self.assertEqual(ctx.exception.status_code, 500)
+        self.assertEqual(self._contar(Documento), 13)
+
+        progreso_archivo = os.listdir(os.path.join(self.carpeta.name, "restauraciones"))[0]
+        with open(os.path.join(self.carpeta.name, "restauraciones", progreso_archivo), encoding="utf-8") as f:
+            progreso = json.load(f)
+        self.assertEqual(progreso["bloques"], ["transacciones/00001.jsonl", "transacciones/00002.jsonl"])
+
+        with mock.patch.object(migracion, "_restaurar_bloque_transacciones", side_effect=original) as restaurar:
+            resultado = self._restaurar()
+        self.assertEqual(restaurar.call_count, 3)
+        self.assertEqual(resultado["resumen"]["bloques_procesados"], 5)
+        self.assertEqual(resultado["resumen"]["documentos_procesados"], 29)
+        self.assertEqual(self._contar(Documento), 29)
+        self.assertEqual(len(os.listdir(os.path.join(self.carpeta.name, "safety"))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import aliased, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import MovimientoEliminado, Tercero
+from app.services import busqueda
+
+_TERCEROS = [
+    (1, "900123456", "Distribuidora El Sol SAS"),
+    (2, "800555111", "Sol y Luna Ltda"),
+    (3, "123", "Ferretería Central"),
+    (4, "900777888", "Central de Soluciones"),
+]
+
+
+class TestBusqueda(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.Sesion = sessionmaker(bind=self.engine)
+        # Filas previas al índice: asegurar_indices debe cargarlas
+        with self.engine.begin() as conn:
+            for id_, nit, razon in _TERCEROS:
+                conn.exec_driver_sql(
+                    "INSERT INTO terceros (id, version_id, empresa_id, nit, razon_social, es_empleado, "
+                    "es_regimen_simple, es_vendedor) VALUES (?, 1, 1, ?, ?, 0, 0, 0)", (id_, nit, razon)
+                )
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.reindexadas = busqueda.asegurar_indices(self.engine)
+        self.db = self.Sesion()
+
+    def tearDown(self):
+        self.db.close()
+        busqueda._fts_listas.pop(self.engine, None)
+
+    def _ids(self, texto, **kwargs):
+        query = self.db.query(Tercero.id).filter(Tercero.empresa_id == 1)
+        return sorted(r.id for r in busqueda.filtrar(query, "tercero", texto, **kwargs))
+
+    def test_indexa_lo_existente_y_filtra_por_fts(self):
+        self.assertEqual(self.reindexadas["tercero"], 4)
+        expresion = busqueda.condicion(self.db, "tercero", "central")
+        self.assertIn("busqueda_tercero_fts", str(expresion.compile(self.engine)))
+        self.assertEqual(self._ids("central"), [3, 4])
+        self.assertEqual(self._ids("9001"), [1])
+        self.assertEqual(self._ids("SOL"), [1, 2, 4])
+
+    def test_texto_corto_y_comodines(self):
+        self.assertEqual(self._ids("12"), [1, 3])
+        self.assertEqual(self._ids("%"), [])
+        self.assertEqual(self._ids(""), [1, 2, 3, 4])
+
+    def test_aproximada_y_relevancia(self):
+        self.assertEqual(self._ids("soluciones central"), [])
+        self.assertEqual(self._ids("soluciones central", aproximada=True), [4])
+        query = busqueda.filtrar(self.db.query(Tercero.id), "tercero", "sol", ordenar=True)
+        self.assertEqual(query.order_by(Tercero.id).all()[0].id, 2)
+
+    def test_sincroniza_con_el_orm(self):
+        nuevo = Tercero(id=10, empresa_id=1, nit="555", razon_social="Panadería Solar")
+        self.db.add(nuevo)
+        self.db.flush()
+        self.assertIn(10, self._ids("solar"))
+
+        nuevo.razon_social = "Panadería Norte"
+        self.db.delete(self.db.get(Tercero, 3))
+        self.db.commit()
+        self.assertEqual(self._ids("solar"), [])
+        self.assertEqual(self._ids("norte"), [10])
+        self.assertEqual(self._ids("ferreter"), [])
+
+    def test_update_masivo_reindexa_solo_lo_afectado(self):
+        # Fila FTS desactualizada a propósito: una reconstrucción completa la corregiría
+        self.db.execute(text("UPDATE busqueda_tercero_fts SET razon_social = 'Obsoleto' WHERE rowid = 3"))
+        consultas = []
+        event.listen(self.engine, "before_cursor_execute", lambda *args: consultas.append(args[2]))
+
+        self.db.query(Tercero).filter(Tercero.razon_social.like("Sol%")).update(
+            {"razon_social": "Estrella Ltda"}, synchronize_session=False
+        )
+        self.assertEqual(self._ids("estrella"), [2])
+        self.assertEqual(self._ids("luna"), [])
+        self.db.commit()
+        self.assertEqual(self._ids("estrella"), [2])
+        self.assertEqual(self._ids("obsoleto"), [3])
+
+        # Un UPDATE que no toca columnas indexadas no escribe en la tabla FTS
+        consultas.clear()
+        self.db.query(Tercero).filter(Tercero.id == 1).update({"email": "sol@example.com"}, synchronize_session=False)
+        self.db.commit()
+        self.assertFalse([c for c in consultas if "fts" in c])
+
+    def test_sin_tabla_fts_verifica_una_vez(self):
+        motor = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(motor)
+        db = sessionmaker(bind=motor)()
+        consultas = []
+        event.listen(motor, "before_cursor_execute", lambda *args: consultas.append(args[2]))
+        try:
+            for lote in range(3):
+                db.add_all([Tercero(empresa_id=1, nit=f"{lote}{i}", razon_social=f"Tercero {i}") for i in range(20)])
+                db.flush()
+            self.assertEqual(len([c for c in consultas if "sqlite_master" in c]), 1)
+            self.assertEqual(db.query(Tercero).filter(busqueda.condicion(db, "tercero", "Tercero 1")).count(), 33)
+        finally:
+            db.close()
+            busqueda._fts_listas.pop(motor, None)
+
+    def test_alias_y_otras_tablas(self):
+        alias = aliased(Tercero)
+        self.assertIn("busqueda_tercero_fts", str(busqueda.condicion(self.db, "tercero", "central", objetivo=alias)))
+        # Sin tabla FTS propia (papelera): mismo resultado con ILIKE
+        expresion = busqueda.condicion(self.db, "concepto", "pago", objetivo=MovimientoEliminado)
+        self.assertNotIn("fts", str(expresion))
+        with self.assertRaises(ValueError):
+            busqueda.condicion(self.db, "tercero", "x", columnas=["email"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import sys
+import os
+import tempfile
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.cache import TenantCache
+
+
+class _TenantCacheCasos:
+    backend = "memory"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = TenantCache(max_entries=3, backend=self.backend,
+                                 sqlite_path=os.path.join(self.tmp.name, "cache.sqlite3"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lru_desaloja_la_menos_usada(self):
+        for i in range(3):
+            self.cache.set(f"k{i}", i)
+        self.assertEqual(self.cache.get("k0"), 0)  # k0 pasa a ser la más reciente
+        self.cache.set("k3", 3)
+        self.assertIsNone(self.cache.get("k1"))
+        self.assertEqual(self.cache.get("k0"), 0)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_invalidacion_por_empresa_y_etiqueta(self):
+        k1 = self.cache._generate_key("balance", 1, empresa_id=12)
+        k2 = self.cache._generate_key("cartera", 1, empresa_id=12)
+        k3 = self.cache._generate_key("balance", 1, empresa_id=13)
+        self.assertTrue(k1.startswith("empresa:12:balance:"))
+        self.cache.set(k1, "a", empresa_id=12, tags=["balances"])
+        self.cache.set(k2, "b", empresa_id=12)
+        self.cache.set(k3, "c", empresa_id=13, tags=["balances"])
+
+        self.assertEqual(self.cache.invalidate_tags("balances", empresa_id=12), 1)
+        self.assertIsNone(self.cache.get(k1))
+        self.assertEqual(self.cache.get(k3), "c")
+
+        self.assertEqual(self.cache.invalidate_empresa(12), 1)
+        self.assertIsNone(self.cache.get(k2))
+
+    def test_invalidacion_por_patron(self):
+        self.cache.set(self.cache._generate_key("import_config", empresa_id=5), 1)
+        self.cache.set(self.cache._generate_key("import_config", empresa_id=6), 2)
+        self.assertEqual(self.cache.invalidate_pattern("empresa:5:import_config:*"), 1)
+        self.assertEqual(self.cache.get_stats()['total_entries'], 1)
+
+    def test_contadores(self):
+        self.cache.set("k", None)
+        self.cache.get("k")
+        self.cache.get("otra")
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+class TestTenantCacheMemoria(_TenantCacheCasos, unittest.TestCase):
+    backend = "memory"
+
+    def test_tamano_se_mide_solo_en_estadisticas(self):
+        with mock.patch("app.core.cache.pickle.dumps") as dumps:
+            self.cache.set("k", [1, 2, 3])
+            self.cache.set("no_serializable", lambda: None)
+        dumps.assert_not_called()
+        self.assertEqual(self.cache.get("k"), [1, 2, 3])
+        self.assertGreater(self.cache.get_stats()['memory_usage_mb'], 0)
+
+
+class TestTenantCacheSQLite(_TenantCacheCasos, unittest.TestCase):
+    backend = "sqlite"
+
+    def test_entradas_compartidas_entre_instancias(self):
+        otro = TenantCache(max_entries=3, backend="sqlite", sqlite_path=self.cache._backend.path)
+        self.cache.set("compartida", {"valor": 1})
+        self.assertEqual(otro.get("compartida"), {"valor": 1})
+
+    def test_contador_de_entradas(self):
+        conn = self.cache._backend._conn()
+        total = lambda: conn.execute("SELECT total FROM cache_meta").fetchone()[0]
+        for i in range(3):
+            self.cache.set(f"k{i}", i)
+        self.cache.set("k1", "otro valor")  # Reemplazo: no suma
+        self.assertEqual(total(), 3)
+        self.cache.set("k3", 3)  # Desaloja una
+        self.assertEqual((total(), self.cache.evictions), (3, 1))
+        self.cache.delete("k3")
+        self.assertEqual(total(), 2)
+        self.cache.set("no_serializable", lambda: None)
+        self.assertEqual(total(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
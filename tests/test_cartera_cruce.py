@@ -0,0 +1,206 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+import random
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import Documento, Empresa, MovimientoContable, PlanCuenta, Tercero, TipoDocumento
+from app.models.aplicacion_pago import AplicacionPago
+from app.models.propiedad_horizontal import PHConcepto, PHUnidad
+from app.services import cartera as cartera_service
+from app.services.cartera import _DocCartera, _cruzar_cxc, _cruzar_cxp, _ordenar_fifo
+
+
+def _doc(doc_id, dia, unidad=None):
+    return _DocCartera(doc_id, date(2026, 1, dia), doc_id, unidad, "RC")
+
+
+class _Mov:
+    def __init__(self, credito, concepto="ABONO"):
+        self.credito = credito
+        self.concepto = concepto
+
+
+class TestCruceCartera(unittest.TestCase):
+
+    def _cruzar(self, facturas, pagos):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return _cruzar_cxc(_ordenar_fifo(facturas), _ordenar_fifo(pagos), [], tercero_id=1)
+
+    def test_fifo_por_fecha(self):
+        facturas = [
+            {'doc': _doc(2, 5), 'saldo': 100.0, 'saldo_x_cid': {0: 100.0}},
+            {'doc': _doc(1, 1), 'saldo': 50.0, 'saldo_x_cid': {0: 50.0}},
+        ]
+        pagos = [{'doc': _doc(3, 10), 'monto': 120.0, 'movs': [_Mov(120.0)]}]
+        self.assertEqual(self._cruzar(facturas, pagos), {(1, 3): 50.0, (2, 3): 70.0})
+
+    def test_pago_agregado_al_final_equivale_a_cruce_completo(self):
+        def facturas():
+            return [
+                {'doc': _doc(1, 1), 'saldo': 100.0, 'saldo_x_cid': {0: 100.0}},
+                {'doc': _doc(2, 2), 'saldo': 100.0, 'saldo_x_cid': {0: 100.0}},
+            ]
+        p1 = {'doc': _doc(3, 3), 'monto': 150.0, 'movs': [_Mov(150.0)]}
+        p2 = {'doc': _doc(4, 4), 'monto': 30.0, 'movs': [_Mov(30.0)]}
+        completo = self._cruzar(facturas(), [p1, p2])
+
+        # Incremental: saldos tras el primer pago y cruce solo del pago nuevo
+        previo = self._cruzar(facturas(), [p1])
+        parciales = facturas()
+        for fac in parciales:
+            fac['saldo'] -= sum(v for (f, _), v in previo.items() if f == fac['doc'].id)
+        delta = self._cruzar(parciales, [p2])
+        self.assertEqual({**previo, **delta}, completo)
+
+    def test_cxp_fifo_simple(self):
+        facturas = [{'doc': _doc(1, 1), 'saldo': 40.0}, {'doc': _doc(2, 2), 'saldo': 40.0}]
+        pagos = [{'doc': _doc(3, 3), 'monto': 60.0}]
+        self.assertEqual(_cruzar_cxp(facturas, pagos, {}), {(1, 3): 40.0, (2, 3): 20.0})
+
+
+CXC, CXP, CAJA, INGRESO = 1, 2, 3, 4
+CUOTA, INTERES = 1, 2
+TEXTOS_FACTURA = {CUOTA: "Cuota de Administración", INTERES: "Intereses de Mora"}
+
+
+class TestRecalculoAcotado(unittest.TestCase):
+    """Cada recálculo con pista debe dejar lo mismo que el completo."""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add_all([
+            Empresa(id=1, razon_social="Conjunto", nit="900"),
+            PlanCuenta(id=CXC, empresa_id=1, codigo="130505", nombre="Cartera", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=CXP, empresa_id=1, codigo="220505", nombre="Proveedores", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=CAJA, empresa_id=1, codigo="110505", nombre="Caja", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=INGRESO, empresa_id=1, codigo="417005", nombre="Ingresos", nivel=4, permite_movimiento=True),
+            TipoDocumento(id=1, empresa_id=1, codigo="FV", nombre="Factura"),
+            Tercero(id=1, empresa_id=1, nit="101", razon_social="Propietario"),
+            PHUnidad(id=1, empresa_id=1, codigo="101"),
+            PHUnidad(id=2, empresa_id=1, codigo="102"),
+            PHConcepto(id=CUOTA, empresa_id=1, nombre=TEXTOS_FACTURA[CUOTA], cuenta_ingreso_id=INGRESO, orden=1),
+            PHConcepto(id=INTERES, empresa_id=1, nombre=TEXTOS_FACTURA[INTERES], cuenta_ingreso_id=INGRESO, orden=2),
+        ])
+        self.db.commit()
+        self.numero = 0
+
+    def tearDown(self):
+        self.db.close()
+
+    def _documento(self, dia, movimientos, unidad=None):
+        self.numero += 1
+        doc = Documento(empresa_id=1, tipo_documento_id=1, numero=self.numero, fecha=date(2026, 1 + dia // 28, 1 + dia % 28),
+                        beneficiario_id=1, unidad_ph_id=unidad, movimientos=movimientos)
+        self.db.add(doc)
+        self.db.commit()
+        return doc.id
+
+    def _factura(self, dia, valores, unidad=None):
+        return self._documento(dia, [
+            MovimientoContable(cuenta_id=CXC, concepto=TEXTOS_FACTURA[cid], debito=valor, credito=0)
+            for cid, valor in valores
+        ], unidad)
+
+    def _pago(self, dia, valor, unidad=None, concepto="ABONO PH"):
+        return self._documento(dia, [
+            MovimientoContable(cuenta_id=CAJA, concepto=concepto, debito=valor, credito=0),
+            MovimientoContable(cuenta_id=CXC, concepto=concepto, debito=0, credito=valor),
+        ], unidad)
+
+    def _recalcular(self, pista=None, conceptos=True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return cartera_service.recalcular_aplicaciones_tercero(
+                self.db, 1, 1, injected_cuentas_cxc=[CXC], injected_cuentas_cxp=[CXP],
+                injected_conceptos_ph=self.db.query(PHConcepto).order_by(PHConcepto.orden).all() if conceptos else [],
+                documento_id=pista
+            )
+
+    def _assert_igual_al_completo(self, conceptos=True):
+        resultado = self._recalcular(conceptos=conceptos)
+        self.assertEqual((resultado["insertadas"], resultado["actualizadas"], resultado["eliminadas"]), (0, 0, 0))
+
+    def test_factura_nueva_sin_anticipos_no_recalcula(self):
+        factura = self._factura(1, [(CUOTA, 100)], unidad=1)
+        self._pago(2, 100, unidad=1)
+        self._recalcular()
+        resultado = self._recalcular(self._factura(3, [(CUOTA, 100)], unidad=1))
+        self.assertEqual((resultado["modo"], resultado["insertadas"], resultado["eliminadas"]), ("incremental", 0, 0))
+        self.assertEqual(self.db.query(AplicacionPago.documento_factura_id).scalar(), factura)
+        self._assert_igual_al_completo()
+
+    def test_factura_nueva_absorbe_anticipo(self):
+        self._factura(1, [(CUOTA, 100)], unidad=1)
+        pago = self._pago(2, 150, unidad=1)
+        self._recalcular()
+        factura = self._factura(3, [(INTERES, 80)], unidad=1)
+        resultado = self._recalcular(factura)
+        self.assertEqual((resultado["modo"], resultado["insertadas"]), ("incremental", 1))
+        fila = self.db.query(AplicacionPago).filter_by(documento_factura_id=factura).one()
+        self.assertEqual((fila.documento_pago_id, float(fila.valor_aplicado), fila.valor_por_concepto), (pago, 50.0, {str(INTERES): 50.0}))
+        self._assert_igual_al_completo()
+
+    def test_cambios_aleatorios_equivalen_al_completo(self):
+        for semilla in range(6):
+            with self.subTest(semilla=semilla):
+                self.tearDown()
+                self.setUp()
+                self._escenario(random.Random(semilla), conceptos=semilla % 3 != 0)
+
+    def _escenario(self, rnd, conceptos):
+        def cambio():
+            dia = rnd.randint(0, 80)
+            unidad = rnd.choice([None, 1, 2])
+            opcion = rnd.random()
+            if opcion < 0.35:
+                valores = [(cid, rnd.choice([40, 75, 120])) for cid in rnd.sample([CUOTA, INTERES], rnd.randint(1, 2))]
+                return self._factura(dia, valores, unidad)
+            if opcion < 0.7:
+                concepto = rnd.choice(["ABONO PH", "ABONO PH", TEXTOS_FACTURA[INTERES], "Pago recibido"])
+                return self._pago(dia, rnd.choice([30, 60, 110, 200]), unidad, concepto)
+            if opcion < 0.8:
+                return self._documento(dia, [
+                    MovimientoContable(cuenta_id=CXP, concepto="Compra", debito=0, credito=rnd.choice([50, 90])),
+                    MovimientoContable(cuenta_id=INGRESO, concepto="Compra", debito=0, credito=0),
+                ]) if rnd.random() < 0.5 else self._documento(dia, [
+                    MovimientoContable(cuenta_id=CXP, concepto="Egreso", debito=rnd.choice([40, 70]), credito=0),
+                ])
+            documentos = self.db.query(Documento).all()
+            if not documentos:
+                return self._factura(dia, [(CUOTA, 100)], unidad)
+            doc = rnd.choice(documentos)
+            if opcion < 0.9:
+                doc.anulado = True
+                self.db.commit()
+                return doc.id
+            pista = cartera_service.PistaEliminado(doc.fecha, doc.id)
+            self.db.delete(doc)
+            self.db.commit()
+            return pista
+
+        for _ in range(12):
+            cambio()
+        self._recalcular(conceptos=conceptos)
+        modos = []
+        for _ in range(25):
+            pistas = [cambio() for _ in range(rnd.choice([1, 1, 2]))]
+            modos.append(self._recalcular(pistas, conceptos=conceptos)["modo"])
+            self.db.commit()
+            self._assert_igual_al_completo(conceptos=conceptos)
+        self.assertEqual(set(modos), {"incremental"})
+
+
+if __name__ == '__main__':
+    unittest.main()
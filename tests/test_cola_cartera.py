@@ -0,0 +1,112 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+from types import SimpleNamespace
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services import cartera as cartera_service
+from app.services import cola_cartera
+
+
+class _SesionFalsa:
+    """Lo mínimo que usa la cola: info, commit y el dialecto."""
+
+    def __init__(self, dialecto="sqlite"):
+        self.info = {}
+        self.commits = 0
+        self._bind = SimpleNamespace(dialect=SimpleNamespace(name=dialecto))
+
+    def commit(self):
+        self.commits += 1
+
+    def get_bind(self):
+        return self._bind
+
+
+class TestColaRecalculoCartera(unittest.TestCase):
+
+    def _lote(self, db, **kwargs):
+        return cola_cartera.recalculo_diferido(
+            db, 1, descripcion="test", injected_cuentas_cxc=[10], injected_cuentas_cxp=[20],
+            injected_conceptos_ph=[], **kwargs
+        )
+
+    def test_recalculo_dentro_del_lote_solo_marca(self):
+        db = _SesionFalsa()
+        llamadas = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self._lote(db) as cola:
+                for doc_id in (100, 101, 100):
+                    res = cartera_service.recalcular_aplicaciones_tercero(db, 7, 1, documento_id=doc_id)
+                    self.assertEqual(res["status"], "diferido")
+                cartera_service.recalcular_aplicaciones_tercero(db, 8, 1, documento_id=200)
+                cartera_service.recalcular_aplicaciones_tercero(db, 8, 1)
+                self.assertEqual(cola.pendientes, {7: {100, 101}, 8: None})
+
+                def falso(db_, tercero_id, empresa_id, **kw):
+                    llamadas.append((tercero_id, kw["documento_id"], kw["commit"]))
+                    return {"status": "ok", "modo": "incremental" if kw["documento_id"] else "completo"}
+
+                parche = mock.patch.object(cartera_service, "recalcular_aplicaciones_tercero", side_effect=falso)
+                parche.start()
+            parche.stop()
+
+        # Cada tercero una sola vez; las pistas se fusionan y "completo" domina
+        self.assertEqual(sorted(llamadas), [(7, [100, 101], True), (8, None, True)])
+        self.assertEqual(db.info[cola_cartera._CLAVE_COLAS], [])
+        self.assertEqual(cola.resumen["terceros"], 2)
+        self.assertEqual(cola.resumen["marcas"], 5)
+
+        progreso = cola_cartera.get_progreso_lote(cola.lote_id, 1)
+        self.assertEqual(progreso["estado"], "COMPLETADO")
+        self.assertEqual((progreso["procesados"], progreso["incrementales"], progreso["completos"]), (2, 1, 1))
+        self.assertIsNone(cola_cartera.get_progreso_lote(cola.lote_id, 2))
+
+    def test_lote_anidado_reutiliza_la_cola_externa(self):
+        db = _SesionFalsa()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with mock.patch.object(cola_cartera.ColaRecalculoCartera, "procesar", return_value={}) as procesar:
+                with self._lote(db) as externa:
+                    with self._lote(db) as interna:
+                        self.assertIs(interna, externa)
+                        interna.marcar(5)
+                    procesar.assert_not_called()
+                procesar.assert_called_once()
+        self.assertEqual(externa.pendientes, {5: None})
+
+    def test_excepcion_descarta_la_cola(self):
+        db = _SesionFalsa()
+        with mock.patch.object(cola_cartera.ColaRecalculoCartera, "procesar") as procesar:
+            with self.assertRaises(RuntimeError):
+                with self._lote(db) as cola:
+                    cola.marcar(5)
+                    raise RuntimeError("fallo del lote")
+            procesar.assert_not_called()
+        self.assertIsNone(cola_cartera.cola_activa(db, 1))
+
+    def test_error_de_un_tercero_no_detiene_el_lote(self):
+        db = _SesionFalsa()
+
+        def falso(db_, tercero_id, empresa_id, **kw):
+            if tercero_id == 2:
+                raise ValueError("sin cuentas")
+            return {"status": "ok", "modo": "completo"}
+
+        cola = cola_cartera.ColaRecalculoCartera(1, injected_cuentas_cxc=[10], injected_cuentas_cxp=[],
+                                                 injected_conceptos_ph=[])
+        for t_id in (1, 2, 3):
+            cola.marcar(t_id)
+        with contextlib.redirect_stdout(io.StringIO()):
+            with mock.patch.object(cartera_service, "recalcular_aplicaciones_tercero", side_effect=falso):
+                resumen = cola.procesar(db)
+        self.assertEqual(len(resumen["errores"]), 1)
+        self.assertEqual(cola_cartera.get_progreso_lote(cola.lote_id, 1)["estado"], "COMPLETADO_CON_ERRORES")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import Documento, Empresa, MovimientoContable, PlanCuenta, TipoDocumento
+from app.models.conciliacion_bancaria import BankMovement, Reconciliation, ReconciliationMovement
+from app.services import conciliacion_grupos
+from app.services.conciliacion_bancaria import MatchingEngine
+from app.services.conciliacion_grupos import Partida
+
+
+class TestSolverGrupos(unittest.TestCase):
+
+    def test_busca_subconjuntos_en_la_ventana(self):
+        partidas = [Partida("a", date(2025, 3, 9), 5000), Partida("b", date(2025, 3, 10), 3000),
+                    Partida("c", date(2025, 3, 10), 2000), Partida("d", date(2025, 3, 10), 4500),
+                    Partida("lejos", date(2025, 3, 20), 1000)]
+        grupos = conciliacion_grupos.buscar_grupos(
+            [Partida("x", date(2025, 3, 10), 10000), Partida("y", date(2025, 3, 20), 6000)],
+            partidas, tolerancia=0, ventana_dias=3, max_partidas=4
+        )
+        self.assertEqual([(g["objetivo"], g["partidas"], g["dias"]) for g in grupos], [("x", ("a", "b", "c"), 1)])
+
+        # Con tolerancia de 5 pesos entra 4500 + 5000 contra 10000
+        grupos = conciliacion_grupos.buscar_grupos(
+            [Partida("x", date(2025, 3, 10), 10000)], partidas, tolerancia=500, ventana_dias=3, max_partidas=2
+        )
+        self.assertEqual([(g["partidas"], g["diferencia"]) for g in grupos], [(("a", "d"), 500)])
+
+    def test_ambiguos_y_asignacion_global(self):
+        iguales = [Partida(i, date(2025, 3, 10), 100) for i in range(3)]
+        grupos = conciliacion_grupos.buscar_grupos([Partida("x", date(2025, 3, 10), 200)], iguales, 0, 3, 4)
+        for grupo in grupos:
+            grupo["puntaje"] = conciliacion_grupos.puntaje_grupo(grupo, 3, 4)
+        conciliacion_grupos.marcar_ambiguos(grupos)
+        self.assertEqual(len(grupos), 3)
+        self.assertTrue(all(g["ambiguo"] for g in grupos))
+
+        # El banco 1 tiene la misma partida como mejor opción que el banco 2: gana el mayor puntaje
+        elegidos = conciliacion_grupos.asignar([
+            (0.8, [1], [10]), (0.95, [2], [10]), (0.75, [1], [11]), (0.9, [3], [12, 13]), (0.9, [4], [13])
+        ])
+        self.assertEqual(elegidos, [1, 4, 2])
+
+
+class TestConciliacionPorGrupos(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add_all([
+            Empresa(id=1, razon_social="Empresa Uno", nit="900", is_lite_mode=True),
+            TipoDocumento(id=1, empresa_id=1, codigo="RC", nombre="Recibo"),
+            PlanCuenta(id=1, empresa_id=1, codigo="111005", nombre="Banco", nivel=4, permite_movimiento=True),
+        ])
+        self.db.flush()
+        self.numero = 0
+
+    def tearDown(self):
+        self.db.close()
+
+    def _contable(self, fecha, debito=0, credito=0, concepto="Recaudo"):
+        self.numero += 1
+        documento = Documento(empresa_id=1, tipo_documento_id=1, numero=self.numero, fecha=fecha, estado="ACTIVO")
+        self.db.add(documento)
+        self.db.flush()
+        movimiento = MovimientoContable(documento_id=documento.id, cuenta_id=1, concepto=concepto,
+                                        debito=Decimal(debito), credito=Decimal(credito))
+        self.db.add(movimiento)
+        self.db.flush()
+        return movimiento.id
+
+    def _banco(self, fecha, monto, descripcion="MOVIMIENTO", tipo=None):
+        movimiento = BankMovement(import_session_id="s1", bank_account_id=1, empresa_id=1, transaction_date=fecha,
+                                  amount=Decimal(monto), description=descripcion, transaction_type=tipo)
+        self.db.add(movimiento)
+        self.db.flush()
+        return movimiento.id
+
+    def _auto(self):
+        self.db.commit()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return MatchingEngine(self.db).auto_match(1, 1)
+
+    def test_consignacion_en_lote_y_pago_fraccionado(self):
+        recaudos = [self._contable(date(2025, 3, 8), debito="120000.00"),
+                    self._contable(date(2025, 3, 9), debito="80000.50"),
+                    self._contable(date(2025, 3, 10), debito="45000.00")]
+        consignacion = self._banco(date(2025, 3, 10), "245000.50", "CONSIGNACION EFECTIVO")
+        pago = self._contable(date(2025, 3, 15), credito="900000.00", concepto="Pago proveedor")
+        abonos = [self._banco(date(2025, 3, 15), "-500000.00", "TRANSFERENCIA"),
+                  self._banco(date(2025, 3, 17), "400000.00", "TRANSFERENCIA", tipo="DEBITO")]
+        # Ruido en sentido contrario: si se mezclaran sentidos el grupo quedaría ambiguo
+        self._contable(date(2025, 3, 9), credito="80000.50")
+
+        resultado = self._auto()
+        aplicados = {m["match_type"]: m for m in resultado["matches_applied"]}
+        self.assertEqual(set(aplicados), {"GROUP", "SPLIT"})
+        self.assertEqual(resultado["pending_review"], 0)
+
+        grupo = self.db.get(Reconciliation, aplicados["GROUP"]["reconciliation_id"])
+        self.assertEqual(grupo.bank_movement_id, consignacion)
+        self.assertEqual(sorted(r.accounting_movement_id for r in grupo.accounting_movements), recaudos)
+
+        fraccionado = aplicados["SPLIT"]["reconciliation_ids"]
+        self.assertEqual(sorted(self.db.get(Reconciliation, r).bank_movement_id for r in fraccionado), abonos)
+        self.assertEqual(self.db.get(MovimientoContable, pago).reconciliation_status, "RECONCILED")
+
+        # Revertir una parte del pago fraccionado no libera la partida mientras la otra siga activa
+        motor = MatchingEngine(self.db)
+        motor.reverse_reconciliation(fraccionado[0], 1, 1, "prueba")
+        self.assertEqual(self.db.get(MovimientoContable, pago).reconciliation_status, "RECONCILED")
+        motor.reverse_reconciliation(fraccionado[1], 1, 1, "prueba")
+        self.assertEqual(self.db.get(MovimientoContable, pago).reconciliation_status, "UNRECONCILED")
+
+    def test_grupo_ambiguo_solo_se_sugiere(self):
+        for _ in range(3):
+            self._contable(date(2025, 4, 2), debito="100.00")
+        self._banco(date(2025, 4, 2), "200.00")
+
+        resultado = self._auto()
+        self.assertEqual(resultado["auto_applied"], 0)
+        self.assertEqual(resultado["group_matches"], 3)
+        self.assertTrue(all(m["ambiguous"] for m in resultado["suggested_groups"]))
+        self.assertEqual(self.db.query(Reconciliation).count(), 0)
+
+    def test_cada_partida_se_concilia_una_sola_vez(self):
+        contable = self._contable(date(2025, 5, 6), debito="50000.00")
+        self._banco(date(2025, 5, 6), "50000.00")
+        self._banco(date(2025, 5, 6), "50000.00")
+
+        resultado = self._auto()
+        self.assertEqual(resultado["exact_matches"], 2)
+        self.assertEqual(resultado["auto_applied"], 1)
+        self.assertEqual(len(resultado["unmatched_bank"]), 1)
+        self.assertEqual(self.db.query(ReconciliationMovement).filter(
+            ReconciliationMovement.accounting_movement_id == contable).count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import Empresa
+from app.models.conciliacion_bancaria import BankMovement
+from app.schemas.conciliacion_bancaria import BankMovementCreate
+from app.services.conciliacion_bancaria import ImportEngine, bank_movement_hash
+
+
+class TestImportacionExtractos(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add(Empresa(id=1, razon_social="Empresa Uno", nit="900", is_lite_mode=True))
+        self.db.commit()
+        self.motor = ImportEngine(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def _linea(self, dia, monto, descripcion="RETIRO CAJERO", referencia=None):
+        return BankMovementCreate(import_session_id="s1", bank_account_id=1, transaction_date=date(2025, 3, dia),
+                                  amount=Decimal(monto), description=descripcion, reference=referencia)
+
+    def _extracto(self):
+        lineas = [self._linea(1 + i % 28, f"{1000 + i}.50", f"TRANSFERENCIA {i}") for i in range(1500)]
+        # Dos retiros idénticos el mismo día son movimientos distintos
+        lineas += [self._linea(5, "200000.00"), self._linea(5, "200000.00")]
+        return lineas
+
+    def test_huella_normaliza_descripcion_y_monto(self):
+        self.assertEqual(
+            bank_movement_hash(1, date(2025, 3, 5), Decimal("200000"), "Retiro   cajero ", " AB1 "),
+            bank_movement_hash(1, date(2025, 3, 5), "200000.00", "RETIRO CAJERO", "ab1")
+        )
+        self.assertNotEqual(
+            bank_movement_hash(1, date(2025, 3, 5), "200000.00", "RETIRO CAJERO", None),
+            bank_movement_hash(2, date(2025, 3, 5), "200000.00", "RETIRO CAJERO", None)
+        )
+
+    def test_almacena_en_bloque_y_detecta_reimportacion(self):
+        lineas = self._extracto()
+        self.assertEqual(self.motor.detect_duplicates(lineas, 1).total_duplicates, 1)  # Solo el par del lote
+
+        inserciones = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda *args: inserciones.append(1) if args[2].lstrip().upper().startswith("INSERT") else None)
+        resultado = self.motor.store_movements(lineas, "s1", 1, 1)
+        self.assertEqual(len(inserciones), 2)
+        self.assertEqual(resultado["total_stored"], 1502)
+        self.assertEqual(resultado["total_skipped"], 0)
+        primero = self.db.get(BankMovement, resultado["movements"][0])
+        self.assertEqual((primero.description, primero.amount, primero.status), ("TRANSFERENCIA 0", Decimal("1000.50"), "PENDING"))
+
+        consultas = []
+        event.listen(self.engine, "before_cursor_execute", lambda *args: consultas.append(1))
+        reporte = self.motor.detect_duplicates(lineas, 1)
+        self.assertEqual(len(consultas), 2)
+        self.assertEqual(reporte.total_duplicates, 1503)
+        existente = reporte.duplicate_groups[-2]["existing_movement"]
+        self.assertEqual(existente["id"], resultado["movements"][-1])
+
+        # Sin omitir, la línea repetida hace fallar la importación completa
+        with self.assertRaises(Exception):
+            self.motor.store_movements(lineas[:3], "s2", 1, 1)
+        self.assertEqual(self.db.query(func.count(BankMovement.id)).scalar(), 1502)
+
+    def test_omitir_duplicados_en_extracto_solapado(self):
+        lineas = self._extracto()
+        self.motor.store_movements(lineas[:1000], "s1", 1, 1)
+
+        resultado = self.motor.store_movements(lineas, "s2", 1, 1, skip_duplicates=True)
+        self.assertEqual(resultado["total_stored"], 502)
+        self.assertEqual(resultado["total_skipped"], 1000)
+        self.assertEqual(resultado["movements"], sorted(resultado["movements"]))
+        self.assertEqual(self.db.query(func.count(BankMovement.id)).scalar(), 1502)
+        nuevos = self.db.query(func.count(BankMovement.id)).filter(BankMovement.import_session_id == "s2").scalar()
+        self.assertEqual(nuevos, 502)
+
+
+if __name__ == '__main__':
+    unittest.main()
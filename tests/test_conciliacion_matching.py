@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import Documento, Empresa, MovimientoContable, PlanCuenta, TipoDocumento
+from app.models.conciliacion_bancaria import BankMovement, Reconciliation, ReconciliationMovement
+from app.services.conciliacion_bancaria import MatchingEngine
+
+_CONCEPTOS = ["Pago proveedor ACME", "Transferencia nómina", "Consignación cliente Sol", "Comisión bancaria",
+              "Pago servicios públicos", "Recaudo PSE"]
+
+
+class TestConciliacionMatching(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add_all([
+            Empresa(id=1, razon_social="Empresa Uno", nit="900", is_lite_mode=True),
+            TipoDocumento(id=1, empresa_id=1, codigo="CE", nombre="Egreso"),
+            PlanCuenta(id=1, empresa_id=1, codigo="111005", nombre="Banco", nivel=4, permite_movimiento=True),
+        ])
+        self.db.flush()
+
+        azar = random.Random(7)
+        inicio = date(2025, 3, 1)
+        montos = [Decimal(azar.randint(1, 40) * 25000) / 100 for _ in range(60)]
+        for i in range(400):
+            documento = Documento(empresa_id=1, tipo_documento_id=1, numero=i + 1,
+                                  fecha=inicio + timedelta(days=azar.randint(0, 20)), estado="ACTIVO")
+            self.db.add(documento)
+            self.db.flush()
+            valor = azar.choice(montos) + (Decimal("0.00") if azar.random() < 0.7 else Decimal(azar.randint(1, 900)) / 100)
+            debito = valor if azar.random() < 0.5 else 0
+            self.db.add(MovimientoContable(documento_id=documento.id, cuenta_id=1, concepto=azar.choice(_CONCEPTOS),
+                                           debito=debito, credito=0 if debito else valor))
+        for i in range(250):
+            self.db.add(BankMovement(
+                import_session_id="s1", bank_account_id=1, empresa_id=1,
+                transaction_date=inicio + timedelta(days=azar.randint(0, 20)),
+                amount=azar.choice(montos) + (Decimal("0.00") if azar.random() < 0.6 else Decimal(azar.randint(1, 5000)) / 100),
+                description=azar.choice(_CONCEPTOS).upper() + f" REF{azar.randint(1, 99)}"
+            ))
+        self.db.commit()
+        self.motor = MatchingEngine(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def _referencia(self, bank_movements, accounting_movements):
+        """Recorrido de todos contra todos, como lo hacía el motor antes de los índices"""
+        exactos = []
+        for bank_mov in bank_movements:
+            for acc_mov in accounting_movements:
+                if (bank_mov.transaction_date == acc_mov.documento.fecha and
+                        abs(bank_mov.amount - abs(acc_mov.debito - acc_mov.credito)) < 0.01):
+                    exactos.append((bank_mov.id, acc_mov.id))
+                    break
+        exact_bank = {b for b, _ in exactos}
+        exact_acc = {a for _, a in exactos}
+        probables = []
+        for bank_mov in bank_movements:
+            if bank_mov.id in exact_bank:
+                continue
+            mejores = []
+            for acc_mov in accounting_movements:
+                if acc_mov.id in exact_acc:
+                    continue
+                score = self.motor._calculate_match_score(bank_mov, acc_mov)
+                if score["confidence_score"] >= 0.5:
+                    mejores.append((bank_mov.id, acc_mov.id, score))
+            mejores.sort(key=lambda x: x[2]["confidence_score"], reverse=True)
+            probables.extend(mejores[:3])
+        return exactos, probables
+
+    def test_mismos_resultados_que_el_recorrido_completo(self):
+        bancarios = self.motor._get_unmatched_bank_movements(1, 1)
+        contables = self.motor._get_unmatched_accounting_movements(1, 1)
+        exactos_ref, probables_ref = self._referencia(bancarios, contables)
+
+        exactos = self.motor._find_exact_matches(bancarios, contables)
+        probables = self.motor._find_probable_matches(bancarios, contables, exactos)
+
+        self.assertGreater(len(exactos_ref), 20)
+        self.assertGreater(len(probables_ref), 20)
+        self.assertEqual([(m["bank_movement"].id, m["accounting_movements"][0].id) for m in exactos], exactos_ref)
+        self.assertEqual(
+            [(m["bank_movement"].id, m["accounting_movements"][0].id,
+              {k: m[k] for k in ("confidence_score", "criteria_matched", "date_difference",
+                                 "amount_difference", "reference_similarity")}) for m in probables],
+            probables_ref
+        )
+
+    def test_auto_match_resuelve_el_estado_en_memoria(self):
+        # Conciliación previa ya revertida: el movimiento contable sigue contando como conciliado
+        contable = self.db.query(MovimientoContable).order_by(MovimientoContable.id).first()
+        self.db.add(Reconciliation(id=900, bank_movement_id=9999, empresa_id=1, reconciliation_type="MANUAL",
+                                   user_id=1, status="REVERSED"))
+        self.db.add(ReconciliationMovement(reconciliation_id=900, accounting_movement_id=contable.id))
+        self.db.commit()
+
+        consultas = []
+        event.listen(self.engine, "before_cursor_execute", lambda *args: consultas.append(args[2]))
+        resultado = self.motor.auto_match(1, 1)
+        lecturas = [c for c in consultas if c.lstrip().upper().startswith("SELECT")]
+        self.assertLessEqual(len(lecturas), 4)
+
+        conciliados_banco = {r.bank_movement_id for r in self.db.query(Reconciliation).filter(Reconciliation.status == "ACTIVE")}
+        conciliados_contables = {r.accounting_movement_id for r in self.db.query(ReconciliationMovement)}
+        aplicados = {bm.id for m in resultado["matches_applied"] for bm in m.get("bank_movements") or [m["bank_movement"]]}
+        self.assertEqual(aplicados, conciliados_banco)
+        self.assertEqual(len(resultado["unmatched_bank"]), 250 - len(conciliados_banco))
+        self.assertFalse({bm.id for bm in resultado["unmatched_bank"]} & conciliados_banco)
+        self.assertFalse({am.id for am in resultado["unmatched_accounting"]} & conciliados_contables)
+        self.assertNotIn(contable.id, {am.id for am in resultado["unmatched_accounting"]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import (
+    Documento, Empresa, MovimientoContable, PeriodoContableCerrado, PlanCuenta, TipoDocumento
+)
+from app.models.consumo_registros import HistorialConsumo
+from app.models.saldo_mensual import SaldoMensualCuenta
+from app.schemas.documento import DocumentoCreate, MovimientoContableCreate
+from app.services import busqueda, consumo_service, documento_masivo
+from app.services.universal_import_service import UniversalImportService
+
+
+class TestDocumentoMasivo(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        with contextlib.redirect_stdout(io.StringIO()):
+            busqueda.asegurar_indices(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add_all([
+            Empresa(id=1, razon_social="Empresa Uno", nit="900", is_lite_mode=True),
+            TipoDocumento(id=1, empresa_id=1, codigo="RC", nombre="Recibo", consecutivo_actual=10),
+            TipoDocumento(id=2, empresa_id=1, codigo="CI", nombre="Importado", numeracion_manual=True),
+            PlanCuenta(id=1, empresa_id=1, codigo="110505", nombre="Caja", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=2, empresa_id=1, codigo="413505", nombre="Ingresos", nivel=4, permite_movimiento=True),
+        ])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        busqueda._fts_listas.pop(self.engine, None)
+
+    def _documento(self, valor, fecha=date(2025, 3, 10), tipo=1, numero=None, credito=None):
+        return DocumentoCreate(
+            empresa_id=1, tipo_documento_id=tipo, fecha=fecha, numero=numero,
+            movimientos=[
+                MovimientoContableCreate(cuenta_id=1, concepto=f"Recaudo lote {valor}", debito=valor, credito=0),
+                MovimientoContableCreate(cuenta_id=2, concepto="Ingreso", debito=0,
+                                         credito=valor if credito is None else credito),
+            ]
+        )
+
+    def _crear(self, documentos, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return documento_masivo.create_documentos_bulk(self.db, documentos, user_id=None, empresa_id=1,
+                                                          skip_recalculo=True, **kwargs)
+
+    def test_reserva_consecutivos_e_inserta_el_lote(self):
+        documentos = [self._documento(100 + i) for i in range(2500)]
+        documentos.append(self._documento(5, tipo=2, numero=777))
+        resultado = self._crear(documentos)
+
+        self.assertEqual(resultado["creados"], 2501)
+        self.assertEqual(resultado["numeros"][:3], [11, 12, 13])
+        self.assertEqual(resultado["numeros"][2499], 2510)
+        self.assertEqual(resultado["numeros"][-1], 777)
+        self.assertEqual(self.db.get(TipoDocumento, 1).consecutivo_actual, 2510)
+        self.assertEqual(self.db.query(func.count(MovimientoContable.id)).scalar(), 5002)
+
+        primero = self.db.get(Documento, resultado["ids"][0])
+        self.assertEqual((primero.numero, primero.estado, primero.anulado), (11, "ACTIVO", False))
+        self.assertEqual(len(primero.movimientos), 2)
+
+        # Saldos mensuales y búsqueda de conceptos sin pasar por el flush
+        debito_caja = self.db.query(SaldoMensualCuenta.debito).filter(
+            SaldoMensualCuenta.cuenta_id == 1, SaldoMensualCuenta.ano == 2025, SaldoMensualCuenta.mes == 3
+        ).scalar()
+        self.assertEqual(Decimal(str(debito_caja)), Decimal(sum(100 + i for i in range(2500)) + 5))
+        encontrados = self.db.query(MovimientoContable.id).filter(
+            busqueda.condicion(self.db, "concepto", "lote 2599")
+        ).all()
+        self.assertEqual(len(encontrados), 1)
+
+    def test_lote_invalido_se_rechaza_completo(self):
+        self.db.add(PeriodoContableCerrado(empresa_id=1, ano=2024, mes=12))
+        self.db.commit()
+        documentos = [self._documento(10), self._documento(10, credito=9), self._documento(10, fecha=date(2024, 12, 5))]
+        with self.assertRaises(HTTPException) as ctx:
+            self._crear(documentos)
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual([e["indice"] for e in ctx.exception.detail["errores"]], [1, 2])
+        self.assertEqual(self.db.query(func.count(Documento.id)).scalar(), 0)
+        self.assertEqual(self.db.get(TipoDocumento, 1).consecutivo_actual, 10)
+
+        resultado = self._crear(documentos, omitir_invalidos=True)
+        self.assertEqual(resultado["creados"], 1)
+        self.assertEqual(resultado["ids"][1:], [None, None])
+        self.assertEqual(resultado["numeros"][0], 11)
+
+    def test_conservar_numeros(self):
+        resultado = self._crear([self._documento(1, numero=500), self._documento(1)], conservar_numeros=True)
+        self.assertEqual(resultado["numeros"], [500, 11])
+
+    def test_importacion_universal_por_lote(self):
+        empresa = self.db.get(Empresa, 1)
+        empresa.fecha_inicio_operaciones = date(2025, 1, 1)
+        self.db.commit()
+
+        def linea(numero, fecha, cuenta, nit, debito, credito):
+            return {"tipo_doc": "RC", "nombre_tipo_doc": None, "numero": numero, "fecha": fecha, "cuenta": cuenta,
+                    "nombre_cuenta": None, "nit": nit, "nombre_tercero": f"Tercero {nit}", "detalle": f"Importado {numero}",
+                    "debito": debito, "credito": credito}
+
+        entradas = [
+            # Anterior al inicio de operaciones: contabilidad histórica
+            linea("45", date(2024, 6, 1), "110505", "800", 100, 0), linea("45", date(2024, 6, 1), "413505", "801", 0, 100),
+            linea("46", date(2025, 2, 1), "110505", "800", 50, 0), linea("46", date(2025, 2, 1), "413505", "800", 0, 40),
+            linea("45", date(2025, 3, 1), "110505", "800", 10, 0), linea("45", date(2025, 3, 1), "413505", "800", 0, 10),
+        ]
+        with mock.patch.object(UniversalImportService, "parse_excel_file", return_value=entradas), \
+                contextlib.redirect_stdout(io.StringIO()):
+            resultado = UniversalImportService.process_import(self.db, 1, b"")
+
+        self.assertEqual((resultado["documents"], resultado["transactions"], resultado["third_parties"]), (1, 2, 1))
+        self.assertEqual(len(resultado["created_documents"]), 2)
+        self.assertEqual(resultado["errors"], ["Doc RC-45 saltado: Ya existe (Activo).",
+                                               "Doc RC-46 saltado: Error de partida doble."])
+        documento = self.db.query(Documento).one()
+        self.assertEqual((documento.numero, documento.fecha), (45, date(2024, 6, 1)))
+        terceros = {m.cuenta_id: m.tercero_id for m in documento.movimientos}
+        self.assertNotEqual(terceros[1], terceros[2])
+        self.assertEqual(self.db.get(TipoDocumento, 1).consecutivo_actual, 10)
+
+    def test_consumo_se_reparte_por_documento(self):
+        self.db.add(HistorialConsumo(empresa_id=1, cantidad=5, tipo_operacion="CONSUMO", fuente_tipo="PLAN",
+                                     fuente_id=1, saldo_fuente_antes=10, saldo_fuente_despues=5, documento_id=1))
+        self.db.add(HistorialConsumo(empresa_id=1, cantidad=2, tipo_operacion="CONSUMO", fuente_tipo="RECARGA",
+                                     fuente_id=7, saldo_fuente_antes=2, saldo_fuente_despues=0, documento_id=1))
+        self.db.flush()
+        consumo_service._repartir_historial(self.db, 1, [(1, None, 3), (2, None, 3), (3, None, 1)])
+        self.db.flush()
+        filas = self.db.query(HistorialConsumo.documento_id, HistorialConsumo.fuente_tipo, HistorialConsumo.cantidad,
+                              HistorialConsumo.saldo_fuente_despues).order_by(HistorialConsumo.id).all()
+        self.assertEqual([tuple(f) for f in filas], [
+            (1, "PLAN", 3, 7), (2, "RECARGA", 1, 1), (2, "PLAN", 2, 5), (3, "RECARGA", 1, 0)
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+from datetime import date
+from unittest import mock
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import Documento, Empresa, MovimientoContable, PlanCuenta, TipoDocumento
+from app.models.propiedad_horizontal import PHConcepto, PHEstadoCuentaCorte, PHEstadoCuentaUnidad, PHUnidad
+from app.services.propiedad_horizontal import estado_cuenta_service, pago_service, reportes
+
+CXC, ADMIN, INTERES, CAJA = 1, 2, 3, 4
+
+
+class TestEstadoCuentaPH(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add_all([
+            Empresa(id=1, razon_social="Conjunto Uno", nit="900", is_lite_mode=True),
+            PlanCuenta(id=CXC, empresa_id=1, codigo="130505", nombre="Cartera", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=ADMIN, empresa_id=1, codigo="417005", nombre="Administración", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=INTERES, empresa_id=1, codigo="421005", nombre="Intereses", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=CAJA, empresa_id=1, codigo="110505", nombre="Caja", nivel=4, permite_movimiento=True),
+            TipoDocumento(id=1, empresa_id=1, codigo="FPH", nombre="Factura PH", cuenta_debito_cxc_id=CXC),
+            TipoDocumento(id=2, empresa_id=1, codigo="RC", nombre="Recibo", cuenta_credito_cxc_id=CXC),
+            PHConcepto(id=1, empresa_id=1, nombre="Intereses de Mora", cuenta_ingreso_id=INTERES, es_interes=True, orden=1),
+            PHConcepto(id=2, empresa_id=1, nombre="Cuota de Administración", cuenta_ingreso_id=ADMIN, orden=2),
+            PHUnidad(id=1, empresa_id=1, codigo="101"),
+            PHUnidad(id=2, empresa_id=1, codigo="102"),
+        ])
+        self.db.commit()
+        self.numero = 0
+
+    def tearDown(self):
+        self.db.close()
+
+    def _factura(self, unidad_id, fecha, admin, interes=0):
+        movimientos = [MovimientoContable(cuenta_id=CXC, concepto="Cuenta de cobro", debito=admin + interes, credito=0),
+                       MovimientoContable(cuenta_id=ADMIN, concepto="Cuota de Administración", debito=0, credito=admin)]
+        if interes:
+            movimientos.append(MovimientoContable(cuenta_id=INTERES, concepto="Intereses de Mora", debito=0, credito=interes))
+        return self._documento(1, unidad_id, fecha, movimientos)
+
+    def _pago(self, unidad_id, fecha, valor):
+        return self._documento(2, unidad_id, fecha, [
+            MovimientoContable(cuenta_id=CAJA, concepto="Recaudo", debito=valor, credito=0),
+            MovimientoContable(cuenta_id=CXC, concepto="Abono cartera", debito=0, credito=valor),
+        ])
+
+    def _documento(self, tipo, unidad_id, fecha, movimientos):
+        self.numero += 1
+        documento = Documento(empresa_id=1, tipo_documento_id=tipo, numero=self.numero, fecha=fecha,
+                              unidad_ph_id=unidad_id, movimientos=movimientos)
+        self.db.add(documento)
+        return documento
+
+    def _historia(self):
+        for mes in range(1, 9):
+            self._factura(1, date(2025, mes, 1), 300000, 4500 * (mes > 2))
+            self._factura(2, date(2025, mes, 1), 250000)
+            if mes % 3:
+                self._pago(1, date(2025, mes, 20), 200000)
+        self._pago(2, date(2025, 2, 10), 900000)  # Anticipo que cubre varias cuotas
+        self.db.commit()
+
+    def _replay(self, unidad_id, fecha_corte=None):
+        """Resultado del replay completo (como lo calculaban los reportes)"""
+        docs = self.db.query(Documento).filter(
+            Documento.unidad_ph_id == unidad_id, Documento.estado.in_(['ACTIVO', 'PROCESADO'])
+        ).order_by(Documento.fecha, Documento.id).all()
+        actual, _, corte, saf_actual, saf_corte = pago_service._simular_cronologia_pagos(
+            self.db, docs, 1, fecha_corte_snapshot=fecha_corte
+        )
+        if fecha_corte is not None and corte is not None:
+            return corte, saf_corte
+        return actual, saf_actual
+
+    def _estados(self, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return estado_cuenta_service.estados(self.db, 1, **kwargs)
+
+    def _comparar(self, fecha_corte=None):
+        estados = self._estados(fecha_corte=fecha_corte)
+        for unidad_id in (1, 2):
+            deudas, saldo_a_favor = self._replay(unidad_id, fecha_corte)
+            self.assertEqual(estados[unidad_id]["deudas"], deudas)
+            self.assertAlmostEqual(estados[unidad_id]["saldo_a_favor"], saldo_a_favor)
+
+    def _contar_simulaciones(self):
+        llamadas = []
+        original = pago_service._simular_cronologia_pagos
+
+        def contar(db, docs, *args, **kwargs):
+            llamadas.append(len(docs))
+            return original(db, docs, *args, **kwargs)
+        return llamadas, mock.patch.object(pago_service, "_simular_cronologia_pagos", side_effect=contar)
+
+    def test_estado_igual_al_replay_completo(self):
+        self._historia()
+        self._comparar()
+        self._comparar(fecha_corte=date(2025, 5, 15))
+        self._comparar(fecha_corte=date(2025, 2, 1))
+        self._comparar(fecha_corte=date(2026, 1, 1))
+
+        # Una foto por mes con movimiento
+        fotos = self.db.query(func.count(PHEstadoCuentaCorte.id)).filter(PHEstadoCuentaCorte.unidad_id == 1).scalar()
+        self.assertEqual(fotos, 8)
+        fila = self.db.get(PHEstadoCuentaUnidad, 1)
+        self.assertEqual((fila.ultima_fecha, fila.documentos, fila.recalcular_desde), (date(2025, 8, 20), 14, None))
+
+    def test_documento_nuevo_solo_simula_lo_posterior(self):
+        self._historia()
+        self._estados()
+
+        self._factura(1, date(2025, 9, 1), 300000, 4500)
+        self.db.commit()
+        self.assertEqual(self.db.get(PHEstadoCuentaUnidad, 1).recalcular_desde, date(2025, 9, 1))
+
+        llamadas, parche = self._contar_simulaciones()
+        with parche:
+            self._estados()
+        self.assertEqual(llamadas, [1])
+        self._comparar()
+
+        # Sin cambios no se simula nada
+        llamadas, parche = self._contar_simulaciones()
+        with parche:
+            self._estados()
+        self.assertEqual(llamadas, [])
+
+    def test_edicion_con_fecha_anterior_retoma_desde_la_foto(self):
+        self._historia()
+        self._estados()
+
+        # Anular el pago de julio y cambiar el valor de la factura de julio
+        pago = self.db.query(Documento).filter(Documento.unidad_ph_id == 1, Documento.tipo_documento_id == 2,
+                                               Documento.fecha == date(2025, 7, 20)).one()
+        pago.estado = 'ANULADO'
+        factura = self.db.query(Documento).filter(Documento.unidad_ph_id == 1,
+                                                  Documento.fecha == date(2025, 7, 1)).one()
+        factura.movimientos[1].credito = 310000
+        factura.movimientos[0].debito = 314500
+        self.db.commit()
+        self.assertEqual(self.db.get(PHEstadoCuentaUnidad, 1).recalcular_desde, date(2025, 7, 1))
+        self.assertIsNone(self.db.get(PHEstadoCuentaUnidad, 2).recalcular_desde)
+
+        llamadas, parche = self._contar_simulaciones()
+        with parche:
+            self._estados()
+        # Julio (factura) y agosto (factura + pago), desde la foto del 1 de julio
+        self.assertEqual(llamadas, [1, 2])
+        self._comparar()
+        self._comparar(fecha_corte=date(2025, 7, 10))
+
+    def test_cartera_por_edades_en_una_pasada(self):
+        self._historia()
+        self.db.expunge_all()
+        corte = date(2025, 8, 31)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cartera = reportes.get_cartera_edades(self.db, 1, fecha_corte=corte)
+        # La simulación no carga documentos como entidades
+        self.assertFalse([obj for obj in self.db.identity_map.values() if isinstance(obj, Documento)])
+
+        esperado = {}
+        for unidad_id in (1, 2):
+            deudas, saldo_a_favor = self._replay(unidad_id, corte)
+            rangos = [0, 0, 0, 0]
+            for deuda in deudas:
+                dias = (corte - deuda['fecha']).days
+                rangos[0 if dias <= 30 else 1 if dias <= 60 else 2 if dias <= 90 else 3] += deuda['saldo']
+            esperado[unidad_id] = (-saldo_a_favor if saldo_a_favor > 0.001 else 0, *rangos)
+
+        items = {item["unidad_id"]: item for item in cartera["items"]}
+        self.assertEqual([item["unidad_codigo"] for item in cartera["items"]], ["101", "102"])
+        for unidad_id, referencia in esperado.items():
+            fila = items[unidad_id]
+            obtenido = (fila["saldo_corriente"], fila["edad_0_30"], fila["edad_31_60"], fila["edad_61_90"], fila["edad_mas_90"])
+            for valor, ref in zip(obtenido, referencia):
+                self.assertAlmostEqual(valor, ref)
+            self.assertAlmostEqual(fila["saldo_total"], sum(referencia))
+        self.assertAlmostEqual(cartera["total_general"], sum(esperado[1]) + sum(esperado[2]))
+        self.assertIn("Cuota de Administración", items[1]["detalle_0_30"])
+
+    def test_insercion_sin_marca_reconstruye_la_unidad(self):
+        self._historia()
+        self._estados()
+
+        # Documento escrito sin pasar por el flush del ORM (ni por marcar_documentos)
+        with self.engine.begin() as conn:
+            doc_id = conn.execute(Documento.__table__.insert().values(
+                empresa_id=1, tipo_documento_id=2, numero=999, fecha=date(2025, 3, 5), unidad_ph_id=2,
+                anulado=False, estado='ACTIVO')).inserted_primary_key[0]
+            conn.execute(MovimientoContable.__table__.insert(), [
+                {"documento_id": doc_id, "cuenta_id": CAJA, "concepto": "Recaudo", "debito": 50000, "credito": 0},
+                {"documento_id": doc_id, "cuenta_id": CXC, "concepto": "Abono", "debito": 0, "credito": 50000},
+            ])
+        self._comparar()
+        self.assertEqual(self.db.get(PHEstadoCuentaUnidad, 2).documentos, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import sys
+import os
+import io
+from unittest import mock
+
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core import database
+from app.services import exportacion_streaming
+
+_Base = declarative_base()
+
+
+class _Fila(_Base):
+    __tablename__ = "filas_exportacion"
+    id = Column(Integer, primary_key=True)
+    nombre = Column(String)
+
+
+class TestExportacionStreaming(unittest.TestCase):
+
+    def test_csv_por_bloques_con_un_solo_bom(self):
+        filas = ([i, f"nombre; {i}", None] for i in range(20000))
+        bloques = list(exportacion_streaming.csv_en_streaming(["ID", "NOMBRE", "VACIO"], filas))
+        self.assertGreater(len(bloques), 1)
+        self.assertTrue(all(len(b) < 2 * 64 * 1024 for b in bloques))
+
+        texto = b"".join(bloques).decode("utf-8")
+        self.assertEqual(texto.count("\ufeff"), 1)
+        lineas = texto.lstrip("\ufeff").splitlines()
+        self.assertEqual(lineas[0], "ID;NOMBRE;VACIO")
+        self.assertEqual(lineas[1], '0;"nombre; 0";')
+        self.assertEqual(len(lineas), 20001)
+
+    def test_csv_es_perezoso(self):
+        consumidas = []
+
+        def filas():
+            for i in range(3):
+                consumidas.append(i)
+                yield [i]
+
+        bloques = exportacion_streaming.csv_en_streaming(None, filas(), bom=False)
+        self.assertEqual(consumidas, [])
+        self.assertEqual(b"".join(bloques), b"0\r\n1\r\n2\r\n")
+
+    def test_xlsx_en_streaming(self):
+        from openpyxl import load_workbook
+        contenido = b"".join(exportacion_streaming.xlsx_en_streaming(["A", "B"], iter([[1, "x"], [2, None]]), titulo="Prueba"))
+        hoja = load_workbook(io.BytesIO(contenido)).active
+        self.assertEqual(hoja.title, "Prueba")
+        self.assertEqual([list(fila) for fila in hoja.iter_rows(values_only=True)], [["A", "B"], [1, "x"], [2, None]])
+
+    def test_formato_no_soportado(self):
+        with self.assertRaises(ValueError):
+            exportacion_streaming.exportar("pdf", ["A"], [])
+
+    def test_consulta_por_lotes_en_sesion_propia(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        _Base.metadata.create_all(engine)
+        Sesion = sessionmaker(bind=engine)
+        with Sesion() as db:
+            db.add_all([_Fila(id=i, nombre=f"f{i}") for i in range(1, 51)])
+            db.commit()
+
+        sesiones = []
+
+        def generar(db):
+            sesiones.append(db)
+            query = db.query(_Fila.id, _Fila.nombre).order_by(_Fila.id)
+            filas = ([r.id, r.nombre] for r in exportacion_streaming.iterar_consulta(query, tamano_lote=7))
+            return exportacion_streaming.csv_en_streaming(["ID", "NOMBRE"], filas)
+
+        with mock.patch.object(database, "SessionLocal", Sesion):
+            bloques = exportacion_streaming.en_sesion_propia(generar)
+            self.assertEqual(sesiones, [])  # La sesión se abre al pedir el primer bloque
+            texto = b"".join(bloques).decode("utf-8-sig")
+
+        self.assertEqual(len(texto.splitlines()), 51)
+        self.assertTrue(texto.splitlines()[-1].startswith("50;f50"))
+        self.assertFalse(sesiones[0].in_transaction())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+import tempfile
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import pdfplumber
+from reportlab.pdfgen import canvas
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.core.database import Base
+from app.models import Empresa
+from app.services import conciliacion_bancaria, extracto_pdf
+from app.services.conciliacion_bancaria import ImportEngine
+
+
+def _extracto(ruta, paginas=6, filas=30):
+    """Extracto sin cuadrícula: columnas alineadas por posición, encabezado en cada página"""
+    c = canvas.Canvas(ruta)
+    n = 0
+    for _ in range(paginas):
+        y = 780
+        for x, titulo in ((40, "FECHA"), (130, "DESCRIPCION"), (360, "VALOR"), (460, "SALDO")):
+            c.drawString(x, y, titulo)
+        for _ in range(filas):
+            n += 1
+            y -= 22
+            c.drawString(40, y, f"2025-03-{1 + n % 28:02d}")
+            c.drawString(130, y, f"TRANSFERENCIA {n}")
+            c.drawString(360, y, f"{1000 + n}.50")
+            c.drawString(460, y, f"{50000 + n}.00")
+        c.showPage()
+    c.save()
+
+
+_CONFIG = SimpleNamespace(file_format="PDF", date_format="YYYY-MM-DD", header_rows=1,
+                          field_mapping={"date": 0, "description": 1, "amount": 3, "balance": 4})
+
+
+class TestExtractoPdf(unittest.TestCase):
+
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.carpeta.name, "extracto.pdf")
+        _extracto(self.ruta)
+        self.parches = [
+            mock.patch.object(settings, "EXTRACTO_PDF_CACHE_DIR", os.path.join(self.carpeta.name, "cache")),
+            mock.patch.object(settings, "EXTRACTO_PDF_WORKERS", 0),
+            mock.patch.object(settings, "EXTRACTO_PDF_PAGINAS_POR_TAREA", 2),
+        ]
+        for parche in self.parches:
+            parche.start()
+
+    def tearDown(self):
+        for parche in self.parches:
+            parche.stop()
+        self.carpeta.cleanup()
+
+    def _contar_extracciones(self):
+        return mock.patch.object(extracto_pdf, "_extraer_paginas", side_effect=extracto_pdf._extraer_paginas)
+
+    def test_cada_pagina_se_extrae_una_vez(self):
+        with pdfplumber.open(self.ruta) as pdf:
+            referencia = [[[str(c).replace('\\n', ' ').strip() if c else "" for c in fila]
+                           for fila in tabla if any(c for c in fila)]
+                          for tabla in pdf.pages[4].extract_tables(extracto_pdf.TABLE_SETTINGS)]
+
+        # La validación lee las primeras páginas; la importación solo extrae las demás
+        with self._contar_extracciones() as extraer:
+            self.assertEqual(len(list(extracto_pdf.paginas(self.ruta, limite=3))), 3)
+            paginas = list(extracto_pdf.paginas(self.ruta))
+        self.assertEqual([llamada.args[2] for llamada in extraer.call_args_list], [[0, 1], [2], [3, 4], [5]])
+        self.assertEqual(paginas[4]["tablas"], referencia)
+        self.assertIn("TRANSFERENCIA 121", paginas[4]["texto"])
+
+        # El mismo archivo subido de nuevo sale de la caché; con otra contraseña no
+        copia = os.path.join(self.carpeta.name, "copia.pdf")
+        with open(self.ruta, "rb") as origen, open(copia, "wb") as destino:
+            destino.write(origen.read())
+        with self._contar_extracciones() as extraer:
+            self.assertEqual(list(extracto_pdf.paginas(copia)), paginas)
+        self.assertEqual(extraer.call_count, 0)
+        self.assertNotEqual(extracto_pdf.huella_archivo(copia), extracto_pdf.huella_archivo(copia, "clave"))
+
+    def test_pool_de_procesos_conserva_el_orden(self):
+        en_proceso = list(extracto_pdf.paginas(self.ruta))
+        with mock.patch.object(settings, "EXTRACTO_PDF_WORKERS", 2), \
+                mock.patch.object(settings, "EXTRACTO_PDF_CACHE_DIR", os.path.join(self.carpeta.name, "cache_pool")):
+            self.assertEqual(list(extracto_pdf.paginas(self.ruta)), en_proceso)
+
+    def test_importacion_por_bloques(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        db.add(Empresa(id=1, razon_social="Empresa Uno", nit="900", is_lite_mode=True))
+        db.commit()
+        motor = ImportEngine(db)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            validacion = motor._validate_pdf_file(self.ruta, _CONFIG)
+            movimientos = motor.parse_bank_statement(self.ruta, _CONFIG)
+        self.assertTrue(validacion.is_valid)
+        self.assertEqual(len(movimientos), 180)
+        self.assertEqual((movimientos[0].transaction_date, movimientos[0].amount, movimientos[0].balance),
+                         (date(2025, 3, 2), Decimal("1001.50"), Decimal("50001.00")))
+
+        with mock.patch.object(conciliacion_bancaria, "_IMPORT_BLOCK_SIZE", 50), \
+                contextlib.redirect_stdout(io.StringIO()):
+            primera = motor.store_movements_stream(motor.iter_bank_statement(self.ruta, _CONFIG), "s1", 1, 1)
+            segunda = motor.store_movements_stream(motor.iter_bank_statement(self.ruta, _CONFIG), "s2", 1, 1)
+        self.assertEqual((primera["total_stored"], primera["total_skipped"]), (180, 0))
+        self.assertEqual((segunda["total_stored"], segunda["total_skipped"]), (0, 180))
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
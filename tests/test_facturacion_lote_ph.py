@@ -0,0 +1,149 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+from datetime import date
+from unittest import mock
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.core.database import Base
+from app.models import Documento, Empresa, MovimientoContable, PlanCuenta, Tercero, TipoDocumento
+from app.models.aplicacion_pago import AplicacionPago
+from app.models.propiedad_horizontal import (
+    PHConcepto, PHConfiguracion, PHFacturacionLote, PHFacturacionLoteUnidad, PHUnidad
+)
+from app.services import documento_masivo
+from app.services.propiedad_horizontal import facturacion_lote_service, facturacion_service
+
+CXC, ADMIN, ANTICIPOS, CAJA = 1, 2, 3, 4
+FACTURA, CRUCE, RECIBO = 1, 2, 3
+FECHA = date(2025, 3, 1)
+
+
+class TestFacturacionLotePH(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add_all([
+            Empresa(id=1, razon_social="Conjunto Uno", nit="900", is_lite_mode=True),
+            PlanCuenta(id=CXC, empresa_id=1, codigo="130505", nombre="Cartera", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=ADMIN, empresa_id=1, codigo="417005", nombre="Administración", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=ANTICIPOS, empresa_id=1, codigo="280505", nombre="Anticipos", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=CAJA, empresa_id=1, codigo="110505", nombre="Caja", nivel=4, permite_movimiento=True),
+            TipoDocumento(id=FACTURA, empresa_id=1, codigo="FPH", nombre="Factura PH", cuenta_debito_cxc_id=CXC, consecutivo_actual=100),
+            TipoDocumento(id=CRUCE, empresa_id=1, codigo="NC", nombre="Cruce anticipos", consecutivo_actual=20),
+            TipoDocumento(id=RECIBO, empresa_id=1, codigo="RC", nombre="Recibo", consecutivo_actual=0),
+            PHConfiguracion(empresa_id=1, tipo_documento_factura_id=FACTURA, tipo_documento_cruce_id=CRUCE,
+                            cuenta_cartera_id=CXC, cuenta_anticipos_id=ANTICIPOS, interes_mora_mensual=0),
+            PHConcepto(id=1, empresa_id=1, nombre="Cuota de Administración", cuenta_ingreso_id=ADMIN, valor_defecto=250000, orden=1),
+        ])
+        for i in range(1, 6):
+            self.db.add(Tercero(id=i, empresa_id=1, nit=f"10{i}", razon_social=f"Propietario {i}"))
+            self.db.add(PHUnidad(id=i, empresa_id=1, codigo=f"10{i}", propietario_principal_id=i))
+        self.db.add(PHUnidad(id=6, empresa_id=1, codigo="106"))  # Sin propietario
+        # Anticipo del propietario 2 (cubre parte de su factura)
+        self.db.add(Documento(empresa_id=1, tipo_documento_id=RECIBO, numero=1, fecha=date(2025, 2, 10), beneficiario_id=2,
+                              movimientos=[MovimientoContable(cuenta_id=CAJA, concepto="Anticipo", debito=100000, credito=0),
+                                           MovimientoContable(cuenta_id=ANTICIPOS, concepto="Anticipo", debito=0, credito=100000)]))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def _iniciar(self, tamano_bloque=2):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return facturacion_lote_service.iniciar_facturacion(self.db, 1, FECHA, usuario_id=None, tamano_bloque=tamano_bloque)
+
+    def _ejecutar(self, lote_id):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return facturacion_lote_service.ejecutar_facturacion_en_sesion(self.db, lote_id, 1)
+
+    def _facturas(self):
+        return self.db.query(Documento).filter(Documento.tipo_documento_id == FACTURA).order_by(Documento.numero).all()
+
+    def test_reserva_consecutivos_y_crea_por_bloques(self):
+        lote = self._iniciar()
+        self.assertEqual((lote.numero_inicial, lote.numero_final, lote.total_unidades, lote.total_bloques), (101, 105, 5, 3))
+        self.assertEqual(lote.detalles, ["Unidad 106: Sin propietario asignado."])
+        self.assertEqual(self.db.get(TipoDocumento, FACTURA).consecutivo_actual, 105)
+        self.assertEqual(self.db.get(TipoDocumento, CRUCE).consecutivo_actual, 21)
+
+        # Los documentos se crean con los números reservados, sin volver a tomar consecutivo
+        with mock.patch.object(documento_masivo, "reservar_consecutivos", side_effect=AssertionError):
+            progreso = self._ejecutar(lote.id)
+        self.assertEqual((progreso["estado"], progreso["unidades_facturadas"], progreso["porcentaje"]), ("COMPLETADO", 5, 100.0))
+
+        facturas = self._facturas()
+        self.assertEqual([f.numero for f in facturas], [101, 102, 103, 104, 105])
+        self.assertEqual([f.unidad_ph_id for f in facturas], [1, 2, 3, 4, 5])
+        self.assertEqual(self.db.get(TipoDocumento, FACTURA).consecutivo_actual, 105)
+
+        # Cruce del anticipo de la unidad 102 contra su factura
+        cruce = self.db.query(Documento).filter(Documento.tipo_documento_id == CRUCE).one()
+        self.assertEqual((cruce.numero, cruce.unidad_ph_id, cruce.beneficiario_id), (21, 2, 2))
+        self.assertEqual(sum(m.debito for m in cruce.movimientos if m.cuenta_id == ANTICIPOS), 100000)
+        aplicacion = self.db.query(AplicacionPago).one()
+        self.assertEqual((aplicacion.documento_factura_id, aplicacion.documento_pago_id, aplicacion.valor_aplicado),
+                         (facturas[1].id, cruce.id, 100000))
+
+        resultado = facturacion_lote_service.get_resultado(self.db, lote.id, 1)
+        self.assertEqual((resultado["generadas"], resultado["errores"]), (5, 1))
+        self.assertIn("Unidad 102: Doc 102 por $250,000", resultado["detalles"])
+
+    def test_reanudar_solo_procesa_lo_pendiente(self):
+        lote = self._iniciar()
+        original = facturacion_lote_service._persistir
+        llamadas = []
+
+        def fallar_unidad_103(db, empresa_id, lote_id, usuario_id, pendientes):
+            llamadas.append(len(pendientes))
+            if any(p[1]["unidad_ph_id"] == 3 for p in pendientes):
+                raise RuntimeError("Fallo simulado")
+            return original(db, empresa_id, lote_id, usuario_id, pendientes)
+
+        with mock.patch.object(facturacion_lote_service, "_persistir", side_effect=fallar_unidad_103):
+            progreso = self._ejecutar(lote.id)
+        # El bloque 2 (103, 104) falla y se reintenta por unidad: solo 103 queda en error
+        self.assertEqual(llamadas, [2, 2, 1, 1, 1])
+        self.assertEqual(progreso["estado"], "COMPLETADO_CON_ERRORES")
+        self.assertEqual(progreso["errores"], [{"unidad": "103", "error": "Fallo simulado"}])
+        self.assertEqual([f.numero for f in self._facturas()], [101, 102, 104, 105])
+
+        facturacion_lote_service.reanudar_facturacion(self.db, lote.id, 1)
+        progreso = self._ejecutar(lote.id)
+        self.assertEqual(progreso["estado"], "COMPLETADO")
+        self.assertEqual([f.numero for f in self._facturas()], [101, 102, 103, 104, 105])
+        self.assertEqual(self.db.query(Documento).filter(Documento.tipo_documento_id == CRUCE).count(), 1)
+
+        # Un lote completo no se reanuda
+        with self.assertRaises(HTTPException):
+            facturacion_lote_service.reanudar_facturacion(self.db, lote.id, 1)
+        self.assertEqual(self.db.query(PHFacturacionLoteUnidad).filter(PHFacturacionLoteUnidad.estado == "FACTURADA").count(), 5)
+
+    def test_lote_abierto_se_reutiliza(self):
+        lote = self._iniciar()
+        self.assertEqual(self._iniciar().id, lote.id)
+        self.assertEqual(self.db.query(PHFacturacionLote).count(), 1)
+        self.assertEqual(self.db.get(TipoDocumento, FACTURA).consecutivo_actual, 105)
+
+    def test_facturacion_masiva_sincrona_conserva_formato(self):
+        with mock.patch.object(settings, "PH_FACTURACION_TAMANO_BLOQUE", 3), contextlib.redirect_stdout(io.StringIO()):
+            resultado = facturacion_service.generar_facturacion_masiva(self.db, 1, FECHA, None)
+        self.assertEqual((resultado["generadas"], resultado["errores"]), (5, 1))
+        self.assertEqual(len(self._facturas()), 5)
+        self.assertEqual(self.db.get(PHFacturacionLote, resultado["lote_id"]).total_bloques, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
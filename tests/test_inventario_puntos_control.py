@@ -0,0 +1,41 @@
+import unittest
+import sys
+import os
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services import inventario_puntos_control as pc
+
+
+class TestPuntosControlInventario(unittest.TestCase):
+
+    def test_minimo_por_producto_con_fechas_mixtas(self):
+        minimos = {}
+        pc._acumular_minimo(minimos, 1, datetime(2026, 3, 5, 10, tzinfo=timezone.utc))
+        pc._acumular_minimo(minimos, 1, date(2026, 3, 4))
+        pc._acumular_minimo(minimos, 1, datetime(2026, 3, 6))
+        pc._acumular_minimo(minimos, 2, datetime(2026, 1, 1, 8))
+        pc._acumular_minimo(minimos, None, datetime(2020, 1, 1))
+        pc._acumular_minimo(minimos, 3, None)
+        self.assertEqual(minimos, {1: datetime(2026, 3, 4), 2: datetime(2026, 1, 1, 8)})
+
+    def test_punto_conserva_el_estado_del_kardex(self):
+        mov = SimpleNamespace(id=77, fecha=datetime(2026, 2, 1, 9))
+        punto = pc.nuevo_punto(5, mov, 500, 12.5, 3.25, {1: 10.0, 4: 2.5})
+        self.assertEqual((punto.producto_id, punto.movimiento_id, punto.num_movimientos), (5, 77, 500))
+        self.assertEqual(pc.stocks_de_punto(punto), {1: 10.0, 4: 2.5})
+
+    def test_recalculando_marca_y_desmarca(self):
+        db = SimpleNamespace(info={})
+        with self.assertRaises(ValueError):
+            with pc.recalculando(db, 9):
+                self.assertIn(9, db.info[pc._CLAVE_RECALCULANDO])
+                raise ValueError()
+        self.assertNotIn(9, db.info[pc._CLAVE_RECALCULANDO])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core import database
+from app.services import inventario_recalculo as rec
+
+
+class _SesionFalsa:
+    def __init__(self, dialecto="sqlite"):
+        self._bind = SimpleNamespace(dialect=SimpleNamespace(name=dialecto))
+
+    def get_bind(self):
+        return self._bind
+
+    def commit(self):
+        pass
+
+    def expire_all(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _recalculo(**kwargs):
+    datos = dict(id=3, estado="PENDIENTE", total_productos=10, productos_procesados=4, total_bloques=5,
+                 bloques_completados=2, bloques_con_error=0, tamano_bloque=2, workers=4,
+                 fecha_inicio=None, fecha_actualizacion=None, fecha_fin=None, bloques=[])
+    datos.update(kwargs)
+    return SimpleNamespace(**datos)
+
+
+class TestRecalculoInventario(unittest.TestCase):
+
+    def test_vista_resume_errores_y_negativos(self):
+        bloques = [(1, None, None), (2, "deadlock", None), (3, None, [9, 4]), (4, None, [4])]
+        vista = rec._vista(_recalculo(), bloques)
+        self.assertEqual(vista["porcentaje"], 40.0)
+        self.assertEqual(vista["errores"], [{"bloque": 2, "error": "deadlock"}])
+        self.assertEqual(vista["productos_negativos"], [4, 9])
+        self.assertEqual(rec._vista(_recalculo(total_productos=0, productos_procesados=0))["porcentaje"], 100.0)
+
+    def test_sin_avance_detecta_recalculo_interrumpido(self):
+        viejo = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+        reciente = datetime.utcnow().isoformat()
+        base = {"en_ejecucion": False, "estado": "EN_PROCESO"}
+        self.assertTrue(rec._sin_avance({**base, "fecha_actualizacion": viejo}))
+        self.assertFalse(rec._sin_avance({**base, "fecha_actualizacion": reciente}))
+        self.assertFalse(rec._sin_avance({**base, "en_ejecucion": True, "fecha_actualizacion": viejo}))
+        self.assertFalse(rec._sin_avance({**base, "estado": "COMPLETADO", "fecha_actualizacion": viejo}))
+
+    def test_reanudar_solo_procesa_bloques_pendientes(self):
+        bloques = [
+            SimpleNamespace(id=11, estado="COMPLETADO", producto_ids=[1, 2]),
+            SimpleNamespace(id=12, estado="ERROR", producto_ids=[3, 4]),
+            SimpleNamespace(id=13, estado="PENDIENTE", producto_ids=[5]),
+        ]
+        recalculo = _recalculo(estado="EN_PROCESO", bloques=bloques)
+        procesados = []
+        with contextlib.redirect_stdout(io.StringIO()), \
+                mock.patch.object(database, "SessionLocal", return_value=_SesionFalsa()), \
+                mock.patch.object(rec, "get_recalculo", return_value=recalculo), \
+                mock.patch.object(rec, "get_progreso", return_value={"estado": "COMPLETADO"}), \
+                mock.patch.object(rec, "_procesar_bloque",
+                                  side_effect=lambda db, emp, r_id, b_id, ids: procesados.append((b_id, ids))):
+            rec.ejecutar_recalculo(3, 1)
+
+        self.assertEqual(procesados, [(12, [3, 4]), (13, [5])])
+        self.assertEqual(recalculo.estado, "COMPLETADO")
+        self.assertNotIn(3, rec._en_ejecucion)
+
+    def test_no_ejecuta_dos_veces_el_mismo_recalculo(self):
+        rec._en_ejecucion.add(8)
+        try:
+            self.assertIsNone(rec.ejecutar_recalculo(8, 1))
+        finally:
+            rec._en_ejecucion.discard(8)
+
+
+if __name__ == '__main__':
+    unittest.main()
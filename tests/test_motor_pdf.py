@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+import time
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.motor_pdf import (
+    PoolPDF, ErrorRenderPDF, TiempoPDFAgotado, PRIORIDAD_INTERACTIVA, PRIORIDAD_LIBRO
+)
+
+
+def _pool(renderizador, **opciones):
+    # Los builtins se pueden enviar a un proceso "spawn"; no se necesita WeasyPrint
+    opciones.setdefault("workers", 1)
+    opciones.setdefault("timeout", 5)
+    opciones.setdefault("memoria_maxima_mb", 0)
+    opciones.setdefault("trabajos_por_worker", 50)
+    return PoolPDF(renderizador=renderizador, calentar=False, **opciones)
+
+
+class TestMotorPdf(unittest.TestCase):
+
+    def test_resultado_y_error(self):
+        pool = _pool(str.encode)
+        try:
+            self.assertEqual(pool.enviar("hola").result(), b"hola")
+            with self.assertRaises(ErrorRenderPDF):
+                pool.enviar(123).result()  # str.encode(123) -> TypeError en el worker
+            self.assertEqual(pool.enviar("sigue").result(), b"sigue")
+            self.assertEqual(pool.estadisticas()["errores"], 1)
+        finally:
+            pool.detener()
+
+    def test_prioridad_interactiva_antes_que_libros(self):
+        pool = _pool(time.sleep)
+        orden = []
+        try:
+            pool.enviar(0).result()  # worker listo
+            ocupado = pool.enviar(0.5)
+            while not ocupado.running():
+                time.sleep(0.01)
+            futuros = [pool.enviar(0, prioridad=PRIORIDAD_LIBRO) for _ in range(3)]
+            futuros.append(pool.enviar(0, prioridad=PRIORIDAD_INTERACTIVA))
+            for etiqueta, futuro in zip(["libro", "libro", "libro", "interactiva"], futuros):
+                futuro.add_done_callback(lambda _f, etiqueta=etiqueta: orden.append(etiqueta))
+            for futuro in futuros:
+                futuro.result()
+            self.assertEqual(orden[0], "interactiva")
+        finally:
+            pool.detener()
+
+    def test_tiempo_agotado_reemplaza_el_worker(self):
+        pool = _pool(time.sleep, timeout=0.5)
+        try:
+            with self.assertRaises(TiempoPDFAgotado):
+                pool.enviar(5).result()
+            self.assertIsNone(pool.enviar(0).result())
+            estadisticas = pool.estadisticas()
+            self.assertEqual(estadisticas["tiempos_agotados"], 1)
+            self.assertEqual(estadisticas["reinicios"], 1)
+        finally:
+            pool.detener()
+
+    def test_recicla_el_worker(self):
+        pool = _pool(str.encode, trabajos_por_worker=2)
+        try:
+            for i in range(5):
+                self.assertEqual(pool.enviar(f"p{i}").result(), f"p{i}".encode())
+            self.assertEqual(pool.estadisticas()["reinicios"], 2)
+        finally:
+            pool.detener()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+from datetime import date
+
+from fastapi import HTTPException
+from sqlalchemy import Column, Date, Integer, Numeric, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services import paginacion_keyset
+
+_Base = declarative_base()
+
+
+class _Movimiento(_Base):
+    __tablename__ = "movimientos_keyset"
+    id = Column(Integer, primary_key=True)
+    fecha = Column(Date)
+    documento_id = Column(Integer)
+    debito = Column(Numeric(18, 2))
+    credito = Column(Numeric(18, 2))
+
+
+class TestPaginacionKeyset(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        _Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine)()
+        # Varias filas por fecha y por documento: la llave necesita las tres columnas
+        for i in range(1, 41):
+            self.db.add(_Movimiento(id=i, fecha=date(2025, 1, 1 + i % 3), documento_id=i // 2, debito=i, credito=1))
+        self.db.commit()
+        self.query = self.db.query(
+            _Movimiento.id.label("movimiento_id"), _Movimiento.fecha, _Movimiento.documento_id,
+            _Movimiento.debito, _Movimiento.credito
+        )
+        self.orden = [("fecha", _Movimiento.fecha), ("documento_id", _Movimiento.documento_id),
+                      ("movimiento_id", _Movimiento.id)]
+
+    def tearDown(self):
+        self.db.close()
+
+    def _recorrer(self, descendente, acumulados=False):
+        filas, acumulado, cursor = [], [], None
+        while True:
+            pagina = paginacion_keyset.paginar(self.query, self.orden, 6, cursor, "h", descendente, acumulados)
+            filas += pagina["filas"]
+            acumulado += pagina["acumulados"] or []
+            cursor = pagina["siguiente_cursor"]
+            if not pagina["tiene_mas"]:
+                self.assertIsNone(cursor)
+                return filas, acumulado
+
+    def test_recorre_todo_sin_repetir_en_ambos_sentidos(self):
+        for descendente in (False, True):
+            filas, _ = self._recorrer(descendente)
+            llaves = [(f.fecha, f.documento_id, f.movimiento_id) for f in filas]
+            self.assertEqual(llaves, sorted(llaves, reverse=descendente))
+            self.assertEqual(len(set(llaves)), 40)
+
+    def test_acumulados_viajan_en_el_cursor(self):
+        filas, acumulado = self._recorrer(False, acumulados=True)
+        self.assertEqual(len(acumulado), 40)
+        self.assertEqual(acumulado[-1], (sum(range(1, 41)), 40))
+        self.assertEqual(acumulado[6][0] - acumulado[5][0], filas[6].debito)
+
+    def test_cursor_de_otros_filtros_o_invalido(self):
+        cursor = paginacion_keyset.paginar(self.query, self.orden, 5, None, "h")["siguiente_cursor"]
+        with self.assertRaises(HTTPException) as ctx:
+            paginacion_keyset.paginar(self.query, self.orden, 5, cursor, "otra")
+        self.assertEqual(ctx.exception.status_code, 400)
+        with self.assertRaises(HTTPException):
+            paginacion_keyset.paginar(self.query, self.orden, 5, "no-es-un-cursor", "h")
+
+    def test_totales_del_filtro(self):
+        totales = paginacion_keyset.totales(
+            self.query.filter(_Movimiento.fecha == date(2025, 1, 1)),
+            _Movimiento.id, _Movimiento.debito, _Movimiento.credito
+        )
+        esperados = [i for i in range(1, 41) if i % 3 == 0]
+        self.assertEqual(totales, {
+            "total_registros": len(esperados), "total_debito": float(sum(esperados)), "total_credito": float(len(esperados))
+        })
+
+    def test_huella_estable(self):
+        self.assertEqual(
+            paginacion_keyset.huella_filtros(a=1, fecha=date(2025, 1, 1)),
+            paginacion_keyset.huella_filtros(fecha=date(2025, 1, 1), a=1)
+        )
+        self.assertNotEqual(paginacion_keyset.huella_filtros(a=1), paginacion_keyset.huella_filtros(a=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
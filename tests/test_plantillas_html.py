@@ -0,0 +1,60 @@
+import unittest
+import sys
+import os
+import types
+from datetime import datetime
+from types import SimpleNamespace
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services import plantillas_html
+
+
+class TestPlantillasHtml(unittest.TestCase):
+
+    def setUp(self):
+        self.paquete = {"reports/saludo.html": "<p>Hola {{ nombre }}</p>",
+                        "reports/base.html": "<div>{% include 'reports/saludo.html' %}</div>"}
+        self.env = plantillas_html.crear_entorno(loader=plantillas_html.CargadorEmpaquetado(self.paquete))
+
+    def test_carga_perezosa_del_modulo_empaquetado(self):
+        modulo = types.ModuleType("_plantillas_prueba")
+        modulo.TEMPLATES_EMPAQUETADOS = self.paquete
+        vista = plantillas_html._PlantillasEmpaquetadas("_plantillas_prueba")
+        self.assertIsNone(vista._datos)
+        sys.modules["_plantillas_prueba"] = modulo
+        try:
+            self.assertIn("reports/saludo.html", vista)
+            self.assertEqual(len(vista), 2)
+        finally:
+            del sys.modules["_plantillas_prueba"]
+
+    def test_compilar_reutiliza_la_plantilla(self):
+        fuente = "<b>{{ x }}</b>"
+        primera = plantillas_html.compilar(self.env, fuente)
+        self.assertIs(plantillas_html.compilar(self.env, fuente), primera)
+        otra = plantillas_html.compilar(self.env, "<i>{{ x }}</i>")
+        self.assertIsNot(otra, primera)
+        self.assertEqual(otra.render(x=1), "<i>1</i>")
+
+    def test_cache_separada_por_entorno(self):
+        otro_env = plantillas_html.crear_entorno()
+        fuente = "{{ x }}"
+        self.assertIsNot(plantillas_html.compilar(self.env, fuente), plantillas_html.compilar(otro_env, fuente))
+
+    def test_cargador_resuelve_include(self):
+        self.assertEqual(self.env.get_template("reports/base.html").render(nombre="Ana"), "<div><p>Hola Ana</p></div>")
+
+    def test_formato_usuario_por_id_y_modificacion(self):
+        formato = SimpleNamespace(id=7, ultima_modificacion=datetime(2026, 1, 1), contenido_html="<p>{{ a }}</p>")
+        primera = plantillas_html.compilar_formato(self.env, formato)
+        self.assertIs(plantillas_html.compilar_formato(self.env, formato), primera)
+
+        formato.contenido_html = "<b>{{ a }}</b>"
+        formato.ultima_modificacion = datetime(2026, 1, 2)
+        self.assertEqual(plantillas_html.compilar_formato(self.env, formato).render(a=1), "<b>1</b>")
+
+
+if __name__ == '__main__':
+    unittest.main()
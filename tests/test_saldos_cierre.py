@@ -0,0 +1,149 @@
+import unittest
+import sys
+import os
+import io
+import contextlib
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import (
+    Documento, Empresa, MovimientoContable, PeriodoContableCerrado, PlanCuenta, Tercero, TipoDocumento
+)
+from app.services import saldos_cierre
+from app.services import saldos_mensuales  # registra los listeners de invalidación
+from app.services import tercero as tercero_service
+from app.services.saldos_cierre import _calcular_checksum, _fin_de_mes
+
+
+class TestSaldosCierre(unittest.TestCase):
+
+    def test_checksum_no_depende_del_orden(self):
+        filas = [(1, 0, 0, Decimal("100"), Decimal("0")), (2, 5, 3, Decimal("0"), Decimal("100.00"))]
+        self.assertEqual(_calcular_checksum(filas), _calcular_checksum(list(reversed(filas))))
+
+    def test_checksum_detecta_cambios(self):
+        filas = [(1, 0, 0, Decimal("100"), Decimal("0"))]
+        alteradas = [(1, 0, 0, Decimal("100.01"), Decimal("0"))]
+        self.assertNotEqual(_calcular_checksum(filas), _calcular_checksum(alteradas))
+
+    def test_fin_de_mes(self):
+        self.assertEqual(_fin_de_mes(2024, 2), date(2024, 2, 29))
+        self.assertEqual(_fin_de_mes(2026, 12), date(2026, 12, 31))
+
+
+class TestLecturaSaldosCierre(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add_all([
+            Empresa(id=1, razon_social="Empresa Uno", nit="900", is_lite_mode=True),
+            PlanCuenta(id=1, empresa_id=1, codigo="110505", nombre="Caja", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=2, empresa_id=1, codigo="413505", nombre="Ventas", nivel=4, permite_movimiento=True),
+            TipoDocumento(id=1, empresa_id=1, codigo="RC", nombre="Recibo"),
+            Documento(empresa_id=1, tipo_documento_id=1, numero=1, fecha=date(2026, 1, 15), movimientos=[
+                MovimientoContable(cuenta_id=1, concepto="Venta", debito=500, credito=0),
+                MovimientoContable(cuenta_id=2, concepto="Venta", debito=0, credito=500),
+            ]),
+        ])
+        self.db.commit()
+        self.cierre = saldos_cierre.congelar_saldos_periodo(self.db, 1, 2026, 1)
+        self.db.commit()
+        self.consultas = []
+        event.listen(self.engine, "before_cursor_execute", self._registrar)
+
+    def tearDown(self):
+        event.remove(self.engine, "before_cursor_execute", self._registrar)
+        saldos_cierre._CHECKSUMS_VERIFICADOS.pop(self.cierre.id, None)
+        self.db.close()
+
+    def _registrar(self, conn, cursor, statement, parameters, context, executemany):
+        self.consultas.append(statement)
+
+    def _lecturas_detalle(self):
+        return [q for q in self.consultas if "FROM saldos_cierre_periodo_detalle" in q and "sum(" not in q]
+
+    def test_foto_verificada_no_relee_el_detalle(self):
+        self.assertEqual(saldos_cierre.ultimo_cierre_valido(self.db, 1, date(2026, 2, 10)).id, self.cierre.id)
+        self.assertTrue(saldos_cierre._checksum_valido(self.db, self.cierre))
+        self.assertEqual(self._lecturas_detalle(), [])
+
+    def test_foto_sin_verificar_se_lee_una_vez(self):
+        saldos_cierre._CHECKSUMS_VERIFICADOS.clear()
+        for _ in range(3):
+            self.assertIsNotNone(saldos_cierre.ultimo_cierre_valido(self.db, 1, date(2026, 2, 10)))
+        self.assertEqual(len(self._lecturas_detalle()), 1)
+
+
+class TestCierreAlCambiarTercero(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add_all([
+            Empresa(id=1, razon_social="Empresa Uno", nit="900", is_lite_mode=True),
+            PlanCuenta(id=1, empresa_id=1, codigo="130505", nombre="Clientes", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=2, empresa_id=1, codigo="413505", nombre="Ventas", nivel=4, permite_movimiento=True),
+            TipoDocumento(id=1, empresa_id=1, codigo="FV", nombre="Factura"),
+            Tercero(id=10, empresa_id=1, nit="10", razon_social="Cliente duplicado"),
+            Tercero(id=20, empresa_id=1, nit="20", razon_social="Cliente"),
+            Documento(empresa_id=1, tipo_documento_id=1, numero=1, fecha=date(2026, 1, 15), beneficiario_id=10, movimientos=[
+                MovimientoContable(cuenta_id=1, concepto="Venta", debito=500, credito=0),
+                MovimientoContable(cuenta_id=2, concepto="Venta", debito=0, credito=500),
+            ]),
+            # Movimiento con tercero propio en un documento de otro beneficiario
+            Documento(empresa_id=1, tipo_documento_id=1, numero=2, fecha=date(2026, 1, 20), beneficiario_id=20, movimientos=[
+                MovimientoContable(cuenta_id=1, tercero_id=10, concepto="Venta", debito=300, credito=0),
+                MovimientoContable(cuenta_id=2, concepto="Venta", debito=0, credito=300),
+            ]),
+            PeriodoContableCerrado(empresa_id=1, ano=2026, mes=1),
+        ])
+        self.db.commit()
+        saldos_cierre.congelar_saldos_periodo(self.db, 1, 2026, 1)
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def _saldo_inicial(self, tercero_id):
+        return saldos_cierre.saldos_anteriores_por_cuenta(self.db, 1, date(2026, 2, 1), cuenta_ids=[1],
+                                                          tercero_id=tercero_id)
+
+    def test_fusion_de_terceros_mueve_el_saldo_congelado(self):
+        self.assertEqual(self._saldo_inicial(20), {})
+        with contextlib.redirect_stdout(io.StringIO()):
+            tercero_service.fusionar_terceros(self.db, origen_id=10, destino_id=20, empresa_id=1)
+        self.assertIsNotNone(saldos_cierre.ultimo_cierre_valido(self.db, 1, date(2026, 1, 31)))
+        self.assertEqual(self._saldo_inicial(20), {1: (Decimal("800"), Decimal("0"))})
+        self.assertEqual(self._saldo_inicial(10), {})
+
+    def test_cambio_de_beneficiario_invalida_la_foto(self):
+        documento = self.db.query(Documento).filter(Documento.numero == 1).one()
+        documento.beneficiario_id = 20
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.db.commit()
+        self.assertIsNone(saldos_cierre.ultimo_cierre_valido(self.db, 1, date(2026, 1, 31)))
+        self.assertEqual(self._saldo_inicial(20), {1: (Decimal("500"), Decimal("0"))})
+
+    def test_update_masivo_del_tercero_invalida_la_foto(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.db.query(MovimientoContable).filter(MovimientoContable.tercero_id == 10).update(
+                {"tercero_id": 20}, synchronize_session=False
+            )
+            self.db.commit()
+        self.assertIsNone(saldos_cierre.ultimo_cierre_valido(self.db, 1, date(2026, 1, 31)))
+        self.assertEqual(self._saldo_inicial(20), {1: (Decimal("300"), Decimal("0"))})
+
+
+if __name__ == '__main__':
+    unittest.main()
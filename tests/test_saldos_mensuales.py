@@ -0,0 +1,105 @@
+import unittest
+import sys
+import os
+from datetime import date
+from unittest import mock
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.database import Base
+from app.models import Documento, Empresa, MovimientoContable, PlanCuenta, TipoDocumento
+from app.models.saldo_mensual import SaldoMensualCuenta
+from app.services import activo_fijo, saldos_cierre
+from app.services.saldos_mensuales import _segmentar_rango
+
+
+class TestSegmentarRango(unittest.TestCase):
+
+    def test_meses_completos_sin_dias_sueltos(self):
+        meses, en_vivo = _segmentar_rango(date(2026, 1, 1), date(2026, 3, 31))
+        self.assertEqual(meses, (202601, 202603))
+        self.assertEqual(en_vivo, [])
+
+    def test_meses_borde_se_consultan_en_vivo(self):
+        meses, en_vivo = _segmentar_rango(date(2026, 1, 15), date(2026, 3, 10))
+        self.assertEqual(meses, (202602, 202602))
+        self.assertEqual(en_vivo, [
+            (date(2026, 1, 15), date(2026, 1, 31)),
+            (date(2026, 3, 1), date(2026, 3, 10)),
+        ])
+
+    def test_rango_dentro_de_un_mes(self):
+        meses, en_vivo = _segmentar_rango(date(2026, 1, 3), date(2026, 1, 20))
+        self.assertIsNone(meses)
+        self.assertEqual(en_vivo, [(date(2026, 1, 3), date(2026, 1, 20))])
+
+    def test_saldo_inicial_desde_el_inicio(self):
+        # Saldo inicial al 15 de marzo: todo hasta febrero desde la tabla + 1..14 de marzo en vivo
+        meses, en_vivo = _segmentar_rango(None, date(2026, 3, 14))
+        self.assertEqual(meses, (None, 202602))
+        self.assertEqual(en_vivo, [(date(2026, 3, 1), date(2026, 3, 14))])
+
+    def test_sin_fecha_de_corte(self):
+        meses, en_vivo = _segmentar_rango(None, None)
+        self.assertEqual(meses, (None, None))
+        self.assertEqual(en_vivo, [])
+
+
+class TestEliminacionDocumentosActivos(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.db.add_all([
+            Empresa(id=1, razon_social="Empresa Uno", nit="900", is_lite_mode=True),
+            PlanCuenta(id=1, empresa_id=1, codigo="516005", nombre="Depreciación", nivel=4, permite_movimiento=True),
+            PlanCuenta(id=2, empresa_id=1, codigo="159205", nombre="Depreciación acumulada", nivel=4, permite_movimiento=True),
+            TipoDocumento(id=1, empresa_id=1, codigo="DEP", nombre="Depreciación"),
+        ])
+        for numero, fecha in ((1, date(2026, 1, 31)), (2, date(2026, 2, 28))):
+            self.db.add(Documento(empresa_id=1, tipo_documento_id=1, numero=numero, fecha=fecha,
+                                  observaciones="Depreciación mensual", movimientos=[
+                                      MovimientoContable(cuenta_id=1, concepto="Gasto", debito=1000, credito=0),
+                                      MovimientoContable(cuenta_id=2, concepto="Acumulada", debito=0, credito=1000),
+                                  ]))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def _saldos(self):
+        return self.db.query(func.sum(SaldoMensualCuenta.debito), func.sum(SaldoMensualCuenta.credito),
+                             func.sum(SaldoMensualCuenta.cantidad_movimientos)).one()
+
+    def test_eliminar_documentos_de_activos_retira_sus_saldos(self):
+        self.assertEqual(self._saldos(), (2000, 2000, 4))
+        resultado = activo_fijo.eliminar_todos_documentos_activos(self.db, 1, user_id=1)
+        self.assertEqual(resultado["documentos_eliminados"], 2)
+        self.assertEqual(self._saldos(), (0, 0, 0))
+
+    def test_borrar_movimientos_con_el_orm_retira_sus_saldos(self):
+        febrero = self.db.query(Documento).filter(Documento.numero == 2).one()
+        gasto = next(m for m in febrero.movimientos if m.cuenta_id == 1)
+        with mock.patch.object(saldos_cierre, "invalidar_desde") as invalidar:
+            self.db.delete(gasto)
+            self.db.commit()
+        invalidar.assert_called_once_with(mock.ANY, 1, 2026, 2)
+        fila = self.db.query(SaldoMensualCuenta).filter(SaldoMensualCuenta.cuenta_id == 1,
+                                                        SaldoMensualCuenta.mes == 2).one()
+        self.assertEqual((fila.debito, fila.credito, fila.cantidad_movimientos), (0, 0, 0))
+        self.assertEqual(self._saldos(), (1000, 2000, 3))
+
+        # Borrado en cascada con el documento
+        self.db.delete(self.db.query(Documento).filter(Documento.numero == 1).one())
+        self.db.commit()
+        self.assertEqual(self._saldos(), (0, 1000, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import unittest
+import sys
+import os
+import io
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+from unittest import mock
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core import database
+from app.core.config import settings
+from app.core.reporting_registry import BaseReport, ReportRegistry, reportar_avance, rows_to_csv, rows_to_xlsx
+from app.models.trabajo_reporte import TrabajoReporte
+from app.services import trabajos_reportes as trabajos
+
+
+class _FiltrosPrueba(BaseModel):
+    anio: int
+    cuenta: str = "1105"
+
+
+@ReportRegistry.register
+class _ReportePrueba(BaseReport):
+    key = "prueba_trabajos"
+    description = "Reporte de prueba"
+    filter_schema = _FiltrosPrueba
+    formats = ("csv", "xlsx")
+
+    avances = []
+
+    def generate_csv(self, db, empresa_id, filtros):
+        filtros_obj = _FiltrosPrueba(**filtros)
+        if filtros_obj.cuenta == "falla":
+            raise HTTPException(status_code=400, detail="Cuenta inválida")
+        if filtros_obj.cuenta == "avance":
+            return self._bloques_con_avance(), "prueba.csv"
+        return rows_to_csv(["ANIO", "CUENTA"], [[filtros_obj.anio, filtros_obj.cuenta]]), "prueba.csv"
+
+    def _bloques_con_avance(self):
+        for porcentaje in (0, 50):
+            reportar_avance(porcentaje, f"Bloque {porcentaje}")
+            db = database.SessionLocal()
+            trabajo = db.query(TrabajoReporte).one()
+            self.avances.append((trabajo.estado, trabajo.porcentaje, trabajo.mensaje))
+            db.close()
+            yield f"{porcentaje};".encode()
+
+
+class TestTrabajosReportes(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        TrabajoReporte.__table__.create(engine)
+        self.Sesion = sessionmaker(bind=engine)
+        self.db = self.Sesion()
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.parches = [
+            mock.patch.object(database, "SessionLocal", self.Sesion),
+            mock.patch.object(settings, "REPORTES_RESULTADOS_DIR", self.carpeta.name),
+            mock.patch.object(trabajos, "_MODULOS_REPORTES", ()),
+        ]
+        for parche in self.parches:
+            parche.start()
+
+    def tearDown(self):
+        for parche in self.parches:
+            parche.stop()
+        self.db.close()
+        self.carpeta.cleanup()
+
+    def _ejecutar(self, trabajo_id):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            trabajos.ejecutar_trabajo(trabajo_id, 1)
+        self.db.expire_all()
+
+    def test_deduplica_solicitudes_identicas_en_curso(self):
+        primero, nuevo = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2025})
+        self.assertTrue(nuevo)
+        # Mismos filtros con otra forma (default explícito, tipo distinto): misma huella
+        repetido, nuevo = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "CSV", {"anio": "2025", "cuenta": "1105"})
+        self.assertFalse(nuevo)
+        self.assertEqual(repetido.id, primero.id)
+
+        otro_formato, nuevo = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "xlsx", {"anio": 2025})
+        self.assertTrue(nuevo)
+        otra_empresa, nuevo = trabajos.crear_trabajo(self.db, 2, "prueba_trabajos", "csv", {"anio": 2025})
+        self.assertTrue(nuevo)
+        self.assertEqual(len({primero.id, otro_formato.id, otra_empresa.id}), 3)
+
+    def test_valida_formato_y_filtros(self):
+        with self.assertRaises(HTTPException) as ctx:
+            trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "pdf", {"anio": 2025})
+        self.assertEqual(ctx.exception.status_code, 400)
+        with self.assertRaises(HTTPException) as ctx:
+            trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {})
+        self.assertEqual(ctx.exception.status_code, 422)
+        with self.assertRaises(HTTPException) as ctx:
+            trabajos.crear_trabajo(self.db, 1, "no_existe", "csv", {})
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    def test_ejecuta_y_guarda_el_resultado(self):
+        trabajo, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2025})
+        self._ejecutar(trabajo.id)
+
+        progreso = trabajos.get_progreso(self.db, trabajo.id, 1)
+        self.assertEqual(progreso["estado"], "COMPLETADO")
+        self.assertEqual(progreso["porcentaje"], 100)
+        ruta, nombre, media_type = trabajos.get_archivo(self.db, trabajo.id, 1)
+        self.assertEqual(nombre, "prueba.csv")
+        self.assertTrue(media_type.startswith("text/csv"))
+        with open(ruta, "rb") as archivo:
+            self.assertIn(b"2025;1105", archivo.read())
+
+        # Terminado, una solicitud igual genera un trabajo nuevo
+        _, nuevo = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2025})
+        self.assertTrue(nuevo)
+
+    def test_error_queda_registrado(self):
+        trabajo, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2025, "cuenta": "falla"})
+        self._ejecutar(trabajo.id)
+        trabajo = trabajos.get_trabajo(self.db, trabajo.id, 1)
+        self.assertEqual(trabajo.estado, "ERROR")
+        self.assertEqual(trabajo.error, "Cuenta inválida")
+        with self.assertRaises(HTTPException) as ctx:
+            trabajos.get_archivo(self.db, trabajo.id, 1)
+        self.assertEqual(ctx.exception.status_code, 409)
+
+    def test_limpieza_expira_resultados_y_cierra_huerfanos(self):
+        completo, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2024})
+        self._ejecutar(completo.id)
+        ruta = completo.ruta_archivo
+        completo.fecha_expiracion = datetime.utcnow() - timedelta(minutes=1)
+
+        huerfano, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2023})
+        huerfano.estado = "EN_PROCESO"
+        huerfano.fecha_actualizacion = datetime.utcnow() - timedelta(hours=2)
+        self.db.commit()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            resumen = trabajos.limpiar_expirados()
+        self.assertEqual(resumen["expirados"], 1)
+        self.assertEqual(resumen["interrumpidos"], 1)
+        self.assertFalse(os.path.exists(ruta))
+        self.db.expire_all()
+        with self.assertRaises(HTTPException) as ctx:
+            trabajos.get_archivo(self.db, completo.id, 1)
+        self.assertEqual(ctx.exception.status_code, 410)
+        self.assertEqual(trabajos.get_trabajo(self.db, huerfano.id, 1).estado, "ERROR")
+
+    def test_pendiente_en_la_cola_de_otro_worker_no_es_huerfano(self):
+        # Encolado por otro proceso (no está en _activos) y esperando turno hace rato
+        trabajo, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2025})
+        trabajo.fecha_actualizacion = datetime.utcnow() - timedelta(hours=1)
+        self.db.commit()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            resumen = trabajos.limpiar_expirados()
+        self.assertEqual(resumen["interrumpidos"], 0)
+        repetido, nuevo = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2025})
+        self.assertFalse(nuevo)
+        self.assertEqual(repetido.id, trabajo.id)
+
+        # Cuando el worker dueño llega a él, lo genera
+        self._ejecutar(trabajo.id)
+        self.assertEqual(trabajos.get_trabajo(self.db, trabajo.id, 1).estado, "COMPLETADO")
+
+    def test_avance_del_reporte_queda_en_el_trabajo(self):
+        _ReportePrueba.avances = []
+        trabajo, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2025, "cuenta": "avance"})
+        with mock.patch.object(trabajos, "_INTERVALO_AVANCE", 0):
+            self._ejecutar(trabajo.id)
+        # El avance del reporte (0-100) se escala entre el arranque (10%) y el final
+        self.assertEqual(_ReportePrueba.avances, [("EN_PROCESO", 10, "Bloque 0"), ("EN_PROCESO", 52, "Bloque 50")])
+        self.assertEqual(trabajos.get_trabajo(self.db, trabajo.id, 1).porcentaje, 100)
+        # Fuera de un trabajo, reportar avance no hace nada
+        reportar_avance(80, "Sin trabajo")
+
+    def test_un_trabajo_tomado_por_otro_proceso_no_se_repite(self):
+        trabajo, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2025})
+        trabajo.estado = "EN_PROCESO"
+        self.db.commit()
+        self._ejecutar(trabajo.id)
+        trabajo = trabajos.get_trabajo(self.db, trabajo.id, 1)
+        self.assertEqual((trabajo.estado, trabajo.ruta_archivo), ("EN_PROCESO", None))
+
+    def test_al_iniciar_se_reencolan_los_trabajos_abiertos(self):
+        pendiente, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2021})
+        interrumpido, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2022})
+        en_otro_worker, _ = trabajos.crear_trabajo(self.db, 2, "prueba_trabajos", "csv", {"anio": 2023})
+        en_este_proceso, _ = trabajos.crear_trabajo(self.db, 1, "prueba_trabajos", "csv", {"anio": 2024})
+        interrumpido.estado = en_otro_worker.estado = "EN_PROCESO"
+        interrumpido.fecha_actualizacion = datetime.utcnow() - timedelta(minutes=10)
+        self.db.commit()
+
+        encolados = []
+        with mock.patch.object(trabajos, "_activos", {en_este_proceso.id}), \
+                mock.patch.object(trabajos, "programar", side_effect=lambda t_id, e_id: encolados.append((t_id, e_id))), \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(trabajos.recuperar_trabajos(), 2)
+        self.assertEqual(encolados, [(pendiente.id, 1), (interrumpido.id, 1)])
+        self.db.expire_all()
+        self.assertEqual(trabajos.get_trabajo(self.db, interrumpido.id, 1).estado, "PENDIENTE")
+        self.assertEqual(trabajos.get_trabajo(self.db, en_otro_worker.id, 2).estado, "EN_PROCESO")
+
+        # Reencolado, el trabajo interrumpido se genera normalmente
+        self._ejecutar(interrumpido.id)
+        self.assertEqual(trabajos.get_trabajo(self.db, interrumpido.id, 1).estado, "COMPLETADO")
+
+    def test_rows_to_xlsx(self):
+        from openpyxl import load_workbook
+        contenido = rows_to_xlsx(["A", "B"], [[1, "x"], [2, None]], title="Prueba")
+        hoja = load_workbook(io.BytesIO(contenido)).active
+        self.assertEqual([list(fila) for fila in hoja.iter_rows(values_only=True)], [["A", "B"], [1, "x"], [2, None]])
+
+
+if __name__ == '__main__':
+    unittest.main()